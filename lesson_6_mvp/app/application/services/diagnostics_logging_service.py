@@ -16,7 +16,10 @@ import pandas as pd
 
 from ...infrastructure.db import DB
 from ...infrastructure.market_data_service import MarketDataService
+from ...infrastructure.repositories.diagnostics_repository import DiagnosticsRepository
 from ...domain.market_diagnostics.diagnostics_logger import DiagnosticsLogger
+from ...domain.market_diagnostics.anomaly_detector import AnomalyDetector
+from ...domain.market_diagnostics.anomaly_stream import get_anomaly_stream
 from ...domain.market_diagnostics.report_builder import ReportBuilder
 from ...domain.market_diagnostics.analyzer import MarketAnalyzer
 from ...domain.market_diagnostics.scoring_engine import ScoringEngine
@@ -40,6 +43,9 @@ class DiagnosticsLoggingService:
         self.db = db
         self.market_data_service = market_data_service
         self.diagnostics_logger = DiagnosticsLogger(db)
+        self.anomaly_stream = get_anomaly_stream(db)
+        # прогрев рядов потока историей репозитория — тем же путём, что и в /doctor
+        self.anomaly_detector = AnomalyDetector(DiagnosticsRepository(db), stream=self.anomaly_stream)
         self.report_builder = ReportBuilder()
         self.market_analyzer = MarketAnalyzer()
         self.scoring_engine = ScoringEngine()
@@ -168,18 +174,22 @@ class DiagnosticsLoggingService:
                     )
                     
                     # Логируем снимок
+                    snapshot_ts = int(datetime.now(timezone.utc).timestamp() * 1000)
                     snapshot_id = self.diagnostics_logger.log_snapshot(
                         symbol=symbol,
                         timeframe=tf,
                         multi_tf_score=multi_tf_score,
                         diagnostics=diagnostics,
                         compact_report=compact_report,
-                        current_price=current_price
+                        current_price=current_price,
+                        timestamp_ms=snapshot_ts
                     )
                     
                     snapshot_ids[tf] = snapshot_id
                     logger.info(f"Logged snapshot {snapshot_id} for {symbol} {tf}")
                     
+                    self._observe_anomalies(symbol, tf, snapshot_ts, target_diag, derivatives_dict.get(tf) or {})
+                    
                 except Exception as e:
                     logger.error(f"Error logging snapshot for {symbol} {tf}: {e}", exc_info=True)
                     continue
@@ -189,6 +199,24 @@ class DiagnosticsLoggingService:
         
         return snapshot_ids
     
+    def _observe_anomalies(self, symbol: str, timeframe: str, timestamp_ms: int, diag, derivatives: Dict) -> list:
+        """
+        Потоковые статистики аномалий обновляются на каждом записанном снимке (O(1));
+        новый ряд (например, после рестарта) сначала прогревается историей репозитория.
+        """
+        self.anomaly_detector.ensure_warm(symbol, timeframe, before_ms=timestamp_ms)
+        alerts = self.anomaly_stream.observe(
+            symbol, timeframe, timestamp_ms,
+            risk_score=diag.risk_score,
+            pump_score=diag.pump_score,
+            phase=diag.phase,
+            funding=derivatives.get('funding_rate'),
+            oi_change=derivatives.get('oi_change_pct')
+        )
+        for alert in alerts:
+            logger.info(f"Anomaly {alert.anomaly_type} for {symbol} {timeframe}: score={alert.score:.2f}")
+        return alerts
+    
     async def compute_results_for_snapshots(
         self,
         symbol: str,
@@ -422,10 +450,13 @@ class DiagnosticsLoggingService:
             return None
     
     async def _get_derivatives(self, symbol: str) -> Dict:
-        """Получить данные деривативов."""
-        # Упрощённо возвращаем пустой словарь
-        # В реальности нужно получать funding rate, OI и т.д.
-        return {}
+        """Получить данные деривативов (funding, OI Δ%, CVD) — как в /doctor; при ошибке пустой словарь."""
+        try:
+            snapshot = await self.market_data_service.get_derivatives(symbol)
+            return snapshot.to_dict()
+        except Exception as e:
+            logger.debug(f"Derivatives unavailable for {symbol}: {e}")
+            return {}
 
 
 async def run_periodic_logging(
@@ -78,6 +78,8 @@ class MarketScannerService:
         self.tradability_analyzer = TradabilityAnalyzer(db)
         self.calibration_service = CalibrationService(db)
         self.regime_analyzer = GlobalRegimeAnalyzer(db)
+        # все разобранные символы последнего scan_universe (до фильтров) — для алертов watchlist
+        self.last_analyzed: List[SetupCandidate] = []
     
     @property
     def report_renderer(self):
@@ -133,6 +135,7 @@ class MarketScannerService:
         results = await asyncio.gather(*tasks, return_exceptions=True)
         
         # Обрабатываем результаты
+        self.last_analyzed = []
         for symbol, result in zip(symbols, results):
             if isinstance(result, Exception):
                 logger.debug(f"Failed to analyze {symbol}: {result}")
@@ -141,6 +144,7 @@ class MarketScannerService:
             candidate = result
             if not candidate:
                 continue
+            self.last_analyzed.append(candidate)
             
             # Используем адаптивный порог вместо статического
             effective_threshold = self.calibration_service.get_effective_pump_threshold(
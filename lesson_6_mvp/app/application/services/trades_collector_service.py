@@ -4,7 +4,7 @@
 Собирает данные каждый час и хранит их в БД для быстрого доступа.
 """
 
-from typing import List, Dict
+from typing import List, Dict, Optional
 from datetime import datetime
 import logging
 
@@ -16,27 +16,31 @@ logger = logging.getLogger("alt_forecast.services.trades_collector")
 class TradesCollectorService:
     """Сервис для сбора сделок с бирж и сохранения в БД."""
     
-    def __init__(self, db):
+    def __init__(self, db, exchange_clients: Optional[List] = None):
         """
         Args:
             db: Экземпляр DB для работы с базой данных
+            exchange_clients: Клиенты бирж (по умолчанию get_exchange_clients(); replay подставляет заглушки)
         """
         self.db = db
-        self.exchange_clients = get_exchange_clients()
+        self.exchange_clients = exchange_clients if exchange_clients is not None else get_exchange_clients()
         self.symbols = ["BTCUSDT", "ETHUSDT", "SOLUSDT", "XRPUSDT"]
     
-    def collect_trades_for_symbol(self, symbol: str, window_minutes: int = 60) -> int:
+    def collect_trades_for_symbol(self, symbol: str, window_minutes: int = 60,
+                                  now_ms: Optional[int] = None) -> int:
         """
         Собрать сделки для символа за последние N минут.
         
         Args:
             symbol: Символ торговли (например, "BTCUSDT")
             window_minutes: Окно сбора данных в минутах (по умолчанию 60)
+            now_ms: Текущее время в мс (по умолчанию — системное; replay передаёт симулированное)
         
         Returns:
             Количество собранных сделок
         """
-        now_ms = int(datetime.now().timestamp() * 1000)
+        if now_ms is None:
+            now_ms = int(datetime.now().timestamp() * 1000)
         since_ms = now_ms - (window_minutes * 60 * 1000)
         collected_at = now_ms
         
@@ -60,6 +64,7 @@ class TradesCollectorService:
                         "price": trade["price"],
                         "qty": trade["qty"],
                         "is_buyer": trade["is_buyer"],
+                        "trade_id": trade.get("trade_id"),
                         "collected_at": collected_at,
                     })
                 
@@ -78,12 +83,13 @@ class TradesCollectorService:
         
         return len(all_trades)
     
-    def collect_all_symbols(self, window_minutes: int = 60) -> Dict[str, int]:
+    def collect_all_symbols(self, window_minutes: int = 60, now_ms: Optional[int] = None) -> Dict[str, int]:
         """
         Собрать сделки для всех символов.
         
         Args:
             window_minutes: Окно сбора данных в минутах (по умолчанию 60)
+            now_ms: Текущее время в мс (см. collect_trades_for_symbol)
         
         Returns:
             Словарь {symbol: количество_собранных_сделок}
@@ -92,7 +98,7 @@ class TradesCollectorService:
         
         for symbol in self.symbols:
             try:
-                count = self.collect_trades_for_symbol(symbol, window_minutes)
+                count = self.collect_trades_for_symbol(symbol, window_minutes, now_ms=now_ms)
                 results[symbol] = count
             except Exception as e:
                 logger.exception(f"Error collecting trades for {symbol}: {e}")
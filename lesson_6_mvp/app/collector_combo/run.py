@@ -91,9 +91,17 @@ http = _session_with_retries()
 
 values_lock = threading.Lock()
 # держим минутные точки (ts_ms, value) для агрегации в OHLC
-values: Dict[str, Deque[Tuple[int, float]]] = defaultdict(lambda: deque(maxlen=24 * 60 + 10))  # ~сутки минуток
+POINTS_MAXLEN = 24 * 60 + 10  # ~сутки минуток
+values: Dict[str, Deque[Tuple[int, float]]] = defaultdict(lambda: deque(maxlen=POINTS_MAXLEN))
 
-db = DB(DB_PATH)
+_db: Optional[DB] = None
+
+def get_db() -> DB:
+    # ленивое открытие: модуль импортируется replay-харнессом без /data/data.db
+    global _db
+    if _db is None:
+        _db = DB(DB_PATH)
+    return _db
 
 def now_ms() -> int:
     return int(time.time() * 1000)
@@ -113,6 +121,31 @@ def upsert_bar_from_points(metric: str, tf: str, points: List[Tuple[int, float]]
     c = points[-1][1]
     return (metric, tf, ts_close, o, h, l, c, None)
 
+def flush_windows(
+    points_by_metric: Dict[str, Deque[Tuple[int, float]]],
+    last_written: Dict[Tuple[str, str], int],
+    ts: int,
+) -> List[Tuple[str, str, int, float, float, float, float, None]]:
+    """
+    Закрывает окна 15m/1h/4h/1d на момент ts: по одному бару на (metric, tf) за окно
+    (ts_close - tf, ts_close]. last_written обновляется — повторный вызов в том же окне пуст.
+    """
+    batch: List[Tuple[str, str, int, float, float, float, float, None]] = []
+    for metric, dq in list(points_by_metric.items()):
+        if not dq:
+            continue
+        for tf, (_, tf_ms) in INTERVALS.items():
+            ts_close = floor_ts(ts, tf_ms)
+            key = (metric, tf)
+            if last_written.get(key) == ts_close:
+                continue
+            win = [(t, v) for (t, v) in dq if (ts_close - tf_ms) < t <= ts_close]
+            item = upsert_bar_from_points(metric, tf, win)
+            if item:
+                batch.append(item)
+                last_written[key] = ts_close
+    return batch
+
 # -------- источники --------
 
 def binance_klines(symbol: str, interval: str, limit=2):
@@ -221,29 +254,13 @@ def flusher():
     Пишем батчами и идемпотентно.
     """
     last_written: dict[tuple[str, str], int] = {}
-    tfs = list(INTERVALS.items())
     while True:
         try:
-            ts = now_ms()
-            batch: List[Tuple[str, str, int, float, float, float, float, None]] = []
             with values_lock:
-                # копия ссылок, чтобы минимизировать время локов
-                for metric, dq in list(values.items()):
-                    if not dq:
-                        continue
-                    for tf, (_, tf_ms) in tfs:
-                        ts_close = floor_ts(ts, tf_ms)
-                        key = (metric, tf)
-                        if last_written.get(key) == ts_close:
-                            continue
-                        # окно (ts_close - tf, ts_close]
-                        win = [(t, v) for (t, v) in dq if (ts_close - tf_ms) < t <= ts_close]
-                        item = upsert_bar_from_points(metric, tf, win)
-                        if item:
-                            batch.append(item)
-                            last_written[key] = ts_close
+                batch = flush_windows(values, last_written, now_ms())
             if batch:
                 # быстрее одной транзакцией
+                db = get_db()
                 with db.atomic():
                     db.upsert_many_bars(batch)
                 log.info("[flush] wrote %d bars", len(batch))
@@ -325,6 +342,7 @@ def tv_fetcher():
                         log.warning("[tv] error %s %s: %s", metric, tf, e)
 
             if batch:
+                db = get_db()
                 with db.atomic():
                     db.upsert_many_bars(batch)
                 log.info("[tv] wrote %d bars total", len(batch))
@@ -6,6 +6,7 @@
 
 from typing import List, Optional, Tuple, Dict, Any
 from dataclasses import dataclass
+from . import kernels as K
 from .models import Metric, Timeframe, Divergence
 from .services import rsi, macd, ema, pivots_high, pivots_low, _last_two_indices, _strength_tag, _alts_implication
 import math
@@ -29,110 +30,24 @@ class DivergenceSignal:
 def stochastic(highs: List[float], lows: List[float], closes: List[float], 
                k_period: int = 14, d_period: int = 3) -> Tuple[List[Optional[float]], List[Optional[float]]]:
     """Вычислить Stochastic Oscillator (%K и %D)."""
-    n = len(closes)
-    if n < k_period:
-        return [None] * n, [None] * n
-    
-    k_values: List[Optional[float]] = [None] * n
-    d_values: List[Optional[float]] = [None] * n
-    
-    for i in range(k_period - 1, n):
-        period_high = max(highs[i - k_period + 1:i + 1])
-        period_low = min(lows[i - k_period + 1:i + 1])
-        
-        if period_high != period_low:
-            k = 100 * (closes[i] - period_low) / (period_high - period_low)
-            k_values[i] = k
-        else:
-            k_values[i] = 50.0
-    
-    # %D - сглаженная %K
-    for i in range(k_period + d_period - 2, n):
-        k_sum = sum(k_values[i - d_period + 1:i + 1])
-        if k_sum is not None:
-            d_values[i] = k_sum / d_period
-    
-    return k_values, d_values
+    k_values, d_values = K.stochastic(highs, lows, closes, k_period, d_period)
+    return K.to_optional_list(k_values), K.to_optional_list(d_values)
 
 
 def cci(highs: List[float], lows: List[float], closes: List[float], period: int = 20) -> List[Optional[float]]:
     """Вычислить Commodity Channel Index (CCI)."""
-    n = len(closes)
-    if n < period:
-        return [None] * n
-    
-    tp = [(h + l + c) / 3.0 for h, l, c in zip(highs, lows, closes)]  # Typical Price
-    cci_values: List[Optional[float]] = [None] * n
-    
-    for i in range(period - 1, n):
-        tp_sma = sum(tp[i - period + 1:i + 1]) / period
-        mean_dev = sum(abs(tp[j] - tp_sma) for j in range(i - period + 1, i + 1)) / period
-        
-        if mean_dev != 0:
-            cci_values[i] = (tp[i] - tp_sma) / (0.015 * mean_dev)
-        else:
-            cci_values[i] = 0.0
-    
-    return cci_values
+    return K.to_optional_list(K.cci(highs, lows, closes, period))
 
 
 def mfi(highs: List[float], lows: List[float], closes: List[float], 
         volumes: List[Optional[float]], period: int = 14) -> List[Optional[float]]:
     """Вычислить Money Flow Index (MFI)."""
-    n = len(closes)
-    if n < period + 1:
-        return [None] * n
-    
-    tp = [(h + l + c) / 3.0 for h, l, c in zip(highs, lows, closes)]  # Typical Price
-    mfi_values: List[Optional[float]] = [None] * n
-    
-    raw_money_flow: List[Optional[float]] = [None] * n
-    for i in range(1, n):
-        if volumes[i] is not None and volumes[i] > 0:
-            raw_money_flow[i] = tp[i] * volumes[i]
-        else:
-            raw_money_flow[i] = None
-    
-    for i in range(period, n):
-        positive_flow = 0.0
-        negative_flow = 0.0
-        
-        for j in range(i - period + 1, i + 1):
-            if raw_money_flow[j] is not None and j > 0:
-                if tp[j] > tp[j - 1]:
-                    positive_flow += raw_money_flow[j] or 0.0
-                elif tp[j] < tp[j - 1]:
-                    negative_flow += raw_money_flow[j] or 0.0
-        
-        if negative_flow != 0:
-            mfi_values[i] = 100 - (100 / (1 + positive_flow / negative_flow))
-        else:
-            mfi_values[i] = 100.0 if positive_flow > 0 else 50.0
-    
-    return mfi_values
+    return K.to_optional_list(K.mfi(highs, lows, closes, volumes, period))
 
 
 def obv(closes: List[float], volumes: List[Optional[float]]) -> List[Optional[float]]:
     """Вычислить On-Balance Volume (OBV)."""
-    n = len(closes)
-    if n < 2:
-        return [None] * n
-    
-    obv_values: List[Optional[float]] = [None] * n
-    obv_values[0] = volumes[0] if volumes[0] is not None else 0.0
-    
-    for i in range(1, n):
-        prev_obv = obv_values[i - 1] or 0.0
-        vol = volumes[i] if volumes[i] is not None else 0.0
-        
-        if closes[i] > closes[i - 1]:
-            obv_values[i] = prev_obv + vol
-        elif closes[i] < closes[i - 1]:
-            obv_values[i] = prev_obv - vol
-        else:
-            obv_values[i] = prev_obv
-    
-    return obv_values
+    return K.to_optional_list(K.obv(closes, volumes))
 
 
 def detect_divergences(
@@ -0,0 +1,293 @@
+# app/domain/kernels.py
+"""
+Векторные ядра индикаторов на NumPy (опционально Numba) с семантикой domain/services.py
+и domain/divergence_detector.py. Паритет — в пределах float-допуска (rtol 1e-9, см. tests/test_kernels.py):
+порядок операций в блочных рекурсиях другой, поэтому значения могут отличаться в последних битах;
+прогрев (NaN/None), пивоты и ветки «== 0» совпадают точно.
+
+- на вход — что угодно, приводимое к np.ndarray float64 (list / ndarray; None → NaN);
+- на выход — np.ndarray float64, прогрев (там, где список-версия отдаёт None) = NaN;
+- EMA засевается SMA первых `period` значений, RSI — Уайлдер (SMA-затравка, затем
+  avg = (avg·(p−1) + x) / p), как в исходных циклах;
+- пивоты — строгие неравенства против `left`/`right` соседей.
+
+Рекурсивные фильтры (EMA, Уайлдер) в чистом NumPy считаются блоками в замкнутой форме
+(y_t = a·y_{t−1} + b·x_t), окна (CCI, MFI, Stochastic) — через sliding_window_view
+без накопленных сумм, поэтому нули в окнах остаются точными нулями (ветки «== 0» совпадают).
+Если установлен numba (и KERNELS_NUMBA != 0), рекурсии идут через @njit-циклы.
+
+Списочные обёртки с None — to_optional_list(); публичный API services.py остаётся прежним.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from typing import Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+__all__ = [
+    "HAS_NUMBA", "as_array", "to_optional_list",
+    "ema", "wilder", "rsi", "macd", "true_range", "atr",
+    "pivots_high", "pivots_low", "last_two_true",
+    "stochastic", "cci", "mfi", "obv",
+]
+
+# ---------- backend ----------
+
+HAS_NUMBA = False
+if os.getenv("KERNELS_NUMBA", "1") != "0":
+    try:
+        from numba import njit
+
+        @njit(cache=True)
+        def _linear_filter_nb(x, a, b, y0):
+            out = np.empty(x.shape[0])
+            y = y0
+            for i in range(x.shape[0]):
+                y = a * y + b * x[i]
+                out[i] = y
+            return out
+
+        HAS_NUMBA = True
+    except ImportError:
+        pass
+
+# |log(a^-B)| ≤ 27.6 → множители в блоке не больше 1e12 (ошибка ~B·eps относительно |x|)
+_BLOCK_LOG_RANGE = 27.6
+
+
+def _linear_filter_np(x: np.ndarray, a: float, b: float, y0: float) -> np.ndarray:
+    """y_t = a·y_{t−1} + b·x_t, y_{−1} = y0 — блочно в замкнутой форме."""
+    n = x.shape[0]
+    out = np.empty(n)
+    if n == 0:
+        return out
+    if a <= 0.0:
+        out[:] = b * x
+        return out
+    la = -math.log(a)
+    block = n if la == 0.0 else max(1, min(n, int(_BLOCK_LOG_RANGE / la)))
+    t = np.arange(block, dtype=float)
+    pw = np.exp(-la * t)          # a^t
+    inv = np.exp(la * t)          # a^-t
+    y = y0
+    for s in range(0, n, block):
+        xs = x[s:s + block]
+        m = xs.shape[0]
+        c = np.cumsum(xs * inv[:m])
+        seg = pw[:m] * (a * y + b * c)
+        out[s:s + m] = seg
+        y = seg[-1]
+    return out
+
+
+def _linear_filter(x: np.ndarray, a: float, b: float, y0: float) -> np.ndarray:
+    if HAS_NUMBA:
+        return _linear_filter_nb(np.ascontiguousarray(x, dtype=np.float64), float(a), float(b), float(y0))
+    return _linear_filter_np(x, a, b, y0)
+
+
+# ---------- конверсия ----------
+
+def as_array(values) -> np.ndarray:
+    """list/tuple/ndarray → float64 ndarray; None → NaN."""
+    if isinstance(values, np.ndarray) and values.dtype == np.float64:
+        return values
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except TypeError:
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def to_optional_list(arr: np.ndarray) -> list:
+    """NaN → None (формат списочных функций services.py)."""
+    return [None if v != v else v for v in arr.tolist()]
+
+
+# ---------- скользящие средние / осцилляторы ----------
+
+def ema(values, period: int) -> np.ndarray:
+    """EMA с SMA-затравкой в индексе period−1; до него NaN (n < period → всё NaN)."""
+    x = as_array(values)
+    n = x.shape[0]
+    out = np.full(n, np.nan)
+    if period <= 0 or n < period:
+        return out
+    k = 2.0 / (period + 1)
+    seed = float(sum(x[:period].tolist())) / period   # та же последовательность сложения, что sum(list)
+    out[period - 1] = seed
+    if n > period:
+        out[period:] = _linear_filter(x[period:], 1.0 - k, k, seed)
+    return out
+
+
+def wilder(values, period: int, start: int = 0) -> np.ndarray:
+    """
+    Сглаживание Уайлдера: SMA первых `period` значений начиная со start (результат в start+period−1),
+    далее avg = (avg·(p−1) + x) / p.
+    """
+    x = as_array(values)
+    n = x.shape[0]
+    out = np.full(n, np.nan)
+    first = start + period - 1
+    if period <= 0 or n <= first:
+        return out
+    seed = float(sum(x[start:start + period].tolist())) / period
+    out[first] = seed
+    if n > first + 1:
+        out[first + 1:] = _linear_filter(x[first + 1:], (period - 1) / period, 1.0 / period, seed)
+    return out
+
+
+def rsi(values, period: int = 14) -> np.ndarray:
+    """RSI Уайлдера; первое значение в индексе period; avg_loss == 0 → 100."""
+    x = as_array(values)
+    n = x.shape[0]
+    if n < period + 1:
+        return np.full(n, np.nan)
+    ch = np.empty(n)
+    ch[0] = 0.0
+    ch[1:] = x[1:] - x[:-1]
+    gains = np.maximum(ch, 0.0)
+    losses = -np.minimum(ch, 0.0)
+    avg_gain = wilder(gains, period, start=1)
+    avg_loss = wilder(losses, period, start=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = np.where(avg_loss != 0, avg_gain / avg_loss, np.inf)
+        out = 100 - (100 / (1 + rs))
+    out[:period] = np.nan
+    return out
+
+
+def macd(values, fast: int = 12, slow: int = 26, signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(macd, signal, hist). Сигнал — EMA линии MACD, где прогрев заменён нулями (как в services.macd)."""
+    x = as_array(values)
+    line = ema(x, fast) - ema(x, slow)
+    sig = ema(np.where(np.isnan(line), 0.0, line), signal)
+    return line, sig, line - sig
+
+
+def true_range(highs, lows, closes) -> np.ndarray:
+    """TR; для первого бара — high − low."""
+    h, l, c = as_array(highs), as_array(lows), as_array(closes)
+    tr = h - l
+    if tr.shape[0] > 1:
+        prev = c[:-1]
+        tr[1:] = np.maximum(np.maximum(tr[1:], np.abs(h[1:] - prev)), np.abs(l[1:] - prev))
+    return tr
+
+
+def atr(highs, lows, closes, period: int = 14) -> np.ndarray:
+    """ATR = EMA(TR, period) — вариант services.atr (не Уайлдер)."""
+    return ema(true_range(highs, lows, closes), period)
+
+
+# ---------- пивоты ----------
+
+def _pivots(x: np.ndarray, left: int, right: int, higher: bool) -> np.ndarray:
+    n = x.shape[0]
+    res = np.zeros(n, dtype=bool)
+    if n - right <= left:
+        return res
+    core = x[left:n - right]
+    ok = np.ones(core.shape[0], dtype=bool)
+    for j in range(1, left + 1):
+        other = x[left - j:n - right - j]
+        ok &= (core > other) if higher else (core < other)
+    for j in range(1, right + 1):
+        other = x[left + j:n - right + j]
+        ok &= (core > other) if higher else (core < other)
+    res[left:n - right] = ok
+    return res
+
+
+def pivots_high(values, left: int = 2, right: int = 2) -> np.ndarray:
+    """Строгий локальный максимум относительно left/right соседей."""
+    return _pivots(as_array(values), left, right, True)
+
+
+def pivots_low(values, left: int = 2, right: int = 2) -> np.ndarray:
+    """Строгий локальный минимум относительно left/right соседей."""
+    return _pivots(as_array(values), left, right, False)
+
+
+def last_two_true(flags) -> list:
+    """Индексы двух последних True (как services._last_two_indices)."""
+    return np.flatnonzero(np.asarray(flags, dtype=bool))[-2:].tolist()
+
+
+# ---------- индикаторы divergence_detector ----------
+
+def stochastic(highs, lows, closes, k_period: int = 14, d_period: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """%K (50 при нулевом диапазоне) и %D = SMA(%K, d_period)."""
+    h, l, c = as_array(highs), as_array(lows), as_array(closes)
+    n = c.shape[0]
+    k = np.full(n, np.nan)
+    d = np.full(n, np.nan)
+    if n < k_period:
+        return k, d
+    hh = sliding_window_view(h, k_period).max(axis=1)
+    ll = sliding_window_view(l, k_period).min(axis=1)
+    rng = hh - ll
+    cc = c[k_period - 1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k[k_period - 1:] = np.where(rng != 0, 100 * (cc - ll) / rng, 50.0)
+    first_d = k_period + d_period - 2
+    if n > first_d:
+        d[first_d:] = sliding_window_view(k[k_period - 1:], d_period).sum(axis=1) / d_period
+    return k, d
+
+
+def cci(highs, lows, closes, period: int = 20) -> np.ndarray:
+    """CCI по typical price; среднее отклонение считается по окну (0 → CCI = 0)."""
+    h, l, c = as_array(highs), as_array(lows), as_array(closes)
+    n = c.shape[0]
+    out = np.full(n, np.nan)
+    if n < period:
+        return out
+    tp = (h + l + c) / 3.0
+    win = sliding_window_view(tp, period)
+    sma = win.sum(axis=1) / period
+    mean_dev = np.abs(win - sma[:, None]).sum(axis=1) / period
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out[period - 1:] = np.where(mean_dev != 0, (tp[period - 1:] - sma) / (0.015 * mean_dev), 0.0)
+    return out
+
+
+def mfi(highs, lows, closes, volumes, period: int = 14) -> np.ndarray:
+    """MFI; бары без объёма (None/≤0) в поток не входят; neg == 0 → 100 (если pos > 0) иначе 50."""
+    h, l, c = as_array(highs), as_array(lows), as_array(closes)
+    n = c.shape[0]
+    out = np.full(n, np.nan)
+    if n < period + 1:
+        return out
+    v = as_array(volumes)
+    tp = (h + l + c) / 3.0
+    valid = np.zeros(n, dtype=bool)
+    valid[1:] = v[1:] > 0                       # NaN (None) > 0 → False
+    rmf = np.where(valid, tp * np.where(valid, v, 0.0), 0.0)
+    up = np.zeros(n, dtype=bool)
+    dn = np.zeros(n, dtype=bool)
+    up[1:] = tp[1:] > tp[:-1]
+    dn[1:] = tp[1:] < tp[:-1]
+    pos = sliding_window_view(np.where(up, rmf, 0.0), period).sum(axis=1)[1:]
+    neg = sliding_window_view(np.where(dn, rmf, 0.0), period).sum(axis=1)[1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out[period:] = np.where(neg != 0, 100 - (100 / (1 + pos / neg)), np.where(pos > 0, 100.0, 50.0))
+    return out
+
+
+def obv(closes, volumes) -> np.ndarray:
+    """OBV; None-объём = 0; первый бар = его объём."""
+    c = as_array(closes)
+    n = c.shape[0]
+    if n < 2:
+        return np.full(n, np.nan)
+    v = np.nan_to_num(as_array(volumes), nan=0.0)
+    step = np.zeros(n)
+    step[0] = v[0]
+    step[1:] = np.where(c[1:] > c[:-1], v[1:], np.where(c[1:] < c[:-1], -v[1:], 0.0))
+    return np.cumsum(step)
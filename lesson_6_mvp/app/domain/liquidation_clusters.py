@@ -0,0 +1,251 @@
+# app/domain/liquidation_clusters.py
+"""
+Векторная аналитика ликвидаций на NumPy: кластеры по ценовым корзинам и метрики окна
+за один проход группировки вместо словарей и повторных обходов списков уровней.
+
+События — колонки (ts, venue, is_long, price, usd) одной сортировкой по времени;
+биржи — коды в кортеже venues. Дальше:
+
+- корзины: ширина масштабируется волатильностью — ref · σ / LIQ_BUCKETS_PER_SIGMA, где σ —
+  переданная волатильность (доля) или робастный разброс лог-цен событий 1.4826·MAD;
+  ширина округлена вверх до 1/2/5·10^k и зажата в [LIQ_BUCKET_MIN_BPS, LIQ_BUCKET_MAX_BPS] от ref;
+- группировка: ключ (корзина, сторона) → np.unique(return_inverse), затем bincount по весам:
+  сумма USD, цена, взвешенная USD, число событий, сила кластера с экспоненциальным
+  затуханием 0.5^(возраст / half-life) и присутствие бирж (bincount по ключ × venue);
+- метрики окна из тех же сумм: long/short, скорость USD/ч, HHI по кластерам
+  Σ(usd_k / Σusd)² и разбивка по биржам;
+- rolling: скользящие окна по накопленным суммам и searchsorted по ts, без цикла по окнам.
+
+    ev = LiquidationEvents.from_rows([(ts, "bybit", "long", price, usd), ...])
+    st = analyze(ev, now_ms=now, hours=48, ref_price=px)   # LiquidationStats с кластерами
+    levels = st.clusters                                   # по убыванию цены, как прежние уровни
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+__all__ = [
+    "LiquidationEvents", "Cluster", "LiquidationStats",
+    "nice_step", "bucket_width", "analyze", "rolling",
+]
+
+HOUR_MS = 3_600_000
+LIQ_BUCKETS_PER_SIGMA = 4.0         # корзин на одну σ цены
+LIQ_BUCKET_MIN_BPS = 2.0            # не уже 0.02% от ref
+LIQ_BUCKET_MAX_BPS = 200.0          # не шире 2% от ref
+LIQ_HALF_LIFE_H = 12.0              # затухание силы кластера
+_MAD_SIGMA = 1.4826                 # MAD → σ для нормального распределения
+
+
+class LiquidationEvents:
+    """Колоночный журнал ликвидаций одного инструмента, отсортированный по ts."""
+
+    __slots__ = ("venues", "ts", "venue", "is_long", "price", "usd")
+
+    def __init__(self, venues: Sequence[str], ts: np.ndarray, venue: np.ndarray, is_long: np.ndarray,
+                 price: np.ndarray, usd: np.ndarray):
+        ts = np.asarray(ts, dtype=np.int64)
+        order = np.argsort(ts, kind="stable")
+        self.venues: Tuple[str, ...] = tuple(venues)
+        self.ts = ts[order]
+        self.venue = np.asarray(venue, dtype=np.int64)[order]
+        self.is_long = np.asarray(is_long, dtype=bool)[order]
+        self.price = np.asarray(price, dtype=float)[order]
+        self.usd = np.asarray(usd, dtype=float)[order]
+
+    @classmethod
+    def empty(cls) -> "LiquidationEvents":
+        z = np.zeros(0)
+        return cls((), z, z, z, z, z)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable) -> "LiquidationEvents":
+        """Из кортежей (ts, venue, side, price, usd); side — 'long'/'buy' или 'short'/'sell'.
+        Строки с неизвестной стороной и неположительными ценой/объёмом пропускаются."""
+        ts, venue, is_long, price, usd = [], [], [], [], []
+        for t, v, side, p, u in rows:
+            side = str(side).lower()
+            if side not in ("long", "buy", "short", "sell"):
+                continue
+            p, u = float(p), float(u)
+            if not (p > 0 and u > 0):
+                continue
+            ts.append(int(t))
+            venue.append(str(v))
+            is_long.append(side in ("long", "buy"))
+            price.append(p)
+            usd.append(u)
+        venues = sorted(set(venue))
+        index = {v: i for i, v in enumerate(venues)}
+        return cls(venues, np.array(ts, dtype=np.int64), np.array([index[v] for v in venue], dtype=np.int64),
+                   np.array(is_long, dtype=bool), np.array(price, dtype=float), np.array(usd, dtype=float))
+
+    @classmethod
+    def concat(cls, parts: Iterable["LiquidationEvents"]) -> "LiquidationEvents":
+        """Склейка журналов разных бирж: коды venue перенумеровываются в общий словарь."""
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return cls.empty()
+        venues = sorted({v for p in parts for v in p.venues})
+        index = {v: i for i, v in enumerate(venues)}
+        codes = [np.array([index[v] for v in p.venues], dtype=np.int64)[p.venue] for p in parts]
+        return cls(venues, np.concatenate([p.ts for p in parts]), np.concatenate(codes),
+                   np.concatenate([p.is_long for p in parts]), np.concatenate([p.price for p in parts]),
+                   np.concatenate([p.usd for p in parts]))
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def window(self, since_ms: Optional[int] = None, until_ms: Optional[int] = None) -> "LiquidationEvents":
+        """Срез [since_ms, until_ms] по времени (бинарный поиск по отсортированному ts)."""
+        lo = 0 if since_ms is None else int(np.searchsorted(self.ts, since_ms, side="left"))
+        hi = len(self.ts) if until_ms is None else int(np.searchsorted(self.ts, until_ms, side="right"))
+        s = slice(lo, hi)
+        out = LiquidationEvents.__new__(LiquidationEvents)
+        out.venues = self.venues
+        out.ts, out.venue, out.is_long, out.price, out.usd = \
+            self.ts[s], self.venue[s], self.is_long[s], self.price[s], self.usd[s]
+        return out
+
+
+@dataclass(frozen=True)
+class Cluster:
+    """Кластер ликвидаций: корзина цены × сторона."""
+    level: float                 # якорь корзины: k · width (floor — нижняя граница, nearest — центр)
+    price: float                 # средняя цена, взвешенная USD
+    side: str                    # "long" | "short"
+    usd: float
+    strength: float              # USD с затуханием по возрасту событий
+    count: int
+    venues: Tuple[str, ...]
+
+    @property
+    def exchange(self) -> str:
+        return "+".join(self.venues)
+
+
+@dataclass(frozen=True)
+class LiquidationStats:
+    count: int
+    total_usd: float
+    long_usd: float
+    short_usd: float
+    long_short_ratio: float      # inf, если шортов нет, а лонги есть; 0 — если пусто
+    velocity_usd_h: float
+    hhi: float                   # концентрация по кластерам, 0..1
+    width: float                 # ширина корзины
+    clusters: List[Cluster] = field(default_factory=list)
+    by_venue: Dict[str, float] = field(default_factory=dict)
+
+
+def nice_step(x: float, up: bool = True) -> float:
+    """Ближайший шаг вида 1/2/5 · 10^k: сверху (up) или снизу."""
+    if not (x > 0 and math.isfinite(x)):
+        return 0.0
+    base = 10.0 ** math.floor(math.log10(x))
+    cands = [m * base for m in (1.0, 2.0, 5.0, 10.0)]
+    if up:
+        return next(c for c in cands if x <= c * (1 + 1e-9))
+    return [c for c in cands if c <= x * (1 + 1e-9)][-1]
+
+
+def bucket_width(price, ref_price: Optional[float] = None, vol: Optional[float] = None,
+                 per_sigma: float = LIQ_BUCKETS_PER_SIGMA,
+                 min_bps: float = LIQ_BUCKET_MIN_BPS, max_bps: float = LIQ_BUCKET_MAX_BPS) -> float:
+    """Ширина ценовой корзины, масштабированная волатильностью (см. модульный docstring)."""
+    price = np.asarray(price, dtype=float)
+    price = price[price > 0]
+    ref = float(ref_price) if ref_price else (float(np.median(price)) if len(price) else 0.0)
+    if not ref > 0:
+        return 0.0
+    if vol is None or not vol > 0:
+        lp = np.log(price) if len(price) else np.zeros(1)
+        vol = _MAD_SIGMA * float(np.median(np.abs(lp - np.median(lp))))
+    w = nice_step(max(ref * float(vol) / per_sigma, ref * min_bps / 1e4))
+    return min(w, nice_step(ref * max_bps / 1e4, up=False))
+
+
+def _side_ratio(long_usd: float, short_usd: float) -> float:
+    if short_usd <= 0:
+        return math.inf if long_usd > 0 else 0.0
+    return long_usd / short_usd
+
+
+def analyze(ev: LiquidationEvents, now_ms: Optional[int] = None, hours: Optional[float] = None,
+            width: Optional[float] = None, ref_price: Optional[float] = None, vol: Optional[float] = None,
+            half_life_h: float = LIQ_HALF_LIFE_H, min_usd: float = 0.0, rounding: str = "floor") -> LiquidationStats:
+    """
+    Кластеры и метрики окна за один проход группировки.
+
+    hours — длина окна для скорости (по умолчанию — размах ts событий, не меньше часа);
+    width — фиксированная ширина корзины (иначе bucket_width); rounding='nearest' — корзины
+    с центром в k·width (np.round, как прежний round(price / step) * step);
+    min_usd — порог кластера; HHI считается по оставшимся кластерам.
+    """
+    now_ms = int(time.time() * 1000) if now_ms is None else int(now_ms)
+    n = len(ev)
+    if not n:
+        return LiquidationStats(0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, float(width or 0.0))
+    if hours is None:
+        hours = max((int(ev.ts[-1]) - int(ev.ts[0])) / HOUR_MS, 1.0)
+    width = float(width) if width else bucket_width(ev.price, ref_price, vol)
+    q = ev.price / width
+    b = (np.round(q) if rounding == "nearest" else np.floor(q)).astype(np.int64)
+    key = (b - b.min()) * 2 + ev.is_long
+    keys, inv = np.unique(key, return_inverse=True)
+    k = len(keys)
+    usd = np.bincount(inv, weights=ev.usd, minlength=k)
+    pxw = np.bincount(inv, weights=ev.usd * ev.price, minlength=k)
+    cnt = np.bincount(inv, minlength=k)
+    decay = np.exp2(-np.maximum(now_ms - ev.ts, 0) / (half_life_h * HOUR_MS))
+    strength = np.bincount(inv, weights=ev.usd * decay, minlength=k)
+    nv = max(len(ev.venues), 1)
+    present = np.bincount(inv * nv + ev.venue, minlength=k * nv).reshape(k, nv) > 0
+    sides = np.bincount(ev.is_long.astype(np.int64), weights=ev.usd, minlength=2)
+    per_venue = np.bincount(ev.venue, weights=ev.usd, minlength=nv)
+
+    keep = np.flatnonzero(usd >= min_usd)
+    kept = usd[keep]
+    tot_kept = float(kept.sum())
+    hhi = float(np.square(kept / tot_kept).sum()) if tot_kept > 0 else 0.0
+    bucket = (keys // 2) + b.min()
+    order = keep[np.argsort(-bucket[keep], kind="stable")]
+    clusters = [
+        Cluster(level=float(bucket[i] * width), price=float(pxw[i] / usd[i]),
+                side="long" if keys[i] % 2 else "short", usd=float(usd[i]), strength=float(strength[i]),
+                count=int(cnt[i]), venues=tuple(ev.venues[j] for j in np.flatnonzero(present[i])))
+        for i in order
+    ]
+    total = float(sides.sum())
+    return LiquidationStats(
+        count=n, total_usd=total, long_usd=float(sides[1]), short_usd=float(sides[0]),
+        long_short_ratio=_side_ratio(float(sides[1]), float(sides[0])),
+        velocity_usd_h=total / hours if hours > 0 else 0.0, hhi=hhi, width=width, clusters=clusters,
+        by_venue={v: float(per_venue[i]) for i, v in enumerate(ev.venues)})
+
+
+def rolling(ev: LiquidationEvents, window_ms: int, step_ms: int, since_ms: int, until_ms: int) -> Dict[str, np.ndarray]:
+    """
+    Скользящие окна (end − window_ms, end] с концами end = since_ms + step_ms, …, ≤ until_ms:
+    {end, count, long_usd, short_usd, velocity_usd_h, long_short_ratio} — массивы по окнам.
+    """
+    ends = np.arange(int(since_ms) + int(step_ms), int(until_ms) + 1, int(step_ms), dtype=np.int64)
+    cum_long = np.concatenate([[0.0], np.cumsum(np.where(ev.is_long, ev.usd, 0.0))])
+    cum_short = np.concatenate([[0.0], np.cumsum(np.where(ev.is_long, 0.0, ev.usd))])
+    hi = np.searchsorted(ev.ts, ends, side="right")
+    lo = np.searchsorted(ev.ts, ends - int(window_ms), side="right")
+    long_usd = cum_long[hi] - cum_long[lo]
+    short_usd = cum_short[hi] - cum_short[lo]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(short_usd > 0, long_usd / np.where(short_usd > 0, short_usd, 1.0),
+                         np.where(long_usd > 0, np.inf, 0.0))
+    return {
+        "end": ends, "count": hi - lo, "long_usd": long_usd, "short_usd": short_usd,
+        "velocity_usd_h": (long_usd + short_usd) / (window_ms / HOUR_MS), "long_short_ratio": ratio,
+    }
@@ -12,6 +12,7 @@ from .config import MarketDoctorConfig, DEFAULT_CONFIG
 from .multi_tf import MultiTFDiagnostics
 from .profile_provider import ProfileProvider, RiskProfile
 from .anomaly_detector import AnomalyDetector
+from .anomaly_stream import AnomalyAlert, AnomalyStream, get_anomaly_stream
 from .calibration_service import CalibrationService
 from .pattern_utils import generate_pattern_id
 from .tradability import TradabilityAnalyzer, TradabilityState, TradabilitySnapshot
@@ -47,6 +48,9 @@ __all__ = [
     "RiskProfile",
     # Anomaly detection
     "AnomalyDetector",
+    "AnomalyAlert",
+    "AnomalyStream",
+    "get_anomaly_stream",
     # Calibration and reliability
     "CalibrationService",
     "generate_pattern_id",
@@ -6,11 +6,13 @@
 - Резкие изменения funding/OI/CVD
 - Аномалии деривативов
 - Резкие изменения фаз рынка
+- Выбросы и плавный дрейф risk/pump/funding/OI (потоковые статистики anomaly_stream)
+
+История ряда (symbol, tf) читается из репозитория один раз для прогрева AnomalyStream;
+дальше смена фазы и скачок риска берутся из состояния потока, без запросов на каждую проверку.
 """
 
-from dataclasses import dataclass
-from typing import Optional, List, Dict, Any, TYPE_CHECKING
-from datetime import datetime, timedelta
+from typing import Optional, List, Dict, TYPE_CHECKING
 import time
 
 if TYPE_CHECKING:
@@ -19,29 +21,35 @@ else:
     IDiagnosticsRepository = object
 
 from .analyzer import MarketDiagnostics, MarketPhase
+from .anomaly_stream import PHASE_CHANGE_SEVERITY, RISK_JUMP, AnomalyAlert, AnomalyStream
 
-
-@dataclass
-class AnomalyAlert:
-    """Алерт об аномалии."""
-    symbol: str
-    timeframe: str
-    anomaly_type: str  # "funding_spike", "oi_anomaly", "cvd_divergence", "phase_change", "doctor_concerned"
-    severity: str  # "low", "medium", "high"
-    message: str
-    timestamp: int
-    metadata: Optional[Dict[str, Any]] = None
+# сколько последних снимков репозитория прогревают ряд при первом обращении
+ANOMALY_WARM_SNAPSHOTS = 200
 
 
 class AnomalyDetector:
     """Детектор аномалий для Market Doctor."""
     
-    def __init__(self, diagnostics_repo: IDiagnosticsRepository):
+    def __init__(self, diagnostics_repo: IDiagnosticsRepository, stream: Optional[AnomalyStream] = None):
         """
         Args:
             diagnostics_repo: Репозиторий диагностик для проверки истории (реализует IDiagnosticsRepository интерфейс)
+            stream: Потоковое состояние аномалий (по умолчанию — своё на детектор)
         """
         self.diagnostics_repo = diagnostics_repo
+        self.stream = stream if stream is not None else AnomalyStream()
+    
+    def ensure_warm(self, symbol: str, timeframe: str, before_ms: Optional[int] = None) -> None:
+        """Прогреть ряд историей репозитория (один запрос на ряд); снимки с ts ≥ before_ms не берутся."""
+        if self.stream.has(symbol, timeframe):
+            return
+        rows = self.diagnostics_repo.get_snapshots(
+            symbol=symbol,
+            timeframe=timeframe,
+            limit=ANOMALY_WARM_SNAPSHOTS
+        ) or []
+        rows = [r for r in rows if before_ms is None or int(r.get('timestamp') or 0) < before_ms]
+        self.stream.warm(symbol, timeframe, sorted(rows, key=lambda r: int(r.get('timestamp') or 0)))
     
     def detect_derivatives_anomalies(
         self,
@@ -137,34 +145,19 @@ class AnomalyDetector:
         Returns:
             Алерт об изменении фазы или None
         """
-        # Получаем предыдущие диагностики
-        snapshots = self.diagnostics_repo.get_snapshots(
-            symbol=symbol,
-            timeframe=timeframe,
-            limit=10
-        )
-        
-        if len(snapshots) < 2:
+        # Последние два снимка ряда — из состояния потока
+        self.ensure_warm(symbol, timeframe)
+        st = self.stream.state(symbol, timeframe)
+        if st is None or st.prev_phase is None:
             return None
         
-        # Берем последнюю диагностику (текущую) и предпоследнюю
-        current_snapshot = snapshots[0]
-        previous_snapshot = snapshots[1]
-        
-        current_phase_str = current_snapshot.get('phase')
-        previous_phase_str = previous_snapshot.get('phase')
+        current_phase_str = st.phase
+        previous_phase_str = st.prev_phase
         
         if current_phase_str != previous_phase_str:
             # Проверяем, было ли это резкое изменение
-            phase_changes = {
-                ("ACCUMULATION", "EXPANSION_DOWN"): "high",
-                ("EXPANSION_UP", "EXPANSION_DOWN"): "high",
-                ("ACCUMULATION", "DISTRIBUTION"): "medium",
-                ("EXPANSION_UP", "DISTRIBUTION"): "medium",
-            }
-            
             change_key = (previous_phase_str, current_phase_str)
-            severity = phase_changes.get(change_key, "low")
+            severity = PHASE_CHANGE_SEVERITY.get(change_key, "low")
             
             return AnomalyAlert(
                 symbol=symbol,
@@ -204,24 +197,16 @@ class AnomalyDetector:
         Returns:
             Алерт о росте риска или None
         """
-        # Получаем предыдущие диагностики
-        snapshots = self.diagnostics_repo.get_snapshots(
-            symbol=symbol,
-            timeframe=timeframe,
-            limit=10
-        )
-        
-        if len(snapshots) < 2:
+        # Риск предыдущего снимка ряда — из состояния потока
+        self.ensure_warm(symbol, timeframe)
+        st = self.stream.state(symbol, timeframe)
+        if st is None or st.prev_risk is None:
             return None
         
-        # Берем последнюю диагностику (текущую) и предпоследнюю
-        current_snapshot = snapshots[0]
-        previous_snapshot = snapshots[1]
-        
-        previous_risk = previous_snapshot.get('risk_score', 0.0)
+        previous_risk = st.prev_risk
         
         # Если risk_score подскочил на 0.2 или больше
-        if current_risk_score - previous_risk >= 0.2:
+        if current_risk_score - previous_risk >= RISK_JUMP:
             return AnomalyAlert(
                 symbol=symbol,
                 timeframe=timeframe,
@@ -247,40 +232,43 @@ class AnomalyDetector:
         timeframe: str,
         diagnostics: MarketDiagnostics,
         derivatives: Dict[str, float],
-        current_price: float
+        current_price: float,
+        timestamp_ms: Optional[int] = None
     ) -> List[AnomalyAlert]:
         """
         Обнаружить все аномалии для символа.
         
+        Текущий снимок учитывается в потоке (O(1)): смена фазы, скачок риска, выбросы и
+        дрейф risk/pump/funding/OI; в репозиторий идём только для прогрева нового ряда.
+        
         Args:
             symbol: Символ
             timeframe: Таймфрейм
             diagnostics: Текущая диагностика
             derivatives: Данные деривативов
             current_price: Текущая цена
+            timestamp_ms: Время снимка (по умолчанию — сейчас); повтор по тому же снимку не учитывается дважды
         
         Returns:
             Список всех обнаруженных аномалий
         """
-        alerts = []
+        ts = int(time.time() * 1000) if timestamp_ms is None else int(timestamp_ms)
+        derivatives = derivatives or {}
         
         # Деривативные аномалии
-        alerts.extend(self.detect_derivatives_anomalies(
+        alerts = self.detect_derivatives_anomalies(
             symbol, timeframe, derivatives, current_price
-        ))
-        
-        # Изменение фазы
-        phase_alert = self.detect_phase_change(symbol, timeframe, diagnostics.phase)
-        if phase_alert:
-            alerts.append(phase_alert)
-        
-        # Рост риска
-        risk_alert = self.detect_risk_spike(
-            symbol, timeframe, diagnostics.risk_score
         )
-        if risk_alert:
-            alerts.append(risk_alert)
+        
+        # Изменение фазы, рост риска и статистические аномалии рядов
+        self.ensure_warm(symbol, timeframe, before_ms=ts)
+        alerts.extend(self.stream.observe(
+            symbol, timeframe, ts,
+            risk_score=diagnostics.risk_score,
+            pump_score=diagnostics.pump_score,
+            phase=diagnostics.phase,
+            funding=derivatives.get('funding_rate'),
+            oi_change=derivatives.get('oi_change_pct')
+        ))
         
         return alerts
-
-
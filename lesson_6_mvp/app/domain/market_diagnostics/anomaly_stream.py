@@ -0,0 +1,304 @@
+# app/domain/market_diagnostics/anomaly_stream.py
+"""
+Потоковый детектор аномалий Market Doctor: состояние на (symbol, tf), обновление O(1) на снимок.
+
+Раньше каждая проверка AnomalyDetector читала последние снимки из репозитория и сравнивала
+соседние пороги — постепенный дрейф без скачка между двумя снимками не ловился, а
+detect_all_anomalies ходил в БД на каждый тип аномалии. Здесь на каждый ряд
+(risk_score, pump_score, funding, OI) держатся:
+- EW-среднее и дисперсия (полураспад ANOMALY_HALFLIFE снимков): d = x − μ; μ += αd;
+  σ² = (1 − α)(σ² + αd²) — z-оценка;
+- робастные центр/MAD с клиппингом по Хуберу: r = x − m, σᵣ = 1.2533·MAD, c = ANOMALY_CLIP·σᵣ;
+  m += α·clip(r, ±c), MAD += α(min(|r|, c) − MAD) — одиночный выброс оценки почти не сдвигает;
+  на старте α = max(α, 1/n) — первые снимки усредняются поровну, без смещения к нулю;
+- двусторонний CUSUM по робастной z (обрезанной до ±ANOMALY_CUSUM_ZCLIP):
+  S⁺ = max(0, S⁺ + z − k), S⁻ = max(0, S⁻ − z − k); S > h — дрейф, суммы сбрасываются.
+Оценки считаются до обновления состояния: z — насколько новый снимок выбивается из прошлого.
+Фаза и прошлый risk_score хранятся там же — смена фазы и скачок риска не требуют запроса.
+
+    stream = get_anomaly_stream(db)
+    alerts = stream.observe("BTCUSDT", "1h", ts, risk_score=0.4, pump_score=0.6, phase="ACCUMULATION",
+                            funding=0.0001, oi_change=3.2)
+    stream.active(since_ms=now - 3600_000)          # по всей вселенной, без БД
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterable, List, Mapping, Optional, Tuple
+
+ANOMALY_HALFLIFE = float(os.getenv("ANOMALY_HALFLIFE", "24"))          # снимков
+ANOMALY_WARMUP = int(os.getenv("ANOMALY_WARMUP", "12"))                # снимков до первых z-событий
+ANOMALY_Z = float(os.getenv("ANOMALY_Z", "4"))                         # робастная z выброса
+ANOMALY_CUSUM_K = float(os.getenv("ANOMALY_CUSUM_K", "0.75"))
+ANOMALY_CUSUM_H = float(os.getenv("ANOMALY_CUSUM_H", "8"))
+ANOMALY_CUSUM_ZCLIP = 4.0
+ANOMALY_CLIP = 3.0
+ANOMALY_RECENT = int(os.getenv("ANOMALY_RECENT", "32"))                # событий на ряд в памяти
+
+RISK_JUMP = 0.2                     # прежний порог doctor_concerned
+_MAD_SIGMA = math.sqrt(math.pi / 2)    # среднее |r| → σ для нормального распределения
+
+# метрика → (подпись, минимальная σ: шум ниже неё аномалией не считается)
+METRICS: Dict[str, Tuple[str, float]] = {
+    "risk": ("risk_score", 0.02),
+    "pump": ("pump_score", 0.02),
+    "funding": ("funding", 2e-5),
+    "oi": ("OI Δ%", 0.5),
+}
+
+PHASE_CHANGE_SEVERITY: Dict[Tuple[str, str], str] = {
+    ("ACCUMULATION", "EXPANSION_DOWN"): "high",
+    ("EXPANSION_UP", "EXPANSION_DOWN"): "high",
+    ("ACCUMULATION", "DISTRIBUTION"): "medium",
+    ("EXPANSION_UP", "DISTRIBUTION"): "medium",
+}
+_SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2}
+
+
+@dataclass
+class AnomalyAlert:
+    """Алерт об аномалии."""
+    symbol: str
+    timeframe: str
+    anomaly_type: str  # "funding_spike", "oi_anomaly", "cvd_divergence", "phase_change", "doctor_concerned",
+                       # "<metric>_outlier", "<metric>_drift"
+    severity: str  # "low", "medium", "high"
+    message: str
+    timestamp: int
+    metadata: Optional[Dict[str, Any]] = None
+    score: float = 0.0  # сила аномалии: |z|, S/h CUSUM, скачок риска / RISK_JUMP
+
+
+class RunningStat:
+    """EW-моменты, робастные медиана/MAD и CUSUM одного ряда (см. модульный docstring)."""
+
+    __slots__ = ("alpha", "floor", "n", "mean", "var", "med", "mad", "pos", "neg", "last")
+
+    def __init__(self, halflife: float = ANOMALY_HALFLIFE, floor: float = 0.0):
+        self.alpha = 1.0 - math.exp(math.log(0.5) / max(halflife, 1e-9))
+        self.floor = floor
+        self.n = 0
+        self.mean = self.var = self.med = self.mad = 0.0
+        self.pos = self.neg = 0.0
+        self.last = math.nan
+
+    def sigma(self) -> float:
+        return max(math.sqrt(self.var), self.floor)
+
+    def robust_sigma(self) -> float:
+        return max(_MAD_SIGMA * self.mad, self.floor)
+
+    def update(self, x: float) -> Tuple[float, float, int]:
+        """Добавляет x; возвращает (z, робастная z, сигнал CUSUM: +1 / −1 / 0) относительно прошлого состояния."""
+        a = max(self.alpha, 1.0 / (self.n + 1))
+        if self.n == 0:
+            self.mean = self.med = x
+            self.n, self.last = 1, x
+            return 0.0, 0.0, 0
+        d = x - self.mean
+        z = d / self.sigma() if self.sigma() > 0 else 0.0
+        r = x - self.med
+        rs = self.robust_sigma()
+        rz = r / rs if rs > 0 else 0.0
+
+        self.mean += a * d
+        self.var = (1.0 - a) * (self.var + a * d * d)
+        c = ANOMALY_CLIP * rs if rs > 0 else abs(r)
+        self.med += a * max(-c, min(c, r))
+        self.mad += a * (min(abs(r), c) - self.mad)
+
+        signal = 0
+        zc = max(-ANOMALY_CUSUM_ZCLIP, min(ANOMALY_CUSUM_ZCLIP, rz))
+        self.pos = max(0.0, self.pos + zc - ANOMALY_CUSUM_K)
+        self.neg = max(0.0, self.neg - zc - ANOMALY_CUSUM_K)
+        if self.pos > ANOMALY_CUSUM_H or self.neg > ANOMALY_CUSUM_H:
+            signal = 1 if self.pos >= self.neg else -1
+        self.n += 1
+        self.last = x
+        return z, rz, signal
+
+    def reset_cusum(self) -> None:
+        self.pos = self.neg = 0.0
+
+
+class SeriesState:
+    """Состояние ряда (symbol, tf): статистики метрик, фаза и прошлый риск, последние события."""
+
+    __slots__ = ("ts", "phase", "prev_phase", "risk", "prev_risk", "stats", "events")
+
+    def __init__(self, halflife: float):
+        self.ts = 0
+        self.phase: Optional[str] = None
+        self.prev_phase: Optional[str] = None
+        self.risk: Optional[float] = None
+        self.prev_risk: Optional[float] = None
+        self.stats = {m: RunningStat(halflife, floor) for m, (_, floor) in METRICS.items()}
+        self.events: Deque[AnomalyAlert] = deque(maxlen=ANOMALY_RECENT)
+
+
+def _num(x) -> Optional[float]:
+    try:
+        v = float(x)
+    except (TypeError, ValueError):
+        return None
+    return v if math.isfinite(v) else None
+
+
+def _phase(p) -> Optional[str]:
+    if p is None:
+        return None
+    return str(getattr(p, "value", p))
+
+
+class AnomalyStream:
+    """Потоковые статистики по всем (symbol, tf); потокобезопасно."""
+
+    def __init__(self, halflife: float = ANOMALY_HALFLIFE, warmup: int = ANOMALY_WARMUP, z_threshold: float = ANOMALY_Z):
+        self.halflife = halflife
+        self.warmup = warmup
+        self.z_threshold = z_threshold
+        self._series: Dict[Tuple[str, str], SeriesState] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(symbol: str, timeframe: str) -> Tuple[str, str]:
+        return symbol.upper(), timeframe
+
+    def has(self, symbol: str, timeframe: str) -> bool:
+        return self._key(symbol, timeframe) in self._series
+
+    def state(self, symbol: str, timeframe: str) -> Optional[SeriesState]:
+        return self._series.get(self._key(symbol, timeframe))
+
+    def observe(self, symbol: str, timeframe: str, ts: Optional[int] = None, *, risk_score=None, pump_score=None,
+                phase=None, funding=None, oi_change=None, emit: bool = True) -> List[AnomalyAlert]:
+        """
+        Учитывает снимок и возвращает его аномалии. Снимок не новее последнего учтённого
+        игнорируется (повторный вызов по тому же снимку ничего не двигает); emit=False —
+        только прогрев состояния.
+        """
+        ts = int(time.time() * 1000) if ts is None else int(ts)
+        key = self._key(symbol, timeframe)
+        values = {"risk": _num(risk_score), "pump": _num(pump_score), "funding": _num(funding), "oi": _num(oi_change)}
+        phase = _phase(phase)
+        with self._lock:
+            st = self._series.get(key)
+            if st is None:
+                st = self._series[key] = SeriesState(self.halflife)
+            elif ts <= st.ts:
+                return []
+            st.ts = ts
+            out: List[AnomalyAlert] = []
+
+            if phase is not None:
+                st.prev_phase, st.phase = st.phase, phase
+                if emit and st.prev_phase is not None and phase != st.prev_phase:
+                    out.append(self._phase_alert(key, ts, st.prev_phase, phase))
+            if values["risk"] is not None:
+                st.prev_risk, st.risk = st.risk, values["risk"]
+                if emit and st.prev_risk is not None and st.risk - st.prev_risk >= RISK_JUMP:
+                    out.append(self._risk_alert(key, ts, st.prev_risk, st.risk))
+
+            for m, x in values.items():
+                if x is None:
+                    continue
+                rs = st.stats[m]
+                warm = rs.n >= self.warmup
+                _, rz, signal = rs.update(x)
+                if not (emit and warm):
+                    if signal:
+                        rs.reset_cusum()
+                    continue
+                if abs(rz) >= self.z_threshold:
+                    out.append(self._outlier_alert(key, ts, m, x, rz, rs))
+                elif signal:
+                    out.append(self._drift_alert(key, ts, m, x, signal, rs))
+                if signal:
+                    rs.reset_cusum()
+            st.events.extend(out)
+            return out
+
+    def warm(self, symbol: str, timeframe: str, rows: Iterable[Mapping[str, Any]]) -> int:
+        """Прогрев ряда историческими снимками (словари репозитория, от старых к новым) без событий."""
+        n = 0
+        for r in rows:
+            ts = r.get("timestamp", r.get("timestamp_ms"))
+            if ts is None:
+                continue
+            self.observe(symbol, timeframe, int(ts), risk_score=r.get("risk_score"), pump_score=r.get("pump_score"),
+                         phase=r.get("phase", r.get("regime")), emit=False)
+            n += 1
+        return n
+
+    def active(self, since_ms: Optional[int] = None, min_severity: str = "medium") -> List[AnomalyAlert]:
+        """Последние события по всей вселенной (новые первыми) — из памяти, без БД."""
+        since_ms = 0 if since_ms is None else since_ms
+        rank = _SEVERITY_RANK.get(min_severity, 0)
+        with self._lock:
+            out = [e for st in self._series.values() if st.ts >= since_ms for e in st.events
+                   if e.timestamp >= since_ms and _SEVERITY_RANK.get(e.severity, 0) >= rank]
+        out.sort(key=lambda e: (-e.timestamp, -e.score))
+        return out
+
+    # ---- события ----
+
+    @staticmethod
+    def _phase_alert(key, ts: int, prev: str, cur: str) -> AnomalyAlert:
+        severity = PHASE_CHANGE_SEVERITY.get((prev, cur), "low")
+        return AnomalyAlert(
+            symbol=key[0], timeframe=key[1], anomaly_type="phase_change", severity=severity,
+            message=(f"⚡ {key[0]}: резкое изменение фазы — {prev} → {cur}. "
+                     f"Рынок перешел в другую структуру."),
+            timestamp=ts, metadata={"previous_phase": prev, "current_phase": cur},
+            score=float(_SEVERITY_RANK[severity] + 1))
+
+    @staticmethod
+    def _risk_alert(key, ts: int, prev: float, cur: float) -> AnomalyAlert:
+        return AnomalyAlert(
+            symbol=key[0], timeframe=key[1], anomaly_type="doctor_concerned",
+            severity="high" if cur > 0.7 else "medium",
+            message=(f"⚡ {key[0]}: резкий рост риска — risk_score подскочил с {prev:.2f} до {cur:.2f}. "
+                     f"Рынок стал более нестабильным."),
+            timestamp=ts, metadata={"previous_risk": prev, "current_risk": cur}, score=(cur - prev) / RISK_JUMP)
+
+    def _outlier_alert(self, key, ts: int, metric: str, x: float, rz: float, rs: RunningStat) -> AnomalyAlert:
+        label = METRICS[metric][0]
+        return AnomalyAlert(
+            symbol=key[0], timeframe=key[1], anomaly_type=f"{metric}_outlier",
+            severity="high" if abs(rz) >= 1.5 * self.z_threshold else "medium",
+            message=(f"⚡ {key[0]}: {label} {x:.4g} выбивается из истории "
+                     f"({rz:+.1f}σ от медианы {rs.med:.4g})."),
+            timestamp=ts, metadata={"metric": metric, "value": x, "robust_z": rz, "median": rs.med, "mad": rs.mad},
+            score=abs(rz))
+
+    @staticmethod
+    def _drift_alert(key, ts: int, metric: str, x: float, signal: int, rs: RunningStat) -> AnomalyAlert:
+        label = METRICS[metric][0]
+        s = rs.pos if signal > 0 else rs.neg
+        return AnomalyAlert(
+            symbol=key[0], timeframe=key[1], anomaly_type=f"{metric}_drift",
+            severity="high" if s > 2 * ANOMALY_CUSUM_H else "medium",
+            message=(f"⚡ {key[0]}: {label} плавно {'растёт' if signal > 0 else 'снижается'} — "
+                     f"накопленный сдвиг без резкого скачка (сейчас {x:.4g}, EW-среднее {rs.mean:.4g})."),
+            timestamp=ts, metadata={"metric": metric, "value": x, "direction": signal, "cusum": s, "mean": rs.mean},
+            score=s / ANOMALY_CUSUM_H)
+
+
+_streams: "weakref.WeakKeyDictionary[Any, AnomalyStream]" = weakref.WeakKeyDictionary()
+_streams_lock = threading.Lock()
+
+
+def get_anomaly_stream(db) -> AnomalyStream:
+    """Одно состояние на экземпляр DB: бот и воркер логирования снимков кормят один поток."""
+    with _streams_lock:
+        stream = _streams.get(db)
+        if stream is None:
+            stream = _streams[db] = AnomalyStream()
+        return stream
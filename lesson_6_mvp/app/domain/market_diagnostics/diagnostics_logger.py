@@ -196,7 +196,8 @@ class DiagnosticsLogger:
         multi_tf_score: MultiTFScore,
         diagnostics: Dict[str, MarketDiagnostics],
         compact_report: CompactReport,
-        current_price: Optional[float] = None
+        current_price: Optional[float] = None,
+        timestamp_ms: Optional[int] = None
     ) -> int:
         """
         Записать снимок диагностики.
@@ -208,6 +209,7 @@ class DiagnosticsLogger:
             diagnostics: Словарь диагностик по таймфреймам
             compact_report: Компактный отчёт
             current_price: Текущая цена
+            timestamp_ms: Время снимка (по умолчанию — сейчас)
         
         Returns:
             ID созданного снимка
@@ -284,7 +286,8 @@ class DiagnosticsLogger:
             else:
                 per_tf_scores_dict[tf] = score_data
         
-        timestamp_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+        if timestamp_ms is None:
+            timestamp_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
         
         cur = self.db.conn.cursor()
         cur.execute("""
@@ -0,0 +1,216 @@
+# app/domain/options.py
+"""
+Векторная аналитика опционной цепочки на NumPy: max pain, OI-стены, приближённый
+профиль гамма-экспозиции дилеров (GEX) и IV-скью по экспирациям.
+
+Цепочка — массивы (expiry, strike, is_call, oi, iv) одной сортировкой (expiry, strike);
+дальше по каждой экспирации только срезы и накопленные суммы:
+
+- max pain: боль на страйке K_j = Σ_{K_i<K_j} C_i·(K_j−K_i) + Σ_{K_i>K_j} P_i·(K_i−K_j)
+  = K_j·ΣC_≤j − Σ(CK)_≤j + (Σ(PK) − Σ(PK)_≤j) − K_j·(ΣP − ΣP_≤j) — O(S log S) вместо O(S²);
+  при равной боли берётся меньший страйк, как min() в прежнем переборе;
+- стены: страйк с наибольшим OI коллов / путов;
+- GEX: Блэк–Шоулз гамма (r = 0) × OI × S² × 1% — дилер длинный коллы, короткий путы
+  (колл +, пут −); USD на 1% движения базового при контракте = 1 монета (Deribit);
+- скью: IV OTM-пута на 0.9·S минус IV OTM-колла на 1.1·S (интерполяция по страйкам),
+  ATM IV — по OTM-стороне в S; вне диапазона страйков — NaN.
+
+    chain = OptionChain.from_rows(deribit.fetch_chain("BTC"))
+    stats = analyze(chain, spot=px, max_expiries=10)       # [ExpiryStats, ...] по датам
+    profile = gamma_profile(chain, np.linspace(0.8 * px, 1.2 * px, 41))
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+__all__ = [
+    "OptionChain", "ExpiryStats",
+    "max_pain", "analyze", "bs_gamma", "gamma_profile", "gamma_flip",
+]
+
+YEAR_MS = 365.0 * 86_400_000
+EXPIRY_HOUR_UTC = 8                 # экспирации Deribit — 08:00 UTC
+MIN_T_YEARS = 1.0 / (365.0 * 24)    # не меньше часа до экспирации: гамма в ноль не взрывается
+SKEW_MONEYNESS = 0.1                # скью: пут на (1 − m)·S против колла на (1 + m)·S
+
+
+@dataclass(frozen=True)
+class ExpiryStats:
+    expiry: str         # 'YYYY-MM-DD'
+    max_pain: float
+    call_oi: float      # контракты
+    put_oi: float
+    call_wall: float    # страйк с наибольшим OI коллов
+    put_wall: float
+    gex: float          # USD на 1% движения базового
+    atm_iv: float       # доли (0.55 = 55%)
+    skew: float         # IV пута − IV колла, доли
+
+
+class OptionChain:
+    """Цепочка в массивах, отсортированная по (expiry, strike); expiry — индекс в self.expiries."""
+
+    __slots__ = ("expiries", "code", "strike", "is_call", "oi", "iv", "bounds")
+
+    def __init__(self, expiries: Sequence[str], code: np.ndarray, strike: np.ndarray, is_call: np.ndarray,
+                 oi: np.ndarray, iv: np.ndarray):
+        order = np.lexsort((strike, code))
+        self.expiries: Tuple[str, ...] = tuple(expiries)
+        self.code = np.asarray(code, dtype=np.int64)[order]
+        self.strike = np.asarray(strike, dtype=float)[order]
+        self.is_call = np.asarray(is_call, dtype=bool)[order]
+        self.oi = np.clip(np.nan_to_num(np.asarray(oi, dtype=float)[order]), 0.0, None)
+        self.iv = np.asarray(iv, dtype=float)[order]
+        # границы групп экспираций: строки [bounds[i], bounds[i + 1])
+        self.bounds = np.searchsorted(self.code, np.arange(len(self.expiries) + 1))
+
+    @classmethod
+    def from_rows(cls, rows: Iterable) -> "OptionChain":
+        """Из объектов с полями expiry, strike, kind ('C'/'P'), oi и необязательным iv; прочие kind пропускаются."""
+        exp, strike, is_call, oi, iv = [], [], [], [], []
+        for x in rows:
+            if x.kind not in ("C", "P"):
+                continue
+            exp.append(x.expiry)
+            strike.append(float(x.strike))
+            is_call.append(x.kind == "C")
+            oi.append(float(x.oi))
+            iv.append(float(getattr(x, "iv", math.nan)))
+        expiries = sorted(set(exp))
+        index = {e: i for i, e in enumerate(expiries)}
+        return cls(expiries, np.array([index[e] for e in exp], dtype=np.int64), np.array(strike, dtype=float),
+                   np.array(is_call, dtype=bool), np.array(oi, dtype=float), np.array(iv, dtype=float))
+
+    def __len__(self) -> int:
+        return len(self.strike)
+
+    def group(self, i: int) -> slice:
+        return slice(int(self.bounds[i]), int(self.bounds[i + 1]))
+
+    def years_to_expiry(self, now_ms: Optional[int] = None) -> np.ndarray:
+        """Время до экспирации (годы) по каждой дате, не меньше часа."""
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        out = np.empty(len(self.expiries))
+        for i, e in enumerate(self.expiries):
+            ts = datetime.strptime(e, "%Y-%m-%d").replace(hour=EXPIRY_HOUR_UTC, tzinfo=timezone.utc).timestamp()
+            out[i] = max((ts * 1000 - now_ms) / YEAR_MS, MIN_T_YEARS)
+        return out
+
+
+def _by_strike(strike: np.ndarray, is_call: np.ndarray, oi: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Уникальные страйки (по возрастанию) и OI коллов / путов на каждом."""
+    ks, inv = np.unique(strike, return_inverse=True)
+    calls = np.bincount(inv, weights=np.where(is_call, oi, 0.0), minlength=len(ks))
+    puts = np.bincount(inv, weights=np.where(is_call, 0.0, oi), minlength=len(ks))
+    return ks, calls, puts
+
+
+def _max_pain_sorted(ks: np.ndarray, calls: np.ndarray, puts: np.ndarray) -> float:
+    if not len(ks):
+        return float("nan")
+    cum_c, cum_ck = np.cumsum(calls), np.cumsum(calls * ks)
+    cum_p, cum_pk = np.cumsum(puts), np.cumsum(puts * ks)
+    pain = ks * cum_c - cum_ck + (cum_pk[-1] - cum_pk) - ks * (cum_p[-1] - cum_p)
+    return float(ks[int(np.argmin(pain))])
+
+
+def max_pain(strike, call_oi, put_oi) -> float:
+    """Max pain по страйкам одной экспирации (страйки в любом порядке, повторы суммируются)."""
+    strike = np.asarray(strike, dtype=float)
+    n = len(strike)
+    is_call = np.concatenate([np.ones(n, dtype=bool), np.zeros(n, dtype=bool)])
+    oi = np.clip(np.concatenate([np.asarray(call_oi, dtype=float), np.asarray(put_oi, dtype=float)]), 0.0, None)
+    return _max_pain_sorted(*_by_strike(np.concatenate([strike, strike]), is_call, oi))
+
+
+def bs_gamma(spot, strike, iv, t) -> np.ndarray:
+    """Гамма Блэка–Шоулза (r = 0) на 1 контракт; NaN/нулевая IV — 0."""
+    spot, strike, iv, t = (np.asarray(a, dtype=float) for a in (spot, strike, iv, t))
+    sig = np.where(np.isfinite(iv) & (iv > 0), iv, np.nan)
+    vol = sig * np.sqrt(t)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d1 = (np.log(spot / strike) + 0.5 * vol * vol) / vol
+        g = np.exp(-0.5 * d1 * d1) / (math.sqrt(2 * math.pi) * spot * vol)
+    return np.nan_to_num(g, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def _gex(spot: float, strike, is_call, oi, iv, t) -> float:
+    sign = np.where(is_call, 1.0, -1.0)
+    return float(np.sum(sign * oi * bs_gamma(spot, strike, iv, t)) * spot * spot * 0.01)
+
+
+def _iv_at(strike: np.ndarray, iv: np.ndarray, x: float) -> float:
+    ok = np.isfinite(iv) & (iv > 0)
+    if not ok.any():
+        return float("nan")
+    ks, vs = strike[ok], iv[ok]
+    if x < ks[0] or x > ks[-1]:
+        return float("nan")
+    return float(np.interp(x, ks, vs))
+
+
+def _skew(spot: float, strike, is_call, iv) -> Tuple[float, float]:
+    """(ATM IV, скью) по OTM-стороне: путы ниже S, коллы выше."""
+    puts = ~is_call & (strike <= spot)
+    calls = is_call & (strike >= spot)
+    otm = puts | calls
+    atm = _iv_at(strike[otm], iv[otm], spot)
+    put_iv = _iv_at(strike[puts], iv[puts], spot * (1 - SKEW_MONEYNESS))
+    call_iv = _iv_at(strike[calls], iv[calls], spot * (1 + SKEW_MONEYNESS))
+    return atm, put_iv - call_iv
+
+
+def analyze(chain: OptionChain, spot: float, now_ms: Optional[int] = None,
+            max_expiries: Optional[int] = None) -> List[ExpiryStats]:
+    """Статистика по ближайшим max_expiries экспирациям (все — если None), по возрастанию даты."""
+    n_exp = len(chain.expiries) if max_expiries is None else min(len(chain.expiries), max(1, int(max_expiries)))
+    t_all = chain.years_to_expiry(now_ms)
+    out: List[ExpiryStats] = []
+    for i in range(n_exp):
+        g = chain.group(i)
+        strike, is_call, oi, iv = chain.strike[g], chain.is_call[g], chain.oi[g], chain.iv[g]
+        if not len(strike):
+            continue
+        ks, calls, puts = _by_strike(strike, is_call, oi)
+        atm, skew = _skew(spot, strike, is_call, iv) if spot > 0 else (float("nan"), float("nan"))
+        out.append(ExpiryStats(
+            expiry=chain.expiries[i],
+            max_pain=_max_pain_sorted(ks, calls, puts),
+            call_oi=float(calls.sum()),
+            put_oi=float(puts.sum()),
+            call_wall=float(ks[int(np.argmax(calls))]) if calls.any() else float("nan"),
+            put_wall=float(ks[int(np.argmax(puts))]) if puts.any() else float("nan"),
+            gex=_gex(spot, strike, is_call, oi, iv, t_all[i]) if spot > 0 else float("nan"),
+            atm_iv=atm,
+            skew=skew,
+        ))
+    return out
+
+
+def gamma_profile(chain: OptionChain, spots, now_ms: Optional[int] = None,
+                  max_expiries: Optional[int] = None) -> np.ndarray:
+    """Суммарный GEX (USD на 1%) всей цепочки при каждой цене из spots — матрица цены × опционы."""
+    spots = np.asarray(spots, dtype=float)
+    stop = len(chain) if max_expiries is None else int(chain.bounds[min(len(chain.expiries), max(1, max_expiries))])
+    t = chain.years_to_expiry(now_ms)[chain.code[:stop]]
+    sign = np.where(chain.is_call[:stop], 1.0, -1.0) * chain.oi[:stop]
+    g = bs_gamma(spots[:, None], chain.strike[None, :stop], chain.iv[None, :stop], t[None, :])
+    return (g * sign[None, :]).sum(axis=1) * spots * spots * 0.01
+
+
+def gamma_flip(spots, profile) -> float:
+    """Цена смены знака GEX (линейная интерполяция первого перехода); NaN — знак не меняется."""
+    spots, profile = np.asarray(spots, dtype=float), np.asarray(profile, dtype=float)
+    idx = np.flatnonzero(np.signbit(profile[:-1]) != np.signbit(profile[1:]))
+    if not len(idx):
+        return float("nan")
+    i = int(idx[0])
+    y0, y1 = profile[i], profile[i + 1]
+    return float(spots[i] + (spots[i + 1] - spots[i]) * (-y0 / (y1 - y0)))
@@ -1,9 +1,10 @@
 # app/domain/services.py
 from __future__ import annotations
-from typing import Tuple, Optional, Dict, List
+from typing import Tuple, Optional, Dict
 import math
 import statistics as stats
 
+from . import kernels as K
 from .models import Metric, Timeframe, Divergence
 
 ARROW_UP = "⬆"
@@ -34,57 +35,16 @@ def arrow_from_delta(delta: float | None, eps: float = 0.0) -> str:
     return ARROW_FLAT
 
 def ema(values: list[float], period: int) -> list[Optional[float]]:
-    if period <= 0 or not values:
+    if period <= 0 or len(values) == 0:
         return []
-    n = len(values)
-    out: list[Optional[float]] = [None] * n
-    if n < period:
-        return out
-    k = 2 / (period + 1)
-    sma = sum(values[:period]) / period
-    out[period - 1] = sma
-    prev = sma
-    for i in range(period, n):
-        prev = (values[i] - prev) * k + prev
-        out[i] = prev
-    return out
+    return K.to_optional_list(K.ema(values, period))
 
 def rsi(values: list[float], period: int = 14) -> list[Optional[float]]:
-    n = len(values)
-    if n < period + 1:
-        return [None] * n
-    rsis: list[Optional[float]] = [None] * n
-    gains: List[float] = []
-    losses: List[float] = []
-    for i in range(1, period + 1):
-        ch = values[i] - values[i - 1]
-        gains.append(max(ch, 0.0))
-        losses.append(-min(ch, 0.0))
-    avg_gain = sum(gains) / period
-    avg_loss = sum(losses) / period
-    rs = (avg_gain / avg_loss) if avg_loss != 0 else float("inf")
-    rsis[period] = 100 - (100 / (1 + rs))
-    for i in range(period + 1, n):
-        ch = values[i] - values[i - 1]
-        gain = max(ch, 0.0)
-        loss = -min(ch, 0.0)
-        avg_gain = (avg_gain * (period - 1) + gain) / period
-        avg_loss = (avg_loss * (period - 1) + loss) / period
-        rs = (avg_gain / avg_loss) if avg_loss != 0 else float("inf")
-        rsis[i] = 100 - (100 / (1 + rs))
-    return rsis
+    return K.to_optional_list(K.rsi(values, period))
 
 def macd(values: list[float], fast: int = 12, slow: int = 26, signal: int = 9) -> tuple[list[Optional[float]], list[Optional[float]], list[Optional[float]]]:
-    ema_fast = ema(values, fast)
-    ema_slow = ema(values, slow)
-    macd_line: list[Optional[float]] = [None] * len(values)
-    for i in range(len(values)):
-        if ema_fast[i] is not None and ema_slow[i] is not None:
-            macd_line[i] = ema_fast[i] - ema_slow[i]
-    macd_vals = [x if x is not None else 0.0 for x in macd_line]
-    sig = ema(macd_vals, signal)
-    hist: list[Optional[float]] = [None if (m is None or s is None) else (m - s) for m, s in zip(macd_line, sig)]
-    return macd_line, sig, hist
+    macd_line, sig, hist = K.macd(values, fast, slow, signal)
+    return K.to_optional_list(macd_line), K.to_optional_list(sig), K.to_optional_list(hist)
 
 def true_range(h: float, l: float, prev_c: float | None) -> float:
     if prev_c is None:
@@ -92,38 +52,19 @@ def true_range(h: float, l: float, prev_c: float | None) -> float:
     return max(h - l, abs(h - prev_c), abs(l - prev_c))
 
 def atr(highs: list[float], lows: list[float], closes: list[float], period: int = 14) -> list[Optional[float]]:
-    n = len(closes)
-    if n == 0:
+    if len(closes) == 0 or period <= 0:
         return []
-    trs: list[float] = []
-    prev_c: float | None = None
-    for i in range(n):
-        trs.append(true_range(highs[i], lows[i], prev_c))
-        prev_c = closes[i]
-    return ema(trs, period)
+    return K.to_optional_list(K.atr(highs, lows, closes, period))
 
 def _last_two_indices(flags: list[bool]) -> list[int]:
     # последние два True-индекса
-    idx = [i for i, b in enumerate(flags) if b]
-    return idx[-2:]
+    return K.last_two_true(flags)
 
 def pivots_high(values: list[float], left: int = 2, right: int = 2) -> list[bool]:
-    n = len(values)
-    res = [False] * n
-    for i in range(left, n - right):
-        v = values[i]
-        if all(v > values[i - j] for j in range(1, left + 1)) and all(v > values[i + j] for j in range(1, right + 1)):
-            res[i] = True
-    return res
+    return K.pivots_high(values, left, right).tolist()
 
 def pivots_low(values: list[float], left: int = 2, right: int = 2) -> list[bool]:
-    n = len(values)
-    res = [False] * n
-    for i in range(left, n - right):
-        v = values[i]
-        if all(v < values[i - j] for j in range(1, left + 1)) and all(v < values[i + j] for j in range(1, right + 1)):
-            res[i] = True
-    return res
+    return K.pivots_low(values, left, right).tolist()
 
 # ---------------- levels (ATR-based clustering) ----------------
 
@@ -95,6 +95,7 @@ class BinanceClient(ExchangeClient):
             trades = []
             for trade in data:
                 trades.append({
+                    "trade_id": trade.get("a"),  # id агрегированной сделки (дедупликация в хранилище)
                     "time": trade["T"],  # Время закрытия агрегированной сделки
                     "price": float(trade["p"]),  # Цена
                     "qty": float(trade["q"]),  # Количество
@@ -144,6 +145,7 @@ class BinanceClient(ExchangeClient):
                         break
                     
                     batch_trades.append({
+                        "trade_id": trade.get("a"),
                         "time": trade_time,
                         "price": float(trade["p"]),
                         "qty": float(trade["q"]),
@@ -215,6 +217,7 @@ class BybitClient(ExchangeClient):
                         "time": trade_time,
                         "price": float(trade["price"]),
                         "qty": float(trade["size"]),
+                        "trade_id": trade.get("execId"),
                         "is_buyer": trade["side"] == "Buy",
                         "exchange": self.name,
                     })
@@ -277,6 +280,7 @@ class OKXClient(ExchangeClient):
                         "time": trade_time,
                         "price": float(trade["px"]),
                         "qty": float(trade["sz"]),
+                        "trade_id": trade.get("tradeId"),
                         "is_buyer": trade["side"] == "buy",
                         "exchange": self.name,
                     })
@@ -338,6 +342,7 @@ class GateClient(ExchangeClient):
                         "time": trade_time,
                         "price": float(trade["price"]),
                         "qty": float(trade["amount"]),
+                        "trade_id": trade.get("id"),
                         "is_buyer": trade["side"] == "buy",
                         "exchange": self.name,
                     })
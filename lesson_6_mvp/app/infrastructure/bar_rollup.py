@@ -0,0 +1,282 @@
+# app/infrastructure/bar_rollup.py
+"""
+Производные таймфреймы и ярусное хранение баров.
+
+Каждый ТФ в bars пишется своим источником (webhook TradingView, collector_combo, TV fetcher) — ничто не
+держит 1h/4h/1d согласованными с 15m, а 15m копится бесконечно. Здесь:
+
+- rollup: по мере закрытия баров 1h/4h/1d/1w выводятся из самого мелкого доступного ТФ метрики
+  (o — первый, h — max, l — min, c — последний, v — сумма; бар ts покрывает окно (ts - tf, ts]).
+  Инкрементально: водяной знак (metric, tf) в bar_rollups + BARS_ROLLUP_LOOKBACK последних окон на поздние правки;
+- разметка: производные бары пишутся с bars.src='rollup', принятые извне — src NULL;
+- сверка: если принятый бар расходится с полным (все мелкие бары на месте) производным, то при
+  BARS_ROLLUP_RECONCILE=derived (по умолчанию) он заменяется производным, при =ingested — остаётся;
+  расхождения считаются в alt_forecast_bars_rollup_total{outcome="reconciled"|"conflict"};
+- retention: BARS_RETENTION="15m:90d,1h:730d" (ТФ без срока хранятся всегда); мелкие бары удаляются
+  только после того, как их окна свёрнуты; compact() делает VACUUM, когда свободных страниц > BARS_VACUUM_FREE_RATIO.
+
+    rollup = get_bar_rollup(db)
+    rollup.run()            # job воркера раз в 15 минут
+    rollup.maintain()       # раз в сутки: retention + компакция
+"""
+
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..utils.metrics import BARS_PURGED, BARS_ROLLUP
+from .db import DB
+
+log = logging.getLogger("alt_forecast.bar_rollup")
+
+MINUTE_MS = 60_000
+TF_MS: Dict[str, int] = {
+    "15m": 15 * MINUTE_MS,
+    "1h": 60 * MINUTE_MS,
+    "4h": 240 * MINUTE_MS,
+    "1d": 1440 * MINUTE_MS,
+    "1w": 7 * 1440 * MINUTE_MS,
+}
+# эпоха — четверг; недели закрываются в понедельник 00:00 UTC
+TF_OFFSET_MS: Dict[str, int] = {"1w": 4 * 1440 * MINUTE_MS}
+
+SOURCE_TIMEFRAMES: Tuple[str, ...] = ("15m", "1h", "4h", "1d")
+ROLLUP_TIMEFRAMES: Tuple[str, ...] = tuple(
+    x.strip() for x in os.getenv("BARS_ROLLUP_TIMEFRAMES", "1h,4h,1d,1w").split(",") if x.strip())
+BARS_ROLLUP_LOOKBACK = int(os.getenv("BARS_ROLLUP_LOOKBACK", "2"))
+BARS_ROLLUP_RECONCILE = os.getenv("BARS_ROLLUP_RECONCILE", "derived")   # derived | ingested
+BARS_RETENTION = os.getenv("BARS_RETENTION", "15m:90d,1h:730d")
+BARS_VACUUM_FREE_RATIO = float(os.getenv("BARS_VACUUM_FREE_RATIO", "0.2"))
+# VACUUM ждёт, пока другие соединения допишут свои транзакции
+BARS_VACUUM_BUSY_MS = int(os.getenv("BARS_VACUUM_BUSY_MS", "60000"))
+
+SRC_ROLLUP = "rollup"
+_REL_TOL = 1e-9
+
+Bar = Tuple[int, float, float, float, float, Optional[float]]   # ts,o,h,l,c,v
+
+
+def bucket_close(ts_ms: int, tf: str) -> int:
+    """Время закрытия окна tf, которому принадлежит бар с закрытием ts_ms (правый край включён)."""
+    step, off = TF_MS[tf], TF_OFFSET_MS.get(tf, 0)
+    return -((off - ts_ms) // step) * step + off
+
+
+def parse_retention(spec: str) -> Dict[str, int]:
+    """'15m:90d,1h:730d' → {'15m': 90 дней в ms, ...}; суффиксы h/d/w, 0 — хранить всегда."""
+    units = {"h": 3_600_000, "d": 86_400_000, "w": 7 * 86_400_000}
+    out: Dict[str, int] = {}
+    for part in (spec or "").split(","):
+        if not part.strip():
+            continue
+        tf, _, age = part.strip().partition(":")
+        if tf not in TF_MS or not age or age[-1] not in units:
+            raise ValueError(f"bad BARS_RETENTION entry: {part!r}")
+        ms = int(float(age[:-1]) * units[age[-1]])
+        if ms > 0:
+            out[tf] = ms
+    return out
+
+
+def aggregate(bars: List[Bar]) -> Tuple[float, float, float, float, Optional[float]]:
+    """OHLCV окна из баров мельче, по возрастанию ts."""
+    vs = [b[5] for b in bars]
+    return (bars[0][1], max(b[2] for b in bars), min(b[3] for b in bars), bars[-1][4],
+            None if any(v is None for v in vs) else float(sum(vs)))
+
+
+def _same(a: Tuple, b: Tuple) -> bool:
+    return all(abs(x - y) <= _REL_TOL * max(1.0, abs(x), abs(y)) for x, y in zip(a, b))
+
+
+class BarRollup:
+    def __init__(self, db: DB, targets: Iterable[str] = ROLLUP_TIMEFRAMES,
+                 sources: Iterable[str] = SOURCE_TIMEFRAMES, lookback: int = BARS_ROLLUP_LOOKBACK,
+                 reconcile: str = BARS_ROLLUP_RECONCILE):
+        if reconcile not in ("derived", "ingested"):
+            raise ValueError(f"reconcile must be 'derived' or 'ingested', got {reconcile!r}")
+        self.db = db
+        self.targets = tuple(targets)
+        self.sources = tuple(sorted(sources, key=TF_MS.__getitem__))
+        self.lookback = lookback
+        self.reconcile = reconcile
+        self._lock = threading.Lock()
+        db.conn.execute(
+            """CREATE TABLE IF NOT EXISTS bar_rollups (
+                   metric TEXT NOT NULL,
+                   timeframe TEXT NOT NULL,
+                   ts INTEGER NOT NULL,          -- последнее закрытое производное окно
+                   source TEXT NOT NULL,         -- ТФ, из которого выводилось
+                   PRIMARY KEY (metric, timeframe)
+               )""")
+
+    # ---- rollup ----
+
+    def _metrics(self) -> List[str]:
+        marks = ",".join("?" * len(self.sources))
+        rows = self.db.conn.execute(
+            f"SELECT DISTINCT metric FROM bars WHERE timeframe IN ({marks})", self.sources).fetchall()
+        return sorted(r[0] for r in rows)
+
+    def _source_for(self, metric: str, tf: str, since: int) -> Optional[str]:
+        """Самый мелкий ТФ, кратный tf, у которого есть бары новее водяного знака."""
+        for src in self.sources:
+            if TF_MS[src] >= TF_MS[tf] or (TF_MS[tf] % TF_MS[src]) or TF_OFFSET_MS.get(src, 0):
+                continue
+            last = self.db.get_last_ts(metric, src)
+            if last is not None and last > since:
+                return src
+        return None
+
+    def run(self, now_ms: Optional[int] = None) -> Dict[str, int]:
+        """Досворачивает закрытые окна всех метрик; возвращает счётчики исходов."""
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        totals: Dict[str, int] = {}
+        with self._lock:
+            state = {(m, tf): (ts, src) for m, tf, ts, src in
+                     self.db.conn.execute("SELECT metric, timeframe, ts, source FROM bar_rollups")}
+            for metric in self._metrics():
+                for tf in self.targets:
+                    wm = state.get((metric, tf), (None, None))[0]
+                    for k, v in self._roll(metric, tf, wm, now_ms).items():
+                        totals[k] = totals.get(k, 0) + v
+        if totals.get("derived") or totals.get("reconciled"):
+            log.info("bar rollup: %s", totals)
+        return totals
+
+    def _roll(self, metric: str, tf: str, wm: Optional[int], now_ms: int) -> Dict[str, int]:
+        step = TF_MS[tf]
+        src = self._source_for(metric, tf, wm if wm is not None else -1)
+        if src is None:
+            return {}
+        start = -1 if wm is None else wm - self.lookback * step
+        fine = list(self.db.iter_bars_between(metric, src, start + 1, now_ms))
+        if not fine:
+            return {}
+        last_fine = fine[-1][0]
+        buckets: Dict[int, List[Bar]] = {}
+        for b in fine:
+            buckets.setdefault(bucket_close(b[0], tf), []).append(b)
+        per = step // TF_MS[src]
+        # окно закрыто, если пришёл его последний мелкий бар (или что-то позже) либо время вышло
+        closed = sorted(t for t in buckets if t <= last_fine or t + TF_MS[src] <= now_ms)
+        if not closed:
+            return {}
+
+        existing = {
+            r[0]: (r[1:6], r[6]) for r in self.db.conn.execute(
+                "SELECT ts, o, h, l, c, v, src FROM bars WHERE metric=? AND timeframe=? AND ts BETWEEN ? AND ?",
+                (metric, tf, closed[0], closed[-1]))
+        }
+        counts: Dict[str, int] = {}
+        rows = []
+        for t in closed:
+            o, h, l, c, v = aggregate(buckets[t])
+            complete = len(buckets[t]) == per
+            have = existing.get(t)
+            if have is None:
+                outcome = "derived"
+            else:
+                (eo, eh, el, ec, ev), esrc = have
+                if esrc == SRC_ROLLUP and _same((o, h, l, c), (eo, eh, el, ec)) and (v is None) == (ev is None) \
+                        and (v is None or _same((v,), (ev,))):
+                    outcome = "unchanged"
+                elif esrc != SRC_ROLLUP and _same((o, h, l, c), (eo, eh, el, ec)):
+                    outcome = "match"
+                elif esrc == SRC_ROLLUP:
+                    outcome = "derived"
+                elif complete and self.reconcile == "derived":
+                    outcome = "reconciled"
+                    if v is None:
+                        v = ev
+                    log.debug("bar rollup: %s %s %d ingested %s != derived %s", metric, tf, t,
+                              (eo, eh, el, ec), (o, h, l, c))
+                else:
+                    outcome = "conflict"
+            counts[outcome] = counts.get(outcome, 0) + 1
+            BARS_ROLLUP.inc(timeframe=tf, outcome=outcome)
+            if outcome in ("derived", "reconciled"):
+                rows.append((metric, tf, t, o, h, l, c, v))
+        with self.db.atomic():
+            if rows:
+                self.db.upsert_many_bars(rows, src=SRC_ROLLUP)
+            self.db.conn.execute(
+                "INSERT OR REPLACE INTO bar_rollups(metric, timeframe, ts, source) VALUES (?,?,?,?)",
+                (metric, tf, closed[-1], src))
+        return counts
+
+    # ---- retention / компакция ----
+
+    def retain(self, now_ms: Optional[int] = None, retention: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        """
+        Удаляет бары старше срока своего яруса. Бары ТФ, из которых ещё выводятся старшие, режутся
+        не дальше самого раннего водяного знака — несвёрнутые окна не теряются.
+        """
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        retention = parse_retention(BARS_RETENTION) if retention is None else retention
+        with self._lock:
+            # водяной знак на (исходный ТФ, метрика): застрявшая метрика не держит retention остальных
+            margin = self.lookback * max(TF_MS[t] for t in self.targets) - 1
+            held: Dict[Tuple[str, str], int] = {}
+            cutoffs = {tf: now_ms - age for tf, age in retention.items()}
+            for src, metric, wm in self.db.conn.execute(
+                    "SELECT source, metric, MIN(ts) FROM bar_rollups GROUP BY source, metric"):
+                # бары с ts <= водяного знака уже свёрнуты (окна закрыты справа включительно)
+                if src in cutoffs and wm - margin < cutoffs[src]:
+                    held[(src, metric)] = wm - margin
+            deleted = self.db.purge_old_bars(cutoffs, held)
+            for tf, n in deleted.items():
+                BARS_PURGED.inc(n, timeframe=tf)
+            if deleted:
+                log.info("bar retention: deleted %s", deleted)
+            return deleted
+
+    def compact(self, free_ratio: float = BARS_VACUUM_FREE_RATIO) -> bool:
+        """VACUUM, если свободные страницы занимают больше free_ratio файла; True — если сжимали."""
+        if self.db.path == ":memory:":
+            return False
+        # отдельное соединение: VACUUM падает внутри открытой транзакции, а соединение потока могло её держать
+        with self._lock, contextlib.closing(sqlite3.connect(self.db.path, isolation_level=None)) as conn:
+            conn.execute(f"PRAGMA busy_timeout={BARS_VACUUM_BUSY_MS};")
+            pages = conn.execute("PRAGMA page_count").fetchone()[0]
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not pages or free / pages <= free_ratio:
+                return False
+            t0 = time.perf_counter()
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("VACUUM")
+            log.info("bars compaction: %d/%d free pages, VACUUM %.1fs", free, pages, time.perf_counter() - t0)
+            return True
+
+    def maintain(self, now_ms: Optional[int] = None) -> Dict[str, int]:
+        self.run(now_ms)
+        deleted = self.retain(now_ms)
+        self.compact()
+        return deleted
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """Число баров по ТФ и источнику (ingested / rollup) — для контроля размера хранилища."""
+        out: Dict[str, Dict[str, int]] = {}
+        for tf, src, n in self.db.conn.execute(
+                "SELECT timeframe, COALESCE(src, 'ingested'), COUNT(*) FROM bars GROUP BY 1, 2"):
+            out.setdefault(tf, {})[src] = n
+        return out
+
+
+_rollups: "weakref.WeakKeyDictionary[DB, BarRollup]" = weakref.WeakKeyDictionary()
+_rollups_lock = threading.Lock()
+
+
+def get_bar_rollup(db: DB) -> BarRollup:
+    with _rollups_lock:
+        r = _rollups.get(db)
+        if r is None:
+            r = _rollups[db] = BarRollup(db)
+        return r
@@ -4,12 +4,12 @@ from __future__ import annotations
 
 import os
 import re
-import time
 import logging
 from typing import Any, Dict, Optional
 
-import requests
-from requests import Response, HTTPError, RequestException
+from requests import HTTPError
+
+from .http_transport import HttpResponse, get_transport
 
 __all__ = ["notional_by_expiry"]
 
@@ -40,44 +40,17 @@ def _to_float(v: Any) -> Optional[float]:
         return None
 
 
-def _request_with_retries(url: str, params: Dict[str, Any]) -> Response:
+def _request_with_retries(url: str, params: Dict[str, Any]) -> HttpResponse:
     """
-    Простые ретраи с экспоненциальным бэкоффом и уважением Retry-After для 429.
+    GET через общий транспорт (бэкофф, Retry-After для 429, лимит eapi.binance.com).
     """
-    backoff = 1.0
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            resp = requests.get(url, params=params, headers=_headers(), timeout=DEFAULT_TIMEOUT)
-            if resp.status_code == 429:
-                ra = resp.headers.get("Retry-After")
-                sleep_for = _to_float(ra) or backoff
-                log.warning("Binance EAPI 429 Retry-After=%s; sleep %.1fs (attempt %d/%d)",
-                            ra, sleep_for, attempt, MAX_RETRIES)
-                time.sleep(min(max(0.5, sleep_for), 10.0))
-                backoff = min(backoff * 2, 8.0)
-                continue
-            resp.raise_for_status()
-            return resp
-        except HTTPError as e:
-            code = getattr(e.response, "status_code", 0)
-            if 500 <= code < 600 and attempt < MAX_RETRIES:
-                log.warning("Binance EAPI %s, retry in %.1fs (attempt %d/%d)",
-                            code, backoff, attempt, MAX_RETRIES)
-                time.sleep(backoff)
-                backoff = min(backoff * 2, 8.0)
-                continue
-            log.exception("Binance EAPI HTTP error: %s", code)
-            raise
-        except RequestException:
-            if attempt < MAX_RETRIES:
-                log.warning("Binance EAPI network error, retry in %.1fs (attempt %d/%d)",
-                            backoff, attempt, MAX_RETRIES)
-                time.sleep(backoff)
-                backoff = min(backoff * 2, 8.0)
-                continue
-            log.exception("Binance EAPI network error, giving up")
-            raise
-    raise RuntimeError("unreachable")
+    resp = get_transport().get(url, params=params, headers=_headers(), timeout=DEFAULT_TIMEOUT, retries=MAX_RETRIES)
+    try:
+        resp.raise_for_status()
+    except HTTPError:
+        log.exception("Binance EAPI HTTP error: %s", resp.status_code)
+        raise
+    return resp
 
 
 def notional_by_expiry(underlying: str, yymmdd: str) -> float | None:
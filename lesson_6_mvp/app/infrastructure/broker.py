@@ -0,0 +1,266 @@
+# app/infrastructure/broker.py
+"""
+Асинхронный брокер сообщений для пула потребителей (infrastructure.consumer_pool).
+
+Два варианта с одним интерфейсом:
+- AmqpBroker — RabbitMQ через aio_pika (опциональная зависимость, как pika у queue.MessageQueue);
+  очереди задач привязываются к exchange alt_forecast по routing key = имя очереди,
+  поэтому MessageQueue.publish_task продолжает работать как издатель;
+- MemoryBroker — очереди в памяти процесса с теми же prefetch/ack/nack; тесты и бенчмарк без RabbitMQ.
+
+    broker = make_broker()                 # QUEUE_BROKER=amqp|memory
+    await broker.connect()
+    async for d in broker.consume("forecast_btc", prefetch=32):
+        ...; await d.ack()
+    await broker.publish("forecast_results", body, correlation_id=d.correlation_id)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import itertools
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+log = logging.getLogger("alt_forecast.broker")
+
+QUEUE_BROKER = os.getenv("QUEUE_BROKER", "amqp")           # amqp | memory
+AMQP_EXCHANGE = "alt_forecast"
+
+
+def amqp_url() -> str:
+    url = os.getenv("AMQP_URL", "")
+    if url:
+        return url
+    return "amqp://{}:{}@{}:{}/".format(
+        os.getenv("RABBITMQ_USER", "guest"), os.getenv("RABBITMQ_PASS", "guest"),
+        os.getenv("RABBITMQ_HOST", "rabbitmq"), os.getenv("RABBITMQ_PORT", "5672"))
+
+
+class Delivery:
+    """Полученное сообщение; ack/nack ровно один раз."""
+
+    body: bytes
+    correlation_id: Optional[str]
+    reply_to: Optional[str]
+    headers: Dict[str, Any]
+    redelivered: bool
+    queue: str
+
+    async def ack(self) -> None:
+        raise NotImplementedError
+
+    async def nack(self, requeue: bool = True) -> None:
+        raise NotImplementedError
+
+
+# ---------- в памяти ----------
+
+@dataclass
+class _Message:
+    body: bytes
+    correlation_id: Optional[str] = None
+    reply_to: Optional[str] = None
+    headers: Dict[str, Any] = field(default_factory=dict)
+    redelivered: bool = False
+
+
+class _MemoryDelivery(Delivery):
+    def __init__(self, broker: "MemoryBroker", queue: str, msg: _Message, slots: asyncio.Semaphore):
+        self._broker, self._msg, self._slots = broker, msg, slots
+        self.queue = queue
+        self.body = msg.body
+        self.correlation_id = msg.correlation_id
+        self.reply_to = msg.reply_to
+        self.headers = dict(msg.headers)
+        self.redelivered = msg.redelivered
+        self._settled = False
+
+    def _settle(self) -> None:
+        if self._settled:
+            raise RuntimeError("delivery already acked/nacked")
+        self._settled = True
+        self._broker.unacked -= 1
+        self._slots.release()
+
+    async def ack(self) -> None:
+        self._settle()
+        self._broker.acked += 1
+
+    async def nack(self, requeue: bool = True) -> None:
+        self._settle()
+        if requeue:
+            self._msg.redelivered = True
+            self._broker._queue(self.queue).appendleft(self._msg)
+            self._broker._wake(self.queue)
+
+
+class MemoryBroker:
+    """Очереди FIFO в памяти; prefetch ограничивает неподтверждённые сообщения на одного потребителя."""
+
+    def __init__(self):
+        self._queues: Dict[str, Deque[_Message]] = collections.defaultdict(collections.deque)
+        self._events: Dict[str, asyncio.Event] = {}
+        self._closed = False
+        self.unacked = 0
+        self.max_unacked = 0
+        self.acked = 0
+
+    def _queue(self, name: str) -> Deque[_Message]:
+        return self._queues[name]
+
+    def _event(self, name: str) -> asyncio.Event:
+        ev = self._events.get(name)
+        if ev is None:
+            ev = self._events[name] = asyncio.Event()
+        return ev
+
+    def _wake(self, name: str) -> None:
+        self._event(name).set()
+
+    async def connect(self) -> None:
+        pass
+
+    async def declare(self, queue: str) -> None:
+        self._queue(queue)
+
+    async def publish(self, queue: str, body: bytes, *, correlation_id: Optional[str] = None,
+                      reply_to: Optional[str] = None, headers: Optional[Dict[str, Any]] = None,
+                      declare: bool = True) -> None:
+        self._queue(queue).append(_Message(body, correlation_id, reply_to, dict(headers or {})))
+        self._wake(queue)
+
+    def depth(self, queue: str) -> int:
+        return len(self._queue(queue))
+
+    def drain(self, queue: str) -> list:
+        """Забирает всё из очереди (для тестов: результаты, DLQ)."""
+        q = self._queue(queue)
+        out = list(q)
+        q.clear()
+        return out
+
+    async def consume(self, queue: str, prefetch: int = 1) -> AsyncIterator[Delivery]:
+        slots = asyncio.Semaphore(max(1, prefetch))
+        q = self._queue(queue)
+        ev = self._event(queue)
+        while not self._closed:
+            await slots.acquire()
+            while not q and not self._closed:
+                ev.clear()
+                await ev.wait()
+            if self._closed:
+                slots.release()
+                return
+            self.unacked += 1
+            self.max_unacked = max(self.max_unacked, self.unacked)
+            yield _MemoryDelivery(self, queue, q.popleft(), slots)
+
+    async def close(self) -> None:
+        self._closed = True
+        for ev in self._events.values():
+            ev.set()
+
+
+# ---------- RabbitMQ ----------
+
+class _AmqpDelivery(Delivery):
+    def __init__(self, queue: str, msg):
+        self._msg = msg
+        self.queue = queue
+        self.body = msg.body
+        self.correlation_id = msg.correlation_id
+        self.reply_to = msg.reply_to
+        self.headers = dict(msg.headers or {})
+        self.redelivered = bool(msg.redelivered)
+
+    async def ack(self) -> None:
+        await self._msg.ack()
+
+    async def nack(self, requeue: bool = True) -> None:
+        await self._msg.nack(requeue=requeue)
+
+
+class AmqpBroker:
+    """RabbitMQ через aio_pika: одно robust-соединение, канал на потребителя (свой prefetch), канал на публикацию."""
+
+    def __init__(self, url: Optional[str] = None):
+        self.url = url or amqp_url()
+        self._conn = None
+        self._channel = None
+        self._declared: set = set()
+        self._lock = asyncio.Lock()
+
+    async def connect(self) -> None:
+        try:
+            import aio_pika
+        except ImportError:
+            raise RuntimeError("aio-pika is not installed. Install it with: pip install aio-pika")
+        self._aio_pika = aio_pika
+        self._conn = await aio_pika.connect_robust(self.url)
+        self._channel = await self._conn.channel(publisher_confirms=True)
+        log.info("Connected to RabbitMQ (aio_pika)")
+
+    async def _declare_on(self, channel, queue: str):
+        ap = self._aio_pika
+        exchange = await channel.declare_exchange(AMQP_EXCHANGE, ap.ExchangeType.DIRECT, durable=True)
+        q = await channel.declare_queue(queue, durable=True)
+        await q.bind(exchange, routing_key=queue)
+        return q
+
+    async def declare(self, queue: str) -> None:
+        async with self._lock:
+            if queue not in self._declared:
+                await self._declare_on(self._channel, queue)
+                self._declared.add(queue)
+
+    async def publish(self, queue: str, body: bytes, *, correlation_id: Optional[str] = None,
+                      reply_to: Optional[str] = None, headers: Optional[Dict[str, Any]] = None,
+                      declare: bool = True) -> None:
+        """
+        declare=False — чужая очередь (reply_to клиента: exclusive / auto-delete, amq.rabbitmq.reply-to):
+        не объявляем и не привязываем её (PRECONDITION_FAILED закрыл бы общий канал публикации),
+        а шлём в default exchange по routing_key=queue.
+        """
+        ap = self._aio_pika
+        if declare:
+            await self.declare(queue)
+        await self._channel.default_exchange.publish(
+            ap.Message(body, correlation_id=correlation_id, reply_to=reply_to, headers=headers or {},
+                       content_type="application/json", delivery_mode=ap.DeliveryMode.PERSISTENT),
+            routing_key=queue)
+
+    async def consume(self, queue: str, prefetch: int = 1) -> AsyncIterator[Delivery]:
+        channel = await self._conn.channel()
+        await channel.set_qos(prefetch_count=max(1, prefetch))
+        q = await self._declare_on(channel, queue)
+        try:
+            async with q.iterator() as it:
+                async for msg in it:
+                    yield _AmqpDelivery(queue, msg)
+        finally:
+            if not channel.is_closed:
+                await channel.close()
+
+    async def close(self) -> None:
+        if self._conn is not None and not self._conn.is_closed:
+            await self._conn.close()
+            log.info("RabbitMQ connection closed")
+
+
+def make_broker(kind: str = QUEUE_BROKER):
+    if kind == "memory":
+        return MemoryBroker()
+    if kind == "amqp":
+        return AmqpBroker()
+    raise ValueError(f"unknown QUEUE_BROKER: {kind!r}")
+
+
+_ids = itertools.count(1)
+
+
+def new_correlation_id() -> str:
+    return f"{os.getpid()}-{next(_ids)}"
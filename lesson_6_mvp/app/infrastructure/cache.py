@@ -1,15 +1,20 @@
 # app/infrastructure/cache.py
 import time, threading
 from functools import wraps
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+from ..utils.metrics import CACHE_REQUESTS
 
 _locks: Dict[Tuple, threading.Lock] = {}
 _cache: Dict[Tuple, Tuple[float, Any]] = {}
+# (fn_name, group) → ключи _cache: точечная инвалидация без прохода по всему кэшу
+_groups: Dict[Tuple[str, Hashable], Set[Tuple]] = {}
 
 def cached(ttl: int, key_fn=None, stale_ok: bool = True):
     """
     Декоратор кэширования с TTL и stale-while-revalidate.
     Один и тот же ключ не выполняет конкурентно несколько внешних запросов.
+    ttl — секунды или функция без аргументов (TTL читается на каждом вызове, см. quota.ttl_for).
     """
     def deco(fn):
         @wraps(fn)
@@ -17,13 +22,16 @@ def cached(ttl: int, key_fn=None, stale_ok: bool = True):
             key = (fn.__name__, key_fn(*args, **kwargs) if key_fn else (args, tuple(sorted(kwargs.items()))))
             now = time.time()
             ts, val = _cache.get(key, (0.0, None))
+            ttl_now = ttl() if callable(ttl) else ttl
 
             # свежий кэш
-            if val is not None and (now - ts) < ttl:
+            if val is not None and (now - ts) < ttl_now:
+                CACHE_REQUESTS.inc(fn=fn.__name__, result="hit")
                 return val
 
             # отдаём устаревший кэш и рефрешим в фоне
             if stale_ok and val is not None:
+                CACHE_REQUESTS.inc(fn=fn.__name__, result="stale")
                 threading.Thread(target=_refresh, args=(fn, key, args, kwargs), daemon=True).start()
                 return val
 
@@ -31,13 +39,16 @@ def cached(ttl: int, key_fn=None, stale_ok: bool = True):
             lock = _locks.setdefault(key, threading.Lock())
             with lock:
                 ts2, val2 = _cache.get(key, (0.0, None))
-                if val2 is not None and (time.time() - ts2) < ttl:
+                if val2 is not None and (time.time() - ts2) < ttl_now:
+                    CACHE_REQUESTS.inc(fn=fn.__name__, result="hit")
                     return val2
                 try:
                     out = fn(*args, **kwargs)
                     _cache[key] = (time.time(), out)
+                    CACHE_REQUESTS.inc(fn=fn.__name__, result="miss")
                     return out
                 except Exception:
+                    CACHE_REQUESTS.inc(fn=fn.__name__, result="error")
                     # Если функция упала, но есть stale данные, вернём их
                     if stale_ok and val is not None:
                         return val
@@ -92,7 +103,7 @@ def get_cache(fn_name: str, cache_key: str, ttl: int = 60):
     return None
 
 
-def set_cache(fn_name: str, cache_key: str, value: Any):
+def set_cache(fn_name: str, cache_key: str, value: Any, group: Optional[Hashable] = None):
     """
     Сохранить значение в кэш.
     
@@ -100,6 +111,30 @@ def set_cache(fn_name: str, cache_key: str, value: Any):
         fn_name: Имя функции
         cache_key: Ключ кэша
         value: Значение для кэширования
+        group: Группа записи (например, (metric, timeframe)) для invalidate_cache(group=...)
     """
     key = (fn_name, cache_key)
     _cache[key] = (time.time(), value)
+    if group is not None:
+        _groups.setdefault((fn_name, group), set()).add(key)
+
+
+def invalidate_cache(fn_name: str, key_prefix: str = "", group: Optional[Hashable] = None) -> int:
+    """
+    Удалить записи кэша функции: группы group (поиск по индексу) или,
+    без group, все записи с ключом, начинающимся с key_prefix (проход по кэшу).
+
+    Returns:
+        Количество удалённых записей
+    """
+    if group is not None:
+        keys = _groups.pop((fn_name, group), ())
+        return sum(_cache.pop(k, None) is not None for k in keys)
+    keys = [k for k in list(_cache) if k[0] == fn_name and str(k[1]).startswith(key_prefix)]
+    for k in keys:
+        _cache.pop(k, None)
+    for g in [g for g in list(_groups) if g[0] == fn_name]:
+        _groups[g].difference_update(keys)
+        if not _groups[g]:
+            _groups.pop(g, None)
+    return len(keys)
@@ -1,25 +1,15 @@
 #app/infrastructure/coingecko.py
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 from typing import List, Dict, Tuple, Optional
 from .cache import cached
-from .quota import budget_guard
+from .quota import budget_guard, demand, ttl_for
 from ..config import settings
+from .http_transport import get_transport
+from .market_snapshot import STABLE_TICKERS, is_stable  # список стейблов — общий с колоночным снапшотом
 
 
-_SESSION = requests.Session()
-_RETRY = Retry(
-    total=3, connect=3, read=3,
-    backoff_factor=1.0,
-    status_forcelist=(429, 500, 502, 503, 504),
-    allowed_methods=frozenset(["GET"])
-)
-_SESSION.mount("https://", HTTPAdapter(max_retries=_RETRY))
-_SESSION.mount("http://",  HTTPAdapter(max_retries=_RETRY))
-
-# Список стейблкоинов для фильтрации
-STABLE_TICKERS = {"usdt", "usdc", "busd", "dai", "tusd", "usdp", "usdd", "frax", "lusd", "susd"}
+# общий транспорт: лимит api.coingecko.com и ретраи 429/5xx — в http_transport
+_SESSION = get_transport()
 
 def markets_page(vs: str = "usd", page: int = 1, per_page: int = 250):
     """Одна страница рынка. Берём сразу 250, чтобы не листать."""
@@ -37,12 +27,13 @@ def markets_page(vs: str = "usd", page: int = 1, per_page: int = 250):
     r.raise_for_status()
     return r.json()
 
-@budget_guard(units=1)  # Квота списывается только при реальном запросе
+@budget_guard(units=1, endpoint="markets_snapshot")  # Квота списывается только при реальном запросе
 def _markets_snapshot_with_quota(vs: str = "usd"):
     """Внутренняя функция для запроса с учётом квоты."""
     return markets_page(vs=vs, page=1, per_page=250)
 
-@cached(ttl=60*60, key_fn=lambda vs: f"markets-snapshot:{vs}", stale_ok=True)  # Увеличено до 60 минут
+@demand("markets_snapshot")
+@cached(ttl=ttl_for("markets_snapshot"), key_fn=lambda vs: f"markets-snapshot:{vs}", stale_ok=True)  # TTL ведёт планировщик квоты
 def markets_snapshot(vs: str = "usd"):
     """Получить снапшот рынка с обработкой ошибок и fallback на кэш.
     
@@ -66,19 +57,20 @@ def markets_snapshot(vs: str = "usd"):
         )
         return []
 
-# --- категории (раз в сутки) ---
-@budget_guard(units=1)
+# --- категории (TTL ~сутки, ведёт планировщик квоты) ---
+@budget_guard(units=1, endpoint="categories")
 def _categories_with_quota():
     url = f"{settings.coingecko_api_base}/coins/categories"
     r = _SESSION.get(url, headers=_headers(), timeout=20)
     r.raise_for_status()
     return r.json()
 
-@cached(ttl=24*60*60, key_fn=lambda : "categories", stale_ok=True)
+@demand("categories")
+@cached(ttl=ttl_for("categories"), key_fn=lambda : "categories", stale_ok=True)
 def categories():
     return _categories_with_quota()
 
-@budget_guard(units=1)
+@budget_guard(units=1, endpoint="markets_by_category")
 def _markets_by_category_with_quota(category: str, vs: str="usd"):
     url = f"{settings.coingecko_api_base}/coins/markets"
     params = {"vs_currency": vs, "category": category, "order": "market_cap_desc",
@@ -92,43 +84,46 @@ def _markets_by_category_with_quota(category: str, vs: str="usd"):
 def markets_by_category(category: str, vs: str="usd"):
     return _markets_by_category_with_quota(category, vs)
 
-# --- trending (каждые 30 мин) ---
-@budget_guard(units=1)
+# --- trending (TTL ~30 мин, ведёт планировщик квоты) ---
+@budget_guard(units=1, endpoint="trending")
 def _trending_with_quota():
     url = f"{settings.coingecko_api_base}/search/trending"
     r = _SESSION.get(url, headers=_headers(), timeout=20)
     r.raise_for_status()
     return r.json()
 
-@cached(ttl=30*60, key_fn=lambda : "trending", stale_ok=True)  # Увеличено до 30 минут
+@demand("trending")
+@cached(ttl=ttl_for("trending"), key_fn=lambda : "trending", stale_ok=True)
 def trending():
     return _trending_with_quota()
 
-# --- global (каждые 60 мин) ---
-@budget_guard(units=1)
+# --- global (TTL ~60 мин, ведёт планировщик квоты) ---
+@budget_guard(units=1, endpoint="global_stats")
 def _global_stats_with_quota():
     url = f"{settings.coingecko_api_base}/global"
     r = _SESSION.get(url, headers=_headers(), timeout=20)
     r.raise_for_status()
     return r.json()
 
-@cached(ttl=60*60, key_fn=lambda : "global", stale_ok=True)  # Увеличено до 60 минут
+@demand("global_stats")
+@cached(ttl=ttl_for("global_stats"), key_fn=lambda : "global", stale_ok=True)
 def global_stats():
     return _global_stats_with_quota()
 
-@budget_guard(units=1)
+@budget_guard(units=1, endpoint="defi_global")
 def _defi_global_with_quota():
     url = f"{settings.coingecko_api_base}/global/decentralized_finance_defi"
     r = _SESSION.get(url, headers=_headers(), timeout=20)
     r.raise_for_status()
     return r.json()
 
-@cached(ttl=60*60, key_fn=lambda : "global_defi", stale_ok=True)  # Увеличено до 60 минут
+@demand("defi_global")
+@cached(ttl=ttl_for("defi_global"), key_fn=lambda : "global_defi", stale_ok=True)
 def defi_global():
     return _defi_global_with_quota()
 
 def top_movers(vs: str = "usd", tf: str = "24h", limit_each: int = 5, top: int = 500):
-    """Берём из кэшированного снапшота, чтобы не бить API на каждой кнопке.
+    """Берём из колоночного снапшота (market_snapshot), чтобы не бить API и не сортировать на каждой кнопке.
     
     Args:
         vs: валюта (usd, eur, etc.)
@@ -140,8 +135,9 @@ def top_movers(vs: str = "usd", tf: str = "24h", limit_each: int = 5, top: int =
         Tuple[List[Dict], List[Dict], List[Dict], str]: (coins_for_bubbles, gainers, losers, tf)
         Если API недоступен и кэш пуст, возвращает пустые списки.
     """
+    from .market_snapshot import get_market_store
     try:
-        data = markets_snapshot(vs=vs)
+        snap = get_market_store().current(vs)
     except Exception as e:
         import logging
         logging.getLogger("alt_forecast.coingecko").error(
@@ -150,33 +146,14 @@ def top_movers(vs: str = "usd", tf: str = "24h", limit_each: int = 5, top: int =
         # Возвращаем пустые списки
         return [], [], [], tf
     
-    if not data:
+    if not len(snap):
         # Если данные пустые, возвращаем пустые списки
         return [], [], [], tf
 
-    # Ограничиваем по топу (universe)
-    # markets_snapshot уже возвращает отсортированные по market_cap_desc, так что просто берем первые top
-    coins_universe = data[:min(top, len(data))]
-
-    # отфильтруй стейблы, если у тебя есть _is_stable
-    try:
-        coins = [c for c in coins_universe if not _is_stable(c)]
-    except NameError:
-        coins = coins_universe
-
-    coins_for_bubbles = coins  # используем все монеты из universe (до count будет ограничено в render)
-
-    def change(c):
-        if tf == "1h":
-            return float(c.get("price_change_percentage_1h_in_currency") or c.get("price_change_percentage_1h") or 0.0)
-        elif tf == "7d":
-            return float(c.get("price_change_percentage_7d_in_currency") or c.get("price_change_percentage_7d") or 0.0)
-        else:
-            return float(c.get("price_change_percentage_24h_in_currency") or c.get("price_change_percentage_24h") or 0.0)
-
-    sorted_by = sorted(coins, key=change, reverse=True)
-    gainers = sorted_by[:limit_each]
-    losers  = list(reversed(sorted_by))[:limit_each]
+    # вселенная — топ-N по капе без стейблов; используем все монеты (до count будет ограничено в render)
+    coins_for_bubbles = snap.universe(top, exclude_stable=True)
+    gainers = snap.top(tf, limit_each, desc=True, exclude_stable=True, universe=top)
+    losers = snap.top(tf, limit_each, desc=False, exclude_stable=True, universe=top)
     return coins_for_bubbles, gainers, losers, tf
 
 
@@ -204,9 +181,7 @@ def markets_page(vs: str = "usd", page: int = 1, per_page: int = 250) -> List[Di
     return r.json()
 
 def _is_stable(c: Dict) -> bool:
-    sym = str(c.get("symbol", "")).lower()
-    name = str(c.get("name", "")).lower()
-    return (sym in STABLE_TICKERS) or ("stable" in name)
+    return is_stable(c)
 
 def _change(c: Dict, tf: str) -> float:
     if tf == "1h":
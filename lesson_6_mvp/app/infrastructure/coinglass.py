@@ -8,8 +8,9 @@ from dataclasses import dataclass
 from typing import Any, Dict, List
 import re
 
-import requests
-from requests import Response, HTTPError, RequestException
+from requests import HTTPError
+
+from .http_transport import HttpResponse, get_transport
 
 log = logging.getLogger("alt_forecast.coinglass")
 
@@ -110,50 +111,17 @@ def _to_float(v: Any, default: float = 0.0) -> float:
         return default
 
 
-def _request_with_retries(url: str, params: Dict[str, Any], max_retries: int = 3) -> Response:
+def _request_with_retries(url: str, params: Dict[str, Any], max_retries: int = 3) -> HttpResponse:
     """
-    Simple exponential backoff + honor Retry-After on 429.
+    GET через общий транспорт: бэкофф, Retry-After на 429 и лимит хоста — там.
     """
-    backoff = 1.0
-    for attempt in range(1, max_retries + 1):
-        try:
-            resp = requests.get(url, headers=_hdr(), params=params, timeout=DEFAULT_TIMEOUT)
-            if resp.status_code == 429:
-                retry_after = resp.headers.get("Retry-After")
-                sleep_for = _to_float(retry_after, backoff)
-                log.warning(
-                    "CoinGlass 429 Retry-After=%s; sleeping %.1fs (attempt %d/%d)",
-                    retry_after, sleep_for, attempt, max_retries
-                )
-                time.sleep(sleep_for)
-                backoff = min(backoff * 2, 8.0)
-                continue
-            resp.raise_for_status()
-            return resp
-
-        except HTTPError as e:
-            code = getattr(e.response, "status_code", 0)
-            if 500 <= code < 600 and attempt < max_retries:
-                log.warning("CoinGlass %s, retrying in %.1fs (attempt %d/%d)",
-                            code, backoff, attempt, max_retries)
-                time.sleep(backoff)
-                backoff = min(backoff * 2, 8.0)
-                continue
-            log.exception("CoinGlass HTTP error: %s", code)
-            raise
-
-        except RequestException:
-            if attempt < max_retries:
-                log.warning("CoinGlass network error, retrying in %.1fs (attempt %d/%d)",
-                            backoff, attempt, max_retries)
-                time.sleep(backoff)
-                backoff = min(backoff * 2, 8.0)
-                continue
-            log.exception("CoinGlass network error, giving up")
-            raise
-
-    # should be unreachable
-    raise RuntimeError("unreachable")
+    resp = get_transport().get(url, headers=_hdr(), params=params, timeout=DEFAULT_TIMEOUT, retries=max_retries)
+    try:
+        resp.raise_for_status()
+    except HTTPError:
+        log.exception("CoinGlass HTTP error: %s", resp.status_code)
+        raise
+    return resp
 
 
 def fetch_max_pain(symbol: str) -> MaxPainResult:
@@ -0,0 +1,235 @@
+# app/infrastructure/consumer_pool.py
+"""
+Пул асинхронных потребителей очередей с микро-батчингом.
+
+Вместо QueueWorker (pika BlockingConnection, prefetch=1, ack по одному сообщению):
+- consumers потребителей на очередь, у каждого свой prefetch — сообщения подтягиваются, пока идёт расчёт;
+- сообщения копятся в батчи по ключу handler.batch_key(message) (для прогнозов — (задача, tf, horizon));
+  батч уходит в обработку при batch_max сообщениях или через batch_wait секунд после первого;
+- обработкой одновременно заняты не больше consumers батчей — общие «тёплые» сервисы живут в handler;
+- результат публикуется в reply_to сообщения (или results_queue) с его correlation_id, затем ack;
+- ошибка обработки: сообщение переиздаётся с заголовком x-attempts+1, после max_attempts — в DLQ;
+- poison (не JSON, неизвестная задача, нет полей): сразу в DLQ (<queue>.dlq) с x-error.
+
+    pool = ConsumerPool(broker, ["forecast_btc", "forecast"], handler)
+    await pool.run()        # до pool.stop()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from ..utils.metrics import QUEUE_BATCH_SECONDS, QUEUE_BATCHES, QUEUE_DEPTH, QUEUE_MESSAGES
+from .broker import Delivery
+
+log = logging.getLogger("alt_forecast.consumer_pool")
+
+QUEUE_CONSUMERS = int(os.getenv("QUEUE_CONSUMERS", str(os.cpu_count() or 2)))
+QUEUE_PREFETCH = int(os.getenv("QUEUE_PREFETCH", "32"))
+QUEUE_BATCH_MAX = int(os.getenv("QUEUE_BATCH_MAX", "64"))
+QUEUE_BATCH_WAIT_SEC = float(os.getenv("QUEUE_BATCH_WAIT_MS", "50")) / 1000
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+QUEUE_RESULTS = os.getenv("QUEUE_RESULTS", "forecast_results")
+
+ATTEMPTS_HEADER = "x-attempts"
+
+
+class PoisonMessage(ValueError):
+    """Сообщение, которое никогда не обработается (формат/тип задачи) — сразу в DLQ."""
+
+
+def _json_default(o):
+    if hasattr(o, "item"):                      # numpy-скаляры
+        return o.item()
+    if hasattr(o, "tolist"):
+        return o.tolist()
+    if hasattr(o, "isoformat"):
+        return o.isoformat()
+    return str(o)
+
+
+def dumps(obj: Any) -> bytes:
+    return json.dumps(obj, default=_json_default, ensure_ascii=False).encode()
+
+
+class BatchHandler:
+    """Интерфейс обработчика: ключ батча и обработка батча целиком."""
+
+    def batch_key(self, message: Dict[str, Any]) -> Hashable:
+        """Ключ батча; PoisonMessage/ValueError — сообщение в DLQ без повторов."""
+        raise NotImplementedError
+
+    async def handle(self, key: Hashable, messages: List[Dict[str, Any]]) -> List[Any]:
+        """Результат на каждое сообщение (в том же порядке); Exception на месте результата — повтор только его."""
+        raise NotImplementedError
+
+
+class ConsumerPool:
+    def __init__(
+        self,
+        broker,
+        queues: Sequence[str],
+        handler: BatchHandler,
+        *,
+        consumers: int = QUEUE_CONSUMERS,
+        prefetch: int = QUEUE_PREFETCH,
+        batch_max: int = QUEUE_BATCH_MAX,
+        batch_wait: float = QUEUE_BATCH_WAIT_SEC,
+        max_attempts: int = QUEUE_MAX_ATTEMPTS,
+        results_queue: str = QUEUE_RESULTS,
+    ):
+        self.broker = broker
+        self.queues = [queues] if isinstance(queues, str) else list(queues)
+        self.handler = handler
+        self.consumers = max(1, consumers)
+        self.prefetch = max(1, prefetch)
+        self.batch_max = max(1, batch_max)
+        self.batch_wait = batch_wait
+        self.max_attempts = max(1, max_attempts)
+        self.results_queue = results_queue
+        self._pending: Dict[Hashable, List[Tuple[Delivery, Dict[str, Any]]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._inflight: set = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stopped = asyncio.Event()
+        self.stats = {"messages": 0, "batches": 0, "batched": 0, "ok": 0, "retry": 0, "dead": 0, "poison": 0}
+
+    # ---- жизненный цикл ----
+
+    async def run(self) -> None:
+        """Потребляет все очереди до stop(); на выходе дожидается начатых батчей."""
+        self._slots = asyncio.Semaphore(self.consumers)
+        await self.broker.connect()
+        for q in self.queues:
+            await self.broker.declare(q)
+        QUEUE_DEPTH.set_function(lambda: sum(len(v) for v in self._pending.values()), queue="consumer_batches")
+        self._tasks = [asyncio.create_task(self._consume(q), name=f"consume:{q}:{i}")
+                       for q in self.queues for i in range(self.consumers)]
+        log.info("consumer pool: queues=%s consumers=%d prefetch=%d batch_max=%d wait=%.3fs",
+                 self.queues, self.consumers, self.prefetch, self.batch_max, self.batch_wait)
+        try:
+            await self._stopped.wait()
+        finally:
+            # новые доставки возвращаются в очередь, начатое доделывается, пока каналы открыты
+            for key in list(self._pending):
+                self._flush(key)
+            if self._inflight:
+                await asyncio.gather(*list(self._inflight), return_exceptions=True)
+            for t in self._tasks:
+                t.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    async def _consume(self, queue: str) -> None:
+        async for d in self.broker.consume(queue, prefetch=self.prefetch):
+            if self._stopped.is_set():
+                # останавливаемся: не берём новое, канал держим открытым до ack начатых батчей
+                await d.nack(requeue=True)
+                await asyncio.Event().wait()
+            self.stats["messages"] += 1
+            try:
+                message = json.loads(d.body)
+                if not isinstance(message, dict):
+                    raise PoisonMessage("message is not a JSON object")
+                key = self.handler.batch_key(message)
+            except (ValueError, TypeError) as e:
+                await self._dead(d, "poison", f"{type(e).__name__}: {e}")
+                continue
+            self._add(key, d, message)
+
+    # ---- батчи ----
+
+    def _add(self, key: Hashable, d: Delivery, message: Dict[str, Any]) -> None:
+        batch = self._pending.setdefault(key, [])
+        batch.append((d, message))
+        if len(batch) >= self.batch_max:
+            self._flush(key)
+        elif len(batch) == 1:
+            self._timers[key] = asyncio.get_running_loop().call_later(self.batch_wait, self._flush, key)
+
+    def _flush(self, key: Hashable) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if batch:
+            task = asyncio.create_task(self._run_batch(key, batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _run_batch(self, key: Hashable, batch: List[Tuple[Delivery, Dict[str, Any]]]) -> None:
+        async with self._slots:
+            queue = batch[0][0].queue
+            self.stats["batches"] += 1
+            self.stats["batched"] += len(batch)
+            QUEUE_BATCHES.inc(queue=queue)
+            t0 = time.perf_counter()
+            try:
+                results = await self.handler.handle(key, [m for _, m in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"handler returned {len(results)} results for {len(batch)} messages")
+            except Exception as e:
+                log.exception("batch %s failed (%d messages)", key, len(batch))
+                results = [e] * len(batch)
+            took = time.perf_counter() - t0
+            QUEUE_BATCH_SECONDS.observe(took, queue=queue)
+            log.debug("batch %s: %d messages in %.3fs", key, len(batch), took)
+            await asyncio.gather(*(self._settle(d, r) for (d, _), r in zip(batch, results)))
+
+    async def _settle(self, d: Delivery, result: Any) -> None:
+        try:
+            if isinstance(result, Exception):
+                await self._retry(d, f"{type(result).__name__}: {result}")
+                return
+            # reply_to — очередь клиента: публикуем как есть, объявляем только свои (results, задачи, .dlq)
+            await self.broker.publish(d.reply_to or self.results_queue, dumps(result),
+                                      correlation_id=d.correlation_id, declare=not d.reply_to)
+            await d.ack()
+            self._count(d, "ok")
+        except Exception:
+            # публикация не прошла — сообщение вернётся в очередь (без ack до publish потери нет)
+            log.exception("failed to settle message on %s", d.queue)
+            await d.nack(requeue=True)
+
+    async def _retry(self, d: Delivery, error: str) -> None:
+        attempts = int(d.headers.get(ATTEMPTS_HEADER, 0)) + 1
+        if attempts >= self.max_attempts:
+            await self._dead(d, "dead", error, attempts)
+            return
+        headers = dict(d.headers)
+        headers[ATTEMPTS_HEADER] = attempts
+        headers["x-error"] = error[:500]
+        await self.broker.publish(d.queue, d.body, correlation_id=d.correlation_id, reply_to=d.reply_to,
+                                  headers=headers)
+        await d.ack()
+        self._count(d, "retry")
+
+    async def _dead(self, d: Delivery, outcome: str, error: str, attempts: Optional[int] = None) -> None:
+        headers = dict(d.headers)
+        headers.update({"x-error": error[:500], "x-original-queue": d.queue})
+        if attempts is not None:
+            headers[ATTEMPTS_HEADER] = attempts
+        log.warning("%s message on %s → %s.dlq: %s", outcome, d.queue, d.queue, error)
+        await self.broker.publish(f"{d.queue}.dlq", d.body, correlation_id=d.correlation_id,
+                                  reply_to=d.reply_to, headers=headers)
+        await d.ack()
+        self._count(d, outcome)
+
+    def _count(self, d: Delivery, outcome: str) -> None:
+        self.stats[outcome] += 1
+        QUEUE_MESSAGES.inc(queue=d.queue, outcome=outcome)
+
+    def get_stats(self) -> Dict[str, Any]:
+        s = dict(self.stats)
+        s["avg_batch"] = round(s["batched"] / s["batches"], 2) if s["batches"] else 0.0
+        s["pending"] = sum(len(v) for v in self._pending.values())
+        s["inflight_batches"] = len(self._inflight)
+        return s
@@ -2,41 +2,92 @@
 from __future__ import annotations
 import os
 import sqlite3
-from typing import Tuple, Iterable, Dict, Iterator, Optional, List, Any
+import threading
+import weakref
+from typing import Tuple, Iterable, Dict, Iterator, Optional, List, Any, Set
 from contextlib import contextmanager
 from datetime import datetime
 from functools import lru_cache
 
 from ..utils.time import ensure_path
 from ..config import settings
-from .cache import get_cache, set_cache
+from .cache import get_cache, invalidate_cache, set_cache
 from ..utils.performance import measure_time
+from ..utils.metrics import DB_QUERY_SECONDS, instrument_methods
 import time
 
 RowBars = Tuple[int, float, float, float, float, float | None]  # ts,o,h,l,c,v
 RowClose = Tuple[int, float]                                    # ts,c
 
+
+class _ThreadConn:
+    """Держатель соединения в threading.local: умирает вместе с потоком и закрывает соединение."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+
+def _release_conn(conns: List[sqlite3.Connection], lock: threading.Lock, conn: sqlite3.Connection) -> None:
+    with lock:
+        try:
+            conns.remove(conn)
+        except ValueError:
+            pass                 # уже закрыто DB.close()
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+@instrument_methods(DB_QUERY_SECONDS, skip=("atomic", "close"))
 class DB:
     def __init__(self, path: str | None = None):
         self.path = path or settings.database_path
         ensure_path(self.path)
-        # isolation_level=None => явный контроль транзакций (BEGIN/COMMIT),
-        # check_same_thread=False — допускаем вызовы из разных потоков
-        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
-        self.conn.row_factory = sqlite3.Row
+        # Соединение на поток: io-задачи job_runtime и asyncio.to_thread работают в своих потоках,
+        # и их BEGIN IMMEDIATE … COMMIT не должны смешиваться с чужими (как у Outbox).
+        # ':memory:' — одна общая база, соединение тоже одно. Соединение потока закрывается,
+        # когда поток завершается (пулы потоков anyio/asyncio пересоздают их), — _conns не растёт.
+        self._local = threading.local()
+        self._conns: List[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        self._shared: Optional[sqlite3.Connection] = None
+        if self.path == ":memory:":
+            self._shared = self._connect()
         self._setup()
         self._init()
 
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Соединение текущего потока (открывается при первом обращении)."""
+        if self._shared is not None:
+            return self._shared
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            conn = self._connect()
+            holder = self._local.holder = _ThreadConn(conn)
+            weakref.finalize(holder, _release_conn, self._conns, self._conns_lock, conn)
+        return holder.conn
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None => явный контроль транзакций (BEGIN/COMMIT),
+        # check_same_thread=False — закрывает соединения close() из любого потока
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute("PRAGMA busy_timeout=5000;")        # подождём до 5с при блокировке
+        conn.execute("PRAGMA temp_store=MEMORY;")
+        conn.execute("PRAGMA foreign_keys=ON;")
+        with self._conns_lock:
+            self._conns.append(conn)
+        return conn
+
     def _setup(self):
-        # устойчивые настройки для write-heavy небольшой БД
+        # устойчивые настройки для write-heavy небольшой БД (journal_mode хранится в файле — один раз)
         cur = self.conn.cursor()
         # journal_mode настраиваем через переменную окружения (WAL по умолчанию)
         mode = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
         cur.execute(f"PRAGMA journal_mode={mode};")
-        cur.execute("PRAGMA synchronous=NORMAL;")
-        cur.execute("PRAGMA busy_timeout=5000;")        # подождём до 5с при блокировке
-        cur.execute("PRAGMA temp_store=MEMORY;")
-        cur.execute("PRAGMA foreign_keys=ON;")
         cur.execute("PRAGMA wal_autocheckpoint=1000;")  # чекпойнт каждые ~1000 страниц
         self.conn.commit()
 
@@ -95,21 +146,12 @@ class DB:
                 score REAL DEFAULT 0.0,            -- качество (опц.)
                 uniq TEXT UNIQUE                   -- idempotency ключ
             );
-            
-            -- сделки с бирж для TWAP анализа
-            CREATE TABLE IF NOT EXISTS trades (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                symbol TEXT NOT NULL,              -- BTCUSDT, ETHUSDT и т.д.
-                exchange TEXT NOT NULL,            -- Binance, Bybit, OKX, Gate
-                time INTEGER NOT NULL,            -- timestamp сделки (ms)
-                price REAL NOT NULL,
-                qty REAL NOT NULL,
-                is_buyer INTEGER NOT NULL,        -- 0 = продажа, 1 = покупка
-                collected_at INTEGER NOT NULL,      -- когда собрали данные (ms)
-                UNIQUE(symbol, exchange, time, price, qty)  -- дедупликация
-            );
             """
         )
+        cur.execute("PRAGMA table_info('bars')")
+        if 'src' not in [r[1] for r in cur.fetchall()]:
+            # NULL — бар принят извне (webhook/collector/TV), 'rollup' — выведен из мелкого ТФ (bar_rollup.py)
+            cur.execute("ALTER TABLE bars ADD COLUMN src TEXT")
         cur.execute("PRAGMA table_info('divs')")
         _cols = [r[1] for r in cur.fetchall()]
         if 'confirm_grade' not in _cols:
@@ -133,21 +175,23 @@ class DB:
         cur.execute("CREATE INDEX IF NOT EXISTS idx_divs_active ON divs(status, timeframe, metric)")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_divs_detected ON divs(detected_ts DESC)")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_divs_status ON divs(status, confirm_grade)")
-        
-        # Индексы для trades
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_trades_symbol_time ON trades(symbol, time DESC)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_trades_exchange_time ON trades(exchange, time DESC)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_trades_collected_at ON trades(collected_at DESC)")
 
         self.conn.commit()
 
     # ---------- housekeeping ----------
 
     def close(self):
-        try:
-            self.conn.close()
-        except Exception:
-            pass
+        from .trade_store import close_trade_store
+        close_trade_store(self)
+        with self._conns_lock:
+            conns = list(self._conns)
+            self._conns.clear()
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
 
     @contextmanager
     def atomic(self):
@@ -161,17 +205,32 @@ class DB:
             self.conn.rollback()
             raise
 
-    def purge_old_bars(self, retention_by_tf: Dict[str, int]):
+    def purge_old_bars(self, retention_by_tf: Dict[str, int],
+                       retention_by_metric: Optional[Dict[Tuple[str, str], int]] = None) -> Dict[str, int]:
         """
         Удаляет старые бары по таймфреймам.
         retention_by_tf: {'15m': cutoff_ts_ms, '1h': cutoff_ts_ms, ...}
+        retention_by_metric: {('15m', 'BTC'): cutoff_ts_ms} — свой срез для метрики вместо среза ТФ
+        Возвращает число удалённых строк по ТФ.
         """
+        per_metric: Dict[str, Dict[str, int]] = {}
+        for (tf, metric), cutoff in (retention_by_metric or {}).items():
+            per_metric.setdefault(tf, {})[metric] = int(cutoff)
+        deleted: Dict[str, int] = {}
         with self.atomic():
             for tf, cutoff in (retention_by_tf or {}).items():
-                self.conn.execute(
-                    "DELETE FROM bars WHERE timeframe=? AND ts<?",
-                    (tf, int(cutoff))
-                )
+                own = per_metric.get(tf, {})
+                n = self.conn.execute(
+                    f"DELETE FROM bars WHERE timeframe=? AND ts<? AND metric NOT IN ({','.join('?' * len(own))})",
+                    (tf, int(cutoff), *own)
+                ).rowcount
+                for metric, c in own.items():
+                    n += self.conn.execute(
+                        "DELETE FROM bars WHERE metric=? AND timeframe=? AND ts<?", (metric, tf, c)).rowcount
+                if n:
+                    deleted[tf] = n
+        self._invalidate_bar_reads()
+        return deleted
 
     # -------- subscriptions (как было) --------
 
@@ -324,22 +383,41 @@ class DB:
         # Коммитим только если не в транзакции (иначе преждевременный commit ломает батч)
         if not self.conn.in_transaction:
             self.conn.commit()
+        self._invalidate_bar_reads({(metric, timeframe)})
 
-    def upsert_many_bars(self, rows: Iterable[Tuple[str, str, int, float, float, float, float, Optional[float]]]):
+    def upsert_many_bars(self, rows: Iterable[Tuple[str, str, int, float, float, float, float, Optional[float]]],
+                         src: Optional[str] = None):
         """
         Быстрый батч-апсерт. rows: iterable of (metric, timeframe, ts_ms, o, h, l, c, v)
         Используй внутри self.atomic() при больших пачках для максимальной скорости.
+        src — метка происхождения (None — принятый бар, 'rollup' — производный).
         """
+        series: Set[Tuple[str, str]] = set()
+
+        def _params():
+            for m, tf, ts, o, h, l, c, v in rows:
+                series.add((m, tf))
+                yield (m, tf, int(ts), float(o), float(h), float(l), float(c),
+                       (None if v is None else float(v)), src)
+
         self.conn.executemany(
-            "INSERT OR REPLACE INTO bars(metric,timeframe,ts,o,h,l,c,v) VALUES(?,?,?,?,?,?,?,?)",
-            (
-                (m, tf, int(ts), float(o), float(h), float(l), float(c),
-                 (None if v is None else float(v)))
-                for m, tf, ts, o, h, l, c, v in rows
-            )
+            "INSERT OR REPLACE INTO bars(metric,timeframe,ts,o,h,l,c,v,src) VALUES(?,?,?,?,?,?,?,?,?)",
+            _params()
         )
         if not self.conn.in_transaction:
             self.conn.commit()
+        self._invalidate_bar_reads(series)
+
+    def _invalidate_bar_reads(self, series: Optional[Iterable[Tuple[str, str]]] = None) -> None:
+        # кэш last_n/last_n_closes живёт 30 с по wall-clock — после записи бары должны читаться сразу;
+        # записи сгруппированы по (path, metric, timeframe), поэтому сбрасываются только затронутые серии
+        if series is None:
+            invalidate_cache("DB.last_n", f"{self.path}|")
+            invalidate_cache("DB.last_n_closes", f"{self.path}|")
+            return
+        for metric, timeframe in series:
+            invalidate_cache("DB.last_n", group=(self.path, metric, timeframe))
+            invalidate_cache("DB.last_n_closes", group=(self.path, metric, timeframe))
 
     # ---- helpers to convert rows ----
 
@@ -367,7 +445,7 @@ class DB:
         Кэшируется на 30 секунд для часто используемых запросов.
         """
         # Используем кэш с ключом на основе параметров
-        cache_key = f"{metric}_{timeframe}_{n}"
+        cache_key = f"{self.path}|{metric}_{timeframe}_{n}"
         cached_result = get_cache("DB.last_n", cache_key, ttl=30)
         if cached_result is not None:
             return cached_result
@@ -382,7 +460,7 @@ class DB:
         result = [self._row_to_bars_tuple(r) for r in rows]
         
         # Сохраняем в кэш
-        set_cache("DB.last_n", cache_key, result)
+        set_cache("DB.last_n", cache_key, result, group=(self.path, metric, timeframe))
         return result
 
     def last_n_closes(self, metric: str, timeframe: str, n: int) -> List[RowClose]:
@@ -391,7 +469,7 @@ class DB:
         Кэшируется на 30 секунд для часто используемых запросов.
         """
         # Используем кэш с ключом на основе параметров
-        cache_key = f"{metric}_{timeframe}_{n}"
+        cache_key = f"{self.path}|{metric}_{timeframe}_{n}"
         cached_result = get_cache("DB.last_n_closes", cache_key, ttl=30)
         if cached_result is not None:
             return cached_result
@@ -406,7 +484,7 @@ class DB:
         result = [self._row_to_close_tuple(r) for r in rows]
         
         # Сохраняем в кэш
-        set_cache("DB.last_n_closes", cache_key, result)
+        set_cache("DB.last_n_closes", cache_key, result, group=(self.path, metric, timeframe))
         return result
 
     def iter_bars_between(
@@ -433,6 +511,173 @@ class DB:
         row = cur.fetchone()
         return int(row["ts"]) if row else None
 
+    def bar_metrics(self, timeframe: str) -> List[str]:
+        """Метрики, по которым в bars есть хотя бы один бар этого ТФ."""
+        cur = self.conn.cursor()
+        cur.execute("SELECT DISTINCT metric FROM bars WHERE timeframe=? ORDER BY metric", (timeframe,))
+        return [r["metric"] for r in cur.fetchall()]
+
+    # ---- export readers (REST /api/export/bars) ----
+
+    def recent_bars(
+        self, metric: str, timeframes: Iterable[str], limit: int, offset: int = 0
+    ) -> List[Tuple[str, int, float, float, float, float, float | None]]:
+        """
+        Последние бары метрики по нескольким ТФ одним запросом, newest→oldest.
+        LIMIT/OFFSET выполняются в SQLite. Строки: (timeframe, ts, o, h, l, c, v).
+        """
+        tfs = list(timeframes)
+        if not tfs:
+            return []
+        placeholders = ",".join("?" * len(tfs))
+        cur = self.conn.cursor()
+        cur.execute(
+            f"""SELECT timeframe, ts, o, h, l, c, v FROM bars
+                WHERE metric=? AND timeframe IN ({placeholders})
+                ORDER BY ts DESC, timeframe
+                LIMIT ? OFFSET ?""",
+            (metric, *tfs, int(limit), int(offset))
+        )
+        return [(r["timeframe"],) + self._row_to_bars_tuple(r) for r in cur.fetchall()]
+
+    def bars_since(
+        self, metrics: Iterable[str], timeframes: Iterable[str], since_ts: int, limit: int
+    ) -> List[Tuple[str, str, int, float, float, float, float, float | None]]:
+        """
+        Бары нескольких серий с ts >= since_ts, по возрастанию ts. При превышении limit
+        отбрасываются самые старые, а не серии в конце алфавита: LIMIT берётся по ts DESC.
+        Строки: (metric, timeframe, ts, o, h, l, c, v).
+        """
+        ms, tfs = list(metrics), list(timeframes)
+        if not ms or not tfs:
+            return []
+        cur = self.conn.cursor()
+        cur.execute(
+            f"""SELECT metric, timeframe, ts, o, h, l, c, v FROM bars
+                WHERE metric IN ({','.join('?' * len(ms))}) AND timeframe IN ({','.join('?' * len(tfs))})
+                  AND ts >= ?
+                ORDER BY ts DESC, metric DESC, timeframe DESC
+                LIMIT ?""",
+            (*ms, *tfs, int(since_ts), int(limit))
+        )
+        rows = [(r["metric"], r["timeframe"]) + self._row_to_bars_tuple(r) for r in cur.fetchall()]
+        rows.reverse()
+        return rows
+
+    def bars_page(
+        self,
+        metrics: Iterable[str],
+        timeframes: Iterable[str],
+        *,
+        since_ts: Optional[int] = None,
+        until_ts: Optional[int] = None,
+        after: Optional[Tuple[str, str, int]] = None,
+        limit: int = 1000,
+    ) -> List[Tuple[str, str, int, float, float, float, float, float | None]]:
+        """
+        Keyset-пагинация по нескольким сериям, порядок (metric, timeframe, ts) ASC —
+        совпадает с PRIMARY KEY, поэтому страница читается по индексу без сортировки.
+
+        after: курсор (metric, timeframe, ts) последней строки предыдущей страницы.
+        Строки: (metric, timeframe, ts, o, h, l, c, v).
+        """
+        ms, tfs = list(metrics), list(timeframes)
+        if not ms or not tfs:
+            return []
+        sql = (
+            f"SELECT metric, timeframe, ts, o, h, l, c, v FROM bars "
+            f"WHERE metric IN ({','.join('?' * len(ms))}) AND timeframe IN ({','.join('?' * len(tfs))})"
+        )
+        params: List[Any] = [*ms, *tfs]
+        if since_ts is not None:
+            sql += " AND ts >= ?"
+            params.append(int(since_ts))
+        if until_ts is not None:
+            sql += " AND ts <= ?"
+            params.append(int(until_ts))
+        if after is not None:
+            sql += " AND (metric, timeframe, ts) > (?, ?, ?)"
+            params.extend([after[0], after[1], int(after[2])])
+        sql += " ORDER BY metric, timeframe, ts LIMIT ?"
+        params.append(int(limit))
+        cur = self.conn.cursor()
+        cur.execute(sql, params)
+        return [(r["metric"], r["timeframe"]) + self._row_to_bars_tuple(r) for r in cur.fetchall()]
+
+    def iter_bars_export(
+        self,
+        metrics: Iterable[str],
+        timeframes: Iterable[str],
+        *,
+        since_ts: Optional[int] = None,
+        until_ts: Optional[int] = None,
+        after: Optional[Tuple[str, str, int]] = None,
+        chunk: int = 5000,
+    ) -> Iterator[Tuple[str, str, int, float, float, float, float, float | None]]:
+        """Генератор по всему диапазону: последовательные keyset-страницы по chunk строк."""
+        ms, tfs = list(metrics), list(timeframes)
+        while True:
+            page = self.bars_page(ms, tfs, since_ts=since_ts, until_ts=until_ts, after=after, limit=chunk)
+            yield from page
+            if len(page) < chunk:
+                return
+            after = (page[-1][0], page[-1][1], page[-1][2])
+
+    def bars_version(self, metrics: Iterable[str], timeframes: Iterable[str]) -> List[Tuple[str, str, int, float]]:
+        """
+        Последний бар каждой серии: (metric, timeframe, ts, c).
+        Основа для ETag/Last-Modified — меняется при новом баре и при апдейте текущего.
+        """
+        ms, tfs = list(metrics), list(timeframes)
+        if not ms or not tfs:
+            return []
+        cur = self.conn.cursor()
+        # SQLite: «голые» колонки при MAX() берутся из строки с максимумом
+        cur.execute(
+            f"""SELECT metric, timeframe, MAX(ts) AS ts, c FROM bars
+                WHERE metric IN ({','.join('?' * len(ms))}) AND timeframe IN ({','.join('?' * len(tfs))})
+                GROUP BY metric, timeframe
+                ORDER BY metric, timeframe""",
+            (*ms, *tfs)
+        )
+        return [(r["metric"], r["timeframe"], int(r["ts"]), float(r["c"])) for r in cur.fetchall()]
+
+    def bars_revision(self, metrics: Iterable[str], timeframes: Iterable[str]) -> List[Tuple[str, str, int, int]]:
+        """
+        Ревизия серий: (metric, timeframe, число баров, MAX(rowid)). В отличие от bars_version
+        меняется и при дозагрузке/правке старых баров (INSERT OR REPLACE выдаёт строке новый rowid);
+        основа ETag выгрузки.
+        """
+        ms, tfs = list(metrics), list(timeframes)
+        if not ms or not tfs:
+            return []
+        cur = self.conn.cursor()
+        cur.execute(
+            f"""SELECT metric, timeframe, COUNT(*) AS n, MAX(rowid) AS rid FROM bars
+                WHERE metric IN ({','.join('?' * len(ms))}) AND timeframe IN ({','.join('?' * len(tfs))})
+                GROUP BY metric, timeframe
+                ORDER BY metric, timeframe""",
+            (*ms, *tfs)
+        )
+        return [(r["metric"], r["timeframe"], int(r["n"]), int(r["rid"])) for r in cur.fetchall()]
+
+    def closes_after(self, metrics: Iterable[str], timeframe: str, after_ts: int) -> List[Tuple[str, int, float]]:
+        """
+        Клоузы (metric, ts, c) с ts > after_ts по набору метрик, ORDER BY ts.
+        Дочитывание новых баров для потоковой статистики (usecases.streaming_stats).
+        """
+        ms = list(metrics)
+        if not ms:
+            return []
+        cur = self.conn.cursor()
+        cur.execute(
+            f"""SELECT metric, ts, c FROM bars
+                WHERE metric IN ({','.join('?' * len(ms))}) AND timeframe=? AND ts>?
+                ORDER BY ts, metric""",
+            (*ms, timeframe, int(after_ts))
+        )
+        return [(r["metric"], int(r["ts"]), float(r["c"])) for r in cur.fetchall()]
+
     # ---- batch readers (для pair_divergences и отчётов) ----
 
     @measure_time
@@ -574,6 +819,18 @@ class DB:
     def list_active_divs(self, metric: str, timeframe: str) -> list[tuple]:
         return self.list_open_divs(metric, timeframe)
 
+    def last_div_confirm_ts(self) -> int:
+        row = self.conn.execute("SELECT MAX(confirm_ts) FROM divs WHERE status='confirmed'").fetchone()
+        return int(row[0] or 0)
+
+    def divs_confirmed_after(self, after_ts: int) -> List[Tuple[str, str, str, str, int]]:
+        """(metric, timeframe, indicator, side, confirm_ts) подтверждённых после after_ts — для алертов watchlist."""
+        cur = self.conn.execute(
+            """SELECT metric, timeframe, indicator, side, confirm_ts FROM divs
+               WHERE status='confirmed' AND confirm_ts>? ORDER BY confirm_ts""",
+            (int(after_ts),))
+        return [(r[0], r[1], r[2], r[3], int(r[4])) for r in cur.fetchall()]
+
     def confirm_div_by_id(self, div_id: int, ts_ms: int) -> None:
         cur = self.conn.cursor()
         cur.execute("UPDATE divs SET status='confirmed', confirm_ts=? WHERE id=? AND status='active'",
@@ -644,8 +901,15 @@ class DB:
         self.conn.commit()
 
     # ---------- trades persistence (для TWAP анализа) ----------
+    # Сделки живут в отдельном файле <db>_trades.db с дневными партициями (см. trade_store.py);
+    # старая таблица trades при первом обращении переносится туда и удаляется.
 
-    def upsert_many_trades(self, trades: List[Dict]) -> None:
+    @property
+    def trade_store(self):
+        from .trade_store import get_trade_store
+        return get_trade_store(self)
+
+    def upsert_many_trades(self, trades: List[Dict]) -> int:
         """
         Батч-вставка сделок с дедупликацией.
         
@@ -657,28 +921,14 @@ class DB:
                 - price: float
                 - qty: float
                 - is_buyer: bool (True = покупка, False = продажа)
-                - collected_at: int (timestamp когда собрали данные, в миллисекундах)
+                - trade_id: id сделки на бирже (опционально; без него дедупликация по цене и объёму)
+        
+        Returns:
+            Количество новых сделок
         """
         if not trades:
-            return
-        
-        cur = self.conn.cursor()
-        with self.atomic():
-            for trade in trades:
-                cur.execute(
-                    """INSERT OR IGNORE INTO trades(symbol, exchange, time, price, qty, is_buyer, collected_at)
-                       VALUES(?, ?, ?, ?, ?, ?, ?)""",
-                    (
-                        trade["symbol"],
-                        trade["exchange"],
-                        trade["time"],
-                        trade["price"],
-                        trade["qty"],
-                        1 if trade["is_buyer"] else 0,
-                        trade["collected_at"],
-                    )
-                )
-        self.conn.commit()
+            return 0
+        return self.trade_store.insert(trades)
 
     def get_trades_by_period(
         self,
@@ -699,43 +949,14 @@ class DB:
         Returns:
             Список сделок в формате [{"time": ms, "price": float, "qty": float, "is_buyer": bool, "exchange": str}, ...]
         """
-        cur = self.conn.cursor()
-        
         if until_ms is None:
             until_ms = int(datetime.now().timestamp() * 1000)
-        
-        if exchange:
-            cur.execute(
-                """SELECT time, price, qty, is_buyer, exchange
-                   FROM trades
-                   WHERE symbol=? AND exchange=? AND time >= ? AND time <= ?
-                   ORDER BY time ASC""",
-                (symbol, exchange, since_ms, until_ms)
-            )
-        else:
-            cur.execute(
-                """SELECT time, price, qty, is_buyer, exchange
-                   FROM trades
-                   WHERE symbol=? AND time >= ? AND time <= ?
-                   ORDER BY time ASC""",
-                (symbol, since_ms, until_ms)
-            )
-        
-        rows = cur.fetchall()
-        return [
-            {
-                "time": row["time"],
-                "price": float(row["price"]),
-                "qty": float(row["qty"]),
-                "is_buyer": bool(row["is_buyer"]),
-                "exchange": row["exchange"],
-            }
-            for row in rows
-        ]
+        return self.trade_store.range(symbol, since_ms, until_ms, exchange)
 
     def cleanup_old_trades(self, max_age_hours: int = 24) -> int:
         """
-        Удалить старые сделки (старше указанного количества часов).
+        Удалить старые сделки: партиции дней, целиком старше max_age_hours (по времени сделки).
+        Если задан TRADES_ARCHIVE_DIR, день сначала выгружается в Parquet.
         
         Args:
             max_age_hours: Максимальный возраст данных в часах (по умолчанию 24)
@@ -743,13 +964,6 @@ class DB:
         Returns:
             Количество удаленных записей
         """
-        cur = self.conn.cursor()
-        cutoff_ms = int(datetime.now().timestamp() * 1000) - (max_age_hours * 60 * 60 * 1000)
-        
-        cur.execute("DELETE FROM trades WHERE collected_at < ?", (cutoff_ms,))
-        deleted = cur.rowcount
-        self.conn.commit()
-        
-        return deleted
+        return self.trade_store.retain(max_age_hours)
 
 
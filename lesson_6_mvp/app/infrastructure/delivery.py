@@ -0,0 +1,656 @@
+# app/infrastructure/delivery.py
+"""
+Доставка исходящих сообщений Telegram: лимитер Bot API + персистентная очередь (outbox) с полосами приоритета.
+
+DeliveryRateLimiter — BaseRateLimiter PTB: через него проходит КАЖДЫЙ вызов бота (и ответы в хендлерах,
+и рассылки). Токен-бакеты: общий на бота (DELIVERY_GLOBAL_RPS, ~30 msg/s у Telegram) и на чат
+(1 msg/s в личке, 20 msg/min в группах). Полоса берётся из rate_limit_args={"lane": ...} или из
+контекста `with delivery_lane(LANE_BROADCAST)`; пока ждут интерактивные ответы, рассылки токены не берут.
+RetryAfter (flood control) замораживает бакеты на retry_after и повторяет вызов.
+
+Outbox — очередь в SQLite (tg_outbox): переживает рестарт, дедуплицирует одинаковые payload'ы в окне
+DELIVERY_DEDUP_SEC, доставляет по полосам (interactive → alert → broadcast) с сохранением порядка внутри
+чата, повторяет сетевые ошибки с экспоненциальной задержкой, Forbidden отдаёт в on_forbidden (отписка).
+
+    outbox = get_outbox(db)
+    outbox.broadcast(db.list_subs(), "send_message", lane=LANE_BROADCAST, text=html, parse_mode="HTML")
+
+Метрики: alt_forecast_delivery_messages_total{lane,outcome}, delivery_backlog{lane},
+delivery_latency_seconds{lane}, delivery_limiter_wait_seconds{lane}.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from telegram import InlineKeyboardMarkup, InputMediaDocument, InputMediaPhoto, ReplyKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+from telegram.ext import BaseRateLimiter
+
+from ..utils.metrics import DELIVERY_BACKLOG, DELIVERY_LATENCY, DELIVERY_MESSAGES, DELIVERY_WAIT
+
+log = logging.getLogger("alt_forecast.delivery")
+
+LANE_INTERACTIVE = 0
+LANE_ALERT = 1
+LANE_BROADCAST = 2
+LANES = {LANE_INTERACTIVE: "interactive", LANE_ALERT: "alert", LANE_BROADCAST: "broadcast"}
+
+DELIVERY_GLOBAL_RPS = float(os.getenv("DELIVERY_GLOBAL_RPS", "25"))
+DELIVERY_GLOBAL_BURST = float(os.getenv("DELIVERY_GLOBAL_BURST", "5"))
+DELIVERY_CHAT_RPS = float(os.getenv("DELIVERY_CHAT_RPS", "1"))
+DELIVERY_CHAT_BURST = float(os.getenv("DELIVERY_CHAT_BURST", "2"))
+DELIVERY_GROUP_PER_MIN = float(os.getenv("DELIVERY_GROUP_PER_MIN", "20"))
+# рассылки не выбирают общий лимит целиком — запас под интерактив
+DELIVERY_BROADCAST_SHARE = float(os.getenv("DELIVERY_BROADCAST_SHARE", "0.8"))
+DELIVERY_LIMITER_RETRIES = int(os.getenv("DELIVERY_LIMITER_RETRIES", "2"))
+
+DELIVERY_CONCURRENCY = int(os.getenv("DELIVERY_CONCURRENCY", "16"))
+DELIVERY_MAX_ATTEMPTS = int(os.getenv("DELIVERY_MAX_ATTEMPTS", "6"))
+DELIVERY_BACKOFF_SEC = float(os.getenv("DELIVERY_BACKOFF_SEC", "2"))
+DELIVERY_BACKOFF_MAX_SEC = float(os.getenv("DELIVERY_BACKOFF_MAX_SEC", "300"))
+DELIVERY_DEDUP_SEC = int(os.getenv("DELIVERY_DEDUP_SEC", "3600"))
+DELIVERY_KEEP_SEC = int(os.getenv("DELIVERY_KEEP_SEC", "86400"))
+DELIVERY_POLL_SEC = float(os.getenv("DELIVERY_POLL_SEC", "1.0"))
+
+_LANE: contextvars.ContextVar[int] = contextvars.ContextVar("delivery_lane", default=LANE_INTERACTIVE)
+
+
+@contextmanager
+def delivery_lane(lane: int):
+    """Все вызовы бота внутри блока идут в полосе lane (для кода, который шлёт сам, напр. _send_bubbles)."""
+    token = _LANE.set(lane)
+    try:
+        yield
+    finally:
+        _LANE.reset(token)
+
+
+def _seconds(x) -> float:
+    """RetryAfter.retry_after — int или timedelta в зависимости от версии PTB."""
+    return x.total_seconds() if isinstance(x, timedelta) else float(x or 1)
+
+
+# ---------- лимитер ----------
+
+class TokenBucket:
+    """Классический token bucket на монотонном времени; hold() — заморозка после flood control."""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp", "held_until")
+
+    def __init__(self, rate: float, burst: float, now: Optional[float] = None):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.stamp = time.monotonic() if now is None else now
+        self.held_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self.stamp:
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+
+    def delay(self, now: float) -> float:
+        """Сколько ждать до свободного токена (0 — можно сейчас)."""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+        return max(wait, self.held_until - now)
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1.0
+
+    def hold(self, until: float) -> None:
+        self.held_until = max(self.held_until, until)
+        self.tokens = min(self.tokens, 0.0)
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst and now >= self.held_until
+
+
+class DeliveryRateLimiter(BaseRateLimiter):
+    """Пэйсинг вызовов Bot API: общий бакет + бакет чата + приоритет интерактива над рассылками."""
+
+    def __init__(self, global_rps: float = DELIVERY_GLOBAL_RPS, global_burst: float = DELIVERY_GLOBAL_BURST,
+                 chat_rps: float = DELIVERY_CHAT_RPS, chat_burst: float = DELIVERY_CHAT_BURST,
+                 group_per_min: float = DELIVERY_GROUP_PER_MIN, broadcast_share: float = DELIVERY_BROADCAST_SHARE,
+                 max_retries: int = DELIVERY_LIMITER_RETRIES):
+        self.global_bucket = TokenBucket(global_rps, global_burst)
+        self.broadcast_bucket = TokenBucket(global_rps * broadcast_share, max(1.0, global_burst * broadcast_share))
+        self.chat_rps, self.chat_burst = chat_rps, chat_burst
+        self.group_rate = group_per_min / 60.0
+        self.max_retries = max_retries
+        self._chats: Dict[int, TokenBucket] = {}
+        self._urgent_waiting = 0
+        self.flood_events = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        b = self._chats.get(chat_id)
+        if b is None:
+            if len(self._chats) > 50_000:
+                self._chats = {k: v for k, v in self._chats.items() if not v.full(now)}
+            rate, burst = (self.group_rate, 3.0) if chat_id < 0 else (self.chat_rps, self.chat_burst)
+            b = self._chats[chat_id] = TokenBucket(rate, burst, now)
+        return b
+
+    async def acquire(self, chat_id: Optional[int], lane: int = LANE_INTERACTIVE) -> float:
+        """Ждёт токены (общий + чата), возвращает время ожидания."""
+        t0 = now = time.monotonic()
+        urgent = lane == LANE_INTERACTIVE
+        if urgent:
+            self._urgent_waiting += 1
+        try:
+            while True:
+                now = time.monotonic()
+                buckets = [self.global_bucket]
+                if lane == LANE_BROADCAST:
+                    buckets.append(self.broadcast_bucket)
+                if chat_id is not None:
+                    buckets.append(self._chat_bucket(chat_id, now))
+                wait = max(b.delay(now) for b in buckets)
+                if not urgent and self._urgent_waiting:
+                    wait = max(wait, 0.01)
+                if wait <= 0:
+                    for b in buckets:
+                        b.take(now)
+                    break
+                await asyncio.sleep(wait)
+        finally:
+            if urgent:
+                self._urgent_waiting -= 1
+        waited = now - t0
+        DELIVERY_WAIT.observe(waited, lane=LANES.get(lane, str(lane)))
+        return waited
+
+    def hold(self, chat_id: Optional[int], seconds: float) -> None:
+        until = time.monotonic() + seconds
+        self.global_bucket.hold(until)
+        if chat_id is not None:
+            self._chat_bucket(chat_id, time.monotonic()).hold(until)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id") if isinstance(data, dict) else None
+        try:
+            chat_id = int(chat_id) if chat_id is not None else None
+        except (TypeError, ValueError):
+            chat_id = None  # @channelusername — только общий лимит
+        lane = (rate_limit_args or {}).get("lane", _LANE.get()) if isinstance(rate_limit_args, dict) else _LANE.get()
+        # getUpdates, setMyCommands и прочие служебные вызовы не считаем
+        paced = chat_id is not None or "chat_id" in (data or {})
+        for attempt in range(self.max_retries + 1):
+            if paced:
+                await self.acquire(chat_id, lane)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                wait = _seconds(e.retry_after)
+                self.flood_events += 1
+                self.hold(chat_id, wait)
+                log.warning("flood control on %s chat_id=%s: retry after %.1fs (attempt %d)",
+                            endpoint, chat_id, wait, attempt + 1)
+                if attempt >= self.max_retries:
+                    raise
+
+
+_limiter: Optional[DeliveryRateLimiter] = None
+
+
+def get_rate_limiter() -> DeliveryRateLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = DeliveryRateLimiter()
+    return _limiter
+
+
+# ---------- сериализация payload'а ----------
+
+_MARKUPS = {"InlineKeyboardMarkup": InlineKeyboardMarkup, "ReplyKeyboardMarkup": ReplyKeyboardMarkup}
+_MEDIA = {"photo": InputMediaPhoto, "document": InputMediaDocument}
+_FILE_KEYS = ("photo", "document", "animation", "video", "audio")
+
+
+def _file_bytes(x) -> Optional[bytes]:
+    """bytes / BytesIO / открытый файл / telegram.InputFile → bytes; file_id и URL (str) — None."""
+    if isinstance(x, (bytes, bytearray)):
+        return bytes(x)
+    if hasattr(x, "getvalue"):
+        return x.getvalue()
+    if isinstance(x, io.IOBase):
+        return x.read()
+    content = getattr(x, "input_file_content", None)
+    return content if isinstance(content, bytes) else None
+
+
+def encode_payload(kwargs: Dict[str, Any]) -> Tuple[str, Dict[str, bytes]]:
+    """
+    kwargs метода бота → (JSON, файлы по sha256). Байты/BytesIO выносятся в tg_outbox_files:
+    одна PNG на тысячу подписчиков хранится один раз, в payload — ссылка {"$file": sha}.
+    """
+    files: Dict[str, bytes] = {}
+
+    def put(data: bytes) -> Dict[str, str]:
+        sha = hashlib.sha256(data).hexdigest()
+        files[sha] = data
+        return {"$file": sha}
+
+    out: Dict[str, Any] = {}
+    for key, val in kwargs.items():
+        if val is None:
+            continue
+        if key == "reply_markup":
+            out[key] = {"$markup": type(val).__name__, "data": val.to_dict()}
+        elif key == "media":
+            items = []
+            for m in val:
+                kind = "document" if isinstance(m, InputMediaDocument) else "photo"
+                data = _file_bytes(m.media)
+                items.append({"$media": kind, "media": put(data) if data is not None else m.media,
+                              "caption": m.caption,
+                              "parse_mode": m.parse_mode if isinstance(m.parse_mode, str) else None})
+            out[key] = items
+        elif key in _FILE_KEYS and _file_bytes(val) is not None:
+            out[key] = put(_file_bytes(val))
+        else:
+            out[key] = val
+    return json.dumps(out, ensure_ascii=False, sort_keys=True), files
+
+
+def decode_payload(payload: str, files: Dict[str, bytes]) -> Dict[str, Any]:
+    def get(ref):
+        return files[ref["$file"]] if isinstance(ref, dict) and "$file" in ref else ref
+
+    kwargs = json.loads(payload)
+    for key, val in list(kwargs.items()):
+        if key == "reply_markup" and isinstance(val, dict) and "$markup" in val:
+            kwargs[key] = _MARKUPS[val["$markup"]].de_json(val["data"], None)
+        elif key == "media":
+            kwargs[key] = [_MEDIA[m["$media"]](media=get(m["media"]), caption=m.get("caption"),
+                                               parse_mode=m.get("parse_mode")) for m in val]
+        elif isinstance(val, dict) and "$file" in val:
+            kwargs[key] = get(val)
+    return kwargs
+
+
+def payload_key(chat_id: int, method: str, payload: str) -> str:
+    """Ключ дедупликации: файлы входят в payload своими sha256."""
+    return hashlib.sha256(f"{chat_id}|{method}|{payload}".encode()).hexdigest()
+
+
+def split_html(text: str, limit: int = 4096 - 32) -> List[str]:
+    """Длинный текст → части по строкам, каждая ≤ limit (как _send_html у бота)."""
+    parts, cur, cur_len = [], [], 0
+    for line in text.splitlines(keepends=True):
+        if cur and cur_len + len(line) > limit:
+            parts.append("".join(cur))
+            cur, cur_len = [], 0
+        cur.append(line)
+        cur_len += len(line)
+    if cur:
+        parts.append("".join(cur))
+    return parts
+
+
+# ---------- outbox ----------
+
+@dataclass
+class OutboxItem:
+    id: int
+    chat_id: int
+    lane: int
+    method: str
+    payload: str
+    files: str
+    attempts: int
+    created_ms: int
+
+
+class Outbox:
+    """Персистентная очередь исходящих + диспетчер поверх бота (обычно с DeliveryRateLimiter)."""
+
+    def __init__(self, db, concurrency: int = DELIVERY_CONCURRENCY, max_attempts: int = DELIVERY_MAX_ATTEMPTS,
+                 dedup_sec: int = DELIVERY_DEDUP_SEC, backoff_sec: float = DELIVERY_BACKOFF_SEC):
+        # своё соединение к тому же файлу: транзакции очереди не смешиваются с чужими вызовами DB.conn
+        self.path = db.path
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA busy_timeout=5000;")
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
+        self.concurrency = max(1, int(concurrency))
+        self.max_attempts = max_attempts
+        self.dedup_sec = dedup_sec
+        self.backoff_sec = backoff_sec
+        self.on_forbidden: Optional[Callable[[int], Any]] = None
+        self._lock = threading.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Dict[int, asyncio.Task] = {}
+        self._bot = None
+        self._init_tables()
+        for lane, name in LANES.items():
+            DELIVERY_BACKLOG.set_function(lambda lane=lane: self.backlog().get(lane, 0), lane=name)
+
+    def _init_tables(self) -> None:
+        with self._lock:
+            self.conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS tg_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id INTEGER NOT NULL,
+                    lane INTEGER NOT NULL,
+                    method TEXT NOT NULL,           -- send_message / send_photo / send_media_group / ...
+                    payload TEXT NOT NULL,          -- JSON kwargs, файлы — ссылки {"$file": sha256}
+                    files TEXT NOT NULL DEFAULT '', -- sha256 файлов через пробел
+                    dedup_key TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',  -- pending / sending / sent / failed
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    not_before_ms INTEGER NOT NULL,
+                    created_ms INTEGER NOT NULL,
+                    done_ms INTEGER,
+                    last_error TEXT
+                );
+                CREATE TABLE IF NOT EXISTS tg_outbox_files (
+                    sha TEXT PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    created_ms INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_outbox_ready ON tg_outbox(status, lane, id);
+                CREATE INDEX IF NOT EXISTS idx_outbox_chat ON tg_outbox(chat_id, status, id);
+                CREATE INDEX IF NOT EXISTS idx_outbox_dedup ON tg_outbox(dedup_key, created_ms);
+                """
+            )
+            # рестарт посреди отправки: at-least-once, возвращаем в очередь
+            self.conn.execute("UPDATE tg_outbox SET status='pending' WHERE status='sending'")
+
+    # ---- постановка ----
+
+    def enqueue(self, chat_id: int, method: str = "send_message", lane: int = LANE_BROADCAST,
+                delay_sec: float = 0.0, **kwargs) -> Optional[int]:
+        """Кладёт вызов бота в очередь; None — такой же payload этому чату уже был в окне дедупликации."""
+        ids = self.enqueue_many([chat_id], method, lane=lane, delay_sec=delay_sec, **kwargs)
+        return ids[0] if ids else None
+
+    def enqueue_many(self, chat_ids: Iterable[int], method: str = "send_message", lane: int = LANE_BROADCAST,
+                     delay_sec: float = 0.0, **kwargs) -> List[int]:
+        payload, files = encode_payload(kwargs)
+        now_ms = int(time.time() * 1000)
+        since_ms = now_ms - self.dedup_sec * 1000
+        shas = " ".join(sorted(files))
+        ids: List[int] = []
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute("BEGIN")
+            try:
+                for chat_id in chat_ids:
+                    key = payload_key(int(chat_id), method, payload)
+                    dup = cur.execute(
+                        "SELECT 1 FROM tg_outbox WHERE dedup_key=? AND created_ms>=? AND status!='failed' LIMIT 1",
+                        (key, since_ms)).fetchone()
+                    if dup:
+                        DELIVERY_MESSAGES.inc(lane=LANES.get(lane, str(lane)), outcome="dedup")
+                        continue
+                    cur.execute(
+                        "INSERT INTO tg_outbox(chat_id, lane, method, payload, files, dedup_key, not_before_ms, "
+                        "created_ms) VALUES (?,?,?,?,?,?,?,?)",
+                        (int(chat_id), lane, method, payload, shas, key, now_ms + int(delay_sec * 1000), now_ms))
+                    ids.append(cur.lastrowid)
+                if ids and files:
+                    cur.executemany("INSERT OR IGNORE INTO tg_outbox_files(sha, data, created_ms) VALUES (?,?,?)",
+                                    [(sha, data, now_ms) for sha, data in files.items()])
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        if ids:
+            self._notify()
+        return ids
+
+    def broadcast(self, chat_ids: Iterable[int], method: str = "send_message", lane: int = LANE_BROADCAST,
+                  **kwargs) -> int:
+        return len(self.enqueue_many(chat_ids, method, lane=lane, **kwargs))
+
+    def broadcast_html(self, chat_ids: Iterable[int], text: str, lane: int = LANE_BROADCAST,
+                       reply_markup=None, **kwargs) -> int:
+        """HTML-текст любой длины: части подряд (порядок внутри чата сохраняется), клавиатура — на последней."""
+        chat_ids = list(chat_ids)
+        parts = split_html(text) if text else []
+        n = 0
+        for i, chunk in enumerate(parts):
+            n += self.broadcast(chat_ids, "send_message", lane=lane, text=chunk, parse_mode="HTML",
+                                disable_web_page_preview=True,
+                                reply_markup=reply_markup if i == len(parts) - 1 else None, **kwargs)
+        return n
+
+    def _notify(self) -> None:
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None or loop.is_closed():
+            return
+        try:
+            if asyncio.get_running_loop() is loop:
+                wake.set()
+                return
+        except RuntimeError:
+            pass
+        loop.call_soon_threadsafe(wake.set)
+
+    # ---- выборка ----
+
+    def _claim(self, limit: int, busy: Set[int]) -> List[OutboxItem]:
+        """Готовые к отправке: по полосам, первое незавершённое сообщение каждого чата (FIFO внутри чата)."""
+        now_ms = int(time.time() * 1000)
+        with self._lock:
+            rows = self.conn.execute(
+                """
+                SELECT o.id, o.chat_id, o.lane, o.method, o.payload, o.files, o.attempts, o.created_ms
+                FROM tg_outbox o
+                WHERE o.status='pending' AND o.not_before_ms<=?
+                  AND NOT EXISTS (SELECT 1 FROM tg_outbox p
+                                  WHERE p.chat_id=o.chat_id AND p.status IN ('pending','sending') AND p.id<o.id)
+                ORDER BY o.lane, o.id
+                LIMIT ?
+                """, (now_ms, limit + len(busy))).fetchall()
+            out: List[OutboxItem] = []
+            for r in rows:
+                if r[1] in busy or len(out) >= limit:
+                    continue
+                out.append(OutboxItem(*r))
+            if out:
+                self.conn.executemany("UPDATE tg_outbox SET status='sending' WHERE id=?", [(x.id,) for x in out])
+        return out
+
+    def _files(self, shas: str) -> Dict[str, bytes]:
+        if not shas:
+            return {}
+        keys = shas.split()
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT sha, data FROM tg_outbox_files WHERE sha IN ({','.join('?' * len(keys))})", keys).fetchall()
+        return {r[0]: bytes(r[1]) for r in rows}
+
+    def _finish(self, item: OutboxItem, status: str, error: str = "", retry_in: Optional[float] = None,
+                count_attempt: bool = True) -> None:
+        now_ms = int(time.time() * 1000)
+        attempts = item.attempts + (1 if count_attempt else 0)
+        with self._lock:
+            if retry_in is not None:
+                self.conn.execute(
+                    "UPDATE tg_outbox SET status='pending', attempts=?, not_before_ms=?, last_error=? WHERE id=?",
+                    (attempts, now_ms + int(retry_in * 1000), error[:500], item.id))
+            else:
+                self.conn.execute(
+                    "UPDATE tg_outbox SET status=?, attempts=?, done_ms=?, last_error=? WHERE id=?",
+                    (status, attempts, now_ms, error[:500] or None, item.id))
+
+    def backlog(self) -> Dict[int, int]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT lane, COUNT(*) FROM tg_outbox WHERE status IN ('pending','sending') GROUP BY lane").fetchall()
+        return {int(r[0]): int(r[1]) for r in rows}
+
+    def purge(self, keep_sec: int = DELIVERY_KEEP_SEC) -> int:
+        """Удаляет доставленные/проваленные старше keep_sec (но не раньше окна дедупликации)."""
+        cutoff = int(time.time() * 1000) - max(keep_sec, self.dedup_sec) * 1000
+        with self._lock:
+            n = self.conn.execute(
+                "DELETE FROM tg_outbox WHERE status IN ('sent','failed') AND done_ms<?", (cutoff,)).rowcount
+            # файлы, на которые больше не ссылается ни одно недоставленное сообщение
+            self.conn.execute(
+                "DELETE FROM tg_outbox_files WHERE NOT EXISTS (SELECT 1 FROM tg_outbox o "
+                "WHERE o.status IN ('pending','sending') AND instr(o.files, tg_outbox_files.sha) > 0)")
+        return n
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM tg_outbox GROUP BY status").fetchall()
+        return {"by_status": {r[0]: r[1] for r in rows},
+                "backlog": {LANES.get(k, str(k)): v for k, v in self.backlog().items()},
+                "inflight": len(self._inflight)}
+
+    # ---- доставка ----
+
+    async def deliver(self, item: OutboxItem) -> str:
+        lane = LANES.get(item.lane, str(item.lane))
+        try:
+            kwargs = decode_payload(item.payload, self._files(item.files))
+            send = getattr(self._bot, item.method)
+            with delivery_lane(item.lane):
+                await send(chat_id=item.chat_id, **kwargs)
+        except RetryAfter as e:
+            # лимитер уже подождал и повторил — откладываем без расхода попытки
+            self._finish(item, "pending", f"RetryAfter {e.retry_after}", retry_in=_seconds(e.retry_after),
+                         count_attempt=False)
+            outcome = "flood"
+        except Forbidden as e:
+            self._finish(item, "failed", f"Forbidden: {e}")
+            outcome = "failed"
+            if self.on_forbidden is not None:
+                try:
+                    res = self.on_forbidden(item.chat_id)
+                    if asyncio.iscoroutine(res):
+                        await res
+                except Exception:
+                    log.exception("on_forbidden failed chat_id=%s", item.chat_id)
+        except BadRequest as e:
+            self._finish(item, "failed", f"BadRequest: {e}")
+            outcome = "failed"
+            log.warning("outbox %d: BadRequest chat_id=%s: %s", item.id, item.chat_id, e)
+        except (TimedOut, NetworkError, OSError) as e:
+            outcome = self._retry(item, e)
+        except Exception as e:
+            log.exception("outbox %d: send failed chat_id=%s", item.id, item.chat_id)
+            outcome = self._retry(item, e)
+        else:
+            self._finish(item, "sent")
+            outcome = "sent"
+            DELIVERY_LATENCY.observe(max(0.0, time.time() - item.created_ms / 1000.0), lane=lane)
+        DELIVERY_MESSAGES.inc(lane=lane, outcome=outcome)
+        return outcome
+
+    def _retry(self, item: OutboxItem, err: Exception) -> str:
+        error = f"{type(err).__name__}: {err}"
+        if item.attempts + 1 >= self.max_attempts:
+            self._finish(item, "failed", error)
+            log.warning("outbox %d: giving up after %d attempts: %s", item.id, item.attempts + 1, error)
+            return "failed"
+        delay = min(DELIVERY_BACKOFF_MAX_SEC, self.backoff_sec * 2 ** item.attempts) * random.uniform(0.8, 1.2)
+        self._finish(item, "pending", error, retry_in=delay)
+        return "retry"
+
+    async def drain(self, bot=None, timeout: float = 60.0) -> int:
+        """Доставляет всё готовое и ждёт завершения (для тестов/бенчмарка/однократного прогона)."""
+        if bot is not None:
+            self._bot = bot
+        done, deadline = 0, time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            batch = self._claim(self.concurrency, set())
+            if not batch:
+                break
+            await asyncio.gather(*(self.deliver(x) for x in batch))
+            done += len(batch)
+        return done
+
+    async def run(self, bot) -> None:
+        """Диспетчер: держит до concurrency отправок в полёте, не больше одной на чат."""
+        self._bot = bot
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        last_purge = 0.0
+        log.info("outbox dispatcher started: concurrency=%d", self.concurrency)
+        while True:
+            free = self.concurrency - len(self._inflight)
+            batch = self._claim(free, set(self._inflight)) if free > 0 else []
+            for item in batch:
+                task = asyncio.create_task(self.deliver(item))
+                self._inflight[item.chat_id] = task
+                task.add_done_callback(lambda _t, chat_id=item.chat_id: self._done(chat_id))
+            if time.monotonic() - last_purge > 3600:
+                last_purge = time.monotonic()
+                self.purge()
+            if not batch:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), DELIVERY_POLL_SEC)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(0)
+
+    def _done(self, chat_id: int) -> None:
+        self._inflight.pop(chat_id, None)
+        if self._wake is not None:
+            self._wake.set()
+
+    def close(self) -> None:
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+    def start(self, bot) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run(bot))
+        return self._task
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._inflight:
+            await asyncio.gather(*self._inflight.values(), return_exceptions=True)
+
+
+_outbox: Optional[Outbox] = None
+
+
+def get_outbox(db=None) -> Outbox:
+    global _outbox
+    if _outbox is None:
+        if db is None:
+            from .db import DB
+            db = DB()
+        _outbox = Outbox(db)
+    return _outbox
@@ -8,12 +8,10 @@ import logging
 from dataclasses import dataclass
 from typing import List, Dict, Optional, Any, Iterable
 
-import requests
-from requests import Response, HTTPError, RequestException
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from ..domain.options import OptionChain, ExpiryStats, analyze, max_pain
+from .http_transport import HttpResponse, get_transport
 
-__all__ = ["OptionOI", "fetch_chain", "get_index_price", "build_series"]
+__all__ = ["OptionOI", "fetch_chain", "get_index_price", "build_series", "series_points"]
 
 log = logging.getLogger("alt_forecast.deribit")
 
@@ -27,6 +25,7 @@ class OptionOI:
     strike: float
     kind: str       # 'C' or 'P'
     oi: float       # contracts (1 contract = 1 BTC/ETH on Deribit inverse options)
+    iv: float = float("nan")    # mark IV, доли (0.55 = 55%)
 
 # Примеры имён: BTC-27SEP24-60000-C
 _NAME_RE = re.compile(r"^(BTC|ETH)-(\d{1,2}[A-Z]{3}\d{2})-(\d+(?:\.\d+)*)-([CP])$")
@@ -35,23 +34,7 @@ _MONTHS = {
     'JUL':'07','AUG':'08','SEP':'09','OCT':'10','NOV':'11','DEC':'12'
 }
 
-def _session_with_retries(total: int = MAX_RETRIES, backoff: float = 0.4) -> requests.Session:
-    s = requests.Session()
-    retry = Retry(
-        total=total,
-        backoff_factor=backoff,
-        status_forcelist=(429, 500, 502, 503, 504),
-        allowed_methods=frozenset(["GET"])
-    )
-    adapter = HTTPAdapter(max_retries=retry, pool_connections=10, pool_maxsize=10)
-    s.mount("https://", adapter)
-    s.mount("http://", adapter)
-    s.headers.update({"User-Agent": "alt-forecast-bot/1.0 (+deribit)"})
-    return s
-
-_http = _session_with_retries()
-
-def _json(resp: Response) -> Any:
+def _json(resp: HttpResponse) -> Any:
     try:
         return resp.json()
     except Exception as e:
@@ -73,7 +56,8 @@ def _dmmmYY_to_iso(token: str) -> Optional[str]:
 
 def _get(path: str, params: Dict[str, Any]) -> Any:
     url = f"{DERIBIT_BASE.rstrip('/')}/{path.lstrip('/')}"
-    resp = _http.get(url, params=params, timeout=DEFAULT_TIMEOUT)
+    resp = get_transport().get(url, params=params, headers={"User-Agent": "alt-forecast-bot/1.0 (+deribit)"},
+                               timeout=DEFAULT_TIMEOUT, retries=MAX_RETRIES)
     resp.raise_for_status()
     return _json(resp)
 
@@ -108,7 +92,9 @@ def fetch_chain(currency: str) -> List[OptionOI]:
         try:
             oi_raw = it.get("open_interest", 0.0)
             oi = float(oi_raw) if oi_raw is not None else 0.0
-            out.append(OptionOI(expiry=expiry, strike=float(strike), kind=kind, oi=oi))
+            iv_raw = it.get("mark_iv")
+            iv = float(iv_raw) / 100.0 if iv_raw is not None else float("nan")
+            out.append(OptionOI(expiry=expiry, strike=float(strike), kind=kind, oi=oi, iv=iv))
         except Exception:
             # пропустим странные строки
             continue
@@ -125,58 +111,41 @@ def get_index_price(currency: str) -> float:
         raise RuntimeError("Deribit: missing index_price") from e
 
 def _max_pain_for_expiry(rows: List[OptionOI]) -> float:
-    """
-    Максимальная боль по одной дате: перебираем страйки и считаем суммарные выплаты.
-    Сложность O(N^2) приемлема (N по страйкам в рамках одной экспирации).
-    """
-    strikes = sorted({x.strike for x in rows})
-    if not strikes:
+    """Максимальная боль по одной дате (domain.options.max_pain, O(S log S))."""
+    rows = [x for x in rows if x.kind in ("C", "P")]
+    if not rows:
         return float("nan")
-    by: Dict[float, Dict[str, float]] = {s: {"C": 0.0, "P": 0.0} for s in strikes}
-    for x in rows:
-        # защитимся от неожиданных kind
-        k = "C" if x.kind == "C" else ("P" if x.kind == "P" else None)
-        if not k:
-            continue
-        by[x.strike][k] += max(0.0, float(x.oi))
+    return max_pain([x.strike for x in rows],
+                    [x.oi if x.kind == "C" else 0.0 for x in rows],
+                    [x.oi if x.kind == "P" else 0.0 for x in rows])
 
-    def pain(price: float) -> float:
-        total = 0.0
-        for k, v in by.items():
-            total += v["C"] * max(price - k, 0.0) + v["P"] * max(k - price, 0.0)
-        return total
-
-    # минимизируем «боль» по дискретному множеству страйков
-    best = min(strikes, key=pain)
-    return float(best)
+def series_points(stats: Iterable[ExpiryStats], index_price: float) -> List[Dict]:
+    """Точки build_series из статистики экспираций; 1 контракт = 1 BTC/ETH → USD по индексу."""
+    points: List[Dict] = []
+    for st in stats:
+        if st.max_pain != st.max_pain:  # NaN check
+            continue
+        points.append({
+            "date": st.expiry,
+            "max_pain": float(st.max_pain),
+            "deribit_notional_usd": float((st.call_oi + st.put_oi) * float(index_price)),
+            "call_wall": st.call_wall,
+            "put_wall": st.put_wall,
+            "gex_usd": st.gex,
+            "atm_iv": st.atm_iv,
+            "iv_skew": st.skew,
+        })
+    return points
 
 def build_series(currency: str, max_expiries: int = 10) -> List[Dict]:
     """
     Серия по ближайшим экспирациям:
-    [{'date':'YYYY-MM-DD','max_pain':112000.0,'deribit_notional_usd':7.8e9}, ...]
+    [{'date':'YYYY-MM-DD','max_pain':112000.0,'deribit_notional_usd':7.8e9,
+      'call_wall':..., 'put_wall':..., 'gex_usd':..., 'atm_iv':..., 'iv_skew':...}, ...]
+    Вся цепочка считается одним проходом domain.options.analyze.
     """
     chain = fetch_chain(currency)
     if not chain:
         return []
-
-    expiries = sorted({x.expiry for x in chain})[:max(1, int(max_expiries))]
     px = get_index_price(currency)
-
-    points: List[Dict] = []
-    for exp in expiries:
-        rows = [x for x in chain if x.expiry == exp]
-        if not rows:
-            continue
-        mp = _max_pain_for_expiry(rows)
-        if mp != mp:  # NaN check
-            continue
-        calls = sum(max(0.0, x.oi) for x in rows if x.kind == "C")
-        puts  = sum(max(0.0, x.oi) for x in rows if x.kind == "P")
-        # 1 контракт = 1 BTC/ETH -> в USD по индексу
-        deribit_usd = (calls + puts) * float(px)
-        points.append({
-            "date": exp,
-            "max_pain": float(mp),
-            "deribit_notional_usd": float(deribit_usd),
-        })
-    return points
+    return series_points(analyze(OptionChain.from_rows(chain), px, max_expiries=max_expiries), px)
@@ -6,11 +6,17 @@
 import os
 import logging
 from typing import Dict, Optional
-import requests
+
+from .http_transport import get_transport
 
 logger = logging.getLogger("alt_forecast.derivatives")
 
 
+def has_api_key() -> bool:
+    """Есть ли ключ CoinGlass (без него OI/CVD — нули-заглушки, а не данные)."""
+    return bool(os.getenv("COINGLASS_API_KEY") or os.getenv("COINGLASS_SECRET"))
+
+
 def get_oi_and_cvd(symbol: str, timeframe: str = "1h") -> Dict[str, float]:
     """
     Получить данные Open Interest и CVD из CoinGlass.
@@ -56,7 +62,7 @@ def get_oi_and_cvd(symbol: str, timeframe: str = "1h") -> Dict[str, float]:
             oi_url = f"{api_base}/futures/openInterest"
             params = {"symbol": symbol_clean}
             
-            response = requests.get(oi_url, headers=headers, params=params, timeout=10)
+            response = get_transport().get(oi_url, headers=headers, params=params, timeout=10)
             if response.status_code == 200:
                 data = response.json()
                 # Парсим данные OI (формат зависит от CoinGlass API)
@@ -79,7 +85,7 @@ def get_oi_and_cvd(symbol: str, timeframe: str = "1h") -> Dict[str, float]:
             cvd_url = f"{api_base}/futures/cvd"
             params = {"symbol": symbol_clean}
             
-            response = requests.get(cvd_url, headers=headers, params=params, timeout=10)
+            response = get_transport().get(cvd_url, headers=headers, params=params, timeout=10)
             if response.status_code == 200:
                 data = response.json()
                 # Парсим CVD данные
@@ -0,0 +1,330 @@
+# app/infrastructure/derivatives_store.py
+"""
+Локальные временные ряды деривативов: funding, mark/index и базис, открытый интерес, CVD, ликвидации.
+
+Раньше MarketDataService.get_derivatives, сканер и алерты funding ходили на биржи на каждый запрос
+(50+ последовательных REST-вызовов на скан), а история не копилась — z-score funding, скорость OI
+или тренд CVD посчитать было не из чего. Здесь job воркера раз в DERIV_COLLECT_SEC собирает всё
+по отслеживаемой вселенной:
+- funding/mark/index — одним запросом premiumIndex на весь рынок Binance;
+- OI, CVD (если есть ключ CoinGlass) и ликвидации за прошедший интервал — по символам,
+  не больше DERIV_COLLECT_WORKERS запросов одновременно (лимиты хостов — в http_transport);
+и пишет точки в deriv_series (symbol, field, ts) → value. Чтение — get_derivatives: последние
+значения с возрастом и признаком свежести по каждому полю + окна истории numpy-массивами.
+
+    store = get_derivatives_store(db)
+    DerivativesCollector(store).collect(["BTC", "ETH"])      # job
+    view = store.get_derivatives("BTC", window_sec=86400)
+    view.value("funding_rate"), view.fields["oi_usd"].age_sec, view.history["cvd"]
+    store.features("BTC")                                    # funding_z, oi_change_pct, cvd_slope, ликвидации
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .db import DB
+
+log = logging.getLogger("alt_forecast.derivatives_store")
+
+DERIV_COLLECT_SEC = int(os.getenv("DERIV_COLLECT_SEC", "300"))
+DERIV_COLLECT_WORKERS = int(os.getenv("DERIV_COLLECT_WORKERS", "8"))
+# ликвидации Bybit — только по первым N символам вселенной (по запросу на символ за интервал)
+DERIV_LIQ_TOP = int(os.getenv("DERIV_LIQ_TOP", "20"))
+# значение старше этого считается несвежим (get_derivatives отдаёт его с fresh=False)
+DERIV_MAX_AGE_SEC = int(os.getenv("DERIV_MAX_AGE_SEC", str(3 * DERIV_COLLECT_SEC)))
+DERIV_RETENTION_DAYS = float(os.getenv("DERIV_RETENTION_DAYS", "30"))
+
+# порядок — часть схемы: в таблице хранится индекс поля
+DERIV_FIELDS = ("funding_rate", "mark", "index", "basis_pct", "oi", "oi_usd", "cvd", "liq_long_usd", "liq_short_usd")
+_FIELD_ID = {f: i for i, f in enumerate(DERIV_FIELDS)}
+
+HOUR_MS = 3_600_000
+
+
+class FieldValue(NamedTuple):
+    value: float
+    ts: int
+    age_sec: float
+    fresh: bool
+
+
+class DerivativesView:
+    """Последние значения (с метаданными свежести) и окна истории по одному символу."""
+
+    def __init__(self, symbol: str, fields: Dict[str, FieldValue],
+                 history: Optional[Dict[str, Tuple[np.ndarray, np.ndarray]]] = None):
+        self.symbol = symbol
+        self.fields = fields
+        self.history = history or {}
+
+    def value(self, field: str, fresh_only: bool = True) -> Optional[float]:
+        fv = self.fields.get(field)
+        if fv is None or (fresh_only and not fv.fresh):
+            return None
+        return fv.value
+
+    @property
+    def fresh(self) -> bool:
+        return bool(self.fields) and all(fv.fresh for fv in self.fields.values())
+
+    def to_dict(self) -> Dict:
+        return {"symbol": self.symbol,
+                "fields": {f: fv._asdict() for f, fv in self.fields.items()},
+                "history": {f: {"ts": ts.tolist(), "value": v.tolist()} for f, (ts, v) in self.history.items()}}
+
+
+def _base(symbol: str) -> str:
+    s = (symbol or "").upper().strip().replace("/", "").replace("-", "").replace(".P", "")
+    return s[:-4] if s.endswith("USDT") and len(s) > 4 else s
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class DerivativesStore:
+    def __init__(self, db: DB, max_age_sec: int = DERIV_MAX_AGE_SEC,
+                 retention_days: float = DERIV_RETENTION_DAYS):
+        self.db = db
+        self.max_age_sec = max_age_sec
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        # (symbol, field_id) -> (ts, value): последние точки без запроса к БД
+        self._latest: Dict[Tuple[str, int], Tuple[int, float]] = {}
+        self._loaded: set = set()
+        db.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS deriv_series (
+                symbol TEXT NOT NULL,
+                field INTEGER NOT NULL,       -- индекс в DERIV_FIELDS
+                ts INTEGER NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (symbol, field, ts)
+            ) WITHOUT ROWID;
+            """)
+
+    # ---- запись ----
+
+    def write_many(self, points: Iterable[Tuple[str, str, int, float]]) -> int:
+        """Точки (symbol, field, ts, value) одной транзакцией; NaN и неизвестные поля пропускаются."""
+        rows = []
+        for sym, field, ts, value in points:
+            fid = _FIELD_ID.get(field)
+            if fid is None or value is None or value != value:
+                continue
+            rows.append((_base(sym), fid, int(ts), float(value)))
+        if not rows:
+            return 0
+        with self._lock, self.db.atomic():
+            self.db.conn.executemany(
+                "INSERT OR REPLACE INTO deriv_series(symbol, field, ts, value) VALUES(?,?,?,?)", rows)
+            for sym, fid, ts, value in rows:
+                cur = self._latest.get((sym, fid))
+                if cur is None or ts >= cur[0]:
+                    self._latest[(sym, fid)] = (ts, value)
+        return len(rows)
+
+    def write(self, symbol: str, ts: int, values: Dict[str, float]) -> int:
+        return self.write_many((symbol, f, ts, v) for f, v in values.items())
+
+    def retain(self, now_ms: Optional[int] = None) -> int:
+        """Удаляет точки старше retention_days; возвращает число удалённых."""
+        now_ms = _now_ms() if now_ms is None else now_ms
+        cutoff = now_ms - int(self.retention_days * 86_400_000)
+        with self._lock, self.db.atomic():
+            return self.db.conn.execute("DELETE FROM deriv_series WHERE ts < ?", (cutoff,)).rowcount
+
+    # ---- чтение ----
+
+    def _latest_of(self, sym: str) -> Dict[int, Tuple[int, float]]:
+        with self._lock:
+            if sym not in self._loaded:
+                # SQLite: голые колонки рядом с MAX() берутся из строки с максимумом
+                for fid, ts, value in self.db.conn.execute(
+                        "SELECT field, MAX(ts), value FROM deriv_series WHERE symbol=? GROUP BY field", (sym,)):
+                    cur = self._latest.get((sym, fid))
+                    if cur is None or ts > cur[0]:
+                        self._latest[(sym, fid)] = (int(ts), float(value))
+                self._loaded.add(sym)
+            return {fid: tv for (s, fid), tv in self._latest.items() if s == sym}
+
+    def latest(self, symbol: str, now_ms: Optional[int] = None) -> Dict[str, FieldValue]:
+        now_ms = _now_ms() if now_ms is None else now_ms
+        out = {}
+        for fid, (ts, value) in sorted(self._latest_of(_base(symbol)).items()):
+            age = max(0.0, (now_ms - ts) / 1000.0)
+            out[DERIV_FIELDS[fid]] = FieldValue(value, ts, age, age <= self.max_age_sec)
+        return out
+
+    def latest_value(self, symbol: str, field: str, now_ms: Optional[int] = None) -> Optional[float]:
+        """Свежее значение поля или None (нет данных / старше max_age_sec)."""
+        fv = self.latest(symbol, now_ms).get(field)
+        return fv.value if fv is not None and fv.fresh else None
+
+    def history(self, symbol: str, field: str, since_ms: int = 0,
+                until_ms: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(ts, value) поля по времени — numpy-массивы."""
+        fid = _FIELD_ID[field]
+        until_ms = _now_ms() if until_ms is None else until_ms
+        rows = self.db.conn.execute(
+            "SELECT ts, value FROM deriv_series WHERE symbol=? AND field=? AND ts>=? AND ts<=? ORDER BY ts",
+            (_base(symbol), fid, int(since_ms), int(until_ms))).fetchall()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        arr = np.asarray(rows, dtype=float)
+        return arr[:, 0].astype(np.int64), arr[:, 1]
+
+    def get_derivatives(self, symbol: str, fields: Optional[Sequence[str]] = None,
+                        window_sec: Optional[float] = None, now_ms: Optional[int] = None) -> DerivativesView:
+        """Последние значения + (если задан window_sec) история полей за окно."""
+        now_ms = _now_ms() if now_ms is None else now_ms
+        latest = self.latest(symbol, now_ms)
+        if fields is not None:
+            latest = {f: fv for f, fv in latest.items() if f in fields}
+        hist = {}
+        if window_sec:
+            since = now_ms - int(window_sec * 1000)
+            for f in (fields or DERIV_FIELDS):
+                ts, v = self.history(symbol, f, since, now_ms)
+                if len(ts):
+                    hist[f] = (ts, v)
+        return DerivativesView(_base(symbol), latest, hist)
+
+    def features(self, symbol: str, now_ms: Optional[int] = None, window_sec: float = 7 * 86400,
+                 change_sec: float = 3600) -> Dict[str, Optional[float]]:
+        """
+        Признаки из истории: z-score funding за окно, изменение OI и наклон CVD (в час) за change_sec,
+        ликвидации за change_sec. Чего нет (мало точек / несвежие данные) — None.
+        """
+        now_ms = _now_ms() if now_ms is None else now_ms
+        view = self.get_derivatives(symbol, window_sec=window_sec, now_ms=now_ms)
+        out: Dict[str, Optional[float]] = {"funding_z": None, "oi_change_pct": None, "cvd_slope": None,
+                                           "liq_long_usd": None, "liq_short_usd": None}
+        since = now_ms - int(change_sec * 1000)
+
+        funding = view.history.get("funding_rate")
+        cur = view.value("funding_rate")
+        if funding is not None and cur is not None and len(funding[1]) >= 8:
+            sd = float(np.std(funding[1]))
+            out["funding_z"] = 0.0 if sd == 0 else (cur - float(np.mean(funding[1]))) / sd
+
+        oi = view.history.get("oi")
+        if oi is not None and view.value("oi") is not None:
+            ts, v = oi
+            j = int(np.searchsorted(ts, since, side="right")) - 1     # последняя точка не позже since
+            if j >= 0 and v[j] > 0:
+                out["oi_change_pct"] = (v[-1] / v[j] - 1.0) * 100.0
+
+        cvd = view.history.get("cvd")
+        if cvd is not None and view.value("cvd") is not None:
+            ts, v = cvd
+            m = ts >= since
+            if int(m.sum()) >= 2:
+                x = (ts[m] - ts[m][0]) / HOUR_MS
+                out["cvd_slope"] = float(np.polyfit(x, v[m], 1)[0]) if x[-1] > 0 else None
+
+        for f in ("liq_long_usd", "liq_short_usd"):
+            h = view.history.get(f)
+            if h is not None and view.fields.get(f) is not None and view.fields[f].fresh:
+                out[f] = float(h[1][h[0] > since].sum())
+        return out
+
+
+class DerivativesCollector:
+    """Периодический сбор по вселенной: один общий запрос funding/mark + ограниченный пул по символам."""
+
+    def __init__(self, store: DerivativesStore, workers: int = DERIV_COLLECT_WORKERS, liq_top: int = DERIV_LIQ_TOP,
+                 interval_sec: int = DERIV_COLLECT_SEC):
+        self.store = store
+        self.workers = max(1, int(workers))
+        self.liq_top = max(0, int(liq_top))
+        self.interval_sec = interval_sec
+        self._liq_until: Dict[str, int] = {}      # до какого момента ликвидации уже учтены
+
+    def _per_symbol(self, sym: str, now_ms: int, mark: Optional[float], want_liq: bool,
+                    want_cvd: bool) -> Tuple[List[Tuple[str, str, int, float]], int]:
+        from . import derivatives_client, liquidations, market_data
+        points: List[Tuple[str, str, int, float]] = []
+        errors = 0
+        try:
+            oi = market_data.binance_open_interest(f"{sym}USDT")
+            points.append((sym, "oi", now_ms, oi))
+            if mark:
+                points.append((sym, "oi_usd", now_ms, oi * mark))
+        except Exception as e:
+            errors += 1
+            log.debug("open interest %s: %s", sym, e)
+        if want_cvd:
+            try:
+                points.append((sym, "cvd", now_ms, derivatives_client.get_oi_and_cvd(sym)["cvd"]))
+            except Exception as e:
+                errors += 1
+                log.debug("cvd %s: %s", sym, e)
+        if want_liq:
+            start = self._liq_until.get(sym, now_ms - self.interval_sec * 1000)
+            try:
+                long_usd, short_usd, _ = liquidations.bybit_liqs_window(sym, start, now_ms)
+                points += [(sym, "liq_long_usd", now_ms, long_usd), (sym, "liq_short_usd", now_ms, short_usd)]
+                self._liq_until[sym] = now_ms
+            except Exception as e:
+                errors += 1
+                log.debug("liquidations %s: %s", sym, e)
+        return points, errors
+
+    def collect(self, symbols: Sequence[str], now_ms: Optional[int] = None) -> Dict[str, int]:
+        """Один проход сбора; возвращает {"symbols", "points", "errors"}."""
+        from . import derivatives_client, market_data
+        now_ms = _now_ms() if now_ms is None else now_ms
+        syms = list(dict.fromkeys(_base(s) for s in symbols if s))
+        points: List[Tuple[str, str, int, float]] = []
+        errors = 0
+        marks: Dict[str, float] = {}
+        try:
+            prem = market_data.binance_premium_index_all()
+        except Exception as e:
+            prem = {}
+            errors += 1
+            log.warning("premiumIndex failed: %s", e)
+        for sym in syms:
+            p = prem.get(f"{sym}USDT")
+            if not p:
+                continue
+            mark, index = p["markPrice"], p["indexPrice"]
+            marks[sym] = mark
+            points += [(sym, "funding_rate", now_ms, p["fundingRate"]), (sym, "mark", now_ms, mark)]
+            if index > 0:
+                points += [(sym, "index", now_ms, index), (sym, "basis_pct", now_ms, (mark - index) / index * 100.0)]
+
+        want_cvd = derivatives_client.has_api_key()
+        liq = set(syms[:self.liq_top])
+        with ThreadPoolExecutor(max_workers=min(self.workers, max(1, len(syms))),
+                                thread_name_prefix="deriv") as pool:
+            futures = [pool.submit(self._per_symbol, s, now_ms, marks.get(s), s in liq, want_cvd) for s in syms]
+            for f in futures:
+                pts, err = f.result()
+                points += pts
+                errors += err
+        n = self.store.write_many(points)
+        log.info("derivatives collected: %d symbols, %d points, %d errors", len(syms), n, errors)
+        return {"symbols": len(syms), "points": n, "errors": errors}
+
+
+_stores: "weakref.WeakKeyDictionary[DB, DerivativesStore]" = weakref.WeakKeyDictionary()
+_stores_lock = threading.Lock()
+
+
+def get_derivatives_store(db: DB) -> DerivativesStore:
+    with _stores_lock:
+        store = _stores.get(db)
+        if store is None:
+            store = _stores[db] = DerivativesStore(db)
+        return store
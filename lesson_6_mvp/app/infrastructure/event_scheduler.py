@@ -0,0 +1,219 @@
+# app/infrastructure/event_scheduler.py
+"""
+Планировщик напоминаний о событиях (/events_add): куча (fire_ms, event_id, kind) в памяти вместо
+опроса таблицы раз в минуту.
+
+При старте куча строится по БД (events.pending_events): неотправленные 24h/1h напоминания и переносы
+повторяющихся событий ("roll" в момент события). Корутина спит ровно до вершины кучи или до изменения
+(events.add_listener: добавление/удаление/перенос будит её через call_soon_threadsafe). Устаревшие
+записи не удаляются из кучи — у события есть версия, запись с чужой версией просто пропускается.
+Всё, что созрело в одну секунду, уходит в outbox одной пачкой, отметки notified_* — одной транзакцией.
+
+    sched = get_event_scheduler()
+    sched.start(send=lambda chat_id, text: outbox.enqueue(chat_id, lane=LANE_ALERT, text=text, parse_mode="HTML"))
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from . import events
+
+logger = logging.getLogger("alt_forecast.event_scheduler")
+
+# раз в столько секунд куча пересобирается по БД (страховка от правок мимо events.py и скачков часов)
+EVENTS_RESYNC_SEC = float(os.getenv("EVENTS_RESYNC_SEC", "3600"))
+# 24h-напоминание не шлём, если до события уже меньше часа — его заменит 1h
+_SKIP_24H_WITHIN_MS = events.HOUR_MS + events.LEEWAY_MS
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class EventScheduler:
+    """Напоминания о событиях точно в срок; состояние — в events (БД), здесь только расписание."""
+
+    def __init__(self, send: Optional[Callable[[int, str], None]] = None):
+        self._send = send
+        self._heap: List[Tuple[int, int, str, int]] = []   # (fire_ms, event_id, kind, version)
+        self._version: Dict[int, int] = {}
+        self._dirty: Set[int] = set()
+        self._mu = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._synced_at = 0.0
+        self.sent = 0
+        self.skipped = 0
+
+    # ---------- расписание ----------
+
+    def _push(self, row: events.EventRow, now_ms: int) -> None:
+        ver = self._version.get(row.id, 0) + 1
+        self._version[row.id] = ver
+        for fire_ms, kind in events.reminder_plan(row, now_ms):
+            heapq.heappush(self._heap, (fire_ms, row.id, kind, ver))
+
+    def rebuild(self, now_ms: Optional[int] = None) -> int:
+        """Построить кучу заново по БД. Возвращает число запланированных записей."""
+        now_ms = _now_ms() if now_ms is None else int(now_ms)
+        with self._mu:
+            self._dirty.clear()
+        self._heap, self._version = [], {}
+        for row in events.pending_events(now_ms):
+            self._push(row, now_ms)
+        self._synced_at = time.monotonic()
+        return len(self._heap)
+
+    def invalidate(self, event_id: int) -> None:
+        """Событие изменилось (из любого потока): перечитать его перед следующим сном."""
+        with self._mu:
+            self._dirty.add(int(event_id))
+        loop, wake = self._loop, self._wake
+        if loop is not None and wake is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:
+                pass
+
+    def _apply_changes(self, now_ms: int) -> None:
+        with self._mu:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        rows = events.get_events(dirty)
+        for eid in dirty:
+            self._version[eid] = self._version.get(eid, 0) + 1   # старые записи кучи — мимо
+            row = rows.get(eid)
+            if row is not None:
+                self._push(row, now_ms)
+            else:
+                self._version.pop(eid, None)
+
+    def next_fire_ms(self) -> Optional[int]:
+        while self._heap and self._version.get(self._heap[0][1]) != self._heap[0][3]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    # ---------- срабатывание ----------
+
+    def _text(self, row: events.EventRow, chat_id: int, now_ms: int) -> str:
+        tz = events.resolve_tz(events.get_user_tz_name(chat_id) or row.tz)
+        hours = round((row.ts - now_ms) / events.HOUR_MS)   # после простоя бота напоминание может опоздать
+        when = "через ~1 час" if hours <= 1 else ("через ~24 часа" if hours >= 24 else f"через ~{hours} ч")
+        dt = datetime.fromtimestamp(row.ts / 1000.0, tz).strftime("%Y-%m-%d %H:%M %Z")
+        return f"🔔 Напоминание: {row.title}\nКогда: <code>{dt}</code> ({when})"
+
+    def fire_due(self, now_ms: Optional[int] = None) -> int:
+        """Отправить всё созревшее к now_ms. Возвращает число отправленных напоминаний."""
+        now_ms = _now_ms() if now_ms is None else int(now_ms)
+        self._apply_changes(now_ms)
+        due: List[Tuple[int, str]] = []
+        while self.next_fire_ms() is not None and self._heap[0][0] <= now_ms:
+            _, eid, kind, _ = heapq.heappop(self._heap)
+            due.append((eid, kind))
+        if not due:
+            return 0
+
+        rows = events.get_events(eid for eid, _ in due)
+        marks: List[Tuple[int, str]] = []
+        rolls: List[int] = []
+        sent = 0
+        for eid, kind in due:
+            row = rows.get(eid)
+            if row is None:
+                continue
+            if kind == "roll":
+                rolls.append(eid)
+                continue
+            if (row.notified_24h_at if kind == "24h" else row.notified_1h_at) is not None:
+                continue
+            marks.append((eid, kind))
+            chat_id = row.author_chat_id
+            if row.ts <= now_ms or not chat_id or (kind == "24h" and row.ts - now_ms <= _SKIP_24H_WITHIN_MS):
+                self.skipped += 1
+                continue
+            try:
+                if self._send is not None:
+                    self._send(int(chat_id), self._text(row, int(chat_id), now_ms))
+                sent += 1
+            except Exception:
+                logger.exception("failed to enqueue event reminder id=%s", eid)
+        events.mark_notified_many(marks, now_ms)
+        if rolls:
+            events.roll_recurring(now_ms, rolls)
+            with self._mu:
+                self._dirty.update(rolls)              # перечитать новое повторение
+        self._apply_changes(now_ms)
+        self.sent += sent
+        return sent
+
+    # ---------- цикл на event loop ----------
+
+    async def _run(self) -> None:
+        self.rebuild()
+        while True:
+            try:
+                self._wake.clear()
+                if time.monotonic() - self._synced_at >= EVENTS_RESYNC_SEC:
+                    self.rebuild()
+                self.fire_due()
+                nxt = self.next_fire_ms()
+                delay = EVENTS_RESYNC_SEC if nxt is None else max(0.0, (nxt - _now_ms()) / 1000.0)
+                delay = min(delay, max(0.0, EVENTS_RESYNC_SEC - (time.monotonic() - self._synced_at)))
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("event scheduler iteration failed")
+                await asyncio.sleep(5)
+
+    def start(self, send: Optional[Callable[[int, str], None]] = None) -> None:
+        """Запустить на текущем event loop (из post_init бота)."""
+        if send is not None:
+            self._send = send
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        events.add_listener(self.invalidate)
+        self._task = self._loop.create_task(self._run(), name="event_scheduler")
+
+    async def stop(self) -> None:
+        events.remove_listener(self.invalidate)
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._loop = self._wake = None
+
+    def get_stats(self) -> Dict[str, object]:
+        return {"scheduled": len(self._heap), "next_fire_ms": self.next_fire_ms(),
+                "sent": self.sent, "skipped": self.skipped}
+
+
+_scheduler: Optional[EventScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_event_scheduler() -> EventScheduler:
+    """Единый планировщик процесса бота."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = EventScheduler()
+        return _scheduler
@@ -1,13 +1,45 @@
 from __future__ import annotations
 
+import calendar
+import logging
 import sqlite3
+import threading
 import time
 import datetime as _dt
-from typing import List, Tuple, Optional
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
 
-from zoneinfo import ZoneInfo  # используется в purge_past_events
+from zoneinfo import ZoneInfo
 from ..config import settings
 
+logger = logging.getLogger("alt_forecast.events")
+
+HOUR_MS = 60 * 60 * 1000
+DAY_MS = 24 * HOUR_MS
+LEEWAY_MS = 5 * 60 * 1000  # ±5 минут
+
+# напоминания: (kind, за сколько до события)
+REMINDERS: Tuple[Tuple[str, int], ...] = (("24h", DAY_MS), ("1h", HOUR_MS))
+RECUR_KINDS = ("daily", "weekly", "monthly")
+
+# Одно долгоживущее соединение на файл БД: миграции — один раз при первом обращении,
+# дальше только запросы. Доступ сериализуем замком (вызовы идут из loop'а бота и планировщика).
+_lock = threading.RLock()
+_conns: Dict[str, sqlite3.Connection] = {}
+_cols: Dict[str, frozenset] = {}
+_listeners: List[Callable[[int], None]] = []
+
+
+class EventRow(NamedTuple):
+    id: int
+    ts: int
+    title: str
+    author_chat_id: Optional[int]
+    recur: Optional[str]
+    tz: Optional[str]
+    first_ts: Optional[int]
+    notified_24h_at: Optional[int]
+    notified_1h_at: Optional[int]
+
 
 # =========================================================
 #  Вспомогательные утилиты
@@ -58,116 +90,202 @@ def _ensure_columns(conn: sqlite3.Connection) -> None:
 
         cols = _col_info(conn, "events")
 
-        # возможная старая колонка chat_id (иногда NOT NULL) — если её нет, можно добавить NULL
-        if "chat_id" not in cols:
-            try:
-                conn.execute("ALTER TABLE events ADD COLUMN chat_id INTEGER;")
-            except Exception:
-                pass
+        # возможная старая колонка chat_id (иногда NOT NULL) — если её нет, можно добавить NULL;
+        # автор, created_at, флаги уведомлений и повторения — все опциональные
+        for col, decl in (
+            ("chat_id", "INTEGER"),
+            ("author_chat_id", "INTEGER"),
+            ("created_at", "INTEGER"),
+            ("notified_24h_at", "INTEGER"),
+            ("notified_1h_at", "INTEGER"),
+            ("recur", "TEXT"),        # daily / weekly / monthly
+            ("tz", "TEXT"),           # зона, в которой повторение держит «настенное» время
+            ("first_ts", "INTEGER"),  # якорь повторения (31-е число не съезжает в 28-е)
+        ):
+            if col not in cols:
+                try:
+                    conn.execute(f"ALTER TABLE events ADD COLUMN {col} {decl};")
+                except Exception:
+                    pass
+
+        # часовые пояса пользователей
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS event_user_tz (
+                user_id INTEGER PRIMARY KEY,
+                tz TEXT NOT NULL
+            );
+            """
+        )
 
-        # автор, created_at и флаги уведомлений — все опциональные
-        if "author_chat_id" not in cols:
-            try:
-                conn.execute("ALTER TABLE events ADD COLUMN author_chat_id INTEGER;")
-            except Exception:
-                pass
 
-        if "created_at" not in cols:
+def _conn() -> sqlite3.Connection:
+    """Возвращает долгоживущее соединение; схема/колонки/индексы — при первом обращении к файлу."""
+    path = settings.database_path
+    with _lock:
+        conn = _conns.get(path)
+        if conn is None:
+            conn = sqlite3.connect(path, check_same_thread=False)
+            _init_connection_pragmas(conn)
+            _ensure_columns(conn)
+            _conns[path] = conn
+            _cols[path] = frozenset(_col_info(conn, "events"))
+        return conn
+
+
+def _columns() -> frozenset:
+    _conn()
+    return _cols[settings.database_path]
+
+
+def close_connections() -> None:
+    """Закрыть кэшированные соединения (тесты / останов)."""
+    with _lock:
+        for conn in _conns.values():
             try:
-                conn.execute("ALTER TABLE events ADD COLUMN created_at INTEGER;")
+                conn.close()
             except Exception:
                 pass
+        _conns.clear()
+        _cols.clear()
 
-        cols = _col_info(conn, "events")  # обновим после ALTER
 
-        if "notified_24h_at" not in cols:
-            try:
-                conn.execute("ALTER TABLE events ADD COLUMN notified_24h_at INTEGER;")
-            except Exception:
-                pass
+def add_listener(fn: Callable[[int], None]) -> None:
+    """Подписаться на изменения событий: fn(event_id) после добавления/удаления/переноса повторения."""
+    with _lock:
+        if fn not in _listeners:
+            _listeners.append(fn)
+
+
+def remove_listener(fn: Callable[[int], None]) -> None:
+    with _lock:
+        if fn in _listeners:
+            _listeners.remove(fn)
+
 
-        if "notified_1h_at" not in cols:
+def _changed(event_ids: Iterable[int]) -> None:
+    for eid in event_ids:
+        for fn in list(_listeners):
             try:
-                conn.execute("ALTER TABLE events ADD COLUMN notified_1h_at INTEGER;")
+                fn(int(eid))
             except Exception:
-                pass
+                logger.exception("events listener failed")
 
 
-def _conn() -> sqlite3.Connection:
-    """Возвращает соединение и гарантирует схему/колонки/индексы."""
-    path = settings.database_path
-    conn = sqlite3.connect(path, check_same_thread=False)
-    _init_connection_pragmas(conn)
-    _ensure_columns(conn)
-    return conn
+def resolve_tz(name: Optional[str]):
+    """ZoneInfo по имени; неизвестная/пустая зона — settings.tz."""
+    if name:
+        try:
+            return ZoneInfo(name)
+        except Exception:
+            pass
+    try:
+        return settings.tz
+    except Exception:
+        return _dt.timezone.utc
+
+
+# =========================================================
+#  Повторения
+# =========================================================
+
+def _shift(local: _dt.datetime, recur: str, k: int) -> _dt.datetime:
+    """k-е повторение от якоря в «настенном» времени (без tzinfo)."""
+    if recur == "daily":
+        return local + _dt.timedelta(days=k)
+    if recur == "weekly":
+        return local + _dt.timedelta(weeks=k)
+    month = local.month - 1 + k
+    year, month = local.year + month // 12, month % 12 + 1
+    day = min(local.day, calendar.monthrange(year, month)[1])
+    return local.replace(year=year, month=month, day=day)
+
+
+def next_occurrence(first_ts: int, recur: str, tz_name: Optional[str], after_ms: int) -> int:
+    """
+    Ближайшее повторение строго позже after_ms. Шаг считается от якоря first_ts в зоне tz_name,
+    поэтому 19:00 остаётся 19:00 при переходе на летнее время, а 31-е число — последним днём месяца.
+    """
+    if recur not in RECUR_KINDS:
+        raise ValueError(f"unknown recurrence: {recur}")
+    tz = resolve_tz(tz_name)
+    local = _dt.datetime.fromtimestamp(first_ts / 1000.0, tz).replace(tzinfo=None)
+    # оценка снизу (месяц — не длиннее 31 дня, ±1 день на DST), дальше — шагами
+    step_ms = {"daily": DAY_MS, "weekly": 7 * DAY_MS, "monthly": 31 * DAY_MS}[recur]
+    k = max(1, int((after_ms - first_ts) // step_ms) - 1)
+    while True:
+        ts = int(_shift(local, recur, k).replace(tzinfo=tz).timestamp() * 1000)
+        if ts > after_ms:
+            return ts
+        k += 1
 
 
 # =========================================================
 #  Публичный API (добавление/списки/очистка)
 # =========================================================
 
-def add_event(date_ts_ms: int, title: str, author_chat_id: int | None = None) -> int:
+def add_event(date_ts_ms: int, title: str, author_chat_id: int | None = None,
+              recur: Optional[str] = None, tz: Optional[str] = None) -> int:
     """
     Добавляет событие, видимое всем.
+    :param recur: None | daily | weekly | monthly
+    :param tz: зона автора (для повторений и отображения)
     :return: id вставленной записи
     """
     title = (title or "").strip()
     if not title:
         raise ValueError("empty title")
+    if recur is not None and recur not in RECUR_KINDS:
+        raise ValueError(f"unknown recurrence: {recur}")
 
-    conn = _conn()
-    cols = _col_info(conn, "events")
-    has_chat = "chat_id" in cols
-    has_author = "author_chat_id" in cols
-    has_created = "created_at" in cols
-
+    cols = _columns()
+    row: Dict[str, object] = {"ts": int(date_ts_ms), "title": title}
     # значение для chat_id, если колонка есть (некоторые схемы требуют NOT NULL)
-    chat_value = (author_chat_id if author_chat_id is not None else 0) if has_chat else None
-
-    with conn:  # автокоммит
-        if has_chat and has_author and has_created:
-            cur = conn.execute(
-                "INSERT INTO events(ts, title, chat_id, author_chat_id, created_at) VALUES(?, ?, ?, ?, ?)",
-                (int(date_ts_ms), title, chat_value, author_chat_id, int(time.time() * 1000)),
-            )
-        elif has_chat and has_author and not has_created:
-            cur = conn.execute(
-                "INSERT INTO events(ts, title, chat_id, author_chat_id) VALUES(?, ?, ?, ?)",
-                (int(date_ts_ms), title, chat_value, author_chat_id),
-            )
-        elif has_chat and not has_author and has_created:
-            cur = conn.execute(
-                "INSERT INTO events(ts, title, chat_id, created_at) VALUES(?, ?, ?, ?)",
-                (int(date_ts_ms), title, chat_value, int(time.time() * 1000)),
-            )
-        elif has_chat and not has_author and not has_created:
-            cur = conn.execute(
-                "INSERT INTO events(ts, title, chat_id) VALUES(?, ?, ?)",
-                (int(date_ts_ms), title, chat_value),
-            )
-        elif not has_chat and has_author and has_created:
-            cur = conn.execute(
-                "INSERT INTO events(ts, title, author_chat_id, created_at) VALUES(?, ?, ?, ?)",
-                (int(date_ts_ms), title, author_chat_id, int(time.time() * 1000)),
-            )
-        elif not has_chat and has_author and not has_created:
-            cur = conn.execute(
-                "INSERT INTO events(ts, title, author_chat_id) VALUES(?, ? , ?)",
-                (int(date_ts_ms), title, author_chat_id),
-            )
-        elif not has_chat and not has_author and has_created:
-            cur = conn.execute(
-                "INSERT INTO events(ts, title, created_at) VALUES(?, ? , ?)",
-                (int(date_ts_ms), title, int(time.time() * 1000)),
-            )
-        else:
-            # самая старая схема: только ts,title
-            cur = conn.execute(
-                "INSERT INTO events(ts, title) VALUES(?, ?)",
-                (int(date_ts_ms), title),
-            )
-
-        return int(cur.lastrowid)
+    if "chat_id" in cols:
+        row["chat_id"] = author_chat_id if author_chat_id is not None else 0
+    if "author_chat_id" in cols:
+        row["author_chat_id"] = author_chat_id
+    if "created_at" in cols:
+        row["created_at"] = int(time.time() * 1000)
+    if recur and "recur" in cols:
+        row["recur"] = recur
+        row["first_ts"] = int(date_ts_ms)
+    if tz and "tz" in cols:
+        row["tz"] = tz
+
+    names = ", ".join(row)
+    marks = ", ".join("?" for _ in row)
+    with _lock:
+        conn = _conn()
+        with conn:  # автокоммит
+            cur = conn.execute(f"INSERT INTO events({names}) VALUES({marks})", tuple(row.values()))
+        eid = int(cur.lastrowid)
+    _changed([eid])
+    return eid
+
+
+def _select_rows(where: str, args: tuple, order_limit: str = "") -> List[EventRow]:
+    cols = _columns()
+    sel = ", ".join(c if c in cols else f"NULL AS {c}" for c in EventRow._fields)
+    with _lock:
+        cur = _conn().execute(f"SELECT {sel} FROM events WHERE {where} {order_limit}", args)
+        rows = cur.fetchall()
+    return [EventRow(int(r[0]), int(r[1]), str(r[2]), *(r[3:])) for r in rows]
+
+
+def get_events(event_ids: Iterable[int]) -> Dict[int, EventRow]:
+    """События по id (одним запросом)."""
+    ids = sorted({int(i) for i in event_ids})
+    if not ids:
+        return {}
+    rows = _select_rows(f"id IN ({', '.join('?' for _ in ids)})", tuple(ids))
+    return {r.id: r for r in rows}
+
+
+def upcoming_events(limit: int = 200) -> List[EventRow]:
+    """Ближайшие события (включая «вчерашние» — 24h назад) с полями повторения и зоны."""
+    now_ms = int(time.time() * 1000)
+    return _select_rows("ts >= ?", (now_ms - DAY_MS,), f"ORDER BY ts ASC LIMIT {int(limit)}")
 
 
 def list_all_events(limit: int = 200) -> List[Tuple[int, int, str]]:
@@ -175,42 +293,60 @@ def list_all_events(limit: int = 200) -> List[Tuple[int, int, str]]:
     Возвращает список ближайших событий, включая сегодняшние и будущие.
     Формат: (id, ts_ms, title). Включаем «вчерашние» (24h назад).
     """
-    now_ms = int(time.time() * 1000)
-    conn = _conn()
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            "SELECT id, ts, title FROM events WHERE ts >= ? ORDER BY ts ASC LIMIT ?",
-            (now_ms - 24 * 3600 * 1000, int(limit)),
-        )
-        return [(int(r[0]), int(r[1]), str(r[2])) for r in cur.fetchall()]
-    finally:
-        cur.close()
+    return [(r.id, r.ts, r.title) for r in upcoming_events(limit)]
+
+
+def roll_recurring(now_ms: Optional[int] = None, event_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Переносит прошедшие повторяющиеся события на ближайшее будущее повторение и сбрасывает
+    флаги напоминаний. Возвращает количество перенесённых событий.
+    """
+    now_ms = _now_ms() if now_ms is None else int(now_ms)
+    if "recur" not in _columns():
+        return 0
+    where, args = "recur IS NOT NULL AND ts <= ?", (now_ms,)
+    if event_ids is not None:
+        ids = sorted({int(i) for i in event_ids})
+        if not ids:
+            return 0
+        where += f" AND id IN ({', '.join('?' for _ in ids)})"
+        args = args + tuple(ids)
+    updates = []
+    for r in _select_rows(where, args):
+        try:
+            nxt = next_occurrence(r.first_ts or r.ts, r.recur, r.tz, now_ms)
+        except ValueError:
+            continue
+        updates.append((nxt, r.id))
+    if updates:
+        with _lock:
+            conn = _conn()
+            with conn:
+                conn.executemany(
+                    "UPDATE events SET ts=?, notified_24h_at=NULL, notified_1h_at=NULL WHERE id=?", updates
+                )
+        _changed(eid for _, eid in updates)
+    return len(updates)
 
 
 def purge_past_events() -> int:
     """
     Удаляет все события, которые уже прошли (ts < сегодня 00:00 лок. времени).
+    Повторяющиеся не удаляются, а переносятся на следующее повторение.
     Возвращает количество удалённых записей.
     """
-    # пытаемся взять TZ из settings.tz или переменной окружения TZ
-    try:
-        tz = getattr(settings, "tz", None)
-    except Exception:
-        tz = None
-    if tz is None:
-        import os
-        tzname = os.getenv("TZ")
-        tz = ZoneInfo(tzname) if tzname else None
-
-    now = _dt.datetime.now(tz) if tz else _dt.datetime.utcnow()
+    tz = resolve_tz(None)
+    now = _dt.datetime.now(tz)
     start_today = _dt.datetime(now.year, now.month, now.day, tzinfo=tz)
     cutoff_ms = int(start_today.timestamp() * 1000)
 
-    conn = _conn()
-    with conn:
-        cur = conn.execute("DELETE FROM events WHERE ts < ?", (cutoff_ms,))
-        return cur.rowcount
+    roll_recurring()
+    recur_filter = " AND recur IS NULL" if "recur" in _columns() else ""
+    with _lock:
+        conn = _conn()
+        with conn:
+            cur = conn.execute(f"DELETE FROM events WHERE ts < ?{recur_filter}", (cutoff_ms,))
+            return cur.rowcount
 
 
 # Совместимость со старым API (если где-то вызывалось)
@@ -219,6 +355,36 @@ def list_events(_chat_id: int) -> List[Tuple[int, int, str]]:
     return list_all_events()
 
 
+# =========================================================
+#  Часовые пояса пользователей
+# =========================================================
+
+def set_user_tz(user_id: int, tz_name: str) -> str:
+    """Сохраняет зону пользователя (IANA, напр. Europe/Moscow). Возвращает нормализованное имя."""
+    try:
+        name = str(ZoneInfo(tz_name.strip()))
+    except Exception:
+        raise ValueError(f"неизвестная зона: {tz_name}")
+    with _lock:
+        conn = _conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO event_user_tz(user_id, tz) VALUES(?, ?)", (int(user_id), name))
+    return name
+
+
+def get_user_tz_name(user_id: Optional[int]) -> Optional[str]:
+    if user_id is None:
+        return None
+    with _lock:
+        row = _conn().execute("SELECT tz FROM event_user_tz WHERE user_id=?", (int(user_id),)).fetchone()
+    return str(row[0]) if row else None
+
+
+def get_user_tz(user_id: Optional[int]):
+    """Зона пользователя; по умолчанию — settings.tz."""
+    return resolve_tz(get_user_tz_name(user_id))
+
+
 # =========================================================
 #  Напоминания: выборка «созревших» и отметка отправки
 # =========================================================
@@ -227,71 +393,76 @@ def _now_ms() -> int:
     return int(time.time() * 1000)
 
 
+def reminder_plan(row: EventRow, now_ms: int) -> List[Tuple[int, str]]:
+    """
+    Что и когда запланировать по событию: [(fire_ms, kind)], kind ∈ {"24h","1h","roll"}.
+    Просроченные (бот был выключен) напоминания — на now_ms; "roll" — перенос повторения в момент события.
+    """
+    plan: List[Tuple[int, str]] = []
+    if row.ts > now_ms:
+        for kind, before in REMINDERS:
+            if (row.notified_24h_at if kind == "24h" else row.notified_1h_at) is None:
+                plan.append((max(row.ts - before, now_ms), kind))
+    if row.recur:
+        plan.append((max(row.ts, now_ms), "roll"))
+    return plan
+
+
+def pending_events(now_ms: int) -> List[EventRow]:
+    """События, по которым ещё что-то предстоит: неотправленные напоминания или повторение."""
+    cols = _columns()
+    where = "(ts > ? AND (notified_24h_at IS NULL OR notified_1h_at IS NULL))"
+    if "recur" in cols:
+        where += " OR recur IS NOT NULL"
+    return _select_rows(where, (now_ms,))
+
+
 def due_events(now_ms: int) -> List[Tuple[int, Optional[int], int, str, str]]:
     """
     Возвращает напоминания, которые «созрели» к отправке.
     Формат: (event_id, target_chat_id, ts_ms, title, kind), kind ∈ {"24h","1h"}.
     По умолчанию получатель — author_chat_id (если колонка есть).
     """
-    conn = _conn()
-    cur = conn.cursor()
-    try:
-        HOUR = 60 * 60 * 1000
-        DAY = 24 * HOUR
-        LEEWAY = 5 * 60 * 1000  # ±5 минут
-
-        cols = _col_info(conn, "events")
-        author_sel = "author_chat_id" if "author_chat_id" in cols else "NULL as author_chat_id"
-
-        # 24 часа до события
-        cur.execute(
-            f"""
-            SELECT id, {author_sel}, ts, title
-            FROM events
-            WHERE ts > ?
-              AND ts - ? <= ?
-              AND (notified_24h_at IS NULL)
-            ORDER BY ts ASC
-            """,
-            (now_ms, now_ms, DAY + LEEWAY),
-        )
-        rows_24 = [
-            (int(eid), (int(chat) if chat is not None else None), int(ts), str(title), "24h")
-            for (eid, chat, ts, title) in cur.fetchall()
-        ]
-
-        # 1 час до события
-        cur.execute(
-            f"""
-            SELECT id, {author_sel}, ts, title
-            FROM events
-            WHERE ts > ?
-              AND ts - ? <= ?
-              AND (notified_1h_at IS NULL)
-            ORDER BY ts ASC
-            """,
-            (now_ms, now_ms, HOUR + LEEWAY),
-        )
-        rows_1 = [
-            (int(eid), (int(chat) if chat is not None else None), int(ts), str(title), "1h")
-            for (eid, chat, ts, title) in cur.fetchall()
-        ]
-
-        return rows_24 + rows_1
-    finally:
-        cur.close()
+    rows_24: list = []
+    rows_1: list = []
+    for r in _select_rows("ts > ? AND ts - ? <= ?", (now_ms, now_ms, DAY_MS + LEEWAY_MS), "ORDER BY ts ASC"):
+        chat = int(r.author_chat_id) if r.author_chat_id is not None else None
+        if r.notified_24h_at is None:
+            rows_24.append((r.id, chat, r.ts, r.title, "24h"))
+        if r.notified_1h_at is None and r.ts - now_ms <= HOUR_MS + LEEWAY_MS:
+            rows_1.append((r.id, chat, r.ts, r.title, "1h"))
+    return rows_24 + rows_1
+
+
+def mark_notified_many(items: Iterable[Tuple[int, str]], now_ms: Optional[int] = None) -> int:
+    """Помечает пачку (event_id, kind) одной транзакцией. Возвращает количество отметок."""
+    now_ms = _now_ms() if now_ms is None else int(now_ms)
+    by_col: Dict[str, List[tuple]] = {"notified_24h_at": [], "notified_1h_at": []}
+    for eid, kind in items:
+        by_col["notified_24h_at" if kind == "24h" else "notified_1h_at"].append((now_ms, int(eid)))
+    n = sum(len(v) for v in by_col.values())
+    if not n:
+        return 0
+    with _lock:
+        conn = _conn()
+        with conn:
+            for col, rows in by_col.items():
+                if rows:
+                    conn.executemany(f"UPDATE events SET {col}=? WHERE id=?", rows)
+    return n
 
 
 def mark_notified(event_id: int, kind: str) -> None:
     """Помечает событие как уведомлённое для окна (24h или 1h)."""
-    col = "notified_24h_at" if kind == "24h" else "notified_1h_at"
-    conn = _conn()
-    with conn:
-        conn.execute(f"UPDATE events SET {col}=? WHERE id=?", (_now_ms(), int(event_id)))
+    mark_notified_many([(event_id, kind)])
 
 
 def del_event(_chat_id: int, event_id: int) -> int:
-    conn = _conn()
-    with conn:
-        cur = conn.execute("DELETE FROM events WHERE id=?", (int(event_id),))
-        return cur.rowcount
+    with _lock:
+        conn = _conn()
+        with conn:
+            cur = conn.execute("DELETE FROM events WHERE id=?", (int(event_id),))
+            n = cur.rowcount
+    if n:
+        _changed([event_id])
+    return n
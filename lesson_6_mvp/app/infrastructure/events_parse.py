@@ -16,3 +16,33 @@ def parse_date_to_ms(date_str: str, tz: ZoneInfo | None) -> int:
         return int(dt_obj.timestamp() * 1000)
     # UTC по умолчанию
     return int(dt.datetime(y, m, d, 0, 0, 0, tzinfo=dt.timezone.utc).timestamp() * 1000)
+
+
+_ADD_RE = re.compile(r"^/events_add(?:@\w+)?\s+(\d{4}-\d{2}-\d{2}(?:\s+\d{2}:\d{2})?)\s+(.+)$", re.S)
+_RECUR_RE = re.compile(r"\s+@(daily|weekly|monthly)$", re.I)
+
+EVENTS_ADD_USAGE = (
+    "Формат: /events_add YYYY-MM-DD [HH:MM] Текст события [@daily|@weekly|@monthly]\n"
+    "Пример: /events_add 2025-10-05 19:00 FOMC\n"
+    "Время — в вашем поясе (/events_tz Europe/Moscow)."
+)
+
+
+def parse_event_add(text: str, tz: ZoneInfo | None) -> Tuple[int, str, str | None]:
+    """
+    Разбирает '/events_add YYYY-MM-DD [HH:MM] Текст [@daily|@weekly|@monthly]'.
+    Дата/время — в зоне tz (без времени — полночь). Возвращает (ts_ms, title, recur).
+    """
+    m = _ADD_RE.match((text or "").strip())
+    if not m:
+        raise ValueError(EVENTS_ADD_USAGE)
+    date_str, title = " ".join(m.group(1).split()), m.group(2).strip()
+    recur = None
+    r = _RECUR_RE.search(title)
+    if r:
+        recur, title = r.group(1).lower(), title[:r.start()].strip()
+    if not title:
+        raise ValueError(EVENTS_ADD_USAGE)
+    fmt = "%Y-%m-%d %H:%M" if " " in date_str else "%Y-%m-%d"
+    local = dt.datetime.strptime(date_str, fmt)
+    return int(local.replace(tzinfo=tz or dt.timezone.utc).timestamp() * 1000), title, recur
@@ -0,0 +1,218 @@
+# app/infrastructure/fake_bot_api.py
+"""
+Фейковый Telegram Bot API (aiohttp) для тестов и нагрузочного прогона доставки (infrastructure.delivery).
+
+Отвечает как api.telegram.org на /bot<token>/<method>, считает лимиты скользящим окном 1с
+(global_rps на бота, chat_rps на чат) и при превышении отдаёт 429 с retry_after — как flood control.
+blocked — чаты, где бот заблокирован (403), fail_next — ближайшие N запросов получают 502.
+
+    python -m app.infrastructure.fake_bot_api --messages 3000 --chats 1000 --rps 300
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import tempfile
+import time
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from aiohttp import web
+
+log = logging.getLogger("alt_forecast.fake_bot_api")
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+
+
+class FakeBotApi:
+    def __init__(self, global_rps: int = 30, chat_rps: int = 3, retry_after: int = 1, latency: float = 0.0):
+        self.global_rps = global_rps
+        self.chat_rps = chat_rps
+        self.retry_after = retry_after
+        self.latency = latency
+        self.blocked: Set[int] = set()
+        self.fail_next = 0
+        self.sent: List[Tuple[float, str, int, Dict[str, Any]]] = []   # (monotonic, method, chat_id, поля)
+        self.rejected = collections.Counter()                             # 429 / 403 / 502
+        self._global: Deque[float] = collections.deque()
+        self._chats: Dict[int, Deque[float]] = collections.defaultdict(collections.deque)
+        self._message_id = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    # ---- жизненный цикл ----
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}/bot"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def bot(self, token: str = "123:TEST", rate_limiter=None, pool_size: int = 64):
+        """ExtBot, смотрящий на этот сервер."""
+        from telegram.ext import ExtBot
+        from telegram.request import HTTPXRequest
+        return ExtBot(token, base_url=self.base_url, rate_limiter=rate_limiter,
+                      request=HTTPXRequest(connection_pool_size=pool_size))
+
+    # ---- учёт ----
+
+    def messages(self, chat_id: Optional[int] = None) -> List[Tuple[float, str, int, Dict[str, Any]]]:
+        return [m for m in self.sent if chat_id is None or m[2] == chat_id]
+
+    def max_per_window(self, chat_id: Optional[int] = None, window: float = 1.0) -> int:
+        """Максимум принятых запросов в любом окне window секунд (глобально или в чат)."""
+        ts = sorted(m[0] for m in self.messages(chat_id))
+        best, lo = 0, 0
+        for hi, t in enumerate(ts):
+            while t - ts[lo] >= window:
+                lo += 1
+            best = max(best, hi - lo + 1)
+        return best
+
+    @staticmethod
+    def _trim(q: Deque[float], now: float) -> None:
+        while q and now - q[0] >= 1.0:
+            q.popleft()
+
+    # ---- обработчик ----
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        fields = await self._fields(request)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == "getMe":
+            return self._ok(BOT_USER)
+        if "chat_id" not in fields:
+            return self._ok(True)
+
+        chat_id = int(fields["chat_id"])
+        now = time.monotonic()
+        if self.fail_next > 0:
+            self.fail_next -= 1
+            self.rejected[502] += 1
+            return web.Response(status=502, text="Bad Gateway")
+        if chat_id in self.blocked:
+            self.rejected[403] += 1
+            return self._error(403, "Forbidden: bot was blocked by the user")
+
+        chat_q = self._chats[chat_id]
+        self._trim(self._global, now)
+        self._trim(chat_q, now)
+        if len(self._global) >= self.global_rps or len(chat_q) >= self.chat_rps:
+            self.rejected[429] += 1
+            return self._error(429, f"Too Many Requests: retry after {self.retry_after}",
+                               {"retry_after": self.retry_after})
+        self._global.append(now)
+        chat_q.append(now)
+        self.sent.append((now, method, chat_id, fields))
+
+        if method == "sendMediaGroup":
+            media = json.loads(fields.get("media", "[]"))
+            return self._ok([self._message(chat_id, {"caption": m.get("caption")}) for m in media])
+        return self._ok(self._message(chat_id, fields))
+
+    @staticmethod
+    async def _fields(request: web.Request) -> Dict[str, Any]:
+        if request.content_type == "application/json":
+            data = await request.json()
+            return {k: v for k, v in data.items()}
+        form = await request.post()
+        return {k: (v if isinstance(v, str) else f"<file {getattr(v, 'filename', '')}>") for k, v in form.items()}
+
+    def _message(self, chat_id: int, fields: Dict[str, Any]) -> Dict[str, Any]:
+        self._message_id += 1
+        msg: Dict[str, Any] = {"message_id": self._message_id, "date": int(time.time()),
+                               "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"}}
+        if fields.get("text"):
+            msg["text"] = fields["text"]
+        if fields.get("caption"):
+            msg["caption"] = fields["caption"]
+        return msg
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    @staticmethod
+    def _error(code: int, description: str, parameters: Optional[Dict[str, Any]] = None) -> web.Response:
+        body: Dict[str, Any] = {"ok": False, "error_code": code, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return web.json_response(body, status=code)
+
+
+# ---------- нагрузочный прогон ----------
+
+async def _bench(messages: int, chats: int, rps: int, interactive: int) -> Dict[str, Any]:
+    from .db import DB
+    from .delivery import LANE_BROADCAST, DeliveryRateLimiter, Outbox
+
+    server = FakeBotApi(global_rps=rps, chat_rps=3)
+    await server.start()
+    limiter = DeliveryRateLimiter(global_rps=rps * 0.9, global_burst=max(1.0, rps * 0.1), chat_rps=1, chat_burst=2)
+    bot = server.bot(rate_limiter=limiter)
+    await bot.initialize()
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DB(f"{tmp}/bench.db")
+        outbox = Outbox(db, concurrency=64)
+        per_chat = max(1, messages // chats)
+        t0 = time.perf_counter()
+        for i in range(per_chat):
+            outbox.broadcast(range(1, chats + 1), "send_message", lane=LANE_BROADCAST, text=f"broadcast #{i}")
+        enqueue_sec = time.perf_counter() - t0
+
+        dispatcher = outbox.start(bot)
+        lat: List[float] = []
+        for k in range(interactive):
+            await asyncio.sleep(0.25)
+            t = time.perf_counter()
+            await bot.send_message(chat_id=10_000_000 + k, text="reply")
+            lat.append(time.perf_counter() - t)
+        while sum(outbox.backlog().values()):
+            await asyncio.sleep(0.2)
+        total_sec = time.perf_counter() - t0
+        await outbox.stop()
+        dispatcher.cancel()
+        outbox.close()
+        db.close()
+    await bot.shutdown()
+    await server.stop()
+    lat.sort()
+    n = per_chat * chats
+    return {
+        "messages": n, "enqueue_sec": round(enqueue_sec, 3), "total_sec": round(total_sec, 2),
+        "throughput_msg_s": round(n / total_sec, 1), "rejected": dict(server.rejected),
+        "max_global_per_sec": server.max_per_window(), "flood_events": limiter.flood_events,
+        "interactive_p50_ms": round(lat[len(lat) // 2] * 1000, 1) if lat else None,
+        "interactive_max_ms": round(lat[-1] * 1000, 1) if lat else None,
+    }
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Нагрузочный прогон доставки против фейкового Bot API")
+    p.add_argument("--messages", type=int, default=3000)
+    p.add_argument("--chats", type=int, default=1000)
+    p.add_argument("--rps", type=int, default=300, help="глобальный лимит фейкового сервера, msg/s")
+    p.add_argument("--interactive", type=int, default=20, help="интерактивных ответов во время рассылки")
+    a = p.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    print(json.dumps(asyncio.run(_bench(a.messages, a.chats, a.rps, a.interactive)), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,200 @@
 # app/infrastructure/forecast_worker.py
 """
-Воркер для обработки задач прогнозирования из очереди RabbitMQ.
+Воркер задач прогнозирования из очереди RabbitMQ.
+
+Работает на пуле асинхронных потребителей (consumer_pool) вместо QueueWorker по одному сообщению:
+- forecast_btc {timeframe, horizon} — запросы с одинаковыми (tf, horizon) в батче считаются одним
+  вызовом общего ForecastService (его кэши прогнозов и моделей живут между сообщениями);
+- forecast {symbol, timeframe, horizon} — символы батча (tf, horizon) без повторов уходят одним
+  BatchForecaster.run (общая матрица признаков на семейство модели, пул процессов — по ядрам).
+Ответ — JSON в reply_to сообщения (или QUEUE_RESULTS) с тем же correlation_id.
+
+    python -m app.infrastructure.forecast_worker
+    python -m app.infrastructure.forecast_worker --bench --messages 2000     # in-memory брокер, без RabbitMQ
 """
 
 from __future__ import annotations
 
+import argparse
+import asyncio
+import json
 import logging
 import os
-from typing import Dict, Any
-from .queue import MessageQueue, QueueWorker, TaskType
-from .db import DB
+import signal
+import time
+from typing import Any, Dict, Hashable, List, Optional
+
+from .broker import MemoryBroker, make_broker, new_correlation_id
+from .consumer_pool import BatchHandler, ConsumerPool, PoisonMessage
+from .queue import TaskType
 from ..config import settings
 
 log = logging.getLogger("alt_forecast.forecast_worker")
 
+FORECAST_QUEUES = tuple(
+    q.strip() for q in os.getenv("FORECAST_QUEUES", f"{TaskType.FORECAST_BTC.value},{TaskType.FORECAST.value}").split(",")
+    if q.strip())
+
+
+class ForecastBatchHandler(BatchHandler):
+    """Батч-обработчик задач прогнозирования; сервисы создаются один раз на процесс."""
+
+    def __init__(self, db=None, forecaster=None, service=None):
+        self._db = db
+        self._forecaster = forecaster
+        self._service = service
+
+    @property
+    def db(self):
+        if self._db is None:
+            from .db import DB
+            db_path = (
+                getattr(settings, "DATABASE_PATH", None)
+                or getattr(settings, "database_path", None)
+                or "/data/data.db"
+            )
+            self._db = DB(db_path)
+        return self._db
+
+    @property
+    def service(self):
+        if self._service is None:
+            from ..application.services.forecast_service import ForecastService
+            self._service = ForecastService(self.db)
+        return self._service
+
+    @property
+    def forecaster(self):
+        if self._forecaster is None:
+            from ..ml.batch_forecaster import get_batch_forecaster
+            self._forecaster = get_batch_forecaster()
+        return self._forecaster
 
-class ForecastWorker(QueueWorker):
-    """Воркер для обработки задач прогнозирования."""
-    
-    def __init__(self):
-        db_path = (
-            getattr(settings, "DATABASE_PATH", None)
-            or getattr(settings, "database_path", None)
-            or "/data/data.db"
-        )
-        self.db = DB(db_path)
-        
-        # Инициализируем очередь
-        queue = MessageQueue(
-            host=os.getenv("RABBITMQ_HOST", "rabbitmq"),
-            port=int(os.getenv("RABBITMQ_PORT", "5672")),
-            username=os.getenv("RABBITMQ_USER", "guest"),
-            password=os.getenv("RABBITMQ_PASS", "guest")
-        )
-        
-        super().__init__(queue, "forecast_btc")
-    
-    def process_message(self, message: Dict[str, Any]):
-        """Обрабатывает сообщение о задаче прогнозирования."""
+    def batch_key(self, message: Dict[str, Any]) -> Hashable:
         task_type = message.get("task_type")
-        payload = message.get("payload", {})
-        
-        log.info(f"Processing task: {task_type}, payload: {payload}")
-        
-        if task_type == TaskType.FORECAST_BTC.value:
-            self._process_forecast_btc(payload)
-        else:
-            log.warning(f"Unknown task type: {task_type}")
-    
-    def _process_forecast_btc(self, payload: Dict[str, Any]):
-        """Обрабатывает задачу прогнозирования BTC."""
-        timeframe = payload.get("timeframe", "1h")
-        horizon = payload.get("horizon", 24)
-        
+        payload = message.get("payload") or {}
+        if not isinstance(payload, dict):
+            raise PoisonMessage("payload is not an object")
+        timeframe = str(payload.get("timeframe", "1h"))
         try:
-            from ..application.services.forecast_service import ForecastService
-            forecast_service = ForecastService(self.db)
-            forecast = forecast_service.forecast_btc(timeframe, horizon)
-            
-            if forecast:
-                log.info(f"Forecast generated: {forecast}")
+            horizon = int(payload.get("horizon", 24))
+        except (TypeError, ValueError):
+            raise PoisonMessage(f"bad horizon: {payload.get('horizon')!r}")
+        if task_type == TaskType.FORECAST_BTC.value:
+            return (task_type, timeframe, horizon)
+        if task_type == TaskType.FORECAST.value:
+            if not str(payload.get("symbol") or "").strip():
+                raise PoisonMessage("forecast task without symbol")
+            return (task_type, timeframe, horizon)
+        raise PoisonMessage(f"unknown task type: {task_type!r}")
+
+    async def handle(self, key: Hashable, messages: List[Dict[str, Any]]) -> List[Any]:
+        task_type, timeframe, horizon = key
+        loop = asyncio.get_running_loop()
+        if task_type == TaskType.FORECAST_BTC.value:
+            forecast = await loop.run_in_executor(None, self.service.forecast_btc, timeframe, horizon)
+            if forecast is None:
+                raise RuntimeError("forecast_btc returned no forecast")
+            result = {"task_type": task_type, "timeframe": timeframe, "horizon": horizon, "forecast": forecast}
+            return [result] * len(messages)
+
+        from ..ml.data_adapter import _symbol_norm
+        symbols = [_symbol_norm(str(m["payload"]["symbol"]).strip()) for m in messages]     # ETH → ETHUSDT, как в батче
+        report = await self.forecaster.run(list(dict.fromkeys(symbols)), timeframe, horizon)
+        by_symbol = {it.symbol: it for it in report.items}
+        out: List[Any] = []
+        for sym in symbols:
+            it = by_symbol.get(sym)
+            if it is None or it.status == "error":
+                out.append(RuntimeError(it.error if it else "no result"))
             else:
-                log.warning("Failed to generate forecast")
-        except Exception as e:
-            log.exception(f"Error processing forecast: {e}")
+                out.append({"task_type": task_type, "symbol": sym, "timeframe": timeframe, "horizon": horizon,
+                            "status": it.status, "result": it.result, "error": it.error})
+        return out
+
+
+async def run_worker(broker=None, handler: Optional[ForecastBatchHandler] = None, **pool_kw) -> ConsumerPool:
+    broker = broker or make_broker()
+    pool = ConsumerPool(broker, FORECAST_QUEUES, handler or ForecastBatchHandler(), **pool_kw)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, pool.stop)
+        except (NotImplementedError, RuntimeError):
+            pass
+    try:
+        await pool.run()
+    finally:
+        await broker.close()
+        log.info("forecast worker stopped: %s", pool.get_stats())
+    return pool
+
+
+# ---------- нагрузочный прогон ----------
+
+class _SimForecaster:
+    """Стоимость как у BatchForecaster: загрузка моделей/баров на вызов + признаки и predict на символ."""
+
+    def __init__(self, call_ms: float, per_symbol_ms: float, warm: bool = True):
+        self.call_sec = call_ms / 1000
+        self.per_symbol_sec = per_symbol_ms / 1000
+        self.warm = warm
+        self._loaded = False
+        self.calls = 0
+
+    def _compute(self, symbols: List[str]) -> None:
+        if not (self.warm and self._loaded):
+            time.sleep(self.call_sec)               # чтение моделей; холодный сервис платит каждый раз
+            self._loaded = True
+        time.sleep(self.per_symbol_sec * len(symbols))
+
+    async def run(self, symbols, tf, horizon):
+        from ..ml.batch_forecaster import BatchItem, BatchReport
+        self.calls += 1
+        await asyncio.get_running_loop().run_in_executor(None, self._compute, list(symbols))
+        return BatchReport(tf, horizon, [BatchItem(s, "ok", {"ret_pred": 0.0, "p_up": 0.5}) for s in symbols])
+
+
+async def _bench_once(messages: int, symbols: int, legacy: bool, call_ms: float, per_symbol_ms: float,
+                      consumers: int) -> Dict[str, Any]:
+    broker = MemoryBroker()
+    for i in range(messages):
+        body = {"task_type": TaskType.FORECAST.value,
+                "payload": {"symbol": f"S{i % symbols}", "timeframe": "1h", "horizon": 24}}
+        await broker.publish(TaskType.FORECAST.value, json.dumps(body).encode(), correlation_id=new_correlation_id())
+
+    if legacy:
+        # как QueueWorker + ForecastWorker: prefetch=1, один потребитель, новый сервис на каждое сообщение
+        class _Cold(ForecastBatchHandler):
+            async def handle(self, key, msgs):
+                self._forecaster = _SimForecaster(call_ms, per_symbol_ms, warm=False)
+                return await super().handle(key, msgs)
+
+        handler = _Cold()
+        kw = dict(consumers=1, prefetch=1, batch_max=1, batch_wait=0.0)
+    else:
+        handler = ForecastBatchHandler(forecaster=_SimForecaster(call_ms, per_symbol_ms))
+        kw = dict(consumers=consumers)
+    pool = ConsumerPool(broker, [TaskType.FORECAST.value], handler, **kw)
+    t0 = time.perf_counter()
+    runner = asyncio.create_task(pool.run())
+    while len(broker._queue(pool.results_queue)) < messages:
+        await asyncio.sleep(0.005)
+    took = time.perf_counter() - t0
+    pool.stop()
+    await runner
+    stats = pool.get_stats()
+    return {"mode": "legacy" if legacy else "pool", "messages": messages, "sec": round(took, 3),
+            "msg_per_sec": round(messages / took, 1), "batches": stats["batches"], "avg_batch": stats["avg_batch"]}
+
+
+def bench(messages: int = 2000, symbols: int = 50, call_ms: float = 20.0, per_symbol_ms: float = 0.5,
+          consumers: int = 4) -> List[Dict[str, Any]]:
+    legacy_n = min(messages, 200)
+    return [
+        asyncio.run(_bench_once(legacy_n, symbols, True, call_ms, per_symbol_ms, 1)),
+        asyncio.run(_bench_once(messages, symbols, False, call_ms, per_symbol_ms, consumers)),
+    ]
 
 
 def main():
@@ -72,17 +203,20 @@ def main():
         level=logging.INFO,
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
-    
-    worker = ForecastWorker()
-    try:
-        worker.start()
-    except KeyboardInterrupt:
-        log.info("Worker stopped")
-    finally:
-        worker.queue.close()
-        worker.db.close()
+    ap = argparse.ArgumentParser(description="Forecast queue worker")
+    ap.add_argument("--bench", action="store_true", help="прогон на in-memory брокере против старого пути")
+    ap.add_argument("--messages", type=int, default=2000)
+    ap.add_argument("--symbols", type=int, default=50)
+    ap.add_argument("--consumers", type=int, default=4)
+    args = ap.parse_args()
+
+    if args.bench:
+        logging.getLogger().setLevel(logging.WARNING)
+        for row in bench(args.messages, args.symbols, consumers=args.consumers):
+            print(json.dumps(row, ensure_ascii=False))
+        return
+    asyncio.run(run_worker())
 
 
 if __name__ == "__main__":
     main()
-
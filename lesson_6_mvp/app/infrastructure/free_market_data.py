@@ -6,15 +6,17 @@
 from __future__ import annotations
 
 import time
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 from dataclasses import dataclass
 from typing import List, Dict, Optional, Tuple
 import logging
 from functools import lru_cache
 from threading import Lock
 
+import numpy as np
+
+from ..domain.liquidation_clusters import LiquidationEvents, LiquidationStats, analyze as analyze_liquidations
+from .http_transport import get_transport
+
 log = logging.getLogger("alt_forecast.free_market_data")
 
 BINANCE_FUT = "https://fapi.binance.com"
@@ -24,19 +26,14 @@ OKX = "https://www.okx.com"
 BITGET = "https://api.bitget.com"
 GATEIO = "https://api.gateio.ws"
 
-# Общий Session с retry логикой
-_sess = requests.Session()
-_sess.mount("https://", HTTPAdapter(max_retries=Retry(
-    total=2,
-    backoff_factor=0.3,
-    status_forcelist=(429, 500, 502, 503, 504),
-    allowed_methods=frozenset(["GET"])
-)))
+# Общий транспорт: пул соединений, лимиты бирж и ретраи 429/5xx (http_transport)
+_sess = get_transport()
 
 # Простой кеш с TTL (в секундах)
 _cache: Dict[str, Tuple[float, any]] = {}
 _cache_lock = Lock()
 CACHE_TTL = 60  # 60 секунд кеш
+LIQ_MIN_USD = 500.0  # минимальный объём уровня ликвидаций для карты
 
 
 @dataclass(frozen=True, slots=True)
@@ -86,120 +83,132 @@ def _set_cached(key: str, value: any):
         _cache[key] = (time.time(), value)
 
 
-def get_liquidation_levels_from_bybit(symbol: str, hours: int = 48) -> List[LiquidationLevel]:
+def _streamed_whales(venue: str, symbol: str, min_amount_usd: Optional[float],
+                     current_price: Optional[float]) -> Optional[List[WhaleOrder]]:
+    """Заявки из живого стакана (orderbook), если поток по символу свежий; иначе None — идём в REST."""
+    from .orderbook import get_orderbook_service
+    book = get_orderbook_service().fresh_book(venue, symbol)
+    return None if book is None else book.whale_orders(min_amount_usd, current_price, exchange=venue)
+
+
+def _book_whales(venue: str, symbol: str, bids, asks, min_amount_usd: Optional[float],
+                 current_price: Optional[float]) -> List[WhaleOrder]:
     """
-    Получить уровни ликвидации из исторических данных Bybit.
-    Группирует ликвидации по ценовым уровням для создания карты.
-    Использует несколько запросов для получения большего количества данных.
+    REST-снапшот → общий стакан (orderbook): фильтр заявок векторный, порог по умолчанию —
+    max(2M$, 0.05% всего стакана), цена по умолчанию — mid; стены сверяются с прошлым снапшотом.
+    """
+    from .orderbook import get_orderbook_service
+    book = get_orderbook_service().apply_snapshot(venue, symbol, bids, asks)
+    if min_amount_usd is None:
+        min_amount_usd = max(2_000_000.0, book.total_notional * 0.0005)
+    return book.whale_orders(min_amount_usd, current_price, exchange=venue)
+
+
+def _liq_step(symbol: str) -> float:
+    """Шаг округления цены уровней: BTC — $100, ETH — $10, остальные — 0.01."""
+    s = symbol.upper()
+    return 100.0 if s == "BTC" else 10.0 if s == "ETH" else 0.01
+
+
+def _levels_from_events(events: LiquidationEvents, symbol: str, exchange: str) -> List[LiquidationLevel]:
+    """Уровни одной биржи: корзины ±шаг/2 вокруг округлённой цены, от $500, по убыванию цены."""
+    st = analyze_liquidations(events, width=_liq_step(symbol), rounding="nearest", min_usd=LIQ_MIN_USD)
+    return [LiquidationLevel(price=c.level, usd_value=c.usd, side=c.side, exchange=exchange) for c in st.clusters]
+
+
+def liquidation_levels(stats: LiquidationStats) -> List[LiquidationLevel]:
+    """Кластеры domain.liquidation_clusters → уровни для карты (цена — средняя, взвешенная USD)."""
+    return [LiquidationLevel(price=c.price, usd_value=c.usd, side=c.side, exchange=c.exchange)
+            for c in stats.clusters]
+
+
+def fetch_liquidation_events_bybit(symbol: str, hours: int = 48) -> LiquidationEvents:
+    """
+    Сырые ликвидации Bybit колонками (ts, venue, side, price, usd).
+    Использует несколько запросов по 6-часовым окнам; если событий мало — inverse контракт.
     """
     symbol_usdt = f"{symbol}USDT" if not symbol.endswith("USDT") else symbol
-    
-    try:
-        end_ms = int(time.time() * 1000) - 2000
-        all_liqs = []
-        
-        # Делаем несколько запросов с разными временными окнами для получения больше данных
-        window_hours = 6  # Каждое окно 6 часов
-        num_windows = max(1, hours // window_hours)
-        
-        for i in range(num_windows):
-            window_end = end_ms - (i * window_hours * 3600 * 1000)
-            window_start = window_end - (window_hours * 3600 * 1000)
-            
-            try:
-                url = f"{BYBIT}/v5/market/liquidation"
-                params = {
-                    "category": "linear",
-                    "symbol": symbol_usdt,
-                    "startTime": int(window_start),
-                    "endTime": int(window_end),
-                    "limit": 200
-                }
-                
-                r = _sess.get(url, params=params, timeout=15)
-                if r.status_code == 404:
-                    continue
+
+    cache_key = f"liq_events_bybit_{symbol}_{hours}"
+    cached = _get_cached(cache_key, ttl=120)
+    if cached is not None:
+        return cached
+
+    end_ms = int(time.time() * 1000) - 2000
+    all_liqs = []
+
+    # Делаем несколько запросов с разными временными окнами для получения больше данных
+    window_hours = 6  # Каждое окно 6 часов
+    num_windows = max(1, hours // window_hours)
+
+    for i in range(num_windows):
+        window_end = end_ms - (i * window_hours * 3600 * 1000)
+        window_start = window_end - (window_hours * 3600 * 1000)
+
+        try:
+            url = f"{BYBIT}/v5/market/liquidation"
+            params = {
+                "category": "linear",
+                "symbol": symbol_usdt,
+                "startTime": int(window_start),
+                "endTime": int(window_end),
+                "limit": 200
+            }
+
+            r = _sess.get(url, params=params, timeout=15)
+            if r.status_code == 404:
+                continue
+            r.raise_for_status()
+            data = r.json()
+
+            liqs = data.get("result", {}).get("list", [])
+            if liqs:
+                all_liqs.extend(liqs)
+
+        except Exception as e:
+            log.debug("Failed to get liquidations for window %d: %s", i, e)
+            continue
+
+    # Если данных все еще мало, пробуем inverse контракт
+    if len(all_liqs) < 10:
+        symbol_usd = symbol_usdt.replace("USDT", "USD")
+        try:
+            url = f"{BYBIT}/v5/market/liquidation"
+            params = {
+                "category": "inverse",
+                "symbol": symbol_usd,
+                "startTime": end_ms - (hours * 3600 * 1000),
+                "endTime": end_ms,
+                "limit": 200
+            }
+            r = _sess.get(url, params=params, timeout=15)
+            if r.status_code != 404:
                 r.raise_for_status()
                 data = r.json()
-                
                 liqs = data.get("result", {}).get("list", [])
                 if liqs:
                     all_liqs.extend(liqs)
-                    
-            except Exception as e:
-                log.debug("Failed to get liquidations for window %d: %s", i, e)
-                continue
-        
-        # Если данных все еще мало, пробуем inverse контракт
-        if len(all_liqs) < 10:
-            symbol_usd = symbol_usdt.replace("USDT", "USD")
-            try:
-                url = f"{BYBIT}/v5/market/liquidation"
-                params = {
-                    "category": "inverse",
-                    "symbol": symbol_usd,
-                    "startTime": end_ms - (hours * 3600 * 1000),
-                    "endTime": end_ms,
-                    "limit": 200
-                }
-                r = _sess.get(url, params=params, timeout=15)
-                if r.status_code != 404:
-                    r.raise_for_status()
-                    data = r.json()
-                    liqs = data.get("result", {}).get("list", [])
-                    if liqs:
-                        all_liqs.extend(liqs)
-            except Exception:
-                pass
-        
-        if not all_liqs:
-            return []
-        
-        # Группируем ликвидации по ценовым уровням
-        price_groups: Dict[Tuple[str, float], float] = {}
-        
-        for liq in all_liqs:
-            side = str(liq.get("side", "")).lower()
-            if side not in ("buy", "sell", "long", "short"):
-                continue
-            
-            price = float(liq.get("price", 0))
-            value = float(liq.get("value", 0) or liq.get("qty", 0))
-            
-            if price <= 0 or value <= 0:
-                continue
-            
-            # Нормализуем side
-            side_normalized = "long" if side in ("buy", "long") else "short"
-            
-            # Округляем цену для группировки (более агрессивное округление для лучшей группировки)
-            # Для BTC округляем до $100, для ETH до $10
-            if symbol.upper() == "BTC":
-                price_rounded = round(price / 100) * 100
-            elif symbol.upper() == "ETH":
-                price_rounded = round(price / 10) * 10
-            else:
-                price_rounded = round(price * 100) / 100  # Округление до 0.01
-            
-            key = (side_normalized, price_rounded)
-            price_groups[key] = price_groups.get(key, 0) + value
-        
-        # Создаем список уровней
-        levels = []
-        for (side, price), total_value in price_groups.items():
-            # Снижаем минимальный порог для отображения
-            if total_value >= 500:  # Минимум $500 для отображения
-                levels.append(LiquidationLevel(
-                    price=price,
-                    usd_value=total_value,
-                    side=side,
-                    exchange="bybit"
-                ))
-        
-        result = sorted(levels, key=lambda x: x.price, reverse=True)
-        _set_cached(cache_key, result)
-        return result
-        
+        except Exception:
+            pass
+
+    # side: buy/long → long, sell/short → short; прочее и нулевые цена/объём отбрасывает from_rows.
+    # Без времени биржи событие пропускаем: подставленное «сейчас» меняется от запроса к запросу,
+    # и первичный ключ liq_events перестаёт отсекать дубликаты
+    events = LiquidationEvents.from_rows(
+        (int(liq.get("updatedTime") or liq.get("time")), "bybit", liq.get("side", ""),
+         float(liq.get("price", 0) or 0), float(liq.get("value", 0) or liq.get("qty", 0) or 0))
+        for liq in all_liqs if liq.get("updatedTime") or liq.get("time"))
+    _set_cached(cache_key, events)
+    return events
+
+
+def get_liquidation_levels_from_bybit(symbol: str, hours: int = 48) -> List[LiquidationLevel]:
+    """
+    Получить уровни ликвидации из исторических данных Bybit.
+    Группирует ликвидации по ценовым уровням для создания карты.
+    """
+    try:
+        return _levels_from_events(fetch_liquidation_events_bybit(symbol, hours), symbol, "bybit")
     except Exception as e:
         log.warning("Failed to get liquidation levels from Bybit for %s: %s", symbol, e)
         return []
@@ -212,6 +221,10 @@ def get_whale_orders_from_binance(symbol: str, min_amount_usd: Optional[float] =
     """
     symbol_usdt = f"{symbol}USDT" if not symbol.endswith("USDT") else symbol
     
+    streamed = _streamed_whales("binance", symbol_usdt, min_amount_usd, current_price)
+    if streamed is not None:
+        return streamed
+
     # Проверяем кеш
     cache_key = f"whale_orders_{symbol_usdt}"
     cached = _get_cached(cache_key, ttl=60)  # 1 минута кеш для ордеров
@@ -227,68 +240,7 @@ def get_whale_orders_from_binance(symbol: str, min_amount_usd: Optional[float] =
         r.raise_for_status()
         data = r.json()
         
-        # Получаем текущую цену для расчета USD значения
-        if current_price is None:
-            ticker_url = f"{BINANCE_FUT}/fapi/v1/ticker/price"
-            ticker_r = _sess.get(ticker_url, params={"symbol": symbol_usdt}, timeout=10)
-            ticker_r.raise_for_status()
-            current_price = float(ticker_r.json()["price"])
-        
-        # Умный порог если не указан
-        if min_amount_usd is None:
-            bids = data.get("bids", [])
-            asks = data.get("asks", [])
-            total_notional = sum(float(p) * float(q) for p, q in bids + asks)
-            min_amount_usd = max(2_000_000.0, total_notional * 0.0005)  # 0.05% от общего объема стакана
-        
-        orders = []
-        
-        # Обрабатываем bids (buy orders)
-        bids = data.get("bids", [])
-        for bid in bids:
-            price = float(bid[0])
-            quantity = float(bid[1])
-            amount_usd = price * quantity
-            
-            # Фильтр по размеру
-            if amount_usd < min_amount_usd:
-                continue
-            
-            # Фильтр по расстоянию от текущей цены (не дальше 10%)
-            if abs(price - current_price) / current_price > 0.1:
-                continue
-            
-            orders.append(WhaleOrder(
-                price=price,
-                amount=amount_usd,
-                side="buy",
-                age="Live"
-            ))
-        
-        # Обрабатываем asks (sell orders)
-        asks = data.get("asks", [])
-        for ask in asks:
-            price = float(ask[0])
-            quantity = float(ask[1])
-            amount_usd = price * quantity
-            
-            # Фильтр по размеру
-            if amount_usd < min_amount_usd:
-                continue
-            
-            # Фильтр по расстоянию от текущей цены (не дальше 10%)
-            if abs(price - current_price) / current_price > 0.1:
-                continue
-            
-            orders.append(WhaleOrder(
-                price=price,
-                amount=amount_usd,
-                side="sell",
-                age="Live",
-                exchange="binance"
-            ))
-        
-        result = sorted(orders, key=lambda x: x.amount, reverse=True)
+        result = _book_whales("binance", symbol_usdt, data.get("bids"), data.get("asks"), min_amount_usd, current_price)
         _set_cached(cache_key, result)
         return result
         
@@ -303,6 +255,10 @@ def get_whale_orders_from_bybit(symbol: str, min_amount_usd: Optional[float] = N
     """
     symbol_usdt = f"{symbol}USDT"
     
+    streamed = _streamed_whales("bybit", symbol_usdt, min_amount_usd, current_price)
+    if streamed is not None:
+        return streamed
+
     cache_key = f"whale_orders_bybit_{symbol_usdt}"
     cached = _get_cached(cache_key, ttl=60)
     if cached is not None:
@@ -327,74 +283,7 @@ def get_whale_orders_from_bybit(symbol: str, min_amount_usd: Optional[float] = N
         if not result_data:
             return []
         
-        # Получаем текущую цену если не указана
-        if current_price is None:
-            ticker_url = f"{BYBIT}/v5/market/tickers"
-            ticker_params = {"category": "linear", "symbol": symbol_usdt}
-            ticker_r = _sess.get(ticker_url, params=ticker_params, timeout=10)
-            ticker_r.raise_for_status()
-            ticker_data = ticker_r.json()
-            if ticker_data.get("retCode") == 0 and ticker_data.get("result", {}).get("list"):
-                current_price = float(ticker_data["result"]["list"][0].get("lastPrice", 0))
-            else:
-                return []
-        
-        bids = result_data.get("b", [])  # bids в формате [["price", "size"], ...]
-        asks = result_data.get("a", [])  # asks в формате [["price", "size"], ...]
-        
-        # Умный порог
-        if min_amount_usd is None:
-            try:
-                total_notional = sum(float(p) * float(q) for p, q in bids + asks)
-                min_amount_usd = max(2_000_000.0, total_notional * 0.0005)
-            except Exception:
-                min_amount_usd = 2_000_000.0
-        
-        orders = []
-        
-        # Bids (buy)
-        for bid in bids:
-            if not isinstance(bid, (list, tuple)) or len(bid) < 2:
-                continue
-            price = float(bid[0])
-            quantity = float(bid[1])
-            amount_usd = price * quantity
-            
-            if amount_usd < min_amount_usd:
-                continue
-            if abs(price - current_price) / current_price > 0.1:
-                continue
-            
-            orders.append(WhaleOrder(
-                price=price,
-                amount=amount_usd,
-                side="buy",
-                age="Live",
-                exchange="bybit"
-            ))
-        
-        # Asks (sell)
-        for ask in asks:
-            if not isinstance(ask, (list, tuple)) or len(ask) < 2:
-                continue
-            price = float(ask[0])
-            quantity = float(ask[1])
-            amount_usd = price * quantity
-            
-            if amount_usd < min_amount_usd:
-                continue
-            if abs(price - current_price) / current_price > 0.1:
-                continue
-            
-            orders.append(WhaleOrder(
-                price=price,
-                amount=amount_usd,
-                side="sell",
-                age="Live",
-                exchange="bybit"
-            ))
-        
-        result = sorted(orders, key=lambda x: x.amount, reverse=True)
+        result = _book_whales("bybit", symbol_usdt, result_data.get("b"), result_data.get("a"), min_amount_usd, current_price)
         _set_cached(cache_key, result)
         return result
         
@@ -411,6 +300,10 @@ def get_whale_orders_from_coinbase(symbol: str, min_amount_usd: Optional[float]
     # Coinbase использует формат BTC-USD для спотовых пар
     symbol_coinbase = f"{symbol}-USD"
     
+    streamed = _streamed_whales("coinbase", symbol_coinbase, min_amount_usd, current_price)
+    if streamed is not None:
+        return streamed
+
     cache_key = f"whale_orders_coinbase_{symbol_coinbase}"
     cached = _get_cached(cache_key, ttl=60)
     if cached is not None:
@@ -425,72 +318,7 @@ def get_whale_orders_from_coinbase(symbol: str, min_amount_usd: Optional[float]
         r.raise_for_status()
         data = r.json()
         
-        # Получаем текущую цену если не указана
-        if current_price is None:
-            ticker_url = f"https://api.exchange.coinbase.com/products/{symbol_coinbase}/ticker"
-            ticker_r = _sess.get(ticker_url, timeout=10)
-            ticker_r.raise_for_status()
-            ticker_data = ticker_r.json()
-            current_price = float(ticker_data.get("price", 0))
-            if current_price == 0:
-                return []
-        
-        bids = data.get("bids", [])
-        asks = data.get("asks", [])
-        
-        # Умный порог
-        if min_amount_usd is None:
-            try:
-                total_notional = sum(float(p) * float(q) for p, q in bids + asks)
-                min_amount_usd = max(2_000_000.0, total_notional * 0.0005)
-            except Exception:
-                min_amount_usd = 2_000_000.0
-        
-        orders = []
-        
-        # Bids (buy) - формат Coinbase: [price, size]
-        for bid in bids:
-            if not isinstance(bid, (list, tuple)) or len(bid) < 2:
-                continue
-            price = float(bid[0])
-            quantity = float(bid[1])
-            amount_usd = price * quantity
-            
-            if amount_usd < min_amount_usd:
-                continue
-            if abs(price - current_price) / current_price > 0.1:
-                continue
-            
-            orders.append(WhaleOrder(
-                price=price,
-                amount=amount_usd,
-                side="buy",
-                age="Live",
-                exchange="coinbase"
-            ))
-        
-        # Asks (sell)
-        for ask in asks:
-            if not isinstance(ask, (list, tuple)) or len(ask) < 2:
-                continue
-            price = float(ask[0])
-            quantity = float(ask[1])
-            amount_usd = price * quantity
-            
-            if amount_usd < min_amount_usd:
-                continue
-            if abs(price - current_price) / current_price > 0.1:
-                continue
-            
-            orders.append(WhaleOrder(
-                price=price,
-                amount=amount_usd,
-                side="sell",
-                age="Live",
-                exchange="coinbase"
-            ))
-        
-        result = sorted(orders, key=lambda x: x.amount, reverse=True)
+        result = _book_whales("coinbase", symbol_coinbase, data.get("bids"), data.get("asks"), min_amount_usd, current_price)
         _set_cached(cache_key, result)
         return result
         
@@ -567,25 +395,29 @@ def estimate_liquidation_levels_from_positions(
     Это упрощенная оценка, основанная на предположениях о среднем плече.
     """
     try:
-        # Получаем orderbook для анализа концентрации позиций
+        from .orderbook import get_orderbook_service, parse_levels
+
+        # Стакан для анализа концентрации позиций: живой (orderbook), иначе REST
         symbol_usdt = f"{symbol}USDT" if not symbol.endswith("USDT") else symbol
-        url = f"{BINANCE_FUT}/fapi/v1/depth"
-        params = {"symbol": symbol_usdt, "limit": 100}
-        
-        r = _sess.get(url, params=params, timeout=10)
-        r.raise_for_status()
-        data = r.json()
+        book = get_orderbook_service().fresh_book("binance", symbol_usdt)
+        if book is not None:
+            bid_px, bid_n = (a[:20] for a in book.bids.from_best())      # Топ 20 уровней
+            ask_px, ask_n = (a[:20] for a in book.asks.from_best())
+        else:
+            url = f"{BINANCE_FUT}/fapi/v1/depth"
+            params = {"symbol": symbol_usdt, "limit": 100}
+
+            r = _sess.get(url, params=params, timeout=10)
+            r.raise_for_status()
+            data = r.json()
+            bid_px, bid_q = parse_levels(data.get("bids", [])[:20])
+            ask_px, ask_q = parse_levels(data.get("asks", [])[:20])
+            bid_n, ask_n = bid_px * bid_q, ask_px * ask_q
         
         levels = []
         
         # Анализируем bids (длинные позиции) - ликвидация ниже текущей цены
-        bids = data.get("bids", [])
-        total_long_value = 0.0
-        for bid in bids[:20]:  # Топ 20 уровней
-            price = float(bid[0])
-            quantity = float(bid[1])
-            if price < current_price:
-                total_long_value += price * quantity
+        total_long_value = float(bid_n[bid_px < current_price].sum())
         
         # Оцениваем уровни ликвидации для long позиций
         # Предполагаем среднее плечо 20x
@@ -602,13 +434,7 @@ def estimate_liquidation_levels_from_positions(
                 ))
         
         # Анализируем asks (короткие позиции) - ликвидация выше текущей цены
-        asks = data.get("asks", [])
-        total_short_value = 0.0
-        for ask in asks[:20]:
-            price = float(ask[0])
-            quantity = float(ask[1])
-            if price > current_price:
-                total_short_value += price * quantity
+        total_short_value = float(ask_n[ask_px > current_price].sum())
         
         # Оцениваем уровни ликвидации для short позиций
         if total_short_value > 0:
@@ -630,101 +456,54 @@ def estimate_liquidation_levels_from_positions(
 
 # ==================== Поддержка других бирж ====================
 
-def get_liquidation_levels_from_okx(symbol: str, hours: int = 48) -> List[LiquidationLevel]:
+def fetch_liquidation_events_okx(symbol: str, hours: int = 48) -> LiquidationEvents:
     """
-    Получить уровни ликвидации из OKX API.
+    Сырые ликвидации OKX колонками (ts, venue, side, price, usd); USD = sz × цена.
     """
     symbol_usdt = f"{symbol}-USDT-SWAP" if not symbol.endswith("-USDT-SWAP") else symbol
-    
-    cache_key = f"liqs_okx_{symbol}_{hours}"
+
+    cache_key = f"liq_events_okx_{symbol}_{hours}"
     cached = _get_cached(cache_key, ttl=120)
     if cached is not None:
         return cached
-    
+
+    url = f"{OKX}/api/v5/public/liquidation-orders"
+    # Публичный endpoint отдаёт последние события без временных параметров
+    params = {
+        "instType": "SWAP",
+        "limit": "100"
+    }
+
+    # Если есть конкретный символ, добавляем его
+    if symbol_usdt:
+        params["instId"] = symbol_usdt
+
+    r = _sess.get(url, params=params, timeout=15)
+    r.raise_for_status()
+    data = r.json()
+
+    if data.get("code") != "0":
+        log.debug("OKX API returned code: %s, msg: %s", data.get("code"), data.get("msg"))
+        return LiquidationEvents.empty()
+
+    rows = []
+    for liq in data.get("data", []):
+        side = str(liq.get("side", "")).lower()
+        if side not in ("long", "short") or not liq.get("ts"):      # без времени биржи — не дедуплицируется
+            continue
+        price = float(liq.get("price", 0) or liq.get("px", 0) or 0)
+        rows.append((int(liq["ts"]), "okx", side, price, float(liq.get("sz", 0) or 0) * price))
+    events = LiquidationEvents.from_rows(rows)
+    _set_cached(cache_key, events)
+    return events
+
+
+def get_liquidation_levels_from_okx(symbol: str, hours: int = 48) -> List[LiquidationLevel]:
+    """
+    Получить уровни ликвидации из OKX API.
+    """
     try:
-        # OKX API требует временные метки в миллисекундах
-        # Но для публичного API ликвидаций может быть ограничение по времени
-        # Используем более короткий период и правильный формат
-        end_ms = int(time.time() * 1000)
-        # Ограничиваем до 24 часов максимум для публичного API
-        hours_limited = min(hours, 24)
-        start_ms = end_ms - (hours_limited * 3600 * 1000)
-        
-        url = f"{OKX}/api/v5/public/liquidation-orders"
-        # OKX API может требовать параметры без instId для получения всех или использовать другой формат
-        # Попробуем упрощенный запрос без временных ограничений сначала
-        params = {
-            "instType": "SWAP",
-            "limit": "100"
-        }
-        
-        # Если есть конкретный символ, добавляем его
-        if symbol_usdt:
-            params["instId"] = symbol_usdt
-        
-        r = _sess.get(url, params=params, timeout=15)
-        
-        # Если 400 ошибка, пробуем без временных параметров
-        if r.status_code == 400:
-            # Пробуем без begin/end - возможно API не поддерживает эти параметры для публичного endpoint
-            params_no_time = {
-                "instType": "SWAP",
-                "limit": "100"
-            }
-            if symbol_usdt:
-                params_no_time["instId"] = symbol_usdt
-            r = _sess.get(url, params=params_no_time, timeout=15)
-        
-        r.raise_for_status()
-        data = r.json()
-        
-        if data.get("code") != "0":
-            log.debug("OKX API returned code: %s, msg: %s", data.get("code"), data.get("msg"))
-            return []
-        
-        liqs = data.get("data", [])
-        if not liqs:
-            return []
-        
-        # Группируем по ценам
-        price_groups: Dict[Tuple[str, float], float] = {}
-        
-        for liq in liqs:
-            side = str(liq.get("side", "")).lower()
-            if side not in ("long", "short"):
-                continue
-            
-            price = float(liq.get("price", 0) or liq.get("px", 0))
-            value = float(liq.get("sz", 0)) * price  # размер * цена
-            
-            if price <= 0 or value <= 0:
-                continue
-            
-            # Округление как в Bybit функции
-            if symbol.upper() == "BTC":
-                price_rounded = round(price / 100) * 100
-            elif symbol.upper() == "ETH":
-                price_rounded = round(price / 10) * 10
-            else:
-                price_rounded = round(price * 100) / 100
-            
-            key = (side, price_rounded)
-            price_groups[key] = price_groups.get(key, 0) + value
-        
-        levels = []
-        for (side, price), total_value in price_groups.items():
-            if total_value >= 500:
-                levels.append(LiquidationLevel(
-                    price=price,
-                    usd_value=total_value,
-                    side=side,
-                    exchange="okx"
-                ))
-        
-        result = sorted(levels, key=lambda x: x.price, reverse=True)
-        _set_cached(cache_key, result)
-        return result
-        
+        return _levels_from_events(fetch_liquidation_events_okx(symbol, hours), symbol, "okx")
     except Exception as e:
         log.warning("Failed to get liquidation levels from OKX for %s: %s", symbol, e)
         return []
@@ -736,6 +515,10 @@ def get_whale_orders_from_okx(symbol: str, min_amount_usd: Optional[float] = Non
     """
     symbol_usdt = f"{symbol}-USDT-SWAP" if not symbol.endswith("-USDT-SWAP") else symbol
     
+    streamed = _streamed_whales("okx", symbol_usdt, min_amount_usd, current_price)
+    if streamed is not None:
+        return streamed
+
     cache_key = f"whale_orders_okx_{symbol_usdt}"
     cached = _get_cached(cache_key, ttl=60)
     if cached is not None:
@@ -756,79 +539,7 @@ def get_whale_orders_from_okx(symbol: str, min_amount_usd: Optional[float] = Non
         if not book_data:
             return []
         
-        if current_price is None:
-            # Получаем текущую цену
-            ticker_url = f"{OKX}/api/v5/market/ticker"
-            ticker_r = _sess.get(ticker_url, params={"instId": symbol_usdt}, timeout=10)
-            ticker_r.raise_for_status()
-            ticker_data = ticker_r.json()
-            if ticker_data.get("code") == "0" and ticker_data.get("data"):
-                current_price = float(ticker_data["data"][0].get("last", 0))
-            else:
-                return []
-        
-        bids = book_data.get("bids", [])
-        asks = book_data.get("asks", [])
-        
-        # Умный порог
-        if min_amount_usd is None:
-            # OKX может возвращать данные в формате [price, size, ...] или [price, size]
-            try:
-                total_notional = 0.0
-                for item in bids + asks:
-                    if isinstance(item, (list, tuple)) and len(item) >= 2:
-                        total_notional += float(item[0]) * float(item[1])
-                min_amount_usd = max(2_000_000.0, total_notional * 0.0005)
-            except Exception:
-                min_amount_usd = 2_000_000.0
-        
-        orders = []
-        
-        # Bids (buy)
-        for bid in bids:
-            # OKX формат: [price, size, ...] - берем первые два элемента
-            if not isinstance(bid, (list, tuple)) or len(bid) < 2:
-                continue
-            price = float(bid[0])
-            quantity = float(bid[1])
-            amount_usd = price * quantity
-            
-            if amount_usd < min_amount_usd:
-                continue
-            if abs(price - current_price) / current_price > 0.1:
-                continue
-            
-            orders.append(WhaleOrder(
-                price=price,
-                amount=amount_usd,
-                side="buy",
-                age="Live",
-                exchange="okx"
-            ))
-        
-        # Asks (sell)
-        for ask in asks:
-            # OKX формат: [price, size, ...] - берем первые два элемента
-            if not isinstance(ask, (list, tuple)) or len(ask) < 2:
-                continue
-            price = float(ask[0])
-            quantity = float(ask[1])
-            amount_usd = price * quantity
-            
-            if amount_usd < min_amount_usd:
-                continue
-            if abs(price - current_price) / current_price > 0.1:
-                continue
-            
-            orders.append(WhaleOrder(
-                price=price,
-                amount=amount_usd,
-                side="sell",
-                age="Live",
-                exchange="okx"
-            ))
-        
-        result = sorted(orders, key=lambda x: x.amount, reverse=True)
+        result = _book_whales("okx", symbol_usdt, book_data.get("bids"), book_data.get("asks"), min_amount_usd, current_price)
         _set_cached(cache_key, result)
         return result
         
@@ -940,12 +651,36 @@ def get_liquidation_levels_aggregated(
     return results
 
 
+def fetch_liquidation_events(
+    symbol: str,
+    exchanges: Optional[List[str]] = None,
+    hours: int = 48
+) -> LiquidationEvents:
+    """
+    Сырые ликвидации с нескольких бирж одним колоночным журналом (для liquidation_store).
+    Ошибка одной биржи не мешает остальным.
+    """
+    fetchers = {"bybit": fetch_liquidation_events_bybit, "okx": fetch_liquidation_events_okx}
+    parts = []
+    for ex in (exchanges or ["bybit", "okx"]):
+        fn = fetchers.get(ex)
+        if fn is None:
+            continue
+        try:
+            parts.append(fn(symbol, hours))
+        except Exception as e:
+            log.warning("Failed to get %s liquidations: %s", ex, e)
+    return LiquidationEvents.concat(parts)
+
+
 def aggregate_liquidation_levels(
     levels_by_exchange: Dict[str, List[LiquidationLevel]],
     price_tolerance: float = 0.001
 ) -> List[LiquidationLevel]:
     """
     Агрегировать уровни ликвидации с разных бирж, объединяя близкие по цене.
+    Группа — (сторона, цена, округлённая по величине: >1000 — до $100, >100 — до $10, иначе 0.01);
+    цена группы — средняя, взвешенная USD.
     
     Args:
         levels_by_exchange: Словарь {exchange: [levels]}
@@ -954,53 +689,41 @@ def aggregate_liquidation_levels(
     Returns:
         Агрегированный список уровней
     """
-    # Собираем все уровни с указанием биржи
-    all_levels: List[Tuple[LiquidationLevel, str]] = []
-    for exchange, levels in levels_by_exchange.items():
-        for level in levels:
-            all_levels.append((level, exchange))
-    
-    if not all_levels:
+    rows = [(level, exchange) for exchange, levels in levels_by_exchange.items() for level in levels]
+    if not rows:
         return []
-    
-    # Группируем по близким ценам и стороне
-    aggregated: Dict[Tuple[str, float], Tuple[float, float, List[str]]] = {}
-    # key: (side, rounded_price) -> (total_value, avg_price, exchanges)
-    
-    for level, exchange in all_levels:
-        # Округление для группировки
-        if level.price > 1000:  # BTC
-            rounded = round(level.price / 100) * 100
-        elif level.price > 100:  # ETH
-            rounded = round(level.price / 10) * 10
-        else:
-            rounded = round(level.price * 100) / 100
-        
-        key = (level.side, rounded)
-        
-        if key in aggregated:
-            total_val, avg_price, exchanges_list = aggregated[key]
-            total_val += level.usd_value
-            # Взвешенное среднее
-            avg_price = (avg_price * (len(exchanges_list) - 1) + level.price) / len(exchanges_list)
-            exchanges_list.append(exchange)
-            aggregated[key] = (total_val, avg_price, exchanges_list)
-        else:
-            aggregated[key] = (level.usd_value, level.price, [exchange])
-    
-    # Создаем финальный список
-    result = []
-    for (side, _), (total_value, avg_price, exchanges_list) in aggregated.items():
-        # Объединяем биржи в строку
-        exchanges_str = "+".join(sorted(set(exchanges_list)))
-        
-        result.append(LiquidationLevel(
-            price=avg_price,
-            usd_value=total_value,
-            side=side,
-            exchange=exchanges_str
-        ))
-    
+
+    n = len(rows)
+    price = np.fromiter((lv.price for lv, _ in rows), dtype=float, count=n)
+    usd = np.fromiter((lv.usd_value for lv, _ in rows), dtype=float, count=n)
+    sides, side_code = np.unique([lv.side for lv, _ in rows], return_inverse=True)
+    venues, venue_code = np.unique([ex for _, ex in rows], return_inverse=True)
+
+    # Округление для группировки и ключ (side, rounded) одним np.unique по строкам
+    step = np.where(price > 1000, 100.0, np.where(price > 100, 10.0, 0.01))
+    rounded = np.round(price / step) * step
+    _, inv = np.unique(np.column_stack([side_code, rounded]), axis=0, return_inverse=True)
+    inv = inv.ravel()
+    k = int(inv.max()) + 1
+    total = np.bincount(inv, weights=usd, minlength=k)
+    wsum = np.bincount(inv, weights=usd * price, minlength=k)
+    cnt = np.bincount(inv, minlength=k)
+    avg = np.where(total > 0, wsum / np.where(total > 0, total, 1.0),
+                   np.bincount(inv, weights=price, minlength=k) / cnt)
+    first = np.full(k, n, dtype=np.int64)
+    np.minimum.at(first, inv, np.arange(n))
+    nv = len(venues)
+    present = np.bincount(inv * nv + venue_code, minlength=k * nv).reshape(k, nv) > 0
+
+    result = [
+        LiquidationLevel(
+            price=float(avg[g]),
+            usd_value=float(total[g]),
+            side=str(sides[side_code[first[g]]]),
+            exchange="+".join(venues[present[g]].tolist())
+        )
+        for g in range(k)
+    ]
     return sorted(result, key=lambda x: x.price, reverse=True)
 
 
@@ -1361,14 +1084,17 @@ def get_large_trades_aggregated(
 
 # ==================== Дополнительные метрики ====================
 
+def _level_usd(levels: List[LiquidationLevel]) -> np.ndarray:
+    return np.fromiter((l.usd_value for l in levels), dtype=float, count=len(levels))
+
+
 def calculate_liquidation_velocity(levels: List[LiquidationLevel], hours: int) -> float:
     """
     Рассчитать скорость ликвидаций (USD в час).
     """
     if not levels or hours <= 0:
         return 0.0
-    total_usd = sum(l.usd_value for l in levels)
-    return total_usd / hours
+    return float(_level_usd(levels).sum()) / hours
 
 
 def calculate_liquidity_concentration(levels: List[LiquidationLevel]) -> float:
@@ -1378,22 +1104,22 @@ def calculate_liquidity_concentration(levels: List[LiquidationLevel]) -> float:
     """
     if not levels:
         return 0.0
-    
-    total_usd = sum(l.usd_value for l in levels)
+    usd = _level_usd(levels)
+    total_usd = float(usd.sum())
     if total_usd <= 0:
         return 0.0
-    
     # Сумма квадратов долей
-    hhi = sum((l.usd_value / total_usd) ** 2 for l in levels)
-    return hhi
+    return float(np.square(usd / total_usd).sum())
 
 
 def calculate_long_short_ratio(levels: List[LiquidationLevel]) -> float:
     """
     Рассчитать соотношение long/short ликвидаций.
     """
-    long_usd = sum(l.usd_value for l in levels if l.side == "long")
-    short_usd = sum(l.usd_value for l in levels if l.side == "short")
+    usd = _level_usd(levels)
+    is_long = np.fromiter((l.side == "long" for l in levels), dtype=bool, count=len(levels))
+    is_short = np.fromiter((l.side == "short" for l in levels), dtype=bool, count=len(levels))
+    long_usd, short_usd = float(usd[is_long].sum()), float(usd[is_short].sum())
     
     if short_usd == 0:
         return float('inf') if long_usd > 0 else 0.0
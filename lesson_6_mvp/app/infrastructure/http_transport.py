@@ -0,0 +1,744 @@
+# app/infrastructure/http_transport.py
+"""
+Единый HTTP-транспорт для клиентов бирж и источников данных (Binance, Deribit, Bybit, OKX,
+CoinGlass, CoinGecko, alternative.me ...).
+
+Раньше каждый клиент жил сам по себе: голые requests.get без keep-alive, свои циклы ретраев
+с time.sleep (в том числе на потоке event loop), urllib3 Retry поверх 429 без учёта соседей,
+новый aiohttp.ClientSession на каждый вызов. Здесь всё это — один объект на процесс:
+
+- пул keep-alive соединений на хост (requests.Session / aiohttp.ClientSession на event loop);
+- политика хоста (HTTP_HOST_LIMITS): token bucket под лимиты площадки + предел параллельных
+  запросов; 429/Retry-After замораживает бакет хоста для всех вызывающих сразу;
+- ретраи только идемпотентных GET на сетевые ошибки и 429/5xx: экспонента с full jitter,
+  Retry-After уважается; повторы ограничены бюджетом хоста (доля от потока запросов), чтобы
+  при отказе площадки ретраи не умножали нагрузку;
+- circuit breaker: после HTTP_BREAKER_FAILURES отказов подряд хост «открыт» — вызовы сразу
+  получают CircuitOpenError; через HTTP_BREAKER_RESET_SEC пропускается одна пробная попытка;
+- single-flight: одинаковые одновременные GET (url + params + headers) уходят в сеть один раз;
+  ожидающий ждёт лидера не дольше своего timeout (на event loop — HTTP_LOOP_MAX_BLOCK_SEC);
+- на потоке с работающим event loop синхронный вызов не спит дольше HTTP_LOOP_MAX_BLOCK_SEC
+  на ожидание токенов и паузы ретраев — лучше вернуть 429/ошибку, чем заморозить бота;
+- фикстуры: HTTP_FIXTURES=record пишет ответы в HTTP_FIXTURES_DIR, replay отдаёт их без сети
+  (FixtureMissingError, если ответа нет) — офлайн-тесты клиентов.
+
+Ответ — HttpResponse с интерфейсом requests.Response (status_code, headers, json(), text,
+raise_for_status() → requests.HTTPError), ошибки — наследники requests.RequestException,
+так что существующие except в клиентах работают как раньше.
+
+    http = get_transport()
+    r = http.get(url, params={...}, headers={...}, timeout=10)
+    r = await http.aget(url, params={...})
+
+Метрики: alt_forecast_http_client_calls_total{host,outcome}; задержки — http_client_seconds
+(install_http_instrumentation патчит те же requests/aiohttp, через которые ходит транспорт).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+try:
+    import aiohttp
+except Exception:  # pragma: no cover
+    aiohttp = None  # type: ignore
+
+from ..utils.metrics import HTTP_CLIENT_CALLS
+
+log = logging.getLogger("alt_forecast.http")
+
+# "host=rate/burst/concurrency,..." — переопределяет и дополняет DEFAULT_HOST_LIMITS
+HTTP_HOST_LIMITS = os.getenv("HTTP_HOST_LIMITS", "")
+HTTP_MAX_ATTEMPTS = int(os.getenv("HTTP_MAX_ATTEMPTS", "3"))
+HTTP_BACKOFF_SEC = float(os.getenv("HTTP_BACKOFF_SEC", "0.5"))
+HTTP_BACKOFF_MAX_SEC = float(os.getenv("HTTP_BACKOFF_MAX_SEC", "10"))
+# на каждый запрос в бюджет ретраев хоста кладётся RATIO повтора, плюс MIN_PER_SEC в секунду
+HTTP_RETRY_BUDGET_RATIO = float(os.getenv("HTTP_RETRY_BUDGET_RATIO", "0.2"))
+HTTP_RETRY_MIN_PER_SEC = float(os.getenv("HTTP_RETRY_MIN_PER_SEC", "0.2"))
+HTTP_BREAKER_FAILURES = int(os.getenv("HTTP_BREAKER_FAILURES", "5"))
+HTTP_BREAKER_RESET_SEC = float(os.getenv("HTTP_BREAKER_RESET_SEC", "30"))
+HTTP_LOOP_MAX_BLOCK_SEC = float(os.getenv("HTTP_LOOP_MAX_BLOCK_SEC", "0.25"))
+HTTP_DEFAULT_TIMEOUT = float(os.getenv("HTTP_DEFAULT_TIMEOUT_SEC", "15"))
+HTTP_FIXTURES = os.getenv("HTTP_FIXTURES", "").strip().lower()       # "" | record | replay
+HTTP_FIXTURES_DIR = os.getenv("HTTP_FIXTURES_DIR", "tests/fixtures/http")
+
+USER_AGENT = "alt-forecast-bot/1.0"
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+IDEMPOTENT = frozenset({"GET", "HEAD", "OPTIONS"})
+
+__all__ = [
+    "HttpTransport", "HttpResponse", "HostPolicy", "TransportError", "CircuitOpenError",
+    "RateLimitedError", "FixtureMissingError", "get_transport",
+]
+
+
+class TransportError(requests.RequestException):
+    """Ошибка транспорта (не ответа сервера)."""
+
+
+class CircuitOpenError(TransportError):
+    """Хост временно отключён circuit breaker'ом."""
+
+
+class RateLimitedError(TransportError):
+    """Ожидание токена/паузы ретрая превысило допустимую блокировку (поток event loop)."""
+
+
+class FixtureMissingError(TransportError):
+    """HTTP_FIXTURES=replay, а записанного ответа на запрос нет."""
+
+
+@dataclass(frozen=True)
+class HostPolicy:
+    rate: float          # запросов в секунду в среднем
+    burst: float         # ёмкость бакета
+    concurrency: int     # одновременных запросов на хост
+
+
+DEFAULT_POLICY = HostPolicy(5.0, 10.0, 4)
+# по публичным лимитам площадок с запасом: Binance spot 6000 weight/min, fapi 2400/min,
+# eapi ~400/min; Deribit 20 rps для непривязанных; OKX 20 req/2s на эндпоинт;
+# CoinGlass/CoinGecko бесплатные тарифы — 30 req/min
+DEFAULT_HOST_LIMITS: Dict[str, HostPolicy] = {
+    "api.binance.com": HostPolicy(20.0, 40.0, 8),
+    "fapi.binance.com": HostPolicy(10.0, 20.0, 8),
+    "eapi.binance.com": HostPolicy(5.0, 10.0, 4),
+    "www.deribit.com": HostPolicy(10.0, 20.0, 4),
+    "www.okx.com": HostPolicy(8.0, 16.0, 4),
+    "api.bybit.com": HostPolicy(20.0, 40.0, 8),
+    "api.bytick.com": HostPolicy(20.0, 40.0, 8),
+    "api.bitget.com": HostPolicy(10.0, 20.0, 4),
+    "api.gateio.ws": HostPolicy(15.0, 30.0, 4),
+    "open-api.coinglass.com": HostPolicy(0.5, 5.0, 2),
+    "open-api-v4.coinglass.com": HostPolicy(0.5, 5.0, 2),
+    "api.coingecko.com": HostPolicy(0.5, 5.0, 2),
+    "pro-api.coingecko.com": HostPolicy(5.0, 10.0, 4),
+}
+
+
+def parse_host_limits(spec: str) -> Dict[str, HostPolicy]:
+    """'host=rate/burst/concurrency,...' → {host: HostPolicy}; burst и concurrency можно опустить."""
+    out: Dict[str, HostPolicy] = {}
+    for part in (spec or "").split(","):
+        host, _, val = part.strip().partition("=")
+        if not host or not val:
+            continue
+        try:
+            nums = [float(x) for x in val.split("/")]
+            rate = nums[0]
+            burst = nums[1] if len(nums) > 1 else max(1.0, 2 * rate)
+            conc = int(nums[2]) if len(nums) > 2 else DEFAULT_POLICY.concurrency
+            out[host.strip().lower()] = HostPolicy(rate, burst, max(1, conc))
+        except (ValueError, IndexError):
+            log.warning("HTTP_HOST_LIMITS: bad entry %r", part)
+    return out
+
+
+# ---------- ответ ----------
+
+class HttpResponse:
+    """Тело прочитано целиком; интерфейс — подмножество requests.Response, которым пользуются клиенты."""
+
+    __slots__ = ("status_code", "headers", "content", "url", "reason", "__weakref__")
+
+    def __init__(self, status_code: int, headers: Mapping[str, str], content: bytes, url: str, reason: str = ""):
+        self.status_code = int(status_code)
+        self.headers = CaseInsensitiveDict(headers or {})
+        self.content = content or b""
+        self.url = url
+        self.reason = reason
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self, **kwargs) -> Any:
+        return json.loads(self.content, **kwargs)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            kind = "Client" if self.status_code < 500 else "Server"
+            raise requests.HTTPError(f"{self.status_code} {kind} Error: {self.reason} for url: {self.url}",
+                                     response=self)
+
+    def __repr__(self) -> str:
+        return f"<HttpResponse [{self.status_code}]>"
+
+
+# ---------- политика хоста ----------
+
+class _Bucket:
+    """Token bucket с резервированием: take() списывает токен (в долг) и говорит, сколько ждать."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = max(1e-6, float(rate))
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self.held_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        if now > self.stamp:
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+
+    def take(self, cost: float = 1.0) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= cost
+            wait = max(0.0, -self.tokens / self.rate)
+            return max(wait, self.held_until - now)
+
+    def give_back(self, cost: float = 1.0) -> None:
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + cost)
+
+    def hold(self, seconds: float) -> None:
+        """Retry-After / 429: никто не шлёт на хост ещё seconds."""
+        with self._lock:
+            self.held_until = max(self.held_until, time.monotonic() + seconds)
+            self.tokens = min(self.tokens, 0.0)
+
+
+class _Gate:
+    """Предел одновременных запросов на хост, общий для потоков и корутин."""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, int(limit))
+        self.active = 0
+        self._cond = threading.Condition()
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            return False
+
+    def acquire(self, timeout: Optional[float]) -> bool:
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.active < self.limit, timeout):
+                return False
+            self.active += 1
+            return True
+
+    async def aacquire(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        delay = 0.005
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        return True
+
+    def release(self) -> None:
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+
+class CircuitBreaker:
+    """closed → open после failures отказов подряд → half-open через reset_sec (одна проба) → closed/open."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failures: int = HTTP_BREAKER_FAILURES, reset_sec: float = HTTP_BREAKER_RESET_SEC):
+        self.failures = max(1, int(failures))
+        self.reset_sec = float(reset_sec)
+        self.state = self.CLOSED
+        self.fails = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_sec:
+                self.state, self._probing = self.HALF_OPEN, False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                log.info("circuit closed")
+            self.state, self.fails, self._probing = self.CLOSED, 0, False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.fails += 1
+            if self.state == self.HALF_OPEN or self.fails >= self.failures:
+                self.state, self.opened_at, self._probing = self.OPEN, time.monotonic(), False
+
+    def abandon(self) -> None:
+        """Разрешённая попытка не состоялась (не дождались токена) — проба свободна."""
+        with self._lock:
+            self._probing = False
+
+
+class RetryBudget:
+    """Повторов не больше ratio от потока запросов (+ min_per_sec на редкие хосты)."""
+
+    def __init__(self, ratio: float = HTTP_RETRY_BUDGET_RATIO, min_per_sec: float = HTTP_RETRY_MIN_PER_SEC):
+        self.ratio = float(ratio)
+        self.min_per_sec = float(min_per_sec)
+        self.cap = max(10.0, 10.0 * self.min_per_sec)
+        self.balance = self.cap / 2
+        self.stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.balance = min(self.cap, self.balance + (now - self.stamp) * self.min_per_sec)
+        self.stamp = now
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._refill()
+            self.balance = min(self.cap, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self.balance < 1.0:
+                return False
+            self.balance -= 1.0
+            return True
+
+
+class _Host:
+    def __init__(self, name: str, policy: HostPolicy):
+        self.name = name
+        self.policy = policy
+        self.bucket = _Bucket(policy.rate, policy.burst)
+        self.gate = _Gate(policy.concurrency)
+        self.breaker = CircuitBreaker()
+        self.budget = RetryBudget()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(policy.concurrency, 2), max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = USER_AGENT
+
+
+class _Attempts:
+    """Решения одного вызова (breaker, токены, повторы, предел блокировки) — общие для sync и async."""
+
+    def __init__(self, host: _Host, method: str, weight: float, attempts: int, max_block: float):
+        self.host = host
+        self.retryable = method in IDEMPOTENT
+        self.weight = weight
+        self.attempts = max(1, attempts)
+        self.max_block = max_block
+        self.n = 0
+        self.blocked = 0.0
+        host.budget.deposit()
+
+    def _spend(self, wait: float) -> bool:
+        if self.blocked + wait > self.max_block:
+            return False
+        self.blocked += wait
+        return True
+
+    def before_send(self) -> float:
+        """Пауза до отправки; CircuitOpenError / RateLimitedError — не отправлять."""
+        h = self.host
+        if not h.breaker.allow():
+            HTTP_CLIENT_CALLS.inc(host=h.name, outcome="circuit_open")
+            raise CircuitOpenError(f"circuit open for {h.name}")
+        wait = h.bucket.take(self.weight)
+        if not self._spend(wait):
+            h.bucket.give_back(self.weight)
+            h.breaker.abandon()
+            HTTP_CLIENT_CALLS.inc(host=h.name, outcome="rate_limited")
+            raise RateLimitedError(f"{h.name}: would block {wait:.2f}s on the event loop thread")
+        self.n += 1
+        return wait
+
+    def after(self, resp: Optional[HttpResponse], error: Optional[BaseException]) -> Optional[float]:
+        """None — вернуть resp / поднять error; число — пауза перед повтором."""
+        h = self.host
+        if resp is not None and resp.status_code not in RETRY_STATUSES:
+            h.breaker.success()
+            HTTP_CLIENT_CALLS.inc(host=h.name, outcome="ok" if resp.ok else "http_error")
+            return None
+        h.breaker.failure()
+        retry_after = _retry_after(resp) if resp is not None else None
+        if retry_after is not None and resp.status_code == 429:
+            h.bucket.hold(retry_after)
+        delay = retry_after if retry_after is not None else _backoff(self.n)
+        if (not self.retryable or self.n >= self.attempts or not self._spend(delay)
+                or not h.budget.withdraw()):
+            HTTP_CLIENT_CALLS.inc(host=h.name, outcome="failed")
+            return None
+        HTTP_CLIENT_CALLS.inc(host=h.name, outcome="retry")
+        log.debug("%s: retry %d in %.2fs (%s)", h.name, self.n, delay,
+                  resp.status_code if resp is not None else type(error).__name__)
+        return delay
+
+
+def _backoff(attempt: int) -> float:
+    """Экспонента с full jitter."""
+    return random.uniform(0.0, min(HTTP_BACKOFF_MAX_SEC, HTTP_BACKOFF_SEC * (2 ** max(0, attempt - 1))))
+
+
+def _retry_after(resp: HttpResponse) -> Optional[float]:
+    raw = resp.headers.get("Retry-After")
+    if not raw:
+        return None
+    try:
+        sec = float(raw)
+    except ValueError:
+        try:
+            sec = parsedate_to_datetime(raw).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(0.0, sec), HTTP_BACKOFF_MAX_SEC * 6)
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def _full_url(url: str, params: Optional[Mapping[str, Any]]) -> str:
+    if not params:
+        return url
+    items = sorted((str(k), "" if v is None else str(v)) for k, v in params.items())
+    return url + ("&" if "?" in url else "?") + urlencode(items)
+
+
+# ---------- фикстуры ----------
+
+class _Fixtures:
+    """Ответы на диске: <root>/<host>/<sha1(method url+params body)>.json."""
+
+    def __init__(self, mode: str, root: str):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"unknown fixtures mode: {mode!r}")
+        self.mode = mode
+        self.root = Path(root)
+
+    def path(self, method: str, full_url: str, body: Optional[bytes]) -> Path:
+        h = hashlib.sha1(f"{method} {full_url}".encode())
+        if body:
+            h.update(b"\n" + body)
+        return self.root / (urlsplit(full_url).hostname or "_") / f"{h.hexdigest()[:20]}.json"
+
+    def load(self, method: str, full_url: str, body: Optional[bytes]) -> HttpResponse:
+        p = self.path(method, full_url, body)
+        if not p.exists():
+            raise FixtureMissingError(f"no fixture for {method} {full_url} ({p})")
+        d = json.loads(p.read_text(encoding="utf-8"))
+        content = base64.b64decode(d["body_b64"]) if "body_b64" in d else d.get("body", "").encode("utf-8")
+        return HttpResponse(d["status"], d.get("headers") or {}, content, d.get("url", full_url))
+
+    def save(self, method: str, full_url: str, body: Optional[bytes], resp: HttpResponse) -> None:
+        p = self.path(method, full_url, body)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        d: Dict[str, Any] = {"method": method, "url": full_url, "status": resp.status_code,
+                             "headers": {k: v for k, v in resp.headers.items() if k.lower() in ("content-type", "retry-after")}}
+        try:
+            d["body"] = resp.content.decode("utf-8")
+        except UnicodeDecodeError:
+            d["body_b64"] = base64.b64encode(resp.content).decode("ascii")
+        tmp = p.with_suffix(".tmp")
+        tmp.write_text(json.dumps(d, ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, p)
+
+
+# ---------- транспорт ----------
+
+class _Flight:
+    __slots__ = ("done", "resp", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.resp: Optional[HttpResponse] = None
+        self.error: Optional[BaseException] = None
+
+
+class HttpTransport:
+    def __init__(self, host_limits: Optional[Mapping[str, HostPolicy]] = None,
+                 max_attempts: int = HTTP_MAX_ATTEMPTS, loop_max_block: float = HTTP_LOOP_MAX_BLOCK_SEC,
+                 fixtures: str = HTTP_FIXTURES, fixtures_dir: str = HTTP_FIXTURES_DIR):
+        limits = dict(DEFAULT_HOST_LIMITS)
+        limits.update(parse_host_limits(HTTP_HOST_LIMITS) if host_limits is None else host_limits)
+        self.limits = limits
+        self.max_attempts = max_attempts
+        self.loop_max_block = loop_max_block
+        self._fixtures = _Fixtures(fixtures, fixtures_dir) if fixtures else None
+        self._hosts: Dict[str, _Host] = {}
+        self._lock = threading.Lock()
+        self._flights: Dict[Tuple, _Flight] = {}
+        self._aflights: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, asyncio.Future]]" = \
+            weakref.WeakKeyDictionary()
+        self._asessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+    # ---- служебное ----
+
+    def _host(self, url: str) -> _Host:
+        name = (urlsplit(url).hostname or "").lower()
+        h = self._hosts.get(name)
+        if h is None:
+            with self._lock:
+                h = self._hosts.get(name)
+                if h is None:
+                    h = self._hosts[name] = _Host(name, self.limits.get(name, DEFAULT_POLICY))
+        return h
+
+    @contextmanager
+    def fixtures(self, mode: str, root: str):
+        """Запись/воспроизведение ответов на время блока (тесты)."""
+        prev, self._fixtures = self._fixtures, _Fixtures(mode, root)
+        try:
+            yield self
+        finally:
+            self._fixtures = prev
+
+    @staticmethod
+    def _body(data: Any, json_body: Any) -> Optional[bytes]:
+        if json_body is not None:
+            return json.dumps(json_body, sort_keys=True).encode()
+        if isinstance(data, (bytes, bytearray)):
+            return bytes(data)
+        if isinstance(data, str):
+            return data.encode()
+        if isinstance(data, Mapping):
+            return urlencode(sorted(data.items())).encode()
+        return None
+
+    @staticmethod
+    def _flight_key(method: str, full_url: str, headers: Optional[Mapping[str, str]]) -> Optional[Tuple]:
+        if method != "GET":
+            return None
+        return full_url, tuple(sorted((k.lower(), str(v)) for k, v in (headers or {}).items()))
+
+    # ---- sync ----
+
+    def get(self, url: str, params: Optional[Mapping[str, Any]] = None, **kwargs) -> HttpResponse:
+        return self.request("GET", url, params=params, **kwargs)
+
+    def request(self, method: str, url: str, *, params: Optional[Mapping[str, Any]] = None,
+                headers: Optional[Mapping[str, str]] = None, data: Any = None, json: Any = None,
+                timeout: Optional[float] = None, retries: Optional[int] = None, weight: float = 1.0) -> HttpResponse:
+        """Синхронный запрос через пул хоста; retries — число попыток (по умолчанию HTTP_MAX_ATTEMPTS)."""
+        method = method.upper()
+        full_url = _full_url(url, params)
+        body = self._body(data, json)
+        fx = self._fixtures
+        if fx is not None and fx.mode == "replay":
+            return fx.load(method, full_url, body)
+
+        key = self._flight_key(method, full_url, headers)
+        if key is None:
+            return self._send_sync(method, url, params, headers, data, json, timeout, retries, weight, body)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            host = urlsplit(url).hostname or ""
+            HTTP_CLIENT_CALLS.inc(host=host, outcome="coalesced")
+            # ждём лидера не дольше, чем ждал бы сам вызов: на event loop — loop_max_block, иначе — timeout
+            on_loop = _on_event_loop()
+            limit = min(self.loop_max_block if on_loop else float("inf"),
+                        HTTP_DEFAULT_TIMEOUT if timeout is None else timeout)
+            if flight.done.wait(limit):
+                if flight.error is not None:
+                    raise flight.error
+                return flight.resp
+            if on_loop:
+                HTTP_CLIENT_CALLS.inc(host=host, outcome="rate_limited")
+                raise RateLimitedError(f"{host}: identical request in flight longer than {limit:.2f}s")
+            # лидер застрял в ретраях — идём в сеть сами
+            return self._send_sync(method, url, params, headers, data, json, timeout, retries, weight, body)
+        try:
+            flight.resp = self._send_sync(method, url, params, headers, data, json, timeout, retries, weight, body)
+            return flight.resp
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _send_sync(self, method, url, params, headers, data, json_body, timeout, retries, weight, body):
+        h = self._host(url)
+        timeout = HTTP_DEFAULT_TIMEOUT if timeout is None else timeout
+        max_block = self.loop_max_block if _on_event_loop() else float("inf")
+        plan = _Attempts(h, method, weight, self.max_attempts if retries is None else retries, max_block)
+        while True:
+            wait = plan.before_send()
+            if wait > 0:
+                time.sleep(wait)
+            if not h.gate.acquire(timeout=min(max_block, timeout)):
+                h.breaker.abandon()
+                HTTP_CLIENT_CALLS.inc(host=h.name, outcome="rate_limited")
+                raise RateLimitedError(f"{h.name}: all {h.gate.limit} connection slots busy")
+            resp, error = None, None
+            try:
+                r = h.session.request(method, url, params=params, headers=headers, data=data, json=json_body,
+                                      timeout=timeout)
+                resp = HttpResponse(r.status_code, r.headers, r.content, r.url, r.reason or "")
+            except requests.RequestException as e:
+                error = e
+            finally:
+                h.gate.release()
+            delay = plan.after(resp, error)
+            if delay is None:
+                break
+            time.sleep(delay)
+        if resp is None:
+            raise error
+        fx = self._fixtures
+        if fx is not None and fx.mode == "record":
+            fx.save(method, _full_url(url, params), body, resp)
+        return resp
+
+    # ---- async ----
+
+    async def aget(self, url: str, params: Optional[Mapping[str, Any]] = None, **kwargs) -> HttpResponse:
+        return await self.arequest("GET", url, params=params, **kwargs)
+
+    async def arequest(self, method: str, url: str, *, params: Optional[Mapping[str, Any]] = None,
+                       headers: Optional[Mapping[str, str]] = None, data: Any = None, json: Any = None,
+                       timeout: Optional[float] = None, retries: Optional[int] = None,
+                       weight: float = 1.0) -> HttpResponse:
+        """То же для корутин: aiohttp-сессия на event loop, паузы — asyncio.sleep."""
+        method = method.upper()
+        full_url = _full_url(url, params)
+        body = self._body(data, json)
+        fx = self._fixtures
+        if fx is not None and fx.mode == "replay":
+            return fx.load(method, full_url, body)
+        if aiohttp is None:
+            return await asyncio.to_thread(self.request, method, url, params=params, headers=headers, data=data,
+                                           json=json, timeout=timeout, retries=retries, weight=weight)
+
+        loop = asyncio.get_running_loop()
+        key = self._flight_key(method, full_url, headers)
+        flights = self._aflights.setdefault(loop, {})
+        if key is not None and key in flights:
+            HTTP_CLIENT_CALLS.inc(host=urlsplit(url).hostname or "", outcome="coalesced")
+            return await asyncio.shield(flights[key])
+        fut = None
+        if key is not None:
+            fut = flights[key] = loop.create_future()
+        try:
+            resp = await self._send_async(method, url, params, headers, data, json, timeout, retries, weight, body)
+        except BaseException as e:
+            if fut is not None:
+                fut.set_exception(e)
+                fut.exception()          # ведомых может не быть — не ругаться «exception never retrieved»
+            raise
+        else:
+            if fut is not None:
+                fut.set_result(resp)
+            return resp
+        finally:
+            if key is not None:
+                flights.pop(key, None)
+
+    def _asession(self, loop) -> Any:
+        s = self._asessions.get(loop)
+        if s is None or s.closed:
+            s = aiohttp.ClientSession(headers={"User-Agent": USER_AGENT},
+                                      connector=aiohttp.TCPConnector(limit=0, ttl_dns_cache=300))
+            self._asessions[loop] = s
+        return s
+
+    async def _send_async(self, method, url, params, headers, data, json_body, timeout, retries, weight, body):
+        h = self._host(url)
+        timeout = HTTP_DEFAULT_TIMEOUT if timeout is None else timeout
+        plan = _Attempts(h, method, weight, self.max_attempts if retries is None else retries, float("inf"))
+        session = self._asession(asyncio.get_running_loop())
+        q = [(str(k), "" if v is None else str(v)) for k, v in (params or {}).items()]
+        while True:
+            wait = plan.before_send()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if not await h.gate.aacquire(timeout):
+                h.breaker.abandon()
+                HTTP_CLIENT_CALLS.inc(host=h.name, outcome="rate_limited")
+                raise RateLimitedError(f"{h.name}: all {h.gate.limit} connection slots busy")
+            resp, error = None, None
+            try:
+                async with session.request(method, url, params=q or None, headers=headers, data=data,
+                                           json=json_body, timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+                    content = await r.read()
+                    resp = HttpResponse(r.status, r.headers, content, str(r.url), r.reason or "")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = TransportError(f"{type(e).__name__}: {e}")
+            finally:
+                h.gate.release()
+            delay = plan.after(resp, error)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+        if resp is None:
+            raise error
+        fx = self._fixtures
+        if fx is not None and fx.mode == "record":
+            fx.save(method, _full_url(url, params), body, resp)
+        return resp
+
+    async def aclose(self) -> None:
+        """Закрывает aiohttp-сессию текущего event loop (при остановке приложения)."""
+        s = self._asessions.pop(asyncio.get_running_loop(), None)
+        if s is not None and not s.closed:
+            await s.close()
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: {"state": h.breaker.state, "fails": h.breaker.fails, "active": h.gate.active,
+                       "tokens": round(h.bucket.tokens, 2), "retry_budget": round(h.budget.balance, 2),
+                       "rate": h.policy.rate, "concurrency": h.policy.concurrency}
+                for name, h in list(self._hosts.items())}
+
+
+_transport: Optional[HttpTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HttpTransport:
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = HttpTransport()
+    return _transport
@@ -19,7 +19,7 @@ try:
 except ImportError:
     BeautifulSoup = None  # type: ignore
 
-from urllib.request import urlopen, Request
+from .http_transport import get_transport
 
 _FNG_URL         = "https://api.alternative.me/fng/"
 _FNG_WIDGET_PNG  = "https://alternative.me/crypto/fear-and-greed-index.png"
@@ -56,7 +56,7 @@ def _to_ts(value) -> Optional[int]:
 
 class IndicesService:
     """
-    HTTP-запросы через aiohttp (если установлен) или stdlib (urllib).
+    HTTP-запросы через переданную aiohttp-сессию или общий транспорт (http_transport).
     Кэш:
       - общий TTL (self._ttl) = 30 мин
       - тикер — 5 мин
@@ -83,21 +83,13 @@ class IndicesService:
 
     # ---------- HTTP ----------
     async def _get_text(self, url: str) -> str:
-        if aiohttp:
-            if self._session is not None:
-                async with self._session.get(url, timeout=15) as r:
-                    r.raise_for_status()
-                    return await r.text()
-            async with aiohttp.ClientSession() as s:
-                async with s.get(url, timeout=15) as r:
-                    r.raise_for_status()
-                    return await r.text()
-        # fallback stdlib (в отдельном потоке)
-        def _sync_get() -> str:
-            req = Request(url, headers={"User-Agent": "Mozilla/5.0"})
-            with urlopen(req, timeout=15) as resp:
-                return resp.read().decode("utf-8", errors="ignore")
-        return await asyncio.to_thread(_sync_get)
+        if self._session is not None:
+            async with self._session.get(url, timeout=15) as r:
+                r.raise_for_status()
+                return await r.text()
+        r = await get_transport().aget(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=15)
+        r.raise_for_status()
+        return r.text
 
     async def _get_json(self, url: str) -> Any:
         txt = await self._get_text(url)
@@ -0,0 +1,316 @@
+# app/infrastructure/job_runtime.py
+"""
+Исполнение фоновых задач PTB JobQueue вне event loop бота.
+
+Каждая задача объявляет свой характер (JobSpec.kind):
+- "async" — корутина на event loop (отправка сообщений, aiohttp); отменяется по таймауту;
+- "io"    — синхронная функция (requests, SQLite) в пуле потоков; DB.conn у каждого потока своё,
+            транзакции задач не пересекаются;
+- "cpu"   — синхронная функция уровня модуля в пуле процессов (spawn); аргументы — из JobSpec.args(context),
+            должны сериализоваться. По таймауту процессы пула убиваются и пул пересоздаётся.
+
+Результат io/cpu-задачи можно доставить обратно на loop через JobSpec.on_result(context, result)
+(например, разослать подписчикам). Дополнительно runtime:
+- не запускает задачу, пока не завершились её прошлые запуски сверх бюджета concurrency (1 = skip-if-running);
+- размазывает старт (first / время run_daily) случайным сдвигом до jitter секунд;
+- ограничивает время выполнения max_runtime;
+- пишет длительность и исход (ok / error / timeout / skipped) в метрики и get_stats().
+
+    rt = get_job_runtime()
+    rt.schedule(jq, JobSpec("collect_trades", collect_trades, kind=KIND_IO, interval=3600, first=300, max_runtime=600))
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from datetime import date, datetime, time as dtime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from ..utils.metrics import JOB_ERRORS, JOB_RUNNING, JOB_RUNS, JOB_SECONDS
+
+log = logging.getLogger("alt_forecast.jobs")
+
+KIND_ASYNC = "async"
+KIND_IO = "io"
+KIND_CPU = "cpu"
+KINDS = (KIND_ASYNC, KIND_IO, KIND_CPU)
+
+OUTCOME_OK = "ok"
+OUTCOME_ERROR = "error"
+OUTCOME_TIMEOUT = "timeout"
+OUTCOME_SKIPPED = "skipped"
+
+# 0 процессов = cpu-задачи идут в пул потоков (dev/тесты)
+JOB_PROCESS_WORKERS = int(os.getenv("JOB_PROCESS_WORKERS", "1"))
+JOB_THREAD_WORKERS = int(os.getenv("JOB_THREAD_WORKERS", "4"))
+# случайный сдвиг старта по умолчанию, чтобы задачи с одинаковым first не стартовали в одну секунду
+JOB_JITTER_SEC = float(os.getenv("JOB_JITTER_SEC", "30"))
+# потолок времени выполнения по умолчанию (0 = без ограничения)
+JOB_MAX_RUNTIME_SEC = float(os.getenv("JOB_MAX_RUNTIME_SEC", "900"))
+
+
+@dataclass(frozen=True)
+class JobSpec:
+    """
+    Описание фоновой задачи.
+
+    fn:        async def fn(context) | def fn(context) (io) | def fn(*args) (cpu)
+    args:      context → аргументы fn (для io по умолчанию (context,), для cpu — ())
+    on_result: async def(context, result) — выполняется на loop после io/cpu-части
+    interval / daily_at — расписание (run_repeating / run_daily)
+    """
+    name: str
+    fn: Callable[..., Any]
+    kind: str = KIND_ASYNC
+    interval: Optional[float] = None
+    daily_at: Optional[dtime] = None
+    first: float = 0.0
+    jitter: float = JOB_JITTER_SEC
+    max_runtime: float = JOB_MAX_RUNTIME_SEC
+    concurrency: int = 1
+    args: Optional[Callable[[Any], Tuple]] = None
+    on_result: Optional[Callable[[Any, Any], Awaitable[None]]] = None
+
+    def __post_init__(self):
+        if self.kind not in KINDS:
+            raise ValueError(f"job {self.name}: неизвестный kind={self.kind!r}")
+        if self.kind == KIND_ASYNC and not asyncio.iscoroutinefunction(self.fn):
+            raise ValueError(f"job {self.name}: kind=async требует корутину")
+        if self.kind != KIND_ASYNC and asyncio.iscoroutinefunction(self.fn):
+            raise ValueError(f"job {self.name}: kind={self.kind} требует синхронную функцию")
+
+
+@dataclass
+class JobState:
+    running: int = 0
+    runs: int = 0
+    ok: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    skipped: int = 0
+    total_sec: float = 0.0
+    max_sec: float = 0.0
+    last_sec: float = 0.0
+    last_outcome: str = ""
+    last_error: str = ""
+    last_started: float = 0.0
+    outcomes: Dict[str, int] = field(default_factory=dict)
+
+
+class JobRuntime:
+    """Общие пулы + учёт запусков для всех задач процесса."""
+
+    def __init__(self, process_workers: int = JOB_PROCESS_WORKERS, thread_workers: int = JOB_THREAD_WORKERS):
+        self.process_workers = max(0, int(process_workers))
+        self.thread_workers = max(1, int(thread_workers))
+        self._specs: Dict[str, JobSpec] = {}
+        self._state: Dict[str, JobState] = {}
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._procs: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    # ---- пулы ----
+
+    def _get_threads(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.thread_workers, thread_name_prefix="job")
+            return self._threads
+
+    def _get_procs(self) -> Optional[ProcessPoolExecutor]:
+        if self.process_workers <= 0:
+            return None
+        with self._pool_lock:
+            if self._procs is None:
+                # spawn: процесс бота многопоточный, fork небезопасен (как в render_service)
+                self._procs = ProcessPoolExecutor(
+                    max_workers=self.process_workers, mp_context=multiprocessing.get_context("spawn"))
+                log.info("job process pool started: workers=%d", self.process_workers)
+            return self._procs
+
+    def _kill_procs(self) -> None:
+        """Жёсткая отмена cpu-задач: убиваем процессы пула, следующий запуск поднимет новый."""
+        with self._pool_lock:
+            pool, self._procs = self._procs, None
+        if pool is None:
+            return
+        for p in list((getattr(pool, "_processes", None) or {}).values()):
+            try:
+                p.terminate()
+            except Exception:
+                pass
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        self._kill_procs()
+        with self._pool_lock:
+            threads, self._threads = self._threads, None
+        if threads is not None:
+            threads.shutdown(wait=False, cancel_futures=True)
+
+    # ---- регистрация ----
+
+    def add(self, spec: JobSpec) -> JobSpec:
+        if spec.name in self._specs:
+            raise ValueError(f"job {spec.name} уже зарегистрирована")
+        self._specs[spec.name] = spec
+        self._state[spec.name] = JobState()
+        JOB_RUNNING.set_function(lambda n=spec.name: self._state[n].running, job=spec.name)
+        return spec
+
+    def callback(self, spec: JobSpec) -> Callable[[Any], Awaitable[None]]:
+        """Callback для JobQueue."""
+        async def _job(context) -> None:
+            await self.run(spec.name, context)
+        _job.__name__ = spec.name
+        return _job
+
+    def schedule(self, job_queue, spec: JobSpec):
+        """Регистрирует задачу в runtime и в PTB JobQueue (run_repeating / run_daily) со сдвигом старта."""
+        self.add(spec)
+        shift = random.uniform(0.0, spec.jitter) if spec.jitter > 0 else 0.0
+        cb = self.callback(spec)
+        if spec.daily_at is not None:
+            at = spec.daily_at
+            moved = (datetime.combine(date(2000, 1, 1), at) + timedelta(seconds=shift)).time()
+            return job_queue.run_daily(cb, time=moved.replace(tzinfo=at.tzinfo), name=spec.name)
+        if spec.interval is None:
+            raise ValueError(f"job {spec.name}: нужен interval или daily_at")
+        return job_queue.run_repeating(cb, interval=spec.interval, first=spec.first + shift, name=spec.name)
+
+    # ---- выполнение ----
+
+    async def run(self, name: str, context: Any = None) -> str:
+        """Один запуск задачи с учётом бюджета, таймаута и метрик. Возвращает исход."""
+        spec, st = self._specs[name], self._state[name]
+        if st.running >= max(1, spec.concurrency):
+            st.skipped += 1
+            st.outcomes[OUTCOME_SKIPPED] = st.outcomes.get(OUTCOME_SKIPPED, 0) + 1
+            JOB_RUNS.inc(job=name, outcome=OUTCOME_SKIPPED)
+            log.warning("job %s: previous run still in progress (%d), skipped", name, st.running)
+            return OUTCOME_SKIPPED
+
+        st.running += 1
+        st.last_started = time.time()
+        t0 = time.perf_counter()
+        outcome, release = OUTCOME_OK, True
+        try:
+            result, release = await self._execute(spec, context)
+            if spec.on_result is not None:
+                await spec.on_result(context, result)
+        except asyncio.TimeoutError:
+            outcome = OUTCOME_TIMEOUT
+            st.last_error = f"timeout after {spec.max_runtime:g}s"
+            log.error("job %s: exceeded max_runtime=%gs, cancelled", name, spec.max_runtime)
+        except _StillRunning:
+            # io-поток нельзя прервать: слот освободится, когда поток вернётся
+            outcome, release = OUTCOME_TIMEOUT, False
+            st.last_error = f"timeout after {spec.max_runtime:g}s (thread still running)"
+            log.error("job %s: exceeded max_runtime=%gs, thread keeps the slot until it returns", name, spec.max_runtime)
+        except Exception as e:
+            outcome = OUTCOME_ERROR
+            st.last_error = f"{type(e).__name__}: {e}"
+            log.exception("job %s: FAIL", name)
+        finally:
+            dt = time.perf_counter() - t0
+            if release:
+                st.running -= 1
+            st.runs += 1
+            st.total_sec += dt
+            st.last_sec = dt
+            st.max_sec = max(st.max_sec, dt)
+            st.last_outcome = outcome
+            st.outcomes[outcome] = st.outcomes.get(outcome, 0) + 1
+            if outcome == OUTCOME_OK:
+                st.ok += 1
+            elif outcome == OUTCOME_TIMEOUT:
+                st.timeouts += 1
+            else:
+                st.errors += 1
+            JOB_SECONDS.observe(dt, job=name)
+            JOB_RUNS.inc(job=name, outcome=outcome)
+            if outcome != OUTCOME_OK:
+                JOB_ERRORS.inc(job=name)
+        return outcome
+
+    async def _execute(self, spec: JobSpec, context: Any) -> Tuple[Any, bool]:
+        """(результат, слот_можно_освободить)."""
+        timeout = spec.max_runtime if spec.max_runtime and spec.max_runtime > 0 else None
+        if spec.kind == KIND_ASYNC:
+            return await asyncio.wait_for(spec.fn(context), timeout), True
+
+        args = spec.args(context) if spec.args is not None else ((context,) if spec.kind == KIND_IO else ())
+        procs = self._get_procs() if spec.kind == KIND_CPU else None
+        if procs is not None:
+            try:
+                fut: Future = procs.submit(spec.fn, *args)
+            except BrokenProcessPool:
+                self._kill_procs()
+                fut = self._get_procs().submit(spec.fn, *args)
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(fut), timeout), True
+            except asyncio.TimeoutError:
+                self._kill_procs()
+                raise
+
+        fut = self._get_threads().submit(spec.fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(fut)), timeout), True
+        except asyncio.TimeoutError:
+            if fut.done():
+                raise
+            loop = asyncio.get_running_loop()
+            fut.add_done_callback(lambda _f, n=spec.name: loop.call_soon_threadsafe(self._release, n))
+            raise _StillRunning() from None
+
+    def _release(self, name: str) -> None:
+        self._state[name].running -= 1
+
+    # ---- статистика ----
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        out = {}
+        for name, st in self._state.items():
+            spec = self._specs[name]
+            done = st.runs
+            out[name] = {
+                "kind": spec.kind, "running": st.running, "runs": done, "ok": st.ok, "errors": st.errors,
+                "timeouts": st.timeouts, "skipped": st.skipped,
+                "avg_sec": round(st.total_sec / done, 3) if done else 0.0,
+                "max_sec": round(st.max_sec, 3), "last_sec": round(st.last_sec, 3),
+                "last_outcome": st.last_outcome, "last_error": st.last_error,
+            }
+        return out
+
+    def format_stats(self) -> str:
+        """Текст для админа (HTML)."""
+        lines = ["<b>Фоновые задачи</b>", "<pre>"]
+        lines.append(f"{'job':<28} {'kind':<5} {'runs':>5} {'err':>4} {'t/o':>4} {'skip':>4} {'avg,s':>7} {'max,s':>7}")
+        for name, s in sorted(self.get_stats().items()):
+            lines.append(f"{name[:28]:<28} {s['kind']:<5} {s['runs']:>5} {s['errors']:>4} {s['timeouts']:>4} "
+                         f"{s['skipped']:>4} {s['avg_sec']:>7.2f} {s['max_sec']:>7.2f}")
+        lines.append("</pre>")
+        return "\n".join(lines)
+
+
+class _StillRunning(Exception):
+    """Таймаут io-задачи, поток которой ещё работает."""
+
+
+_runtime: Optional[JobRuntime] = None
+
+
+def get_job_runtime() -> JobRuntime:
+    global _runtime
+    if _runtime is None:
+        _runtime = JobRuntime()
+    return _runtime
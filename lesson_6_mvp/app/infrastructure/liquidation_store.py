@@ -0,0 +1,156 @@
+# app/infrastructure/liquidation_store.py
+"""
+Локальный журнал ликвидаций по биржам для карты и метрик /liqs.
+
+Раньше каждый запрос карты заново тянул Bybit и OKX, группировал события словарями по
+округлённой цене, а слияние бирж и HHI/скорость/long-short пересчитывались отдельными
+проходами по спискам уровней; истории не оставалось. Здесь сырые события пишутся в
+liq_events (дубликаты из перекрывающихся окон отсекает первичный ключ), окно читается
+колонками и считается domain.liquidation_clusters.analyze за один проход.
+
+    store = get_liquidation_store(db)
+    store.collect("BTC")                                   # Bybit + OKX → журнал (не чаще LIQ_COLLECT_MIN_SEC)
+    st = store.analyze("BTC", hours=48, ref_price=px)      # кластеры, HHI, скорость, long/short
+    series = store.rolling("BTC", window_h=1, step_h=1, span_h=24)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+
+from ..domain.liquidation_clusters import LiquidationEvents, LiquidationStats, analyze, rolling
+from .db import DB
+
+log = logging.getLogger("alt_forecast.liquidation_store")
+
+LIQ_LOG_SYMBOLS = tuple(s.strip().upper() for s in os.getenv("LIQ_LOG_SYMBOLS", "BTC,ETH").split(",") if s.strip())
+LIQ_LOG_VENUES = tuple(s.strip().lower() for s in os.getenv("LIQ_LOG_VENUES", "bybit,okx").split(",") if s.strip())
+LIQ_COLLECT_SEC = int(os.getenv("LIQ_COLLECT_SEC", "900"))
+# повторный collect() по символу раньше этого — из журнала, без запросов к биржам
+LIQ_COLLECT_MIN_SEC = int(os.getenv("LIQ_COLLECT_MIN_SEC", "120"))
+LIQ_RETENTION_DAYS = float(os.getenv("LIQ_RETENTION_DAYS", "14"))
+
+HOUR_MS = 3_600_000
+
+
+def _base(symbol: str) -> str:
+    s = symbol.upper()
+    for suf in ("-USDT-SWAP", "USDT"):
+        if s.endswith(suf) and len(s) > len(suf):
+            return s[:-len(suf)]
+    return s
+
+
+class LiquidationStore:
+    def __init__(self, db: DB, retention_days: float = LIQ_RETENTION_DAYS, collect_min_sec: int = LIQ_COLLECT_MIN_SEC):
+        self.db = db
+        self.retention_days = retention_days
+        self.collect_min_sec = collect_min_sec
+        self._lock = threading.Lock()
+        self._collected: Dict[str, float] = {}
+        db.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS liq_events (
+                symbol TEXT NOT NULL,         -- базовый актив: BTC, ETH
+                ts INTEGER NOT NULL,
+                venue TEXT NOT NULL,
+                is_long INTEGER NOT NULL,
+                price REAL NOT NULL,
+                usd REAL NOT NULL,
+                PRIMARY KEY (symbol, ts, venue, is_long, price, usd)
+            ) WITHOUT ROWID;
+            """)
+
+    # ---- запись ----
+
+    def insert(self, symbol: str, ev: LiquidationEvents) -> int:
+        """Пишет события; уже известные пропускаются. Возвращает число новых строк."""
+        if not len(ev):
+            return 0
+        sym = _base(symbol)
+        venues = np.array(ev.venues, dtype=object)[ev.venue]
+        rows = zip([sym] * len(ev), ev.ts.tolist(), venues.tolist(), ev.is_long.astype(int).tolist(),
+                   ev.price.tolist(), ev.usd.tolist())
+        with self._lock, self.db.atomic():
+            before = self.db.conn.total_changes
+            self.db.conn.executemany(
+                "INSERT OR IGNORE INTO liq_events(symbol, ts, venue, is_long, price, usd) VALUES(?,?,?,?,?,?)", rows)
+            return self.db.conn.total_changes - before
+
+    def collect(self, symbol: str, venues: Sequence[str] = LIQ_LOG_VENUES, hours: int = 48,
+                now: Optional[float] = None, force: bool = False) -> int:
+        """Тянет события с бирж в журнал; чаще collect_min_sec на символ не ходит."""
+        from .free_market_data import fetch_liquidation_events
+        sym = _base(symbol)
+        now = time.time() if now is None else now
+        with self._lock:
+            last = self._collected.get(sym)
+            if not force and last is not None and now - last < self.collect_min_sec:
+                return 0
+            self._collected[sym] = now
+        ev = fetch_liquidation_events(sym, venues, hours)
+        added = self.insert(sym, ev)
+        log.debug("liq log %s: %d fetched, %d new", sym, len(ev), added)
+        return added
+
+    def retain(self, now_ms: Optional[int] = None) -> int:
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        cutoff = now_ms - int(self.retention_days * 86_400_000)
+        with self._lock, self.db.atomic():
+            return self.db.conn.execute("DELETE FROM liq_events WHERE ts < ?", (cutoff,)).rowcount
+
+    # ---- чтение ----
+
+    def load(self, symbol: str, since_ms: int = 0, until_ms: Optional[int] = None,
+             venues: Optional[Iterable[str]] = None) -> LiquidationEvents:
+        """Окно журнала колонками (по возрастанию ts)."""
+        sql = "SELECT ts, venue, is_long, price, usd FROM liq_events WHERE symbol=? AND ts>=?"
+        args: list = [_base(symbol), int(since_ms)]
+        if until_ms is not None:
+            sql += " AND ts<=?"
+            args.append(int(until_ms))
+        if venues:
+            vs = [v.lower() for v in venues]
+            sql += f" AND venue IN ({','.join('?' * len(vs))})"
+            args += vs
+        rows = self.db.conn.execute(sql + " ORDER BY ts", args).fetchall()
+        if not rows:
+            return LiquidationEvents.empty()
+        ts, venue, is_long, price, usd = zip(*rows)
+        names, codes = np.unique(np.array(venue, dtype=object), return_inverse=True)
+        return LiquidationEvents([str(v) for v in names], np.array(ts, dtype=np.int64), codes,
+                                 np.array(is_long, dtype=bool), np.array(price, dtype=float),
+                                 np.array(usd, dtype=float))
+
+    def analyze(self, symbol: str, hours: float = 48, now_ms: Optional[int] = None, **kw) -> LiquidationStats:
+        """Кластеры и метрики за последние hours часов журнала; kw — параметры domain analyze."""
+        now_ms = int(time.time() * 1000) if now_ms is None else int(now_ms)
+        ev = self.load(symbol, now_ms - int(hours * HOUR_MS), now_ms)
+        return analyze(ev, now_ms=now_ms, hours=hours, **kw)
+
+    def rolling(self, symbol: str, window_h: float = 1, step_h: float = 1, span_h: float = 24,
+                now_ms: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Скользящие окна window_h с шагом step_h за последние span_h часов."""
+        now_ms = int(time.time() * 1000) if now_ms is None else int(now_ms)
+        window_ms, span_ms = int(window_h * HOUR_MS), int(span_h * HOUR_MS)
+        ev = self.load(symbol, now_ms - span_ms - window_ms, now_ms)
+        return rolling(ev, window_ms, int(step_h * HOUR_MS), now_ms - span_ms, now_ms)
+
+
+_stores: "weakref.WeakKeyDictionary[DB, LiquidationStore]" = weakref.WeakKeyDictionary()
+_stores_lock = threading.Lock()
+
+
+def get_liquidation_store(db: DB) -> LiquidationStore:
+    with _stores_lock:
+        store = _stores.get(db)
+        if store is None:
+            store = _stores[db] = LiquidationStore(db)
+        return store
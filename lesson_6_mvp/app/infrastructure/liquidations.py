@@ -1,13 +1,8 @@
 # app/infrastructure/liquidations.py
 import time
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
-_sess = requests.Session()
-_sess.mount("https://", HTTPAdapter(max_retries=Retry(
-    total=2, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset(["GET"])
-)))
+from .http_transport import get_transport
 
 BYBIT  = "https://api.bybit.com"
 BYTICK = "https://api.bytick.com"
@@ -25,13 +20,45 @@ def _clamp_range_ms(end_ms: int, span_ms: int, max_span_ms: int = 7*24*3600*1000
 def _req_liqs(host: str, category: str, symbol: str, start_ms: int, end_ms: int, limit: int = 200) -> dict:
     url = f"{host}/v5/market/liquidation"
     params = dict(category=category, symbol=symbol, startTime=start_ms, endTime=end_ms, limit=limit)
-    r = _sess.get(url, params=params, timeout=15)
+    r = get_transport().get(url, params=params, timeout=15)
     if r.status_code == 404:
         # у Bybit 404 часто = "пусто" — не бросаем исключение
         return {"retCode": 10000, "result": {"list": []}}
     r.raise_for_status()
     return r.json()
 
+def _sum_liqs(arr: list) -> tuple[float, float, int]:
+    total_long = total_short = 0.0
+    count = 0
+    for it in arr:
+        side = str(it.get("side") or it.get("position") or "").lower()
+        qty_usd = float(it.get("value", 0) or it.get("qty", 0) or 0)
+        if side.startswith("buy") or side == "long":
+            total_long += qty_usd
+        elif side.startswith("sell") or side == "short":
+            total_short += qty_usd
+        count += 1
+    return total_long, total_short, count
+
+def bybit_liqs_window(base: str, start_ms: int, end_ms: int, *, limit: int = 200) -> tuple[float, float, int]:
+    """
+    Ликвидации linear-контракта base+USDT ровно за окно [start_ms, end_ms] — один запрос (с запасным хостом),
+    без шагов назад, как нужно периодическому сборщику. Ошибка обоих хостов — исключение.
+    """
+    base = (base or "BTC").upper().strip()
+    symbol = base if base.endswith("USDT") else f"{base}USDT"
+    s, e = _clamp_range_ms(end_ms, max(1, end_ms - start_ms))
+    err: Exception | None = None
+    for host in (BYBIT, BYTICK):
+        try:
+            data = _req_liqs(host, "linear", symbol, s, e, limit)
+        except Exception as ex:
+            err = ex
+            continue
+        long_usd, short_usd, count = _sum_liqs(((data or {}).get("result") or {}).get("list") or [])
+        return float(long_usd), float(short_usd), int(count)
+    raise err if err is not None else RuntimeError("liquidations unavailable")
+
 def bybit_liqs_any(base: str = "BTC", *, minutes: int = 120, limit: int = 200) -> tuple[float, float, int, str, bool]:
     """
     Возвращает (long_usd, short_usd, count, symbol_used, ok).
@@ -67,20 +94,11 @@ def bybit_liqs_any(base: str = "BTC", *, minutes: int = 120, limit: int = 200) -
         s, e = _clamp_range_ms(end_ms - back, span_ms)
         for category, symbol in candidates:
             last_symbol = symbol
-            total_long = total_short = 0.0
-            count = 0
             for host in hosts:
                 try:
                     data = _req_liqs(host, category, symbol, s, e, limit)
                     arr = (((data or {}).get("result") or {}).get("list") or [])
-                    for it in arr:
-                        side = str(it.get("side") or it.get("position") or "").lower()
-                        qty_usd = float(it.get("value", 0) or it.get("qty", 0) or 0)
-                        if side.startswith("buy") or side == "long":
-                            total_long += qty_usd
-                        elif side.startswith("sell") or side == "short":
-                            total_short += qty_usd
-                        count += 1
+                    total_long, total_short, count = _sum_liqs(arr)
                     if count > 0 or (total_long + total_short) > 0:
                         return float(total_long), float(total_short), int(count), symbol, True
                 except requests.HTTPError:
@@ -0,0 +1,465 @@
+# app/infrastructure/live_stream.py
+"""
+Push-канал для дашборда: live-бары, дивергенции и прогнозы (SSE + WebSocket).
+
+- LiveHub — in-process pub/sub: подписка на топики (metric, timeframe), «*» — любой;
+- у каждого клиента своя ограниченная очередь: апдейты одного и того же бара схлопываются,
+  при переполнении старые события выбрасываются и клиент получает событие "lag"
+  (сигнал переподключиться с since=<последний ts>);
+- ChangeTailer — один фоновый опрос SQLite на процесс (а не на клиента): ловит бары,
+  записанные другими процессами (collector_combo, TV fetcher), новые/подтверждённые
+  дивергенции и новые прогнозы. Пока подписчиков нет — не опрашивает вовсе;
+- /webhook публикует бар сразу после upsert, без ожидания опроса;
+- resume: since=<ts> (или заголовок Last-Event-ID для SSE) — досылаем пропущенное из БД;
+  при переполнении LIVE_REPLAY_LIMIT досылаются самые свежие события.
+
+Запросы к SQLite (опрос tailer-а и replay) выполняются в пуле потоков (asyncio.to_thread),
+event loop только рассылает готовые события.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+from .db import DB
+from ..domain.models import METRICS, TIMEFRAMES
+
+log = logging.getLogger("alt_forecast.api.live")
+
+LIVE_POLL_SEC = float(os.getenv("LIVE_POLL_SEC", "1.0"))
+LIVE_MAX_PENDING = int(os.getenv("LIVE_MAX_PENDING", "1000"))
+LIVE_REPLAY_LIMIT = int(os.getenv("LIVE_REPLAY_LIMIT", "5000"))
+LIVE_HEARTBEAT_SEC = float(os.getenv("LIVE_HEARTBEAT_SEC", "15"))
+
+WILDCARD = "*"
+TopicKey = Tuple[str, str]  # (metric, timeframe)
+
+
+@dataclass
+class LiveEvent:
+    """Дельта для клиента: type = bar | div | forecast | lag."""
+    type: str
+    metric: str
+    timeframe: str
+    ts: int
+    data: Dict[str, Any] = field(default_factory=dict)
+
+    def key(self) -> tuple:
+        # ключ схлопывания: новый апдейт того же бара/дивергенции заменяет старый в очереди
+        if self.type == "bar":
+            return ("bar", self.metric, self.timeframe, self.ts)
+        return (self.type, self.data.get("id"), self.ts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": self.type, "metric": self.metric, "timeframe": self.timeframe, "ts": self.ts, "data": self.data}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), separators=(",", ":"), default=str)
+
+    @classmethod
+    def bar(cls, metric: str, timeframe: str, ts: int, o: float, h: float, l: float, c: float,
+            v: Optional[float] = None) -> "LiveEvent":
+        return cls("bar", metric, timeframe, int(ts), {"o": o, "h": h, "l": l, "c": c, "v": v})
+
+
+class Subscriber:
+    """Клиент хаба: ограниченная очередь с coalescing и счётчиком выброшенных событий."""
+
+    def __init__(self, topics: Iterable[TopicKey], max_pending: int = LIVE_MAX_PENDING):
+        self.topics: Set[TopicKey] = set(topics)
+        self.max_pending = max(1, int(max_pending))
+        self._pending: "OrderedDict[tuple, LiveEvent]" = OrderedDict()
+        self._ready = asyncio.Event()
+        self.dropped = 0
+        self.delivered = 0
+
+    def offer(self, ev: LiveEvent) -> None:
+        """Неблокирующая постановка в очередь (вызывается из event loop)."""
+        key = ev.key()
+        if key in self._pending:
+            self._pending[key] = ev  # тот же бар обновился — отдаём только последнюю версию
+        else:
+            self._pending[key] = ev
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+        self._ready.set()
+
+    async def next_batch(self, timeout: Optional[float] = None) -> List[LiveEvent]:
+        """Дождаться событий и забрать всё накопленное (пустой список — таймаут)."""
+        if not self._pending:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        batch = list(self._pending.values())
+        self._pending.clear()
+        if self.dropped:
+            last_ts = batch[0].ts if batch else 0
+            batch.insert(0, LiveEvent("lag", WILDCARD, WILDCARD, last_ts, {"dropped": self.dropped}))
+            self.dropped = 0
+        self.delivered += len(batch)
+        return batch
+
+
+class LiveHub:
+    """In-process fan-out по топикам (metric, timeframe)."""
+
+    def __init__(self):
+        self._subs: Set[Subscriber] = set()
+        self._by_topic: Dict[TopicKey, Set[Subscriber]] = {}
+        self._last_bar: Dict[TopicKey, tuple] = {}
+        self.published = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self._subs)
+
+    def subscribe(self, topics: Iterable[TopicKey], max_pending: int = LIVE_MAX_PENDING) -> Subscriber:
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        sub = Subscriber(topics, max_pending)
+        self._subs.add(sub)
+        for t in sub.topics:
+            self._by_topic.setdefault(t, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        self._subs.discard(sub)
+        for t in sub.topics:
+            subs = self._by_topic.get(t)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._by_topic[t]
+
+    def _targets(self, metric: str, timeframe: str) -> Set[Subscriber]:
+        out: Set[Subscriber] = set()
+        for key in ((metric, timeframe), (metric, WILDCARD), (WILDCARD, timeframe), (WILDCARD, WILDCARD)):
+            out |= self._by_topic.get(key, set())
+        return out
+
+    def publish(self, ev: LiveEvent) -> int:
+        """Разослать событие подписчикам топика. Повторная публикация того же бара игнорируется."""
+        if ev.type == "bar":
+            sig = (ev.ts, ev.data.get("o"), ev.data.get("h"), ev.data.get("l"), ev.data.get("c"), ev.data.get("v"))
+            topic = (ev.metric, ev.timeframe)
+            prev = self._last_bar.get(topic)
+            if prev == sig or (prev is not None and prev[0] > ev.ts):
+                return 0
+            self._last_bar[topic] = sig
+        targets = self._targets(ev.metric, ev.timeframe)
+        for sub in targets:
+            sub.offer(ev)
+        self.published += 1
+        return len(targets)
+
+    def publish_threadsafe(self, ev: LiveEvent) -> None:
+        """Публикация из потока, отличного от event loop хаба."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self.publish, ev)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self._subs),
+            "topics": len(self._by_topic),
+            "published": self.published,
+            "pending": sum(len(s._pending) for s in self._subs),
+        }
+
+
+# ---------- чтение изменений из БД ----------
+
+def _expand(topics: Iterable[TopicKey]) -> Tuple[List[str], List[str]]:
+    metrics, tfs = set(), set()
+    for m, tf in topics:
+        metrics |= set(METRICS) if m == WILDCARD else {m}
+        tfs |= set(TIMEFRAMES) if tf == WILDCARD else {tf}
+    return sorted(metrics), sorted(tfs)
+
+
+def _div_event(r) -> LiveEvent:
+    ts = max(int(r["detected_ts"] or 0), int(r["confirm_ts"] or 0), int(r["invalid_ts"] or 0))
+    return LiveEvent("div", r["metric"], r["timeframe"], ts, {
+        "id": r["id"], "indicator": r["indicator"], "side": r["side"], "implication": r["implication"],
+        "status": r["status"], "confirm_grade": r["confirm_grade"], "score": r["score"] or 0.0,
+        "detected_ts": r["detected_ts"],
+    })
+
+
+def _forecast_event(r) -> LiveEvent:
+    return LiveEvent("forecast", r["symbol"], r["timeframe"], int(r["timestamp_ms"]), {
+        "id": r["id"], "horizon": r["horizon"], "predicted_return": r["predicted_return"],
+        "probability_up": r["probability_up"], "target_price": r["target_price"],
+        "current_price": r["current_price"],
+    })
+
+
+_DIV_COLS = "id, metric, timeframe, indicator, side, implication, status, confirm_grade, score, detected_ts, confirm_ts, invalid_ts"
+_FORECAST_COLS = "id, symbol, timeframe, horizon, predicted_return, probability_up, target_price, current_price, timestamp_ms"
+
+
+def replay_events(db: DB, topics: Iterable[TopicKey], since_ts: int, limit: int = LIVE_REPLAY_LIMIT) -> List[LiveEvent]:
+    """
+    События с ts > since_ts из БД (resume после переподключения), по возрастанию ts.
+    limit действует на каждый тип событий отдельно и оставляет самые свежие.
+    """
+    metrics, tfs = _expand(topics)
+    events = [
+        LiveEvent.bar(m, tf, ts, o, h, l, c, v)
+        for m, tf, ts, o, h, l, c, v in db.bars_since(metrics, tfs, since_ts + 1, limit)
+    ]
+    ph_m, ph_t = ",".join("?" * len(metrics)), ",".join("?" * len(tfs))
+    cur = db.conn.cursor()
+    cur.execute(
+        f"""SELECT {_DIV_COLS} FROM divs
+            WHERE metric IN ({ph_m}) AND timeframe IN ({ph_t})
+              AND (detected_ts > ? OR confirm_ts > ? OR invalid_ts > ?)
+            ORDER BY id DESC LIMIT ?""",
+        (*metrics, *tfs, since_ts, since_ts, since_ts, limit)
+    )
+    events.extend(_div_event(r) for r in cur.fetchall())
+    try:
+        cur.execute(
+            f"""SELECT {_FORECAST_COLS} FROM forecast_history
+                WHERE symbol IN ({ph_m}) AND timeframe IN ({ph_t}) AND timestamp_ms > ?
+                ORDER BY id DESC LIMIT ?""",
+            (*metrics, *tfs, since_ts, limit)
+        )
+        events.extend(_forecast_event(r) for r in cur.fetchall())
+    except sqlite3.OperationalError:
+        pass  # forecast_history создаётся лениво сервисом прогнозов
+    events.sort(key=lambda e: e.ts)
+    return events
+
+
+class ChangeTailer:
+    """
+    Один опрос БД на процесс: одинаковая нагрузка на чтение при любом числе клиентов.
+    Бары — через DB.bars_version (последний бар каждой серии), дивергенции и прогнозы — по водяным знакам.
+    Чтение БД (collect) идёт в пуле потоков, публикация в хаб — в event loop.
+    """
+
+    def __init__(self, db: DB, hub: LiveHub, poll_sec: float = LIVE_POLL_SEC):
+        self.db = db
+        self.hub = hub
+        self.poll_sec = poll_sec
+        self._versions: Dict[TopicKey, Tuple[int, float]] = {}
+        self._div_id = 0
+        self._div_status_ts = 0
+        self._forecast_id = 0
+        self._initialized = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self) -> None:
+        while True:
+            try:
+                if self.hub.has_subscribers or not self._initialized:
+                    for ev in await asyncio.to_thread(self.collect):
+                        self.hub.publish(ev)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("live tailer poll failed")
+            await asyncio.sleep(self.poll_sec)
+
+    def poll_once(self) -> int:
+        """Один проход: опубликовать изменения с прошлого опроса. Возвращает число событий."""
+        events = self.collect()
+        for ev in events:
+            self.hub.publish(ev)
+        return len(events)
+
+    def collect(self) -> List[LiveEvent]:
+        """Прочитать изменения с прошлого опроса (без обращения к хабу — можно звать из потока)."""
+        events: List[LiveEvent] = []
+        cur = self.db.conn.cursor()
+
+        # --- бары ---
+        changed: List[Tuple[str, str, int]] = []
+        for m, tf, ts, c in self.db.bars_version(METRICS, TIMEFRAMES):
+            prev = self._versions.get((m, tf))
+            if prev != (ts, c):
+                self._versions[(m, tf)] = (ts, c)
+                if prev is not None:
+                    changed.append((m, tf, prev[0]))
+        if self._initialized:
+            for m, tf, since in changed:
+                events.extend(LiveEvent.bar(*row) for row in self.db.bars_since([m], [tf], since, LIVE_REPLAY_LIMIT))
+
+        # --- дивергенции: новые (id) и смена статуса (confirm_ts/invalid_ts) ---
+        cur.execute(
+            f"""SELECT {_DIV_COLS} FROM divs
+                WHERE id > ? OR confirm_ts > ? OR invalid_ts > ? ORDER BY id""",
+            (self._div_id, self._div_status_ts, self._div_status_ts)
+        )
+        for r in cur.fetchall():
+            self._div_id = max(self._div_id, int(r["id"]))
+            self._div_status_ts = max(self._div_status_ts, int(r["confirm_ts"] or 0), int(r["invalid_ts"] or 0))
+            if self._initialized:
+                events.append(_div_event(r))
+
+        # --- прогнозы ---
+        try:
+            cur.execute(f"SELECT {_FORECAST_COLS} FROM forecast_history WHERE id > ? ORDER BY id", (self._forecast_id,))
+            for r in cur.fetchall():
+                self._forecast_id = max(self._forecast_id, int(r["id"]))
+                if self._initialized:
+                    events.append(_forecast_event(r))
+        except sqlite3.OperationalError:
+            pass
+
+        self._initialized = True
+        return events
+
+
+# ---------- глобальные экземпляры ----------
+
+_global_hub: Optional[LiveHub] = None
+
+
+def get_live_hub() -> LiveHub:
+    """Получить глобальный экземпляр LiveHub."""
+    global _global_hub
+    if _global_hub is None:
+        _global_hub = LiveHub()
+    return _global_hub
+
+
+# ---------- роуты ----------
+
+def parse_topics(raw: Optional[str]) -> List[TopicKey]:
+    """'BTC:1h,TOTAL2:*' → [('BTC','1h'), ('TOTAL2','*')]. Пусто — все топики."""
+    if not raw:
+        return [(WILDCARD, WILDCARD)]
+    out: List[TopicKey] = []
+    for item in raw.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        metric, _, tf = item.partition(":")
+        metric, tf = metric or WILDCARD, tf or WILDCARD
+        if metric != WILDCARD and metric not in METRICS:
+            raise ValueError(f"Invalid metric '{metric}'. Allowed: {METRICS}")
+        if tf != WILDCARD and tf not in TIMEFRAMES:
+            raise ValueError(f"Invalid timeframe '{tf}'. Allowed: {TIMEFRAMES}")
+        out.append((metric, tf))
+    return out or [(WILDCARD, WILDCARD)]
+
+
+def create_live_stream_router(app: FastAPI, db: DB, hub: Optional[LiveHub] = None) -> ChangeTailer:
+    """Регистрирует /api/stream (SSE) и /ws/stream (WebSocket). Возвращает tailer (запускается на startup)."""
+    hub = hub or get_live_hub()
+    tailer = ChangeTailer(db, hub)
+
+    @app.get("/api/stream", tags=["stream"])
+    async def stream_sse(
+        request: Request,
+        topics: Optional[str] = Query(None, description="Топики metric:timeframe через запятую, '*' — любой"),
+        since: Optional[int] = Query(None, ge=0, description="Дослать события с ts > since (unix ms)"),
+    ):
+        """
+        Server-Sent Events: `event: bar|div|forecast|lag`, `id` — ts события.
+        При переподключении браузер сам шлёт Last-Event-ID — пропущенное досылается из БД.
+        """
+        try:
+            keys = parse_topics(topics)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        last_id = request.headers.get("last-event-id")
+        if since is None and last_id and last_id.isdigit():
+            since = int(last_id)
+
+        sub = hub.subscribe(keys)
+        replay = await asyncio.to_thread(replay_events, db, keys, since) if since is not None else []
+
+        def _frame(ev: LiveEvent) -> str:
+            return f"event: {ev.type}\nid: {ev.ts}\ndata: {ev.to_json()}\n\n"
+
+        async def gen():
+            try:
+                yield "retry: 3000\n\n"
+                for ev in replay:
+                    yield _frame(ev)
+                while True:
+                    if await request.is_disconnected():
+                        break
+                    batch = await sub.next_batch(timeout=LIVE_HEARTBEAT_SEC)
+                    if not batch:
+                        yield ": ping\n\n"
+                        continue
+                    yield "".join(_frame(ev) for ev in batch)
+            finally:
+                hub.unsubscribe(sub)
+
+        return StreamingResponse(
+            gen(), media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.websocket("/ws/stream")
+    async def stream_ws(websocket: WebSocket):
+        """
+        WebSocket: первое сообщение клиента — {"topics": "BTC:1h,TOTAL2:*", "since": <ts|null>}.
+        Сервер шлёт JSON-массивы событий (пачки дельт).
+        """
+        await websocket.accept()
+        sub: Optional[Subscriber] = None
+        try:
+            hello = await websocket.receive_json()
+            try:
+                keys = parse_topics(hello.get("topics"))
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                await websocket.close(code=1008)
+                return
+            sub = hub.subscribe(keys)
+            since = hello.get("since")
+            if since is not None:
+                replay = await asyncio.to_thread(replay_events, db, keys, int(since))
+                if replay:
+                    await websocket.send_json([ev.to_dict() for ev in replay])
+            while True:
+                batch = await sub.next_batch(timeout=LIVE_HEARTBEAT_SEC)
+                await websocket.send_json([ev.to_dict() for ev in batch])
+        except WebSocketDisconnect:
+            pass
+        finally:
+            if sub is not None:
+                hub.unsubscribe(sub)
+
+    @app.get("/api/stream/stats", tags=["stream"])
+    async def stream_stats():
+        """Состояние push-канала: подписчики, топики, очередь."""
+        return hub.get_stats()
+
+    return tailer
@@ -1,19 +1,39 @@
 from __future__ import annotations
-import requests
+
+from .http_transport import get_transport
 
 BINANCE_FUT = "https://fapi.binance.com"
 BINANCE_SPOT = "https://api.binance.com"
 
 def binance_funding_and_mark(symbol_usdt: str = "BTCUSDT") -> dict:
     # premiumIndex даёт markPrice и fundingRate
-    r = requests.get(f"{BINANCE_FUT}/fapi/v1/premiumIndex", params={"symbol": symbol_usdt}, timeout=10)
+    r = get_transport().get(f"{BINANCE_FUT}/fapi/v1/premiumIndex", params={"symbol": symbol_usdt}, timeout=10)
     r.raise_for_status()
     j = r.json()
     return {"fundingRate": float(j.get("lastFundingRate", 0.0)),
             "markPrice": float(j.get("markPrice", 0.0))}
 
+def binance_premium_index_all() -> dict:
+    """premiumIndex без symbol — funding/mark/index по всем USDT-M контрактам одним запросом."""
+    r = get_transport().get(f"{BINANCE_FUT}/fapi/v1/premiumIndex", timeout=10)
+    r.raise_for_status()
+    out = {}
+    for j in r.json() or []:
+        sym = str(j.get("symbol") or "")
+        if sym:
+            out[sym] = {"fundingRate": float(j.get("lastFundingRate") or 0.0),
+                        "markPrice": float(j.get("markPrice") or 0.0),
+                        "indexPrice": float(j.get("indexPrice") or 0.0)}
+    return out
+
+def binance_open_interest(symbol_usdt: str = "BTCUSDT") -> float:
+    """Открытый интерес контракта в базовой монете."""
+    r = get_transport().get(f"{BINANCE_FUT}/fapi/v1/openInterest", params={"symbol": symbol_usdt}, timeout=10)
+    r.raise_for_status()
+    return float(r.json().get("openInterest", 0.0))
+
 def binance_spot_price(symbol_usdt: str = "BTCUSDT") -> float:
-    r = requests.get(f"{BINANCE_SPOT}/api/v3/ticker/price", params={"symbol": symbol_usdt}, timeout=10)
+    r = get_transport().get(f"{BINANCE_SPOT}/api/v3/ticker/price", params={"symbol": symbol_usdt}, timeout=10)
     r.raise_for_status()
     return float(r.json()["price"])
 
@@ -175,9 +175,14 @@ class MarketDataService:
                 logger.debug(f"Using cached derivatives data for {cache_key}")
                 return cached_data
         
+        snapshot = self._derivatives_from_store(symbol)
+        if snapshot is not None:
+            self._cache_derivatives[cache_key] = (snapshot, time.time())
+            return snapshot
+
         snapshot = DerivativesSnapshot(quality="none")
         
-        # Получаем funding rate из Binance
+        # В локальном сторе свежих данных нет — идём на биржи: funding rate из Binance
         try:
             from .market_data import binance_funding_and_mark
             binance_symbol = symbol.upper()
@@ -213,6 +218,34 @@ class MarketDataService:
         
         return snapshot
     
+    def _derivatives_from_store(self, symbol: str) -> Optional[DerivativesSnapshot]:
+        """
+        Снимок из временных рядов сборщика (infrastructure.derivatives_store) без запросов к биржам.
+        None — стора нет или свежего funding нет (тогда живой запрос).
+        """
+        if self.db is None:
+            return None
+        try:
+            from .derivatives_store import get_derivatives_store
+            store = get_derivatives_store(self.db)
+            funding = store.latest_value(symbol, "funding_rate")
+            if funding is None:
+                return None
+            feats = store.features(symbol)
+        except Exception as e:
+            logger.debug(f"Derivatives store unavailable for {symbol}: {e}")
+            return None
+        snapshot = DerivativesSnapshot(
+            funding=funding,
+            oi=store.latest_value(symbol, "oi_usd"),
+            oi_change_pct=feats.get("oi_change_pct"),
+            cvd_spot_slope=feats.get("cvd_slope"),
+            quality="partial",
+        )
+        if snapshot.oi_change_pct is not None:
+            snapshot.quality = "full"
+        return snapshot
+
     def _normalize_symbol(self, symbol: str) -> list[str]:
         """Нормализовать символ и вернуть список вариантов."""
         symbol = symbol.upper().strip().replace("/", "").replace("-", "")
@@ -0,0 +1,320 @@
+# app/infrastructure/market_snapshot.py
+"""
+Колоночный снапшот рынка CoinGecko: один разбор списка /coins/markets на все витрины.
+
+Новый снапшот (новый объект из кэша coingecko.markets_snapshot) один раз раскладывается в numpy-колонки
+(цена, капитализация, объём, изменения 1h/24h/7d, флаги стейбла/пустого символа), сразу строятся порядки
+ранжирования по (метрика, без стейблов, направление) и индексы символ/id → строка. Дальше /top, /flop,
+пейджер, bubbles, дайджест и /forecast_alts берут срезы готовых порядков за O(k); варианты с вселенной
+«топ-N по капе» или категорией мемоизируются при первом обращении. Членство в категориях — булевы маски
+по строкам снапшота (битсеты), переносятся на каждый новый снапшот. Кольцо последних снапшотов
+(MARKET_SNAPSHOT_RING) — для дельт «что изменилось с прошлого обновления».
+
+    snap = get_market_store().current("usd")
+    gainers = snap.top("24h", 5, exclude_stable=True, universe=500)
+    page_rows = snap.ranked("1h", desc=False)[20:40]
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("alt_forecast.market_snapshot")
+
+MARKET_SNAPSHOT_RING = int(os.getenv("MARKET_SNAPSHOT_RING", "12"))
+
+STABLE_TICKERS = {"usdt", "usdc", "busd", "dai", "tusd", "usdp", "usdd", "frax", "lusd", "susd"}
+
+FLAG_STABLE = 1
+FLAG_NO_SYMBOL = 2
+
+# метрика -> поля CoinGecko (первое непустое)
+CHANGE_FIELDS = {
+    "1h": ("price_change_percentage_1h_in_currency", "price_change_percentage_1h"),
+    "24h": ("price_change_percentage_24h_in_currency", "price_change_percentage_24h"),
+    "7d": ("price_change_percentage_7d_in_currency", "price_change_percentage_7d"),
+}
+METRICS = ("1h", "24h", "7d", "market_cap", "volume", "price")
+_PRECOMPUTED = ("1h", "24h", "7d", "market_cap", "volume")
+
+
+def is_stable(c: Dict) -> bool:
+    sym = str(c.get("symbol", "")).lower()
+    name = str(c.get("name", "")).lower()
+    return (sym in STABLE_TICKERS) or ("stable" in name)
+
+
+def _num(c: Dict, keys: Sequence[str]) -> float:
+    v = None
+    for k in keys:
+        v = c.get(k)
+        if v:
+            break
+    try:
+        x = float(v or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+    return x if np.isfinite(x) else 0.0
+
+
+def metric_of(tf_or_metric: str) -> str:
+    """Нормализовать метрику: неизвестный таймфрейм — 24h, как в старых хендлерах."""
+    m = (tf_or_metric or "").lower()
+    return m if m in METRICS else "24h"
+
+
+class MarketSnapshot:
+    """Неизменяемый колоночный вид одного ответа /coins/markets (строки — в порядке API, т.е. по капе)."""
+
+    def __init__(self, rows: Sequence[Dict], vs: str = "usd", ts: Optional[float] = None):
+        self.rows: List[Dict] = list(rows or [])
+        self.vs = vs
+        self.ts = time.time() if ts is None else float(ts)
+        n = len(self.rows)
+        self.n = n
+        self.symbols = [str(c.get("symbol") or "").upper() for c in self.rows]
+        self.ids = [str(c.get("id") or "") for c in self.rows]
+        cols = {
+            "price": np.fromiter((_num(c, ("current_price",)) for c in self.rows), float, n),
+            "market_cap": np.fromiter((_num(c, ("market_cap",)) for c in self.rows), float, n),
+            "volume": np.fromiter((_num(c, ("total_volume",)) for c in self.rows), float, n),
+        }
+        for tf, keys in CHANGE_FIELDS.items():
+            cols[tf] = np.fromiter((_num(c, keys) for c in self.rows), float, n)
+        self._cols = cols
+        self.flags = np.fromiter(
+            ((FLAG_STABLE if is_stable(c) else 0) | (0 if sym else FLAG_NO_SYMBOL)
+             for c, sym in zip(self.rows, self.symbols)), np.uint8, n)
+        self._eligible = {
+            False: np.flatnonzero((self.flags & FLAG_NO_SYMBOL) == 0),
+            True: np.flatnonzero(self.flags == 0),
+        }
+        self.sym_row: Dict[str, int] = {}
+        for i, s in enumerate(self.symbols):
+            if s:
+                self.sym_row.setdefault(s, i)        # при дублях символа — старший по капе
+        self.id_row: Dict[str, int] = {cid: i for i, cid in enumerate(self.ids) if cid}
+        self._cats: Dict[str, np.ndarray] = {}
+        self._orders: Dict[tuple, np.ndarray] = {}
+        self._lists: Dict[tuple, List[Dict]] = {}
+        self._lock = threading.Lock()
+        for m in _PRECOMPUTED:
+            for ex in (False, True):
+                for desc in (True, False):
+                    self.order(m, desc=desc, exclude_stable=ex)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def column(self, metric: str) -> np.ndarray:
+        return self._cols[metric_of(metric)]
+
+    def get(self, symbol: str) -> Optional[Dict]:
+        i = self.sym_row.get((symbol or "").upper())
+        return None if i is None else self.rows[i]
+
+    # ---------- категории ----------
+
+    def set_category(self, category: str, coin_ids: Iterable[str]) -> int:
+        """Маска членства категории по строкам снапшота. Возвращает число найденных монет."""
+        mask = np.zeros(self.n, dtype=bool)
+        for cid in coin_ids:
+            i = self.id_row.get(cid)
+            if i is not None:
+                mask[i] = True
+        with self._lock:
+            self._cats[category] = mask
+            for key in [k for k in self._orders if k[4] == category]:
+                self._orders.pop(key, None)
+                self._lists.pop(key, None)
+        return int(mask.sum())
+
+    def in_category(self, category: str) -> np.ndarray:
+        return self._cats.get(category, np.zeros(self.n, dtype=bool))
+
+    # ---------- порядки ----------
+
+    def order(self, metric: str, desc: bool = True, exclude_stable: bool = False,
+              universe: Optional[int] = None, category: Optional[str] = None) -> np.ndarray:
+        """
+        Индексы строк в порядке ранжирования (стабильная сортировка — при равенстве старше по капе).
+        universe — только первые N строк API (топ-N по капе), category — только члены категории.
+        """
+        m = metric_of(metric)
+        if universe is not None and universe >= self.n:
+            universe = None
+        key = (m, bool(desc), bool(exclude_stable), universe, category)
+        idx = self._orders.get(key)
+        if idx is not None:
+            return idx
+        if universe is not None or category is not None:
+            base = self.order(m, desc, exclude_stable)
+            keep = np.ones(self.n, dtype=bool)
+            if universe is not None:
+                keep[universe:] = False
+            if category is not None:
+                keep &= self.in_category(category)
+            idx = base[keep[base]]
+        else:
+            cand = self._eligible[bool(exclude_stable)]
+            vals = self._cols[m][cand]
+            idx = cand[np.argsort(-vals if desc else vals, kind="stable")]
+        with self._lock:
+            self._orders[key] = idx
+        return idx
+
+    def top(self, metric: str, k: int, desc: bool = True, exclude_stable: bool = False,
+            universe: Optional[int] = None, category: Optional[str] = None) -> List[Dict]:
+        """Первые k строк ранжирования — O(k)."""
+        idx = self.order(metric, desc, exclude_stable, universe, category)
+        return [self.rows[i] for i in idx[:max(0, int(k))]]
+
+    def ranked(self, metric: str, desc: bool = True, exclude_stable: bool = False,
+               universe: Optional[int] = None, category: Optional[str] = None) -> List[Dict]:
+        """Весь рейтинг списком словарей (материализуется один раз на снапшот) — для пагинации."""
+        m = metric_of(metric)
+        if universe is not None and universe >= self.n:
+            universe = None
+        key = (m, bool(desc), bool(exclude_stable), universe, category)
+        rows = self._lists.get(key)
+        if rows is None:
+            rows = [self.rows[i] for i in self.order(m, desc, exclude_stable, universe, category)]
+            with self._lock:
+                self._lists[key] = rows
+        return rows
+
+    def universe(self, top: Optional[int] = None, exclude_stable: bool = False) -> List[Dict]:
+        """Строки в порядке API (по капе): первые top, опционально без стейблов."""
+        key = ("universe", exclude_stable, top)
+        rows = self._lists.get(key)
+        if rows is None:
+            lim = self.n if top is None else min(int(top), self.n)
+            rows = [self.rows[i] for i in range(lim) if not (exclude_stable and self.flags[i] & FLAG_STABLE)]
+            with self._lock:
+                self._lists[key] = rows
+        return rows
+
+
+class MarketSnapshotStore:
+    """Текущий снапшот на валюту + кольцо прошлых; членство категорий переживает обновления."""
+
+    def __init__(self, ring: int = MARKET_SNAPSHOT_RING):
+        self._lock = threading.Lock()
+        self._ring: Dict[str, Deque[MarketSnapshot]] = {}
+        self._src: Dict[str, object] = {}
+        self._categories: Dict[str, Tuple[str, ...]] = {}
+        self._cat_snaps: Dict[Tuple[str, str], Tuple[object, MarketSnapshot]] = {}
+        self._size = max(1, int(ring))
+        self.built = 0
+
+    def ingest(self, rows: Sequence[Dict], vs: str = "usd", ts: Optional[float] = None) -> MarketSnapshot:
+        """Принять ответ API. Тот же объект (попадание в кэш) повторно не разбирается."""
+        with self._lock:
+            ring = self._ring.get(vs)
+            if ring and self._src.get(vs) is rows:
+                return ring[-1]
+        if not rows:
+            return MarketSnapshot([], vs, ts)     # пустой ответ не вытесняет историю
+        snap = MarketSnapshot(rows, vs, ts)
+        with self._lock:
+            cats = dict(self._categories)
+        for cat, ids in cats.items():
+            snap.set_category(cat, ids)
+        with self._lock:
+            ring = self._ring.get(vs)
+            if ring and self._src.get(vs) is rows:
+                return ring[-1]
+            self._ring.setdefault(vs, deque(maxlen=self._size)).append(snap)
+            self._src[vs] = rows
+            self.built += 1
+        logger.debug("market snapshot %s: %d rows", vs, snap.n)
+        return snap
+
+    def current(self, vs: str = "usd") -> MarketSnapshot:
+        """Снапшот из кэша coingecko.markets_snapshot (запрос к API — только по TTL кэша)."""
+        from .coingecko import markets_snapshot
+        return self.ingest(markets_snapshot(vs), vs)
+
+    def latest(self, vs: str = "usd") -> Optional[MarketSnapshot]:
+        with self._lock:
+            ring = self._ring.get(vs)
+            return ring[-1] if ring else None
+
+    def history(self, vs: str = "usd") -> List[MarketSnapshot]:
+        with self._lock:
+            return list(self._ring.get(vs, ()))
+
+    # ---------- категории ----------
+
+    def set_category(self, category: str, coin_ids: Iterable[str]) -> None:
+        ids = tuple(c for c in coin_ids if c)
+        with self._lock:
+            self._categories[category] = ids
+            snaps = [r[-1] for r in self._ring.values() if r]
+        for snap in snaps:
+            snap.set_category(category, ids)
+
+    def category_snapshot(self, category: str, rows: Sequence[Dict], vs: str = "usd") -> MarketSnapshot:
+        """Колоночный вид ответа markets_by_category (тот же объект кэша — тот же вид) + маска членства."""
+        key = (category, vs)
+        with self._lock:
+            hit = self._cat_snaps.get(key)
+            if hit is not None and hit[0] is rows:
+                return hit[1]
+        snap = MarketSnapshot(rows, vs)
+        with self._lock:
+            self._cat_snaps[key] = (rows, snap)
+        self.set_category(category, snap.ids)
+        return snap
+
+    # ---------- дельты ----------
+
+    def delta(self, metric: str = "price", back: int = 1, vs: str = "usd") -> Tuple[Optional[MarketSnapshot], np.ndarray]:
+        """
+        Относительное изменение метрики текущего снапшота к снапшоту back обновлений назад, %.
+        Массив выровнен по строкам текущего снапшота; монет, которых не было, — NaN.
+        """
+        hist = self.history(vs)
+        if len(hist) < 2:
+            cur = hist[-1] if hist else None
+            return cur, np.full(cur.n if cur else 0, np.nan)
+        cur, old = hist[-1], hist[max(0, len(hist) - 1 - int(back))]
+        j = np.fromiter((old.id_row.get(cid, -1) for cid in cur.ids), np.int64, cur.n)
+        have = j >= 0
+        out = np.full(cur.n, np.nan)
+        prev = old.column(metric)[j[have]]
+        now = cur.column(metric)[have]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[have] = np.where(prev != 0, (now / prev - 1.0) * 100.0, np.nan)
+        return cur, out
+
+    def movers_since(self, back: int = 1, k: int = 10, desc: bool = True, vs: str = "usd",
+                     metric: str = "price") -> List[Tuple[Dict, float]]:
+        """Кто сильнее всех изменился с прошлого обновления(й): [(строка, %)]."""
+        cur, d = self.delta(metric, back, vs)
+        if cur is None:
+            return []
+        cand = np.flatnonzero(np.isfinite(d) & (cur.flags == 0))
+        vals = d[cand]
+        idx = cand[np.argsort(-vals if desc else vals, kind="stable")][:max(0, int(k))]
+        return [(cur.rows[i], float(d[i])) for i in idx]
+
+
+_store: Optional[MarketSnapshotStore] = None
+_store_lock = threading.Lock()
+
+
+def get_market_store() -> MarketSnapshotStore:
+    """Единый стор снапшотов процесса."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MarketSnapshotStore()
+        return _store
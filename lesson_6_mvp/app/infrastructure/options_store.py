@@ -0,0 +1,194 @@
+# app/infrastructure/options_store.py
+"""
+Локальные снимки опционных цепочек Deribit с посчитанной статистикой экспираций.
+
+Раньше каждая кнопка /options_*_free и ежедневная рассылка заново тянули всю цепочку
+и считали max pain по месту, а истории не было вовсе. Здесь job воркера раз в
+OPTIONS_SNAPSHOT_SEC снимает цепочку, один раз прогоняет domain.options.analyze и пишет:
+- options_snapshots — сжатые массивы цепочки (strike/kind/oi/iv по экспирациям) + индекс;
+  из них на любой момент можно пересчитать профиль гаммы без запроса к бирже;
+- options_stats — max pain, стены, GEX, ATM IV и скью на (ccy, ts, expiry) — внутридневные
+  графики смещения max pain и стен читаются отсюда.
+
+    store = get_options_store(db)
+    store.snapshot("BTC")                          # job: fetch + analyze + save
+    store.series("BTC", max_expiries=8)            # точки build_series из свежего снимка (или fetch)
+    store.history("BTC", since_ms, expiry="2025-03-28")
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..domain.options import ExpiryStats, OptionChain, analyze
+from .db import DB
+
+log = logging.getLogger("alt_forecast.options_store")
+
+OPTIONS_SNAPSHOT_CCYS = tuple(
+    c.strip().upper() for c in os.getenv("OPTIONS_SNAPSHOT_CCYS", "BTC,ETH").split(",") if c.strip())
+OPTIONS_SNAPSHOT_SEC = int(os.getenv("OPTIONS_SNAPSHOT_SEC", "900"))
+# снимок старше этого не отдаётся в series() — идём на биржу
+OPTIONS_SNAPSHOT_MAX_AGE_SEC = int(os.getenv("OPTIONS_SNAPSHOT_MAX_AGE_SEC", str(2 * OPTIONS_SNAPSHOT_SEC)))
+OPTIONS_SNAPSHOT_RETENTION_DAYS = float(os.getenv("OPTIONS_SNAPSHOT_RETENTION_DAYS", "30"))
+
+_CHAIN_DTYPE = np.dtype([("code", "<i2"), ("strike", "<f8"), ("is_call", "?"), ("oi", "<f8"), ("iv", "<f4")])
+_STATS_COLS = ("max_pain", "call_oi", "put_oi", "call_wall", "put_wall", "gex", "atm_iv", "skew")
+
+
+def pack_chain(chain: OptionChain) -> bytes:
+    """Цепочка → zlib(JSON-заголовок с датами + структурированный массив)."""
+    arr = np.empty(len(chain), dtype=_CHAIN_DTYPE)
+    arr["code"], arr["strike"], arr["is_call"] = chain.code, chain.strike, chain.is_call
+    arr["oi"], arr["iv"] = chain.oi, chain.iv
+    head = json.dumps(list(chain.expiries)).encode()
+    return zlib.compress(len(head).to_bytes(4, "little") + head + arr.tobytes(), 6)
+
+
+def unpack_chain(blob: bytes) -> OptionChain:
+    raw = zlib.decompress(blob)
+    n = int.from_bytes(raw[:4], "little")
+    expiries = json.loads(raw[4:4 + n].decode())
+    arr = np.frombuffer(raw[4 + n:], dtype=_CHAIN_DTYPE)
+    return OptionChain(expiries, arr["code"].astype(np.int64), arr["strike"], arr["is_call"], arr["oi"],
+                       arr["iv"].astype(float))
+
+
+def _none_if_nan(x: float) -> Optional[float]:
+    return None if x != x else float(x)
+
+
+class OptionsSnapshotStore:
+    def __init__(self, db: DB, retention_days: float = OPTIONS_SNAPSHOT_RETENTION_DAYS,
+                 max_age_sec: int = OPTIONS_SNAPSHOT_MAX_AGE_SEC):
+        self.db = db
+        self.retention_days = retention_days
+        self.max_age_sec = max_age_sec
+        db.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS options_snapshots (
+                ccy TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                spot REAL NOT NULL,
+                n INTEGER NOT NULL,           -- инструментов в цепочке
+                chain BLOB NOT NULL,          -- pack_chain()
+                PRIMARY KEY (ccy, ts)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS options_stats (
+                ccy TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                expiry TEXT NOT NULL,
+                max_pain REAL, call_oi REAL, put_oi REAL, call_wall REAL, put_wall REAL,
+                gex REAL, atm_iv REAL, skew REAL,
+                PRIMARY KEY (ccy, expiry, ts)
+            ) WITHOUT ROWID;
+            """)
+
+    # ---- запись ----
+
+    def save(self, ccy: str, ts: int, chain: OptionChain, spot: float, stats: List[ExpiryStats]) -> None:
+        ccy = ccy.upper()
+        # транзакция на соединении текущего потока: запись писателей сериализует сам SQLite (BEGIN IMMEDIATE)
+        with self.db.atomic():
+            self.db.conn.execute(
+                "INSERT OR REPLACE INTO options_snapshots(ccy, ts, spot, n, chain) VALUES(?,?,?,?,?)",
+                (ccy, int(ts), float(spot), len(chain), pack_chain(chain)))
+            self.db.conn.executemany(
+                f"INSERT OR REPLACE INTO options_stats(ccy, ts, expiry, {', '.join(_STATS_COLS)}) "
+                f"VALUES(?,?,?{',?' * len(_STATS_COLS)})",
+                [(ccy, int(ts), st.expiry, *(_none_if_nan(getattr(st, c)) for c in _STATS_COLS)) for st in stats])
+
+    def snapshot(self, ccy: str, now_ms: Optional[int] = None) -> List[ExpiryStats]:
+        """Снимает цепочку с Deribit, считает все экспирации и сохраняет."""
+        return self._take(ccy, now_ms)[0]
+
+    def _take(self, ccy: str, now_ms: Optional[int]) -> Tuple[List[ExpiryStats], float]:
+        from .deribit import fetch_chain, get_index_price
+        rows = fetch_chain(ccy)
+        if not rows:
+            return [], float("nan")
+        spot = get_index_price(ccy)
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        chain = OptionChain.from_rows(rows)
+        stats = analyze(chain, spot, now_ms=now_ms)
+        self.save(ccy, now_ms, chain, spot, stats)
+        log.debug("options snapshot %s: %d instruments, %d expiries", ccy, len(chain), len(stats))
+        return stats, spot
+
+    def retain(self, now_ms: Optional[int] = None) -> int:
+        """Удаляет снимки старше retention_days; возвращает число удалённых снимков."""
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        cutoff = now_ms - int(self.retention_days * 86_400_000)
+        with self.db.atomic():
+            self.db.conn.execute("DELETE FROM options_stats WHERE ts < ?", (cutoff,))
+            return self.db.conn.execute("DELETE FROM options_snapshots WHERE ts < ?", (cutoff,)).rowcount
+
+    # ---- чтение ----
+
+    def latest_ts(self, ccy: str) -> Optional[int]:
+        row = self.db.conn.execute("SELECT MAX(ts) FROM options_snapshots WHERE ccy=?", (ccy.upper(),)).fetchone()
+        return None if row is None or row[0] is None else int(row[0])
+
+    def load(self, ccy: str, ts: Optional[int] = None) -> Optional[Tuple[int, float, OptionChain]]:
+        """(ts, spot, цепочка) снимка на ts или последнего."""
+        ts = self.latest_ts(ccy) if ts is None else ts
+        if ts is None:
+            return None
+        row = self.db.conn.execute("SELECT ts, spot, chain FROM options_snapshots WHERE ccy=? AND ts=?",
+                                   (ccy.upper(), int(ts))).fetchone()
+        return None if row is None else (int(row[0]), float(row[1]), unpack_chain(row[2]))
+
+    def stats_at(self, ccy: str, ts: int) -> List[ExpiryStats]:
+        rows = self.db.conn.execute(
+            f"SELECT expiry, {', '.join(_STATS_COLS)} FROM options_stats WHERE ccy=? AND ts=? ORDER BY expiry",
+            (ccy.upper(), int(ts))).fetchall()
+        return [self._stats(r) for r in rows]
+
+    def history(self, ccy: str, since_ms: int = 0, expiry: Optional[str] = None) -> List[Tuple[int, ExpiryStats]]:
+        """(ts, статистика) по времени — для внутридневных графиков max pain / стен."""
+        sql = f"SELECT ts, expiry, {', '.join(_STATS_COLS)} FROM options_stats WHERE ccy=? AND ts>=?"
+        args: list = [ccy.upper(), int(since_ms)]
+        if expiry:
+            sql += " AND expiry=?"
+            args.append(expiry)
+        rows = self.db.conn.execute(sql + " ORDER BY ts, expiry", args).fetchall()
+        return [(int(r[0]), self._stats(r[1:])) for r in rows]
+
+    def series(self, ccy: str, max_expiries: int = 10, now_ms: Optional[int] = None) -> List[Dict]:
+        """Точки deribit.build_series из снимка не старше max_age_sec, иначе — свежий снимок."""
+        from .deribit import series_points
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        ts = self.latest_ts(ccy)
+        if ts is not None and now_ms - ts <= self.max_age_sec * 1000:
+            spot = self.db.conn.execute("SELECT spot FROM options_snapshots WHERE ccy=? AND ts=?",
+                                        (ccy.upper(), ts)).fetchone()[0]
+            stats = self.stats_at(ccy, ts)
+        else:
+            stats, spot = self._take(ccy, now_ms)
+        return series_points(stats[:max(1, int(max_expiries))], spot)
+
+    @staticmethod
+    def _stats(r) -> ExpiryStats:
+        vals = [float("nan") if v is None else float(v) for v in r[1:]]
+        return ExpiryStats(r[0], *vals)
+
+
+_stores: "weakref.WeakKeyDictionary[DB, OptionsSnapshotStore]" = weakref.WeakKeyDictionary()
+_stores_lock = threading.Lock()
+
+
+def get_options_store(db: DB) -> OptionsSnapshotStore:
+    with _stores_lock:
+        store = _stores.get(db)
+        if store is None:
+            store = _stores[db] = OptionsSnapshotStore(db)
+        return store
@@ -0,0 +1,623 @@
+# app/infrastructure/orderbook.py
+"""
+L2-стаканы по площадкам, поддерживаемые инкрементально: снапшот + поток диффов.
+
+Раньше каждый /whale_orders и оценка уровней ликвидаций качали полный стакан по REST, заново считали
+total_notional по всем уровням и обходили bids/asks циклом Python. Здесь у каждой пары (площадка, символ)
+один OrderBook:
+- стороны — отсортированные numpy-массивы (цена, объём, нотионал); дифф применяется пачкой
+  (searchsorted + слияние), общий нотионал и корзины глубины по цене (BOOK_BUCKET_BPS) обновляются
+  на дельту, кумулятивный нотионал от лучшей цены пересчитывается лениво один раз на изменение;
+- «стены» — уровни с нотионалом ≥ max(BOOK_WALL_MIN_USD, BOOK_WALL_SHARE × весь стакан), тот же порог,
+  что и «умный порог» whale-запросов. Появление/исчезновение стены публикуется событием WallEvent;
+  стена, которая прожила меньше BOOK_SPOOF_MAX_SEC и исчезла, не дождавшись цены, помечается spoof.
+
+Источники: поток диффов Binance USDT-M (BOOK_STREAM_SYMBOLS, aiohttp WebSocket, синхронизация по
+U/u/pu с перезапросом снапшота при разрыве), REST-снапшоты whale-запросов (free_market_data кладёт их
+сюда же — между снапшотами детектор видит появившиеся и пропавшие стены) и JSONL-файл для тестов/реплея.
+
+    svc = get_orderbook_service()
+    book = svc.fresh_book("binance", "BTCUSDT")          # None — потока нет или он отстал
+    book.whale_orders()                                 # микросекунды, без REST
+    svc.add_listener(lambda ev: ...)                    # WallEvent: appear / disappear (+ spoof)
+    svc.replay("book.jsonl")                            # {"type": "snapshot" | "diff", ...} по строке
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# aiohttp — опционально (только для живого потока диффов)
+try:
+    import aiohttp  # type: ignore
+except Exception:  # pragma: no cover
+    aiohttp = None  # type: ignore
+
+log = logging.getLogger("alt_forecast.orderbook")
+
+BOOK_WALL_MIN_USD = float(os.getenv("BOOK_WALL_MIN_USD", "2000000"))
+BOOK_WALL_SHARE = float(os.getenv("BOOK_WALL_SHARE", "0.0005"))
+BOOK_BUCKET_BPS = float(os.getenv("BOOK_BUCKET_BPS", "10"))
+BOOK_SPOOF_MAX_SEC = float(os.getenv("BOOK_SPOOF_MAX_SEC", "60"))
+# стакан старше этого whale-запросы не используют — идут в REST
+BOOK_MAX_AGE_SEC = float(os.getenv("BOOK_MAX_AGE_SEC", "30"))
+BOOK_EVENTS_KEEP = int(os.getenv("BOOK_EVENTS_KEEP", "1000"))
+BOOK_STREAM_SYMBOLS = tuple(
+    s.strip().upper() for s in os.getenv("BOOK_STREAM_SYMBOLS", "BTCUSDT,ETHUSDT").split(",") if s.strip())
+BOOK_SNAPSHOT_DEPTH = int(os.getenv("BOOK_SNAPSHOT_DEPTH", "1000"))
+
+BINANCE_FUT = "https://fapi.binance.com"
+BINANCE_FUT_WS = "wss://fstream.binance.com"
+
+BID, ASK = "bid", "ask"
+
+
+class WallEvent(NamedTuple):
+    venue: str
+    symbol: str
+    side: str                 # bid | ask
+    price: float
+    notional: float
+    kind: str                 # appear | disappear
+    ts: int
+    lifetime_ms: int = 0      # для disappear — сколько стена простояла
+    spoof: bool = False       # исчезла быстро и до того, как до неё дошла цена
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def parse_levels(rows: Optional[Sequence]) -> Tuple[np.ndarray, np.ndarray]:
+    """[[price, size, ...], ...] (строки или числа, лишние колонки OKX) → (цены, объёмы)."""
+    px: List[float] = []
+    qty: List[float] = []
+    for r in rows or ():
+        if isinstance(r, (list, tuple)) and len(r) >= 2:
+            try:
+                p, q = float(r[0]), float(r[1])
+            except (TypeError, ValueError):
+                continue
+            px.append(p)
+            qty.append(q)
+    return np.asarray(px, dtype=float), np.asarray(qty, dtype=float)
+
+
+class BookSide:
+    """Одна сторона стакана: цены по возрастанию, объёмы, нотионал; total — на дельтах."""
+
+    __slots__ = ("is_bid", "px", "qty", "notional", "total", "_cum")
+
+    def __init__(self, is_bid: bool):
+        self.is_bid = is_bid
+        self.px = np.empty(0)
+        self.qty = np.empty(0)
+        self.notional = np.empty(0)
+        self.total = 0.0
+        self._cum: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.px)
+
+    def load(self, px: np.ndarray, qty: np.ndarray) -> None:
+        keep = qty > 0
+        px, qty = px[keep], qty[keep]
+        order = np.argsort(px, kind="stable")
+        self.px, self.qty = px[order], qty[order]
+        self.notional = self.px * self.qty
+        self.total = float(self.notional.sum())
+        self._cum = None
+
+    def apply(self, px: np.ndarray, qty: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Пачка обновлений (qty=0 — удалить уровень). Возвращает (цены, старый нотионал, новый нотионал)."""
+        if not len(px):
+            return px, px, px
+        if len(px) > 1:                                   # повтор цены в пачке — побеждает последний
+            order = np.argsort(px, kind="stable")
+            ps = px[order]
+            last = np.r_[ps[1:] != ps[:-1], True]
+            px, qty = ps[last], qty[order][last]
+        n = len(self.px)
+        idx = np.searchsorted(self.px, px)
+        hit = idx < n
+        hit[hit] = self.px[idx[hit]] == px[hit]
+        new = np.where(qty > 0, px * qty, 0.0)
+        old = np.zeros(len(px))
+        old[hit] = self.notional[idx[hit]]
+        self.qty[idx[hit]] = qty[hit]
+        self.notional[idx[hit]] = new[hit]
+        add = ~hit & (qty > 0)
+        if add.any() or (hit & (qty <= 0)).any():
+            px_all = np.concatenate([self.px, px[add]])
+            qty_all = np.concatenate([self.qty, qty[add]])
+            keep = qty_all > 0
+            px_all, qty_all = px_all[keep], qty_all[keep]
+            order = np.argsort(px_all, kind="stable")
+            self.px, self.qty = px_all[order], qty_all[order]
+            self.notional = self.px * self.qty
+        self.total += float(new.sum() - old.sum())
+        self._cum = None
+        return px, old, new
+
+    def best(self) -> Optional[float]:
+        if not len(self.px):
+            return None
+        return float(self.px[-1] if self.is_bid else self.px[0])
+
+    def from_best(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(цены, нотионал) от лучшей цены вглубь."""
+        if self.is_bid:
+            return self.px[::-1], self.notional[::-1]
+        return self.px, self.notional
+
+    def cumulative(self) -> np.ndarray:
+        """Кумулятивный нотионал от лучшей цены (один cumsum на изменение стакана)."""
+        if self._cum is None:
+            self._cum = np.cumsum(self.from_best()[1])
+        return self._cum
+
+
+class OrderBook:
+    def __init__(self, venue: str, symbol: str, wall_min_usd: float = BOOK_WALL_MIN_USD,
+                 wall_share: float = BOOK_WALL_SHARE, bucket_bps: float = BOOK_BUCKET_BPS,
+                 spoof_max_sec: float = BOOK_SPOOF_MAX_SEC):
+        self.venue = venue
+        self.symbol = symbol
+        self.wall_min_usd = wall_min_usd
+        self.wall_share = wall_share
+        self.bucket_bps = bucket_bps
+        self.spoof_max_ms = int(spoof_max_sec * 1000)
+        self.sides = {BID: BookSide(True), ASK: BookSide(False)}
+        self.ts = 0
+        self.last_update_id: Optional[int] = None
+        self.synced = False                   # поток диффов стыкуется со снапшотом (для REST-снапшотов — всегда)
+        self.needs_snapshot = False           # разрыв/переподключение потока: диффы копим до нового снапшота
+        self.updates = 0
+        self.bucket_size = 0.0
+        self._buckets: Dict[str, Dict[int, float]] = {BID: {}, ASK: {}}
+        self._walls: Dict[Tuple[str, float], Tuple[int, float]] = {}   # (side, price) -> (first_seen_ms, notional)
+        self._scan_thr = 0.0
+        self._lock = threading.RLock()
+
+    @property
+    def bids(self) -> BookSide:
+        return self.sides[BID]
+
+    @property
+    def asks(self) -> BookSide:
+        return self.sides[ASK]
+
+    @property
+    def total_notional(self) -> float:
+        return self.bids.total + self.asks.total
+
+    def mid(self) -> Optional[float]:
+        b, a = self.bids.best(), self.asks.best()
+        if b is None or a is None:
+            return b if a is None else a
+        return (b + a) / 2.0
+
+    def age_sec(self, now_ms: Optional[int] = None) -> float:
+        now_ms = _now_ms() if now_ms is None else now_ms
+        return max(0.0, (now_ms - self.ts) / 1000.0) if self.ts else float("inf")
+
+    def wall_threshold(self) -> float:
+        return max(self.wall_min_usd, self.total_notional * self.wall_share)
+
+    # ---------- корзины глубины ----------
+
+    def _bucket_ids(self, px: np.ndarray) -> np.ndarray:
+        return np.floor(px / self.bucket_size).astype(np.int64)
+
+    def _rebuild_buckets(self) -> None:
+        mid = self.mid()
+        if self.bucket_size <= 0 and mid:                 # шаг корзин фиксируется по первому снапшоту
+            self.bucket_size = mid * self.bucket_bps / 10_000.0
+        for name, side in self.sides.items():
+            self._buckets[name] = {}
+            self._bump_buckets(name, side.px, side.notional)
+
+    def _bump_buckets(self, side: str, px: np.ndarray, delta: np.ndarray) -> None:
+        if not len(px) or self.bucket_size <= 0:
+            return
+        ids, inv = np.unique(self._bucket_ids(px), return_inverse=True)
+        sums = np.bincount(inv, weights=delta)
+        b = self._buckets[side]
+        for i, d in zip(ids.tolist(), sums.tolist()):
+            v = b.get(i, 0.0) + d
+            if v > 1e-9:
+                b[i] = v
+            else:
+                b.pop(i, None)
+
+    def buckets(self, side: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(нижняя граница корзины, нотионал) по возрастанию цены — глубина для тепловых карт."""
+        with self._lock:
+            b = self._buckets[side]
+            ids = np.fromiter(sorted(b), np.int64, len(b))
+            return ids * self.bucket_size, np.fromiter((b[i] for i in ids.tolist()), float, len(b))
+
+    # ---------- стены ----------
+
+    def _gone(self, key: Tuple[str, float], ts: int, out: List[WallEvent]) -> None:
+        first, notional = self._walls.pop(key)
+        side, price = key
+        best_opp = self.asks.best() if side == BID else self.bids.best()
+        best_own = self.bids.best() if side == BID else self.asks.best()
+        # до стены дошла цена: лучшая цена своей стороны на ней или за ней / противоположная её пересекла
+        reached = (best_own is None or (best_own <= price if side == BID else best_own >= price)
+                   or (best_opp is not None and (best_opp <= price if side == BID else best_opp >= price)))
+        lifetime = max(0, ts - first)
+        out.append(WallEvent(self.venue, self.symbol, side, price, notional, "disappear", ts, lifetime,
+                             spoof=(not reached) and lifetime <= self.spoof_max_ms))
+
+    def _scan_walls(self, ts: int, out: List[WallEvent], in_range: Optional[Tuple[float, float]] = None) -> None:
+        """Полный пересмотр стен (снапшот или сильно упавший порог) — векторно по обеим сторонам."""
+        thr = self.wall_threshold()
+        self._scan_thr = thr
+        now: Dict[Tuple[str, float], float] = {}
+        for name, side in self.sides.items():
+            m = side.notional >= thr
+            now.update(((name, p), n) for p, n in zip(side.px[m].tolist(), side.notional[m].tolist()))
+        for key in [k for k in self._walls if k not in now]:
+            if in_range is not None and not (in_range[0] <= key[1] <= in_range[1]):
+                self._walls.pop(key)                       # уровень просто вышел за глубину снапшота
+                continue
+            self._gone(key, ts, out)
+        for key, n in now.items():
+            if key in self._walls:
+                self._walls[key] = (self._walls[key][0], n)
+            else:
+                self._walls[key] = (ts, n)
+                out.append(WallEvent(self.venue, self.symbol, key[0], key[1], n, "appear", ts))
+
+    def _check_walls(self, side: str, px: np.ndarray, new: np.ndarray, ts: int, out: List[WallEvent]) -> None:
+        thr = self.wall_threshold()
+        if thr < self._scan_thr * 0.8:                     # порог заметно упал — могли «вырасти» нетронутые уровни
+            self._scan_walls(ts, out)
+            return
+        for key in [k for k, (_, n) in self._walls.items() if n < thr]:
+            self._gone(key, ts, out)
+        m = (new >= thr) | np.isin(px, [p for s, p in self._walls if s == side])
+        for p, n in zip(px[m].tolist(), new[m].tolist()):
+            key = (side, p)
+            if n >= thr:
+                if key in self._walls:
+                    self._walls[key] = (self._walls[key][0], n)
+                else:
+                    self._walls[key] = (ts, n)
+                    out.append(WallEvent(self.venue, self.symbol, side, p, n, "appear", ts))
+            elif key in self._walls:
+                self._gone(key, ts, out)
+
+    def walls(self) -> List[Tuple[str, float, float, int]]:
+        """Текущие стены: (side, price, notional, first_seen_ms), крупные первыми."""
+        with self._lock:
+            return sorted(((s, p, n, first) for (s, p), (first, n) in self._walls.items()), key=lambda w: -w[2])
+
+    # ---------- обновления ----------
+
+    def load_snapshot(self, bids: Sequence, asks: Sequence, ts: Optional[int] = None,
+                      last_update_id: Optional[int] = None) -> List[WallEvent]:
+        """Полная замена стакана. Стены сверяются с прошлым состоянием (в пределах глубины снапшота)."""
+        ts = _now_ms() if ts is None else int(ts)
+        out: List[WallEvent] = []
+        with self._lock:
+            had = bool(len(self.bids) or len(self.asks))
+            for name, rows in ((BID, bids), (ASK, asks)):
+                self.sides[name].load(*parse_levels(rows))
+            lo = self.bids.px[0] if len(self.bids) else (self.asks.px[0] if len(self.asks) else 0.0)
+            hi = self.asks.px[-1] if len(self.asks) else (self.bids.px[-1] if len(self.bids) else 0.0)
+            self.ts, self.last_update_id = ts, last_update_id
+            self.synced = last_update_id is None
+            self.needs_snapshot = False
+            self.updates += 1
+            self._rebuild_buckets()
+            self._scan_walls(ts, out, in_range=(lo, hi) if had else None)
+        return out
+
+    def apply_diff(self, bids: Sequence, asks: Sequence, ts: Optional[int] = None,
+                   update_id: Optional[int] = None) -> List[WallEvent]:
+        ts = _now_ms() if ts is None else int(ts)
+        out: List[WallEvent] = []
+        with self._lock:
+            changed = []
+            for name, rows in ((BID, bids), (ASK, asks)):
+                px, old, new = self.sides[name].apply(*parse_levels(rows))
+                self._bump_buckets(name, px, new - old)
+                changed.append((name, px, new))
+            for name, px, new in changed:
+                self._check_walls(name, px, new, ts, out)
+            self.ts = ts
+            if update_id is not None:
+                self.last_update_id = update_id
+            self.updates += 1
+        return out
+
+    # ---------- запросы ----------
+
+    def depth(self, side: str, levels: Optional[int] = None, within_pct: Optional[float] = None) -> float:
+        """Нотионал стороны: первые levels уровней от лучшей цены или в пределах within_pct от mid."""
+        with self._lock:
+            s = self.sides[side]
+            cum = s.cumulative()
+            if not len(cum):
+                return 0.0
+            k = len(cum)
+            if levels is not None:
+                k = min(k, max(0, int(levels)))
+            if within_pct is not None and self.mid():
+                px = s.from_best()[0]
+                lim = self.mid() * (1 - within_pct / 100.0) if s.is_bid else self.mid() * (1 + within_pct / 100.0)
+                k = min(k, int(np.count_nonzero(px >= lim if s.is_bid else px <= lim)))
+            return float(cum[k - 1]) if k > 0 else 0.0
+
+    def whale_orders(self, min_amount_usd: Optional[float] = None, current_price: Optional[float] = None,
+                     max_dist: float = 0.1, exchange: Optional[str] = None) -> list:
+        """
+        Крупные лимитные заявки (free_market_data.WhaleOrder), крупные первыми.
+        Порог по умолчанию — порог стен; фильтр — не дальше max_dist от цены.
+        """
+        from .free_market_data import WhaleOrder
+        with self._lock:
+            price = current_price or self.mid()
+            if not price:
+                return []
+            thr = self.wall_threshold() if min_amount_usd is None else float(min_amount_usd)
+            found = []
+            for name, label in ((BID, "buy"), (ASK, "sell")):
+                s = self.sides[name]
+                m = (s.notional >= thr) & (np.abs(s.px - price) / price <= max_dist)
+                found += [(n, p, label) for p, n in zip(s.px[m].tolist(), s.notional[m].tolist())]
+        found.sort(key=lambda x: -x[0])
+        return [WhaleOrder(price=p, amount=n, side=label, age="Live", exchange=exchange or self.venue)
+                for n, p, label in found]
+
+
+class OrderBookService:
+    """Стаканы процесса по (площадка, символ), события стен и источники обновлений."""
+
+    def __init__(self, events_keep: int = BOOK_EVENTS_KEEP, **book_kwargs):
+        self._books: Dict[Tuple[str, str], OrderBook] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[WallEvent], None]] = []
+        self.events: Deque[WallEvent] = deque(maxlen=max(1, int(events_keep)))
+        self._book_kwargs = book_kwargs
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"snapshots": 0, "diffs": 0, "gaps": 0, "stale_diffs": 0, "events": 0}
+
+    def book(self, venue: str, symbol: str, create: bool = False) -> Optional[OrderBook]:
+        key = (venue.lower(), symbol.upper())
+        with self._lock:
+            b = self._books.get(key)
+            if b is None and create:
+                b = self._books[key] = OrderBook(key[0], key[1], **self._book_kwargs)
+            return b
+
+    def fresh_book(self, venue: str, symbol: str, max_age_sec: float = BOOK_MAX_AGE_SEC,
+                   now_ms: Optional[int] = None) -> Optional[OrderBook]:
+        """Стакан, который можно отдавать вместо REST: синхронизирован и обновлялся недавно."""
+        b = self.book(venue, symbol)
+        if b is None or not b.synced or b.needs_snapshot or b.age_sec(now_ms) > max_age_sec:
+            return None
+        return b
+
+    # ---------- события ----------
+
+    def add_listener(self, fn: Callable[[WallEvent], None]) -> None:
+        with self._lock:
+            if fn not in self._listeners:
+                self._listeners.append(fn)
+
+    def remove_listener(self, fn: Callable[[WallEvent], None]) -> None:
+        with self._lock:
+            if fn in self._listeners:
+                self._listeners.remove(fn)
+
+    def _publish(self, evs: List[WallEvent]) -> List[WallEvent]:
+        if not evs:
+            return evs
+        with self._lock:
+            self.events.extend(evs)
+            self.stats["events"] += len(evs)
+            listeners = list(self._listeners)
+        for fn in listeners:
+            for ev in evs:
+                try:
+                    fn(ev)
+                except Exception:
+                    log.exception("wall event listener failed")
+        return evs
+
+    def recent_events(self, venue: Optional[str] = None, symbol: Optional[str] = None,
+                      kind: Optional[str] = None, since_ms: int = 0, spoof_only: bool = False) -> List[WallEvent]:
+        with self._lock:
+            evs = list(self.events)
+        return [e for e in evs if (venue is None or e.venue == venue.lower())
+                and (symbol is None or e.symbol == symbol.upper()) and (kind is None or e.kind == kind)
+                and e.ts >= since_ms and (not spoof_only or e.spoof)]
+
+    # ---------- обновления ----------
+
+    def apply_snapshot(self, venue: str, symbol: str, bids: Sequence, asks: Sequence, ts: Optional[int] = None,
+                       last_update_id: Optional[int] = None) -> OrderBook:
+        b = self.book(venue, symbol, create=True)
+        if b.last_update_id is not None and last_update_id is None:
+            # стакан ведёт поток диффов — REST-снапшот его не подменяет, считаем по отдельной копии
+            tmp = OrderBook(b.venue, b.symbol, **self._book_kwargs)
+            tmp.load_snapshot(bids, asks, ts)
+            return tmp
+        self.stats["snapshots"] += 1
+        self._publish(b.load_snapshot(bids, asks, ts, last_update_id))
+        return b
+
+    def apply_diff(self, venue: str, symbol: str, bids: Sequence, asks: Sequence, ts: Optional[int] = None,
+                   first_id: Optional[int] = None, last_id: Optional[int] = None,
+                   prev_id: Optional[int] = None) -> List[WallEvent]:
+        """
+        Дифф потока. С id — правила синхронизации Binance: u < lastUpdateId снапшота — устарел; первый
+        применённый должен накрывать lastUpdateId (U ≤ id ≤ u), дальше pu == u предыдущего, иначе —
+        разрыв: стакан помечается несинхронным до следующего снапшота.
+        """
+        b = self.book(venue, symbol)
+        if b is None:
+            return []
+        if last_id is not None and b.last_update_id is not None:
+            lid = b.last_update_id
+            if last_id < lid:
+                self.stats["stale_diffs"] += 1
+                return []
+            if not b.synced:
+                if first_id is not None and first_id > lid + (0 if prev_id is not None else 1):
+                    return self._gap(b)
+                b.synced = True
+            elif (prev_id != lid) if prev_id is not None else (first_id is not None and first_id != lid + 1):
+                return self._gap(b)
+        elif not b.synced:
+            return []
+        self.stats["diffs"] += 1
+        return self._publish(b.apply_diff(bids, asks, ts, last_id))
+
+    def _gap(self, b: OrderBook) -> List[WallEvent]:
+        self.stats["gaps"] += 1
+        b.synced = False
+        b.needs_snapshot = True
+        log.info("order book gap %s %s — ждём новый снапшот", b.venue, b.symbol)
+        return []
+
+    def handle(self, msg: Dict) -> List[WallEvent]:
+        """Сообщение в общем формате (реплей/поток): {"type": "snapshot" | "diff", "venue", "symbol", ...}."""
+        venue, symbol = msg.get("venue", "binance"), msg["symbol"]
+        if msg.get("type") == "snapshot":
+            self.stats["snapshots"] += 1
+            b = self.book(venue, symbol, create=True)
+            return self._publish(b.load_snapshot(msg.get("bids"), msg.get("asks"), msg.get("ts"),
+                                                 msg.get("lastUpdateId")))
+        return self.apply_diff(venue, symbol, msg.get("bids"), msg.get("asks"), msg.get("ts"),
+                               msg.get("U"), msg.get("u"), msg.get("pu"))
+
+    def replay(self, path: str) -> int:
+        """Файловый источник: JSONL в формате handle(). Возвращает число событий стен."""
+        n = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    n += len(self.handle(json.loads(line)))
+        return n
+
+    # ---------- поток диффов Binance USDT-M ----------
+
+    @staticmethod
+    def _fetch_binance_snapshot(symbol: str) -> Dict:
+        from .http_transport import get_transport
+        r = get_transport().get(f"{BINANCE_FUT}/fapi/v1/depth",
+                                params={"symbol": symbol, "limit": BOOK_SNAPSHOT_DEPTH}, timeout=10)
+        r.raise_for_status()
+        j = r.json()
+        return {"type": "snapshot", "venue": "binance", "symbol": symbol, "ts": int(j.get("E") or _now_ms()),
+                "lastUpdateId": int(j["lastUpdateId"]), "bids": j.get("bids"), "asks": j.get("asks")}
+
+    async def _resync(self, symbol: str, buffered: List[Dict]) -> None:
+        try:
+            snap = await asyncio.to_thread(self._fetch_binance_snapshot, symbol)
+        except Exception as e:
+            log.warning("order book snapshot %s failed: %s", symbol, e)
+            return
+        self.handle(snap)
+        pending, buffered[:] = list(buffered), []
+        for msg in pending:
+            self.handle(msg)
+
+    async def _run_binance(self, symbols: Sequence[str]) -> None:
+        streams = "/".join(f"{s.lower()}@depth@100ms" for s in symbols)
+        url = f"{BINANCE_FUT_WS}/stream?streams={streams}"
+        backoff = 1.0
+        while True:
+            buffers: Dict[str, List[Dict]] = {s: [] for s in symbols}
+            resync: Dict[str, asyncio.Task] = {}
+            try:
+                async with aiohttp.ClientSession() as sess:
+                    async with sess.ws_connect(url, heartbeat=30) as ws:
+                        backoff = 1.0
+                        for s in symbols:
+                            b = self.book("binance", s)
+                            if b is not None:
+                                b.needs_snapshot = True
+                        async for frame in ws:
+                            if frame.type != aiohttp.WSMsgType.TEXT:
+                                if frame.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                                    break
+                                continue
+                            d = json.loads(frame.data).get("data") or {}
+                            s = str(d.get("s") or "").upper()
+                            if s not in buffers:
+                                continue
+                            msg = {"type": "diff", "venue": "binance", "symbol": s, "ts": d.get("E"),
+                                   "U": d.get("U"), "u": d.get("u"), "pu": d.get("pu"), "bids": d.get("b"),
+                                   "asks": d.get("a")}
+                            b = self.book("binance", s)
+                            if b is None or b.needs_snapshot:
+                                buffers[s].append(msg)
+                                t = resync.get(s)
+                                if t is None or t.done():
+                                    buffers[s][:] = buffers[s][-1:]
+                                    resync[s] = asyncio.create_task(self._resync(s, buffers[s]))
+                                continue
+                            self.handle(msg)
+            except asyncio.CancelledError:
+                for t in resync.values():
+                    t.cancel()
+                raise
+            except Exception as e:
+                log.warning("order book stream failed: %s", e)
+            for t in resync.values():
+                t.cancel()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    def start(self, symbols: Iterable[str] = BOOK_STREAM_SYMBOLS) -> None:
+        """Поток диффов на текущем event loop (из post_init бота). Без aiohttp — только REST/реплей."""
+        symbols = [s.upper() for s in symbols]
+        if not symbols or aiohttp is None:
+            return
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run_binance(symbols), name="orderbook_stream")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def get_stats(self) -> Dict[str, object]:
+        with self._lock:
+            books = {f"{v}:{s}": {"levels": len(b.bids) + len(b.asks), "synced": b.synced, "age_sec": b.age_sec(),
+                                  "walls": len(b._walls)} for (v, s), b in self._books.items()}
+        return {**self.stats, "books": books}
+
+
+_service: Optional[OrderBookService] = None
+_service_lock = threading.Lock()
+
+
+def get_orderbook_service() -> OrderBookService:
+    """Единый сервис стаканов процесса."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = OrderBookService()
+        return _service
@@ -24,6 +24,7 @@ log = logging.getLogger("alt_forecast.queue")
 class TaskType(str, Enum):
     """Типы задач для очереди."""
     FORECAST_BTC = "forecast_btc"
+    FORECAST = "forecast"              # {symbol, timeframe, horizon} — батчится в forecast_worker
     GENERATE_REPORT = "generate_report"
     UPDATE_CACHE = "update_cache"
     PROCESS_DIVERGENCE = "process_divergence"
@@ -1,134 +1,414 @@
 # app/infrastructure/quota.py
-import os, time, threading
+"""
+Месячная квота CoinGecko: общий для всех процессов леджер в SQLite + планировщик TTL кэша.
+
+Резервирование — атомарный `UPDATE ... WHERE used + n <= limit RETURNING used` на отдельном соединении
+(не на общем соединении DB), поэтому бот, воркер и API не могут вместе перерасходовать месяц.
+Процесс берёт единицы блоками (QUOTA_RESERVE_BLOCK) и раздаёт их локально без записи в БД; около
+лимита блок сжимается до 1. Учёт по эндпоинтам и спрос (вызовы, включая попадания в кэш) копятся
+в памяти и сбрасываются одной транзакцией при взятии следующего блока или раз в QUOTA_FLUSH_SEC.
+
+Планировщик делит остаток месяца между markets_snapshot / categories / trending / global_stats /
+defi_global по наблюдаемому спросу: минимизируем взвешенную спросом устарелость Σ d_i·ttl_i при
+Σ T/ttl_i ≤ остаток, откуда ttl_i ∝ 1/√d_i (с границами [min, max] на эндпоинт). TTL подхватывает
+`cached(ttl=ttl_for(...))` на каждом вызове.
+
+    @demand("trending")
+    @cached(ttl=ttl_for("trending"), key_fn=lambda: "trending", stale_ok=True)
+    def trending(): return _trending_with_quota()
+
+    @budget_guard(units=1, endpoint="trending")
+    def _trending_with_quota(): ...
+"""
+
+import atexit
+import calendar
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
 from functools import wraps
-from typing import Optional
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger("alt_forecast.quota")
 
 MONTH_LIMIT = int(os.getenv("COINGECKO_MONTH_LIMIT", "10000"))
-_state = {"month": None, "used": 0}
-_lock = threading.Lock()
-_db: Optional[object] = None  # БД для персистентности квоты
+# сколько единиц процесс резервирует за одну запись в леджер
+QUOTA_RESERVE_BLOCK = int(os.getenv("QUOTA_RESERVE_BLOCK", "5"))
+QUOTA_FLUSH_SEC = float(os.getenv("QUOTA_FLUSH_SEC", "60"))
+QUOTA_PLAN_SEC = float(os.getenv("QUOTA_PLAN_SEC", "300"))
+# доля остатка, которую планировщик не раздаёт (markets_by_category, ручные запросы, ошибки)
+QUOTA_PLAN_RESERVE = float(os.getenv("QUOTA_PLAN_RESERVE", "0.1"))
+# до стольких секунд наблюдений в месяце спрос считаем неизвестным — TTL по умолчанию
+QUOTA_PLAN_MIN_OBS_SEC = float(os.getenv("QUOTA_PLAN_MIN_OBS_SEC", "3600"))
 
+# эндпоинт -> (min_ttl, default_ttl, max_ttl), сек
+PLANNED_ENDPOINTS: Dict[str, Tuple[int, int, int]] = {
+    "markets_snapshot": (120, 60 * 60, 6 * 60 * 60),
+    "categories": (60 * 60, 24 * 60 * 60, 48 * 60 * 60),
+    "trending": (5 * 60, 30 * 60, 6 * 60 * 60),
+    "global_stats": (5 * 60, 60 * 60, 12 * 60 * 60),
+    "defi_global": (10 * 60, 60 * 60, 24 * 60 * 60),
+}
 
-def init_quota_db(db):
-    """Инициализировать БД для сохранения квоты."""
-    global _db
-    _db = db
-    if _db:
-        _init_quota_table(_db)
-
-
-def _init_quota_table(db):
-    """Инициализировать таблицу для хранения квоты."""
-    cur = db.conn.cursor()
-    cur.executescript("""
-        CREATE TABLE IF NOT EXISTS coingecko_quota (
-            month_id TEXT PRIMARY KEY,
-            used INTEGER NOT NULL DEFAULT 0,
-            updated_at_ms INTEGER NOT NULL
-        );
-    """)
-    db.conn.commit()
-
-
-def _load_quota_from_db():
-    """Загрузить квоту из БД."""
-    global _state
-    if not _db:
-        return
-    
-    try:
-        cur = _db.conn.cursor()
-        mid = _month_id()
-        cur.execute(
-            "SELECT used FROM coingecko_quota WHERE month_id = ?",
-            (mid,)
-        )
-        row = cur.fetchone()
-        if row:
-            _state["month"] = mid
-            _state["used"] = row[0]
-    except Exception:
-        pass  # Если БД недоступна, используем in-memory состояние
-
-
-def _save_quota_to_db():
-    """Сохранить квоту в БД."""
-    if not _db:
-        return
-    
-    try:
-        cur = _db.conn.cursor()
-        mid = _month_id()
-        import time as time_module
-        cur.execute("""
-            INSERT OR REPLACE INTO coingecko_quota (month_id, used, updated_at_ms)
-            VALUES (?, ?, ?)
-        """, (mid, _state["used"], int(time_module.time() * 1000)))
-        _db.conn.commit()
-    except Exception:
-        pass  # Если БД недоступна, продолжаем работу
-
-
-def _month_id():
-    t = time.gmtime()
+
+def _month_id(now: Optional[float] = None):
+    t = time.gmtime(now)
     return f"{t.tm_year:04d}-{t.tm_mon:02d}"
 
 
-def budget_guard(units: int = 1):
+def _month_bounds(now: float) -> Tuple[float, float]:
+    """(начало, конец) текущего месяца UTC в секундах."""
+    t = time.gmtime(now)
+    y, m = (t.tm_year + 1, 1) if t.tm_mon == 12 else (t.tm_year, t.tm_mon + 1)
+    return float(calendar.timegm((t.tm_year, t.tm_mon, 1, 0, 0, 0))), float(calendar.timegm((y, m, 1, 0, 0, 0)))
+
+
+def plan_ttls(remaining: float, horizon_sec: float, rates: Dict[str, float],
+              bounds: Dict[str, Tuple[int, int, int]] = PLANNED_ENDPOINTS) -> Dict[str, float]:
+    """
+    TTL по эндпоинтам: минимум Σ d_i·ttl_i при Σ horizon/ttl_i ≤ remaining, ttl_i ∈ [min_i, max_i].
+
+    Без ограничений ttl_i = horizon·Σ√d_j / (remaining·√d_i); эндпоинты, упёршиеся в границу,
+    фиксируем и пересчитываем остальных на оставшемся бюджете («заливка»).
+    Эндпоинт без спроса — max_ttl. Обновлений больше, чем запросов, не бывает: ttl ≥ 1/d_i.
+    """
+    ttl: Dict[str, float] = {}
+    free = {}
+    for name, (lo, _default, hi) in bounds.items():
+        d = max(0.0, float(rates.get(name, 0.0)))
+        if d <= 0:
+            ttl[name] = float(hi)
+        else:
+            free[name] = (d, max(float(lo), min(float(hi), 1.0 / d)), float(hi))
+    budget = max(0.0, float(remaining)) - sum(horizon_sec / t for t in ttl.values())
+    while free:
+        if budget <= 0:
+            ttl.update({n: hi for n, (_, _, hi) in free.items()})
+            break
+        scale = horizon_sec * sum(math.sqrt(d) for d, _, _ in free.values()) / budget
+        clamped = {}
+        for name, (d, lo, hi) in free.items():
+            t = scale / math.sqrt(d)
+            if t < lo or t > hi:
+                clamped[name] = lo if t < lo else hi
+        if not clamped:
+            ttl.update({n: scale / math.sqrt(d) for n, (d, _, _) in free.items()})
+            break
+        for name, t in clamped.items():
+            ttl[name] = t
+            budget -= horizon_sec / t
+            free.pop(name)
+    return ttl
+
+
+class QuotaLedger:
+    """Леджер квоты на своём соединении с файлом БД; безопасен между потоками и процессами."""
+
+    def __init__(self, path: Optional[str] = None, limit: Optional[int] = None,
+                 block: int = QUOTA_RESERVE_BLOCK, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.limit = MONTH_LIMIT if limit is None else int(limit)
+        self.block = max(1, int(block))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._month: Optional[str] = None
+        self._lease = 0                         # зарезервировано в леджере, ещё не потрачено
+        self._shared_used = 0                   # последнее увиденное значение used (всех процессов)
+        self._local_used = 0                    # потрачено этим процессом без леджера (БД недоступна)
+        self._pending_used: Dict[str, int] = {}
+        self._pending_demand: Dict[str, int] = {}
+        self._flushed_at = 0.0
+        self._plan: Dict[str, float] = {}
+        self._planned_at = -1e18
+
+    # ---------- соединение ----------
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        if self._conn is None and self.path:
+            try:
+                conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5.0)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA busy_timeout=5000")
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS coingecko_quota (
+                        month_id TEXT PRIMARY KEY,
+                        used INTEGER NOT NULL DEFAULT 0,
+                        updated_at_ms INTEGER NOT NULL
+                    );
+                    CREATE TABLE IF NOT EXISTS coingecko_quota_endpoints (
+                        month_id TEXT NOT NULL,
+                        endpoint TEXT NOT NULL,
+                        used INTEGER NOT NULL DEFAULT 0,      -- реальные запросы к API
+                        demand INTEGER NOT NULL DEFAULT 0,    -- вызовы, включая попадания в кэш
+                        PRIMARY KEY (month_id, endpoint)
+                    );
+                """)
+                self._conn = conn
+            except Exception:
+                logger.warning("quota ledger unavailable at %s, counting in memory", self.path, exc_info=True)
+                self.path = None
+        return self._conn
+
+    def _roll_month(self, mid: str) -> None:
+        if self._month != mid:
+            if self._month is not None and self._conn is not None:
+                try:
+                    self._flush_locked(self._conn)      # хвост прошлого месяца — в его строки
+                except sqlite3.Error:
+                    logger.warning("quota flush failed", exc_info=True)
+            self._month, self._lease, self._local_used, self._shared_used = mid, 0, 0, 0
+            self._pending_used.clear()
+            self._pending_demand.clear()
+            self._planned_at = -1e18
+
+    # ---------- резервирование ----------
+
+    def _reserve(self, conn: sqlite3.Connection, want: int) -> int:
+        """Атомарно забрать до want единиц (меньше — если столько не осталось). Возвращает взятое."""
+        now_ms = int(self._clock() * 1000)
+        conn.execute("INSERT OR IGNORE INTO coingecko_quota (month_id, used, updated_at_ms) VALUES (?, 0, ?)",
+                     (self._month, now_ms))
+        for n in sorted({want, 1}, reverse=True):
+            row = conn.execute(
+                "UPDATE coingecko_quota SET used = used + ?, updated_at_ms = ? "
+                "WHERE month_id = ? AND used + ? <= ? RETURNING used",
+                (n, now_ms, self._month, n, self.limit),
+            ).fetchone()
+            if row is not None:
+                self._shared_used = int(row[0])
+                return n
+        row = conn.execute("SELECT used FROM coingecko_quota WHERE month_id = ?", (self._month,)).fetchone()
+        self._shared_used = int(row[0]) if row else self._shared_used
+        return 0
+
+    def _block_size(self, units: int) -> int:
+        # около лимита берём поштучно, чтобы неиспользованные блоки других процессов не съели остаток
+        left = self.limit - self._shared_used
+        return units if left < 20 * self.block else max(units, self.block)
+
+    def consume(self, units: int = 1, endpoint: str = "other") -> None:
+        """Списать units за реальный запрос. RuntimeError, если месяц исчерпан."""
+        with self._lock:
+            self._roll_month(_month_id(self._clock()))
+            conn = self._db()
+            if conn is not None and self._lease < units:
+                try:
+                    self._lease += self._reserve(conn, self._block_size(units - self._lease))
+                    self._flush_locked(conn)
+                except sqlite3.Error:
+                    logger.warning("quota reserve failed, counting in memory", exc_info=True)
+                    conn = None
+            if conn is not None:
+                if self._lease < units:
+                    raise RuntimeError(
+                        f"COINGECKO_BUDGET_EXCEEDED: использовано {self._shared_used}/{self.limit} запросов в этом месяце"
+                    )
+                self._lease -= units
+            else:
+                if self._local_used + units > self.limit:
+                    raise RuntimeError(
+                        f"COINGECKO_BUDGET_EXCEEDED: использовано {self._local_used}/{self.limit} запросов в этом месяце"
+                    )
+                self._local_used += units
+            self._pending_used[endpoint] = self._pending_used.get(endpoint, 0) + units
+            self._maybe_flush_locked(conn)
+
+    def record_demand(self, endpoint: str) -> None:
+        """Учесть обращение к данным эндпоинта (в т.ч. из кэша) — вход планировщика."""
+        with self._lock:
+            self._roll_month(_month_id(self._clock()))
+            self._pending_demand[endpoint] = self._pending_demand.get(endpoint, 0) + 1
+            self._maybe_flush_locked(self._conn)
+
+    # ---------- сброс ----------
+
+    def _maybe_flush_locked(self, conn: Optional[sqlite3.Connection]) -> None:
+        if conn is not None and self._clock() - self._flushed_at >= QUOTA_FLUSH_SEC:
+            try:
+                self._flush_locked(conn)
+            except sqlite3.Error:
+                logger.warning("quota flush failed", exc_info=True)
+
+    def _flush_locked(self, conn: sqlite3.Connection) -> None:
+        self._flushed_at = self._clock()
+        names = set(self._pending_used) | set(self._pending_demand)
+        if not names:
+            return
+        rows = [(self._month, n, self._pending_used.get(n, 0), self._pending_demand.get(n, 0)) for n in names]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO coingecko_quota_endpoints (month_id, endpoint, used, demand) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(month_id, endpoint) DO UPDATE SET used = used + excluded.used, "
+                "demand = demand + excluded.demand",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._pending_used.clear()
+        self._pending_demand.clear()
+
+    def flush(self, release: bool = False) -> None:
+        """Сбросить накопленное; release=True — вернуть неиспользованный блок в леджер (останов процесса)."""
+        with self._lock:
+            conn = self._db()
+            if conn is None or self._month is None:
+                return
+            try:
+                self._flush_locked(conn)
+                if release and self._lease:
+                    conn.execute("UPDATE coingecko_quota SET used = MAX(0, used - ?) WHERE month_id = ?",
+                                 (self._lease, self._month))
+                    self._lease = 0
+            except sqlite3.Error:
+                logger.warning("quota flush failed", exc_info=True)
+
+    # ---------- состояние и план ----------
+
+    def snapshot(self) -> Dict[str, object]:
+        """Состояние месяца по леджеру (все процессы, включая их невыбранные блоки) + учёт по эндпоинтам."""
+        with self._lock:
+            self._roll_month(_month_id(self._clock()))
+            conn = self._db()
+            used = self._local_used
+            endpoints: Dict[str, Dict[str, int]] = {}
+            if conn is not None:
+                try:
+                    self._flush_locked(conn)
+                    row = conn.execute("SELECT used FROM coingecko_quota WHERE month_id = ?", (self._month,)).fetchone()
+                    used = int(row[0]) - self._lease if row else 0
+                    for name, u, d in conn.execute(
+                        "SELECT endpoint, used, demand FROM coingecko_quota_endpoints WHERE month_id = ?", (self._month,)
+                    ):
+                        endpoints[name] = {"used": int(u), "demand": int(d)}
+                except sqlite3.Error:
+                    logger.warning("quota snapshot failed", exc_info=True)
+            else:
+                for name, u in self._pending_used.items():
+                    endpoints.setdefault(name, {"used": 0, "demand": 0})["used"] += u
+                for name, d in self._pending_demand.items():
+                    endpoints.setdefault(name, {"used": 0, "demand": 0})["demand"] += d
+            return {"month": self._month, "used": max(0, used), "limit": self.limit, "endpoints": endpoints}
+
+    def plan(self, force: bool = False) -> Dict[str, float]:
+        """TTL по планируемым эндпоинтам (пересчёт не чаще QUOTA_PLAN_SEC)."""
+        now = self._clock()
+        if not force and now - self._planned_at < QUOTA_PLAN_SEC and self._plan:
+            return self._plan
+        self._planned_at = now
+        snap = self.snapshot()
+        start, end = _month_bounds(now)
+        elapsed, horizon = max(1.0, now - start), max(1.0, end - now)
+        endpoints = snap["endpoints"]
+        if elapsed < QUOTA_PLAN_MIN_OBS_SEC or not any(e["demand"] for e in endpoints.values()):
+            self._plan = {n: float(b[1]) for n, b in PLANNED_ENDPOINTS.items()}
+            return self._plan
+        remaining = snap["limit"] - snap["used"]
+        # непланируемые эндпоинты тратят в прежнем темпе — вычитаем их прогноз
+        other = sum(e["used"] for n, e in endpoints.items() if n not in PLANNED_ENDPOINTS)
+        budget = remaining * (1.0 - QUOTA_PLAN_RESERVE) - other / elapsed * horizon
+        rates = {n: endpoints.get(n, {}).get("demand", 0) / elapsed for n in PLANNED_ENDPOINTS}
+        self._plan = plan_ttls(budget, horizon, rates)
+        logger.debug("quota plan: %s", {n: round(t) for n, t in self._plan.items()})
+        return self._plan
+
+    def ttl(self, endpoint: str) -> float:
+        try:
+            return self.plan().get(endpoint) or float(PLANNED_ENDPOINTS[endpoint][1])
+        except Exception:
+            logger.warning("quota plan failed", exc_info=True)
+            return float(PLANNED_ENDPOINTS[endpoint][1])
+
+
+_ledger: Optional[QuotaLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> QuotaLedger:
+    """Леджер процесса; файл — settings.database_path, пока init_quota_db не указал другой."""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            from ..config import settings
+            _ledger = QuotaLedger(settings.database_path)
+            atexit.register(_ledger.flush, True)
+        return _ledger
+
+
+def init_quota_db(db):
+    """Привязать леджер к файлу БД приложения (соединение — своё, не db.conn)."""
+    global _ledger
+    path = getattr(db, "path", None) if db else None
+    with _ledger_lock:
+        if _ledger is not None:
+            _ledger.flush(release=True)
+        _ledger = QuotaLedger(path)
+        atexit.register(_ledger.flush, True)
+
+
+def budget_guard(units: int = 1, endpoint: Optional[str] = None):
     """
     Месячный счётчик внешних запросов к CoinGecko.
-    
+
     Если лимит превышен — бросает RuntimeError.
     Использовать ТОЛЬКО когда реально делается запрос к API (не при использовании кэша).
-    
+
     Args:
         units: Количество единиц квоты для этого запроса (по умолчанию 1)
+        endpoint: Имя эндпоинта для учёта (по умолчанию — имя функции)
     """
     def deco(fn):
+        name = endpoint or fn.__name__
+
         @wraps(fn)
         def w(*a, **k):
-            with _lock:
-                mid = _month_id()
-                
-                # Загружаем состояние из БД при первом использовании или смене месяца
-                if _state["month"] is None or _state["month"] != mid:
-                    _load_quota_from_db()
-                    if _state["month"] != mid:
-                        _state["month"], _state["used"] = mid, 0
-                
-                # Проверяем лимит
-                if _state["used"] + units > MONTH_LIMIT:
-                    raise RuntimeError(
-                        f"COINGECKO_BUDGET_EXCEEDED: использовано {_state['used']}/{MONTH_LIMIT} запросов в этом месяце"
-                    )
-                
-                # Увеличиваем счётчик
-                _state["used"] += units
-                _save_quota_to_db()
-            
+            get_ledger().consume(units, name)
             return fn(*a, **k)
         return w
     return deco
 
 
+def demand(endpoint: str):
+    """Учитывает каждое обращение к данным (до кэша) — спрос для планировщика TTL."""
+    def deco(fn):
+        @wraps(fn)
+        def w(*a, **k):
+            try:
+                get_ledger().record_demand(endpoint)
+            except Exception:
+                logger.debug("demand tracking failed", exc_info=True)
+            return fn(*a, **k)
+        return w
+    return deco
+
+
+def ttl_for(endpoint: str) -> Callable[[], float]:
+    """TTL кэша, который ведёт планировщик квоты (для cached(ttl=...))."""
+    return lambda: get_ledger().ttl(endpoint)
+
+
 def get_budget():
     """
     Получить текущее состояние квоты.
-    
+
     Returns:
         Tuple[dict, int]: (текущее состояние, лимит)
     """
-    with _lock:
-        mid = _month_id()
-        if _state["month"] is None or _state["month"] != mid:
-            _load_quota_from_db()
-            if _state["month"] != mid:
-                _state["month"], _state["used"] = mid, 0
-        
-        return {
-            "month": _state["month"],
-            "used": _state["used"],
-            "limit": MONTH_LIMIT,
-            "remaining": MONTH_LIMIT - _state["used"],
-            "percentage": (_state["used"] / MONTH_LIMIT * 100) if MONTH_LIMIT > 0 else 0
-        }, MONTH_LIMIT
+    ledger = get_ledger()
+    snap = ledger.snapshot()
+    used, limit = snap["used"], snap["limit"]
+    return {
+        "month": snap["month"],
+        "used": used,
+        "limit": limit,
+        "remaining": limit - used,
+        "percentage": (used / limit * 100) if limit > 0 else 0,
+        "endpoints": snap["endpoints"],
+        "ttl": dict(ledger.plan()),
+    }, limit
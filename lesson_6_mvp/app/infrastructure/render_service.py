@@ -0,0 +1,455 @@
+# app/infrastructure/render_service.py
+"""
+Вынесенный из event loop рендеринг PNG (matplotlib) с контентно-адресуемым кэшем.
+
+- пул «тёплых» процессов: matplotlib, шрифты и БД инициализируются один раз на процесс;
+- на вход — сериализуемая спецификация RenderSpec (kind + params [+ payload]);
+- результат — PNG bytes через awaitable (asyncio);
+- кэш по sha256(spec, data_version): LRU в памяти + опционально на диске, оба ограничены по размеру;
+- одновременные одинаковые запросы схлопываются в один рендер (single-flight).
+
+Пример:
+    svc = get_render_service(db.path)
+    png = await svc.render(RenderSpec("digest", {"tf": "1h"}), db=db)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from ..config import settings
+
+log = logging.getLogger("alt_forecast.render")
+
+# Параметры через ENV (0 воркеров = рендер в потоке без пула, удобно для тестов/dev)
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+RENDER_CACHE_MEM_MB = float(os.getenv("RENDER_CACHE_MEM_MB", "64"))
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", "")  # пусто = дисковый кэш выключен
+RENDER_CACHE_DISK_MB = float(os.getenv("RENDER_CACHE_DISK_MB", "256"))
+# Если версию данных нельзя определить по БД — «версией» служит окно времени
+RENDER_VERSION_BUCKET_SEC = int(os.getenv("RENDER_VERSION_BUCKET_SEC", "60"))
+
+
+@dataclass(frozen=True)
+class RenderSpec:
+    """
+    Сериализуемая спецификация картинки.
+
+    kind:    тип рендера (chart / digest / bubbles / corr_heatmap / liquidity_map)
+    params:  JSON-совместимые параметры, входят в ключ кэша
+    payload: крупные входные данные (список монет, DataFrame), в ключ НЕ входят —
+             их изменение должно отражаться в data_version
+    """
+    kind: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    payload: Any = None
+
+    def cache_key(self, data_version: Any) -> str:
+        raw = json.dumps(
+            {"kind": self.kind, "params": self.params, "v": data_version},
+            sort_keys=True, default=str, ensure_ascii=False,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ---------- кэш PNG ----------
+
+class PngCache:
+    """LRU-кэш PNG в памяти с ограничением по байтам + опциональный дисковый уровень."""
+
+    def __init__(
+        self,
+        max_mem_bytes: int = int(RENDER_CACHE_MEM_MB * 1024 * 1024),
+        disk_dir: Optional[str] = RENDER_CACHE_DIR or None,
+        max_disk_bytes: int = int(RENDER_CACHE_DISK_MB * 1024 * 1024),
+    ):
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._mem_bytes = 0
+        self._max_mem = max(0, int(max_mem_bytes))
+        self._disk_dir = disk_dir
+        self._max_disk = max(0, int(max_disk_bytes))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self._disk_dir:
+            os.makedirs(self._disk_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self._disk_dir, key[:2], f"{key}.png")
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._mem.get(key)
+            if data is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return data
+        if self._disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path, None)  # LRU по mtime
+                self._put_mem(key, data)
+                with self._lock:
+                    self.hits += 1
+                return data
+            except FileNotFoundError:
+                pass
+            except OSError:
+                log.warning("render cache: failed to read %s", path)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, data: bytes) -> None:
+        self._put_mem(key, data)
+        if self._disk_dir:
+            self._put_disk(key, data)
+
+    def _put_mem(self, key: str, data: bytes) -> None:
+        size = len(data)
+        if size > self._max_mem:
+            return
+        with self._lock:
+            old = self._mem.pop(key, None)
+            if old is not None:
+                self._mem_bytes -= len(old)
+            self._mem[key] = data
+            self._mem_bytes += size
+            while self._mem_bytes > self._max_mem and self._mem:
+                _, evicted = self._mem.popitem(last=False)
+                self._mem_bytes -= len(evicted)
+
+    def _put_disk(self, key: str, data: bytes) -> None:
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)  # атомарно, безопасно для нескольких процессов
+            self._evict_disk()
+        except OSError:
+            log.warning("render cache: failed to write %s", path)
+
+    def _evict_disk(self) -> None:
+        entries = []
+        total = 0
+        for root, _dirs, files in os.walk(self._disk_dir):
+            for name in files:
+                if not name.endswith(".png"):
+                    continue
+                p = os.path.join(root, name)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+                total += st.st_size
+        if total <= self._max_disk:
+            return
+        entries.sort()
+        for _mtime, size, p in entries:
+            if total <= self._max_disk:
+                break
+            try:
+                os.remove(p)
+                total -= size
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+            self._mem_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "mem_entries": len(self._mem),
+                "mem_bytes": self._mem_bytes,
+                "mem_limit_bytes": self._max_mem,
+                "disk_dir": self._disk_dir,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / total) if total else 0.0,
+            }
+
+
+# ---------- код, исполняемый в процессах пула ----------
+
+_worker_db = None
+_worker_db_path: Optional[str] = None
+
+
+def _worker_init(db_path: Optional[str]) -> None:
+    """Инициализация воркера: matplotlib (Agg), кэш шрифтов, модули рендеров."""
+    global _worker_db_path
+    _worker_db_path = db_path
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib import font_manager
+    font_manager.findfont("DejaVu Sans")  # прогреваем font cache
+    # Пробный рендер — первый savefig заметно медленнее последующих
+    fig, ax = plt.subplots(figsize=(1, 1), dpi=50)
+    ax.plot([0, 1], [0, 1])
+    fig.savefig(io.BytesIO(), format="png")
+    plt.close(fig)
+    # Импорт модулей рендеров (pandas, mplfinance и т.д.) тоже оплачиваем заранее
+    for mod in (
+        "app.visual.chart_renderer", "app.visual.digest", "app.visual.bubbles",
+        "app.visual.corr_heatmap", "app.liquidity_map.services.image_renderer",
+    ):
+        try:
+            __import__(mod)
+        except Exception:
+            log.debug("render worker: failed to preload %s", mod)
+
+
+def _get_worker_db():
+    global _worker_db
+    if _worker_db is None:
+        from .db import DB
+        _worker_db = DB(_worker_db_path)
+    return _worker_db
+
+
+def _to_bytes(out: Any) -> bytes:
+    if isinstance(out, (bytes, bytearray)):
+        return bytes(out)
+    if hasattr(out, "getvalue"):
+        return out.getvalue()
+    if hasattr(out, "read"):
+        out.seek(0)
+        return out.read()
+    raise TypeError(f"renderer returned {type(out).__name__}, expected PNG bytes")
+
+
+def _render_chart(params: Dict[str, Any], payload: Any) -> bytes:
+    from ..domain.chart_settings import ChartSettings
+    from ..visual.chart_renderer import render_chart
+    chart_settings = ChartSettings.from_params(dict(params.get("settings") or {}))
+    return render_chart(_get_worker_db(), params["metric"], chart_settings, n_bars=int(params.get("n_bars", 500)))
+
+
+def _render_digest(params: Dict[str, Any], payload: Any) -> bytes:
+    from ..visual.digest import render_digest
+    return render_digest(_get_worker_db(), params["tf"], n_bars=int(params.get("n_bars", 120)))
+
+
+def _render_bubbles(params: Dict[str, Any], payload: Any) -> bytes:
+    from ..visual.bubbles import render_bubbles
+    return render_bubbles(payload or [], **params)
+
+
+def _render_corr_heatmap(params: Dict[str, Any], payload: Any) -> bytes:
+    from ..visual.corr_heatmap import render_corr_heatmap
+    return render_corr_heatmap(payload)
+
+
+def _render_liquidity_map(params: Dict[str, Any], payload: Any) -> bytes:
+    from ..liquidity_map.application.generate_liquidity_map import generate_liquidity_map
+    return generate_liquidity_map(params["symbol"], _get_worker_db())
+
+
+RENDERERS: Dict[str, Callable[[Dict[str, Any], Any], Any]] = {
+    "chart": _render_chart,
+    "digest": _render_digest,
+    "bubbles": _render_bubbles,
+    "corr_heatmap": _render_corr_heatmap,
+    "liquidity_map": _render_liquidity_map,
+}
+
+
+def _render_in_worker(kind: str, params: Dict[str, Any], payload: Any) -> bytes:
+    fn = RENDERERS.get(kind)
+    if fn is None:
+        raise ValueError(f"unknown render kind '{kind}'")
+    return _to_bytes(fn(params, payload))
+
+
+# ---------- сервис ----------
+
+class RenderService:
+    """
+    Асинхронный фасад над пулом рендер-процессов и PngCache.
+
+    Версия данных (data_version) входит в ключ кэша: пока не закрылся новый бар,
+    повторные /chart, /bubbles, liquidity map отдаются из кэша без рендера.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        max_workers: int = RENDER_WORKERS,
+        cache: Optional[PngCache] = None,
+    ):
+        self.db_path = db_path or settings.database_path
+        self.max_workers = max(0, int(max_workers))
+        self.cache = cache or PngCache()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.renders = 0
+        self.render_time_sec = 0.0
+
+    # --- пул ---
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.max_workers <= 0:
+            return None
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn: процесс бота многопоточный (PTB, cached-рефреши), fork здесь небезопасен
+                ctx = multiprocessing.get_context("spawn")
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=ctx,
+                    initializer=_worker_init,
+                    initargs=(self.db_path,),
+                )
+                log.info("render pool started: workers=%d", self.max_workers)
+            return self._pool
+
+    def warm_up(self) -> None:
+        """Поднять процессы пула заранее (чтобы первый запрос не платил за старт)."""
+        pool = self._get_pool()
+        if pool is None:
+            return
+        for _ in range(self.max_workers):
+            pool.submit(time.sleep, 0)
+
+    def shutdown(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    # --- версия данных ---
+
+    @staticmethod
+    def data_version(spec: RenderSpec, db=None) -> Any:
+        """
+        Версия данных по умолчанию: ts последнего бара (metric/tf из params),
+        иначе — номер временного окна RENDER_VERSION_BUCKET_SEC.
+        """
+        p = spec.params
+        metric = p.get("metric") or p.get("symbol")
+        tf = p.get("tf") or (p.get("settings") or {}).get("timeframe")
+        if db is not None and metric and tf:
+            try:
+                ts = db.get_last_ts(metric, tf)
+                if ts is not None:
+                    return ts
+            except Exception:
+                log.debug("render: get_last_ts failed for %s %s", metric, tf)
+        return int(time.time() // max(1, RENDER_VERSION_BUCKET_SEC))
+
+    @staticmethod
+    def bars_version(db, metrics, tf: str) -> tuple:
+        """Версия набора серий (digest и т.п.): кортеж ts последних баров."""
+        return tuple(db.get_last_ts(m, tf) for m in metrics)
+
+    @staticmethod
+    def series_version(db, metrics, timeframes, bucket_sec: int = RENDER_VERSION_BUCKET_SEC,
+                       now: Optional[float] = None) -> tuple:
+        """
+        Версия рендера, читающего несколько ТФ (liquidity map и т.п.): ts последних баров всех (metric, tf)
+        и номер окна bucket_sec — в картинке есть «сейчас» (подпись времени, возраст зон), и серия без
+        баров не должна закреплять первый PNG навсегда.
+        """
+        return (tuple(db.get_last_ts(m, tf) for m in metrics for tf in timeframes),
+                int((time.time() if now is None else now) // max(1, bucket_sec)))
+
+    # --- рендер ---
+
+    async def render(self, spec: RenderSpec, *, data_version: Any = None, db=None) -> bytes:
+        """Вернуть PNG для spec (из кэша или отрендерив в пуле)."""
+        if data_version is None:
+            data_version = self.data_version(spec, db)
+        key = spec.cache_key(data_version)
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future = loop.create_future()
+        self._inflight[key] = fut
+        try:
+            png = await self._execute(spec)
+            self.cache.put(key, png)
+            fut.set_result(png)
+            return png
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # помечаем как полученное, чтобы не было warning'а
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _execute(self, spec: RenderSpec) -> bytes:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        pool = self._get_pool()
+        try:
+            if pool is None:
+                png = await loop.run_in_executor(None, self._render_inline, spec)
+            else:
+                try:
+                    png = await loop.run_in_executor(pool, _render_in_worker, spec.kind, spec.params, spec.payload)
+                except BrokenProcessPool:
+                    log.warning("render pool is broken, restarting and rendering inline")
+                    self.shutdown()
+                    png = await loop.run_in_executor(None, self._render_inline, spec)
+        finally:
+            self.renders += 1
+            self.render_time_sec += time.perf_counter() - started
+        return png
+
+    def _render_inline(self, spec: RenderSpec) -> bytes:
+        global _worker_db_path
+        if _worker_db_path is None:
+            _worker_db_path = self.db_path
+        return _render_in_worker(spec.kind, spec.params, spec.payload)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.max_workers,
+            "renders": self.renders,
+            "avg_render_sec": (self.render_time_sec / self.renders) if self.renders else 0.0,
+            "inflight": len(self._inflight),
+            "cache": self.cache.get_stats(),
+        }
+
+
+# Глобальный экземпляр сервиса
+_global_service: Optional[RenderService] = None
+
+
+def get_render_service(db_path: Optional[str] = None) -> RenderService:
+    """Получить глобальный экземпляр RenderService."""
+    global _global_service
+    if _global_service is None:
+        _global_service = RenderService(db_path=db_path)
+    return _global_service
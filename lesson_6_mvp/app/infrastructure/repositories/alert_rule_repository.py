@@ -0,0 +1,100 @@
+# app/infrastructure/repositories/alert_rule_repository.py
+"""
+Репозиторий правил алертов watchlist (usecases.watch_alerts).
+"""
+
+from typing import Iterable, List, Optional, Tuple
+from .base_repository import BaseRepository
+
+
+class AlertRuleRepository(BaseRepository):
+    """Правила алертов пользователей: md_alert_rules."""
+
+    COLUMNS = ("id", "user_id", "symbol", "timeframe", "kind", "level", "direction", "param",
+               "cooldown_sec", "once", "last_fired_ms")
+
+    def __init__(self, db):
+        super().__init__(db)
+        self._ensure_table()
+
+    def _ensure_table(self):
+        """Создать таблицу правил, если её нет."""
+        cur = self.db.conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS md_alert_rules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                symbol TEXT NOT NULL,
+                timeframe TEXT NOT NULL,          -- '*' для funding / twap
+                kind TEXT NOT NULL,               -- price / phase / pump / risk / divergence / funding / twap
+                level REAL,                       -- уровень цены / порог скора / funding % / мин. объём TWAP
+                direction TEXT NOT NULL DEFAULT 'up',   -- up / down / any (для уровней)
+                param TEXT,                       -- фаза / сторона дивергенции / направление TWAP
+                cooldown_sec INTEGER NOT NULL DEFAULT 3600,
+                once INTEGER NOT NULL DEFAULT 0,  -- 1 — выключить после срабатывания
+                active INTEGER NOT NULL DEFAULT 1,
+                created_at INTEGER DEFAULT (strftime('%s', 'now') * 1000),
+                last_fired_ms INTEGER
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_md_alert_rules_user ON md_alert_rules(user_id, active)")
+        self.db.conn.commit()
+
+    def add_rule(self, user_id: int, symbol: str, timeframe: str, kind: str, level: Optional[float] = None,
+                 direction: str = "up", param: Optional[str] = None, cooldown_sec: int = 3600,
+                 once: bool = False) -> int:
+        """
+        Добавить правило.
+
+        Returns:
+            id нового правила
+        """
+        cur = self.db.conn.cursor()
+        cur.execute("""
+            INSERT INTO md_alert_rules (user_id, symbol, timeframe, kind, level, direction, param, cooldown_sec, once)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, symbol.upper(), timeframe, kind, level, direction, param, int(cooldown_sec), int(once)))
+        self.db.conn.commit()
+        return int(cur.lastrowid)
+
+    def deactivate(self, rule_id: int, user_id: Optional[int] = None) -> bool:
+        """
+        Выключить правило (если задан user_id — только своё).
+
+        Returns:
+            True если правило было активно и выключено
+        """
+        cur = self.db.conn.cursor()
+        sql = "UPDATE md_alert_rules SET active = 0 WHERE id = ? AND active = 1"
+        args: list = [int(rule_id)]
+        if user_id is not None:
+            sql += " AND user_id = ?"
+            args.append(int(user_id))
+        cur.execute(sql, args)
+        self.db.conn.commit()
+        return cur.rowcount > 0
+
+    def list_active(self) -> List[tuple]:
+        """Все активные правила (кортежи в порядке COLUMNS) — загрузка индекса при старте."""
+        cur = self.db.conn.cursor()
+        cur.execute(f"SELECT {', '.join(self.COLUMNS)} FROM md_alert_rules WHERE active = 1 ORDER BY id")
+        return [tuple(r) for r in cur.fetchall()]
+
+    def count_user_rules(self, user_id: int) -> int:
+        cur = self.db.conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM md_alert_rules WHERE user_id = ? AND active = 1", (user_id,))
+        return int(cur.fetchone()[0])
+
+    def mark_fired(self, fired: Iterable[Tuple[int, int, bool]]) -> None:
+        """
+        Записать срабатывания пачкой.
+
+        Args:
+            fired: (rule_id, ts_ms, once) — одноразовые правила выключаются
+        """
+        rows = [(int(ts), 0 if once else 1, int(rule_id)) for rule_id, ts, once in fired]
+        if not rows:
+            return
+        cur = self.db.conn.cursor()
+        cur.executemany("UPDATE md_alert_rules SET last_fired_ms = ?, active = active * ? WHERE id = ?", rows)
+        self.db.conn.commit()
@@ -5,11 +5,14 @@
 
 from __future__ import annotations
 
+import hashlib
+import json
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
 from typing import Optional, List
-from fastapi import FastAPI, HTTPException, Query, Path
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Path, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 
 from .db import DB
@@ -114,6 +117,102 @@ class MetricsStatsResponse(BaseModel):
     price_change_24h: Optional[float] = None
 
 
+# ---------- helpers: bars / export ----------
+
+EXPORT_COLUMNS = ("metric", "timeframe", "ts", "o", "h", "l", "c", "v")
+EXPORT_FORMATS = ("columnar", "rows", "ndjson", "arrow")
+EXPORT_DEFAULT_LIMIT = 10_000
+EXPORT_MAX_LIMIT = 100_000
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def _iso(ts_ms: int) -> str:
+    return datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).replace(tzinfo=None).isoformat() + "Z"
+
+
+def _bar_response(metric: str, timeframe: str, bar) -> BarResponse:
+    ts, o, h, l, c, v = bar
+    return BarResponse(
+        metric=metric, timeframe=timeframe, ts=ts, timestamp_iso=_iso(ts),
+        open=o, high=h, low=l, close=c, volume=v,
+    )
+
+
+def _parse_csv(value: str, allowed, name: str) -> List[str]:
+    items = [x.strip() for x in (value or "").split(",") if x.strip()]
+    bad = [x for x in items if x not in allowed]
+    if not items or bad:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: {bad or value!r}. Allowed: {allowed}")
+    return list(dict.fromkeys(items))  # без дублей, порядок сохраняем
+
+
+def _encode_cursor(row) -> str:
+    return f"{row[0]}|{row[1]}|{row[2]}"
+
+
+def _decode_cursor(cursor: Optional[str]):
+    if not cursor:
+        return None
+    try:
+        metric, timeframe, ts = cursor.rsplit("|", 2)
+        return metric, timeframe, int(ts)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _export_etag(version, *params) -> str:
+    raw = json.dumps([version, params], separators=(",", ":"), default=str)
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+
+
+def _http_date(ts_ms: int) -> str:
+    return formatdate(ts_ms / 1000, usegmt=True)
+
+
+def _not_modified(request: Request, etag: str, version) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        return etag in [t.strip() for t in inm.split(",")] or inm.strip() == "*"
+    ims = request.headers.get("if-modified-since")
+    if ims and version:
+        try:
+            since = parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return max(v[2] for v in version) // 1000 <= since
+    return False
+
+
+def _rows_to_series(rows) -> List[dict]:
+    """Строки (metric, tf, ts, o, h, l, c, v) → колонки по сериям (строки уже упорядочены по серии)."""
+    series: List[dict] = []
+    cur = None
+    for m, tf, ts, o, h, l, c, v in rows:
+        if cur is None or cur["metric"] != m or cur["timeframe"] != tf:
+            cur = {"metric": m, "timeframe": tf, "ts": [], "o": [], "h": [], "l": [], "c": [], "v": []}
+            series.append(cur)
+        cur["ts"].append(ts); cur["o"].append(o); cur["h"].append(h)
+        cur["l"].append(l); cur["c"].append(c); cur["v"].append(v)
+    return series
+
+
+def _rows_to_arrow(rows) -> bytes:
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Arrow format requires pyarrow")
+    cols = list(zip(*rows)) if rows else [[] for _ in EXPORT_COLUMNS]
+    schema = pa.schema([
+        ("metric", pa.string()), ("timeframe", pa.string()), ("ts", pa.int64()),
+        ("o", pa.float64()), ("h", pa.float64()), ("l", pa.float64()), ("c", pa.float64()), ("v", pa.float64()),
+    ])
+    table = pa.Table.from_arrays([pa.array(list(col), type=f.type) for col, f in zip(cols, schema)], schema=schema)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
 def create_rest_api_router(app: FastAPI, db: DB):
     """Создает и регистрирует REST API роуты."""
     
@@ -131,68 +230,26 @@ def create_rest_api_router(app: FastAPI, db: DB):
         - **timeframe**: Фильтр по таймфрейму (15m, 1h, 4h, 1d)
         - **limit**: Максимальное количество записей (1-1000)
         - **offset**: Смещение для пагинации
+
+        Для выгрузки больших диапазонов используйте `/api/export/bars`.
         """
         try:
             if metric and metric not in METRICS:
                 raise HTTPException(status_code=400, detail=f"Invalid metric. Allowed: {METRICS}")
             if timeframe and timeframe not in TIMEFRAMES:
                 raise HTTPException(status_code=400, detail=f"Invalid timeframe. Allowed: {TIMEFRAMES}")
-            
-            # Получаем бары из БД
-            if metric and timeframe:
-                bars = db.last_n(metric, timeframe, limit + offset)
-                bars = bars[offset:offset + limit]
-            elif metric:
-                # Если указана только метрика, получаем для всех таймфреймов
-                all_bars = []
-                for tf in TIMEFRAMES:
-                    tf_bars = db.last_n(metric, tf, limit // len(TIMEFRAMES) + 1)
-                    # Добавляем таймфрейм и сохраняем исходный формат бара
-                    for bar in tf_bars:
-                        all_bars.append((tf, bar))  # (tf, (ts, o, h, l, c, v))
-                # Сортируем по ts (второй элемент бара, который находится в bar[0])
-                all_bars.sort(key=lambda x: x[1][0], reverse=True)  # Сортируем по ts
-                bars_with_tf = all_bars[offset:offset + limit]
-                # Сохраняем информацию о таймфрейме для каждого бара
-                bars = [(tf, bar) for tf, bar in bars_with_tf]
-            else:
+            if not metric:
                 raise HTTPException(
                     status_code=400,
                     detail="At least 'metric' or both 'metric' and 'timeframe' must be specified"
                 )
             
-            result = []
-            for item in bars:
-                # Если bars содержит пары (tf, bar), обрабатываем соответственно
-                if isinstance(item, tuple) and len(item) == 2 and isinstance(item[1], tuple):
-                    # Случай когда только metric указан - формат (tf, (ts, o, h, l, c, v))
-                    tf, bar = item
-                    bar_metric = metric
-                else:
-                    # Случай когда metric и timeframe указаны - формат (ts, o, h, l, c, v)
-                    bar = item
-                    tf = timeframe
-                    bar_metric = metric
-                
-                # bar is RowBars = (ts, o, h, l, c, v)
-                if len(bar) >= 5:
-                    ts, o, h, l, c = bar[0], bar[1], bar[2], bar[3], bar[4]
-                    v = bar[5] if len(bar) > 5 else None
-                    
-                    timestamp_iso = datetime.utcfromtimestamp(ts / 1000).isoformat() + "Z"
-                    result.append(BarResponse(
-                        metric=bar_metric,
-                        timeframe=tf,
-                        ts=ts,
-                        timestamp_iso=timestamp_iso,
-                        open=o,
-                        high=h,
-                        low=l,
-                        close=c,
-                        volume=v
-                    ))
-            
-            return result
+            # LIMIT/OFFSET и сортировка по ts выполняются в SQLite одним запросом
+            tfs = [timeframe] if timeframe else list(TIMEFRAMES)
+            rows = db.recent_bars(metric, tfs, limit, offset)
+            if timeframe:
+                rows.reverse()      # одна серия отдаётся, как и раньше, oldest→newest
+            return [_bar_response(metric, tf, bar) for tf, *bar in rows]
         except HTTPException:
             raise
         except Exception as e:
@@ -218,31 +275,86 @@ def create_rest_api_router(app: FastAPI, db: DB):
             raise HTTPException(status_code=400, detail=f"Invalid timeframe. Allowed: {TIMEFRAMES}")
         
         try:
-            bars = db.last_n(metric, timeframe, limit)
-            result = []
-            for bar in bars:
-                if len(bar) >= 5:
-                    ts = bar[1] if len(bar) >= 2 else 0
-                    o, h, l, c = bar[2], bar[3], bar[4], bar[5] if len(bar) > 5 else bar[4]
-                    v = bar[6] if len(bar) > 6 else None
-                    
-                    timestamp_iso = datetime.utcfromtimestamp(ts / 1000).isoformat() + "Z"
-                    result.append(BarResponse(
-                        metric=metric,
-                        timeframe=timeframe,
-                        ts=ts,
-                        timestamp_iso=timestamp_iso,
-                        open=o,
-                        high=h,
-                        low=l,
-                        close=c,
-                        volume=v
-                    ))
-            return result
+            # bar is RowBars = (ts, o, h, l, c, v), oldest→newest
+            return [_bar_response(metric, timeframe, bar) for bar in db.last_n(metric, timeframe, limit)]
         except Exception as e:
             log.exception("Error getting bars")
             raise HTTPException(status_code=500, detail=str(e))
 
+    @app.get("/api/export/bars", tags=["bars"])
+    async def export_bars(
+        request: Request,
+        metrics: str = Query(..., description="Метрики через запятую (BTC,TOTAL2,...)"),
+        timeframes: Optional[str] = Query(None, description="Таймфреймы через запятую, по умолчанию все"),
+        since: Optional[int] = Query(None, ge=0, description="Начало диапазона, unix ms (включительно)"),
+        until: Optional[int] = Query(None, ge=0, description="Конец диапазона, unix ms (включительно)"),
+        cursor: Optional[str] = Query(None, description="next_cursor из предыдущей страницы"),
+        limit: int = Query(EXPORT_DEFAULT_LIMIT, ge=1, le=EXPORT_MAX_LIMIT, description="Размер страницы"),
+        format: str = Query("columnar", description="columnar | rows | ndjson | arrow"),
+    ):
+        """
+        Bulk-выгрузка баров для бэктестов.
+
+        - keyset-пагинация по курсору (metric, timeframe, ts) прямо в SQL;
+        - несколько метрик и таймфреймов одним запросом;
+        - **columnar**: `{"series": [{"metric", "timeframe", "ts": [...], "o": [...], ...}], "next_cursor"}`;
+        - **rows**: компактные JSON-массивы `[metric, timeframe, ts, o, h, l, c, v]`;
+        - **ndjson**: потоковая выгрузка всего диапазона (limit игнорируется), одна строка-массив на бар;
+        - **arrow**: Arrow IPC stream (нужен pyarrow);
+        - `ETag` по последнему бару, числу баров и ревизии каждой серии, `Last-Modified` — по последнему бару;
+          `If-None-Match` → 304.
+        """
+        ms = _parse_csv(metrics, METRICS, "metric")
+        tfs = _parse_csv(timeframes, TIMEFRAMES, "timeframe") if timeframes else list(TIMEFRAMES)
+        if format not in EXPORT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Invalid format. Allowed: {EXPORT_FORMATS}")
+        after = _decode_cursor(cursor)
+
+        try:
+            version = db.bars_version(ms, tfs)
+            revision = db.bars_revision(ms, tfs)      # дозагрузка старых баров тоже меняет ETag
+        except Exception as e:
+            log.exception("Error reading bars version")
+            raise HTTPException(status_code=500, detail=str(e))
+
+        etag = _export_etag([version, revision], ms, tfs, since, until, cursor, limit, format)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if version:
+            headers["Last-Modified"] = _http_date(max(v[2] for v in version))
+        if _not_modified(request, etag, version):
+            return Response(status_code=304, headers=headers)
+
+        try:
+            if format == "ndjson":
+                rows_iter = db.iter_bars_export(ms, tfs, since_ts=since, until_ts=until, after=after)
+                return StreamingResponse(
+                    (json.dumps(list(r), separators=(",", ":")) + "\n" for r in rows_iter),
+                    media_type="application/x-ndjson",
+                    headers=headers,
+                )
+
+            rows = db.bars_page(ms, tfs, since_ts=since, until_ts=until, after=after, limit=limit)
+            next_cursor = _encode_cursor(rows[-1]) if len(rows) == limit else None
+            if next_cursor:
+                headers["X-Next-Cursor"] = next_cursor
+
+            if format == "arrow":
+                return Response(content=_rows_to_arrow(rows), media_type=ARROW_MEDIA_TYPE, headers=headers)
+            if format == "rows":
+                body = {"columns": list(EXPORT_COLUMNS), "rows": rows, "count": len(rows), "next_cursor": next_cursor}
+            else:
+                body = {"series": _rows_to_series(rows), "count": len(rows), "next_cursor": next_cursor}
+            return Response(
+                content=json.dumps(body, separators=(",", ":")),
+                media_type="application/json",
+                headers=headers,
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            log.exception("Error exporting bars")
+            raise HTTPException(status_code=500, detail=str(e))
+
     @app.get("/api/metrics/stats", response_model=List[MetricsStatsResponse], tags=["metrics"])
     async def get_metrics_stats():
         """
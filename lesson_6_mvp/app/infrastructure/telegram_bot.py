@@ -24,7 +24,7 @@ from io import BytesIO
 
 from telegram import Update, InputFile, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, BotCommand
 from telegram.constants import ParseMode
-from telegram.error import TimedOut, NetworkError, RetryAfter, Forbidden, BadRequest
+from telegram.error import TimedOut, NetworkError, BadRequest
 from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler, MessageHandler, filters
 from telegram.request import HTTPXRequest
 
@@ -39,21 +39,12 @@ from ..usecases.generate_report import (
     build_status_report,         # краткий отчёт (каждые N минут и по /status)
     METRICS,
 )
-from ..domain.services import (
-    trend_arrow_metric,          # метрико-специфичный порог
-    indicator_divergences,
-    pair_divergences,
-    risk_score,
-)
-
-from ..lib.series import get_closes        # единый источник клоузов (oldest→newest)
 from .widgets import gen_altseason_png
 
 
 logger = logging.getLogger("alt_forecast.bot")
 
 MAX_TG_LEN = 4096
-SEND_DELAY_SEC = 0.05
 
 
 # Храним активный TF в user_data
@@ -214,13 +205,20 @@ class TeleBot:
             logger.exception("HTTPXRequest compatibility init failed; falling back to default")
             request = None
 
-        builder = Application.builder().token(token)
+        # все вызовы Bot API идут через общий лимитер (30 msg/s на бота, 1 msg/s на чат, RetryAfter)
+        from .delivery import get_outbox, get_rate_limiter
+        builder = Application.builder().token(token).rate_limiter(get_rate_limiter())
         if request is not None:
             builder = builder.request(request)
         self.app = builder.build()
-        
-        # Настройка меню-кнопки с быстрыми командами при старте
-        self.app.post_init = self._setup_menu_commands_async
+
+        # Очередь исходящих рассылок (SQLite): заблокировавших бота отписываем
+        self.outbox = get_outbox(self.db)
+        self.outbox.on_forbidden = self.db.remove_sub
+
+        # Настройка меню-кнопки с быстрыми командами при старте + диспетчер очереди
+        self.app.post_init = self._post_init
+        self.app.post_shutdown = self._post_shutdown
 
         # --- Commands
         self.app.add_handler(CommandHandler("start", self.on_start))
@@ -253,6 +251,9 @@ class TeleBot:
         self.app.add_handler(CommandHandler("md_watch_add", self.on_md_watch_add))
         self.app.add_handler(CommandHandler("md_watch_remove", self.on_md_watch_remove))
         self.app.add_handler(CommandHandler("md_watch_list", self.on_md_watch_list))
+        self.app.add_handler(CommandHandler("md_alert_add", self.on_md_alert_add))
+        self.app.add_handler(CommandHandler("md_alerts", self.on_md_alerts))
+        self.app.add_handler(CommandHandler("md_alert_del", self.on_md_alert_del))
         self.app.add_handler(CommandHandler("md_backtest", self.on_md_backtest))
         self.app.add_handler(CommandHandler("md_calibrate", self.on_md_calibrate))
         self.app.add_handler(CommandHandler("md_apply_weights", self.on_md_apply_weights))
@@ -304,6 +305,7 @@ class TeleBot:
         self.app.add_handler(CommandHandler("events_add", self.on_events_add))
         self.app.add_handler(CommandHandler("events_list", self.on_events_list))
         self.app.add_handler(CommandHandler("events_del", self.on_events_del))
+        self.app.add_handler(CommandHandler("events_tz", self.on_events_tz))
 
         # --- Callback buttons (inline)
         self.app.add_handler(CallbackQueryHandler(self.on_help_btn, pattern=r"^help:"))
@@ -375,20 +377,12 @@ class TeleBot:
                 png_btc, txt_btc = await self._build_free_payload("BTC", context)
                 png_eth, txt_eth = await self._build_free_payload("ETH", context)
 
-            for chat_id in subs:
-                try:
-                    if png_btc:
-                        await context.bot.send_photo(chat_id=chat_id, photo=png_btc, caption=txt_btc, parse_mode=ParseMode.MARKDOWN)
-                    else:
-                        await context.bot.send_message(chat_id=chat_id, text=txt_btc, parse_mode=ParseMode.MARKDOWN)
-
-                    if png_eth:
-                        await context.bot.send_photo(chat_id=chat_id, photo=png_eth, caption=txt_eth, parse_mode=ParseMode.MARKDOWN)
-                    else:
-                        await context.bot.send_message(chat_id=chat_id, text=txt_eth, parse_mode=ParseMode.MARKDOWN)
-                except Exception:
-                    logger.exception("daily send failed chat_id=%s", chat_id)
-                    await asyncio.sleep(0.1)
+            # в очередь рассылок: порядок BTC → ETH внутри чата сохраняется
+            for png, txt in ((png_btc, txt_btc), (png_eth, txt_eth)):
+                if png:
+                    self.outbox.broadcast(subs, "send_photo", photo=png, caption=txt, parse_mode=ParseMode.MARKDOWN)
+                else:
+                    self.outbox.broadcast(subs, "send_message", text=txt, parse_mode=ParseMode.MARKDOWN)
 
         # Используем единый источник TZ из конфига
         tz = settings.tz
@@ -424,79 +418,52 @@ class TeleBot:
             target = min(cand)
             return int((target - now).total_seconds())
 
-        # Планировщик
-        self.app.job_queue.run_daily(_send_daily, time=dtime(hour=9, minute=0, tzinfo=tz), name="daily_max_pain")
+        # Планировщик: все задачи через job_runtime (skip-if-running, таймаут, метрики исходов).
+        # Рассылки привязаны к часу — без jitter.
+        from .job_runtime import KIND_CPU, KIND_IO, JobSpec, get_job_runtime
+        jobs = get_job_runtime()
+        jq = self.app.job_queue
+        jobs.schedule(jq, JobSpec("daily_max_pain", _send_daily, daily_at=dtime(hour=9, minute=0, tzinfo=tz),
+                                  jitter=0, max_runtime=30 * 60))
 
         # Периодические рассылки:
         # 1) Краткий отчёт — ежечасно в :30
-        self.app.job_queue.run_repeating(
-            self.job_broadcast_compact, interval=60 * 60, first=_sec_to_next(30), name="broadcast_compact_30m"
-        )
+        jobs.schedule(jq, JobSpec("broadcast_compact_30m", self.job_broadcast_compact, interval=60 * 60,
+                                  first=_sec_to_next(30), jitter=0, max_runtime=25 * 60))
         # 2) Полный отчёт — ежечасно в :00
-        self.app.job_queue.run_repeating(
-            self.job_broadcast_full, interval=60 * 60, first=_sec_to_next(0), name="broadcast_full_hh00"
-        )
+        jobs.schedule(jq, JobSpec("broadcast_full_hh00", self.job_broadcast_full, interval=60 * 60,
+                                  first=_sec_to_next(0), jitter=0, max_runtime=25 * 60))
         # 3) PNG-дайджест — раз в час
-        self.app.job_queue.run_repeating(
-            self.job_broadcast_chart, interval=60 * 60, first=60, name="broadcast_chart_hourly"
-        )
+        jobs.schedule(jq, JobSpec("broadcast_chart_hourly", self.job_broadcast_chart, interval=60 * 60,
+                                  first=60, max_runtime=25 * 60))
 
-        # Напоминания о событиях (каждую минуту)
-        async def _events_job(context: ContextTypes.DEFAULT_TYPE):
-            from ..infrastructure.events import due_events, mark_notified
-            now_ms = int(time.time() * 1000)
-            for ev_id, chat_id, ts, title, kind in due_events(now_ms):
-                when = "через ~24 часа" if kind == "24h" else "через ~1 час"
-                try:
-                    dt = pd.to_datetime(ts, unit="ms")
-                    await context.bot.send_message(
-                        chat_id=chat_id,
-                        text=f"🔔 Напоминание: {title}\nКогда: <code>{dt}</code> ({when})",
-                        parse_mode=ParseMode.HTML,
-                    )
-                except Exception:
-                    logger.exception("failed to send event reminder")
-                mark_notified(ev_id, kind)
+        # Напоминания о событиях — EventScheduler (точно в срок, без опроса), запускается в _post_init
 
-        self.app.job_queue.run_repeating(_events_job, interval=60, first=10, name="events_reminders")
-        
-        # Автоматические отчёты о качестве моделей (раз в сутки в 8:00 UTC)
-        async def _quality_reports_job(context: CallbackContext):
-            from ..main_worker import generate_quality_reports
-            await generate_quality_reports(context)
-        
-        # Используем уже импортированные dtime и ZoneInfo из начала файла
-        # dtime уже импортирован глобально в строке 5
-        # ZoneInfo уже импортирован глобально в строке 7 (в try-except блоке)
-        # Если ZoneInfo не доступен (старый Python), используем UTC через datetime
-        # Используем глобальный ZoneInfo напрямую - он уже импортирован
+        # Автоматические отчёты о качестве моделей (раз в сутки в 8:00 UTC):
+        # расчёт — в пуле процессов (своё соединение с БД), алерты админу — на loop
+        from ..main_worker import evaluate_forecasts, quality_report_alerts, send_quality_alerts
         try:
-            # ZoneInfo уже импортирован глобально в начале файла (строка 7)
             tz_utc = ZoneInfo("UTC")
         except NameError:
             # Если ZoneInfo не доступен (старый Python), используем UTC через datetime
             from datetime import timezone
             tz_utc = timezone.utc
-        self.app.job_queue.run_daily(
-            _quality_reports_job,
-            time=dtime(hour=8, minute=0, tzinfo=tz_utc),
-            name="quality_reports_daily"
-        )
-        
-        # Автоматическая оценка прогнозов (каждые 2 часа)
-        async def _evaluate_forecasts_job(context: ContextTypes.DEFAULT_TYPE):
-            from ..main_worker import evaluate_forecasts
-            await evaluate_forecasts(context)
-        self.app.job_queue.run_repeating(
-            _evaluate_forecasts_job,
-            interval=7200,  # 2 часа в секундах
-            first=300,  # Первый запуск через 5 минут после старта
-            name="evaluate_forecasts_periodic"
-        )
+        db_path = self.db.path
+        jobs.schedule(jq, JobSpec("quality_reports_daily", quality_report_alerts, kind=KIND_CPU,
+                                  daily_at=dtime(hour=8, minute=0, tzinfo=tz_utc), max_runtime=30 * 60,
+                                  args=lambda _ctx: (db_path,), on_result=send_quality_alerts))
+
+        # Автоматическая оценка прогнозов (каждые 2 часа, первый запуск через 5 минут после старта)
+        jobs.schedule(jq, JobSpec("evaluate_forecasts_periodic", evaluate_forecasts, kind=KIND_IO,
+                                  interval=7200, first=300, max_runtime=60 * 60))
 
         # error handler
         self.app.add_error_handler(self.on_error)
 
+        # латентность/ошибки хендлеров → alt_forecast_handler_seconds (после всех add_handler)
+        from ..utils.metrics import instrument_ptb_application
+        instrument_ptb_application(self.app)
+
     def _fc_key(self, sym: str, tf: str, horizon: int) -> str:
         return f"{sym}:{tf}:{horizon}"
 
@@ -1107,12 +1074,10 @@ class TeleBot:
             reply_markup=get_main_reply_keyboard(),
         )
 
-    def _pair_series_sec(self, tf: str, n: int = 320) -> dict[str, list[tuple[int, float]]]:
-        series: dict[str, list[tuple[int, float]]] = {}
-        for m in METRICS:
-            rows = self.db.last_n_closes(m, tf, n)
-            series[m] = [(_ts_sec(ts), c) for ts, c in rows]
-        return series
+    def _market_state(self, tf: str):
+        """Материализованное состояние ТФ (стрелки, дивергенции, risk) — см. usecases.market_state."""
+        from ..usecases.market_state import get_market_state
+        return get_market_state(self.db).get(tf)
 
     def _vol_hint(self, *, sym: str, tf: str, rv7: float, rv30: float, atr: float, regime: str, pctl: float) -> str:
         reg = (regime or "").lower()
@@ -1173,10 +1138,10 @@ class TeleBot:
         return "1h"
 
     async def _build_free_payload(self, symbol: str, context: ContextTypes.DEFAULT_TYPE):
-        from ..infrastructure.deribit import build_series
+        from ..infrastructure.options_store import get_options_store
         from ..visual.options_chart_free import render_free_series
 
-        pts = build_series(symbol, max_expiries=8)
+        pts = get_options_store(self.db).series(symbol, max_expiries=8)
 
         bmap: dict[str, float] = {}
         try:
@@ -1321,7 +1286,7 @@ class TeleBot:
             "• ⚖️ Базис — /basis symbol.\n\n"
             "• 🔎 Дивергенции — /scan_divs + ТФ.\n\n"
             "• 📐 Уровни — /levels + ТФ (SR/ключевые зоны).\n\n"
-            "• 🧠 BT RSI — /bt rsi + ТФ.\n\n"
+            "• 🧠 BT RSI — /bt rsi + ТФ; перебор параметров — /bt sweep [rsi|ema|macd] [символы] [ТФ].\n\n"
             "• 🌡 Ширина рынка — /breadth + ТФ.\n\n"
             "• 🧮 F&G история — /fng_history [N].\n\n"
             "• 📈 Ticker — /ticker [sort] [limit] [convert] — сортировки: rank | percent_change_1h | percent_change_24h | percent_change_7d | volume_24h | market_cap.\n\n"
@@ -1509,7 +1474,7 @@ class TeleBot:
             from telegram import InputFile
             from telegram.constants import ParseMode
             from ..infrastructure.coingecko import top_movers
-            from ..visual.bubbles import render_bubbles
+            from .render_service import get_render_service, RenderSpec
             import html, math
 
             logger.warning("BUBBLES_V=rank_override_v4")  # <- новый маркер
@@ -1635,18 +1600,25 @@ class TeleBot:
                 }
                 render_size_mode = size_mode_map.get(bub_size_mode, "percent")
                 
-                try:
-                    png = render_bubbles(
-                        coins_for_render, tf=tf,
-                        count=int(bub_count or 50),
-                        hide_stables=bool(bub_hide),
-                        seed=int(bub_seed or 42),
-                        color_mode="quantile",
-                        size_mode=render_size_mode,
-                    )
-                except TypeError:
-                    # Fallback для старой версии render_bubbles
-                    png = render_bubbles(coins_for_render, tf=tf)
+                # Версия данных — состав и обновление монет снапшота: одинаковые настройки
+                # у разных пользователей в пределах одного снапшота дают попадание в кэш
+                snapshot_version = [
+                    (str(c.get("id") or c.get("symbol")), c.get("last_updated"), c.get("volume_share"))
+                    for c in coins_for_render
+                ]
+                spec = RenderSpec(
+                    "bubbles",
+                    {
+                        "tf": tf,
+                        "count": int(bub_count or 50),
+                        "hide_stables": bool(bub_hide),
+                        "seed": int(bub_seed or 42),
+                        "color_mode": "quantile",
+                        "size_mode": render_size_mode,
+                    },
+                    payload=coins_for_render,
+                )
+                png = await get_render_service(self.db.path).render(spec, data_version=snapshot_version)
                 logger.info("bubbles: render OK (size_mode=%s)", render_size_mode)
             except Exception as e_img:
                 img_err = f"(картинку построить не удалось: {type(e_img).__name__})"
@@ -2171,12 +2143,9 @@ class TeleBot:
     
     async def _cmd_forecast_alts_legacy(self, update, context):
         """Старая реализация команды /forecast_alts."""
-        from telegram.constants import ParseMode
         from ..infrastructure.coingecko import top_movers
-        from ..ml.data_adapter import make_loader, _symbol_norm
-        from ..ml.forecaster import forecast_symbol
+        from ..ml.batch_forecaster import stream_to_message
 
-        loader = make_loader()
         vs = "usd"
         try:
             coins, gainers, losers, _ = top_movers(vs=vs, tf="24h", limit_each=24)
@@ -2190,25 +2159,17 @@ class TeleBot:
                              "SUSD", "LUSD", "USDD", "USDJ", "USDE", "USDS", "GUSD", "USD0", "BSC-USD",
                              "STETH", "WSTETH", "WETH"}
 
-        top10 = [c for c in sorted(coins, key=lambda x: float(x.get("market_cap") or 0), reverse=True) if
-                 _is_ok(c.get("symbol"))][:10]
+        from .market_snapshot import get_market_store
+        by_cap = get_market_store().current(vs).ranked("market_cap", exclude_stable=True)
+        top10 = [c for c in by_cap if _is_ok(c.get("symbol"))][:10]
         movers24 = [c for c in (gainers[:12] + losers[:12]) if _is_ok(c.get("symbol"))]
 
-        async def _do_batch(title, arr, tf_for_model="1h", horizon=24):
-            lines = [f"<b>{title}</b>  ({tf_for_model}, +{horizon} бар)"]
-            for c in arr:
-                sym = _symbol_norm(c.get("symbol") or "")
-                try:
-                    res = forecast_symbol(loader, sym, tf_for_model, horizon=horizon)
-                    lines.append(f"{sym}: {res['ret_pred'] * 100:+.2f}% · P(up)={res['p_up']:.2f}")
-                except Exception as e:
-                    lines.append(f"{sym}: ошибка {type(e).__name__}")
-            await update.effective_message.reply_text(
-                "\n".join(lines), parse_mode=ParseMode.HTML, disable_web_page_preview=True
-            )
-
-        await _do_batch("Топ-10 по капитализации (альты)", top10, tf_for_model="1h", horizon=24)
-        await _do_batch("Топ-24 суточных муверов (12↑/12↓)", movers24, tf_for_model="1h", horizon=24)
+        # батч-инференс вне event loop, строки дописываются по мере готовности
+        msg = update.effective_message
+        await stream_to_message(msg, "Топ-10 по капитализации (альты)",
+                                [c.get("symbol") or "" for c in top10], "1h", 24)
+        await stream_to_message(msg, "Топ-24 суточных муверов (12↑/12↓)",
+                                [c.get("symbol") or "" for c in movers24], "1h", 24)
 
     async def cmd_forecast_from_btn(self, update, context):
         return await self.cmd_forecast(update, context)
@@ -2319,18 +2280,16 @@ class TeleBot:
         q = update.callback_query;
         await q.answer()
         cat = q.data.split(":", 2)[2]
+        from .market_snapshot import get_market_store
         data = markets_by_category(cat, vs="usd")
         if not data:
             await self._safe_edit_text(q, f"Нет данных для категории {cat}")
             return
 
-        def chg(c, key):
-            return float(c.get(key) or 0.0)
-
-        # топ/флоп за 24ч
-        sorted24 = sorted(data, key=lambda c: chg(c, "price_change_percentage_24h_in_currency"), reverse=True)
-        gain = sorted24[:5];
-        loss = list(reversed(sorted24))[:5]
+        # топ/флоп за 24ч — по колоночному виду ответа (заодно запоминает членство категории)
+        snap = get_market_store().category_snapshot(cat, data)
+        gain = snap.top("24h", 5, desc=True)
+        loss = snap.top("24h", 5, desc=False)
 
         def fmt(c):
             return f"{c['symbol'].upper():<6} {c['current_price']:.4g} USD ({(c.get('price_change_percentage_24h_in_currency') or 0):+,.2f}%)"
@@ -2592,20 +2551,9 @@ class TeleBot:
         """Старая реализация команды /top."""
         # /top 24h|1h|7d (по умолчанию 24h)
         tf = (context.args[0] if context.args else "24h").lower()
-        from ..infrastructure.coingecko import markets_snapshot
-        data = markets_snapshot("usd")
-
-        def change(c):
-            if tf == "1h":
-                k = ("price_change_percentage_1h_in_currency", "price_change_percentage_1h")
-            elif tf == "7d":
-                k = ("price_change_percentage_7d_in_currency", "price_change_percentage_7d")
-            else:
-                k = ("price_change_percentage_24h_in_currency", "price_change_percentage_24h")
-            v = c.get(k[0], c.get(k[1], 0.0));
-            return float(v or 0.0)
-
-        rows = sorted([c for c in data if c.get("symbol")], key=change, reverse=True)
+        from .market_snapshot import get_market_store
+        # готовый порядок из колоночного снапшота — без сортировки на каждый вызов
+        rows = get_market_store().current("usd").ranked(tf, desc=True)
         await self._send_rank_page(update.effective_chat.id, context, rows, tf, kind="top", page=1)
 
     async def on_flop(self, update, context):
@@ -2626,20 +2574,8 @@ class TeleBot:
     async def _on_flop_legacy(self, update, context):
         """Старая реализация команды /flop."""
         tf = (context.args[0] if context.args else "24h").lower()
-        from ..infrastructure.coingecko import markets_snapshot
-        data = markets_snapshot("usd")
-
-        def change(c):
-            if tf == "1h":
-                k = ("price_change_percentage_1h_in_currency", "price_change_percentage_1h")
-            elif tf == "7d":
-                k = ("price_change_percentage_7d_in_currency", "price_change_percentage_7d")
-            else:
-                k = ("price_change_percentage_24h_in_currency", "price_change_percentage_24h")
-            v = c.get(k[0], c.get(k[1], 0.0));
-            return float(v or 0.0)
-
-        rows = sorted([c for c in data if c.get("symbol")], key=change, reverse=False)
+        from .market_snapshot import get_market_store
+        rows = get_market_store().current("usd").ranked(tf, desc=False)
         await self._send_rank_page(update.effective_chat.id, context, rows, tf, kind="flop", page=1)
 
     def _rank_page(self, rows, page: int, per: int = 20):
@@ -2688,20 +2624,8 @@ class TeleBot:
         await q.answer()
         _, kind, tf, page = q.data.split(":", 3)
         page = max(1, int(page))
-        from ..infrastructure.coingecko import markets_snapshot
-        data = markets_snapshot("usd")
-
-        def change(c):
-            if tf == "1h":
-                k = ("price_change_percentage_1h_in_currency", "price_change_percentage_1h")
-            elif tf == "7d":
-                k = ("price_change_percentage_7d_in_currency", "price_change_percentage_7d")
-            else:
-                k = ("price_change_percentage_24h_in_currency", "price_change_percentage_24h")
-            v = c.get(k[0], c.get(k[1], 0.0));
-            return float(v or 0.0)
-
-        rows = sorted([c for c in data if c.get("symbol")], key=change, reverse=(kind == "top"))
+        from .market_snapshot import get_market_store
+        rows = get_market_store().current("usd").ranked(tf, desc=(kind == "top"))
         page_rows, page, total = self._rank_page(rows, page, 20)
 
         def fmt(c):
@@ -2758,10 +2682,18 @@ class TeleBot:
         else:
             await context.bot.send_message(chat_id=chat_id, text="Используй: /daily on [час] | /daily off")
 
+    async def _render_digest_png(self, tf: str) -> bytes:
+        """Digest-график через RenderService (пул процессов + кэш до закрытия бара)."""
+        from .render_service import get_render_service, RenderSpec
+        svc = get_render_service(self.db.path)
+        return await svc.render(
+            RenderSpec("digest", {"tf": tf}),
+            data_version=svc.bars_version(self.db, METRICS, tf),
+        )
+
     async def _send_chart_tf(self, chat_id: int, tf: str):
-        from ..visual.digest import render_digest
         try:
-            png = render_digest(self.db, tf)
+            png = await self._render_digest_png(tf)
         except Exception as e:
             await self.app.bot.send_message(chat_id=chat_id, text=f"Ошибка рендера графика {tf}: {e}")
             return
@@ -2777,23 +2709,8 @@ class TeleBot:
 
         # Собираем подпись (как в /chart_album)
         try:
-            arrows = {}
-            for m in METRICS:
-                closes = get_closes(self.db, m, tf, 80)
-                arrows[m] = trend_arrow_metric(m, tf, closes)
-
-            all_divs = []
-            series = self._pair_series_sec(tf, 320)
-            for m in METRICS:
-                rows = self.db.last_n(m, tf, 320)
-                highs = [r[2] for r in rows]
-                lows = [r[3] for r in rows]
-                closes = [r[4] for r in rows]
-                vols = [r[5] for r in rows]
-                all_divs.extend(indicator_divergences(m, tf, closes, vols))
-            all_divs.extend(pair_divergences(tf, series))
-            score, label = risk_score(tf, arrows, all_divs)
-            caption = f"<b>{tf}</b>: {label} (счёт {score})\n<i>/chart_album 15m|1h|4h|1d</i>"
+            state = self._market_state(tf)
+            caption = f"<b>{tf}</b>: {state.label} (счёт {state.score:+.1f})\n<i>/chart_album 15m|1h|4h|1d</i>"
         except Exception:
             logger.exception("risk label failed in _send_chart_album_tf")
             caption = f"<b>{tf}</b> альбом"
@@ -2880,13 +2797,17 @@ class TeleBot:
 
     async def _send_corr(self, chat_id: int, tf: str, context: ContextTypes.DEFAULT_TYPE):
         from ..usecases.analytics import corr_matrix_and_beta
-        from ..visual.corr_heatmap import render_corr_heatmap
+        from .render_service import get_render_service, RenderSpec
         df, betas = corr_matrix_and_beta(self.db, METRICS, base="BTC", timeframe=tf, n=600)
         if df.empty or "BTC" not in df.columns:
             await context.bot.send_message(chat_id=chat_id, text="Нет данных для корреляции.")
             return
 
-        png = render_corr_heatmap(df)
+        svc = get_render_service(self.db.path)
+        png = await svc.render(
+            RenderSpec("corr_heatmap", {"tf": tf, "n": 600}, payload=df),
+            data_version=svc.bars_version(self.db, METRICS, tf),
+        )
 
         corr_with_btc = df["BTC"].drop(index="BTC").dropna().clip(-1.0, 1.0)
         corr_lines = [f"{k}: {v:+.2f}" for k, v in corr_with_btc.items()]
@@ -3003,15 +2924,9 @@ class TeleBot:
 
     async def _send_scan_divs(self, chat_id: int, tf: str):
         out = []
+        state = self._market_state(tf)
         for m in METRICS:
-            rows = self.db.last_n(m, tf, 320)
-            if not rows:
-                continue
-            highs  = [r[2] for r in rows]
-            lows   = [r[3] for r in rows]
-            closes = [r[4] for r in rows]
-            vols   = [r[5] for r in rows]
-            divs = indicator_divergences(m, tf, closes, vols)
+            divs = state.divergences.get(m)
             if not divs:
                 continue
             bulls = [d.indicator for d in divs if "bullish" in d.implication]
@@ -3027,34 +2942,16 @@ class TeleBot:
 
     async def _send_risk_now(self, chat_id: int):
         tf = "1h"
-        arrows = {}
-        for m in METRICS:
-            closes = get_closes(self.db, m, tf, 80)
-            arrows[m] = trend_arrow_metric(m, tf, closes)
-
-        all_divs = []
-        for m in METRICS:
-            rows = self.db.last_n(m, tf, 320)
-            if not rows:
-                continue
-            highs  = [r[2] for r in rows]
-            lows   = [r[3] for r in rows]
-            closes = [r[4] for r in rows]
-            vols   = [r[5] for r in rows]
-            all_divs.extend(indicator_divergences(m, tf, closes, vols))
-
-        series = self._pair_series_sec(tf, 320)
-        all_divs.extend(pair_divergences(tf, series))
-
-        score, label = risk_score(tf, arrows, all_divs)
+        state = self._market_state(tf)
+        score, label = state.score, state.label
         from ..visual.risk_card import render_risk_card
 
         png = render_risk_card(tf, score, label)
-        cap = f"*Risk Now ({tf})*: {label} (score {score})"
+        cap = f"*Risk Now ({tf})*: {label} (score {score:+.1f})"
         await self.app.bot.send_photo(chat_id=chat_id, photo=png, caption=cap, parse_mode=ParseMode.MARKDOWN)
         await self.app.bot.send_message(
             chat_id=chat_id,
-            text=f"*Risk Now ({tf})*: {label} (score {score})\n_Зачем_: сводный индикатор risk-on/off на основе тренда и дивергенций.",
+            text=f"*Risk Now ({tf})*: {label} (score {score:+.1f})\n_Зачем_: сводный индикатор risk-on/off на основе тренда и дивергенций.",
             parse_mode=ParseMode.MARKDOWN
         )
 
@@ -3080,6 +2977,15 @@ class TeleBot:
                   "_Зачем_: быстрая прикидка работоспособности простого правила входа/выхода (не финсовет)."),
             parse_mode=ParseMode.MARKDOWN)
 
+    async def _send_bt_sweep(self, chat_id: int, args: list):
+        from ..usecases.backtest import format_table, get_backtester, parse_sweep_args
+        strategy, metrics, tfs = parse_sweep_args(args, METRICS)
+        loop = asyncio.get_running_loop()
+        res = await loop.run_in_executor(None, lambda: get_backtester().sweep(
+            self.db, strategy, metrics=metrics, timeframes=tfs))
+        await self._send_html_safe(self.app.bot, chat_id, format_table(res, top=10) +
+                                   "\n<i>Зачем</i>: какие параметры правила исторически работали лучше (с комиссией, не финсовет).")
+
     # ---------------- commands ----------------
 
     async def on_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -3188,35 +3094,15 @@ class TeleBot:
         tf = self._resolve_tf(update, context)
         if not tf:
             tf = context.user_data.get('tf', DEFAULT_TF)
-        from ..visual.digest import render_digest
         try:
-            png = render_digest(self.db, tf)
+            png = await self._render_digest_png(tf)
         except Exception:
             logger.exception("render_digest failed")
             await update.effective_message.reply_text("Не удалось построить график, попробуйте позже.")
             return
 
-        arrows = {}
-        for m in METRICS:
-            closes = get_closes(self.db, m, tf, 80)
-            arrows[m] = trend_arrow_metric(m, tf, closes)
-
-        all_divs = []
-        for m in METRICS:
-            rows = self.db.last_n(m, tf, 320)
-            if not rows:
-                continue
-            highs  = [r[2] for r in rows]
-            lows   = [r[3] for r in rows]
-            closes = [r[4] for r in rows]
-            vols   = [r[5] for r in rows]
-            all_divs.extend(indicator_divergences(m, tf, closes, vols))
-
-        series = self._pair_series_sec(tf, 320)
-        all_divs.extend(pair_divergences(tf, series))
-
-        score, label = risk_score(tf, arrows, all_divs)
-        caption = f"<b>{tf}</b>: {label} (счёт {score})\n<i>/chart 15m|1h|4h|1d</i>"
+        state = self._market_state(tf)
+        caption = f"<b>{tf}</b>: {state.label} (счёт {state.score:+.1f})\n<i>/chart 15m|1h|4h|1d</i>"
 
         await self.app.bot.send_photo(
             chat_id=update.effective_chat.id,
@@ -3431,6 +3317,48 @@ class TeleBot:
         except Exception:
             logger.exception("on_md_watch_list failed")
     
+    async def on_md_alert_add(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /md_alert_add."""
+        try:
+            if self.integrator:
+                handler = self.integrator.get_handler("market_doctor_watchlist")
+                if handler:
+                    await handler.handle_alert_add(update, context)
+                    return
+            await update.effective_message.reply_text(
+                "Команда /md_alert_add временно недоступна."
+            )
+        except Exception:
+            logger.exception("on_md_alert_add failed")
+    
+    async def on_md_alerts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /md_alerts."""
+        try:
+            if self.integrator:
+                handler = self.integrator.get_handler("market_doctor_watchlist")
+                if handler:
+                    await handler.handle_alert_list(update, context)
+                    return
+            await update.effective_message.reply_text(
+                "Команда /md_alerts временно недоступна."
+            )
+        except Exception:
+            logger.exception("on_md_alerts failed")
+    
+    async def on_md_alert_del(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /md_alert_del."""
+        try:
+            if self.integrator:
+                handler = self.integrator.get_handler("market_doctor_watchlist")
+                if handler:
+                    await handler.handle_alert_remove(update, context)
+                    return
+            await update.effective_message.reply_text(
+                "Команда /md_alert_del временно недоступна."
+            )
+        except Exception:
+            logger.exception("on_md_alert_del failed")
+    
     async def on_md_backtest(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /md_backtest."""
         try:
@@ -3635,8 +3563,9 @@ class TeleBot:
             
             # Рендерим график
             try:
-                from ..visual.chart_renderer import render_chart
-                png = render_chart(self.db, symbol, settings, n_bars=500)
+                from .render_service import get_render_service, RenderSpec
+                spec = RenderSpec("chart", {"metric": symbol, "settings": settings.to_dict(), "n_bars": 500})
+                png = await get_render_service(self.db.path).render(spec, db=self.db)
                 
                 # Отправляем график
                 from telegram import InputFile
@@ -3668,25 +3597,8 @@ class TeleBot:
         from ..visual.digest import render_digest_panels
         panels = render_digest_panels(self.db, tf)
 
-        arrows = {}
-        for m in METRICS:
-            closes = get_closes(self.db, m, tf, 80)
-            arrows[m] = trend_arrow_metric(m, tf, closes)
-
-        all_divs = []
-        series = self._pair_series_sec(tf, 320)
-        for m in METRICS:
-            rows = self.db.last_n(m, tf, 320)
-            if not rows:
-                continue
-            highs = [r[2] for r in rows]
-            lows = [r[3] for r in rows]
-            closes = [r[4] for r in rows]
-            vols = [r[5] for r in rows]
-            all_divs.extend(indicator_divergences(m, tf, closes, vols))
-        all_divs.extend(pair_divergences(tf, series))
-        score, label = risk_score(tf, arrows, all_divs)
-        caption = f"<b>{tf}</b>: {label} (счёт {score})\n<i>/chart_album 15m|1h|4h|1d</i>"
+        state = self._market_state(tf)
+        caption = f"<b>{tf}</b>: {state.label} (счёт {state.score:+.1f})\n<i>/chart_album 15m|1h|4h|1d</i>"
 
         media_group = []
         for i, item in enumerate(panels):
@@ -3977,11 +3889,14 @@ class TeleBot:
     async def _on_backtest_legacy(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Старая реализация команды /bt."""
         parts = update.effective_message.text.split()
+        if len(parts) > 1 and parts[1].lower() == "sweep":
+            await self._send_bt_sweep(update.effective_chat.id, parts[2:])
+            return
         tf = self._resolve_tf(update, context)
         sym = self._resolve_symbol(update, context, "BTC")
         strat = self._resolve_study(update, context, "rsi")
         if strat.lower() != "rsi":
-            await update.effective_message.reply_text("Сейчас доступно: /bt rsi SYMBOL [tf]")
+            await update.effective_message.reply_text("Сейчас доступно: /bt rsi SYMBOL [tf], /bt sweep [rsi|ema|macd] [SYMBOLS] [TFS]")
             return
         await self._send_bt_rsi(update.effective_chat.id, sym=sym, tf=tf)
 
@@ -4022,51 +3937,18 @@ class TeleBot:
     
     async def _on_events_add_legacy(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Старая реализация команды /events_add."""
-        import re
-        from ..infrastructure.events import add_event
-        from zoneinfo import ZoneInfo
-        from datetime import datetime
-
-        def _parse_date_to_ms(date_str: str, tz) -> int:
-            """
-            Преобразует 'YYYY-MM-DD' (или 'YYYY-MM-DD HH:MM') в unix ms локальной TZ.
-            Если время не указано — берём полночь.
-            """
-            date_str = date_str.strip()
-            # поддержим оба формата
-            fmt = "%Y-%m-%d %H:%M" if " " in date_str else "%Y-%m-%d"
-            dt = datetime.strptime(date_str, fmt)
-            # если времени нет — полночь по локальной TZ
-            if fmt == "%Y-%m-%d":
-                dt = dt.replace(hour=0, minute=0, second=0, microsecond=0)
-            if tz:
-                dt = dt.replace(tzinfo=tz)
-            return int(dt.timestamp() * 1000)
-        text = (update.effective_message.text or "").strip()
-
-        # Разрешим оба формата: с временем и без
-        m = re.match(r"^/events_add\s+(\d{4}-\d{2}-\d{2}(?:\s+\d{2}:\d{2})?)\s+(.+)$", text)
-        if not m:
-            await update.effective_message.reply_text(
-                "Формат: /events_add YYYY-MM-DD [HH:MM] Текст события\n"
-                "Пример: /events_add 2025-10-05 19:00 FOMC"
-            )
-            return
-
-        date_str, title = m.group(1), m.group(2)
-
-        try:
-            tz = getattr(settings, "tz", None)
-        except Exception:
-            tz = None
+        from ..infrastructure.events import add_event, get_user_tz, get_user_tz_name
+        from ..infrastructure.events_parse import parse_event_add
 
+        user_id = update.effective_user.id if update.effective_user else None
+        tz = get_user_tz(user_id)
         try:
-            ts_ms = _parse_date_to_ms(date_str, tz)
-        except Exception as e:
-            await update.effective_message.reply_text(f"Ошибка в дате: {e}")
+            ts_ms, title, recur = parse_event_add(update.effective_message.text or "", tz)
+        except ValueError as e:
+            await update.effective_message.reply_text(str(e))
             return
 
-        eid = add_event(ts_ms, title, author_chat_id=(update.effective_user.id if update.effective_user else None))
+        eid = add_event(ts_ms, title, author_chat_id=user_id, recur=recur, tz=get_user_tz_name(user_id) or str(tz))
         await update.effective_message.reply_text(f"✅ Событие добавлено (id={eid}). Видно всем.")
 
     async def on_events_list(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -4126,6 +4008,17 @@ class TeleBot:
             except Exception:
                 logger.exception("on_events_del legacy also failed")
     
+    async def on_events_tz(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /events_tz — часовой пояс пользователя для событий."""
+        try:
+            if self.integrator:
+                handled = await self.integrator.handle_command("events_tz", update, context)
+                if handled:
+                    return
+            await update.effective_message.reply_text("Команда /events_tz временно недоступна.")
+        except Exception:
+            logger.exception("on_events_tz failed")
+
     async def _on_events_del_legacy(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Старая реализация команды /events_del."""
         from ..infrastructure.events import del_event
@@ -4158,127 +4051,43 @@ class TeleBot:
     # ---------------- jobs ----------------
 
     async def job_broadcast_compact(self, context: ContextTypes.DEFAULT_TYPE):
-        """Рассылка краткого отчёта (каждый час в :30)."""
-        text = self._build_compact_safe()
+        """Рассылка краткого отчёта (каждый час в :30) через очередь доставки."""
         subs = list(self.db.list_subs())
         if not subs:
             return
-        delay = SEND_DELAY_SEC
-        for chat_id in subs:
-            try:
-                await self._send_html(chat_id, text, reply_markup=self._kb('main'))
-                await asyncio.sleep(delay)
-            except RetryAfter as e:
-                wait_for = int(getattr(e, "retry_after", 2))
-                logger.warning("429 RetryAfter chat_id=%s, sleeping %ss", chat_id, wait_for)
-                await asyncio.sleep(wait_for)
-            except Forbidden:
-                logger.info("Forbidden chat_id=%s; removing from subs", chat_id)
-                try:
-                    self.db.remove_sub(chat_id)
-                except Exception:
-                    logger.exception("failed to remove sub after Forbidden")
-            except (TimedOut, NetworkError):
-                delay = min(delay * 1.5 + 0.05, 1.0)
-                logger.warning("network issue on send to chat_id=%s; new delay=%.2fs", chat_id, delay)
-                await asyncio.sleep(delay)
-            except Exception:
-                logger.exception("send failed chat_id=%s, delay=%.2f", chat_id, delay)
-                await asyncio.sleep(delay)
+        n = self.outbox.broadcast_html(subs, self._build_compact_safe(), reply_markup=self._kb('main'))
+        logger.info("broadcast_compact: enqueued %d messages for %d subs", n, len(subs))
 
     async def job_broadcast_full(self, context: ContextTypes.DEFAULT_TYPE):
-        """Рассылка полного текста (раз в час в :00)."""
-        text = self._build_full_safe()
+        """Рассылка полного текста (раз в час в :00) через очередь доставки."""
         subs = list(self.db.list_subs())
         if not subs:
             return
-        delay = SEND_DELAY_SEC
-        for chat_id in subs:
-            try:
-                await self._send_html(chat_id, text, reply_markup=self._kb('main'))
-                await asyncio.sleep(delay)
-            except RetryAfter as e:
-                wait_for = int(getattr(e, "retry_after", 2))
-                logger.warning("429 RetryAfter (full) chat_id=%s, sleeping %ss", chat_id, wait_for)
-                await asyncio.sleep(wait_for)
-            except Forbidden:
-                logger.info("Forbidden chat_id=%s; removing from subs", chat_id)
-                try:
-                    self.db.remove_sub(chat_id)
-                except Exception:
-                    logger.exception("failed to remove sub after Forbidden")
-            except (TimedOut, NetworkError):
-                delay = min(delay * 1.5 + 0.05, 1.0)
-                logger.warning("network issue on send full to chat_id=%s; new delay=%.2fs", chat_id, delay)
-                await asyncio.sleep(delay)
-            except Exception:
-                logger.exception("send full failed chat_id=%s", chat_id)
-                await asyncio.sleep(delay)
+        n = self.outbox.broadcast_html(subs, self._build_full_safe(), reply_markup=self._kb('main'))
+        logger.info("broadcast_full: enqueued %d messages for %d subs", n, len(subs))
 
     async def job_broadcast_chart(self, context: ContextTypes.DEFAULT_TYPE):
+        subs = list(self.db.list_subs())
+        if not subs:
+            return
+
         tf = "1h"
-        from ..visual.digest import render_digest
         try:
-            png = render_digest(self.db, tf)
+            png = await self._render_digest_png(tf)
         except Exception:
             logger.exception("render_digest failed in job")
             return
 
         try:
-            arrows = {}
-            for m in METRICS:
-                closes = get_closes(self.db, m, tf, 80)
-                arrows[m] = trend_arrow_metric(m, tf, closes)
-
-            all_divs = []
-            for m in METRICS:
-                rows = self.db.last_n(m, tf, 320)
-                if not rows:
-                    continue
-                highs  = [r[2] for r in rows]
-                lows   = [r[3] for r in rows]
-                closes = [r[4] for r in rows]
-                vols   = [r[5] for r in rows]
-                all_divs.extend(indicator_divergences(m, tf, closes, vols))
-
-            series = self._pair_series_sec(tf, 320)
-            all_divs.extend(pair_divergences(tf, series))
-
-            score, label = risk_score(tf, arrows, all_divs)
-            caption = f"<b>{tf}</b>: {label} (счёт {score})\n<i>/chart 15m|1h|4h|1d</i>"
+            state = self._market_state(tf)
+            caption = f"<b>{tf}</b>: {state.label} (счёт {state.score:+.1f})\n<i>/chart 15m|1h|4h|1d</i>"
         except Exception:
             logger.exception("risk label failed in job")
             caption = f"<b>{tf}</b> дайджест"
 
-        subs = list(self.db.list_subs())
-        if not subs:
-            return
-
-        delay = SEND_DELAY_SEC
-        for chat_id in subs:
-            try:
-                await self.app.bot.send_photo(
-                    chat_id=chat_id, photo=png, caption=caption, parse_mode=ParseMode.HTML,
-                    reply_markup=self._kb('main')
-                )
-                await asyncio.sleep(delay)
-            except RetryAfter as e:
-                wait_for = int(getattr(e, "retry_after", 2))
-                logger.warning("429 on photo chat_id=%s, sleep=%ss", chat_id, wait_for)
-                await asyncio.sleep(wait_for)
-            except Forbidden:
-                logger.info("Forbidden chat_id=%s; removing from subs", chat_id)
-                try:
-                    self.db.remove_sub(chat_id)
-                except Exception:
-                    logger.exception("failed to remove sub after Forbidden")
-            except (TimedOut, NetworkError):
-                delay = min(delay * 1.5 + 0.05, 1.0)
-                logger.warning("network issue on photo to chat_id=%s; delay=%.2fs", chat_id, delay)
-                await asyncio.sleep(delay)
-            except Exception:
-                logger.exception("send_photo failed chat_id=%s", chat_id)
-                await asyncio.sleep(delay)
+        # PNG хранится в очереди один раз на всех подписчиков
+        self.outbox.broadcast(subs, "send_photo", photo=png, caption=caption, parse_mode=ParseMode.HTML,
+                              reply_markup=self._kb('main'))
 
     async def on_events_btn(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         q = update.callback_query
@@ -4337,6 +4146,27 @@ class TeleBot:
         else:
             await update.effective_message.reply_text("Команда /forecast временно недоступна")
 
+    async def _post_init(self, application: Application):
+        await self._setup_menu_commands_async(application)
+        self.outbox.start(application.bot)
+        from .delivery import LANE_ALERT
+        from .event_scheduler import get_event_scheduler
+        get_event_scheduler().start(
+            send=lambda chat_id, text: self.outbox.enqueue(chat_id, lane=LANE_ALERT, text=text,
+                                                          parse_mode=ParseMode.HTML))
+        # живые стаканы (BOOK_STREAM_SYMBOLS) — /whale_orders читает их без REST
+        from .orderbook import get_orderbook_service
+        get_orderbook_service().start()
+
+    async def _post_shutdown(self, application: Application):
+        from .event_scheduler import get_event_scheduler
+        from .orderbook import get_orderbook_service
+        await get_orderbook_service().stop()
+        await get_event_scheduler().stop()
+        await self.outbox.stop()
+        from .http_transport import get_transport
+        await get_transport().aclose()
+
     async def _setup_menu_commands_async(self, application: Application):
         """Настройка меню-кнопки с быстрыми командами (вызывается при старте бота)."""
         commands = [
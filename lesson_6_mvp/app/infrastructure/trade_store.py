@@ -0,0 +1,453 @@
+# app/infrastructure/trade_store.py
+"""
+Хранилище сырых сделок бирж (TWAP-анализ, крупные сделки).
+
+Вместо одной таблицы trades с REAL-колонками и UNIQUE(symbol, exchange, time, price, qty):
+- отдельный файл SQLite рядом с основной БД (<db>_trades.db) — WAL сделок не мешает барам;
+- партиция на UTC-день: таблица tp_YYYYMMDD WITHOUT ROWID, кластеризована по
+  (sym, time, ex, tid) — диапазон «символ × период» читается последовательно, без отдельного индекса;
+- symbol / exchange словарём в маленькие int (UNIQUE(kind, id), выдача под BEGIN IMMEDIATE —
+  безопасно при нескольких процессах на одном файле), цена и объём — целые с масштабом 1e8;
+- дедупликация по id сделки биржи (aggTrade id / execId / tradeId); если id нет — по хэшу (price, qty);
+- retention удаляет партиции целиком (DROP TABLE), опционально выгружая их в Parquet (zstd).
+
+    store = get_trade_store(db)
+    store.insert(trades)                       # dict'ы как у TradesCollectorService
+    store.range("BTCUSDT", since_ms, until_ms)  # как DB.get_trades_by_period
+    store.retain(max_age_hours=24, archive_dir="/data/trades_archive")
+
+Бенчмарк (вставка и чтение диапазона против старой схемы):
+    python -m app.infrastructure.trade_store --rows 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+log = logging.getLogger("alt_forecast.trade_store")
+
+PRICE_SCALE = 10 ** 8
+QTY_SCALE = 10 ** 8
+DAY_MS = 86_400_000
+_INT64_MAX = 2 ** 63 - 1
+_PART_RE = re.compile(r"^tp_(\d{8})$")
+
+TRADES_RETENTION_HOURS = int(os.getenv("TRADES_RETENTION_HOURS", "24"))
+TRADES_ARCHIVE_DIR = os.getenv("TRADES_ARCHIVE_DIR", "")
+
+
+def _day_of(ts_ms: int) -> str:
+    return datetime.fromtimestamp(ts_ms // 1000, tz=timezone.utc).strftime("%Y%m%d")
+
+
+def _day_start_ms(day: str) -> int:
+    return int(datetime.strptime(day, "%Y%m%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def _scaled(x: float, scale: int) -> int:
+    v = int(round(float(x) * scale))
+    if abs(v) > _INT64_MAX:
+        raise ValueError(f"value {x} does not fit int64 at scale {scale}")
+    return v
+
+
+def trade_id(trade: Dict) -> int:
+    """
+    Целочисленный id сделки для дедупликации: id биржи, если он числовой; строковые id (execId Bybit)
+    и сделки без id — 63-битный хэш (для последних — от цены и объёма, как старый UNIQUE).
+    """
+    raw = trade.get("trade_id")
+    if type(raw) is int and 0 <= raw <= _INT64_MAX:
+        return raw
+    if raw is not None:
+        s = str(raw)
+        if s.isdigit() and int(s) <= _INT64_MAX:
+            return int(s)
+        key = s
+    else:
+        key = f"{_scaled(trade['price'], PRICE_SCALE)}:{_scaled(trade['qty'], QTY_SCALE)}"
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big") >> 1
+
+
+def default_path(db_path: str) -> str:
+    root, ext = os.path.splitext(db_path)
+    return f"{root}_trades{ext or '.db'}"
+
+
+class TradeStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        cur = self.conn.cursor()
+        cur.execute(f"PRAGMA journal_mode={os.getenv('SQLITE_JOURNAL_MODE', 'WAL')};")
+        cur.execute("PRAGMA synchronous=NORMAL;")
+        cur.execute("PRAGMA busy_timeout=5000;")
+        cur.execute("PRAGMA temp_store=MEMORY;")
+        cur.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS trade_dict (
+                kind TEXT NOT NULL,                -- 'sym' / 'ex'
+                name TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                PRIMARY KEY (kind, name)
+            ) WITHOUT ROWID;
+            CREATE UNIQUE INDEX IF NOT EXISTS trade_dict_id ON trade_dict(kind, id);
+            """
+        )
+        self._ids: Dict[Tuple[str, str], int] = {}
+        self._names: Dict[Tuple[str, int], str] = {}
+        self._load_dict()
+        self._parts = set(self.partitions())
+
+    def close(self) -> None:
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+    # ---- словарь и партиции ----
+
+    def _load_dict(self) -> None:
+        # словарь мог пополниться другим процессом — перечитываем целиком (десятки строк)
+        for kind, name, i in self.conn.execute("SELECT kind, name, id FROM trade_dict"):
+            self._ids[(kind, name)] = i
+            self._names[(kind, i)] = name
+
+    def _dict_id(self, kind: str, name: str, create: bool = True) -> Optional[int]:
+        i = self._ids.get((kind, name))
+        if i is not None:
+            return i
+        if not create:
+            self._load_dict()
+            return self._ids.get((kind, name))
+        # MAX(id)+1 и INSERT в одной IMMEDIATE-транзакции: второй писатель ждёт и увидит уже выданный id
+        cur = self.conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            row = cur.execute("SELECT id FROM trade_dict WHERE kind=? AND name=?", (kind, name)).fetchone()
+            if row is None:
+                i = cur.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM trade_dict WHERE kind=?", (kind,)).fetchone()[0]
+                cur.execute("INSERT INTO trade_dict(kind, name, id) VALUES (?,?,?)", (kind, name, i))
+            else:
+                i = row[0]
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        self._ids[(kind, name)] = i
+        self._names[(kind, i)] = name
+        return i
+
+    def _name(self, kind: str, i: int) -> str:
+        if (kind, i) not in self._names:
+            self._load_dict()
+        return self._names.get((kind, i), "")
+
+    def partitions(self) -> List[str]:
+        """Дни (YYYYMMDD), для которых есть партиции, по возрастанию."""
+        rows = self.conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'tp_%'").fetchall()
+        return sorted(m.group(1) for (name,) in rows if (m := _PART_RE.match(name)))
+
+    def _ensure_partition(self, day: str) -> str:
+        # CREATE … IF NOT EXISTS на каждый батч: партицию из кэша мог удалить retention другого процесса
+        table = f"tp_{day}"
+        self.conn.execute(
+            f"""CREATE TABLE IF NOT EXISTS {table} (
+                    sym INTEGER NOT NULL,
+                    time INTEGER NOT NULL,     -- ms
+                    ex INTEGER NOT NULL,
+                    tid INTEGER NOT NULL,      -- id сделки на бирже (или хэш)
+                    price INTEGER NOT NULL,    -- × PRICE_SCALE
+                    qty INTEGER NOT NULL,      -- × QTY_SCALE
+                    is_buyer INTEGER NOT NULL,
+                    PRIMARY KEY (sym, time, ex, tid)
+                ) WITHOUT ROWID""")
+        self._parts.add(day)
+        return table
+
+    def _part_rows(self, day: str, sql: str, args: Tuple = ()) -> List[Tuple]:
+        """Запрос к tp_<day>; партиция, удалённая другим процессом, — пустая (и уходит из кэша)."""
+        try:
+            return self.conn.execute(sql, args).fetchall()
+        except sqlite3.OperationalError as e:
+            if "no such table" not in str(e):
+                raise
+            self._parts.discard(day)
+            return []
+
+    # ---- запись ----
+
+    def insert(self, trades: Iterable[Dict]) -> int:
+        """Батч-вставка (INSERT OR IGNORE по PK); возвращает число новых строк."""
+        by_day: Dict[int, List[Tuple]] = {}
+        ps, qs = PRICE_SCALE, QTY_SCALE
+        with self._lock:
+            sym_ids: Dict[str, int] = {}
+            ex_ids: Dict[str, int] = {}
+            for t in trades:
+                ts = int(t["time"])
+                sym = sym_ids.get(t["symbol"]) or sym_ids.setdefault(t["symbol"], self._dict_id("sym", t["symbol"]))
+                ex = ex_ids.get(t["exchange"]) or ex_ids.setdefault(t["exchange"], self._dict_id("ex", t["exchange"]))
+                price, qty = round(t["price"] * ps), round(t["qty"] * qs)
+                if price > _INT64_MAX or qty > _INT64_MAX:
+                    raise ValueError(f"trade does not fit int64 at scale 1e8: {t}")
+                by_day.setdefault(ts // DAY_MS, []).append(
+                    (sym, ts, ex, trade_id(t), price, qty, 1 if t["is_buyer"] else 0))
+            if not by_day:
+                return 0
+            cur = self.conn.cursor()
+            before = self.conn.total_changes
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                for day_n, rows in by_day.items():
+                    table = self._ensure_partition(_day_of(day_n * DAY_MS))
+                    rows.sort()
+                    cur.executemany(f"INSERT OR IGNORE INTO {table} VALUES (?,?,?,?,?,?,?)", rows)
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                self._parts = set(self.partitions())
+                raise
+            return self.conn.total_changes - before
+
+    # ---- чтение ----
+
+    def _days_between(self, since_ms: int, until_ms: int) -> List[str]:
+        lo, hi = _day_of(max(0, since_ms)), _day_of(max(0, until_ms))
+        if hi > max(self._parts, default=""):
+            # новые дни мог создать другой процесс (воркер пишет, бот читает) — перечитываем sqlite_master
+            self._parts = set(self.partitions())
+        return [d for d in sorted(self._parts) if lo <= d <= hi]
+
+    def range_arrays(self, symbol: str, since_ms: int, until_ms: int,
+                     exchange: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """Сделки за период колонками: time, price, qty (float64), is_buyer (bool), ex (код биржи)."""
+        cols: List[List[Tuple]] = []
+        with self._lock:
+            sym = self._dict_id("sym", symbol, create=False)
+            ex = self._dict_id("ex", exchange, create=False) if exchange else None
+            if sym is not None and not (exchange and ex is None):
+                for day in self._days_between(since_ms, until_ms):
+                    sql = f"SELECT time, price, qty, is_buyer, ex FROM tp_{day} WHERE sym=? AND time>=? AND time<=?"
+                    args: Tuple = (sym, since_ms, until_ms)
+                    if ex is not None:
+                        sql += " AND ex=?"
+                        args += (ex,)
+                    cols.append(self._part_rows(day, sql + " ORDER BY time, ex, tid", args))
+        rows = [r for part in cols for r in part]
+        a = np.array(rows, dtype=np.int64).reshape(-1, 5)
+        return {
+            "time": a[:, 0], "price": a[:, 1] / PRICE_SCALE, "qty": a[:, 2] / QTY_SCALE,
+            "is_buyer": a[:, 3].astype(bool), "ex": a[:, 4],
+        }
+
+    def range(self, symbol: str, since_ms: int, until_ms: int, exchange: Optional[str] = None) -> List[Dict]:
+        """То же, что DB.get_trades_by_period: список dict по возрастанию времени."""
+        a = self.range_arrays(symbol, since_ms, until_ms, exchange)
+        with self._lock:
+            names = {i: self._name("ex", i) for i in np.unique(a["ex"]).tolist()}
+        return [
+            {"time": t, "price": p, "qty": q, "is_buyer": b, "exchange": names[e]}
+            for t, p, q, b, e in zip(a["time"].tolist(), a["price"].tolist(), a["qty"].tolist(),
+                                     a["is_buyer"].tolist(), a["ex"].tolist())
+        ]
+
+    def count(self) -> int:
+        with self._lock:
+            self._parts = set(self.partitions())
+            return sum(row[0] for d in sorted(self._parts)
+                       for row in self._part_rows(d, f"SELECT COUNT(*) FROM tp_{d}"))
+
+    # ---- retention / архив ----
+
+    def archive_partition(self, day: str, archive_dir: str) -> str:
+        """Партиция → <archive_dir>/trades_YYYYMMDD.parquet (zstd). Нужен pyarrow (или fastparquet)."""
+        import pandas as pd
+
+        with self._lock:
+            rows = self._part_rows(day, f"SELECT sym, ex, time, tid, price, qty, is_buyer FROM tp_{day} "
+                                        f"ORDER BY sym, time, ex, tid")
+        df = pd.DataFrame(rows, columns=["sym", "ex", "time", "trade_id", "price", "qty", "is_buyer"])
+        with self._lock:
+            df.insert(0, "symbol", df.pop("sym").map(lambda i: self._name("sym", i)))
+            df.insert(1, "exchange", df.pop("ex").map(lambda i: self._name("ex", i)))
+        df["price"] = df["price"] / PRICE_SCALE
+        df["qty"] = df["qty"] / QTY_SCALE
+        df["is_buyer"] = df["is_buyer"].astype(bool)
+        os.makedirs(archive_dir, exist_ok=True)
+        path = os.path.join(archive_dir, f"trades_{day}.parquet")
+        tmp = path + ".tmp"
+        df.to_parquet(tmp, compression="zstd", index=False)
+        os.replace(tmp, path)
+        return path
+
+    def drop_partition(self, day: str) -> int:
+        """DROP TABLE партиции; возвращает число строк в ней."""
+        with self._lock:
+            if day not in self._parts:
+                return 0
+            n = sum(row[0] for row in self._part_rows(day, f"SELECT COUNT(*) FROM tp_{day}"))
+            self.conn.execute(f"DROP TABLE IF EXISTS tp_{day}")
+            self._parts.discard(day)
+            return n
+
+    def retain(self, max_age_hours: int = TRADES_RETENTION_HOURS, archive_dir: str = TRADES_ARCHIVE_DIR,
+               now_ms: Optional[int] = None) -> int:
+        """
+        Удаляет партиции, целиком старше max_age_hours (день кончился до cutoff); возвращает число удалённых строк.
+        С archive_dir сначала пишет Parquet; если выгрузка не удалась — партиция остаётся.
+        """
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        cutoff = now_ms - max_age_hours * 3_600_000
+        dropped, rows = [], 0
+        with self._lock:
+            self._parts = set(self.partitions())      # с учётом дней, созданных другими процессами
+        for day in sorted(self._parts):
+            if _day_start_ms(day) + DAY_MS > cutoff:
+                continue
+            if archive_dir:
+                try:
+                    self.archive_partition(day, archive_dir)
+                except Exception:
+                    log.exception("trade partition %s: archive failed, keeping it", day)
+                    continue
+            rows += self.drop_partition(day)
+            dropped.append(day)
+        if dropped:
+            log.info("trade store: dropped partitions %s (%d rows)", ", ".join(dropped), rows)
+        return rows
+
+    # ---- миграция ----
+
+    def migrate_legacy(self, conn: sqlite3.Connection, chunk: int = 50_000) -> int:
+        """Переносит строки старой таблицы trades основной БД и удаляет её."""
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='trades'").fetchone()
+        if not exists:
+            return 0
+        moved, last_id = 0, 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, symbol, exchange, time, price, qty, is_buyer FROM trades WHERE id>? ORDER BY id LIMIT ?",
+                (last_id, chunk)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            moved += self.insert({"symbol": r[1], "exchange": r[2], "time": r[3], "price": r[4], "qty": r[5],
+                                  "is_buyer": bool(r[6])} for r in rows)
+        conn.execute("DROP TABLE trades")
+        log.info("trade store: migrated %d rows from legacy trades table", moved)
+        return moved
+
+
+_stores: Dict[str, TradeStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_trade_store(db) -> TradeStore:
+    """Хранилище сделок для основной БД db (файл <db>_trades.db); при первом открытии — миграция старой таблицы."""
+    path = default_path(db.path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = TradeStore(path)
+            store.migrate_legacy(db.conn)
+        return store
+
+
+def close_trade_store(db) -> None:
+    with _stores_lock:
+        store = _stores.pop(default_path(db.path), None)
+    if store is not None:
+        store.close()
+
+
+# ---------- бенчмарк ----------
+
+def _bench(rows: int, batch: int, scans: int) -> Dict[str, float]:
+    rng = np.random.default_rng(0)
+    exchanges, symbols = ["Binance", "Bybit", "OKX", "Gate"], ["BTCUSDT", "ETHUSDT", "SOLUSDT", "XRPUSDT"]
+    t0 = 1_735_689_600_000
+    times = np.sort(t0 + rng.integers(0, 2 * DAY_MS, rows))
+    trades = [
+        {"symbol": symbols[i % 4], "exchange": exchanges[(i // 4) % 4], "time": int(times[i]), "trade_id": i,
+         "price": round(float(50_000 + rng.normal(0, 100)), 2), "qty": round(float(rng.exponential(0.1)), 6),
+         "is_buyer": bool(i & 1), "collected_at": int(times[-1])}
+        for i in range(rows)
+    ]
+    out: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # старая схема — как было в DB._init / DB.upsert_many_trades
+        legacy = sqlite3.connect(os.path.join(tmp, "legacy.db"), isolation_level=None)
+        legacy.execute("PRAGMA journal_mode=WAL;")
+        legacy.execute("PRAGMA synchronous=NORMAL;")
+        legacy.executescript("""
+            CREATE TABLE trades (id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT NOT NULL, exchange TEXT NOT NULL,
+                time INTEGER NOT NULL, price REAL NOT NULL, qty REAL NOT NULL, is_buyer INTEGER NOT NULL,
+                collected_at INTEGER NOT NULL, UNIQUE(symbol, exchange, time, price, qty));
+            CREATE INDEX idx_trades_symbol_time ON trades(symbol, time DESC);
+            CREATE INDEX idx_trades_exchange_time ON trades(exchange, time DESC);
+            CREATE INDEX idx_trades_collected_at ON trades(collected_at DESC);
+        """)
+        s = time.perf_counter()
+        for k in range(0, rows, batch):
+            legacy.execute("BEGIN IMMEDIATE")
+            legacy.executemany(
+                "INSERT OR IGNORE INTO trades(symbol, exchange, time, price, qty, is_buyer, collected_at) "
+                "VALUES (?,?,?,?,?,?,?)",
+                [(t["symbol"], t["exchange"], t["time"], t["price"], t["qty"], int(t["is_buyer"]), t["collected_at"])
+                 for t in trades[k:k + batch]])
+            legacy.execute("COMMIT")
+        out["legacy_insert_rows_s"] = rows / (time.perf_counter() - s)
+
+        store = TradeStore(os.path.join(tmp, "store.db"))
+        s = time.perf_counter()
+        for k in range(0, rows, batch):
+            store.insert(trades[k:k + batch])
+        out["store_insert_rows_s"] = rows / (time.perf_counter() - s)
+
+        windows = [(int(t0 + rng.integers(0, 2 * DAY_MS - 3_600_000)), symbols[j % 4]) for j in range(scans)]
+        s = time.perf_counter()
+        for since, sym in windows:
+            legacy.execute("SELECT time, price, qty, is_buyer, exchange FROM trades WHERE symbol=? AND time>=? "
+                           "AND time<=? ORDER BY time ASC", (sym, since, since + 3_600_000)).fetchall()
+        out["legacy_scan_1h_ms"] = (time.perf_counter() - s) / scans * 1000
+        s = time.perf_counter()
+        for since, sym in windows:
+            store.range(sym, since, since + 3_600_000)
+        out["store_scan_1h_ms"] = (time.perf_counter() - s) / scans * 1000
+        s = time.perf_counter()
+        for since, sym in windows:
+            store.range_arrays(sym, since, since + 3_600_000)
+        out["store_scan_1h_arrays_ms"] = (time.perf_counter() - s) / scans * 1000
+        legacy.close()
+        store.close()
+        out["legacy_file_mb"] = os.path.getsize(os.path.join(tmp, "legacy.db")) / 2 ** 20
+        out["store_file_mb"] = os.path.getsize(os.path.join(tmp, "store.db")) / 2 ** 20
+    return {k: round(v, 2) for k, v in out.items()}
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Бенчмарк хранилища сделок против старой таблицы trades")
+    p.add_argument("--rows", type=int, default=500_000)
+    p.add_argument("--batch", type=int, default=5_000)
+    p.add_argument("--scans", type=int, default=50)
+    a = p.parse_args()
+    for k, v in _bench(a.rows, a.batch, a.scans).items():
+        print(f"{k:<26} {v:>12,.2f}")
+
+
+if __name__ == "__main__":
+    main()
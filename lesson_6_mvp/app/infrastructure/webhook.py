@@ -3,16 +3,21 @@ from __future__ import annotations
 
 import hmac
 import logging
+import time
 from typing import Iterable
 
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from pydantic import BaseModel, field_validator
 import os
 
 from .db import DB                    # не меняю импорты, как у тебя
+from .live_stream import ChangeTailer, LiveEvent, create_live_stream_router, get_live_hub
 from ..config import settings         # pydantic-settings или твой конфиг
+from ..utils.metrics import (
+    HTTP_SERVER_SECONDS, PROMETHEUS_CONTENT_TYPE, QUEUE_DEPTH, install_http_instrumentation, render_prometheus,
+)
 
 app = FastAPI(
     title="Alt Forecast Bot API",
@@ -24,6 +29,7 @@ app = FastAPI(
 log = logging.getLogger("alt_forecast.api")
 
 _db: DB | None = None
+_live_tailer: ChangeTailer | None = None
 
 # Разрешённые ТФ и маппинг входящих ключей от TV
 TF_MAP = {
@@ -108,9 +114,29 @@ class BarIn(BaseModel):
             raise ValueError("inconsistent OHLC values")
         return h
 
+@app.middleware("http")
+async def _metrics_middleware(request: Request, call_next):
+    # шаблон пути (/api/bars/{metric}/{timeframe}), а не сырой URL — иначе кардинальность лейблов не ограничена
+    t0 = time.perf_counter()
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_SERVER_SECONDS.observe(
+            time.perf_counter() - t0,
+            route=getattr(route, "path", "unmatched"), method=request.method, status=status,
+        )
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 @app.on_event("startup")
 def _startup():
-    global _db
+    global _db, _live_tailer
     db_path = (
         getattr(settings, "DATABASE_PATH", None)
         or getattr(settings, "database_path", None)
@@ -118,6 +144,8 @@ def _startup():
     )
     _db = DB(db_path)
     log.info("DB initialized at %s", db_path)
+    install_http_instrumentation()
+    QUEUE_DEPTH.set_function(lambda: get_live_hub().get_stats()["pending"], queue="live_stream")
     
     # Регистрируем REST API роуты
     try:
@@ -126,6 +154,13 @@ def _startup():
         log.info("REST API routes registered")
     except Exception as e:
         log.warning("Failed to register REST API routes: %s", e)
+
+    # Push-канал (SSE/WebSocket) для дашборда
+    try:
+        _live_tailer = create_live_stream_router(app, _db)
+        log.info("Live stream routes registered")
+    except Exception as e:
+        log.warning("Failed to register live stream routes: %s", e)
     
     # Статические файлы для веб-интерфейса
     static_dir = os.path.join(os.path.dirname(__file__), "static")
@@ -141,6 +176,17 @@ def _startup():
         
         log.info("Static files mounted at /static, root endpoint configured")
 
+@app.on_event("startup")
+async def _start_live_tailer():
+    # отдельный async-хук: tailer живёт в event loop сервера
+    if _live_tailer is not None:
+        _live_tailer.start()
+
+@app.on_event("shutdown")
+async def _stop_live_tailer():
+    if _live_tailer is not None:
+        await _live_tailer.stop()
+
 @app.post("/webhook")
 async def webhook(request: Request):
     if _db is None:
@@ -159,6 +205,14 @@ async def webhook(request: Request):
     except Exception:
         raise HTTPException(status_code=400, detail="invalid json")
 
+    ingest_payload(_db, data)
+    return {"ok": True}
+
+def ingest_payload(db: DB, data: dict, *, publish: bool = True) -> BarIn:
+    """
+    Путь приёма бара от TradingView без HTTP-обвязки: секрет → валидация → upsert → push.
+    Используется /webhook и replay-харнессом (app.replay). Ошибки — HTTPException.
+    """
     # Проверяем секрет константно-временным сравнением
     if not secret_ok(data.get("secret")):
         raise HTTPException(status_code=401, detail="invalid secret")
@@ -170,14 +224,18 @@ async def webhook(request: Request):
         raise HTTPException(status_code=422, detail=str(e))
 
     try:
-        _db.upsert_bar(bar.metric, bar.timeframe, bar.ts, bar.o, bar.h, bar.l, bar.c, bar.v)
+        db.upsert_bar(bar.metric, bar.timeframe, bar.ts, bar.o, bar.h, bar.l, bar.c, bar.v)
     except Exception as e:
         log.exception("db upsert failed")
         raise HTTPException(status_code=500, detail="db error")
 
+    # Мгновенная рассылка подписчикам /api/stream (без ожидания опроса БД)
+    if publish:
+        get_live_hub().publish(LiveEvent.bar(bar.metric, bar.timeframe, bar.ts, bar.o, bar.h, bar.l, bar.c, bar.v))
+
     # Сдержанный лог без секрета/сырого payload
     log.info("ingest ok: metric=%s tf=%s ts=%s c=%.8f", bar.metric, bar.timeframe, bar.ts, bar.c)
-    return {"ok": True}
+    return bar
 
 @app.get("/healthz")
 async def healthz():
@@ -7,6 +7,9 @@ from ..services.snapshot_builder import build_tf_snapshot
 from ..services.image_renderer import draw_layout
 from ...infrastructure.db import DB
 
+# Таймфреймы согласно спецификации (их же читает версия кэша PNG в хендлере)
+TIMEFRAMES = ["5m", "15m", "1h", "4h", "1d"]
+
 
 def generate_liquidity_map(symbol: str, db: DB) -> bytes:
     """
@@ -19,12 +22,9 @@ def generate_liquidity_map(symbol: str, db: DB) -> bytes:
     Returns:
         PNG bytes
     """
-    # Таймфреймы согласно спецификации
-    timeframes = ["5m", "15m", "1h", "4h", "1d"]
-    
     # Строим снимки для каждого таймфрейма
     snapshots = []
-    for tf in timeframes:
+    for tf in TIMEFRAMES:
         snapshot = build_tf_snapshot(symbol, tf, db)
         snapshots.append(snapshot)
     
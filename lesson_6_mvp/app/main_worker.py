@@ -3,11 +3,15 @@ from __future__ import annotations
 
 import logging
 import os
-from datetime import datetime, timezone
+import time
+from datetime import datetime, time as dtime, timezone
+from typing import List, Optional, Tuple
 from zoneinfo import ZoneInfo
 
 from .infrastructure.telegram_bot import TeleBot
 from .utils.logging_config import setup_basic_logging
+from .infrastructure.job_runtime import JOB_JITTER_SEC, KIND_IO, JobSpec, get_job_runtime
+from .utils.metrics import QUEUE_DEPTH, REGISTRY, install_http_instrumentation, start_metrics_server
 
 # Telegram-PTB job callbacks используют context
 from telegram.ext import CallbackContext
@@ -16,78 +20,72 @@ from telegram.constants import ParseMode
 
 # ---------- фоновые задачи (JobQueue) ----------
 
-async def warm_market(context: CallbackContext) -> None:
+def warm_market(context: CallbackContext) -> None:
     """
     Прогреваем кэш CoinGecko (markets_snapshot) — чтобы кнопки работали без лишних запросов.
-    Стоимость: 1 запрос / запуск (только если кэш пуст).
+    Стоимость: 1 запрос / запуск (только если кэш пуст). Синхронный requests → пул потоков (kind=io).
     """
     log = logging.getLogger("alt_forecast.worker")
-    try:
-        from .infrastructure.coingecko import markets_snapshot
-        result = markets_snapshot("usd")  # кэш внутри функции
-        
-        # Проверяем, что данные получены или есть в кэше
-        if result and len(result) > 0:
-            log.info(f"warm_market: OK (получено {len(result)} монет)")
-        else:
-            # Кэш пуст и API недоступен - это не критично, но логируем
-            log.warning("warm_market: кэш пуст, API недоступен - данные будут недоступны до восстановления API")
-    except Exception as e:
-        log.exception("warm_market: FAIL: %s", e)
+    from .infrastructure.coingecko import markets_snapshot
+    result = markets_snapshot("usd")  # кэш внутри функции
 
+    # Проверяем, что данные получены или есть в кэше
+    if result and len(result) > 0:
+        log.info(f"warm_market: OK (получено {len(result)} монет)")
+    else:
+        # Кэш пуст и API недоступен - это не критично, но логируем
+        log.warning("warm_market: кэш пуст, API недоступен - данные будут недоступны до восстановления API")
 
-async def run_daily(context: CallbackContext) -> None:
+
+def run_daily(context: CallbackContext) -> Optional[Tuple[List[int], str]]:
     """
     Раз в час проверяем, кому отправить «ежедневку» в их локальный час (из user_settings.daily_hour).
     Формат: глобалка + топ/флоп 24h (из снапшота, не бьём API сверх плана).
+    Сбор данных (requests к CoinGecko) — в пуле потоков; рассылка — send_daily_digest на loop.
     """
-    log = logging.getLogger("alt_forecast.worker")
-    try:
-        app = context.application
-        bot = app.bot
-        telebot: TeleBot = app.bot_data["telebot"]  # положим в main()
+    telebot: TeleBot = context.application.bot_data["telebot"]  # положим в main()
 
-        # Час в заданной таймзоне (берём из ENV TZ, по умолчанию Europe/Berlin)
-        tz_name = os.getenv("TZ", "Europe/Berlin")
-        now = datetime.now(ZoneInfo(tz_name))
-        cur_hour = now.hour
+    # Час в заданной таймзоне (берём из ENV TZ, по умолчанию Europe/Berlin)
+    tz_name = os.getenv("TZ", "Europe/Berlin")
+    cur_hour = datetime.now(ZoneInfo(tz_name)).hour
 
-        # Кого слать
-        users = telebot.db.list_daily_users(cur_hour)
-        if not users:
-            return
+    # Кого слать
+    users = telebot.db.list_daily_users(cur_hour)
+    if not users:
+        return None
 
-        from .infrastructure.coingecko import global_stats, top_movers
+    from .infrastructure.coingecko import global_stats, top_movers
 
-        # один вызов top_movers (использует кэш снапшота)
-        coins, gainers, losers, _ = top_movers("usd", "24h", 5)
+    # один вызов top_movers (использует кэш снапшота)
+    coins, gainers, losers, _ = top_movers("usd", "24h", 5)
 
-        g = global_stats().get("data", {})
-        mcap = g.get("total_market_cap", {}).get("usd")
-        vol = g.get("total_volume", {}).get("usd")
-        btc_d = g.get("market_cap_percentage", {}).get("btc")
+    g = global_stats().get("data", {})
+    mcap = g.get("total_market_cap", {}).get("usd")
+    vol = g.get("total_volume", {}).get("usd")
+    btc_d = g.get("market_cap_percentage", {}).get("btc")
 
-        def sym_list(arr):  # короткий список тикеров
-            return ", ".join([str(c.get("symbol", "")).upper() for c in arr])
+    def sym_list(arr):  # короткий список тикеров
+        return ", ".join([str(c.get("symbol", "")).upper() for c in arr])
 
-        text = (
-            "🌅 *Дайджест*\n"
-            f"• Капа: ${float(mcap or 0):,.0f}\n"
-            f"• 24h объём: ${float(vol or 0):,.0f}\n"
-            f"• BTC доминация: {float(btc_d or 0):.1f}%\n\n"
-            f"*Топ-5 24h*: {sym_list(gainers)}\n"
-            f"*Флоп-5 24h*: {sym_list(losers)}"
-        ).replace(",", " ")
+    text = (
+        "🌅 *Дайджест*\n"
+        f"• Капа: ${float(mcap or 0):,.0f}\n"
+        f"• 24h объём: ${float(vol or 0):,.0f}\n"
+        f"• BTC доминация: {float(btc_d or 0):.1f}%\n\n"
+        f"*Топ-5 24h*: {sym_list(gainers)}\n"
+        f"*Флоп-5 24h*: {sym_list(losers)}"
+    ).replace(",", " ")
+    return list(users), text
 
-        for uid in users:
-            try:
-                await bot.send_message(chat_id=uid, text=text, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
-            except Exception:
-                log.exception("run_daily: send_message FAIL user=%s", uid)
-        log.info("run_daily: sent to %d users at %02d:00 %s", len(users), cur_hour, tz_name)
 
-    except Exception as e:
-        log.exception("run_daily: FAIL: %s", e)
+async def send_daily_digest(context: CallbackContext, payload: Optional[Tuple[List[int], str]]) -> None:
+    log = logging.getLogger("alt_forecast.worker")
+    if not payload:
+        return
+    users, text = payload
+    telebot: TeleBot = context.application.bot_data["telebot"]
+    n = telebot.outbox.broadcast(users, text=text, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
+    log.info("run_daily: enqueued for %d/%d users", n, len(users))
 
 
 async def update_twap_detector(context: CallbackContext) -> None:
@@ -120,42 +118,100 @@ async def update_twap_detector(context: CallbackContext) -> None:
         log.exception(f"TWAP detector update failed: {e}")
 
 
-async def collect_trades(context: CallbackContext) -> None:
+def collect_trades(context: CallbackContext) -> None:
     """
     Сбор сделок с бирж каждый час для кэширования в БД.
     Собирает данные за последний час и сохраняет их для быстрого доступа.
+    Синхронные HTTP-запросы и запись в SQLite → пул потоков (kind=io).
     """
     log = logging.getLogger("alt_forecast.worker.trades_collector")
-    try:
-        telebot: TeleBot = context.application.bot_data.get("telebot")
-        if not telebot or not hasattr(telebot, 'db'):
-            log.warning("Telebot or DB not available for trades collection")
-            return
-        
-        from .application.services.trades_collector_service import TradesCollectorService
-        
-        collector = TradesCollectorService(telebot.db)
-        
-        log.info("Starting trades collection")
-        results = collector.collect_all_symbols(window_minutes=60)
-        
-        total_trades = sum(results.values())
-        log.info(f"Collected {total_trades} trades total: {results}")
-        
-        # Очищаем старые данные (старше 24 часов)
-        deleted = collector.cleanup_old_trades(max_age_hours=24)
-        if deleted > 0:
-            log.info(f"Cleaned up {deleted} old trades")
-        
-    except Exception as e:
-        log.exception(f"Trades collection failed: {e}")
+    telebot: TeleBot = context.application.bot_data.get("telebot")
+    if not telebot or not hasattr(telebot, 'db'):
+        log.warning("Telebot or DB not available for trades collection")
+        return
+
+    from .application.services.trades_collector_service import TradesCollectorService
 
+    collector = TradesCollectorService(telebot.db)
 
-async def evaluate_forecasts(context: CallbackContext) -> None:
+    log.info("Starting trades collection")
+    results = collector.collect_all_symbols(window_minutes=60)
+
+    total_trades = sum(results.values())
+    log.info(f"Collected {total_trades} trades total: {results}")
+
+    # Очищаем старые данные: дни, целиком старше TRADES_RETENTION_HOURS
+    from .infrastructure.trade_store import TRADES_RETENTION_HOURS
+    deleted = collector.cleanup_old_trades(max_age_hours=TRADES_RETENTION_HOURS)
+    if deleted > 0:
+        log.info(f"Cleaned up {deleted} old trades")
+
+
+def snapshot_options(context: CallbackContext) -> dict:
+    """
+    Снимок опционных цепочек Deribit (infrastructure.options_store): max pain, стены, GEX и скью
+    по всем экспирациям пишутся локально — кнопки опционов и графики внутри дня читают их без запроса к бирже.
+    """
+    log = logging.getLogger("alt_forecast.worker.options")
+    from .infrastructure.options_store import OPTIONS_SNAPSHOT_CCYS, get_options_store
+
+    telebot: TeleBot = context.application.bot_data["telebot"]
+    store = get_options_store(telebot.db)
+    out = {}
+    for ccy in OPTIONS_SNAPSHOT_CCYS:
+        try:
+            out[ccy] = len(store.snapshot(ccy))
+        except Exception:
+            log.exception("options snapshot %s failed", ccy)
+    store.retain()
+    return out
+
+
+def collect_derivatives(context: CallbackContext) -> dict:
+    """
+    Сбор деривативов (infrastructure.derivatives_store): funding/mark/базис одним запросом на рынок,
+    OI, CVD и ликвидации — ограниченным пулом по символам. Вселенная — топ сканера и символы правил funding из watchlist;
+    Market Doctor, сканер и алерты funding читают ряды из БД вместо живых запросов.
+    """
+    from .application.services.market_scanner_service import MarketScannerService
+    from .infrastructure.derivatives_store import DerivativesCollector, get_derivatives_store
+    from .usecases.watch_alerts import KIND_FUNDING, get_alert_engine
+
+    telebot: TeleBot = context.application.bot_data["telebot"]
+    top = list(MarketScannerService.DEFAULT_TOP_COINS)
+    symbols = top + sorted(get_alert_engine(telebot.db).symbols((KIND_FUNDING,)) - set(top))
+    store = get_derivatives_store(telebot.db)
+    collector = context.application.bot_data.setdefault("deriv_collector", DerivativesCollector(store))
+    out = collector.collect(symbols)
+    store.retain()
+    return out
+
+
+def collect_liquidations(context: CallbackContext) -> dict:
+    """
+    Журнал ликвидаций (infrastructure.liquidation_store): события Bybit и OKX пишутся локально,
+    /liqs и скользящие окна считают кластеры, HHI и скорость по накопленной истории.
+    """
+    log = logging.getLogger("alt_forecast.worker.liquidations")
+    from .infrastructure.liquidation_store import LIQ_LOG_SYMBOLS, get_liquidation_store
+
+    telebot: TeleBot = context.application.bot_data["telebot"]
+    store = get_liquidation_store(telebot.db)
+    out = {}
+    for sym in LIQ_LOG_SYMBOLS:
+        try:
+            out[sym] = store.collect(sym, hours=6, force=True)
+        except Exception:
+            log.exception("liquidation log %s failed", sym)
+    store.retain()
+    return out
+
+
+def evaluate_forecasts(context: CallbackContext) -> None:
     """
     Автоматически оценить качество старых прогнозов.
     Сравнивает предсказания с реальными результатами и обновляет метрики.
-    Запускается каждые 2 часа.
+    Запускается каждые 2 часа, в пуле потоков (kind=io).
     """
     log = logging.getLogger("alt_forecast.worker.forecast_evaluation")
     try:
@@ -199,59 +255,40 @@ async def evaluate_forecasts(context: CallbackContext) -> None:
         log.exception(f"Forecast evaluation failed: {e}")
 
 
-async def generate_quality_reports(context: CallbackContext) -> None:
+QUALITY_REPORT_CONFIGS = [("BTC", "1h", 24), ("BTC", "4h", 24), ("BTC", "1d", 24)]
+
+
+def quality_report_alerts(db_path: str) -> List[str]:
     """
-    Генерировать автоматические отчёты о качестве моделей.
-    Запускается раз в сутки.
+    Генерирует отчёты о качестве моделей и возвращает тексты тех, где есть алерты.
+    Выполняется в пуле процессов (kind=cpu): своё соединение с БД, на вход — только путь.
     """
     log = logging.getLogger("alt_forecast.worker.quality_reports")
-    try:
-        from .application.services.model_quality_reporter import ModelQualityReporter
-        
-        telebot = context.bot_data.get("telebot")
-        if not telebot or not hasattr(telebot, 'db'):
-            log.warning("Telebot or DB not available for quality reports")
-            return
-        
-        db = telebot.db
-        reporter = ModelQualityReporter(db)
-        
-        # Генерируем отчёты для основных конфигураций
-        configs = [
-            ("BTC", "1h", 24),
-            ("BTC", "4h", 24),
-            ("BTC", "1d", 24),
-        ]
-        
-        for symbol, timeframe, horizon in configs:
-            try:
-                report = reporter.generate_report(
-                    symbol=symbol,
-                    timeframe=timeframe,
-                    horizon=horizon,
-                    period_days=30
-                )
-                
-                if report and report.alerts:
-                    # Отправляем алерты админу
-                    admin_chat_id = os.getenv("ADMIN_CHAT_ID")
-                    if admin_chat_id:
-                        try:
-                            formatted = reporter.format_report(report)
-                            await context.bot.send_message(
-                                chat_id=int(admin_chat_id),
-                                text=formatted,
-                                parse_mode=ParseMode.HTML
-                            )
-                            log.info(f"Sent quality report alert for {symbol} {timeframe} H={horizon}")
-                        except Exception as e:
-                            log.exception(f"Failed to send quality report: {e}")
-            except Exception as e:
-                log.exception(f"Failed to generate report for {symbol} {timeframe} H={horizon}: {e}")
-        
-        log.info("Completed quality reports generation")
-    except Exception as e:
-        log.exception(f"Quality reports generation failed: {e}")
+    from .application.services.model_quality_reporter import ModelQualityReporter
+    from .infrastructure.db import DB
+
+    reporter = ModelQualityReporter(DB(db_path))
+    alerts: List[str] = []
+    for symbol, timeframe, horizon in QUALITY_REPORT_CONFIGS:
+        try:
+            report = reporter.generate_report(symbol=symbol, timeframe=timeframe, horizon=horizon, period_days=30)
+            if report and report.alerts:
+                alerts.append(reporter.format_report(report))
+        except Exception as e:
+            log.exception(f"Failed to generate report for {symbol} {timeframe} H={horizon}: {e}")
+    return alerts
+
+
+async def send_quality_alerts(context: CallbackContext, alerts: List[str]) -> None:
+    """Алерты качества моделей — админу (ADMIN_CHAT_ID), полоса alert очереди доставки."""
+    from .infrastructure.delivery import LANE_ALERT
+    log = logging.getLogger("alt_forecast.worker.quality_reports")
+    admin_chat_id = os.getenv("ADMIN_CHAT_ID")
+    if alerts and admin_chat_id:
+        telebot: TeleBot = context.application.bot_data["telebot"]
+        for formatted in alerts:
+            telebot.outbox.enqueue(int(admin_chat_id), lane=LANE_ALERT, text=formatted, parse_mode=ParseMode.HTML)
+    log.info("Completed quality reports generation: %d alerts", len(alerts or []))
 
 
 async def log_diagnostics_periodically(context: CallbackContext) -> None:
@@ -304,7 +341,8 @@ async def log_diagnostics_periodically(context: CallbackContext) -> None:
 async def hourly_top_setups(context: CallbackContext) -> None:
     """
     Ежечасное сканирование топ-сетапов Market Doctor.
-    Отправляет топ-10 сетапов подписчикам (если настроено).
+    Топ-сетапы из watchlist — тем, кто следит за тикером; фазы и pump/risk score всех
+    разобранных символов — в правила алертов watchlist (usecases.watch_alerts).
     """
     log = logging.getLogger("alt_forecast.worker.top_setups")
     try:
@@ -324,31 +362,47 @@ async def hourly_top_setups(context: CallbackContext) -> None:
         # Создаем сервис сканера
         scanner = MarketScannerService(db, DEFAULT_CONFIG)
         
-        # Сканируем рынок
+        # Сканируем рынок: топ-монеты + символы, на которые у пользователей есть правила фаз/скоров
+        from .usecases.watch_alerts import KIND_PHASE, KIND_PUMP, KIND_RISK, get_alert_engine
+        engine = get_alert_engine(db)
+        watched = engine.symbols((KIND_PHASE, KIND_PUMP, KIND_RISK))
+        symbols = list(scanner.DEFAULT_TOP_COINS) + sorted(watched - set(scanner.DEFAULT_TOP_COINS))
         timeframes = ["4h", "1d"]
         candidates = await scanner.scan_universe(
-            symbols=None,  # Используем DEFAULT_TOP_COINS
+            symbols=symbols,
             timeframes=timeframes,
             min_pump_score=0.7,
             max_risk_score=0.7,
             limit=10
         )
-        
+
+        # Фазы и pump/risk score всех разобранных символов → правила алертов watchlist
+        now_ms = int(time.time() * 1000)
+        alerts = []
+        for c in scanner.last_analyzed:
+            for tf, info in (c.timeframes or {}).items():
+                alerts += engine.on_diagnostics(c.symbol, tf, now_ms, phase=info.get("phase"),
+                                                pump_score=info.get("pump_score"), risk_score=info.get("risk_score"))
+        engine.deliver(alerts)
+
         if not candidates:
             log.info("No top setups found")
             return
-        
-        # Формируем отчет
-        report = scanner.format_top_setups_report(candidates, timeframes)
-        
-        # Отправляем отчет всем пользователям, которые подписаны на уведомления
-        # Пока отправляем только в лог, можно расширить для отправки подписчикам
+
         log.info(f"Top setups found: {len(candidates)}")
-        log.debug(f"Report:\n{report}")
-        
-        # TODO: Добавить отправку подписчикам через подписки
-        # Можно создать таблицу md_subscriptions для пользователей, которые хотят получать топ-сетапы
-        
+        log.debug(f"Report:\n{scanner.format_top_setups_report(candidates, timeframes)}")
+
+        # Тикер из watchlist попал в топ-сетапы — сообщаем тем, кто за ним следит
+        from .infrastructure.delivery import LANE_ALERT
+        lines_by_user = {}
+        for c in candidates:
+            line = f"• <b>{c.symbol}</b>: pump {c.avg_pump_score:.2f}, risk {c.avg_risk_score:.2f}, {c.consensus_phase}"
+            for uid in scanner.watchlist_repo.get_users_watching_symbol(c.symbol):
+                lines_by_user.setdefault(uid, []).append(line)
+        for uid, lines in lines_by_user.items():
+            telebot.outbox.enqueue(uid, lane=LANE_ALERT, parse_mode=ParseMode.HTML,
+                                   text="<b>Market Doctor: топ-сетапы из вашего watchlist</b>\n" + "\n".join(lines))
+
     except Exception as e:
         log.exception("hourly_top_setups: FAIL: %s", e)
 
@@ -369,10 +423,13 @@ async def hourly_bubbles(context: CallbackContext) -> None:
         if not chat_ids:
             return
 
-        # отсылаем «пузырь 1h» с реюзом метода бота (он сам использует кэш снапшота)
+        # отсылаем «пузырь 1h» с реюзом метода бота (он сам использует кэш снапшота);
+        # полоса broadcast — интерактивные ответы лимитер пропускает вперёд
+        from .infrastructure.delivery import LANE_BROADCAST, delivery_lane
         for uid in chat_ids:
             try:
-                await telebot._send_bubbles(chat_id=uid, context=context, tf="1h")
+                with delivery_lane(LANE_BROADCAST):
+                    await telebot._send_bubbles(chat_id=uid, context=context, tf="1h")
             except Exception:
                 log.exception("hourly_bubbles: send FAIL chat_id=%s", uid)
 
@@ -381,6 +438,68 @@ async def hourly_bubbles(context: CallbackContext) -> None:
         log.exception("hourly_bubbles: FAIL: %s", e)
 
 
+def refresh_market_state(context: CallbackContext) -> list:
+    """
+    Пересчёт материализованного состояния рынка (usecases.market_state) у ТФ с новыми барами.
+    Кнопки Risk Now / Альбом / Дивергенции и отчёты читают уже готовое состояние.
+    Пересчёт индикаторов — в пуле потоков (kind=io; store живёт в процессе бота), смены режима — notify_risk_changes.
+    """
+    from .usecases.market_state import get_market_state
+
+    telebot: TeleBot = context.application.bot_data["telebot"]
+    return get_market_state(telebot.db).refresh()
+
+
+def refresh_streaming_stats(context: CallbackContext) -> dict:
+    """
+    Дочитывание закрывшихся баров в потоковую статистику (usecases.streaming_stats):
+    корреляции, беты, волатильность и breadth в боте отвечают из неё без чтения истории.
+    """
+    from .usecases.streaming_stats import get_streaming_stats
+
+    telebot: TeleBot = context.application.bot_data["telebot"]
+    return get_streaming_stats(telebot.db).refresh()
+
+
+async def notify_risk_changes(context: CallbackContext, changes: list) -> None:
+    """Смены risk-режима уходят подписчикам при RISK_CHANGE_ALERTS=1 (полоса alert очереди доставки)."""
+    from .infrastructure.delivery import LANE_ALERT
+    if not changes or os.getenv("RISK_CHANGE_ALERTS", "0") != "1":
+        return
+    telebot: TeleBot = context.application.bot_data["telebot"]
+    text = "<b>Смена риск-режима</b>\n" + "\n".join("• " + ch.text() for ch in changes)
+    telebot.outbox.broadcast_html(telebot.db.list_subs(), text, lane=LANE_ALERT)
+
+
+def evaluate_watch_alerts(context: CallbackContext) -> dict:
+    """
+    Алерты watchlist (usecases.watch_alerts): новые закрытые бары и подтверждённые дивергенции
+    (funding и TWAP — реже) проверяются только против правил своих символов; срабатывания — в outbox.
+    """
+    from .usecases.watch_alerts import get_alert_engine
+
+    telebot: TeleBot = context.application.bot_data["telebot"]
+    engine = get_alert_engine(telebot.db)
+    alerts = engine.poll()
+    return {"alerts": len(alerts), "messages": engine.deliver(alerts)}
+
+
+def roll_up_bars(context: CallbackContext) -> dict:
+    """Производные 1h/4h/1d/1w из самого мелкого ТФ по мере закрытия баров (infrastructure.bar_rollup), kind=io."""
+    from .infrastructure.bar_rollup import get_bar_rollup
+
+    telebot: TeleBot = context.application.bot_data["telebot"]
+    return get_bar_rollup(telebot.db).run()
+
+
+def maintain_bars(context: CallbackContext) -> dict:
+    """Ярусный retention баров (BARS_RETENTION) и VACUUM при фрагментации — раз в сутки, kind=io."""
+    from .infrastructure.bar_rollup import get_bar_rollup
+
+    telebot: TeleBot = context.application.bot_data["telebot"]
+    return get_bar_rollup(telebot.db).maintain()
+
+
 # ---------- точка входа ----------
 
 def main():
@@ -391,6 +510,12 @@ def main():
         format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
     )
 
+    # Метрики: латентность исходящих HTTP (requests/aiohttp) и порт /metrics для Prometheus
+    install_http_instrumentation()
+    metrics_port = int(os.getenv("METRICS_PORT", "0") or 0)
+    if metrics_port:
+        start_metrics_server(metrics_port)
+
     # Поднимаем телеграм-бота
     bot = TeleBot()
 
@@ -398,29 +523,78 @@ def main():
     # (PTB хранит произвольные данные в application.bot_data)
     bot.app.bot_data["telebot"] = bot
 
-    # Планировщик PTB
+    # Пул рендера графиков поднимаем заранее (matplotlib/шрифты грузятся при старте, а не на первом /chart)
+    from .infrastructure.render_service import get_render_service
+    render = get_render_service(bot.db.path)
+    render.warm_up()
+    QUEUE_DEPTH.set_function(lambda: render.get_stats()["inflight"], queue="render")
+    REGISTRY.gauge("render_cache_hit_ratio", "PNG render cache hit ratio").set_function(
+        lambda: render.cache.get_stats()["hit_ratio"])
+
+    # Планировщик PTB через job_runtime: io/cpu-задачи уходят с event loop в пулы,
+    # повторный запуск поверх незавершённого пропускается, старт размазан jitter'ом,
+    # длительность/исход → alt_forecast_job_seconds / alt_forecast_job_runs_total{job, outcome}
     jq = bot.app.job_queue
+    jobs = get_job_runtime()
 
     # 1) Прогрев кэша CoinGecko — каждые 15 минут
-    jq.run_repeating(warm_market, interval=15 * 60, first=5)
+    jobs.schedule(jq, JobSpec("warm_market", warm_market, kind=KIND_IO, interval=15 * 60, first=5, max_runtime=120))
 
     # 2) Ежедневка — раз в час проверяем, чьё «окно»
-    jq.run_repeating(run_daily, interval=60 * 60, first=30)
+    jobs.schedule(jq, JobSpec("run_daily", run_daily, kind=KIND_IO, interval=60 * 60, first=30,
+                              max_runtime=300, on_result=send_daily_digest))
 
     # 3) Ежечасный «пузырь 1h» подписчикам
-    jq.run_repeating(hourly_bubbles, interval=60 * 60, first=60)
-    
+    jobs.schedule(jq, JobSpec("hourly_bubbles", hourly_bubbles, interval=60 * 60, first=60, max_runtime=600))
+
     # 4) Ежечасное сканирование топ-сетапов Market Doctor
-    jq.run_repeating(hourly_top_setups, interval=60 * 60, first=120)
-    
+    jobs.schedule(jq, JobSpec("hourly_top_setups", hourly_top_setups, interval=60 * 60, first=120, max_runtime=900))
+
     # 5) Периодическое логирование диагностик Market Doctor (каждые 30 минут)
-    jq.run_repeating(log_diagnostics_periodically, interval=30 * 60, first=180)
-    
-    # 6) Сбор сделок с бирж каждый час для кэширования в БД
-    jq.run_repeating(collect_trades, interval=60 * 60, first=300)  # Первый запуск через 5 минут
+    jobs.schedule(jq, JobSpec("log_diagnostics_periodically", log_diagnostics_periodically,
+                              interval=30 * 60, first=180, max_runtime=25 * 60))
+
+    # 6) Сбор сделок с бирж каждый час для кэширования в БД (первый запуск через 5 минут)
+    jobs.schedule(jq, JobSpec("collect_trades", collect_trades, kind=KIND_IO, interval=60 * 60, first=300, max_runtime=50 * 60))
+
+    # 7) Материализованное состояние рынка: пересчёт только при закрытии баров
+    refresh_sec = int(os.getenv("MARKET_STATE_REFRESH_SEC", "60"))
+    jobs.schedule(jq, JobSpec("refresh_market_state", refresh_market_state, kind=KIND_IO, interval=refresh_sec,
+                              first=15, jitter=min(JOB_JITTER_SEC, refresh_sec / 2), max_runtime=refresh_sec * 5,
+                              on_result=notify_risk_changes))
+    jobs.schedule(jq, JobSpec("refresh_streaming_stats", refresh_streaming_stats, kind=KIND_IO, interval=refresh_sec,
+                              first=20, jitter=min(JOB_JITTER_SEC, refresh_sec / 2), max_runtime=refresh_sec * 5))
+
+    # 8) Сворачивание баров в старшие ТФ и ярусный retention (ночью, вне часовых рассылок)
+    jobs.schedule(jq, JobSpec("roll_up_bars", roll_up_bars, kind=KIND_IO, interval=15 * 60, first=90, max_runtime=10 * 60))
+    jobs.schedule(jq, JobSpec("maintain_bars", maintain_bars, kind=KIND_IO,
+                              daily_at=dtime(hour=3, minute=30, tzinfo=timezone.utc), max_runtime=60 * 60))
+
+    # 9) Снимки опционных цепочек (max pain, стены, GEX, скью) для кнопок и внутридневных графиков
+    from .infrastructure.options_store import OPTIONS_SNAPSHOT_SEC
+    jobs.schedule(jq, JobSpec("snapshot_options", snapshot_options, kind=KIND_IO, interval=OPTIONS_SNAPSHOT_SEC,
+                              first=45, max_runtime=OPTIONS_SNAPSHOT_SEC))
+
+    # 10) Алерты watchlist по закрытию бара (цена, фазы, скоры, дивергенции, funding, TWAP)
+    from .usecases.watch_alerts import WATCH_ALERTS_POLL_SEC
+    jobs.schedule(jq, JobSpec("evaluate_watch_alerts", evaluate_watch_alerts, kind=KIND_IO,
+                              interval=WATCH_ALERTS_POLL_SEC, first=25, max_runtime=WATCH_ALERTS_POLL_SEC * 10))
+
+    # 11) Временные ряды деривативов (funding, базис, OI, CVD, ликвидации) для Market Doctor, сканера и алертов
+    from .infrastructure.derivatives_store import DERIV_COLLECT_SEC
+    jobs.schedule(jq, JobSpec("collect_derivatives", collect_derivatives, kind=KIND_IO, interval=DERIV_COLLECT_SEC,
+                              first=35, max_runtime=DERIV_COLLECT_SEC * 2))
+
+    # 12) Журнал ликвидаций по биржам для карты /liqs и скользящих окон
+    from .infrastructure.liquidation_store import LIQ_COLLECT_SEC
+    jobs.schedule(jq, JobSpec("collect_liquidations", collect_liquidations, kind=KIND_IO, interval=LIQ_COLLECT_SEC,
+                              first=55, max_runtime=LIQ_COLLECT_SEC))
 
     # Запуск long-polling
-    bot.run()
+    try:
+        bot.run()
+    finally:
+        jobs.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,409 @@
+# app/ml/batch_forecaster.py
+"""
+Батч-инференс прогнозов по списку символов (/forecast_alts и т.п.).
+
+Вместо цикла forecast_symbol() по одной монете внутри async-хендлера:
+- бары всех символов читаются за один проход (data_adapter.load_bars_many);
+- символы группируются по файлу модели («семейству»): на группу — одна матрица признаков
+  (строка = символ) и один векторный predict/predict_proba (model.infer_many);
+- группы разлетаются по пулу процессов, результаты отдаются по мере готовности (stream);
+- символы без обученной модели попадают в отчёт со статусом no_model — обучение inline
+  больше не запускается (обучать — model.train_models / forecaster.train_symbol).
+
+Общая модель на несколько символов: ML_BATCH_FAMILY_MODEL=ALTS → для символов без своей
+модели используется ALTS_{tf}_h{horizon}.pkl, и вся группа считается одним predict.
+
+    bf = get_batch_forecaster()
+    async for item in bf.stream(["ETH", "SOL", "XRP"], "1h", 24):
+        print(item.symbol, item.status, item.result)
+
+    # сравнение с последовательным циклом forecast_symbol()
+    python -m app.ml.batch_forecaster --bench ETH SOL XRP ...
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger("alt_forecast.ml.batch")
+
+# 0 воркеров = инференс в потоке без пула (тесты/dev)
+ML_BATCH_WORKERS = int(os.getenv("ML_BATCH_WORKERS", "2"))
+ML_BATCH_FAMILY_MODEL = os.getenv("ML_BATCH_FAMILY_MODEL", "").strip().upper()
+ML_BATCH_BARS_LIMIT = int(os.getenv("ML_BATCH_BARS_LIMIT", "5000"))
+
+BASE_COLS = ["open", "high", "low", "close", "volume"]
+
+STATUS_OK = "ok"
+STATUS_NO_MODEL = "no_model"
+STATUS_NO_DATA = "no_data"
+STATUS_ERROR = "error"
+
+
+@dataclass
+class BatchItem:
+    """Результат по одному символу (result — как у forecast_symbol)."""
+    symbol: str
+    status: str
+    result: Optional[Dict[str, Any]] = None
+    error: str = ""
+
+
+@dataclass
+class BatchReport:
+    tf: str
+    horizon: int
+    items: List[BatchItem] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def by_status(self, status: str) -> List[BatchItem]:
+        return [it for it in self.items if it.status == status]
+
+    @property
+    def ok(self) -> List[BatchItem]:
+        return self.by_status(STATUS_OK)
+
+    @property
+    def missing_models(self) -> List[str]:
+        return [it.symbol for it in self.by_status(STATUS_NO_MODEL)]
+
+
+# ---------- воркер (уровень модуля — для пикла в пул процессов) ----------
+
+_model_cache: Dict[str, Tuple[float, Any]] = {}
+
+
+def _load_model_cached(path: str):
+    """Модель в памяти процесса, пока файл не переписан (mtime)."""
+    mtime = os.path.getmtime(path)
+    hit = _model_cache.get(path)
+    if hit is not None and hit[0] == mtime:
+        return hit[1]
+    with open(path, "rb") as f:
+        obj = pickle.load(f)
+    _model_cache[path] = (mtime, obj)
+    return obj
+
+
+def _forecast_group(path: str, frames: Dict[str, pd.DataFrame], tf: str, horizon: int) -> List[BatchItem]:
+    """Признаки по каждому символу → одна матрица → один predict на всю группу."""
+    from .features import build_features
+    from .forecaster import last_price_and_ema, residual_to_return
+    from .model import infer_many
+
+    model = _load_model_cached(path)
+    feature_names = list((model.get("meta") or {}).get("features") or [])
+
+    items: List[BatchItem] = []
+    rows, prices, emas, symbols = [], [], [], []
+    for sym, df in frames.items():
+        try:
+            feats = build_features(df)
+            X = feats.drop(columns=BASE_COLS, errors="ignore")
+            if feature_names:
+                X = X.reindex(columns=feature_names, fill_value=0.0)
+            rows.append(X.iloc[-1].to_numpy(dtype=float))
+            price, ma = last_price_and_ema(feats)
+            prices.append(price)
+            emas.append(ma)
+            symbols.append(sym)
+        except Exception as e:
+            items.append(BatchItem(sym, STATUS_ERROR, error=f"{type(e).__name__}: {e}"))
+
+    if not rows:
+        return items
+    try:
+        y_hat, p_up = infer_many(model, np.vstack(rows))
+        ret = residual_to_return(y_hat, np.asarray(prices), np.asarray(emas))
+    except Exception as e:
+        return items + [BatchItem(s, STATUS_ERROR, error=f"{type(e).__name__}: {e}") for s in symbols]
+
+    for i, sym in enumerate(symbols):
+        items.append(BatchItem(sym, STATUS_OK, result={
+            "symbol": sym.upper(),
+            "tf": tf,
+            "horizon": horizon,
+            "ret_pred": float(ret[i]),
+            "p_up": float(p_up[i]),
+            "meta": model.get("meta"),
+        }))
+    return items
+
+
+# ---------- движок ----------
+
+def _norm_symbols(symbols: Iterable[str]) -> List[str]:
+    """BTC → BTCUSDT и т.п. (как data_adapter), без дублей, порядок сохраняется."""
+    from .data_adapter import _symbol_norm
+    return list(dict.fromkeys(_symbol_norm(s) for s in symbols))
+
+
+def _default_loader_many(symbols: List[str], tf: str, limit: int) -> Dict[str, pd.DataFrame]:
+    from .data_adapter import load_bars_many
+    return load_bars_many(symbols, tf, limit=limit)
+
+
+class BatchForecaster:
+    """
+    Батч-прогноз по списку символов.
+
+    loader_many(symbols, tf, limit) -> {symbol: DataFrame}; по умолчанию data_adapter.load_bars_many.
+    models_dir — каталог моделей (по умолчанию model.MODELS_DIR).
+    """
+
+    def __init__(
+        self,
+        loader_many: Optional[Callable[[List[str], str, int], Dict[str, pd.DataFrame]]] = None,
+        models_dir: Optional[Path] = None,
+        max_workers: int = ML_BATCH_WORKERS,
+        family_model: str = ML_BATCH_FAMILY_MODEL,
+        bars_limit: int = ML_BATCH_BARS_LIMIT,
+    ):
+        self.loader_many = loader_many or _default_loader_many
+        self._models_dir = Path(models_dir) if models_dir else None
+        self.max_workers = max(0, int(max_workers))
+        self.family_model = (family_model or "").upper()
+        self.bars_limit = bars_limit
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def models_dir(self) -> Path:
+        if self._models_dir is None:
+            from .model import MODELS_DIR
+            self._models_dir = MODELS_DIR
+        return self._models_dir
+
+    # --- пул ---
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.max_workers <= 0:
+            return None
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn: процесс бота многопоточный, fork небезопасен (как в render_service)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+                log.info("batch forecast pool started: workers=%d", self.max_workers)
+            return self._pool
+
+    def shutdown(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    # --- план ---
+
+    def _model_file(self, name: str, tf: str, horizon: int) -> Path:
+        return self.models_dir / f"{name.upper()}_{tf}_h{horizon}.pkl"
+
+    def plan(self, symbols: Iterable[str], tf: str, horizon: int) -> Tuple[Dict[str, List[str]], List[str]]:
+        """
+        Группы {путь модели: [символы]} и список символов без модели.
+        Своя модель символа приоритетнее общей (family_model).
+        """
+        groups: Dict[str, List[str]] = {}
+        missing: List[str] = []
+        family = self._model_file(self.family_model, tf, horizon) if self.family_model else None
+        for sym in _norm_symbols(symbols):
+            own = self._model_file(sym, tf, horizon)
+            if own.exists():
+                groups.setdefault(str(own), []).append(sym)
+            elif family is not None and family.exists():
+                groups.setdefault(str(family), []).append(sym)
+            else:
+                missing.append(sym)
+        return groups, missing
+
+    # --- выполнение ---
+
+    async def stream(self, symbols: Iterable[str], tf: str, horizon: int = 24) -> AsyncIterator[BatchItem]:
+        """Результаты по мере готовности групп; no_model/no_data отдаются сразу."""
+        loop = asyncio.get_running_loop()
+        groups, missing = self.plan(symbols, tf, horizon)
+        for sym in missing:
+            yield BatchItem(sym, STATUS_NO_MODEL, error="модель не обучена")
+        if not groups:
+            return
+
+        wanted = [s for syms in groups.values() for s in syms]
+        frames = await loop.run_in_executor(None, self.loader_many, wanted, tf, self.bars_limit)
+        frames = {str(k).upper(): v for k, v in (frames or {}).items()}
+
+        pool = self._get_pool()
+        tasks = []
+        for path, syms in groups.items():
+            have = {s: frames[s] for s in syms if s in frames and frames[s] is not None and not frames[s].empty}
+            for s in syms:
+                if s not in have:
+                    yield BatchItem(s, STATUS_NO_DATA, error="нет баров")
+            if have:
+                tasks.append(self._submit(loop, pool, path, have, tf, horizon))
+
+        for fut in asyncio.as_completed(tasks):
+            for item in await fut:
+                yield item
+
+    async def _submit(self, loop, pool, path: str, frames: Dict[str, pd.DataFrame],
+                      tf: str, horizon: int) -> List[BatchItem]:
+        try:
+            if pool is None:
+                return await loop.run_in_executor(None, _forecast_group, path, frames, tf, horizon)
+            try:
+                return await loop.run_in_executor(pool, _forecast_group, path, frames, tf, horizon)
+            except BrokenProcessPool:
+                log.warning("batch forecast pool is broken, restarting and running inline")
+                self.shutdown()
+                return await loop.run_in_executor(None, _forecast_group, path, frames, tf, horizon)
+        except Exception as e:
+            log.exception("batch forecast group failed: %s", path)
+            return [BatchItem(s, STATUS_ERROR, error=f"{type(e).__name__}: {e}") for s in frames]
+
+    async def run(self, symbols: Iterable[str], tf: str, horizon: int = 24) -> BatchReport:
+        """Весь батч целиком; items — в порядке входного списка."""
+        symbols = _norm_symbols(symbols)
+        started = time.perf_counter()
+        got: Dict[str, BatchItem] = {}
+        first: Optional[float] = None
+        async for item in self.stream(symbols, tf, horizon):
+            if first is None and item.status == STATUS_OK:
+                first = time.perf_counter() - started
+            got[item.symbol] = item
+        total = time.perf_counter() - started
+        items = [got.get(s) or BatchItem(s, STATUS_ERROR, error="нет результата") for s in symbols]
+        return BatchReport(tf, horizon, items, {"total_sec": total, "first_result_sec": first or total})
+
+
+def format_item(item: BatchItem) -> str:
+    """Строка для Telegram (HTML) по одному символу."""
+    if item.status == STATUS_OK:
+        return f"{item.symbol}: {item.result['ret_pred'] * 100:+.2f}% · P(up)={item.result['p_up']:.2f}"
+    if item.status == STATUS_NO_MODEL:
+        return f"{item.symbol}: нет модели"
+    if item.status == STATUS_NO_DATA:
+        return f"{item.symbol}: нет данных"
+    return f"{item.symbol}: ошибка {item.error.split(':', 1)[0]}"
+
+
+async def stream_to_message(message, title: str, symbols: List[str], tf: str, horizon: int,
+                            forecaster: Optional["BatchForecaster"] = None, min_edit_sec: float = 1.5) -> None:
+    """
+    Отправляет заголовок и дописывает строки по мере готовности (edit_text не чаще min_edit_sec).
+    Итоговый текст — в порядке входного списка, символы без модели — отдельной строкой.
+    """
+    from telegram.constants import ParseMode
+
+    bf = forecaster or get_batch_forecaster()
+    symbols = _norm_symbols(symbols)
+    head = f"<b>{title}</b>  ({tf}, +{horizon} бар)"
+    msg = await message.reply_text(head + "\n⏳ считаю…", parse_mode=ParseMode.HTML)
+
+    got: Dict[str, BatchItem] = {}
+    last_edit = time.monotonic()
+    async for item in bf.stream(symbols, tf, horizon):
+        got[item.symbol] = item
+        if item.status == STATUS_OK and time.monotonic() - last_edit >= min_edit_sec:
+            lines = [format_item(got[s]) for s in symbols if s in got and got[s].status == STATUS_OK]
+            try:
+                await msg.edit_text("\n".join([head, *lines, f"⏳ {len(got)}/{len(symbols)}"]), parse_mode=ParseMode.HTML)
+            except Exception:
+                log.debug("forecast batch: progress edit failed", exc_info=True)
+            last_edit = time.monotonic()
+
+    lines = [format_item(got[s]) for s in symbols if s in got and got[s].status != STATUS_NO_MODEL]
+    missing = [s for s in symbols if s in got and got[s].status == STATUS_NO_MODEL]
+    if missing:
+        lines.append("<i>без модели: " + ", ".join(missing) + "</i>")
+    await msg.edit_text("\n".join([head, *(lines or ["—"])]), parse_mode=ParseMode.HTML,
+                        disable_web_page_preview=True)
+
+
+# ---------- бенчмарк против последовательного цикла ----------
+
+def bench(symbols: List[str], tf: str = "1h", horizon: int = 24, repeat: int = 1,
+          forecaster: Optional[BatchForecaster] = None) -> Dict[str, Any]:
+    """
+    Латентность батча против прежнего цикла forecast_symbol() по тем же символам
+    (только символы с моделью — цикл иначе начал бы обучать).
+    """
+    from .data_adapter import make_loader
+    from .forecaster import forecast_symbol
+
+    bf = forecaster or get_batch_forecaster()
+    symbols = _norm_symbols(symbols)
+    groups, missing = bf.plan(symbols, tf, horizon)
+    with_model = [s for syms in groups.values() for s in syms]
+    loader = make_loader()
+
+    def _loop():
+        for s in with_model:
+            try:
+                forecast_symbol(loader, s, tf, horizon=horizon)
+            except Exception:
+                pass
+
+    loop_times, batch_times = [], []
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        _loop()
+        loop_times.append(time.perf_counter() - t0)
+        report = asyncio.run(bf.run(with_model, tf, horizon))
+        batch_times.append(report.timings["total_sec"])
+
+    loop_sec, batch_sec = min(loop_times), min(batch_times)
+    return {
+        "symbols": len(symbols), "with_model": len(with_model), "missing_models": missing,
+        "groups": len(groups), "workers": bf.max_workers,
+        "loop_sec": loop_sec, "batch_sec": batch_sec,
+        "speedup": (loop_sec / batch_sec) if batch_sec > 0 else 0.0,
+    }
+
+
+_global_forecaster: Optional[BatchForecaster] = None
+
+
+def get_batch_forecaster() -> BatchForecaster:
+    """Глобальный BatchForecaster (пул процессов поднимается при первом батче)."""
+    global _global_forecaster
+    if _global_forecaster is None:
+        _global_forecaster = BatchForecaster()
+    return _global_forecaster
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    ap = argparse.ArgumentParser(description="Batch forecast / benchmark против цикла forecast_symbol")
+    ap.add_argument("symbols", nargs="+")
+    ap.add_argument("--tf", default="1h")
+    ap.add_argument("--horizon", type=int, default=24)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--bench", action="store_true", help="сравнить с последовательным циклом")
+    args = ap.parse_args()
+
+    if args.bench:
+        print(json.dumps(bench(args.symbols, args.tf, args.horizon, args.repeat), indent=2, ensure_ascii=False))
+    else:
+        rep = asyncio.run(get_batch_forecaster().run(args.symbols, args.tf, args.horizon))
+        for it in rep.items:
+            if it.status == STATUS_OK:
+                print(f"{it.symbol}: {it.result['ret_pred'] * 100:+.2f}% · P(up)={it.result['p_up']:.2f}")
+            else:
+                print(f"{it.symbol}: {it.status} {it.error}")
+        print(json.dumps(rep.timings))
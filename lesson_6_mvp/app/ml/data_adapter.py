@@ -11,6 +11,7 @@ import pandas as pd
 
 __all__ = [
     "load_bars_from_project",
+    "load_bars_many",
     "make_loader",
 ]
 
@@ -231,6 +232,54 @@ def _load_from_sqlite(db_path: Path, symbol: str, tf: str, limit: int) -> Option
         con.close()
 
 
+def _load_many_from_sqlite(db_path: Path, symbols: list[str], tf: str, limit: int) -> dict[str, pd.DataFrame]:
+    """
+    Бары сразу для набора символов одним запросом: последние `limit` баров на символ
+    (ROW_NUMBER по символу). Таблицы без колонки символа здесь не подходят — пусто.
+    """
+    con = sqlite3.connect(str(db_path))
+    try:
+        guessed = _sqlite_guess_table(con)
+        if not guessed:
+            return {}
+        table, _ = guessed
+
+        cur = con.cursor()
+        cols = [r[1].lower() for r in cur.execute(f"PRAGMA table_info({table})").fetchall()]
+        sym_cols = [c for c in ("symbol", "ticker", "pair") if c in cols]
+        if not sym_cols:
+            return {}
+        tf_cols = [c for c in ("tf", "interval", "timeframe") if c in cols]
+        base_cols = [c for c in ("ts", "open", "high", "low", "close", "volume") if c in cols]
+        key = sym_cols[0]
+
+        marks = ",".join("?" * len(symbols))
+        where = ["(" + " OR ".join(f"{c} IN ({marks})" for c in sym_cols) + ")"]
+        args: list = [s for _ in sym_cols for s in symbols]
+        if tf_cols:
+            aliases = _tf_aliases(tf)
+            where.append("(" + " OR ".join(f"{c} IN ({','.join('?' * len(aliases))})" for c in tf_cols) + ")")
+            args += [a for _ in tf_cols for a in aliases]
+        args.append(int(limit if limit else 5000))
+
+        sql = (
+            f"SELECT {', '.join(base_cols)}, {key} AS _sym FROM ("
+            f"  SELECT *, ROW_NUMBER() OVER (PARTITION BY {key} ORDER BY ts DESC) AS _rn"
+            f"  FROM {table} WHERE {' AND '.join(where)}"
+            f") WHERE _rn <= ?"
+        )
+        df = pd.read_sql_query(sql, con, params=args)
+        out: dict[str, pd.DataFrame] = {}
+        for sym, part in df.groupby("_sym", sort=False):
+            try:
+                out[str(sym).upper()] = _normalize_df(part.drop(columns=["_sym"]), limit)
+            except ValueError:
+                continue
+        return out
+    finally:
+        con.close()
+
+
 # =========================
 # Files (Parquet/CSV)
 # =========================
@@ -395,6 +444,39 @@ def load_bars_from_project(symbol: str, tf: str, limit: int = 5000) -> pd.DataFr
     )
 
 
+def load_bars_many(symbols: Iterable[str], tf: str, limit: int = 5000) -> dict[str, pd.DataFrame]:
+    """
+    Бары для списка символов за один проход по источникам: каждая SQLite-база читается
+    одним запросом на весь список, оставшиеся символы — поштучно через load_bars_from_project
+    (файлы / TradingView). Символы без данных в результат не попадают.
+
+    Returns: {нормализованный символ: DataFrame ['ts','open','high','low','close','volume']}
+    """
+    syms = list(dict.fromkeys(_symbol_norm(s) for s in symbols))
+    tf = _tf_to_str(tf)
+    out: dict[str, pd.DataFrame] = {}
+
+    for p in _sqlite_paths():
+        todo = [s for s in syms if s not in out]
+        if not todo:
+            break
+        try:
+            for sym, df in _load_many_from_sqlite(p, todo, tf, limit).items():
+                if sym in todo and not df.empty:
+                    out[sym] = df
+        except Exception:
+            continue
+
+    for sym in syms:
+        if sym in out:
+            continue
+        try:
+            out[sym] = load_bars_from_project(sym, tf, limit=limit)
+        except Exception:
+            continue
+    return out
+
+
 def make_loader(db: object | None = None) -> Callable[[str, str, int], pd.DataFrame]:
     """
     Factory that returns a loader(signature: (symbol, tf, limit) -> DataFrame).
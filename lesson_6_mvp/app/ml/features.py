@@ -31,7 +31,7 @@ def advanced_preprocessing(df: pd.DataFrame) -> pd.DataFrame:
     ohlcv_cols = ['open', 'high', 'low', 'close', 'volume']
     for col in ohlcv_cols:
         if col in df_clean.columns:
-            df_clean[col] = df_clean[col].fillna(method='ffill').fillna(method='bfill')
+            df_clean[col] = df_clean[col].ffill().bfill()
     
     # 2. Обработка выбросов (IQR метод для цен) - мягкое ограничение
     for col in ['open', 'high', 'low', 'close']:
@@ -51,7 +51,7 @@ def advanced_preprocessing(df: pd.DataFrame) -> pd.DataFrame:
     # 4. Обработка нулевых/отрицательных объемов
     if 'volume' in df_clean.columns:
         df_clean['volume'] = df_clean['volume'].replace(0, np.nan)
-        df_clean['volume'] = df_clean['volume'].fillna(method='ffill').fillna(method='bfill')
+        df_clean['volume'] = df_clean['volume'].ffill().bfill()
         df_clean['volume'] = df_clean['volume'].clip(lower=0.1)
     
     return df_clean
@@ -206,7 +206,7 @@ def build_features(df: pd.DataFrame, use_selected_features: bool = True) -> pd.D
                     keep_cols = ['open', 'high', 'low', 'close', 'volume'] + available_selected
                     keep_cols = [c for c in keep_cols if c in df_feat.columns]
                     df_feat = df_feat[keep_cols]
-    except Exception:
+            except Exception:
                 # Если не удалось загрузить, используем все признаки
                 pass
     
@@ -4,6 +4,22 @@ import numpy as np
 from .features import build_features
 from .model import train_models, load_model, infer
 
+def last_price_and_ema(feats: pd.DataFrame):
+    """Последняя цена и EMA48 (база таргета log_residual_from_ema) для конвертации прогноза."""
+    close = feats['close']
+    ma = close.ewm(span=48, adjust=False, min_periods=48).mean().iloc[-1]
+    return float(close.iloc[-1]), float(ma)
+
+def residual_to_return(y_hat, current_price, ma):
+    """
+    Конвертация log-отклонения от EMA в доходность (скаляры или np.ndarray по символам).
+    y_hat = log(P_{t+H}) - log(MA(t))  →  P_{t+H} = MA(t) * exp(y_hat)
+    ret_pred = (P_{t+H} - P_t) / P_t
+    (если MA ≈ текущей цене, это ≈ exp(y_hat) - 1)
+    """
+    predicted_price = ma * np.exp(y_hat)
+    return (predicted_price - current_price) / current_price
+
 def train_symbol(loader_fn, symbol: str, tf: str, horizon: int = 24):
     """
     loader_fn(symbol, tf) -> DataFrame[ts, open, high, low, close, volume]
@@ -26,22 +42,8 @@ def forecast_symbol(loader_fn, symbol: str, tf: str, horizon: int = 24):
     X = feats.drop(columns=['open','high','low','close','volume'], errors='ignore')
     x_row = X.iloc[-1].values
     y_hat, p_up = infer(model, x_row)
-    
-    # Конвертация log-отклонения от EMA в доходность
-    # y_hat = log(P_{t+H}) - log(MA(t))
-    # Для получения доходности относительно текущей цены:
-    # P_{t+H} = MA(t) * exp(y_hat)
-    # ret_pred = (P_{t+H} - P_t) / P_t
-    current_price = feats['close'].iloc[-1]
-    # EMA48 для текущего момента
-    ma = feats['close'].ewm(span=48, adjust=False, min_periods=48).mean().iloc[-1]
-    # Предсказанная цена через horizon
-    predicted_price = ma * np.exp(y_hat)
-    # Доходность
-    ret_pred = (predicted_price - current_price) / current_price
-    
-    # Альтернативный упрощенный вариант (если MA ≈ current_price):
-    # ret_pred = np.exp(y_hat) - 1
+    current_price, ma = last_price_and_ema(feats)
+    ret_pred = residual_to_return(y_hat, current_price, ma)
     
     return {
         "symbol": symbol.upper(),
@@ -16,12 +16,18 @@ try:
 except Exception:
     _HAS_LGBM = False
 
-from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier
-from sklearn.metrics import mean_absolute_error, roc_auc_score
-
-MODELS_DIR = Path("/app/data/models")
+# Путь к моделям: /app/data/models в контейнере, иначе локальный data/models (как в catboost_forecaster)
+if Path("/app").exists() and os.access("/app", os.W_OK):
+    MODELS_DIR = Path("/app/data/models")
+else:
+    MODELS_DIR = Path(__file__).parent.parent.parent / "data" / "models"
 MODELS_DIR.mkdir(parents=True, exist_ok=True)
 
+
+def model_path(symbol: str, tf: str, horizon: int = 24) -> Path:
+    """Файл модели symbol/tf/horizon (формат имени общий для train/load и батч-инференса)."""
+    return MODELS_DIR / f"{symbol.upper()}_{tf}_h{horizon}.pkl"
+
 def _make_regressor():
     """Создает регрессор с оптимизированными параметрами из lesson_05"""
     if _HAS_CATBOOST:
@@ -42,6 +48,7 @@ def _make_regressor():
             n_estimators=600, learning_rate=0.03, max_depth=-1,
             subsample=0.9, colsample_bytree=0.9, random_state=42
         )
+    from sklearn.ensemble import RandomForestRegressor
     return RandomForestRegressor(n_estimators=400, random_state=42, n_jobs=-1)
 
 def _make_classifier():
@@ -64,6 +71,7 @@ def _make_classifier():
             n_estimators=600, learning_rate=0.03, max_depth=-1,
             subsample=0.9, colsample_bytree=0.9, random_state=42
         )
+    from sklearn.ensemble import RandomForestClassifier
     return RandomForestClassifier(n_estimators=500, random_state=42, n_jobs=-1)
 
 def _walk_forward_splits(n: int, train_size: int, step: int):
@@ -102,6 +110,8 @@ def train_models(symbol: str, tf: str, df_feat: pd.DataFrame, horizon: int = 24)
     df_feat: выход build_features(); индекс = ts
     horizon: сколько баров вперёд предсказываем (для 5m → 48 = 4 часа)
     """
+    from sklearn.metrics import mean_absolute_error, roc_auc_score
+
     X = df_feat.copy()
     
     # Используем новый таргет: log-отклонение от EMA-тренда
@@ -164,13 +174,13 @@ def train_models(symbol: str, tf: str, df_feat: pd.DataFrame, horizon: int = 24)
 
     # Сохраняем
     obj = {"reg": reg_f, "cls": cls_f, "meta": meta}
-    path = MODELS_DIR / f"{symbol.upper()}_{tf}_h{horizon}.pkl"
+    path = model_path(symbol, tf, horizon)
     with open(path, "wb") as f:
         pickle.dump(obj, f)
     return path, meta
 
 def load_model(symbol: str, tf: str, horizon: int = 24):
-    path = MODELS_DIR / f"{symbol.upper()}_{tf}_h{horizon}.pkl"
+    path = model_path(symbol, tf, horizon)
     if not path.exists():
         return None
     with open(path, "rb") as f:
@@ -184,8 +194,21 @@ def infer(model_obj, x_row: np.ndarray):
         y_hat: log-отклонение от EMA-тренда (для конвертации в доходность нужно exp(y_hat) - 1)
         p_up: вероятность роста
     """
-    reg = model_obj["reg"]
-    cls = model_obj["cls"]
-    y_hat = float(reg.predict(x_row.reshape(1,-1))[0])
-    p_up = float(getattr(cls, "predict_proba")(x_row.reshape(1,-1))[0,1])
+    y_hat, p_up = infer_many(model_obj, x_row.reshape(1, -1))
+    return float(y_hat[0]), float(p_up[0])
+
+def infer_many(model_obj, X: np.ndarray):
+    """
+    Векторное предсказание для матрицы признаков (строка = символ/момент).
+    Один вызов predict/predict_proba на всю матрицу вместо цикла по строкам.
+
+    Returns:
+        y_hat: np.ndarray log-отклонений от EMA-тренда
+        p_up: np.ndarray вероятностей роста
+    """
+    X = np.asarray(X, dtype=float)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    y_hat = np.asarray(model_obj["reg"].predict(X), dtype=float).reshape(-1)
+    p_up = np.asarray(getattr(model_obj["cls"], "predict_proba")(X), dtype=float)[:, 1]
     return y_hat, p_up
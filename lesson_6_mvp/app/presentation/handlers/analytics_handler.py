@@ -8,6 +8,7 @@ from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 from .base_handler import BaseHandler
 from ...infrastructure.ui_keyboards import DEFAULT_TF, build_kb
+import asyncio
 import logging
 import time
 
@@ -155,8 +156,11 @@ class AnalyticsHandler(BaseHandler):
             if len(parts) > 1:
                 strat = parts[1].lower()
             
+            if strat == "sweep":
+                await self._send_bt_sweep(update.effective_chat.id, parts[2:], context)
+                return
             if strat.lower() != "rsi":
-                await update.effective_message.reply_text("Сейчас доступно: /bt rsi SYMBOL [tf]")
+                await update.effective_message.reply_text("Сейчас доступно: /bt rsi SYMBOL [tf], /bt sweep [rsi|ema|macd] [SYMBOLS] [TFS]")
                 return
             
             chat_id = update.effective_chat.id
@@ -235,10 +239,11 @@ class AnalyticsHandler(BaseHandler):
         """Отправить данные по ликвидациям с картой ликвидаций."""
         try:
             from ...infrastructure.free_market_data import (
-                get_liquidation_levels_aggregated,
-                aggregate_liquidation_levels,
-                estimate_liquidation_levels_from_positions
+                LIQ_MIN_USD,
+                estimate_liquidation_levels_from_positions,
+                liquidation_levels,
             )
+            from ...infrastructure.liquidation_store import get_liquidation_store
             from ...visual.liquidation_map import render_liquidation_map, analyze_liquidation_zones
             from telegram import InputFile
             
@@ -257,9 +262,12 @@ class AnalyticsHandler(BaseHandler):
                 except Exception:
                     pass
             
-            # Получаем уровни ликвидации с нескольких бирж и агрегируем
-            levels_by_exchange = get_liquidation_levels_aggregated(base, exchanges=["bybit", "okx"], hours=48)
-            levels = aggregate_liquidation_levels(levels_by_exchange)
+            # Ликвидации Bybit + OKX пишутся в локальный журнал; кластеры и метрики — одним проходом по окну
+            # (сбор ходит на биржи — вне event loop; чаще LIQ_COLLECT_MIN_SEC не повторяется)
+            store = get_liquidation_store(self.db)
+            await asyncio.to_thread(store.collect, base, hours=48)
+            stats = store.analyze(base, hours=48, ref_price=current_price, min_usd=LIQ_MIN_USD)
+            levels = liquidation_levels(stats)
             
             # Если данных все еще мало, добавляем оценку на основе позиций
             if len(levels) < 5 and current_price:
@@ -291,6 +299,12 @@ class AnalyticsHandler(BaseHandler):
                 
                 # Создаем текстовое описание
                 description = analyze_liquidation_zones(levels, current_price)
+                if stats.count:
+                    ratio = "∞" if stats.long_short_ratio == float("inf") else f"{stats.long_short_ratio:.2f}"
+                    metrics = (f"\n\nКонцентрация (HHI): {stats.hhi:.2f} · "
+                               f"${stats.velocity_usd_h:,.0f}/ч · L/S {ratio}").replace(",", " ")
+                    if len(description) + len(metrics) <= 1024:
+                        description += metrics
                 
                 # Отправляем график с описанием
                 photo = InputFile(png, filename=f"liquidation_map_{base}.png")
@@ -434,10 +448,8 @@ class AnalyticsHandler(BaseHandler):
             
             res = backtest_rsi(self.db, symbol, tf)
             text = (f"*BT rsi {symbol} {tf}*\n"
-                   f"Win rate: {res.get('win_rate', 0):.2%}\n"
-                   f"Total trades: {res.get('total_trades', 0)}\n"
-                   f"Avg return: {res.get('avg_return', 0):.2%}\n"
-                   f"Sharpe: {res.get('sharpe', 0):.2f}\n\n"
+                   f"Trades: {res.trades}\nWinrate: {res.winrate:.1f}%\n"
+                   f"Total: {res.total_ret:.2f}%\nSharpe~: {res.sharpe:.2f}\n\n"
                    "_Зачем_: быстрая прикидка работоспособности простого правила входа/выхода (не финсовет).")
             await context.bot.send_message(
                 chat_id=chat_id,
@@ -447,6 +459,25 @@ class AnalyticsHandler(BaseHandler):
         except Exception:
             logger.exception("_send_bt_rsi failed")
     
+    async def _send_bt_sweep(self, chat_id: int, args, context: ContextTypes.DEFAULT_TYPE):
+        """Перебор параметров стратегии и рейтинг комбинаций."""
+        try:
+            import asyncio
+            from ...usecases.backtest import format_table, get_backtester, parse_sweep_args
+            from ...usecases.generate_report import METRICS
+
+            strategy, metrics, tfs = parse_sweep_args(args, METRICS)
+            loop = asyncio.get_running_loop()
+            res = await loop.run_in_executor(None, lambda: get_backtester().sweep(
+                self.db, strategy, metrics=metrics, timeframes=tfs))
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text=format_table(res, top=10) + "\n<i>Зачем</i>: какие параметры правила исторически работали лучше (с комиссией, не финсовет).",
+                parse_mode=ParseMode.HTML,
+            )
+        except Exception:
+            logger.exception("_send_bt_sweep failed")
+
     async def _send_breadth(self, chat_id: int, tf: str, context: ContextTypes.DEFAULT_TYPE):
         """Отправить данные по breadth."""
         try:
@@ -780,19 +811,24 @@ class AnalyticsHandler(BaseHandler):
     async def _send_liquidity_intelligence(self, chat_id: int, symbol: str, context: ContextTypes.DEFAULT_TYPE):
         """Отправить Liquidity Intelligence (изображение + отчет)."""
         try:
-            from ...liquidity_map.application.generate_liquidity_map import generate_liquidity_map
+            from ...liquidity_map.application.generate_liquidity_map import TIMEFRAMES
             from ...liquidity_map.application.generate_liquidity_report import generate_liquidity_report
             from ...liquidity_map.application.generate_liquidity_report_compact import generate_liquidity_report_compact
             from ...liquidity_map.services.report_builder import build_short_caption
             from ...liquidity_map.services.snapshot_builder import build_tf_snapshot
+            from ...infrastructure.render_service import get_render_service, RenderSpec
             from telegram import InputFile
             
-            # Генерируем изображение
-            png = generate_liquidity_map(symbol, self.db)
+            # Генерируем изображение (в пуле рендера, с кэшем до нового бара любого ТФ карты,
+            # но не дольше RENDER_VERSION_BUCKET_SEC)
+            svc = get_render_service(self.db.path)
+            png = await svc.render(
+                RenderSpec("liquidity_map", {"symbol": symbol}),
+                data_version=svc.series_version(self.db, [symbol], TIMEFRAMES),
+            )
             
             # Создаем короткий caption для изображения
-            timeframes = ["5m", "15m", "1h", "4h", "1d"]
-            snapshots = [build_tf_snapshot(symbol, tf, self.db) for tf in timeframes]
+            snapshots = [build_tf_snapshot(symbol, tf, self.db) for tf in TIMEFRAMES]
             short_caption = build_short_caption(snapshots, symbol)
             
             # Отправляем изображение с коротким caption
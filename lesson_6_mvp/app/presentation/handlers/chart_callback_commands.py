@@ -104,8 +104,9 @@ class ChartSymbolCommand:
         
         # Рендерим график
         try:
-            from ...visual.chart_renderer import render_chart
-            png = render_chart(self.db, symbol, settings, n_bars=500)
+            from ...infrastructure.render_service import get_render_service, RenderSpec
+            spec = RenderSpec("chart", {"metric": symbol, "settings": settings.to_dict(), "n_bars": 500})
+            png = await get_render_service(self.db.path).render(spec, db=self.db)
             
             # Отправляем график
             from telegram import InputFile
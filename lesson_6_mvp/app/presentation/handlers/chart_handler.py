@@ -66,9 +66,10 @@ class ChartHandler(BaseHandler):
             
             if has_custom_params:
                 # Используем новый рендерер с настройками
-                from ...visual.chart_renderer import render_chart
+                from ...infrastructure.render_service import get_render_service, RenderSpec
                 try:
-                    png = render_chart(self.db, metric, settings, n_bars=500)
+                    spec = RenderSpec("chart", {"metric": metric, "settings": settings.to_dict(), "n_bars": 500})
+                    png = await get_render_service(self.db.path).render(spec, db=self.db)
                     
                     # Формируем подпись
                     caption_parts = [f"<b>{metric}</b> • {settings.timeframe}"]
@@ -97,9 +98,13 @@ class ChartHandler(BaseHandler):
             # Старый формат - используем существующий рендерер
             tf = self._resolve_tf(update, context)
             
-            from ...visual.digest import render_digest
+            from ...infrastructure.render_service import get_render_service, RenderSpec
             try:
-                png = render_digest(self.db, tf)
+                svc = get_render_service(self.db.path)
+                png = await svc.render(
+                    RenderSpec("digest", {"tf": tf}),
+                    data_version=svc.bars_version(self.db, METRICS, tf),
+                )
             except Exception:
                 logger.exception("render_digest failed")
                 await update.effective_message.reply_text("Не удалось построить график, попробуйте позже.")
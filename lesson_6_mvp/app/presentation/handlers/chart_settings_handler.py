@@ -70,11 +70,12 @@ async def handle_chart_settings_callback(update: Update, context: ContextTypes.D
             settings.timeframe = tf
             
             # Рендерим график
-            from ...visual.chart_renderer import render_chart
+            from ...infrastructure.render_service import get_render_service, RenderSpec
             from telegram import InputFile
             from telegram.constants import ParseMode
             
-            png = render_chart(bot.db, symbol, settings, n_bars=500)
+            spec = RenderSpec("chart", {"metric": symbol, "settings": settings.to_dict(), "n_bars": 500})
+            png = await get_render_service(bot.db.path).render(spec, db=bot.db)
             
             # Формируем подпись
             caption = f"<b>Preview: {symbol}</b> • {tf}"
@@ -9,7 +9,6 @@ from telegram.constants import ParseMode
 from .base_handler import BaseHandler
 from ...infrastructure.ui_keyboards import build_kb
 import logging
-import re
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 
@@ -19,80 +18,49 @@ logger = logging.getLogger("alt_forecast.handlers.events")
 class EventsHandler(BaseHandler):
     """Обработчик команд событий."""
     
-    def _parse_date_to_ms(self, date_str: str, tz) -> int:
-        """
-        Преобразует 'YYYY-MM-DD' (или 'YYYY-MM-DD HH:MM') в unix ms локальной TZ.
-        Если время не указано — берём полночь.
-        """
-        date_str = date_str.strip()
-        fmt = "%Y-%m-%d %H:%M" if " " in date_str else "%Y-%m-%d"
-        dt = datetime.strptime(date_str, fmt)
-        if fmt == "%Y-%m-%d":
-            dt = dt.replace(hour=0, minute=0, second=0, microsecond=0)
-        if tz:
-            dt = dt.replace(tzinfo=tz)
-        return int(dt.timestamp() * 1000)
-    
     async def handle_events_add(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработать команду /events_add."""
+        """Обработать команду /events_add (время — в поясе автора, @daily/@weekly/@monthly — повтор)."""
         try:
-            from ...infrastructure.events import add_event
-            from ...config import settings
-            
-            text = (update.effective_message.text or "").strip()
-            
-            # Разрешим оба формата: с временем и без
-            m = re.match(r"^/events_add\s+(\d{4}-\d{2}-\d{2}(?:\s+\d{2}:\d{2})?)\s+(.+)$", text)
-            if not m:
-                await update.effective_message.reply_text(
-                    "Формат: /events_add YYYY-MM-DD [HH:MM] Текст события\n"
-                    "Пример: /events_add 2025-10-05 19:00 FOMC"
-                )
-                return
-            
-            date_str, title = m.group(1), m.group(2)
+            from ...infrastructure.events import add_event, get_user_tz, get_user_tz_name
+            from ...infrastructure.events_parse import parse_event_add
             
+            user_id = update.effective_user.id if update.effective_user else None
+            tz = get_user_tz(user_id)
             try:
-                tz = getattr(settings, "tz", None)
-            except Exception:
-                tz = None
-            
-            try:
-                ts_ms = self._parse_date_to_ms(date_str, tz)
-            except Exception as e:
-                await update.effective_message.reply_text(f"Ошибка в дате: {e}")
+                ts_ms, title, recur = parse_event_add(update.effective_message.text or "", tz)
+            except ValueError as e:
+                await update.effective_message.reply_text(str(e))
                 return
             
-            eid = add_event(ts_ms, title, author_chat_id=(update.effective_user.id if update.effective_user else None))
-            await update.effective_message.reply_text(f"✅ Событие добавлено (id={eid}). Видно всем.")
+            eid = add_event(ts_ms, title, author_chat_id=user_id, recur=recur, tz=get_user_tz_name(user_id) or str(tz))
+            suffix = f", повтор: {recur}" if recur else ""
+            await update.effective_message.reply_text(f"✅ Событие добавлено (id={eid}{suffix}). Видно всем.")
         except Exception:
             logger.exception("handle_events_add failed")
     
     async def handle_events_list(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработать команду /events_list."""
         try:
-            from ...infrastructure.events import list_all_events, purge_past_events
-            from ...config import settings
+            from ...infrastructure.events import get_user_tz, purge_past_events, upcoming_events
             
             try:
                 purge_past_events()  # мягкая гигиена
             except Exception:
                 logger.exception("purge_past_events failed silently")
             
-            rows = list_all_events()
+            rows = upcoming_events()
             if not rows:
                 await update.effective_message.reply_text("Сейчас нет предстоящих событий.")
                 return
             
-            try:
-                tz = getattr(settings, "tz", None)
-            except Exception:
-                tz = None
+            tz = get_user_tz(update.effective_user.id if update.effective_user else None)
             
             lines = ["<b>Предстоящие события</b>"]
-            for eid, ts, title in rows[:100]:
-                dt = datetime.fromtimestamp(ts / 1000.0, tz=tz or timezone.utc)
-                lines.append(f"• <b>{dt.strftime('%Y-%m-%d')}</b> — {title}")
+            for row in rows[:100]:
+                dt = datetime.fromtimestamp(row.ts / 1000.0, tz=tz or timezone.utc)
+                when = dt.strftime('%Y-%m-%d') if (dt.hour, dt.minute) == (0, 0) else dt.strftime('%Y-%m-%d %H:%M')
+                recur = f" 🔁 {row.recur}" if row.recur else ""
+                lines.append(f"• <b>{when}</b> — {row.title}{recur}")
             
             await update.effective_message.reply_text(
                 "\n".join(lines),
@@ -115,4 +83,24 @@ class EventsHandler(BaseHandler):
             await update.effective_message.reply_text("Удалено.")
         except Exception:
             logger.exception("handle_events_del failed")
-
+    
+    async def handle_events_tz(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработать команду /events_tz [Зона] — показать/задать часовой пояс для событий."""
+        try:
+            from ...infrastructure.events import get_user_tz, set_user_tz
+            
+            user_id = update.effective_user.id if update.effective_user else None
+            parts = (update.effective_message.text or "").split()
+            if len(parts) < 2 or user_id is None:
+                await update.effective_message.reply_text(
+                    f"Ваш пояс: {get_user_tz(user_id)}\nЗадать: /events_tz Europe/Moscow"
+                )
+                return
+            try:
+                name = set_user_tz(user_id, parts[1])
+            except ValueError as e:
+                await update.effective_message.reply_text(f"Ошибка: {e}")
+                return
+            await update.effective_message.reply_text(f"✅ Пояс для событий: {name}")
+        except Exception:
+            logger.exception("handle_events_tz failed")
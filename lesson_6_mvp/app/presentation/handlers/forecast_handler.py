@@ -432,9 +432,8 @@ class ForecastHandler(BaseHandler):
         """Обработать команду /forecast_alts (прогнозы для альткоинов)."""
         try:
             from ...infrastructure.coingecko import top_movers
-            from ...ml.data_adapter import make_loader, _symbol_norm
+            from ...ml.batch_forecaster import stream_to_message
             
-            loader = make_loader()
             vs = "usd"
             
             try:
@@ -449,28 +448,15 @@ class ForecastHandler(BaseHandler):
                                  "SUSD", "LUSD", "USDD", "USDJ", "USDE", "USDS", "GUSD", "USD0", "BSC-USD",
                                  "STETH", "WSTETH", "WETH"}
             
-            top10 = [c for c in sorted(coins, key=lambda x: float(x.get("market_cap") or 0), reverse=True) if
-                     _is_ok(c.get("symbol"))][:10]
+            from ...infrastructure.market_snapshot import get_market_store
+            by_cap = get_market_store().current(vs).ranked("market_cap", exclude_stable=True)
+            top10 = [c for c in by_cap if _is_ok(c.get("symbol"))][:10]
             movers24 = [c for c in (gainers[:12] + losers[:12]) if _is_ok(c.get("symbol"))]
             
-            async def _do_batch(title, arr, tf_for_model="1h", horizon=24):
-                lines = [f"<b>{title}</b>  ({tf_for_model}, +{horizon} бар)"]
-                for c in arr:
-                    sym = _symbol_norm(c.get("symbol") or "")
-                    try:
-                        from ...ml.forecaster import forecast_symbol
-                        res = forecast_symbol(sym, tf_for_model, horizon, loader)
-                        if res:
-                            ret_pct = res.get("ret_pred", 0.0) * 100
-                            p_up = res.get("p_up", 0.5)
-                            lines.append(f"• {sym}: {ret_pct:+.2f}% (P(up)={p_up:.2f})")
-                    except Exception:
-                        continue
-                if len(lines) > 1:
-                    await update.effective_message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
-            
-            await _do_batch("Топ-10 по капе", top10)
-            await _do_batch("Движущиеся 24h", movers24)
+            # Батч-инференс (data_adapter.load_bars_many + пул процессов), результаты — по мере готовности
+            msg = update.effective_message
+            await stream_to_message(msg, "Топ-10 по капе", [c.get("symbol") or "" for c in top10], "1h", 24)
+            await stream_to_message(msg, "Движущиеся 24h", [c.get("symbol") or "" for c in movers24], "1h", 24)
             
         except Exception:
             logger.exception("handle_forecast_alts failed")
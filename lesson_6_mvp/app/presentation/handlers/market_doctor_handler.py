@@ -32,6 +32,7 @@ from ...domain.market_diagnostics.profile_provider import ProfileProvider
 from ...infrastructure.market_data_service import MarketDataService, DerivativesSnapshot
 from ...infrastructure.repositories.diagnostics_repository import DiagnosticsRepository
 from ...domain.market_diagnostics.anomaly_detector import AnomalyDetector
+from ...domain.market_diagnostics.anomaly_stream import get_anomaly_stream
 from ...domain.market_regime import GlobalRegimeAnalyzer
 from ...domain.portfolio import PortfolioAnalyzer
 from ...domain.sentiment import SentimentAnalyzer
@@ -65,7 +66,7 @@ class MarketDoctorHandler(BaseHandler):
         self.trade_planner = TradePlanner(self.config)
         self.data_service = MarketDataService(db)
         self.diagnostics_repo = DiagnosticsRepository(db)
-        self.anomaly_detector = AnomalyDetector(self.diagnostics_repo)
+        self.anomaly_detector = AnomalyDetector(self.diagnostics_repo, stream=get_anomaly_stream(db))
         self.calibration_service = CalibrationService(db)
         self.regime_analyzer = GlobalRegimeAnalyzer(db)
         self.tradability_analyzer = TradabilityAnalyzer(db)
@@ -693,9 +694,11 @@ class MarketDoctorHandler(BaseHandler):
             trade_plan.position_size_comment = comment
         
         # Сохраняем снимок диагностики для валидации
+        snapshot_ts = None
         try:
             from ...infrastructure.repositories.diagnostics_repository import DiagnosticsSnapshot
             import time
+            snapshot_ts = int(time.time() * 1000)
             
             # Подготавливаем метрики по уровням и SMC для backtest анализа
             levels_metrics = {}
@@ -764,7 +767,7 @@ class MarketDoctorHandler(BaseHandler):
                     smc_metrics['has_bos'] = False
             
             snapshot = DiagnosticsSnapshot(
-                timestamp=int(time.time() * 1000),
+                timestamp=snapshot_ts,
                 symbol=symbol,
                 timeframe=timeframe,
                 phase=diagnostics.phase.value,
@@ -801,7 +804,7 @@ class MarketDoctorHandler(BaseHandler):
         try:
             # Используем уже полученную актуальную цену с биржи (current_price определена выше)
             anomalies = self.anomaly_detector.detect_all_anomalies(
-                symbol, timeframe, diagnostics, derivatives, current_price
+                symbol, timeframe, diagnostics, derivatives, current_price, timestamp_ms=snapshot_ts
             )
         except Exception as e:
             logger.debug(f"Failed to detect anomalies: {e}")
@@ -177,6 +177,84 @@ class MarketDoctorWatchlistHandler(BaseHandler):
                 parse_mode=ParseMode.HTML
             )
     
+    async def handle_alert_add(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработать команду /md_alert_add <символ> [ТФ] <тип> [значение]."""
+        from ...usecases.watch_alerts import get_alert_engine, parse_rule_args
+        try:
+            user_id = update.effective_user.id if update.effective_user else None
+            if not user_id:
+                await self._safe_reply_text(update, "❌ Не удалось определить пользователя.", parse_mode=ParseMode.HTML)
+                return
+            try:
+                spec = parse_rule_args(context.args or [])
+                engine = get_alert_engine(self.db)
+                engine.check_symbol(spec["symbol"], spec["tf"], spec["kind"])
+                rule = engine.add_rule(user_id, **spec)
+            except ValueError as e:
+                await self._safe_reply_text(
+                    update,
+                    f"❌ {e}\n\n"
+                    "Использование: /md_alert_add &lt;символ&gt; [ТФ] &lt;тип&gt; [значение]\n"
+                    "Примеры:\n"
+                    "/md_alert_add BTC 1h price &gt; 70000\n"
+                    "/md_alert_add ETH 4h phase MARKUP\n"
+                    "/md_alert_add SOL 4h pump 0.8\n"
+                    "/md_alert_add BTC 4h div bullish\n"
+                    "/md_alert_add BTC funding 0.05\n"
+                    "/md_alert_add BTC twap BUY 1000000",
+                    parse_mode=ParseMode.HTML
+                )
+                return
+            await self._safe_reply_text(
+                update,
+                f"✅ Правило добавлено: <b>{rule.describe()}</b>\n\nСписок: /md_alerts",
+                parse_mode=ParseMode.HTML
+            )
+        except Exception as e:
+            logger.exception("handle_alert_add failed")
+            await self._safe_reply_text(update, f"❌ Ошибка при добавлении правила: {str(e)}", parse_mode=ParseMode.HTML)
+    
+    async def handle_alert_list(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработать команду /md_alerts."""
+        from ...usecases.watch_alerts import get_alert_engine
+        try:
+            user_id = update.effective_user.id if update.effective_user else None
+            if not user_id:
+                await self._safe_reply_text(update, "❌ Не удалось определить пользователя.", parse_mode=ParseMode.HTML)
+                return
+            rules = get_alert_engine(self.db).rules_for(user_id)
+            if not rules:
+                await self._safe_reply_text(
+                    update,
+                    "🔔 Правил алертов нет.\n\nДобавьте: /md_alert_add BTC 1h price &gt; 70000",
+                    parse_mode=ParseMode.HTML
+                )
+                return
+            lines = ["🔔 <b>Ваши алерты:</b>\n"] + [f"• {r.describe()}" for r in rules]
+            lines.append("\nУдалить: /md_alert_del &lt;id&gt;")
+            await self._safe_reply_text(update, "\n".join(lines), parse_mode=ParseMode.HTML)
+        except Exception as e:
+            logger.exception("handle_alert_list failed")
+            await self._safe_reply_text(update, f"❌ Ошибка при получении алертов: {str(e)}", parse_mode=ParseMode.HTML)
+    
+    async def handle_alert_remove(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработать команду /md_alert_del <id>."""
+        from ...usecases.watch_alerts import get_alert_engine
+        try:
+            user_id = update.effective_user.id if update.effective_user else None
+            args = context.args or []
+            if not user_id or not args or not args[0].lstrip("#").isdigit():
+                await self._safe_reply_text(update, "Использование: /md_alert_del &lt;id&gt;", parse_mode=ParseMode.HTML)
+                return
+            rule_id = int(args[0].lstrip("#"))
+            if get_alert_engine(self.db).remove_rule(rule_id, user_id):
+                await self._safe_reply_text(update, f"✅ Правило #{rule_id} удалено.", parse_mode=ParseMode.HTML)
+            else:
+                await self._safe_reply_text(update, f"ℹ️ Правила #{rule_id} нет.", parse_mode=ParseMode.HTML)
+        except Exception as e:
+            logger.exception("handle_alert_remove failed")
+            await self._safe_reply_text(update, f"❌ Ошибка при удалении правила: {str(e)}", parse_mode=ParseMode.HTML)
+    
     async def handle_watchlist_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработать callback для watchlist."""
         try:
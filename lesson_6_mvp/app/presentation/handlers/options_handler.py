@@ -82,11 +82,11 @@ class OptionsHandler(BaseHandler):
     async def handle_options_free(self, update: Update, context: ContextTypes.DEFAULT_TYPE, symbol: str):
         """Обработать команду /options_*_free (бесплатные опционы)."""
         try:
-            from ...infrastructure.deribit import build_series
+            from ...infrastructure.options_store import get_options_store
             from ...visual.options_chart_free import render_free_series
             from telegram import InputFile
             
-            pts = build_series(symbol, max_expiries=8)
+            pts = get_options_store(self.db).series(symbol, max_expiries=8)
             
             bmap: dict[str, float] = {}
             try:
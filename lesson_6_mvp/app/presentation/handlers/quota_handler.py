@@ -46,6 +46,14 @@ class QuotaHandler(BaseHandler):
             filled = int(bar_length * percentage / 100)
             bar = "█" * filled + "░" * (bar_length - filled)
             
+            # Учёт по эндпоинтам и TTL кэша от планировщика
+            endpoint_lines = []
+            ttl = budget_info.get("ttl", {})
+            for name, acc in sorted(budget_info.get("endpoints", {}).items(), key=lambda kv: -kv[1]["used"]):
+                ttl_txt = f", TTL {ttl[name] / 60:.0f} мин" if name in ttl else ""
+                endpoint_lines.append(f"• <code>{name}</code>: {acc['used']:,} запр. / {acc['demand']:,} обращ.{ttl_txt}")
+            endpoints_block = ("\n".join(endpoint_lines) + "\n\n") if endpoint_lines else ""
+            
             message = (
                 f"📊 <b>Использование квоты CoinGecko API</b>\n"
                 f"━━━━━━━━━━━━━━━━━━\n\n"
@@ -55,7 +63,8 @@ class QuotaHandler(BaseHandler):
                 f"📊 Процент: <b>{percentage:.1f}%</b>\n\n"
                 f"{status_emoji} Статус: <b>{status_text}</b>\n\n"
                 f"<code>{bar}</code> {percentage:.1f}%\n\n"
-                f"💡 <i>Кэширование активно для минимизации запросов.</i>\n"
+                f"{endpoints_block}"
+                f"💡 <i>TTL кэша подстраивается под спрос, чтобы остатка хватило до конца месяца.</i>\n"
                 f"<i>Лимит: {limit:,} запросов в месяц (бесплатный план CoinGecko).</i>"
             )
             
@@ -125,6 +125,7 @@ class TopFlopHandler(BaseHandler):
         """Обработать выбор категории."""
         try:
             from ...infrastructure.coingecko import markets_by_category
+            from ...infrastructure.market_snapshot import get_market_store
             
             q = update.callback_query
             if not q:
@@ -137,13 +138,10 @@ class TopFlopHandler(BaseHandler):
                 await q.edit_message_text(f"Нет данных для категории {cat}")
                 return
             
-            def chg(c, key):
-                return float(c.get(key) or 0.0)
-            
-            # топ/флоп за 24ч
-            sorted24 = sorted(data, key=lambda c: chg(c, "price_change_percentage_24h_in_currency"), reverse=True)
-            gain = sorted24[:5]
-            loss = list(reversed(sorted24))[:5]
+            # топ/флоп за 24ч — по колоночному виду ответа (заодно запоминает членство категории)
+            snap = get_market_store().category_snapshot(cat, data)
+            gain = snap.top("24h", 5, desc=True)
+            loss = snap.top("24h", 5, desc=False)
             
             def fmt(c):
                 return f"{c['symbol'].upper():<6} {c['current_price']:.4g} USD ({(c.get('price_change_percentage_24h_in_currency') or 0):+,.2f}%)"
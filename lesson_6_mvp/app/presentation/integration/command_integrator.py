@@ -108,6 +108,7 @@ class CommandIntegrator:
             "events_add": self._handle_events_add,
             "events_list": self._handle_events_list,
             "events_del": self._handle_events_del,
+            "events_tz": self._handle_events_tz,
             "subscribe": self._handle_subscribe,
             "unsubscribe": self._handle_unsubscribe,
             "categories": self._handle_categories,
@@ -132,6 +133,9 @@ class CommandIntegrator:
             "md_watch_add": self._handle_md_watch_add,
             "md_watch_remove": self._handle_md_watch_remove,
             "md_watch_list": self._handle_md_watch_list,
+            "md_alert_add": self._handle_md_alert_add,
+            "md_alerts": self._handle_md_alerts,
+            "md_alert_del": self._handle_md_alert_del,
             "md_backtest": self._handle_md_backtest,
             "md_calibrate": self._handle_md_calibrate,
             "md_apply_weights": self._handle_md_apply_weights,
@@ -342,6 +346,9 @@ class CommandIntegrator:
     async def _handle_events_del(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         await self.handlers["events"].handle_events_del(update, context)
     
+    async def _handle_events_tz(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await self.handlers["events"].handle_events_tz(update, context)
+    
     async def _handle_subscribe(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         await self.handlers["command"].handle_subscribe(update, context)
     
@@ -406,6 +413,15 @@ class CommandIntegrator:
     async def _handle_md_watch_list(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         await self.handlers["market_doctor_watchlist"].handle_watchlist_list(update, context)
     
+    async def _handle_md_alert_add(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await self.handlers["market_doctor_watchlist"].handle_alert_add(update, context)
+    
+    async def _handle_md_alerts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await self.handlers["market_doctor_watchlist"].handle_alert_list(update, context)
+    
+    async def _handle_md_alert_del(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await self.handlers["market_doctor_watchlist"].handle_alert_remove(update, context)
+    
     async def _handle_md_backtest(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         await self.handlers["market_doctor_backtest"].handle_backtest_command(update, context)
     
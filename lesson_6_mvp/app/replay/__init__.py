@@ -0,0 +1,17 @@
+# app/replay/__init__.py
+"""
+Replay-харнесс: детерминированный ускоренный прогон записанной сессии через весь конвейер.
+
+    python -m app.replay --synthetic 3
+    python -m app.replay --recording <dir> --golden <file.json> [--update-golden]
+"""
+
+from .harness import ReplayConfig, ReplayHarness, ReplayResult, compare_golden
+from .recording import Recording, ReplayEvent, synthetic_recording
+from .stubs import ReplayNetworkError, SimClock, StubExchangeClient, StubTelegram
+
+__all__ = [
+    "ReplayConfig", "ReplayHarness", "ReplayResult", "compare_golden",
+    "Recording", "ReplayEvent", "synthetic_recording",
+    "ReplayNetworkError", "SimClock", "StubExchangeClient", "StubTelegram",
+]
@@ -0,0 +1,77 @@
+# app/replay/__main__.py
+"""
+CLI replay-харнесса.
+
+    # бенчмарк на фиксированной синтетической нагрузке (N дней)
+    python -m app.replay --synthetic 3
+
+    # прогон записанной сессии и сверка с golden (exit 1 при расхождении)
+    python -m app.replay --recording data/replay/2024-05-01 --golden data/replay/2024-05-01.golden.json
+
+    # перезаписать golden после осознанного изменения поведения
+    python -m app.replay --recording ... --golden ... --update-golden
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import warnings
+
+from ..infrastructure.db import DB
+from .harness import ReplayConfig, ReplayHarness, compare_golden
+from .recording import Recording, synthetic_recording
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m app.replay", description="Deterministic market replay")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--recording", help="каталог с points/bars/trades/derivatives.ndjson")
+    src.add_argument("--synthetic", type=float, metavar="DAYS", help="синтетическая сессия на DAYS дней")
+    ap.add_argument("--seed", type=int, default=7, help="seed синтетики")
+    ap.add_argument("--db", help="путь к SQLite (по умолчанию временный файл)")
+    ap.add_argument("--golden", help="golden JSON для сверки")
+    ap.add_argument("--update-golden", action="store_true", help="записать golden вместо сверки")
+    ap.add_argument("--forecast", default="", help="символы для стадии прогноза через app.ml (CSV)")
+    ap.add_argument("--json", action="store_true", help="вывести результат JSON-ом")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    # numpy на пустых окнах индикаторов (бары collector'а без объёма) — шум в отчёте бенчмарка
+    warnings.filterwarnings("ignore", category=RuntimeWarning)
+
+    recording = Recording.load(args.recording) if args.recording else synthetic_recording(
+        days=args.synthetic, seed=args.seed)
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="replay_"), "replay.db")
+    config = ReplayConfig(forecast_symbols=tuple(s.strip() for s in args.forecast.split(",") if s.strip()))
+
+    result = ReplayHarness(DB(db_path), recording, config).run()
+    golden = result.golden()
+
+    if args.json:
+        print(json.dumps({"throughput": result.throughput(), "stages": result.stages,
+                          "skipped": result.skipped, "golden": golden}, indent=2, ensure_ascii=False))
+    else:
+        print(result.summary())
+
+    if args.golden:
+        if args.update_golden:
+            with open(args.golden, "w", encoding="utf-8") as f:
+                json.dump(golden, f, indent=2, sort_keys=True)
+            print(f"golden written: {args.golden}")
+        else:
+            with open(args.golden, encoding="utf-8") as f:
+                diffs = compare_golden(json.load(f), golden)
+            if diffs:
+                print("GOLDEN MISMATCH:\n  " + "\n  ".join(diffs), file=sys.stderr)
+                return 1
+            print("golden: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,385 @@
+# app/replay/harness.py
+"""
+Детерминированный ускоренный replay всего конвейера на симулированных часах.
+
+Поток одной минуты симуляции (тик):
+    ingest       события записи: точки → буфер collector'а, бары → webhook.ingest_payload,
+                 сделки/деривативы → заглушки бирж
+    aggregate    collector_combo.flush_windows → DB.upsert_many_bars
+    divergences  на закрытии ТФ: usecases.market_state (детект, persist, confirm/invalidate, risk)
+    doctor       на закрытии ТФ: IndicatorCalculator → FeatureExtractor → MarketAnalyzer
+    forecast     на закрытии ТФ: forecaster(symbol, tf, df) (по умолчанию app.ml, если стек доступен)
+    trades       раз в час: TradesCollectorService с заглушкой биржи
+    alerts       открытые дивергенции строкой отчёта (format_open_div) + краткий отчёт в :30
+
+Результат — ReplayResult: пропускная способность (бары/с, ускорение относительно реального
+времени), тайминги по стадиям (p50/p99 из utils.metrics.Histogram) и выходы конвейера,
+из которых строится golden-снимок для регрессионной проверки.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..infrastructure.db import DB
+from ..utils.metrics import Registry
+from .recording import MINUTE_MS, TF_MS, Recording
+from .stubs import (
+    SimClock, StubDerivatives, StubExchangeClient, StubTelegram, offline, patched_clock,
+)
+
+log = logging.getLogger("alt_forecast.replay")
+
+STAGES = ("ingest", "aggregate", "divergences", "doctor", "forecast", "trades", "alerts")
+
+# forecaster(symbol, tf, df) -> {"ret_pred": float, "p_up": float}
+Forecaster = Callable[[str, str, Any], Dict[str, float]]
+
+
+@dataclass
+class ReplayConfig:
+    analysis_timeframes: Tuple[str, ...] = ("1h", "4h", "1d")
+    doctor_symbols: Tuple[str, ...] = ("BTC",)
+    doctor_timeframes: Tuple[str, ...] = ("1h",)
+    doctor_min_bars: int = 50
+    forecast_symbols: Tuple[str, ...] = ()
+    forecast_timeframe: str = "1h"
+    subscribers: Tuple[int, ...] = (1001,)
+    report_minute: Optional[int] = 30   # минута часа для краткого отчёта; None — выкл.
+    trades_interval_min: int = 60
+
+
+@dataclass
+class ReplayResult:
+    events: int
+    ticks: int
+    bars_written: int
+    webhook_rejected: int
+    sim_span_ms: int
+    wall_sec: float
+    stages: Dict[str, Dict[str, float]]
+    outputs: Dict[str, Any]
+    skipped: Dict[str, str] = field(default_factory=dict)
+
+    def throughput(self) -> Dict[str, float]:
+        wall = max(self.wall_sec, 1e-9)
+        return {
+            "bars_per_sec": self.bars_written / wall,
+            "events_per_sec": self.events / wall,
+            "speedup": (self.sim_span_ms / 1000.0) / wall,
+        }
+
+    def golden(self) -> Dict[str, Any]:
+        """Снимок для регрессии: счётчики + дайджесты выходов (без времени исполнения)."""
+        return {
+            "counts": {
+                "events": self.events, "bars_written": self.bars_written,
+                "webhook_rejected": self.webhook_rejected,
+                **{f"{k}": len(v) for k, v in sorted(self.outputs.items())},
+            },
+            "digests": {k: _digest(v) for k, v in sorted(self.outputs.items())},
+        }
+
+    def summary(self) -> str:
+        tp = self.throughput()
+        lines = [
+            f"events={self.events} bars={self.bars_written} ticks={self.ticks} "
+            f"sim={self.sim_span_ms / 3_600_000:.1f}h wall={self.wall_sec:.2f}s",
+            f"bars/sec={tp['bars_per_sec']:.1f} events/sec={tp['events_per_sec']:.0f} speedup={tp['speedup']:.0f}x",
+        ]
+        for name in STAGES:
+            st = self.stages.get(name)
+            if not st or not st["count"]:
+                continue
+            lines.append(
+                f"  {name:<12} n={st['count']:<6} total={st['sum']:.3f}s "
+                f"p50={st['p50'] * 1000:.2f}ms p99={st['p99'] * 1000:.2f}ms"
+            )
+        for name, reason in self.skipped.items():
+            lines.append(f"  {name:<12} skipped: {reason}")
+        return "\n".join(lines)
+
+
+def _digest(obj: Any) -> str:
+    raw = json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _r(x: Any, nd: int = 6) -> Any:
+    return round(float(x), nd) if x is not None else None
+
+
+def compare_golden(expected: Dict[str, Any], actual: Dict[str, Any]) -> List[str]:
+    """Список расхождений golden-снимков (пустой — совпадают)."""
+    diffs = []
+    for section in ("counts", "digests"):
+        exp, act = expected.get(section, {}), actual.get(section, {})
+        for key in sorted(set(exp) | set(act)):
+            if exp.get(key) != act.get(key):
+                diffs.append(f"{section}.{key}: expected {exp.get(key)!r}, got {act.get(key)!r}")
+    return diffs
+
+
+def _ml_forecaster(symbol: str, tf: str, df) -> Dict[str, float]:
+    from ..ml.forecaster import forecast_symbol
+
+    frame = df.rename(columns={"o": "open", "h": "high", "l": "low", "c": "close", "v": "volume"})
+    out = forecast_symbol(lambda _s, _tf: frame, symbol, tf)
+    return {"ret_pred": out["ret_pred"], "p_up": out["p_up"]}
+
+
+class ReplayHarness:
+    """Прогоняет Recording через конвейер на пустой (или подготовленной) БД."""
+
+    def __init__(self, db: DB, recording: Recording, config: Optional[ReplayConfig] = None,
+                 forecaster: Optional[Forecaster] = None):
+        self.db = db
+        self.recording = recording
+        self.config = config or ReplayConfig()
+        self.forecaster = forecaster
+        self.clock = SimClock(recording.start_ms)
+        self.telegram = StubTelegram(self.clock)
+        self.derivatives = StubDerivatives()
+        self.exchanges: Dict[str, StubExchangeClient] = {}
+
+        self._registry = Registry()
+        self._stage_seconds = self._registry.histogram("replay_stage_seconds", "Replay stage latency", ["stage"])
+        self._skipped: Dict[str, str] = {}
+        self._bars_written = 0
+        self._webhook_rejected = 0
+        self._div_state: Dict[str, str] = {}
+        self._outputs: Dict[str, List[Any]] = {
+            "risk": [], "doctor": [], "forecasts": [], "alerts": [], "trades": [],
+        }
+
+    # ---------- публичный API ----------
+
+    def run(self) -> ReplayResult:
+        from ..collector_combo.run import POINTS_MAXLEN
+
+        self._points = defaultdict(lambda: deque(maxlen=POINTS_MAXLEN))
+        self._last_written: Dict[Tuple[str, str], int] = {}
+        self._prepare()
+        for chat_id in self.config.subscribers:
+            self.db.add_sub(chat_id)
+
+        events = self.recording.events
+        if not events:
+            return self._result(0, 0, 0.0)
+        first_tick = events[0].ts - events[0].ts % MINUTE_MS + MINUTE_MS
+        last_tick = events[-1].ts - events[-1].ts % MINUTE_MS + MINUTE_MS
+
+        t0 = time.perf_counter()
+        ticks = 0
+        with offline(), patched_clock(self.clock):
+            next_tick = first_tick
+            for ev in events:
+                while ev.ts >= next_tick:
+                    self._tick(next_tick)
+                    ticks += 1
+                    next_tick += MINUTE_MS
+                self.clock.advance_to(ev.ts)
+                self._timed("ingest", self._dispatch, ev)
+            while next_tick <= last_tick:
+                self._tick(next_tick)
+                ticks += 1
+                next_tick += MINUTE_MS
+        wall = time.perf_counter() - t0
+        return self._result(len(events), ticks, wall)
+
+    # ---------- подготовка ----------
+
+    def _prepare(self) -> None:
+        from ..config import settings
+        # записи хранятся без секрета TradingView — подставляем действующий, чтобы пройти ту же проверку
+        self._webhook_secret = (
+            getattr(settings, "SECRET_WEBHOOK_TOKEN", None) or getattr(settings, "secret_webhook_token", None)
+        )
+
+        self._doctor = None
+        if self.config.doctor_symbols:
+            try:
+                from ..domain.market_diagnostics import FeatureExtractor, IndicatorCalculator, MarketAnalyzer
+                self._doctor = (IndicatorCalculator(), FeatureExtractor(), MarketAnalyzer())
+            except Exception as e:  # pragma: no cover — зависит от окружения
+                self._skipped["doctor"] = f"market doctor unavailable: {e}"
+
+        if self.config.forecast_symbols and self.forecaster is None:
+            try:
+                from ..ml import forecaster as _ml  # noqa: F401 — проверка, что ML-стек импортируется
+                self.forecaster = _ml_forecaster
+            except Exception as e:
+                self._skipped["forecast"] = f"ML stack unavailable: {type(e).__name__}: {e}"
+
+    # ---------- события ----------
+
+    def _dispatch(self, ev) -> None:
+        d = ev.data
+        if ev.kind == "points":
+            self._points[d["metric"]].append((ev.ts, float(d["value"])))
+        elif ev.kind == "bars":
+            self._ingest_webhook(d)
+        elif ev.kind == "trades":
+            client = self.exchanges.get(d["exchange"])
+            if client is None:
+                client = self.exchanges[d["exchange"]] = StubExchangeClient(d["exchange"])
+            client.add_trade(d["symbol"], ev.ts, d["price"], d["qty"], d["is_buyer"])
+        elif ev.kind == "derivatives":
+            self.derivatives.add_snapshot(d["symbol"], ev.ts, d)
+
+    def _ingest_webhook(self, d: Dict[str, Any]) -> None:
+        from fastapi import HTTPException
+        from ..infrastructure.webhook import ingest_payload
+
+        payload = {
+            "secret": self._webhook_secret,
+            "metric": d["metric"], "timeframe": d["timeframe"], "ts": d["bar_ts"],
+            "o": d["o"], "h": d["h"], "l": d["l"], "c": d["c"], "v": d.get("v"),
+        }
+        try:
+            ingest_payload(self.db, payload, publish=False)
+            self._bars_written += 1
+        except HTTPException:
+            self._webhook_rejected += 1
+
+    # ---------- тик симуляции ----------
+
+    def _tick(self, ts: int) -> None:
+        self.clock.advance_to(ts)
+        self._timed("aggregate", self._aggregate, ts)
+
+        closed = [tf for tf, tf_ms in TF_MS.items() if ts % tf_ms == 0]
+        for tf in closed:
+            if tf in self.config.analysis_timeframes:
+                self._timed("divergences", self._divergences, ts, tf)
+                self._timed("alerts", self._divergence_alerts, ts)
+            if self._doctor is not None and tf in self.config.doctor_timeframes:
+                for sym in self.config.doctor_symbols:
+                    self._timed("doctor", self._market_doctor, ts, sym, tf)
+            if self.forecaster is not None and tf == self.config.forecast_timeframe:
+                for sym in self.config.forecast_symbols:
+                    self._timed("forecast", self._forecast, ts, sym, tf)
+
+        minute = (ts // MINUTE_MS) % 60
+        if self.exchanges and ts % (self.config.trades_interval_min * MINUTE_MS) == 0:
+            self._timed("trades", self._collect_trades, ts)
+        if self.config.report_minute is not None and minute == self.config.report_minute:
+            self._timed("alerts", self._broadcast_report)
+
+    def _aggregate(self, ts: int) -> None:
+        from ..collector_combo.run import flush_windows
+
+        batch = flush_windows(self._points, self._last_written, ts)
+        if batch:
+            with self.db.atomic():
+                self.db.upsert_many_bars(batch)
+            self._bars_written += len(batch)
+
+    def _divergences(self, ts: int, tf: str) -> None:
+        from ..usecases.market_state import get_market_state
+
+        store = get_market_state(self.db)
+        store.refresh([tf])
+        state = store.get(tf)
+        self._outputs["risk"].append([ts, tf, _r(state.score, 4), state.label])
+
+    def _divergence_alerts(self, ts: int) -> None:
+        from ..usecases.generate_report import format_open_div
+
+        rows = self.db.conn.execute(
+            "SELECT uniq, metric, timeframe, indicator, side, status, confirm_grade FROM divs ORDER BY id"
+        ).fetchall()
+        for uniq, metric, tf, ind, side, status, grade in rows:
+            state = f"{status}:{grade or ''}"
+            if self._div_state.get(uniq) == state:
+                continue
+            self._div_state[uniq] = state
+            self._outputs["alerts"].append([ts, uniq, state])
+            if status not in ("active", "confirmed"):
+                continue  # отчёт показывает только открытые дивергенции (DB.list_open_divs)
+            text = f"{tf} · {format_open_div(metric, ind, side, status, grade)}"
+            for chat_id in self.config.subscribers:
+                self.telegram.send_message(chat_id, text)
+
+    def _broadcast_report(self) -> None:
+        from ..usecases.generate_report import build_status_report
+
+        text = build_status_report(self.db)
+        for chat_id in self.db.list_subs():
+            self.telegram.send_message(chat_id, text, parse_mode="HTML")
+
+    def _ohlcv(self, symbol: str, tf: str, n: int = 500):
+        from ..usecases.analytics import _ohlcv_df
+        return _ohlcv_df(self.db, symbol, tf, n)
+
+    def _market_doctor(self, ts: int, symbol: str, tf: str) -> None:
+        df = self._ohlcv(symbol, tf)
+        if len(df) < self.config.doctor_min_bars:
+            return
+        df = df.rename(columns={"o": "open", "h": "high", "l": "low", "c": "close", "v": "volume"})
+        derivatives = self.derivatives.get(symbol, ts).to_dict()
+        calc, extractor, analyzer = self._doctor
+        indicators = calc.calculate_all(df)
+        features = extractor.extract_features(df, indicators, derivatives)
+        diag = analyzer.analyze(symbol, tf, df, indicators, features, derivatives)
+        phase = getattr(diag.phase, "value", diag.phase)
+        self._outputs["doctor"].append([
+            ts, symbol, tf, str(phase), _r(diag.risk_score, 4), _r(diag.pump_score, 4), _r(diag.confidence, 4),
+        ])
+
+    def _forecast(self, ts: int, symbol: str, tf: str) -> None:
+        df = self._ohlcv(symbol, tf)
+        if df.empty:
+            return
+        out = self.forecaster(symbol, tf, df)
+        self._outputs["forecasts"].append([ts, symbol, tf, _r(out.get("ret_pred")), _r(out.get("p_up"), 4)])
+
+    def _collect_trades(self, ts: int) -> None:
+        from ..application.services.trades_collector_service import TradesCollectorService
+
+        svc = TradesCollectorService(self.db, exchange_clients=list(self.exchanges.values()))
+        svc.symbols = sorted({s for c in self.exchanges.values() for s in c.symbols()})
+        counts = svc.collect_all_symbols(window_minutes=self.config.trades_interval_min, now_ms=ts)
+        self._outputs["trades"].append([ts, sorted(counts.items())])
+
+    # ---------- служебное ----------
+
+    def _timed(self, stage: str, fn, *args) -> None:
+        t0 = time.perf_counter()
+        try:
+            fn(*args)
+        finally:
+            self._stage_seconds.observe(time.perf_counter() - t0, stage=stage)
+
+    def _result(self, n_events: int, ticks: int, wall: float) -> ReplayResult:
+        outputs = dict(self._outputs)
+        outputs["bars"] = [
+            [m, tf, ts, _r(o, 8), _r(h, 8), _r(l, 8), _r(c, 8), _r(v, 4)]
+            for m, tf, ts, o, h, l, c, v in self.db.conn.execute(
+                "SELECT metric, timeframe, ts, o, h, l, c, v FROM bars ORDER BY metric, timeframe, ts"
+            ).fetchall()
+        ]
+        outputs["divs"] = [
+            list(r) for r in self.db.conn.execute(
+                "SELECT metric, timeframe, indicator, side, implication, pivot_l_ts, pivot_r_ts, detected_ts, "
+                "status, confirm_grade, confirm_ts, invalid_ts FROM divs ORDER BY uniq"
+            ).fetchall()
+        ]
+        outputs["messages"] = [list(m) for m in self.telegram.transcript()]
+        return ReplayResult(
+            events=n_events,
+            ticks=ticks,
+            bars_written=self._bars_written,
+            webhook_rejected=self._webhook_rejected,
+            sim_span_ms=self.recording.end_ms - self.recording.start_ms,
+            wall_sec=wall,
+            stages={s: self._stage_seconds.snapshot(stage=s) for s in STAGES},
+            outputs=outputs,
+            skipped=dict(self._skipped),
+        )
@@ -0,0 +1,171 @@
+# app/replay/recording.py
+"""
+Записанная рыночная сессия для replay: минутные точки collector'а, бары от TradingView
+(webhook), сделки бирж и снимки деривативов.
+
+Формат на диске — каталог с NDJSON-файлами (можно .ndjson.gz), по одному на вид:
+    points.ndjson       {"ts", "metric", "value"}                       → collector_combo
+    bars.ndjson         {"ts", "metric", "timeframe", "bar_ts", o,h,l,c,v} → webhook
+    trades.ndjson       {"ts", "symbol", "exchange", "price", "qty", "is_buyer"}
+    derivatives.ndjson  {"ts", "symbol", "funding", "oi", "oi_change_pct", "cvd_spot_slope", "cvd_fut_slope"}
+ts — момент, когда событие «пришло» в систему (мс); для баров время самого бара — bar_ts.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import random
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+KINDS = ("points", "bars", "trades", "derivatives")
+# порядок обработки событий с одинаковым ts: сначала состояние рынка, потом сделки
+_KIND_ORDER = {k: i for i, k in enumerate(("derivatives", "points", "bars", "trades"))}
+
+MINUTE_MS = 60_000
+TF_MS = {"15m": 15 * MINUTE_MS, "1h": 60 * MINUTE_MS, "4h": 240 * MINUTE_MS, "1d": 1440 * MINUTE_MS}
+
+
+@dataclass(frozen=True)
+class ReplayEvent:
+    ts: int
+    kind: str
+    data: Dict[str, Any] = field(compare=False)
+
+
+class Recording:
+    """Упорядоченный по времени поток событий одной сессии."""
+
+    def __init__(self, events: List[ReplayEvent]):
+        self.events = sorted(events, key=lambda e: (e.ts, _KIND_ORDER.get(e.kind, 9)))
+
+    def __iter__(self) -> Iterator[ReplayEvent]:
+        return iter(self.events)
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    @property
+    def start_ms(self) -> int:
+        return self.events[0].ts if self.events else 0
+
+    @property
+    def end_ms(self) -> int:
+        return self.events[-1].ts if self.events else 0
+
+    def counts(self) -> Dict[str, int]:
+        out = {k: 0 for k in KINDS}
+        for e in self.events:
+            out[e.kind] = out.get(e.kind, 0) + 1
+        return out
+
+    def symbols(self, kind: str) -> List[str]:
+        return sorted({e.data["symbol"] for e in self.events if e.kind == kind})
+
+    @classmethod
+    def load(cls, path: str) -> "Recording":
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"recording directory not found: {path}")
+        events: List[ReplayEvent] = []
+        for kind in KINDS:
+            for name in (f"{kind}.ndjson", f"{kind}.ndjson.gz"):
+                fp = os.path.join(path, name)
+                if not os.path.exists(fp):
+                    continue
+                opener = gzip.open if name.endswith(".gz") else open
+                with opener(fp, "rt", encoding="utf-8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        data = json.loads(line)
+                        events.append(ReplayEvent(int(data.pop("ts")), kind, data))
+        return cls(events)
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        files = {}
+        try:
+            for e in self.events:
+                f = files.get(e.kind)
+                if f is None:
+                    f = files[e.kind] = open(os.path.join(path, f"{e.kind}.ndjson"), "w", encoding="utf-8")
+                f.write(json.dumps({"ts": e.ts, **e.data}, separators=(",", ":")) + "\n")
+        finally:
+            for f in files.values():
+                f.close()
+
+
+def synthetic_recording(
+    start_ms: int = 1_704_067_200_000,  # 2024-01-01 00:00 UTC
+    days: float = 2.0,
+    seed: int = 7,
+    trades_per_min: int = 4,
+) -> Recording:
+    """
+    Детерминированная синтетическая сессия (фиксированная нагрузка для бенчмарка/тестов).
+    BTC, TOTAL2, TOTAL3, BTC.D, USDT.D идут минутными точками через collector_combo,
+    ETHBTC — закрытыми барами 15m/1h/4h/1d через webhook (как алерты TradingView),
+    плюс сделки BTCUSDT и ежечасные снимки деривативов BTC.
+    """
+    rng = random.Random(seed)
+    minutes = int(days * 1440)
+    start_ms -= start_ms % MINUTE_MS
+    events: List[ReplayEvent] = []
+
+    walk = {"BTC": 42_000.0, "TOTAL2": 7.5e11, "TOTAL3": 5.2e11, "BTC.D": 52.0, "USDT.D": 4.9, "ETHBTC": 0.055}
+    vol = {"BTC": 0.0012, "TOTAL2": 0.0010, "TOTAL3": 0.0011, "BTC.D": 0.0004, "USDT.D": 0.0006, "ETHBTC": 0.0009}
+    # медленный режимный дрейф, чтобы появлялись тренды и дивергенции
+    drift = {m: 0.0 for m in walk}
+    eth_bars: Dict[str, Optional[List[float]]] = {tf: None for tf in TF_MS}
+    oi = 1.8e10
+
+    for i in range(minutes):
+        minute_start = start_ms + i * MINUTE_MS
+        close_ts = minute_start + MINUTE_MS - 1  # closeTime свечи 1m, как у Binance
+        if i % 240 == 0:
+            drift = {m: rng.gauss(0.0, vol[m] * 0.15) for m in walk}
+
+        for m in walk:
+            walk[m] *= 1.0 + drift[m] + rng.gauss(0.0, vol[m])
+
+        for m in ("BTC", "TOTAL2", "TOTAL3", "BTC.D", "USDT.D"):
+            events.append(ReplayEvent(close_ts, "points", {"metric": m, "value": round(walk[m], 10)}))
+
+        px = walk["ETHBTC"]
+        for tf, tf_ms in TF_MS.items():
+            cur = eth_bars[tf]
+            if cur is None:
+                cur = eth_bars[tf] = [px, px, px, px, 0.0]
+            cur[1] = max(cur[1], px)
+            cur[2] = min(cur[2], px)
+            cur[3] = px
+            cur[4] += rng.uniform(5.0, 50.0)
+            if (minute_start + MINUTE_MS) % tf_ms == 0:
+                bar_ts = minute_start + MINUTE_MS - tf_ms
+                o, h, l, c, v = cur
+                events.append(ReplayEvent(close_ts, "bars", {
+                    "metric": "ETHBTC", "timeframe": tf, "bar_ts": bar_ts,
+                    "o": round(o, 10), "h": round(h, 10), "l": round(l, 10), "c": round(c, 10), "v": round(v, 4),
+                }))
+                eth_bars[tf] = None
+
+        btc = walk["BTC"]
+        for k in range(trades_per_min):
+            events.append(ReplayEvent(minute_start + k * (MINUTE_MS // max(1, trades_per_min)), "trades", {
+                "symbol": "BTCUSDT", "exchange": "Binance",
+                "price": round(btc * (1.0 + rng.gauss(0.0, 0.0002)), 2),
+                "qty": round(rng.expovariate(4.0), 5), "is_buyer": rng.random() < 0.5 + drift["BTC"] * 200,
+            }))
+
+        if i % 60 == 0:
+            oi_prev, oi = oi, oi * (1.0 + rng.gauss(0.0, 0.01))
+            events.append(ReplayEvent(minute_start, "derivatives", {
+                "symbol": "BTC", "funding": round(rng.gauss(0.0001, 0.0002), 6), "oi": round(oi, 2),
+                "oi_change_pct": round((oi / oi_prev - 1.0) * 100.0, 4),
+                "cvd_spot_slope": round(rng.gauss(0.0, 1.0), 4), "cvd_fut_slope": None,
+            }))
+
+    return Recording(events)
@@ -0,0 +1,136 @@
+# app/replay/stubs.py
+"""
+Локальные заглушки внешнего мира для replay: биржи, деривативы, Telegram и сеть.
+"""
+
+from __future__ import annotations
+
+import bisect
+import hashlib
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..infrastructure.market_data_service import DerivativesSnapshot
+
+
+class ReplayNetworkError(RuntimeError):
+    """Код под replay попытался сходить в сеть мимо заглушек."""
+
+
+class SimClock:
+    """Симулированное время (мс), которое двигает харнесс."""
+
+    def __init__(self, now_ms: int = 0):
+        self.now_ms = now_ms
+
+    def advance_to(self, ts_ms: int) -> None:
+        if ts_ms > self.now_ms:
+            self.now_ms = ts_ms
+
+    def hhmm(self) -> str:
+        minutes = (self.now_ms // 60_000) % 1440
+        return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class StubExchangeClient:
+    """
+    Клиент биржи для TradesCollectorService: отдаёт записанные сделки.
+    Интерфейс как у domain.twap_detector.exchange_client (name, get_all_trades).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._trades: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+
+    def add_trade(self, symbol: str, ts: int, price: float, qty: float, is_buyer: bool) -> None:
+        # события приходят упорядоченными по времени — append сохраняет сортировку
+        self._trades.setdefault(symbol, []).append(
+            (ts, {"time": ts, "price": price, "qty": qty, "is_buyer": bool(is_buyer)})
+        )
+
+    def symbols(self) -> List[str]:
+        return sorted(self._trades)
+
+    def get_all_trades(self, symbol: str, since_ms: int, until_ms: Optional[int] = None) -> List[Dict[str, Any]]:
+        rows = self._trades.get(symbol, [])
+        lo = bisect.bisect_left(rows, since_ms, key=lambda r: r[0])
+        hi = len(rows) if until_ms is None else bisect.bisect_right(rows, until_ms, key=lambda r: r[0])
+        return [t for _, t in rows[lo:hi]]
+
+
+class StubDerivatives:
+    """Снимки деривативов «на момент времени» (последний снимок с ts ≤ now)."""
+
+    def __init__(self):
+        self._snaps: Dict[str, List[Tuple[int, DerivativesSnapshot]]] = {}
+
+    def add_snapshot(self, symbol: str, ts: int, data: Dict[str, Any]) -> None:
+        snap = DerivativesSnapshot(
+            funding=data.get("funding"), oi=data.get("oi"), oi_change_pct=data.get("oi_change_pct"),
+            cvd_spot_slope=data.get("cvd_spot_slope"), cvd_fut_slope=data.get("cvd_fut_slope"),
+            quality="full",
+        )
+        self._snaps.setdefault(symbol, []).append((ts, snap))
+
+    def get(self, symbol: str, now_ms: int) -> DerivativesSnapshot:
+        rows = self._snaps.get(symbol, [])
+        i = bisect.bisect_right(rows, now_ms, key=lambda r: r[0])
+        return rows[i - 1][1] if i else DerivativesSnapshot()
+
+
+class StubTelegram:
+    """Вместо Bot API: запоминает отправленные сообщения (ts, chat_id, text)."""
+
+    def __init__(self, clock: SimClock):
+        self.clock = clock
+        self.sent: List[Tuple[int, int, str]] = []
+
+    def send_message(self, chat_id: int, text: str, **_kwargs) -> None:
+        self.sent.append((self.clock.now_ms, int(chat_id), text))
+
+    def transcript(self) -> List[Tuple[int, int, str]]:
+        """(ts, chat_id, sha1 текста) — компактно для golden-файлов."""
+        return [(ts, cid, hashlib.sha1(t.encode("utf-8")).hexdigest()[:16]) for ts, cid, t in self.sent]
+
+
+@contextmanager
+def offline():
+    """Запрещает исходящий HTTP (requests/aiohttp) на время replay."""
+    restore = []
+
+    def _deny(*_args, **_kwargs):
+        raise ReplayNetworkError("network access is disabled during replay")
+
+    async def _deny_async(*_args, **_kwargs):
+        raise ReplayNetworkError("network access is disabled during replay")
+
+    try:
+        from requests.adapters import HTTPAdapter
+        restore.append((HTTPAdapter, "send", HTTPAdapter.send))
+        HTTPAdapter.send = _deny
+    except ImportError:
+        pass
+    try:
+        import aiohttp
+        restore.append((aiohttp.ClientSession, "_request", aiohttp.ClientSession._request))
+        aiohttp.ClientSession._request = _deny_async
+    except ImportError:
+        pass
+    try:
+        yield
+    finally:
+        for owner, name, orig in restore:
+            setattr(owner, name, orig)
+
+
+@contextmanager
+def patched_clock(clock: SimClock):
+    """Подменяет «текущее время» в коде, который печатает его в тексты (отчёты)."""
+    from ..usecases import generate_report
+
+    orig = generate_report._now_hhmm
+    generate_report._now_hhmm = clock.hhmm
+    try:
+        yield
+    finally:
+        generate_report._now_hhmm = orig
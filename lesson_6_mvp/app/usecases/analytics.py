@@ -1,13 +1,20 @@
 # app/usecases/analytics.py
 from __future__ import annotations
 
+import logging
 import math
+import os
 from dataclasses import dataclass
 from typing import Dict, List, Tuple, Iterable
 
 import numpy as np
 import pandas as pd
 
+logger = logging.getLogger("alt_forecast.analytics")
+
+# corr/beta, volatility и breadth из потоковой статистики (usecases.streaming_stats), если окна совпадают
+STREAM_STATS = os.getenv("STREAM_STATS", "1") == "1"
+
 
 # ===== базовые утилы ==========================================================
 
@@ -68,6 +75,17 @@ def _ohlcv_df(db, metric: str, timeframe: str, n: int = 1200) -> pd.DataFrame:
     return df
 
 
+def _streaming(db):
+    """Потоковая статистика по БД или None — тогда считаем по барам."""
+    if not STREAM_STATS:
+        return None
+    from .streaming_stats import get_streaming_stats
+    try:
+        return get_streaming_stats(db)
+    except TypeError:                               # не DB (заглушки) — в WeakKeyDictionary не кладётся
+        return None
+
+
 def _is_finite(x) -> bool:
     try:
         xf = float(x)
@@ -82,7 +100,16 @@ def corr_matrix_and_beta(db, metrics: List[str], base: str, timeframe: str, n: i
     """
     Возвращает (corr_df, betas_dict), где бета = Cov(asset, base) / Var(base).
     Безопасно обрабатывает нулевую дисперсию бенчмарка.
+    Окно n совпадает с потоковой статистикой — ответ из неё, без чтения баров.
     """
+    stats = _streaming(db)
+    if stats is not None and n == stats.corr_bars:
+        try:
+            res = stats.corr_beta(timeframe, metrics, base)
+            if res is not None:
+                return res
+        except Exception:
+            logger.exception("streaming corr/beta failed, falling back to bars")
     df = _closes_df(db, metrics, timeframe, n)
     if df.empty or base not in df.columns:
         return pd.DataFrame(), {}
@@ -139,7 +166,20 @@ def atr(series: pd.DataFrame, period: int = 14) -> float:
 def vol_regime(db, metric: str, timeframe: str, n: int = 1200) -> VolStats:
     """
     rv7/rv30, ATR14 и грубая классификация режима по перцентилю текущей волы (RV30) на истории.
+    При окне потоковой статистики RV и перцентиль берутся из неё, с диска — только 15 баров на ATR.
     """
+    stats = _streaming(db)
+    if stats is not None and n == stats.vol_bars:
+        try:
+            rv7 = stats.realized_vol(timeframe, metric, 7)
+            if rv7 is not None:
+                rv30 = stats.realized_vol(timeframe, metric, 30)
+                pctl = stats.vol_percentile(timeframe, metric)
+                a14 = atr(_ohlcv_df(db, metric, timeframe, 15), 14)
+                return VolStats(rv7, rv30, a14, _vol_regime_label(pctl), pctl)
+        except Exception:
+            logger.exception("streaming vol regime failed, falling back to bars")
+
     df = _ohlcv_df(db, metric, timeframe, n)
     if df.empty or len(df) < 60:
         return VolStats(float("nan"), float("nan"), float("nan"), "n/a", float("nan"))
@@ -150,14 +190,18 @@ def vol_regime(db, metric: str, timeframe: str, n: int = 1200) -> VolStats:
     rv_hist = df["c"].pct_change().rolling(30).std().dropna()
     if rv_hist.empty or not np.isfinite(rv_hist.iloc[-1]):
         pctl = float("nan")
-        regime = "unknown"
     else:
         cur = float(rv_hist.iloc[-1])
         pctl = float((rv_hist <= cur).mean() * 100.0)
-        regime = "low" if pctl < 33 else ("high" if pctl > 66 else "normal")
 
     a14 = atr(df, 14)
-    return VolStats(rv7, rv30, a14, regime, pctl)
+    return VolStats(rv7, rv30, a14, _vol_regime_label(pctl), pctl)
+
+
+def _vol_regime_label(pctl: float) -> str:
+    if not np.isfinite(pctl):
+        return "unknown"
+    return "low" if pctl < 33 else ("high" if pctl > 66 else "normal")
 
 
 # ===== 6) уровни S/R и пробои =================================================
@@ -217,7 +261,16 @@ def breadth(db, metrics: List[str], timeframe: str, ma_short: int = 50, ma_long:
     """
     Возвращает словарь с количеством/долей метрик выше MA50/MA200.
     Устойчив к пустым сериям; деление на ноль исключено.
+    MA из потоковой статистики, если она покрывает запрос.
     """
+    stats = _streaming(db)
+    if stats is not None and n >= ma_long:
+        try:
+            res = stats.breadth(timeframe, metrics, ma_short, ma_long)
+            if res is not None:
+                return res
+        except Exception:
+            logger.exception("streaming breadth failed, falling back to bars")
     df = _closes_df(db, metrics, timeframe, n)
     if df.empty:
         return {"above_ma50": 0, "above_ma200": 0, "total": 0, "pct_ma50": 0.0, "pct_ma200": 0.0}
@@ -274,26 +327,17 @@ def backtest_rsi(
     rs = up / dn.replace(0, np.nan)
     rsi = (100 - (100 / (1 + rs))).bfill()
 
-    pos = 0
-    entry = 0.0
-    pnl: List[float] = []
-    wins = 0
-    trades = 0
-
-    for i in range(1, len(df)):
-        # вход: пересечение снизу уровня lower
-        if pos == 0 and rsi.iloc[i - 1] < lower <= rsi.iloc[i]:
-            pos = 1
-            entry = float(df["c"].iloc[i])
-            trades += 1
-        # выход: пересечение снизу уровня upper
-        elif pos == 1 and rsi.iloc[i - 1] < upper <= rsi.iloc[i]:
-            ret = float(df["c"].iloc[i]) / entry - 1.0
-            wins += int(ret > 0)
-            pnl.append(ret)
-            pos = 0
-
-    total = float(np.sum(pnl)) if pnl else 0.0
+    # сигналы — пересечения снизу уровней lower / upper; позиция и сделки — векторным движком
+    from .backtest import cross_up, positions, run_signals
+
+    r = rsi.to_numpy(dtype=float)
+    entries, exits = cross_up(r, lower), cross_up(r, upper)
+    stats = run_signals(df["c"].to_numpy(dtype=float), entries, exits, timeframe=timeframe)
+    pnl = stats.trade_returns
+    wins = int((pnl > 0).sum())
+    trades = stats.trades + int(positions(entries, exits)[-1])  # открытая позиция тоже считается входом
+
+    total = float(np.sum(pnl)) if len(pnl) else 0.0
     winrate = (wins / trades * 100.0) if trades > 0 else float("nan")
 
     rets = pd.Series(pnl, dtype=float)
@@ -0,0 +1,532 @@
+# app/usecases/backtest.py
+"""
+Векторный бэктест стратегий и перебор параметров.
+
+Стратегия = индикатор на ядрах domain.kernels + правило, дающее булевы массивы входов/выходов.
+Позиция (long-only) считается без цикла по барам: вход при flat, выход при позиции,
+одновременные вход+выход на одном баре переворачивают состояние — ровно как if/elif-цикл
+старого backtest_rsi. Сделка исполняется по close сигнального бара; комиссия и проскальзывание
+списываются с каждой стороны (множитель 1 − cost к equity).
+
+Перебор: сетка {параметр: [значения]} × метрики × ТФ. Индикатор считается один раз на
+(метрика, ТФ, параметры индикатора), все пороги правила — столбцами одной матрицы; группы
+раскладываются по процессам (spawn, как render_service / ml.batch_forecaster).
+
+    res = get_backtester().sweep(db, "rsi", {"period": [7, 14, 21], "lower": [20, 30], "upper": [70, 80]},
+                                 metrics=["BTC"], timeframes=["15m", "1h"])
+    format_table(res, top=10)
+"""
+
+from __future__ import annotations
+
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..domain import kernels
+
+log = logging.getLogger("alt_forecast.backtest")
+
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", "2"))
+# сколько комбинаций правила симулируется одной матрицей (память ~ бары × chunk × 8 байт × ~3)
+BACKTEST_CHUNK = int(os.getenv("BACKTEST_CHUNK", "32"))
+# глубина истории по умолчанию: ~3 года 15m
+BACKTEST_BARS = int(os.getenv("BACKTEST_BARS", "105000"))
+BACKTEST_FEE_BPS = float(os.getenv("BACKTEST_FEE_BPS", "10"))
+BACKTEST_SLIPPAGE_BPS = float(os.getenv("BACKTEST_SLIPPAGE_BPS", "5"))
+# строки с меньшим числом сделок уходят в конец рейтинга
+BACKTEST_MIN_TRADES = int(os.getenv("BACKTEST_MIN_TRADES", "5"))
+
+# крипта торгуется 24/7
+BARS_PER_YEAR: Dict[str, float] = {"15m": 35040, "1h": 8760, "4h": 2190, "1d": 365}
+
+
+# ---------- данные ----------
+
+@dataclass(frozen=True)
+class Bars:
+    """OHLC одного ряда (метрика × ТФ) в виде float-массивов."""
+    ts: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+
+    def __len__(self) -> int:
+        return int(self.close.shape[0])
+
+
+def load_bars(db, metric: str, timeframe: str, n: int = BACKTEST_BARS) -> Optional[Bars]:
+    """Бары из БД (дедуп и очистка — как в analytics._ohlcv_df)."""
+    from .analytics import _ohlcv_df
+
+    df = _ohlcv_df(db, metric, timeframe, n)
+    if df.empty:
+        return None
+    return Bars(
+        ts=df.index.as_unit("ms").asi8,
+        high=df["h"].to_numpy(dtype=float),
+        low=df["l"].to_numpy(dtype=float),
+        close=df["c"].to_numpy(dtype=float),
+    )
+
+
+# ---------- издержки и результат ----------
+
+@dataclass(frozen=True)
+class CostModel:
+    """Комиссия и проскальзывание в б.п. на сторону."""
+    fee_bps: float = BACKTEST_FEE_BPS
+    slippage_bps: float = BACKTEST_SLIPPAGE_BPS
+
+    @property
+    def per_side(self) -> float:
+        return (self.fee_bps + self.slippage_bps) / 10_000.0
+
+
+NO_COSTS = CostModel(0.0, 0.0)
+
+
+@dataclass
+class BacktestStats:
+    """Итог одной комбинации. Доходности — доли (0.05 = 5%)."""
+    trades: int             # закрытые сделки
+    winrate: float          # доля прибыльных закрытых сделок
+    total_ret: float        # equity[-1] − 1 (открытая позиция — по последнему close)
+    sharpe: float           # годовой, по побарным доходностям
+    max_drawdown: float     # ≤ 0
+    exposure: float         # доля баров в позиции
+    avg_trade: float
+    equity: Optional[np.ndarray] = field(default=None, repr=False)
+    trade_returns: Optional[np.ndarray] = field(default=None, repr=False)
+
+
+# ---------- движок ----------
+
+def transitions(entries: np.ndarray, exits: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Смены позиции по матрицам сигналов (k, n): (col_in, bar_in, col_out, bar_out), отсортировано по (col, bar).
+    Чистый вход → 1, чистый выход → 0, вход+выход на одном баре → переворот.
+    Считается только по барам с сигналами (их единицы процентов), без плотного прохода по (k, n).
+    """
+    e_m = np.atleast_2d(np.asarray(entries, dtype=bool))
+    x_m = np.atleast_2d(np.asarray(exits, dtype=bool))
+    col, bar = np.nonzero(e_m | x_m)
+    if col.size == 0:
+        empty = np.zeros(0, dtype=np.intp)
+        return empty, empty, empty, empty
+    e, x = e_m[col, bar], x_m[col, bar]
+    j = np.arange(col.size)
+    first = np.r_[True, col[1:] != col[:-1]]
+    start = np.maximum.accumulate(np.where(first, j, 0))
+    # состояние = последний «чистый» сигнал в столбце, перевёрнутый столько раз, сколько было конфликтов после него
+    last = np.maximum.accumulate(np.where(e ^ x, j, -1))
+    has = last >= start
+    li = np.where(has, last, 0)
+    flips = np.cumsum(e & x)
+    ref = np.where(has, flips[li], np.where(start > 0, flips[start - 1], 0))
+    state = (has & e[li]) ^ ((flips - ref) & 1).astype(bool)
+    prev = np.r_[False, state[:-1]] & ~first
+    enter, leave = state & ~prev, prev & ~state
+    return col[enter], bar[enter], col[leave], bar[leave]
+
+
+def positions(entries: np.ndarray, exits: np.ndarray) -> np.ndarray:
+    """Позиция после каждого бара (bool, форма как у entries: (n,) или (k, n))."""
+    e = np.asarray(entries, dtype=bool)
+    k, n = (1, e.shape[0]) if e.ndim == 1 else e.shape
+    ci, bi, co, bo = transitions(entries, exits)
+    d = np.zeros((k, n + 1), dtype=np.int8)
+    d[ci, bi] += 1
+    d[co, bo] -= 1
+    pos = np.cumsum(d[:, :n], axis=1, dtype=np.int8) > 0
+    return pos[0] if e.ndim == 1 else pos
+
+
+def simulate(close: np.ndarray, entries: np.ndarray, exits: np.ndarray,
+             cost: float = 0.0, bars_per_year: float = 8760, with_equity: bool = False) -> Dict[str, np.ndarray]:
+    """
+    Матричная симуляция: entries/exits (k, n) → метрики по k комбинациям.
+    Бар входа: −cost; бары в позиции: r_t; бар выхода: (1 + r_t)(1 − cost) − 1.
+    Сделка = close[exit]/close[entry]·(1 − cost)² − 1; открытая позиция оценивается по последнему close.
+    Сделки, доходность, Шарп и экспозиция — по префиксным суммам на барах смены позиции;
+    плотный проход (k, n) нужен только для просадки.
+    """
+    close = np.asarray(close, dtype=float)
+    e_m = np.atleast_2d(entries)
+    k, n = e_m.shape
+    ci, bi, co, bo = transitions(e_m, exits)
+
+    r = np.zeros(n)
+    r[1:] = close[1:] / close[:-1] - 1.0
+    s1 = np.cumsum(r)
+    s2 = np.cumsum(r * r)
+
+    # последний вход в столбце без выхода — открытая позиция
+    open_mask = np.zeros(ci.size, dtype=bool)
+    if ci.size:
+        last_of_col = np.r_[ci[1:] != ci[:-1], True]
+        closed_per_col = np.bincount(co, minlength=k)
+        opened_per_col = np.bincount(ci, minlength=k)
+        open_mask = last_of_col & (opened_per_col[ci] > closed_per_col[ci])
+    oc, ob = ci[open_mask], bi[open_mask]
+    ei = bi[~open_mask]                                  # входы закрытых сделок, выровнены с (co, bo)
+
+    keep = (1.0 - cost)
+    trade_ret = close[bo] / close[ei] * keep * keep - 1.0
+    rx = r[bo]
+    exit_ret = rx - cost - cost * rx
+    sum_closed = s1[bo] - s1[ei] - rx + exit_ret - cost
+    sq_closed = s2[bo] - s2[ei] - rx * rx + exit_ret * exit_ret + cost * cost
+    sum_open = s1[-1] - s1[ob] - cost
+    sq_open = s2[-1] - s2[ob] + cost * cost
+
+    total = np.bincount(co, weights=sum_closed, minlength=k) + np.bincount(oc, weights=sum_open, minlength=k)
+    total_sq = np.bincount(co, weights=sq_closed, minlength=k) + np.bincount(oc, weights=sq_open, minlength=k)
+    mean = total / n
+    var = np.maximum(total_sq - n * mean * mean, 0.0) / max(n - 1, 1)
+    std = np.sqrt(var)
+
+    log_keep = math.log(keep) if keep > 0 else -np.inf
+    log_closed = np.log(close[bo] / close[ei]) + 2 * log_keep
+    log_open = np.log(close[-1] / close[ob]) + log_keep
+    log_eq = np.bincount(co, weights=log_closed, minlength=k) + np.bincount(oc, weights=log_open, minlength=k)
+
+    trades = np.bincount(co, minlength=k)
+    wins = np.bincount(co, weights=(trade_ret > 0).astype(float), minlength=k)
+    sums = np.bincount(co, weights=trade_ret, minlength=k)
+    held = np.bincount(co, weights=(bo - ei).astype(float), minlength=k) + np.bincount(oc, weights=(n - ob).astype(float), minlength=k)
+
+    # просадка: лог-equity по барам, (k, n) построчно (вдоль непрерывной оси)
+    d = np.zeros((k, n + 1), dtype=np.int8)
+    d[ci, bi] += 1
+    d[co, bo] -= 1
+    pos = np.cumsum(d[:, :n], axis=1, dtype=np.int8)
+    lr = np.zeros(n)
+    lr[1:] = np.log(close[1:] / close[:-1])
+    inc = np.zeros((k, n))
+    np.multiply(pos[:, :-1], lr[1:], out=inc[:, 1:])
+    inc[ci, bi] += log_keep
+    inc[co, bo] += log_keep
+    curve = np.cumsum(inc, axis=1)
+    dd = (curve - np.maximum.accumulate(np.maximum(curve, 0.0), axis=1)).min(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = {
+            "trades": trades,
+            "winrate": np.where(trades > 0, wins / trades, np.nan),
+            "total_ret": np.expm1(log_eq),
+            "sharpe": np.where(std > 0, mean / std * math.sqrt(bars_per_year), np.nan),
+            "max_drawdown": np.expm1(dd),
+            "exposure": held / n,
+            "avg_trade": np.where(trades > 0, sums / trades, np.nan),
+            "trade_cols": co,
+            "trade_returns": trade_ret,
+        }
+    if with_equity:
+        out["equity"] = np.exp(curve)
+    return out
+
+
+def run_signals(close: np.ndarray, entries: np.ndarray, exits: np.ndarray,
+                costs: CostModel = NO_COSTS, timeframe: str = "1h") -> BacktestStats:
+    """Одна комбинация сигналов (n,) → BacktestStats с equity и доходностями сделок."""
+    out = simulate(close, np.asarray(entries)[None, :], np.asarray(exits)[None, :],
+                   costs.per_side, BARS_PER_YEAR.get(timeframe, 8760), with_equity=True)
+    return BacktestStats(
+        trades=int(out["trades"][0]), winrate=float(out["winrate"][0]),
+        total_ret=float(out["total_ret"][0]), sharpe=float(out["sharpe"][0]),
+        max_drawdown=float(out["max_drawdown"][0]), exposure=float(out["exposure"][0]),
+        avg_trade=float(out["avg_trade"][0]),
+        equity=out["equity"][0], trade_returns=out["trade_returns"],
+    )
+
+
+# ---------- стратегии ----------
+
+def cross_up(series: np.ndarray, level) -> np.ndarray:
+    """prev < level ≤ cur; level — скаляр или вектор порогов (→ матрица (k, n))."""
+    s = np.asarray(series, dtype=float)
+    lv = np.asarray(level, dtype=float)
+    prev = np.r_[np.nan, s[:-1]]
+    if lv.ndim:
+        lv = lv[:, None]
+    return (prev < lv) & (lv <= s)
+
+
+def cross_down(series: np.ndarray, level) -> np.ndarray:
+    """prev > level ≥ cur."""
+    s = np.asarray(series, dtype=float)
+    lv = np.asarray(level, dtype=float)
+    prev = np.r_[np.nan, s[:-1]]
+    if lv.ndim:
+        lv = lv[:, None]
+    return (prev > lv) & (lv >= s)
+
+
+@dataclass(frozen=True)
+class Strategy:
+    """
+    indicator(bars, **indicator_params) → ndarray;
+    signals(ind, bars, **rule_params) → (entries, exits) формы (k, n), где каждый rule-параметр — вектор длины k.
+    """
+    name: str
+    indicator_keys: Tuple[str, ...]
+    rule_keys: Tuple[str, ...]
+    indicator: Callable[..., np.ndarray]
+    signals: Callable[..., Tuple[np.ndarray, np.ndarray]]
+    default_grid: Dict[str, List[float]]
+    valid: Callable[[Dict[str, float]], bool] = lambda p: True
+
+
+def _rsi_indicator(bars: Bars, period: int) -> np.ndarray:
+    return kernels.rsi(bars.close, int(period))
+
+
+def _rsi_signals(ind: np.ndarray, bars: Bars, lower: np.ndarray, upper: np.ndarray):
+    return cross_up(ind, lower), cross_up(ind, upper)
+
+
+def _ema_diff(bars: Bars, fast: int, slow: int) -> np.ndarray:
+    return kernels.ema(bars.close, int(fast)) - kernels.ema(bars.close, int(slow))
+
+
+def _macd_hist(bars: Bars, fast: int, slow: int, signal: int) -> np.ndarray:
+    return kernels.macd(bars.close, int(fast), int(slow), int(signal))[2]
+
+
+def _zero_cross_signals(ind: np.ndarray, bars: Bars):
+    return cross_up(ind, [0.0]), cross_down(ind, [0.0])
+
+
+STRATEGIES: Dict[str, Strategy] = {
+    "rsi": Strategy(
+        "rsi", ("period",), ("lower", "upper"), _rsi_indicator, _rsi_signals,
+        {"period": [7, 10, 14, 21], "lower": [20, 25, 30, 35], "upper": [65, 70, 75, 80]},
+        valid=lambda p: p["lower"] < p["upper"],
+    ),
+    "ema": Strategy(
+        "ema", ("fast", "slow"), (), _ema_diff, _zero_cross_signals,
+        {"fast": [5, 9, 12, 20], "slow": [21, 26, 50, 100]},
+        valid=lambda p: p["fast"] < p["slow"],
+    ),
+    "macd": Strategy(
+        "macd", ("fast", "slow", "signal"), (), _macd_hist, _zero_cross_signals,
+        {"fast": [8, 12], "slow": [21, 26], "signal": [5, 9]},
+        valid=lambda p: p["fast"] < p["slow"],
+    ),
+}
+
+
+def expand_grid(strategy: Strategy, grid: Optional[Dict[str, Sequence[float]]] = None) -> Dict[Tuple, List[Dict[str, float]]]:
+    """Сетка → {значения индикаторных параметров: [полные комбинации]} (невалидные отброшены)."""
+    grid = {**strategy.default_grid, **(grid or {})}
+    keys = strategy.indicator_keys + strategy.rule_keys
+    unknown = set(grid) - set(keys)
+    if unknown:
+        raise ValueError(f"{strategy.name}: неизвестные параметры {sorted(unknown)}")
+    groups: Dict[Tuple, List[Dict[str, float]]] = {}
+    for values in itertools.product(*(grid[k] for k in keys)):
+        params = dict(zip(keys, values))
+        if strategy.valid(params):
+            groups.setdefault(tuple(params[k] for k in strategy.indicator_keys), []).append(params)
+    return groups
+
+
+def _run_group(strategy_name: str, bars: Bars, combos: List[Dict[str, float]],
+               cost: float, bars_per_year: float, chunk: int) -> List[Dict[str, float]]:
+    """Воркер: один индикатор, все комбинации правила — матрицами по chunk столбцов."""
+    strat = STRATEGIES[strategy_name]
+    ind = strat.indicator(bars, **{k: combos[0][k] for k in strat.indicator_keys})
+    out: List[Dict[str, float]] = []
+    keys = ("trades", "winrate", "total_ret", "sharpe", "max_drawdown", "exposure", "avg_trade")
+    for s in range(0, len(combos), max(1, chunk)):
+        part = combos[s:s + chunk]
+        rules = {k: np.array([c[k] for c in part], dtype=float) for k in strat.rule_keys}
+        entries, exits = strat.signals(ind, bars, **rules)
+        if entries.shape[0] == 1 and len(part) > 1:   # правило без параметров
+            entries = np.repeat(entries, len(part), axis=0)
+            exits = np.repeat(exits, len(part), axis=0)
+        res = simulate(bars.close, entries, exits, cost, bars_per_year)
+        for j in range(len(part)):
+            out.append({k: float(res[k][j]) for k in keys})
+    return out
+
+
+# ---------- перебор ----------
+
+@dataclass
+class SweepRow:
+    metric: str
+    timeframe: str
+    strategy: str
+    params: Dict[str, float]
+    stats: BacktestStats
+
+
+@dataclass
+class SweepResult:
+    strategy: str
+    rows: List[SweepRow]          # отсортированы по rank_by
+    rank_by: str
+    combos: int
+    elapsed_sec: float
+    missing: List[Tuple[str, str]] = field(default_factory=list)   # (metric, tf) без баров
+
+    def top(self, k: int = 10) -> List[SweepRow]:
+        return self.rows[:k]
+
+
+def rank_rows(rows: List[SweepRow], by: str = "sharpe", min_trades: int = BACKTEST_MIN_TRADES) -> List[SweepRow]:
+    """По убыванию `by`; NaN и строки с малым числом сделок — в конце."""
+    def key(r: SweepRow):
+        v = getattr(r.stats, by)
+        ok = r.stats.trades >= min_trades and v == v
+        return (0 if ok else 1, -v if v == v else 0.0)
+    return sorted(rows, key=key)
+
+
+class Backtester:
+    """Перебор параметров; группы (метрика × ТФ × индикатор) считаются в пуле процессов."""
+
+    def __init__(self, max_workers: int = BACKTEST_WORKERS, chunk: int = BACKTEST_CHUNK):
+        self.max_workers = max(0, int(max_workers))
+        self.chunk = max(1, int(chunk))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.max_workers <= 0:
+            return None
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn: процесс бота многопоточный, fork небезопасен (как в render_service)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+                log.info("backtest pool started: workers=%d", self.max_workers)
+            return self._pool
+
+    def shutdown(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def sweep(
+        self,
+        source,
+        strategy: str,
+        grid: Optional[Dict[str, Sequence[float]]] = None,
+        metrics: Iterable[str] = ("BTC",),
+        timeframes: Iterable[str] = ("1h",),
+        costs: CostModel = CostModel(),
+        n: int = BACKTEST_BARS,
+        rank_by: str = "sharpe",
+        min_trades: int = BACKTEST_MIN_TRADES,
+    ) -> SweepResult:
+        """
+        source — DB (бары читаются load_bars) или callable(metric, tf, n) → Bars | None.
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"неизвестная стратегия: {strategy} (есть: {', '.join(STRATEGIES)})")
+        started = time.perf_counter()
+        groups = expand_grid(STRATEGIES[strategy], grid)
+        loader = source if callable(source) else (lambda m, tf, k: load_bars(source, m, tf, k))
+
+        tasks: List[Tuple[str, str, List[Dict[str, float]], tuple]] = []
+        missing: List[Tuple[str, str]] = []
+        for metric in metrics:
+            for tf in timeframes:
+                bars = loader(metric, tf, n)
+                if bars is None or len(bars) < 2:
+                    missing.append((metric, tf))
+                    continue
+                for combos in groups.values():
+                    tasks.append((metric, tf, combos,
+                                  (strategy, bars, combos, costs.per_side, BARS_PER_YEAR.get(tf, 8760), self.chunk)))
+
+        results = self._map([args for *_, args in tasks])
+        rows: List[SweepRow] = []
+        for (metric, tf, combos, _args), stats in zip(tasks, results):
+            for params, st in zip(combos, stats):
+                rows.append(SweepRow(metric, tf, strategy, params, BacktestStats(trades=int(st.pop("trades")), **st)))
+
+        elapsed = time.perf_counter() - started
+        log.info("backtest sweep %s: %d combos, %d groups in %.2fs", strategy, len(rows), len(tasks), elapsed)
+        return SweepResult(strategy, rank_rows(rows, rank_by, min_trades), rank_by, len(rows), elapsed, missing)
+
+    def _map(self, arglist: List[tuple]) -> List[List[Dict[str, float]]]:
+        pool = self._get_pool() if len(arglist) > 1 else None
+        if pool is None:
+            return [_run_group(*a) for a in arglist]
+        try:
+            futs = [pool.submit(_run_group, *a) for a in arglist]
+            return [f.result() for f in futs]
+        except BrokenProcessPool:
+            log.warning("backtest pool is broken, restarting and running inline")
+            self.shutdown()
+            return [_run_group(*a) for a in arglist]
+
+
+_backtester: Optional[Backtester] = None
+
+
+def get_backtester() -> Backtester:
+    global _backtester
+    if _backtester is None:
+        _backtester = Backtester()
+    return _backtester
+
+
+# ---------- вывод для бота ----------
+
+def _fmt_params(params: Dict[str, float]) -> str:
+    return " ".join(f"{v:g}" for v in params.values())
+
+
+def format_table(result: SweepResult, top: int = 10) -> str:
+    """Рейтинг для Telegram (HTML, моноширинная таблица)."""
+    head = (f"<b>BT sweep {result.strategy}</b> — {result.combos} комбинаций за {result.elapsed_sec:.1f}s, "
+            f"сортировка: {result.rank_by}")
+    rows = result.top(top)
+    if not rows:
+        return head + "\nнет данных"
+    keys = "/".join(rows[0].params)
+    lines = [f"{'#':>2} {'метрика':<7} {'tf':<3} {keys:<14} {'trd':>4} {'win':>4} {'ret%':>7} {'shrp':>5} {'mdd%':>6}"]
+    for i, r in enumerate(rows, 1):
+        s = r.stats
+        win = f"{s.winrate * 100:.0f}" if s.winrate == s.winrate else "—"
+        shrp = f"{s.sharpe:.2f}" if s.sharpe == s.sharpe else "—"
+        lines.append(f"{i:>2} {r.metric:<7} {r.timeframe:<3} {_fmt_params(r.params):<14} {s.trades:>4} "
+                     f"{win:>4} {s.total_ret * 100:>7.1f} {shrp:>5} {s.max_drawdown * 100:>6.1f}")
+    tail = ""
+    if result.missing:
+        tail = "\nнет баров: " + ", ".join(f"{m} {tf}" for m, tf in result.missing)
+    return head + "\n<pre>" + "\n".join(lines) + "</pre>" + tail
+
+
+def parse_sweep_args(args: Sequence[str], all_metrics: Sequence[str],
+                     all_timeframes: Sequence[str] = ("15m", "1h", "4h", "1d")) -> Tuple[str, List[str], List[str]]:
+    """
+    Аргументы после «/bt sweep»: [стратегия] [символы через запятую] [ТФ через запятую], в любом порядке.
+    Без символов/ТФ — все метрики / все ТФ.
+    """
+    strategy, metrics, tfs = "rsi", [], []
+    for a in args:
+        a_low = a.lower()
+        if a_low in STRATEGIES:
+            strategy = a_low
+        elif all(x in all_timeframes for x in a_low.split(",")):
+            tfs += a_low.split(",")
+        else:
+            metrics += [x.upper() for x in a.split(",") if x]
+    return strategy, metrics or list(all_metrics), tfs or list(all_timeframes)
@@ -1,8 +1,8 @@
 # app/usecases/generate_report.py (visual text v2.2: fix TZ attr, avg divisor, indentation)
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Dict, List, Tuple, Any
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Any
 
 from ..infrastructure.db import DB
 from ..domain.models import Metric, Timeframe
@@ -14,7 +14,6 @@ from ..domain.services import (
     trend_arrow,
     ARROW_UP, ARROW_DOWN, ARROW_FLAT,
 )
-from ..domain.divergence_detector import detect_divergences as detect_divergences_new, DivergenceSignal
 from ..lib.series import get_closes
 
 
@@ -208,42 +207,6 @@ def _pivots_for_side(closes: List[float], highs: List[float], lows: List[float],
 
     return None, None, None
 
-def _persist_divergences_new(db: DB, metric: Metric, tf: Timeframe, rows: list[tuple], div_signals: List[DivergenceSignal]):
-    """
-    Сохраняет дивергенции из нового детектора в БД.
-    rows: [(ts,o,h,l,c,v)] oldest→newest
-    """
-    if not div_signals or not rows:
-        return
-    ts_series = [r[0] for r in rows]
-    now_ts = ts_series[-1]
-
-    for ds in div_signals:
-        # Определяем implication из side и метрики
-        if ds.side == "bullish":
-            implication = "bullish_alts" if metric not in ("USDT.D", "BTC.D") else "bearish_alts"
-        else:
-            implication = "bearish_alts" if metric not in ("USDT.D", "BTC.D") else "bullish_alts"
-        
-        # Используем координаты из DivergenceSignal
-        pivot_l_ts = ts_series[ds.price_idx_left] if ds.price_idx_left < len(ts_series) else None
-        pivot_r_ts = ts_series[ds.price_idx_right] if ds.price_idx_right < len(ts_series) else None
-        
-        # Вычисляем score на основе strength
-        score = 0.0
-        if "(сильная)" in ds.strength:
-            score = 1.0
-        elif "(средняя)" in ds.strength:
-            score = 0.5
-        
-        db.upsert_div(
-            metric=metric, timeframe=tf, indicator=ds.indicator, side=ds.side,
-            implication=implication, pivot_l_ts=pivot_l_ts,
-            pivot_l_val=ds.price_val_left,
-            pivot_r_ts=pivot_r_ts, pivot_r_val=ds.price_val_right,
-            detected_ts=now_ts, score=score
-        )
-
 def _persist_divergences(db: DB, metric: Metric, tf: Timeframe, rows: list[tuple], divs):
     """
     rows: [(ts,o,h,l,c,v)] oldest→newest
@@ -312,26 +275,6 @@ def _fmt_levels(metric: Metric, levels: List[float]) -> str:
         return " / ".join(f"{lv:.6f}" for lv in levels)
     return " / ".join(f"{lv:.2f}" for lv in levels)
 
-def _arrows_for_tf_shift(db: DB, tf: Timeframe, shift: int = 1) -> Dict[Metric, str]:
-    """Как _arrows_for_tf, но считает «как если бы» последние `shift` баров не существовали."""
-    arrows: Dict[Metric, str] = {}
-    for m in METRICS:
-        closes = get_closes(db, m, tf, 100 + shift)  # oldest→newest
-        if len(closes) > shift:
-            closes = closes[:-shift]
-        closes = _denoise(closes)
-        arrows[m] = trend_arrow(closes, tf, eps_rel=0.0005)
-    return arrows
-
-def _pair_series_shift(db: DB, tf: Timeframe, n: int = 320, shift: int = 1) -> Dict[Metric, List[Tuple[int, float]]]:
-    res: Dict[Metric, List[Tuple[int, float]]] = {}
-    for m in METRICS:
-        rows = sorted(db.last_n(m, tf, n + shift), key=lambda r: r[0])
-        if shift and len(rows) > shift:
-            rows = rows[:-shift]
-        res[m] = [(ts, c) for (ts, _o, _h, _l, c, _v) in rows]
-    return res
-
 def _grade_weights_for_tf(db: DB, tf: Timeframe) -> dict[tuple[str, str, str], float]:
     """
     Строит словарь {(metric, indicator, side)->weight} для открытых (active+confirmed) дивергенций.
@@ -365,69 +308,8 @@ class TfCalc:
     arrows: Dict[Metric, str]
     counts: Dict[Metric, Tuple[int, int]]
     details: List[str]
-
-def _calc_for_tf_shift(db: DB, tf: Timeframe, shift: int = 1) -> TfCalc:
-    arrows = _arrows_for_tf_shift(db, tf, shift=shift)
-    details: List[str] = []
-    counts: Dict[Metric, Tuple[int, int]] = {m: (0, 0) for m in METRICS}
-
-    all_divs = []
-    for m in METRICS:
-        rows = sorted(db.last_n(m, tf, 320 + shift), key=lambda r: r[0])
-        if shift and len(rows) > shift:
-            rows = rows[:-shift]
-        if not rows:
-            continue
-        highs = [r[2] for r in rows]
-        lows = [r[3] for r in rows]
-        closes = _denoise([r[4] for r in rows])
-        vols = [r[5] for r in rows]
-        
-        # Используем новый детектор дивергенций
-        div_signals = detect_divergences_new(m, tf, closes, highs, lows, vols, enabled_indicators=None)
-        
-        # Преобразуем DivergenceSignal в старый формат Divergence для совместимости
-        from ..domain.models import Divergence
-        divs = []
-        for ds in div_signals:
-            # Определяем implication из side
-            if ds.side == "bullish":
-                implication = "bullish_alts" if m not in ("USDT.D", "BTC.D") else "bearish_alts"
-            else:
-                implication = "bearish_alts" if m not in ("USDT.D", "BTC.D") else "bullish_alts"
-            divs.append(Divergence(tf, m, ds.indicator, ds.text, implication))
-        
-        # Также используем старый детектор для обратной совместимости
-        divs_old = indicator_divergences(m, tf, closes, vols)
-        divs.extend(divs_old)
-        
-        _invalidate_by_price(db, m, tf, rows)
-        _persist_divergences_new(db, m, tf, rows, div_signals)
-        _persist_divergences(db, m, tf, rows, divs_old)  # Сохраняем старые для совместимости
-        _maybe_confirm(db, m, tf, rows)
-
-        try:
-            for (_id, ind, side, _impl, _rts, _rval, status, grade) in db.list_open_divs(m, tf)[:3]:
-                tag = "🟢 bull" if side == "bullish" else "🔴 bear"
-                if status == 'confirmed':
-                    gtxt = 'hard' if grade == 'hard' else 'soft'
-                    details.append(f"{m}: {tag} ({ind}) — подтв. {gtxt} (до отмены)")
-                else:
-                    details.append(f"{m}: {tag} ({ind}) — активна (до отмены)")
-        except Exception:
-            pass
-
-        all_divs.extend(divs)
-        bull = sum(1 for d in divs if "bullish" in d.implication)
-        bear = sum(1 for d in divs if "bearish" in d.implication)
-        counts[m] = (bull, bear)
-
-    pairs = pair_divergences(tf, _pair_series_shift(db, tf, 320, shift=shift))
-    all_divs.extend(pairs)
-
-    grade_weights = _grade_weights_for_tf(db, tf)
-    score, label = risk_score(tf, arrows, all_divs, grade_weights=grade_weights)
-    return TfCalc(score=score, label=label, arrows=arrows, counts=counts, details=details)
+    divs: Dict[Metric, List[Any]] = field(default_factory=dict)   # дивергенции метрик (Divergence)
+    pairs: List[Any] = field(default_factory=list)                # парные дивергенции
 
 def _arrows_for_tf(db: DB, tf: Timeframe) -> Dict[Metric, str]:
     arrows: Dict[Metric, str] = {}
@@ -527,9 +409,15 @@ def _shortcuts_block() -> str:
 
 # --------------- Public builders ---------------
 
+def _materialized_calcs(db: DB, order: Tuple[str, ...]) -> Dict[str, TfCalc]:
+    """TfCalc из материализованного состояния (пересчёт только у ТФ с новыми барами)."""
+    from .market_state import get_market_state
+    return {k: st.calc for k, st in get_market_state(db).snapshot(order).items()}
+
+
 def build_status_report(db: DB) -> str:
     order = ("15m", "1h", "4h", "1d")
-    tfs = {k: _calc_for_tf(db, k) for k in order}
+    tfs = _materialized_calcs(db, order)
     denom = max(1, len(tfs))
     avg = sum(t.score for t in tfs.values()) / denom
 
@@ -558,6 +446,7 @@ def _calc_for_tf(db: DB, tf: Timeframe) -> TfCalc:
     arrows = _arrows_for_tf(db, tf)
     details: List[str] = []
     counts: Dict[Metric, Tuple[int, int]] = {m: (0, 0) for m in METRICS}
+    divs_by_metric: Dict[Metric, List[Any]] = {}
 
     all_divs = []
     for m in METRICS:
@@ -572,6 +461,7 @@ def _calc_for_tf(db: DB, tf: Timeframe) -> TfCalc:
         _invalidate_by_price(db, m, tf, rows)
         _persist_divergences(db, m, tf, rows, divs)
         _maybe_confirm(db, m, tf, rows)
+        divs_by_metric[m] = divs
         all_divs.extend(divs)
         bull = sum(1 for d in divs if "bullish" in d.implication)
         bear = sum(1 for d in divs if "bearish" in d.implication)
@@ -598,13 +488,7 @@ def _calc_for_tf(db: DB, tf: Timeframe) -> TfCalc:
                     _id, ind, side, _impl, _rts, _rval = row
                     status, grade = "active", None
 
-                tag = "🟢 bull" if side == "bullish" else "🔴 bear"
-                if status == "confirmed":
-                    gtxt = "hard" if grade == "hard" else ("soft" if grade == "soft" else "")
-                    suffix = f"подтв.{(' ' + gtxt) if gtxt else ''}"
-                else:
-                    suffix = "активна"
-                details.append(f"{m}: {tag} ({ind}) — {suffix} (до отмены)")
+                details.append(format_open_div(m, ind, side, status, grade))
         except Exception:
             # не роняем отчёт, если таблицы/метода ещё нет
             pass
@@ -614,11 +498,22 @@ def _calc_for_tf(db: DB, tf: Timeframe) -> TfCalc:
 
     grade_weights = _grade_weights_for_tf(db, tf)
     score, label = risk_score(tf, arrows, all_divs, grade_weights=grade_weights)
-    return TfCalc(score=score, label=label, arrows=arrows, counts=counts, details=details)
+    return TfCalc(score=score, label=label, arrows=arrows, counts=counts, details=details,
+                  divs=divs_by_metric, pairs=list(pairs))
+
+def format_open_div(metric: str, indicator: str, side: str, status: str, grade: Optional[str]) -> str:
+    """Строка открытой (active/confirmed) дивергенции для отчёта и алертов."""
+    tag = "🟢 bull" if side == "bullish" else "🔴 bear"
+    if status == "confirmed":
+        gtxt = "hard" if grade == "hard" else ("soft" if grade == "soft" else "")
+        suffix = f"подтв.{(' ' + gtxt) if gtxt else ''}"
+    else:
+        suffix = "активна"
+    return f"{metric}: {tag} ({indicator}) — {suffix} (до отмены)"
 
 def build_full_report(db: DB) -> str:
     order = ("15m", "1h", "4h", "1d")
-    tfs = {k: _calc_for_tf(db, k) for k in order}
+    tfs = _materialized_calcs(db, order)
     denom = max(1, len(tfs))
     avg = sum(t.score for t in tfs.values()) / denom
 
@@ -651,19 +546,24 @@ def build_full_report(db: DB) -> str:
     parts.append("")
     parts.append(_tips_block())
 
-    # Изменения за последний час (сравнение с «снимком» на 1 бар раньше)
-    parts.append("")
+    # Изменения с прошлого закрытого бара — из истории материализованного состояния, без пересчёта
+    from .market_state import get_market_state
+    store = get_market_state(db)
     diffs: List[str] = []
     for k in order:
-        prev = _calc_for_tf_shift(db, k, shift=1)
+        prev = store.previous(k)
+        if prev is None:
+            continue
+        _ts, prev_score, prev_label = prev
         cur = tfs[k]
-        if prev.label != cur.label:
-            diffs.append(f"• {k}: {prev.label} → {cur.label} (счёт {prev.score:+.1f} → {cur.score:+.1f})")
-        elif prev.score != cur.score:
-            diffs.append(f"• {k}: счёт {prev.score:+.1f} → {cur.score:+.1f}")
+        if prev_label != cur.label:
+            diffs.append(f"• {k}: {prev_label} → {cur.label} (счёт {prev_score:+.1f} → {cur.score:+.1f})")
+        elif prev_score != cur.score:
+            diffs.append(f"• {k}: счёт {prev_score:+.1f} → {cur.score:+.1f}")
     if diffs:
-        diffs.append(f"• {k}: {prev.label} → {cur.label} (счёт {prev.score:+.1f} → {cur.score:+.1f})")
-        diffs.append(f"• {k}: счёт {prev.score:+.1f} → {cur.score:+.1f}")
+        parts.append("")
+        parts.append("<b>Изменения с прошлого бара</b>")
+        parts.extend(diffs)
 
     return "\n".join(parts)
 
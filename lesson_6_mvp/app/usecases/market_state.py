@@ -0,0 +1,209 @@
+# app/usecases/market_state.py
+"""
+Материализованное состояние рынка по таймфреймам: стрелки трендов, текущие дивергенции
+метрик, парные дивергенции и risk score/label — один объект на ТФ.
+
+Раньше каждое нажатие «Risk Now», «Альбом», «Дивергенции» и каждый отчёт заново читали
+по 320 баров на метрику и прогоняли детекторы. Теперь пересчёт идёт только когда у ТФ
+закрылся (или обновился) бар хотя бы одной метрики, а потребители читают готовое состояние.
+
+    store = get_market_state(db)
+    state = store.get("1h")          # O(1), пока бары не менялись
+    state.label, state.score, state.divergences["BTC"], state.pairs
+    store.refresh()                  # job воркера: пересчитать ТФ с новыми барами
+    store.changes("1h")              # смены risk-режима из короткой истории, без пересчёта
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from ..domain.models import Divergence, Metric
+from ..infrastructure.db import DB
+from .generate_report import METRICS, TfCalc, _calc_for_tf
+
+logger = logging.getLogger("alt_forecast.market_state")
+
+TIMEFRAMES: Tuple[str, ...] = ("15m", "1h", "4h", "1d")
+# сколько прошлых состояний на ТФ помним для «риск сменился X → Y»
+MARKET_STATE_HISTORY = int(os.getenv("MARKET_STATE_HISTORY", "48"))
+# если job обновления не крутится (API, скрипты), get() сам сверит версии баров не чаще этого
+MARKET_STATE_MAX_AGE_SEC = float(os.getenv("MARKET_STATE_MAX_AGE_SEC", "60"))
+
+# версия ТФ: последний бар каждой метрики (metric, ts, close)
+Version = Tuple[Tuple[str, int, float], ...]
+
+
+@dataclass(frozen=True)
+class MarketState:
+    """Снимок состояния одного ТФ на момент последнего закрытого бара."""
+    tf: str
+    calc: TfCalc
+    version: Version
+    bar_ts: int          # ts самого свежего бара среди метрик ТФ
+    updated_at: float    # time.time() пересчёта
+
+    @property
+    def score(self) -> float:
+        return self.calc.score
+
+    @property
+    def label(self) -> str:
+        return self.calc.label
+
+    @property
+    def arrows(self) -> Dict[Metric, str]:
+        return self.calc.arrows
+
+    @property
+    def divergences(self) -> Dict[Metric, List[Divergence]]:
+        return self.calc.divs
+
+    @property
+    def pairs(self) -> List[Divergence]:
+        return self.calc.pairs
+
+
+@dataclass(frozen=True)
+class RiskChange:
+    """Смена risk-режима между двумя соседними состояниями ТФ."""
+    tf: str
+    bar_ts: int
+    prev_label: str
+    label: str
+    prev_score: float
+    score: float
+
+    def text(self) -> str:
+        return f"{self.tf}: {self.prev_label} → {self.label} (счёт {self.prev_score:+.1f} → {self.score:+.1f})"
+
+
+class MarketStateStore:
+    """
+    Кэш MarketState по ТФ поверх одной БД.
+    Версии всех ТФ проверяются одним запросом (DB.bars_version), пересчитываются только изменившиеся.
+    """
+
+    def __init__(self, db: DB, timeframes: Iterable[str] = TIMEFRAMES,
+                 history: int = MARKET_STATE_HISTORY, max_age_sec: float = MARKET_STATE_MAX_AGE_SEC):
+        self.db = db
+        self.timeframes = tuple(timeframes)
+        self.max_age_sec = max_age_sec
+        self._states: Dict[str, MarketState] = {}
+        self._history: Dict[str, Deque[Tuple[int, float, str]]] = {
+            tf: deque(maxlen=max(2, history)) for tf in self.timeframes
+        }
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        self._stats = {"reads": 0, "refreshes": 0, "recomputes": 0}
+
+    # ---- чтение ----
+
+    def get(self, tf: str) -> MarketState:
+        """Текущее состояние ТФ; пересчёт — только если с прошлой сверки закрылся бар."""
+        self._stats["reads"] += 1
+        if tf not in self._states or time.monotonic() - self._checked_at.get(tf, 0.0) > self.max_age_sec:
+            self.refresh([tf])
+        return self._states[tf]
+
+    def snapshot(self, timeframes: Optional[Iterable[str]] = None) -> Dict[str, MarketState]:
+        """Свежие состояния набора ТФ (для отчётов): одна сверка версий, затем чтение."""
+        tfs = tuple(timeframes or self.timeframes)
+        self.refresh(tfs)
+        return {tf: self._states[tf] for tf in tfs}
+
+    def history(self, tf: str) -> List[Tuple[int, float, str]]:
+        """(bar_ts, score, label) от старых к новым."""
+        return list(self._history.get(tf, ()))
+
+    def changes(self, tf: Optional[str] = None, since_ts: int = 0) -> List[RiskChange]:
+        """Смены label в истории (по всем ТФ, если tf не задан) с bar_ts > since_ts."""
+        out: List[RiskChange] = []
+        for k in ((tf,) if tf else self.timeframes):
+            hist = self.history(k)
+            for (_pts, pscore, plabel), (ts, score, label) in zip(hist, hist[1:]):
+                if label != plabel and ts > since_ts:
+                    out.append(RiskChange(k, ts, plabel, label, pscore, score))
+        return out
+
+    def previous(self, tf: str) -> Optional[Tuple[int, float, str]]:
+        """Предыдущее (до текущего) состояние ТФ из истории."""
+        hist = self._history.get(tf)
+        return hist[-2] if hist and len(hist) >= 2 else None
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self._stats, timeframes=len(self._states))
+
+    # ---- обновление ----
+
+    def refresh(self, timeframes: Optional[Iterable[str]] = None) -> List[RiskChange]:
+        """
+        Сверяет версии баров и пересчитывает изменившиеся ТФ.
+        Возвращает смены risk-режима, случившиеся в этом обновлении.
+        """
+        tfs = tuple(timeframes or self.timeframes)
+        with self._lock:
+            self._stats["refreshes"] += 1
+            versions = self._versions(tfs)
+            now = time.monotonic()
+            changes: List[RiskChange] = []
+            for tf in tfs:
+                self._checked_at[tf] = now
+                prev = self._states.get(tf)
+                if prev is not None and prev.version == versions[tf]:
+                    continue
+                change = self._recompute(tf, versions[tf])
+                if change is not None:
+                    changes.append(change)
+            return changes
+
+    def invalidate(self, tf: Optional[str] = None) -> None:
+        """Принудительный пересчёт при следующем чтении (история сохраняется)."""
+        with self._lock:
+            if tf is None:
+                self._states.clear()
+            else:
+                self._states.pop(tf, None)
+
+    def _versions(self, tfs: Tuple[str, ...]) -> Dict[str, Version]:
+        rows: Dict[str, List[Tuple[str, int, float]]] = {tf: [] for tf in tfs}
+        for m, tf, ts, c in self.db.bars_version(METRICS, tfs):
+            rows[tf].append((m, ts, c))
+        return {tf: tuple(v) for tf, v in rows.items()}
+
+    def _recompute(self, tf: str, version: Version) -> Optional[RiskChange]:
+        calc = _calc_for_tf(self.db, tf)
+        bar_ts = max((ts for _m, ts, _c in version), default=0)
+        self._states[tf] = MarketState(tf=tf, calc=calc, version=version, bar_ts=bar_ts, updated_at=time.time())
+        self._stats["recomputes"] += 1
+
+        hist = self._history.setdefault(tf, deque(maxlen=max(2, MARKET_STATE_HISTORY)))
+        prev = hist[-1] if hist else None
+        if prev is not None and prev[0] == bar_ts:
+            # обновился текущий бар — заменяем последнюю точку, а не копим дубли
+            hist.pop()
+        hist.append((bar_ts, calc.score, calc.label))
+        if prev is not None and prev[2] != calc.label:
+            logger.info("risk %s: %s → %s", tf, prev[2], calc.label)
+            return RiskChange(tf, bar_ts, prev[2], calc.label, prev[1], calc.score)
+        return None
+
+
+_stores: "weakref.WeakKeyDictionary[DB, MarketStateStore]" = weakref.WeakKeyDictionary()
+_stores_lock = threading.Lock()
+
+
+def get_market_state(db: DB) -> MarketStateStore:
+    """Один store на экземпляр DB (бот, API и replay держат свои соединения)."""
+    with _stores_lock:
+        store = _stores.get(db)
+        if store is None:
+            store = _stores[db] = MarketStateStore(db)
+        return store
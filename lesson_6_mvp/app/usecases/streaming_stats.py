@@ -0,0 +1,454 @@
+# app/usecases/streaming_stats.py
+"""
+Потоковая статистика доходностей по ТФ: скользящие окна и экспоненциальные (EW) средние,
+дисперсии и ковариации всех метрик сразу — обновление O(k²) на закрытие бара.
+
+Раньше corr_matrix_and_beta, vol_regime и breadth на каждый вызов читали 600–1500 баров
+на метрику, собирали wide-DataFrame и заново считали pct_change().corr(), cov по колонке,
+rolling std и MA. Теперь у ТФ одно состояние на общей шкале метрик (объединение ts + ffill,
+как _closes_df), а запросы отвечают из накопленных сумм:
+- окно corr_bars: Σr и Σrrᵀ → матрица корреляций и беты;
+- окно vol_bars (диагональ) и окно RV_WINDOW → realized vol и перцентиль текущей RV30;
+- EW-среднее и ковариация с полураспадом STREAM_STATS_HALFLIFE баров;
+- суммы клоузов за MA_WINDOWS → breadth.
+
+Бар ТФ фиксируется, когда по ts пришли все метрики или появился более поздний ts
+(как ffill в _closes_df). Правка уже учтённого бара, новая метрика и каждые corr_bars
+баров — пересборка с нуля: снимает накопленную погрешность сумм и подхватывает
+задним числом дописанные бары.
+
+    stats = get_streaming_stats(db)
+    corr, betas = stats.corr_beta("1h", METRICS, base="BTC")    # None — состояние не покрывает запрос
+    stats.corr("1h", kind="ew")
+    stats.refresh()                                                # job воркера: дочитать новые бары
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import threading
+import time
+import weakref
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ..infrastructure.db import DB
+from .generate_report import METRICS
+
+logger = logging.getLogger("alt_forecast.streaming_stats")
+
+TIMEFRAMES: Tuple[str, ...] = ("15m", "1h", "4h", "1d")
+# дополнительные серии (монеты) к METRICS: STREAM_STATS_METRICS=SOL,XRP,...
+STREAM_STATS_METRICS = tuple(m.strip() for m in os.getenv("STREAM_STATS_METRICS", "").split(",") if m.strip())
+# окна в барах — по умолчанию те же n, что у кнопок бота (corr/beta 600, volatility 1200)
+STREAM_STATS_CORR_BARS = int(os.getenv("STREAM_STATS_CORR_BARS", "600"))
+STREAM_STATS_VOL_BARS = int(os.getenv("STREAM_STATS_VOL_BARS", "1200"))
+STREAM_STATS_HALFLIFE = float(os.getenv("STREAM_STATS_HALFLIFE", "48"))
+# без job'а обновления чтение само сверяет версии баров не чаще этого (как TTL кэша DB.last_n)
+STREAM_STATS_MAX_AGE_SEC = float(os.getenv("STREAM_STATS_MAX_AGE_SEC", "30"))
+
+RV_WINDOW = 30
+MA_WINDOWS: Tuple[int, ...] = (50, 200)
+
+
+class _Ring:
+    """Кольцевой буфер строк (cap × k); ago(0) — последняя добавленная."""
+
+    __slots__ = ("buf", "head", "count")
+
+    def __init__(self, cap: int, k: int):
+        self.buf = np.zeros((max(1, cap), k))
+        self.head = 0
+        self.count = 0
+
+    def ago(self, i: int) -> np.ndarray:
+        return self.buf[(self.head - 1 - i) % len(self.buf)]
+
+    def push(self, row: np.ndarray) -> None:
+        self.buf[self.head] = row
+        self.head = (self.head + 1) % len(self.buf)
+        self.count = min(self.count + 1, len(self.buf))
+
+    def last(self) -> np.ndarray:
+        """Заполненные строки от старых к новым."""
+        idx = (self.head - self.count + np.arange(self.count)) % len(self.buf)
+        return self.buf[idx]
+
+
+class _Window:
+    """Σx и Σxxᵀ (или Σx² при full=False) по последним length строкам кольца."""
+
+    __slots__ = ("length", "full", "n", "s1", "s2")
+
+    def __init__(self, length: int, k: int, full: bool):
+        self.length = max(1, length)
+        self.full = full
+        self.n = 0
+        self.s1 = np.zeros(k)
+        self.s2 = np.zeros((k, k)) if full else np.zeros(k)
+
+    def add(self, ring: _Ring, row: np.ndarray) -> None:
+        """Вызывается до ring.push(row): вытесняемая строка ещё в кольце."""
+        if self.n >= self.length:
+            old = ring.ago(self.length - 1)
+            self.s1 -= old
+            if self.full:
+                self.s2 -= np.outer(old, old)
+            else:
+                self.s2 -= old * old
+        else:
+            self.n += 1
+        self.s1 += row
+        if self.full:
+            self.s2 += np.outer(row, row)
+        else:
+            self.s2 += row * row
+
+    @property
+    def ready(self) -> bool:
+        return self.n >= self.length
+
+    def mean(self) -> np.ndarray:
+        return self.s1 / self.n
+
+    def cov(self) -> np.ndarray:
+        """Выборочная ковариация (ddof=1, как pandas); при full=False — дисперсии."""
+        s1 = self.s1
+        c = (self.s2 - (np.outer(s1, s1) if self.full else s1 * s1) / self.n) / (self.n - 1)
+        if not self.full:
+            np.maximum(c, 0.0, out=c)
+        return c
+
+
+class _Ew:
+    """EW-среднее и ковариация (adjust=False, bias=True): d = r − μ; μ += αd; C = (1 − α)(C + αddᵀ)."""
+
+    __slots__ = ("alpha", "n", "mean", "cov")
+
+    def __init__(self, halflife: float, k: int):
+        self.alpha = 1.0 - math.exp(math.log(0.5) / max(halflife, 1e-9))
+        self.n = 0
+        self.mean = np.zeros(k)
+        self.cov = np.zeros((k, k))
+
+    def add(self, row: np.ndarray) -> None:
+        if self.n == 0:
+            self.mean[:] = row
+        else:
+            d = row - self.mean
+            self.mean += self.alpha * d
+            self.cov += self.alpha * np.outer(d, d)
+            self.cov *= 1.0 - self.alpha
+        self.n += 1
+
+
+class _TfStats:
+    """Состояние одного ТФ на общей шкале метрик cols."""
+
+    def __init__(self, tf: str, cols: Sequence[str], corr_bars: int, vol_bars: int, halflife: float):
+        k = len(cols)
+        self.tf = tf
+        self.cols: Tuple[str, ...] = tuple(cols)
+        self.idx = {m: i for i, m in enumerate(self.cols)}
+        self.ts = 0                                 # ts последней учтённой строки
+        self.bars = 0                               # учтённых строк шкалы
+        self.known = np.full(k, np.nan)             # последний клоуз метрики (ffill), в т.ч. до полной строки
+        self.prev: Optional[np.ndarray] = None      # последняя учтённая строка
+        self.own: Dict[str, Tuple[int, float]] = {}  # последний собственный бар метрики (ts, c)
+
+        self.rets = _Ring(max(corr_bars, vol_bars) - 1, k)
+        self.corr_w = _Window(corr_bars - 1, k, full=True)
+        self.vol_w = _Window(vol_bars - 1, k, full=False)
+        self.rv_w = _Window(RV_WINDOW, k, full=False)
+        self.rv_hist = _Ring(vol_bars - RV_WINDOW, k)
+        self.ew = _Ew(halflife, k)
+        self.closes = _Ring(max(MA_WINDOWS), k)
+        self.ma_sum = {n: np.zeros(k) for n in MA_WINDOWS}
+
+    def push(self, ts: int, row: np.ndarray) -> None:
+        if self.prev is not None:
+            r = row / self.prev - 1.0
+            for w in (self.corr_w, self.vol_w, self.rv_w):
+                w.add(self.rets, r)
+            self.rets.push(r)
+            self.ew.add(r)
+            if self.rv_w.ready:
+                self.rv_hist.push(np.sqrt(self.rv_w.cov()))
+        for n, s in self.ma_sum.items():
+            if self.closes.count >= n:
+                s -= self.closes.ago(n - 1)
+            s += row
+        self.closes.push(row)
+        self.prev = row
+        self.ts = ts
+        self.bars += 1
+
+    def append(self, rows: Iterable[Tuple[str, int, float]]) -> int:
+        """
+        Учитывает (metric, ts, c) по возрастанию ts; последний ts ждёт остальных метрик.
+        Возвращает число учтённых строк шкалы.
+        """
+        groups: List[Tuple[int, Dict[str, float]]] = []
+        for m, ts, c in rows:
+            if m not in self.idx or not math.isfinite(c):
+                continue
+            if not groups or groups[-1][0] != ts:
+                groups.append((ts, {}))
+            groups[-1][1][m] = c
+        if groups and len(groups[-1][1]) < len(self.cols):
+            groups.pop()                            # бар ещё не закрылся у всех метрик
+        pushed = 0
+        for ts, closes in groups:
+            for m, c in closes.items():
+                self.known[self.idx[m]] = c
+                self.own[m] = (ts, c)
+            if np.isnan(self.known).any():
+                continue                            # пока не у всех метрик есть история (dropna в _closes_df)
+            self.push(ts, self.known.copy())
+            pushed += 1
+        return pushed
+
+
+class StreamingStats:
+    """
+    Потоковая статистика по всем ТФ поверх одной БД.
+    Версии ТФ сверяются одним запросом (DB.bars_version); дочитываются только новые бары.
+    """
+
+    def __init__(self, db: DB, metrics: Optional[Iterable[str]] = None, timeframes: Iterable[str] = TIMEFRAMES,
+                 corr_bars: int = STREAM_STATS_CORR_BARS, vol_bars: int = STREAM_STATS_VOL_BARS,
+                 halflife: float = STREAM_STATS_HALFLIFE, max_age_sec: float = STREAM_STATS_MAX_AGE_SEC):
+        self.db = db
+        self.metrics: Tuple[str, ...] = tuple(dict.fromkeys(metrics if metrics is not None
+                                                            else (*METRICS, *STREAM_STATS_METRICS)))
+        self.timeframes = tuple(timeframes)
+        self.corr_bars = max(3, corr_bars)
+        self.vol_bars = max(RV_WINDOW + 2, vol_bars)
+        self.halflife = halflife
+        self.max_age_sec = max_age_sec
+        self._tf: Dict[str, _TfStats] = {}
+        self._versions: Dict[str, tuple] = {}
+        self._since_rebuild: Dict[str, int] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        self._stats = {"reads": 0, "refreshes": 0, "rebuilds": 0, "bars": 0}
+
+    # ---- обновление ----
+
+    def refresh(self, timeframes: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """Сверяет версии баров и дочитывает новые; {tf: учтено строк} по изменившимся ТФ."""
+        tfs = tuple(timeframes or self.timeframes)
+        with self._lock:
+            self._stats["refreshes"] += 1
+            versions: Dict[str, list] = {tf: [] for tf in tfs}
+            for m, tf, ts, c in self.db.bars_version(self.metrics, tfs):
+                versions[tf].append((m, ts, c))
+            now = time.monotonic()
+            out: Dict[str, int] = {}
+            for tf in tfs:
+                self._checked_at[tf] = now
+                version = tuple(versions[tf])
+                st = self._tf.get(tf)
+                if st is not None and self._versions.get(tf) == version:
+                    continue
+                if st is None or not self._consistent(st, version) \
+                        or self._since_rebuild.get(tf, 0) >= self.corr_bars:
+                    st = self._rebuild(tf, version)
+                    out[tf] = st.bars
+                else:
+                    out[tf] = st.append(self.db.closes_after(st.cols, tf, st.ts))
+                    self._since_rebuild[tf] = self._since_rebuild.get(tf, 0) + out[tf]
+                self._versions[tf] = version
+                self._stats["bars"] += out[tf]
+            return out
+
+    def invalidate(self, tf: Optional[str] = None) -> None:
+        """Пересборка с нуля при следующем чтении."""
+        with self._lock:
+            for k in ((tf,) if tf else tuple(self._tf)):
+                self._tf.pop(k, None)
+                self._versions.pop(k, None)
+
+    @staticmethod
+    def _consistent(st: _TfStats, version: tuple) -> bool:
+        """Новые бары только дописаны: набор метрик тот же, учтённые бары не менялись."""
+        if {m for m, _ts, _c in version} != set(st.cols):
+            return False
+        for m, ts, c in version:
+            own = st.own.get(m)
+            if own is not None and (ts < own[0] or (ts == own[0] and c != own[1])):
+                return False
+        return True
+
+    def _rebuild(self, tf: str, version: tuple) -> _TfStats:
+        cols = [m for m in self.metrics if any(v[0] == m for v in version)]
+        st = _TfStats(tf, cols, self.corr_bars, self.vol_bars, self.halflife)
+        depth = max(self.corr_bars, self.vol_bars, max(MA_WINDOWS))
+        rows = [(m, ts, c) for m in cols for ts, c in self.db.last_n_closes(m, tf, depth)]
+        rows.sort(key=lambda r: r[1])
+        st.append(rows)
+        self._tf[tf] = st
+        self._since_rebuild[tf] = 0
+        self._stats["rebuilds"] += 1
+        logger.debug("streaming stats %s: rebuilt %d metrics, %d bars", tf, len(cols), st.bars)
+        return st
+
+    # ---- чтение ----
+
+    def _state(self, tf: str) -> Optional[_TfStats]:
+        self._stats["reads"] += 1
+        if tf not in self._tf or time.monotonic() - self._checked_at.get(tf, 0.0) > self.max_age_sec:
+            self.refresh([tf])
+        return self._tf.get(tf)
+
+    def _columns(self, st: _TfStats, metrics: Optional[Iterable[str]], full: bool) -> Optional[List[str]]:
+        """
+        Запрошенные метрики с историей, если ответ совпадёт с пересчётом по барам: все из вселенной и
+        либо это весь набор ТФ, либо окно заполнено (у подмножества своя, возможно более длинная, общая история).
+        """
+        if metrics is None:
+            return list(st.cols)
+        ms = list(dict.fromkeys(metrics))
+        if any(m not in self.metrics for m in ms):
+            return None
+        have = [m for m in ms if m in st.idx]
+        if set(have) != set(st.cols) and not full:
+            return None
+        return have
+
+    def corr(self, tf: str, metrics: Optional[Iterable[str]] = None, kind: str = "window") -> Optional[pd.DataFrame]:
+        """Матрица корреляций доходностей: kind='window' — окно corr_bars, 'ew' — EW-ковариация."""
+        with self._lock:
+            st = self._state(tf)
+            if st is None:
+                return None
+            ew = kind == "ew"
+            cols = self._columns(st, metrics, ew or st.corr_w.ready)
+            if cols is None or (st.ew.n if ew else st.corr_w.n) < 2:
+                return None
+            cov = st.ew.cov if ew else st.corr_w.cov()
+            ix = [st.idx[m] for m in cols]
+            return pd.DataFrame(_corr(cov[np.ix_(ix, ix)]), index=cols, columns=cols)
+
+    def betas(self, tf: str, base: str, metrics: Optional[Iterable[str]] = None,
+              kind: str = "window") -> Optional[Dict[str, float]]:
+        """β = Cov(asset, base) / Var(base) по окну или EW-ковариации."""
+        with self._lock:
+            st = self._state(tf)
+            if st is None or base not in st.idx:
+                return None
+            ew = kind == "ew"
+            cols = self._columns(st, metrics, ew or st.corr_w.ready)
+            if cols is None or (st.ew.n if ew else st.corr_w.n) < 2:
+                return None
+            cov = st.ew.cov if ew else st.corr_w.cov()
+            return _betas(cov, st.idx, cols, base)
+
+    def corr_beta(self, tf: str, metrics: Iterable[str], base: str):
+        """
+        Ответ в формате analytics.corr_matrix_and_beta (окно corr_bars) или None —
+        тогда считать по барам (метрика вне вселенной, окно подмножества ещё не заполнено).
+        """
+        with self._lock:
+            st = self._state(tf)
+            if st is None or st.corr_w.n < 2:
+                return None
+            cols = self._columns(st, metrics, st.corr_w.ready)
+            if cols is None:
+                return None
+            if base not in cols:
+                return pd.DataFrame(), {}
+            cov = st.corr_w.cov()
+            ix = [st.idx[m] for m in cols]
+            corr = pd.DataFrame(_corr(cov[np.ix_(ix, ix)]), index=cols, columns=cols)
+            return corr, _betas(cov, st.idx, cols, base)
+
+    def realized_vol(self, tf: str, metric: str, window: int) -> Optional[float]:
+        """Как analytics.realized_vol на окне vol_bars: std(returns)·√N, при N < window — просто std."""
+        with self._lock:
+            st = self._state(tf)
+            if st is None or metric not in st.idx or not st.vol_w.ready:
+                return None
+            w = st.vol_w
+            std = float(math.sqrt(w.cov()[st.idx[metric]]))
+            return std * math.sqrt(w.n) if w.n >= window else std
+
+    def vol_percentile(self, tf: str, metric: str) -> Optional[float]:
+        """Перцентиль текущей RV30 среди RV30 окна vol_bars (NaN — нет истории)."""
+        with self._lock:
+            st = self._state(tf)
+            if st is None or metric not in st.idx or not st.vol_w.ready:
+                return None
+            hist = st.rv_hist.last()[:, st.idx[metric]]
+            if not len(hist) or not np.isfinite(hist[-1]):
+                return float("nan")
+            return float((hist <= hist[-1]).mean() * 100.0)
+
+    def breadth(self, tf: str, metrics: Optional[Iterable[str]] = None,
+                ma_short: int = 50, ma_long: int = 200) -> Optional[Dict[str, float]]:
+        """Ответ в формате analytics.breadth или None (другие MA, подмножество без полной MA)."""
+        if ma_short not in MA_WINDOWS or ma_long not in MA_WINDOWS:
+            return None
+        with self._lock:
+            st = self._state(tf)
+            if st is None or st.bars == 0:
+                return None
+            cols = self._columns(st, metrics, st.closes.count >= ma_long)
+            if not cols:
+                return None
+            ix = [st.idx[m] for m in cols]
+            last = st.prev[ix]
+
+            def above(n: int) -> int:
+                if st.closes.count < n:
+                    return 0
+                return int((last > st.ma_sum[n][ix] / n).sum())
+
+            above50, above200, total = above(ma_short), above(ma_long), len(cols)
+            return {
+                "above_ma50": above50,
+                "above_ma200": above200,
+                "total": total,
+                "pct_ma50": round(100.0 * above50 / total, 1),
+                "pct_ma200": round(100.0 * above200 / total, 1),
+            }
+
+    def get_stats(self) -> Dict[str, object]:
+        with self._lock:
+            out: Dict[str, object] = dict(self._stats)
+            for tf, st in self._tf.items():
+                out[tf] = {"metrics": len(st.cols), "bars": st.bars, "ts": st.ts}
+            return out
+
+
+def _corr(cov: np.ndarray) -> np.ndarray:
+    std = np.sqrt(np.clip(np.diag(cov), 0.0, None))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cov / np.outer(std, std)
+    corr[~np.isfinite(corr)] = np.nan                # нулевая дисперсия — NaN, как у pandas
+    return corr
+
+
+def _betas(cov: np.ndarray, idx: Dict[str, int], cols: List[str], base: str) -> Dict[str, float]:
+    b = idx[base]
+    base_var = float(cov[b, b])
+    if not np.isfinite(base_var) or base_var <= 0:
+        return {m: np.nan for m in cols}
+    return {m: float(cov[idx[m], b]) / base_var for m in cols}
+
+
+_stores: "weakref.WeakKeyDictionary[DB, StreamingStats]" = weakref.WeakKeyDictionary()
+_stores_lock = threading.Lock()
+
+
+def get_streaming_stats(db: DB) -> StreamingStats:
+    """Одно состояние на экземпляр DB (бот, API и replay держат свои соединения)."""
+    with _stores_lock:
+        store = _stores.get(db)
+        if store is None:
+            store = _stores[db] = StreamingStats(db)
+        return store
@@ -0,0 +1,603 @@
+# app/usecases/watch_alerts.py
+"""
+Алерты watchlist по закрытию бара: пользовательские правила на символ/ТФ и обратный индекс.
+
+Правило — (symbol, tf, kind) + параметры:
+- price       — закрытие пересекло уровень (direction up / down / any);
+- pump / risk — pump/risk score Market Doctor пересёк порог;
+- funding     — ставка финансирования (% за период) пересекла уровень;
+- phase       — смена фазы Market Doctor (param — целевая фаза или любая);
+- divergence  — подтверждённая дивергенция (param — bullish / bearish или любая);
+- twap        — обнаружен TWAP-алгоритм (param — BUY / SELL, level — мин. объём USD).
+
+Индекс: уровни каждого (symbol, tf, kind) лежат в двух отсортированных списках (пересечение
+вверх / вниз), событие «значение ушло из prev в cur» — два bisect и срез, т.е. O(log n + k)
+независимо от числа правил; событийные правила — в корзинах по (symbol, tf, kind).
+На закрытие бара смотрим только правила этого символа и ТФ. Повторы гасит cooldown правила
+(по времени события), одноразовые (once) снимаются из индекса после срабатывания; алерты одного
+события группируются в одно сообщение на пользователя и уходят в outbox (полоса alert).
+
+Источники событий (job evaluate_watch_alerts и hourly_top_setups в main_worker):
+- poll() — новые закрытые бары символов, на которые есть ценовые правила, и подтверждённые
+  дивергенции (divs.confirm_ts), funding и TWAP — не чаще WATCH_ALERTS_DERIV_SEC;
+- on_diagnostics() — фазы и pump/risk score из сканера Market Doctor.
+
+    engine = get_alert_engine(db)
+    engine.add_rule(user_id, "BTC", "1h", "price", level=70_000, direction="up", once=True)
+    engine.deliver(engine.on_bar("BTC", "1h", ts, close))
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from ..infrastructure.db import DB
+
+log = logging.getLogger("alt_forecast.watch_alerts")
+
+WATCH_ALERTS_POLL_SEC = int(os.getenv("WATCH_ALERTS_POLL_SEC", "30"))
+WATCH_ALERTS_DERIV_SEC = int(os.getenv("WATCH_ALERTS_DERIV_SEC", "300"))
+WATCH_ALERTS_COOLDOWN_SEC = int(os.getenv("WATCH_ALERTS_COOLDOWN_SEC", "3600"))
+WATCH_ALERTS_MAX_PER_USER = int(os.getenv("WATCH_ALERTS_MAX_PER_USER", "50"))
+
+KIND_PRICE = "price"
+KIND_PUMP = "pump"
+KIND_RISK = "risk"
+KIND_FUNDING = "funding"
+KIND_PHASE = "phase"
+KIND_DIVERGENCE = "divergence"
+KIND_TWAP = "twap"
+LEVEL_KINDS = (KIND_PRICE, KIND_PUMP, KIND_RISK, KIND_FUNDING)
+EVENT_KINDS = (KIND_PHASE, KIND_DIVERGENCE, KIND_TWAP)
+KINDS = LEVEL_KINDS + EVENT_KINDS
+# не привязаны к ТФ: правило хранится с tf = "*"
+TF_LESS = (KIND_FUNDING, KIND_TWAP)
+ANY_TF = "*"
+DIRECTIONS = ("up", "down", "any")
+TIMEFRAMES = ("15m", "1h", "4h", "1d")
+# фазы и скоры приходят из ежечасного сканера Market Doctor (hourly_top_setups) — только эти ТФ
+DIAG_KINDS = (KIND_PHASE, KIND_PUMP, KIND_RISK)
+DIAG_TIMEFRAMES = ("4h", "1d")
+
+Key = Tuple[str, str, str]  # (symbol, tf, kind)
+
+
+@dataclass(frozen=True)
+class AlertRule:
+    id: int
+    user_id: int
+    symbol: str
+    tf: str
+    kind: str
+    level: Optional[float] = None
+    direction: str = "up"
+    param: Optional[str] = None
+    cooldown_sec: int = WATCH_ALERTS_COOLDOWN_SEC
+    once: bool = False
+
+    @property
+    def key(self) -> Key:
+        return self.symbol, self.tf, self.kind
+
+    def describe(self) -> str:
+        where = self.symbol if self.tf == ANY_TF else f"{self.symbol} {self.tf}"
+        arrow = {"up": "↑", "down": "↓", "any": "↕"}.get(self.direction, "")
+        if self.kind in LEVEL_KINDS:
+            what = f"{self.kind} {arrow} {_fmt(self.level)}"
+        elif self.kind == KIND_TWAP:
+            what = f"twap {self.param or 'BUY/SELL'} ≥ ${_fmt(self.level or 0)}"
+        else:
+            what = f"{self.kind} {self.param or 'любая'}"
+        return f"#{self.id} {where}: {what}" + (" (однократно)" if self.once else "")
+
+
+@dataclass(frozen=True)
+class Alert:
+    rule: AlertRule
+    ts: int                      # время события, ms
+    value: Optional[float] = None
+    detail: str = ""
+
+    def text(self) -> str:
+        r = self.rule
+        where = r.symbol if r.tf == ANY_TF else f"{r.symbol} {r.tf}"
+        if r.kind == KIND_PRICE:
+            side = "вверх" if self.detail == "up" else "вниз"
+            return f"{where}: цена пересекла {_fmt(r.level)} {side} (закрытие {_fmt(self.value)})"
+        if r.kind in (KIND_PUMP, KIND_RISK):
+            return f"{where}: {r.kind} score {self.value:.2f} пересёк {r.level:.2f}"
+        if r.kind == KIND_FUNDING:
+            return f"{where}: funding {self.value:+.4f}% пересёк {r.level:+.4f}%"
+        if r.kind == KIND_PHASE:
+            return f"{where}: фаза {self.detail}"
+        if r.kind == KIND_DIVERGENCE:
+            return f"{where}: подтверждена дивергенция {self.detail}"
+        return f"{where}: TWAP {self.detail} ~${_fmt(self.value)}"
+
+
+def _fmt(x: Optional[float]) -> str:
+    if x is None:
+        return "—"
+    ax = abs(x)
+    if ax >= 1e6:
+        return f"{x / 1e6:.2f}M"
+    if ax >= 1000:
+        return f"{x:,.0f}".replace(",", " ")
+    if ax >= 1:
+        return f"{x:.2f}"
+    return f"{x:.6g}"
+
+
+class _Levels:
+    """Уровни одного (symbol, tf, kind): отсортированные (уровень, id) для пересечения вверх и вниз."""
+
+    __slots__ = ("up", "up_ids", "down", "down_ids")
+
+    def __init__(self):
+        self.up: List[float] = []
+        self.up_ids: List[int] = []
+        self.down: List[float] = []
+        self.down_ids: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.up) + len(self.down)
+
+    @staticmethod
+    def _insert(levels: List[float], ids: List[int], level: float, rule_id: int) -> None:
+        i = bisect_right(levels, level)
+        levels.insert(i, level)
+        ids.insert(i, rule_id)
+
+    @staticmethod
+    def _delete(levels: List[float], ids: List[int], level: float, rule_id: int) -> None:
+        i, j = bisect_left(levels, level), bisect_right(levels, level)
+        for k in range(i, j):
+            if ids[k] == rule_id:
+                del levels[k], ids[k]
+                return
+
+    def add(self, rule: AlertRule) -> None:
+        if rule.direction in ("up", "any"):
+            self._insert(self.up, self.up_ids, rule.level, rule.id)
+        if rule.direction in ("down", "any"):
+            self._insert(self.down, self.down_ids, rule.level, rule.id)
+
+    def remove(self, rule: AlertRule) -> None:
+        if rule.direction in ("up", "any"):
+            self._delete(self.up, self.up_ids, rule.level, rule.id)
+        if rule.direction in ("down", "any"):
+            self._delete(self.down, self.down_ids, rule.level, rule.id)
+
+    def crossed(self, prev: float, cur: float) -> Tuple[str, List[int]]:
+        """Правила, чьи уровни пройдены движением prev → cur: вверх — (prev, cur], вниз — [cur, prev)."""
+        if cur > prev:
+            return "up", self.up_ids[bisect_right(self.up, prev):bisect_right(self.up, cur)]
+        if cur < prev:
+            return "down", self.down_ids[bisect_left(self.down, cur):bisect_left(self.down, prev)]
+        return "", []
+
+
+class WatchAlertEngine:
+    def __init__(self, db: Optional[DB] = None, send: Optional[Callable[[int, str], None]] = None,
+                 persist: bool = True):
+        """
+        Args:
+            db: база (правила md_alert_rules, бары и дивергенции для poll); None — только в памяти
+            send: (user_id, html) — доставка; по умолчанию outbox, полоса alert
+            persist: хранить правила и срабатывания в md_alert_rules
+        """
+        self.db = db
+        self._send = send
+        self._repo = None
+        if db is not None and persist:
+            from ..infrastructure.repositories.alert_rule_repository import AlertRuleRepository
+            self._repo = AlertRuleRepository(db)
+        self._lock = threading.RLock()
+        self._rules: Dict[int, AlertRule] = {}
+        self._levels: Dict[Key, _Levels] = {}
+        self._events: Dict[Key, Dict[int, AlertRule]] = {}
+        self._last: Dict[Key, object] = {}            # последнее значение / фаза по ключу
+        self._fired: Dict[int, int] = {}              # rule_id → ts последнего срабатывания, ms
+        self._bar_cursor: Dict[Tuple[str, str], int] = {}
+        self._div_cursor: Optional[int] = None
+        self._deriv_at = 0.0
+        self._next_id = -1                            # id правил без БД — отрицательные
+        self.stats = {"events": 0, "evaluated": 0, "fired": 0, "suppressed": 0}
+        if self._repo is not None:
+            self.load()
+
+    # ---- правила ----
+
+    def load(self) -> int:
+        """Поднять активные правила из БД в индекс (с cooldown из last_fired_ms)."""
+        rows = self._repo.list_active()
+        with self._lock:
+            for rid, uid, sym, tf, kind, level, direction, param, cooldown, once, last_ms in rows:
+                self._index(AlertRule(int(rid), int(uid), sym, tf, kind, None if level is None else float(level),
+                                      direction, param, int(cooldown), bool(once)))
+                if last_ms:
+                    self._fired[int(rid)] = int(last_ms)
+        return len(rows)
+
+    def add_rule(self, user_id: int, symbol: str, tf: str, kind: str, level: Optional[float] = None,
+                 direction: str = "up", param: Optional[str] = None,
+                 cooldown_sec: int = WATCH_ALERTS_COOLDOWN_SEC, once: bool = False) -> AlertRule:
+        kind = kind.lower()
+        if kind not in KINDS:
+            raise ValueError(f"неизвестный тип правила: {kind}")
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction: {direction}")
+        if kind in LEVEL_KINDS and level is None:
+            raise ValueError(f"для {kind} нужен уровень")
+        tf = ANY_TF if kind in TF_LESS else tf
+        symbol = symbol.upper()
+        if self._repo is not None:
+            if self._repo.count_user_rules(user_id) >= WATCH_ALERTS_MAX_PER_USER:
+                raise ValueError(f"не больше {WATCH_ALERTS_MAX_PER_USER} правил на пользователя")
+            rid = self._repo.add_rule(user_id, symbol, tf, kind, level, direction, param, cooldown_sec, once)
+        else:
+            with self._lock:
+                rid, self._next_id = self._next_id, self._next_id - 1
+        rule = AlertRule(rid, int(user_id), symbol, tf, kind, None if level is None else float(level),
+                         direction, param, int(cooldown_sec), bool(once))
+        with self._lock:
+            self._index(rule)
+        return rule
+
+    def check_symbol(self, symbol: str, tf: str, kind: str) -> None:
+        """
+        Ценовое правило оценивается только по закрытиям из bars: символ без баров этого ТФ
+        никогда не сработает — отклоняем его при добавлении (ValueError с доступными символами).
+        """
+        if kind.lower() != KIND_PRICE or self.db is None:
+            return
+        available = self.db.bar_metrics(tf)
+        if symbol.upper() not in available:
+            raise ValueError(f"по {symbol.upper()} {tf} нет баров — ценовые алерты доступны для: "
+                             f"{', '.join(available) or 'нет символов'}")
+
+    def remove_rule(self, rule_id: int, user_id: Optional[int] = None) -> bool:
+        with self._lock:
+            rule = self._rules.get(rule_id)
+            if rule is None or (user_id is not None and rule.user_id != user_id):
+                return False
+            self._unindex(rule)
+        if self._repo is not None:
+            self._repo.deactivate(rule_id, user_id)
+        return True
+
+    def rules_for(self, user_id: int) -> List[AlertRule]:
+        with self._lock:
+            return sorted((r for r in self._rules.values() if r.user_id == user_id), key=lambda r: r.id)
+
+    def symbols(self, kinds: Iterable[str], tf: Optional[str] = None) -> Set[str]:
+        """Символы, на которые есть правила этих типов — источники опрашивают только их."""
+        kinds = set(kinds)
+        with self._lock:
+            keys = list(self._levels) + list(self._events)
+        return {s for s, t, k in keys if k in kinds and (tf is None or t == tf)}
+
+    def _index(self, rule: AlertRule) -> None:
+        self._rules[rule.id] = rule
+        if rule.kind in LEVEL_KINDS:
+            self._levels.setdefault(rule.key, _Levels()).add(rule)
+        else:
+            self._events.setdefault(rule.key, {})[rule.id] = rule
+
+    def _unindex(self, rule: AlertRule) -> None:
+        self._rules.pop(rule.id, None)
+        if rule.kind in LEVEL_KINDS:
+            lv = self._levels.get(rule.key)
+            if lv is not None:
+                lv.remove(rule)
+                if not len(lv):
+                    del self._levels[rule.key]
+                    if rule.kind == KIND_PRICE and self._bar_cursor.pop((rule.symbol, rule.tf), None) is not None:
+                        # символ выпал из опроса: курсор и последнее закрытие устареют, следующее
+                        # ценовое правило засеется заново с последнего бара
+                        self._last.pop(rule.key, None)
+        else:
+            bucket = self._events.get(rule.key)
+            if bucket is not None:
+                bucket.pop(rule.id, None)
+                if not bucket:
+                    del self._events[rule.key]
+
+    # ---- события ----
+
+    def on_value(self, symbol: str, tf: str, kind: str, ts: int, value: float) -> List[Alert]:
+        """Числовое значение (цена закрытия, скор, funding): срабатывают пройденные уровни."""
+        key = (symbol.upper(), ANY_TF if kind in TF_LESS else tf, kind)
+        with self._lock:
+            self.stats["events"] += 1
+            prev = self._last.get(key)
+            self._last[key] = value
+            lv = self._levels.get(key)
+            if lv is None or prev is None or value != value:
+                return []
+            direction, ids = lv.crossed(prev, value)
+            return self._fire([self._rules[i] for i in ids], ts, value, direction)
+
+    def on_bar(self, symbol: str, tf: str, ts: int, close: float) -> List[Alert]:
+        return self.on_value(symbol, tf, KIND_PRICE, ts, close)
+
+    def on_funding(self, symbol: str, ts: int, rate_pct: float) -> List[Alert]:
+        return self.on_value(symbol, ANY_TF, KIND_FUNDING, ts, rate_pct)
+
+    def on_phase(self, symbol: str, tf: str, ts: int, phase: str) -> List[Alert]:
+        key = (symbol.upper(), tf, KIND_PHASE)
+        with self._lock:
+            self.stats["events"] += 1
+            prev = self._last.get(key)
+            self._last[key] = phase
+            bucket = self._events.get(key)
+            if not bucket or prev is None or prev == phase:
+                return []
+            hit = [r for r in bucket.values() if r.param is None or r.param.upper() == phase.upper()]
+            return self._fire(hit, ts, None, f"{prev} → {phase}")
+
+    def on_divergence(self, symbol: str, tf: str, ts: int, indicator: str, side: str) -> List[Alert]:
+        with self._lock:
+            self.stats["events"] += 1
+            bucket = self._events.get((symbol.upper(), tf, KIND_DIVERGENCE))
+            if not bucket:
+                return []
+            hit = [r for r in bucket.values() if r.param is None or r.param.lower() == side.lower()]
+            return self._fire(hit, ts, None, f"{side} {indicator}")
+
+    def on_twap(self, symbol: str, ts: int, direction: str, volume_usd: float) -> List[Alert]:
+        with self._lock:
+            self.stats["events"] += 1
+            bucket = self._events.get((symbol.upper(), ANY_TF, KIND_TWAP))
+            if not bucket or direction.upper() not in ("BUY", "SELL"):
+                return []
+            hit = [r for r in bucket.values()
+                   if (r.param is None or r.param.upper() == direction.upper()) and volume_usd >= (r.level or 0.0)]
+            return self._fire(hit, ts, volume_usd, direction.upper())
+
+    def on_diagnostics(self, symbol: str, tf: str, ts: int, phase: Optional[str] = None,
+                       pump_score: Optional[float] = None, risk_score: Optional[float] = None) -> List[Alert]:
+        """Снимок Market Doctor по символу/ТФ: фаза и оба скора за раз."""
+        out: List[Alert] = []
+        if phase:
+            out += self.on_phase(symbol, tf, ts, phase)
+        if pump_score is not None:
+            out += self.on_value(symbol, tf, KIND_PUMP, ts, float(pump_score))
+        if risk_score is not None:
+            out += self.on_value(symbol, tf, KIND_RISK, ts, float(risk_score))
+        return out
+
+    def _fire(self, rules: Sequence[AlertRule], ts: int, value: Optional[float], detail: str) -> List[Alert]:
+        """Cooldown по времени события; once — снять из индекса. Под self._lock."""
+        self.stats["evaluated"] += len(rules)
+        out: List[Alert] = []
+        for r in rules:
+            last = self._fired.get(r.id)
+            if last is not None and ts - last < r.cooldown_sec * 1000:
+                self.stats["suppressed"] += 1
+                continue
+            self._fired[r.id] = ts
+            if r.once:
+                self._unindex(r)
+            out.append(Alert(r, ts, value, detail))
+        self.stats["fired"] += len(out)
+        return out
+
+    # ---- доставка ----
+
+    def deliver(self, alerts: Sequence[Alert]) -> int:
+        """Одно сообщение на пользователя; срабатывания — в md_alert_rules. Возвращает число сообщений."""
+        if not alerts:
+            return 0
+        if self._repo is not None:
+            self._repo.mark_fired((a.rule.id, a.ts, a.rule.once) for a in alerts)
+        by_user: Dict[int, List[Alert]] = defaultdict(list)
+        for a in alerts:
+            by_user[a.rule.user_id].append(a)
+        send = self._send or self._outbox_send
+        for uid, items in by_user.items():
+            text = "<b>🔔 Алерты watchlist</b>\n" + "\n".join("• " + a.text() for a in items)
+            try:
+                send(uid, text)
+            except Exception:
+                log.exception("alert delivery to %s failed", uid)
+        return len(by_user)
+
+    def _outbox_send(self, user_id: int, text: str) -> None:
+        from ..infrastructure.delivery import LANE_ALERT, get_outbox
+        get_outbox(self.db).enqueue(user_id, lane=LANE_ALERT, text=text, parse_mode="HTML")
+
+    # ---- источники ----
+
+    def poll(self, now_ms: Optional[int] = None, derivatives: bool = True) -> List[Alert]:
+        """Новые бары символов с ценовыми правилами + подтверждённые дивергенции (+ funding/TWAP по таймеру)."""
+        out = self._poll_bars(now_ms) + self._poll_divergences()
+        if derivatives and time.time() - self._deriv_at >= WATCH_ALERTS_DERIV_SEC:
+            self._deriv_at = time.time()
+            out += self.poll_derivatives(now_ms)
+        return out
+
+    def _poll_bars(self, now_ms: Optional[int] = None) -> List[Alert]:
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        out: List[Alert] = []
+        for tf in TIMEFRAMES:
+            symbols = sorted(self.symbols((KIND_PRICE,), tf))
+            if not symbols:
+                continue
+            for s in symbols:
+                if (s, tf) not in self._bar_cursor:             # первое знакомство: только запомнить уровень
+                    last = self.db.last_n_closes(s, tf, 1)
+                    # баров ещё нет — курсор с «сейчас»: догруженная история не стреляет
+                    # и не тянет min(курсоров) к нулю (полное перечитывание closes_after каждый опрос)
+                    self._bar_cursor[(s, tf)] = int(last[-1][0]) if last else now_ms
+                    if last:
+                        self._last[(s, tf, KIND_PRICE)] = float(last[-1][1])
+            after = min(self._bar_cursor[(s, tf)] for s in symbols)
+            for metric, ts, close in self.db.closes_after(symbols, tf, after):
+                cursor = self._bar_cursor.get((metric, tf))      # None — последнее правило уже сработало (once)
+                if cursor is not None and ts > cursor:
+                    self._bar_cursor[(metric, tf)] = ts
+                    out += self.on_bar(metric, tf, ts, close)
+        return out
+
+    def _poll_divergences(self) -> List[Alert]:
+        if not self.symbols((KIND_DIVERGENCE,)):
+            return []
+        if self._div_cursor is None:
+            self._div_cursor = self.db.last_div_confirm_ts()
+            return []
+        out: List[Alert] = []
+        for metric, tf, indicator, side, ts in self.db.divs_confirmed_after(self._div_cursor):
+            self._div_cursor = max(self._div_cursor, ts)
+            out += self.on_divergence(metric, tf, ts, indicator, side)
+        return out
+
+    def poll_derivatives(self, now_ms: Optional[int] = None) -> List[Alert]:
+        """Funding (стор деривативов, иначе Binance premiumIndex) и TWAP — только по символам с такими правилами."""
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        out: List[Alert] = []
+        funding = self.symbols((KIND_FUNDING,))
+        if funding:
+            from ..infrastructure.derivatives_store import get_derivatives_store
+            from ..infrastructure.market_data import binance_funding_and_mark
+            store = get_derivatives_store(self.db)
+            for s in sorted(funding):
+                try:
+                    rate = store.latest_value(s, "funding_rate", now_ms)       # свежее от сборщика
+                    if rate is None:
+                        rate = binance_funding_and_mark(f"{s}USDT")["fundingRate"]
+                    rate *= 100.0
+                except Exception as e:
+                    log.debug("funding %s: %s", s, e)
+                    continue
+                out += self.on_funding(s, now_ms, rate)
+        twap = self.symbols((KIND_TWAP,))
+        if twap:
+            from ..application.services.twap_detector_service import TWAPDetectorService
+            svc = TWAPDetectorService(self.db)
+            for s in sorted(twap):
+                rep = svc.get_twap_report(f"{s}USDT")
+                if rep is not None:
+                    out += self.on_twap(s, now_ms, rep.dominant_direction, rep.total_algo_volume_usd)
+        return out
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.stats, "rules": len(self._rules), "keys": len(self._levels) + len(self._events)}
+
+
+def parse_rule_args(args: Sequence[str]) -> dict:
+    """
+    Аргументы /md_alert_add → kwargs add_rule (без user_id).
+
+        BTC 1h price > 70000 | BTC 1h price 70000 | ETH 4h phase MARKUP | SOL 1h pump 0.8
+        BTC 1h risk 0.7 | BTC 4h div bullish | BTC funding 0.05 | BTC twap BUY 1000000
+    """
+    a = [x.strip() for x in args if x.strip()]
+    if len(a) < 2:
+        raise ValueError("нужно: <символ> [ТФ] <тип> [значение]")
+    symbol = a[0].upper()
+    rest = a[1:]
+    tf = None
+    if rest and rest[0].lower() in TIMEFRAMES:
+        tf = rest.pop(0).lower()
+    if not rest:
+        raise ValueError("не указан тип правила")
+    kind = {"div": KIND_DIVERGENCE, "diverg": KIND_DIVERGENCE}.get(rest[0].lower(), rest[0].lower())
+    if kind not in KINDS:
+        raise ValueError(f"тип: {', '.join(KINDS)}")
+    if kind in DIAG_KINDS:
+        tf = tf or DIAG_TIMEFRAMES[0]
+        if tf not in DIAG_TIMEFRAMES:
+            raise ValueError(f"{kind}: ТФ {' / '.join(DIAG_TIMEFRAMES)}")
+    tf = tf or "1h"
+    rest = rest[1:]
+    out: dict = {"symbol": symbol, "tf": tf, "kind": kind}
+    if kind in LEVEL_KINDS:
+        direction = None
+        if rest and rest[0] in (">", "<", "<>"):
+            direction = {">": "up", "<": "down", "<>": "any"}[rest.pop(0)]
+        if not rest:
+            raise ValueError(f"для {kind} нужен уровень")
+        try:
+            level = float(rest[0].replace(",", ".").replace("%", ""))
+        except ValueError:
+            raise ValueError(f"уровень: {rest[0]!r}") from None
+        if direction is None:
+            direction = "down" if kind == KIND_FUNDING and level < 0 else ("any" if kind == KIND_PRICE else "up")
+        out.update(level=level, direction=direction, once=kind == KIND_PRICE)
+    elif kind == KIND_TWAP:
+        if rest and rest[0].upper() in ("BUY", "SELL"):
+            out["param"] = rest.pop(0).upper()
+        if rest:
+            out["level"] = float(rest[0])
+    elif rest:
+        out["param"] = rest[0].lower() if kind == KIND_DIVERGENCE else rest[0].upper()
+    return out
+
+
+_engines: "weakref.WeakKeyDictionary[DB, WatchAlertEngine]" = weakref.WeakKeyDictionary()
+_engines_lock = threading.Lock()
+
+
+def get_alert_engine(db: DB) -> WatchAlertEngine:
+    with _engines_lock:
+        engine = _engines.get(db)
+        if engine is None:
+            engine = _engines[db] = WatchAlertEngine(db)
+        return engine
+
+
+# ---------- бенчмарк ----------
+
+def bench(n_rules: int = 100_000, n_symbols: int = 200, n_bars: int = 2_000, seed: int = 1) -> dict:
+    """Индекс на n_rules правил (уровни цены, скоры, фазы) и прогон n_bars закрытий: время на бар."""
+    import random
+    rng = random.Random(seed)
+    engine = WatchAlertEngine(None, send=lambda uid, text: None)
+    syms = [f"C{i}" for i in range(n_symbols)]
+    price = {s: 100.0 * (1 + i % 50) for i, s in enumerate(syms)}
+    t0 = time.perf_counter()
+    for i in range(n_rules):
+        s = rng.choice(syms)
+        kind = rng.choices((KIND_PRICE, KIND_PUMP, KIND_PHASE), weights=(8, 1, 1))[0]
+        if kind == KIND_PRICE:
+            engine.add_rule(i, s, "1h", kind, level=price[s] * rng.uniform(0.8, 1.2),
+                            direction=rng.choice(("up", "down")), once=True)
+        elif kind == KIND_PUMP:
+            engine.add_rule(i, s, "1h", kind, level=rng.uniform(0.5, 0.9))
+        else:
+            engine.add_rule(i, s, "1h", kind)
+    build = time.perf_counter() - t0
+    for s in syms:
+        engine.on_bar(s, "1h", 0, price[s])
+    times = []
+    fired = 0
+    for b in range(1, n_bars + 1):
+        s = syms[b % n_symbols]
+        price[s] *= 1 + rng.gauss(0, 0.01)
+        t = time.perf_counter()
+        fired += len(engine.on_bar(s, "1h", b * 3_600_000, price[s]))
+        times.append(time.perf_counter() - t)
+    times.sort()
+    return {"rules": n_rules, "build_sec": round(build, 3), "bars": n_bars, "fired": fired,
+            "p50_us": round(times[len(times) // 2] * 1e6, 1), "p99_us": round(times[int(len(times) * 0.99)] * 1e6, 1),
+            "max_us": round(times[-1] * 1e6, 1)}
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Бенчмарк индекса алертов watchlist")
+    p.add_argument("--rules", type=int, default=100_000)
+    p.add_argument("--symbols", type=int, default=200)
+    p.add_argument("--bars", type=int, default=2_000)
+    a = p.parse_args()
+    print(bench(a.rules, a.symbols, a.bars))
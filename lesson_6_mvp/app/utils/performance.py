@@ -1,6 +1,9 @@
 # app/utils/performance.py
 """
 Утилиты для мониторинга и оптимизации производительности.
+
+measure_time / measure_time_async / PerformanceMonitor пишут не только debug-лог,
+но и гистограмму alt_forecast_operation_seconds{op=...} (см. utils.metrics).
 """
 
 import time
@@ -11,6 +14,8 @@ import cProfile
 import pstats
 from io import StringIO
 
+from .metrics import OPERATION_SECONDS
+
 logger = logging.getLogger("alt_forecast.performance")
 
 
@@ -26,14 +31,16 @@ def measure_time(func: Callable) -> Callable:
     """
     @wraps(func)
     def wrapper(*args, **kwargs):
-        start = time.time()
+        start = time.perf_counter()
         try:
             result = func(*args, **kwargs)
-            elapsed = time.time() - start
+            elapsed = time.perf_counter() - start
+            OPERATION_SECONDS.observe(elapsed, op=func.__qualname__)
             logger.debug(f"{func.__name__} took {elapsed:.4f}s")
             return result
         except Exception as e:
-            elapsed = time.time() - start
+            elapsed = time.perf_counter() - start
+            OPERATION_SECONDS.observe(elapsed, op=func.__qualname__)
             logger.warning(f"{func.__name__} failed after {elapsed:.4f}s: {e}")
             raise
     return wrapper
@@ -51,14 +58,16 @@ def measure_time_async(func: Callable) -> Callable:
     """
     @wraps(func)
     async def wrapper(*args, **kwargs):
-        start = time.time()
+        start = time.perf_counter()
         try:
             result = await func(*args, **kwargs)
-            elapsed = time.time() - start
+            elapsed = time.perf_counter() - start
+            OPERATION_SECONDS.observe(elapsed, op=func.__qualname__)
             logger.debug(f"{func.__name__} took {elapsed:.4f}s")
             return result
         except Exception as e:
-            elapsed = time.time() - start
+            elapsed = time.perf_counter() - start
+            OPERATION_SECONDS.observe(elapsed, op=func.__qualname__)
             logger.warning(f"{func.__name__} failed after {elapsed:.4f}s: {e}")
             raise
     return wrapper
@@ -112,11 +121,12 @@ class PerformanceMonitor:
         self.start_time = None
     
     def __enter__(self):
-        self.start_time = time.time()
+        self.start_time = time.perf_counter()
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        elapsed = time.time() - self.start_time
+        elapsed = time.perf_counter() - self.start_time
+        OPERATION_SECONDS.observe(elapsed, op=self.operation_name)
         logger.log(
             self.log_level,
             f"{self.operation_name} took {elapsed:.4f}s"
@@ -186,8 +186,8 @@ def render_digest(db: DB, tf: Timeframe, *, n_bars: int = 120) -> bytes:
     Кэшируется на 60 секунд для ускорения повторных запросов.
     Использует ленивую загрузку matplotlib для ускорения старта приложения.
     """
-    from ...utils.performance import PerformanceMonitor
-    from ...infrastructure.cache import get_cache, set_cache
+    from ..utils.performance import PerformanceMonitor
+    from ..infrastructure.cache import get_cache, set_cache
     
     with PerformanceMonitor("render_digest"):
         # Проверяем кэш
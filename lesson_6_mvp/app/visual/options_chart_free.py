@@ -187,3 +187,35 @@ def render_free_series(
     fig.savefig(buf, format="png", dpi=170, bbox_inches="tight")
     plt.close(fig); buf.seek(0)
     return buf.getvalue()
+
+
+def render_intraday_levels(history: List, *, title: str = "Options — intraday levels", mobile: bool = False) -> bytes:
+    """
+    history: [(ts_ms, ExpiryStats), ...] одной экспирации (из OptionsSnapshotStore.history)
+    Линии Max Pain / Call wall / Put wall во времени — смещение уровней внутри дня.
+    """
+    import datetime as _dt
+
+    pts = sorted(history or [], key=lambda p: p[0])
+    fig, ax = plt.subplots(figsize=((6.6, 4.0) if mobile else (10.5, 4.2)), dpi=170)
+    if not pts:
+        ax.text(0.5, 0.5, "No options snapshots", ha="center", va="center", fontsize=14)
+        ax.axis("off")
+    else:
+        xs = [_dt.datetime.fromtimestamp(ts / 1000, tz=_dt.timezone.utc) for ts, _ in pts]
+        for attr, label, style in (("max_pain", "Max Pain", "-"), ("call_wall", "Call wall", "--"),
+                                   ("put_wall", "Put wall", "--")):
+            ys = [_clean_float(getattr(st, attr), float("nan")) for _, st in pts]
+            ax.plot(xs, ys, style, linewidth=2.0 if attr == "max_pain" else 1.4, marker="o", ms=3, label=label)
+        ax.set_title(f"{title} ({pts[-1][1].expiry})")
+        ax.yaxis.set_major_formatter(FuncFormatter(_money_fmt))
+        ax.yaxis.set_major_locator(MaxNLocator(nbins=6))
+        ax.grid(True, axis="y", linestyle="--", alpha=0.3)
+        ax.legend(loc="upper left", frameon=False)
+        fig.autofmt_xdate()
+    fig.tight_layout()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=170, bbox_inches="tight")
+    plt.close(fig); buf.seek(0)
+    return buf.getvalue()
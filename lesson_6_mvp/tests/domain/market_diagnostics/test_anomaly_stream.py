@@ -0,0 +1,142 @@
+# tests/domain/market_diagnostics/test_anomaly_stream.py
+"""
+Тесты потоковых аномалий Market Doctor (domain.market_diagnostics.anomaly_stream): прежние проверки фазы
+и риска без запросов на каждую проверку, выбросы и плавный дрейф, отсутствие ложных срабатываний на шуме.
+"""
+
+import random
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.domain.market_diagnostics.analyzer import MarketPhase
+from app.domain.market_diagnostics.anomaly_detector import AnomalyDetector
+from app.domain.market_diagnostics.anomaly_stream import AnomalyStream, RunningStat
+
+T0 = 1_750_000_000_000
+H = 3_600_000
+
+
+class _Repo:
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = 0
+
+    def get_snapshots(self, symbol=None, timeframe=None, limit=1000, **kw):
+        self.calls += 1
+        rows = [r for r in self.rows if r["symbol"] == symbol and r["timeframe"] == timeframe]
+        return sorted(rows, key=lambda r: -r["timestamp"])[:limit]
+
+
+def _row(i, phase, risk, pump=0.5, symbol="BTCUSDT"):
+    return {"symbol": symbol, "timeframe": "1h", "timestamp": T0 + i * H, "phase": phase,
+            "risk_score": risk, "pump_score": pump}
+
+
+def _diag(phase, risk, pump=0.5):
+    return SimpleNamespace(phase=MarketPhase(phase), risk_score=risk, pump_score=pump)
+
+
+def test_legacy_checks_from_stream_state():
+    repo = _Repo([_row(0, "ACCUMULATION", 0.3), _row(1, "ACCUMULATION", 0.35), _row(2, "EXPANSION_DOWN", 0.6)])
+    det = AnomalyDetector(repo)
+    ph = det.detect_phase_change("BTCUSDT", "1h", MarketPhase.EXPANSION_DOWN)
+    assert (ph.severity, ph.metadata) == ("high", {"previous_phase": "ACCUMULATION", "current_phase": "EXPANSION_DOWN"})
+    risk = det.detect_risk_spike("BTCUSDT", "1h", 0.6)
+    assert risk.anomaly_type == "doctor_concerned" and risk.metadata["previous_risk"] == 0.35
+    assert det.detect_risk_spike("BTCUSDT", "1h", 0.5) is None
+    assert repo.calls == 1                                                      # один прогрев на ряд
+
+    assert AnomalyDetector(_Repo([])).detect_phase_change("ETHUSDT", "1h", MarketPhase.SHAKEOUT) is None
+
+
+def test_detect_all_observes_snapshot_once():
+    repo = _Repo([_row(i, "EXPANSION_UP", 0.3) for i in range(5)])
+    det = AnomalyDetector(repo, stream=AnomalyStream())
+    ts = T0 + 5 * H
+    repo.rows.append(_row(5, "DISTRIBUTION", 0.55))                             # уже сохранён хендлером
+    alerts = det.detect_all_anomalies("BTCUSDT", "1h", _diag("DISTRIBUTION", 0.55),
+                                      {"funding_rate": 0.02, "oi_change_pct": 1.0}, 100.0, timestamp_ms=ts)
+    assert {a.anomaly_type for a in alerts} == {"funding_spike", "phase_change", "doctor_concerned"}
+    assert [a.severity for a in alerts if a.anomaly_type == "phase_change"] == ["medium"]
+    again = det.detect_all_anomalies("BTCUSDT", "1h", _diag("DISTRIBUTION", 0.55), {}, 100.0, timestamp_ms=ts)
+    assert again == [] and repo.calls == 1
+    st = det.stream.state("btcusdt", "1h")
+    assert st.stats["risk"].n == 6 and st.prev_risk == 0.3
+
+
+def _feed(stream, values, key="BTCUSDT", metric="risk_score", start=0):
+    out = []
+    for i, x in enumerate(values):
+        out += [(start + i, a) for a in stream.observe(key, "1h", T0 + (start + i) * H, **{metric: x})]
+    return out
+
+
+def test_gradual_drift_and_outlier():
+    rnd = random.Random(3)
+    stream = AnomalyStream()
+    base = [0.3 + rnd.gauss(0, 0.02) for _ in range(60)]
+    assert _feed(stream, base) == []
+    ramp = [0.3 + 0.015 * (i + 1) + rnd.gauss(0, 0.02) for i in range(25)]
+    assert max(b - a for a, b in zip(ramp, ramp[1:])) < 0.2                 # соседний порог 0.2 не срабатывает
+    events = _feed(stream, ramp, start=60)
+    drift = [a for _, a in events if a.anomaly_type == "risk_drift"]
+    assert drift and drift[0].metadata["direction"] == 1 and drift[0].score > 1
+
+    stream = AnomalyStream()
+    _feed(stream, [0.3 + rnd.gauss(0, 0.02) for _ in range(40)], metric="pump_score")
+    med = stream.state("BTCUSDT", "1h").stats["pump"].med
+    (i, spike), = _feed(stream, [0.95], metric="pump_score", start=40)
+    assert spike.anomaly_type == "pump_outlier" and spike.severity == "high" and spike.score > 6
+    assert abs(stream.state("BTCUSDT", "1h").stats["pump"].med - med) < 0.01  # выброс медиану почти не двигает
+
+
+def test_no_false_alarms_on_stationary_noise():
+    rnd = random.Random(11)
+    stream = AnomalyStream()
+    for i in range(2000):
+        stream.observe("ETHUSDT", "4h", T0 + i * H, risk_score=0.4 + rnd.gauss(0, 0.03),
+                       funding=0.0001 + rnd.gauss(0, 0.00003), oi_change=rnd.gauss(0, 2.0))
+    assert len([a for a in stream.state("ETHUSDT", "4h").events if a.severity != "low"]) <= 3
+
+    rs = RunningStat(halflife=10)
+    for x in (1.0, 2.0, 3.0):
+        rs.update(x)
+    assert rs.n == 3 and rs.last == 3.0                                         # старт — обычное среднее
+    assert (rs.mean, rs.var) == pytest.approx((2.0, 2.0 / 3))
+
+
+def test_universe_checks_are_cheap():
+    stream = AnomalyStream(warmup=2)
+    keys = [f"C{i}USDT" for i in range(500)]
+    t0 = time.perf_counter()
+    for step in range(20):
+        for k in keys:
+            stream.observe(k, "1h", T0 + step * H, risk_score=0.3 + 0.001 * (step % 3), pump_score=0.5,
+                           phase="ACCUMULATION" if step < 19 or k != "C7USDT" else "EXPANSION_DOWN")
+    per_update = (time.perf_counter() - t0) / (20 * len(keys))
+    assert per_update < 2e-4
+
+    t0 = time.perf_counter()
+    active = stream.active(since_ms=T0 + 19 * H, min_severity="high")
+    assert time.perf_counter() - t0 < 0.05
+    assert [(a.symbol, a.anomaly_type) for a in active] == [("C7USDT", "phase_change")]
+
+
+def test_logging_job_warms_series_before_observing():
+    from app.application.services.diagnostics_logging_service import DiagnosticsLoggingService
+
+    repo = _Repo([_row(i, "ACCUMULATION", 0.3 + 0.01 * (i % 3)) for i in range(40)])
+    stream = AnomalyStream()
+    svc = DiagnosticsLoggingService.__new__(DiagnosticsLoggingService)          # только поток и детектор
+    svc.anomaly_stream, svc.anomaly_detector = stream, AnomalyDetector(repo, stream=stream)
+
+    ts = T0 + 40 * H
+    alerts = svc._observe_anomalies("BTCUSDT", "1h", ts, _diag("EXPANSION_DOWN", 0.9),
+                                    {"funding_rate": 0.0001, "oi_change_pct": 1.0})
+    st = stream.state("BTCUSDT", "1h")
+    assert st.ts == ts and st.stats["risk"].n == 41 and st.stats["funding"].n == 1      # история + снимок
+    assert {"phase_change", "doctor_concerned"} <= {a.anomaly_type for a in alerts}
+    assert svc._observe_anomalies("BTCUSDT", "1h", ts, _diag("EXPANSION_DOWN", 0.9), {}) == []
+    assert repo.calls == 1
@@ -0,0 +1,140 @@
+"""
+Тесты для векторного бэктеста (usecases.backtest) и backtest_rsi поверх него.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.usecases import analytics
+from app.usecases.backtest import (
+    STRATEGIES, Backtester, Bars, CostModel, expand_grid, format_table, parse_sweep_args,
+    positions, run_signals,
+)
+
+HOUR_MS = 3_600_000
+T0 = 1_704_067_200_000
+
+
+def _loop_backtest(close, entries, exits, cost):
+    """Эталон: пошаговый if/elif, как в старом backtest_rsi, плюс издержки и equity."""
+    pos, entry, eq = 0, 0.0, 1.0
+    pos_hist, trades, equity = [], [], []
+    for i in range(len(close)):
+        r = close[i] / close[i - 1] - 1.0 if i else 0.0
+        prev = pos
+        if pos == 0 and entries[i]:
+            pos, entry = 1, close[i]
+        elif pos == 1 and exits[i]:
+            trades.append(close[i] / entry * (1 - cost) ** 2 - 1.0)
+            pos = 0
+        eq *= (1.0 + prev * r) * (1.0 - cost) ** abs(pos - prev)
+        pos_hist.append(pos)
+        equity.append(eq)
+    return np.array(pos_hist, dtype=bool), trades, np.array(equity)
+
+
+def _walk(n, seed):
+    rng = np.random.default_rng(seed)
+    return 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, n)))
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_vector_engine_matches_loop(seed):
+    """Позиция, сделки и equity совпадают с циклом, включая вход+выход на одном баре и издержки."""
+    rng = np.random.default_rng(seed)
+    close = _walk(2000, seed)
+    entries = rng.random(2000) < 0.05
+    exits = rng.random(2000) < 0.05
+    entries[:3] = exits[:3] = True          # конфликты подряд в самом начале
+    costs = CostModel(fee_bps=10, slippage_bps=5)
+
+    want_pos, want_trades, want_eq = _loop_backtest(close, entries, exits, costs.per_side)
+    assert (positions(entries, exits) == want_pos).all()
+
+    st = run_signals(close, entries, exits, costs, "1h")
+    assert st.trades == len(want_trades)
+    np.testing.assert_allclose(st.trade_returns, want_trades, rtol=1e-12, atol=1e-15)
+    np.testing.assert_allclose(st.equity, want_eq, rtol=1e-9)
+    assert st.total_ret == pytest.approx(want_eq[-1] - 1.0)
+    assert st.winrate == pytest.approx(np.mean(np.array(want_trades) > 0))
+    assert st.exposure == pytest.approx(want_pos.mean())
+    peak = np.maximum.accumulate(np.r_[1.0, want_eq])[1:]
+    assert st.max_drawdown == pytest.approx((want_eq / peak - 1).min())
+    bar_ret = np.diff(np.r_[1.0, want_eq]) / np.r_[1.0, want_eq[:-1]]
+    assert st.sharpe == pytest.approx(bar_ret.mean() / bar_ret.std(ddof=1) * math.sqrt(8760), rel=1e-6)
+
+
+def _old_backtest_rsi(df, rsi_period=14, lower=30, upper=70):
+    delta = df["c"].diff()
+    up = delta.clip(lower=0).rolling(rsi_period).mean()
+    dn = (-delta.clip(upper=0)).rolling(rsi_period).mean()
+    rsi = (100 - (100 / (1 + up / dn.replace(0, np.nan)))).bfill()
+    pos, entry, pnl, wins, trades = 0, 0.0, [], 0, 0
+    for i in range(1, len(df)):
+        if pos == 0 and rsi.iloc[i - 1] < lower <= rsi.iloc[i]:
+            pos, entry, trades = 1, float(df["c"].iloc[i]), trades + 1
+        elif pos == 1 and rsi.iloc[i - 1] < upper <= rsi.iloc[i]:
+            ret = float(df["c"].iloc[i]) / entry - 1.0
+            wins += int(ret > 0)
+            pnl.append(ret)
+            pos = 0
+    rets = pd.Series(pnl, dtype=float)
+    vol = float(rets.std())
+    return trades, wins / trades * 100.0, float(np.sum(pnl)) * 100.0, float(np.sqrt(252) * rets.mean() / vol)
+
+
+def test_backtest_rsi_keeps_legacy_numbers(temp_db):
+    close = _walk(1500, 7)
+    temp_db.upsert_many_bars([("BTC", "1h", T0 + i * HOUR_MS, c, c * 1.01, c * 0.99, c, 1.0) for i, c in enumerate(close)])
+    res = analytics.backtest_rsi(temp_db, "BTC", "1h")
+    trades, winrate, total, sharpe = _old_backtest_rsi(analytics._ohlcv_df(temp_db, "BTC", "1h", 3000))
+    assert res.trades == trades > 0
+    assert res.winrate == pytest.approx(winrate)
+    assert res.total_ret == pytest.approx(total)
+    assert res.sharpe == pytest.approx(sharpe)
+
+
+def _bars(n, seed):
+    c = _walk(n, seed)
+    return Bars(ts=np.arange(n, dtype=np.int64), high=c * 1.005, low=c * 0.995, close=c)
+
+
+def test_sweep_ranks_all_combinations():
+    """Все валидные комбинации × метрики × ТФ в одной таблице; сортировка по sharpe; издержки снижают доходность."""
+    data = {("BTC", "1h"): _bars(3000, 1), ("ETHBTC", "1h"): _bars(3000, 2)}
+    loader = lambda m, tf, n: data.get((m, tf))
+    grid = {"period": [7, 14], "lower": [25, 30], "upper": [25, 70, 75]}
+    assert sum(len(v) for v in expand_grid(STRATEGIES["rsi"], grid).values()) == 8   # upper ≤ lower отброшены
+
+    bt = Backtester(max_workers=0, chunk=3)
+    res = bt.sweep(loader, "rsi", grid, metrics=["BTC", "ETHBTC", "DOGE"], timeframes=["1h"], min_trades=1)
+    assert res.combos == 16 and res.missing == [("DOGE", "1h")]
+    sharpes = [r.stats.sharpe for r in res.rows if r.stats.trades >= 1 and not math.isnan(r.stats.sharpe)]
+    assert sharpes == sorted(sharpes, reverse=True)
+
+    free = bt.sweep(loader, "rsi", grid, metrics=["BTC"], timeframes=["1h"], costs=CostModel(0, 0))
+    paid = bt.sweep(loader, "rsi", grid, metrics=["BTC"], timeframes=["1h"], costs=CostModel(10, 5))
+    by = lambda res: {tuple(r.params.values()): r.stats for r in res.rows}
+    for key, st in by(free).items():
+        if st.trades:
+            assert by(paid)[key].total_ret < st.total_ret
+
+    # одиночный прогон даёт то же, что строка перебора
+    row = next(r for r in free.rows if r.params == {"period": 14, "lower": 30, "upper": 70})
+    from app.domain import kernels
+    from app.usecases.backtest import cross_up
+    r = kernels.rsi(data[("BTC", "1h")].close, 14)
+    single = run_signals(data[("BTC", "1h")].close, cross_up(r, 30), cross_up(r, 70))
+    assert row.stats.trades == single.trades
+    assert row.stats.sharpe == pytest.approx(single.sharpe)
+
+    text = format_table(res, top=5)
+    assert "<pre>" in text and "DOGE 1h" in text
+
+
+def test_parse_sweep_args():
+    assert parse_sweep_args([], ["BTC", "TOTAL3"]) == ("rsi", ["BTC", "TOTAL3"], ["15m", "1h", "4h", "1d"])
+    assert parse_sweep_args(["ema", "btc,eth", "15m,1h"], ["BTC"]) == ("ema", ["BTC", "ETH"], ["15m", "1h"])
@@ -0,0 +1,101 @@
+"""
+Тесты производных таймфреймов и ярусного retention (infrastructure.bar_rollup).
+"""
+
+import pytest
+
+from app.infrastructure.bar_rollup import BarRollup, bucket_close, parse_retention
+
+M15 = 15 * 60_000
+H1 = 4 * M15
+T0 = 1_735_689_600_000          # 2025-01-01 00:00 UTC (среда)
+
+
+def _fine(db, start, n, metric="BTC", base=100.0, v=1.0):
+    """n баров 15m с закрытием start + M15, start + 2*M15, ...; цены растут на 1."""
+    rows = [(metric, "15m", start + (i + 1) * M15, base + i, base + i + 0.5, base + i - 0.5, base + i + 0.25, v)
+            for i in range(n)]
+    db.upsert_many_bars(rows)
+
+
+def _bar(db, metric, tf, ts):
+    return db.conn.execute("SELECT o, h, l, c, v, src FROM bars WHERE metric=? AND timeframe=? AND ts=?",
+                           (metric, tf, ts)).fetchone()
+
+
+def test_bucket_close_and_retention_spec():
+    assert bucket_close(T0 + M15, "1h") == T0 + H1
+    assert bucket_close(T0 + H1, "1h") == T0 + H1               # правый край включён
+    monday = T0 + 5 * 86_400_000                                 # 2025-01-06
+    assert bucket_close(T0 + 1, "1w") == monday == bucket_close(monday, "1w")
+    assert parse_retention("15m:90d, 1h:2w,1d:0d") == {"15m": 90 * 86_400_000, "1h": 14 * 86_400_000}
+    with pytest.raises(ValueError):
+        parse_retention("15m:90")
+
+
+def test_rollup_incremental_and_marked(temp_db):
+    r = BarRollup(temp_db, targets=("1h", "4h"), lookback=1)
+    _fine(temp_db, T0, 6)                                        # 1h #1 полный, 1h #2 — два из четырёх
+    out = r.run(now_ms=T0 + 6 * M15 + 1)
+    assert out == {"derived": 1}                                 # 1h закрыт только первый, 4h ещё открыт
+    assert tuple(_bar(temp_db, "BTC", "1h", T0 + H1)) == (100.0, 103.5, 99.5, 103.25, 4.0, "rollup")
+    assert _bar(temp_db, "BTC", "1h", T0 + 2 * H1) is None
+
+    _fine(temp_db, T0, 16)
+    out = r.run(now_ms=T0 + 16 * M15 + 1)
+    assert out["derived"] == 4                                   # 1h #2..#4 + закрывшийся 4h
+    assert out["unchanged"] == 1                                 # окно lookback пересчитано без изменений
+    assert tuple(_bar(temp_db, "BTC", "4h", T0 + 4 * H1))[:5] == (100.0, 115.5, 99.5, 115.25, 16.0)
+    assert r.get_stats()["1h"] == {"rollup": 4}
+
+
+def test_rollup_reconciles_ingested(temp_db):
+    _fine(temp_db, T0, 4)
+    temp_db.upsert_bar("BTC", "1h", T0 + H1, 100.0, 103.5, 99.5, 103.25, 7.0)      # совпадает с 15m
+    temp_db.upsert_bar("ETH", "1h", T0 + H1, 1.0, 2.0, 0.5, 1.5, 9.0)
+    _fine(temp_db, T0, 4, metric="ETH", base=10.0, v=None)
+
+    keep = BarRollup(temp_db, targets=("1h",), reconcile="ingested")
+    assert keep.run(now_ms=T0 + H1) == {"match": 1, "conflict": 1}
+    assert _bar(temp_db, "ETH", "1h", T0 + H1)["o"] == 1.0
+
+    temp_db.conn.execute("DELETE FROM bar_rollups")
+    fix = BarRollup(temp_db, targets=("1h",), reconcile="derived")
+    assert fix.run(now_ms=T0 + H1) == {"match": 1, "reconciled": 1}
+    eth = _bar(temp_db, "ETH", "1h", T0 + H1)
+    assert (eth["o"], eth["c"], eth["v"], eth["src"]) == (10.0, 13.25, 9.0, "rollup")   # объём 15m неизвестен — берём принятый
+    assert _bar(temp_db, "BTC", "1h", T0 + H1)["src"] is None
+
+
+def test_retention_waits_for_rollup_and_compacts(temp_db):
+    day = 86_400_000
+    _fine(temp_db, T0, 4 * 96)                                   # 4 дня 15m
+    r = BarRollup(temp_db, targets=("1h", "1d"), lookback=0)
+    now = T0 + 4 * day
+
+    r.run(now_ms=T0 + 2 * day)                                   # свернули только первые двое суток
+    deleted = r.retain(now_ms=now, retention={"15m": day})
+    assert deleted == {"15m": 2 * 96}                            # 3-й день не свёрнут — остаётся, хотя старше суток
+    assert temp_db.get_last_ts("BTC", "1d") == T0 + 2 * day
+
+    r.run(now_ms=now)
+    assert r.retain(now_ms=now, retention={"15m": day}) == {"15m": 95}            # ts < now - 1d
+    assert temp_db.get_last_ts("BTC", "1h") == now and len(temp_db.last_n("BTC", "1h", 1000)) == 96
+
+    assert r.compact(free_ratio=0.0) is True
+    assert temp_db.conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    assert r.compact(free_ratio=0.5) is False
+
+
+def test_retention_guard_is_per_metric(temp_db):
+    day = 86_400_000
+    _fine(temp_db, T0, 4 * 96)
+    _fine(temp_db, T0, 4 * 96, metric="ETH", base=10.0)
+    r = BarRollup(temp_db, targets=("1h",), lookback=0)
+    now = T0 + 4 * day
+
+    r.run(now_ms=now)
+    temp_db.conn.execute("UPDATE bar_rollups SET ts=? WHERE metric='ETH'", (T0 + day,))   # ETH застрял на 1-м дне
+    assert r.retain(now_ms=now, retention={"15m": day}) == {"15m": (3 * 96 - 1) + 96}
+    left = dict(temp_db.conn.execute("SELECT metric, MIN(ts) FROM bars WHERE timeframe='15m' GROUP BY metric"))
+    assert left == {"BTC": now - day, "ETH": T0 + day + M15}
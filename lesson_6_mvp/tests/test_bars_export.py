@@ -0,0 +1,135 @@
+"""
+Тесты для bulk-выгрузки баров (/api/export/bars) и SQL-пагинации /api/bars.
+"""
+
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.infrastructure.rest_api import create_rest_api_router
+
+H = 3_600_000
+T0 = 1_700_000_000_000
+
+
+@pytest.fixture
+def export_client(temp_db):
+    rows = []
+    for metric in ("BTC", "TOTAL2"):
+        for tf, step in (("1h", H), ("4h", 4 * H)):
+            for i in range(10):
+                px = 100.0 + i
+                rows.append((metric, tf, T0 + i * step, px, px + 1, px - 1, px + 0.5, 10.0 + i))
+    temp_db.upsert_many_bars(rows)
+
+    app = FastAPI()
+    create_rest_api_router(app, temp_db)
+    return TestClient(app), temp_db
+
+
+def test_bars_offset_pushed_to_sql(export_client):
+    """Метрика без ТФ: бары всех ТФ, newest→oldest, offset применяется в SQL."""
+    client, _ = export_client
+    all_rows = client.get("/api/bars?metric=BTC&limit=20").json()
+    page = client.get("/api/bars?metric=BTC&limit=5&offset=3").json()
+
+    assert len(all_rows) == 20
+    assert [r["ts"] for r in all_rows] == sorted((r["ts"] for r in all_rows), reverse=True)
+    assert page == all_rows[3:8]
+
+
+def test_bars_single_series_oldest_first(export_client):
+    """Метрика + ТФ: прежний порядок oldest→newest, offset отступает от последнего бара."""
+    client, _ = export_client
+    bars = client.get("/api/bars?metric=BTC&timeframe=1h&limit=3").json()
+    assert [b["ts"] for b in bars] == [T0 + 7 * H, T0 + 8 * H, T0 + 9 * H]
+    page = client.get("/api/bars?metric=BTC&timeframe=1h&limit=3&offset=2").json()
+    assert [b["ts"] for b in page] == [T0 + 5 * H, T0 + 6 * H, T0 + 7 * H]
+
+
+def test_bars_by_metric_timeframe_fields(export_client):
+    """Поля бара берутся из правильных колонок (ts, o, h, l, c, v)."""
+    client, _ = export_client
+    bars = client.get("/api/bars/BTC/1h?limit=2").json()
+
+    assert [b["ts"] for b in bars] == [T0 + 8 * H, T0 + 9 * H]
+    assert bars[-1]["open"] == 109.0 and bars[-1]["close"] == 109.5 and bars[-1]["volume"] == 19.0
+    assert bars[-1]["timestamp_iso"].endswith("Z")
+
+
+def test_export_keyset_pagination_covers_all_rows(export_client):
+    """Страницы по курсору без пропусков и повторов, в порядке (metric, timeframe, ts)."""
+    client, _ = export_client
+    seen, cursor = [], None
+    while True:
+        url = "/api/export/bars?metrics=BTC,TOTAL2&timeframes=1h,4h&format=rows&limit=7"
+        if cursor:
+            url += f"&cursor={cursor}"
+        body = client.get(url).json()
+        seen.extend(tuple(r[:3]) for r in body["rows"])
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+
+    assert len(seen) == 40
+    assert seen == sorted(seen)
+
+
+def test_export_columnar_and_range(export_client):
+    """Колоночный формат группирует по сериям, since/until фильтруют в SQL."""
+    client, _ = export_client
+    body = client.get(
+        f"/api/export/bars?metrics=BTC&timeframes=1h&since={T0 + 2 * H}&until={T0 + 4 * H}"
+    ).json()
+
+    assert body["count"] == 3
+    (series,) = body["series"]
+    assert series["metric"] == "BTC" and series["timeframe"] == "1h"
+    assert series["ts"] == [T0 + 2 * H, T0 + 3 * H, T0 + 4 * H]
+    assert series["c"] == [102.5, 103.5, 104.5]
+
+
+def test_export_ndjson_streams_whole_range(export_client):
+    """NDJSON отдаёт весь диапазон независимо от limit."""
+    client, _ = export_client
+    resp = client.get("/api/export/bars?metrics=BTC,TOTAL2&format=ndjson&limit=3")
+    lines = [json.loads(x) for x in resp.text.splitlines()]
+
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    assert len(lines) == 40
+    assert lines[0][:3] == ["BTC", "1h", T0]
+
+
+def test_export_etag_and_304(export_client):
+    """Повторный запрос с If-None-Match → 304, новый бар меняет ETag."""
+    client, db = export_client
+    url = "/api/export/bars?metrics=BTC&timeframes=1h"
+    first = client.get(url)
+    etag = first.headers["etag"]
+
+    assert first.headers["last-modified"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    db.upsert_bar("BTC", "1h", T0 + 10 * H, 1, 2, 0.5, 1.5, 1)
+    fresh = client.get(url, headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert fresh.headers["etag"] != etag
+
+    etag = fresh.headers["etag"]
+    db.upsert_bar("BTC", "1h", T0 - H, 1, 2, 0.5, 1.5, 1)                     # дозагрузка истории
+    backfilled = client.get(url, headers={"If-None-Match": etag})
+    assert backfilled.status_code == 200 and backfilled.headers["etag"] != etag
+
+    etag = backfilled.headers["etag"]
+    db.upsert_bar("BTC", "1h", T0 + 3 * H, 1, 2, 0.5, 7.5, 1)                 # правка старого бара
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_export_validation(export_client):
+    """Неизвестные метрики/форматы/курсоры → 400."""
+    client, _ = export_client
+    assert client.get("/api/export/bars?metrics=NOPE").status_code == 400
+    assert client.get("/api/export/bars?metrics=BTC&format=xml").status_code == 400
+    assert client.get("/api/export/bars?metrics=BTC&cursor=broken").status_code == 400
@@ -0,0 +1,122 @@
+"""
+Тесты для батч-инференса прогнозов (ml.batch_forecaster) и загрузки баров пачкой.
+"""
+
+import asyncio
+import pickle
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.ml import batch_forecaster, data_adapter, model
+from app.ml.batch_forecaster import STATUS_NO_DATA, STATUS_NO_MODEL, STATUS_OK, BatchForecaster
+from app.ml.forecaster import forecast_symbol
+
+T0 = 1_704_067_200
+
+
+class LinearReg:
+    """Пиклуемая «модель»: линейная комбинация первых признаков; считает вызовы predict."""
+    calls = 0
+
+    def predict(self, X):
+        LinearReg.calls += 1
+        X = np.asarray(X)
+        return 0.01 * np.tanh(X[:, 0]) - 0.002 * np.tanh(X[:, 1])
+
+
+class LogisticCls:
+    def predict_proba(self, X):
+        p = 1.0 / (1.0 + np.exp(-np.tanh(np.asarray(X)[:, 0])))
+        return np.column_stack([1.0 - p, p])
+
+
+def _bars(seed, n=400):
+    rng = np.random.default_rng(seed)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, n)))
+    return pd.DataFrame({
+        "ts": pd.to_datetime(T0 + np.arange(n) * 3600, unit="s", utc=True),
+        "open": close * 0.999, "high": close * 1.01, "low": close * 0.99, "close": close,
+        "volume": rng.uniform(100.0, 1000.0, n),
+    })
+
+
+def _save_model(path, features):
+    with open(path, "wb") as f:
+        pickle.dump({"reg": LinearReg(), "cls": LogisticCls(), "meta": {"features": features}}, f)
+
+
+@pytest.fixture
+def frames():
+    return {"ETHUSDT": _bars(1), "SOLUSDT": _bars(2), "XRPUSDT": _bars(3)}
+
+
+@pytest.fixture
+def feature_names(frames):
+    from app.ml.features import build_features
+    feats = build_features(frames["ETHUSDT"])
+    return list(feats.drop(columns=batch_forecaster.BASE_COLS, errors="ignore").columns)
+
+
+def test_batch_matches_single_forecast_and_reports_missing(tmp_path, monkeypatch, frames, feature_names):
+    """Батч = forecast_symbol по тем же данным; без модели — no_model без обучения, без баров — no_data."""
+    for sym in ("ETHUSDT", "SOLUSDT", "ADAUSDT"):
+        _save_model(tmp_path / f"{sym}_1h_h24.pkl", feature_names)
+    monkeypatch.setattr(model, "MODELS_DIR", tmp_path)
+    monkeypatch.setattr(model, "train_models", lambda *a, **k: pytest.fail("batch must not train"))
+
+    loads = []
+
+    def loader_many(symbols, tf, limit):
+        loads.append(list(symbols))
+        return {s: frames[s] for s in symbols if s in frames}
+
+    bf = BatchForecaster(loader_many=loader_many, models_dir=tmp_path, max_workers=0)
+    report = asyncio.run(bf.run(["ETH", "SOLUSDT", "XRP", "ADA"], "1h", 24))
+
+    assert loads == [["ETHUSDT", "SOLUSDT", "ADAUSDT"]]  # один проход загрузки, только символы с моделью
+    assert [it.status for it in report.items] == [STATUS_OK, STATUS_OK, STATUS_NO_MODEL, STATUS_NO_DATA]
+    assert report.missing_models == ["XRPUSDT"]
+
+    for it in report.ok:
+        single = forecast_symbol(lambda s, tf: frames[s], it.symbol, "1h", horizon=24)
+        assert it.result["ret_pred"] == pytest.approx(single["ret_pred"], rel=1e-9, abs=1e-12)
+        assert it.result["p_up"] == pytest.approx(single["p_up"], rel=1e-9)
+
+
+def test_family_model_runs_one_predict_per_group(tmp_path, frames, feature_names):
+    """Общая модель семейства: вся группа считается одним вызовом predict."""
+    _save_model(tmp_path / "ALTS_1h_h24.pkl", feature_names)
+    bf = BatchForecaster(loader_many=lambda s, tf, n: frames, models_dir=tmp_path,
+                         max_workers=0, family_model="alts")
+
+    groups, missing = bf.plan(frames, "1h", 24)
+    assert list(groups.values()) == [list(frames)] and missing == []
+
+    LinearReg.calls = 0
+    report = asyncio.run(bf.run(list(frames), "1h", 24))
+    assert len(report.ok) == 3 and LinearReg.calls == 1
+
+
+def test_load_bars_many_single_query(tmp_path, monkeypatch):
+    """SQLite с колонкой символа читается одним запросом на весь список, limit — на символ."""
+    db = tmp_path / "ohlcv.db"
+    con = sqlite3.connect(str(db))
+    con.execute("CREATE TABLE ohlcv(symbol TEXT, tf TEXT, ts INTEGER, open REAL, high REAL, low REAL, close REAL, volume REAL)")
+    for sym in ("ETHUSDT", "SOLUSDT"):
+        for i in range(50):
+            con.execute("INSERT INTO ohlcv VALUES(?,?,?,?,?,?,?,?)", (sym, "1h", T0 + i * 3600, 1, 2, 0.5, 1.5, 10))
+    con.commit()
+    con.close()
+
+    monkeypatch.setenv("OHLCV_DB", str(db))
+    monkeypatch.setattr(data_adapter, "_SQLITE_CANDIDATES", [])
+    monkeypatch.setattr(data_adapter, "_load_from_tv", lambda *a, **k: None)
+    monkeypatch.setattr(data_adapter, "_DATA_DIRS", [])
+
+    out = data_adapter.load_bars_many(["ETH", "SOLUSDT", "DOGE"], "1h", limit=20)
+    assert sorted(out) == ["ETHUSDT", "SOLUSDT"]
+    assert all(len(df) == 20 for df in out.values())
+    assert out["ETHUSDT"]["ts"].iloc[-1] == pd.Timestamp(T0 + 49 * 3600, unit="s", tz="UTC")
@@ -0,0 +1,177 @@
+"""
+Тесты пула потребителей (infrastructure.consumer_pool) на in-memory брокере:
+микро-батчи, correlation id, повторы и DLQ, prefetch, ForecastBatchHandler.
+"""
+
+import asyncio
+import json
+
+from app.infrastructure.broker import MemoryBroker
+from app.infrastructure.consumer_pool import ATTEMPTS_HEADER, BatchHandler, ConsumerPool, PoisonMessage
+from app.infrastructure.forecast_worker import ForecastBatchHandler
+from app.ml.batch_forecaster import BatchForecaster
+
+
+class _Echo(BatchHandler):
+    def __init__(self, fail=(), delay=0.0):
+        self.batches = []
+        self.fail = set(fail)
+        self.delay = delay
+
+    def batch_key(self, message):
+        if "k" not in message:
+            raise PoisonMessage("no key")
+        return message["k"]
+
+    async def handle(self, key, messages):
+        self.batches.append((key, [m["n"] for m in messages]))
+        await asyncio.sleep(self.delay)
+        return [RuntimeError("boom") if m["n"] in self.fail else {"n": m["n"] * 10} for m in messages]
+
+
+async def _run_until(pool, broker, done, timeout=5.0):
+    runner = asyncio.create_task(pool.run())
+    for _ in range(int(timeout / 0.01)):
+        await asyncio.sleep(0.01)
+        if done():
+            break
+    pool.stop()
+    await runner
+
+
+def _publish_all(broker, queue, items, **kw):
+    async def go():
+        for i, body in enumerate(items):
+            raw = body if isinstance(body, bytes) else json.dumps(body).encode()
+            await broker.publish(queue, raw, correlation_id=f"c{i}", **kw)
+    return go()
+
+
+def test_batches_by_key_and_replies_with_correlation_id():
+    broker = MemoryBroker()
+    handler = _Echo()
+    pool = ConsumerPool(broker, ["jobs"], handler, consumers=2, prefetch=8, batch_max=4, batch_wait=0.05)
+
+    async def main():
+        await _publish_all(broker, "jobs", [{"k": "a" if n % 2 else "b", "n": n} for n in range(10)], reply_to="me")
+        await _run_until(pool, broker, lambda: broker.depth("me") == 10)
+
+    asyncio.run(main())
+    replies = {m.correlation_id: json.loads(m.body) for m in broker.drain("me")}
+    assert replies == {f"c{n}": {"n": n * 10} for n in range(10)}
+    assert sorted(n for _, ns in handler.batches for n in ns) == list(range(10))
+    assert all(len(ns) <= 4 and all((n % 2 == 1) == (key == "a") for n in ns) for key, ns in handler.batches)
+    assert len(handler.batches) < 10                              # сообщения реально склеивались
+    assert pool.get_stats()["ok"] == 10 and broker.unacked == 0
+
+
+def test_poison_and_retries_go_to_dlq():
+    broker = MemoryBroker()
+    handler = _Echo(fail={1})
+    pool = ConsumerPool(broker, ["jobs"], handler, consumers=1, prefetch=4, batch_max=8, batch_wait=0.01,
+                        max_attempts=3, results_queue="out")
+
+    async def main():
+        await _publish_all(broker, "jobs", [b"not json", {"n": 0}, {"k": "a", "n": 1}, {"k": "a", "n": 2}])
+        await _run_until(pool, broker, lambda: broker.depth("jobs.dlq") == 3)
+
+    asyncio.run(main())
+    dead = broker.drain("jobs.dlq")
+    assert sorted(m.correlation_id for m in dead) == ["c0", "c1", "c2"]
+    retried = next(m for m in dead if m.correlation_id == "c2")
+    assert retried.headers[ATTEMPTS_HEADER] == 3 and "boom" in retried.headers["x-error"]
+    assert [json.loads(m.body) for m in broker.drain("out")] == [{"n": 20}]
+    stats = pool.get_stats()
+    assert (stats["poison"], stats["retry"], stats["dead"], stats["ok"]) == (2, 2, 1, 1)
+
+
+def test_prefetch_bounds_unacked_and_stop_requeues():
+    broker = MemoryBroker()
+    handler = _Echo(delay=0.05)
+    pool = ConsumerPool(broker, ["jobs"], handler, consumers=2, prefetch=3, batch_max=100, batch_wait=0.01)
+
+    async def main():
+        await _publish_all(broker, "jobs", [{"k": "a", "n": n} for n in range(40)])
+        await _run_until(pool, broker, lambda: broker.depth("forecast_results") >= 12)
+
+    asyncio.run(main())
+    assert broker.max_unacked <= 2 * 3
+    assert broker.unacked == 0
+    assert broker.depth("forecast_results") + broker.depth("jobs") == 40           # ничего не потеряно при stop
+
+
+def test_forecast_handler_dedups_symbols_per_batch(tmp_path):
+    bf = BatchForecaster(loader_many=lambda symbols, tf, limit: {}, models_dir=tmp_path, max_workers=0)
+    handler = ForecastBatchHandler(forecaster=bf)
+    assert handler.batch_key({"task_type": "forecast", "payload": {"symbol": "eth", "timeframe": "4h"}}) == \
+        ("forecast", "4h", 24)
+    for bad in ({"task_type": "forecast", "payload": {}}, {"task_type": "nope"},
+                {"task_type": "forecast_btc", "payload": {"horizon": "x"}}):
+        try:
+            handler.batch_key(bad)
+            raise AssertionError(bad)
+        except PoisonMessage:
+            pass
+
+    msgs = [{"task_type": "forecast", "payload": {"symbol": s}} for s in ("eth", "SOL", "ETH")]
+    out = asyncio.run(handler.handle(("forecast", "1h", 24), msgs))
+    assert [(r["symbol"], r["status"]) for r in out] == [("ETHUSDT", "no_model"), ("SOLUSDT", "no_model"),
+                                                      ("ETHUSDT", "no_model")]
+
+
+def test_replies_to_client_queue_are_not_declared():
+    """Ответ в reply_to клиента уходит без declare/bind; свои очереди (results, задачи) объявляются."""
+    from types import SimpleNamespace
+
+    from app.infrastructure.broker import AmqpBroker
+
+    calls = []
+
+    class _Exchange:
+        async def publish(self, message, routing_key):
+            calls.append(("publish", routing_key))
+
+    class _Queue:
+        async def bind(self, exchange, routing_key):
+            calls.append(("bind", routing_key))
+
+    class _Channel:
+        default_exchange = _Exchange()
+
+        async def declare_exchange(self, name, kind, durable):
+            return name
+
+        async def declare_queue(self, name, durable):
+            calls.append(("declare", name))
+            return _Queue()
+
+    broker = AmqpBroker("amqp://test/")
+    broker._aio_pika = SimpleNamespace(Message=lambda body, **kw: body, ExchangeType=SimpleNamespace(DIRECT="direct"),
+                                       DeliveryMode=SimpleNamespace(PERSISTENT=2))
+    broker._channel = _Channel()
+
+    async def main():
+        await broker.publish("amq.rabbitmq.reply-to.g1h2", b"{}", declare=False)
+        await broker.publish("forecast_results", b"{}")
+
+    asyncio.run(main())
+    assert calls == [("publish", "amq.rabbitmq.reply-to.g1h2"), ("declare", "forecast_results"),
+                     ("bind", "forecast_results"), ("publish", "forecast_results")]
+
+    seen = []
+
+    class _Recording(MemoryBroker):
+        async def publish(self, queue, body, **kw):
+            seen.append((queue, kw.get("declare", True)))
+            await super().publish(queue, body, **kw)
+
+    rec = _Recording()
+    pool = ConsumerPool(rec, ["jobs"], _Echo(), consumers=1, prefetch=4, batch_max=4, batch_wait=0.01)
+
+    async def run_pool():
+        await _publish_all(rec, "jobs", [{"k": "a", "n": 1}], reply_to="client.excl")
+        await _publish_all(rec, "jobs", [{"k": "a", "n": 2}])
+        await _run_until(pool, rec, lambda: rec.depth("client.excl") == 1 and rec.depth(pool.results_queue) == 1)
+
+    asyncio.run(run_pool())
+    assert ("client.excl", False) in seen and (pool.results_queue, True) in seen
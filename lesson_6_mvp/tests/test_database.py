@@ -94,3 +94,60 @@ def test_upsert_many_bars(temp_db):
 
 
 
+
+
+def test_last_n_cache_invalidated_by_writes(temp_db):
+    """Кэш last_n/last_n_closes сбрасывается после записи баров."""
+    now_ms = int(time.time() * 1000)
+    temp_db.upsert_bar("BTC", "1h", now_ms - 3600000, 1.0, 2.0, 0.5, 1.5, 10.0)
+    assert len(temp_db.last_n("BTC", "1h", 10)) == 1
+    assert len(temp_db.last_n_closes("BTC", "1h", 10)) == 1
+
+    temp_db.upsert_bar("BTC", "1h", now_ms, 1.5, 2.5, 1.0, 2.0, 10.0)
+    assert len(temp_db.last_n("BTC", "1h", 10)) == 2
+    assert temp_db.last_n_closes("BTC", "1h", 10)[-1] == (now_ms, 2.0)
+
+
+def test_bar_write_invalidates_only_its_series(temp_db):
+    """Запись бара сбрасывает кэш только своей серии (metric, timeframe), по индексу групп."""
+    from app.infrastructure import cache
+
+    now_ms = int(time.time() * 1000)
+    temp_db.upsert_many_bars([("BTC", "1h", now_ms, 1.0, 2.0, 0.5, 1.5, 10.0),
+                              ("ETH", "1h", now_ms, 1.0, 2.0, 0.5, 1.5, 10.0)])
+    temp_db.last_n("BTC", "1h", 10)
+    temp_db.last_n("ETH", "1h", 10)
+
+    temp_db.upsert_many_bars([("BTC", "1h", now_ms + 3600000, 1.5, 2.5, 1.0, 2.0, 10.0)])
+
+    keys = {k[1] for k in cache._cache if k[0] == "DB.last_n"}
+    assert f"{temp_db.path}|ETH_1h_10" in keys and f"{temp_db.path}|BTC_1h_10" not in keys
+    assert len(temp_db.last_n("BTC", "1h", 10)) == 2
+    assert ("DB.last_n", (temp_db.path, "BTC", "1h")) in cache._groups
+
+
+def test_thread_connections_closed_when_threads_exit(tmp_path):
+    """Соединение потока закрывается при его завершении: короткоживущие потоки не копят _conns."""
+    import gc
+    import threading
+
+    db = DB(str(tmp_path / "threads.db"))
+    try:
+        seen = []
+
+        def work():
+            seen.append(db.conn)
+            db.upsert_bar("BTC", "1h", 1_700_000_000_000 + len(seen), 1.0, 2.0, 0.5, 1.5, 1.0)
+
+        for _ in range(50):
+            t = threading.Thread(target=work)
+            t.start()
+            t.join()
+        gc.collect()
+
+        assert len(db._conns) == 1                                   # осталось только соединение главного потока
+        assert len(db.last_n("BTC", "1h", 100)) == 50
+        with pytest.raises(Exception):
+            seen[0].execute("SELECT 1")                              # соединение завершившегося потока закрыто
+    finally:
+        db.close()
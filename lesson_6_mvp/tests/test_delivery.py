@@ -0,0 +1,161 @@
+"""
+Тесты доставки (infrastructure.delivery) против фейкового Bot API (infrastructure.fake_bot_api).
+"""
+
+import asyncio
+import time
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
+
+from app.infrastructure.delivery import (
+    LANE_ALERT, LANE_BROADCAST, DeliveryRateLimiter, Outbox, TokenBucket, decode_payload, delivery_lane,
+    encode_payload, split_html,
+)
+from app.infrastructure.fake_bot_api import FakeBotApi
+from app.utils.metrics import DELIVERY_MESSAGES
+
+
+async def _with_bot(coro_fn, limiter=None, **server_kw):
+    server = FakeBotApi(**server_kw)
+    await server.start()
+    bot = server.bot(rate_limiter=limiter)
+    await bot.initialize()
+    try:
+        return await coro_fn(server, bot)
+    finally:
+        await bot.shutdown()
+        await server.stop()
+
+
+def test_token_bucket():
+    b = TokenBucket(rate=2.0, burst=2.0, now=0.0)
+    b.take(0.0)
+    b.take(0.0)
+    assert b.delay(0.0) == 0.5
+    assert b.delay(0.5) == 0.0
+    b.hold(10.0)
+    assert b.delay(1.0) == 9.0
+
+
+def test_payload_roundtrip_shares_files():
+    kb = InlineKeyboardMarkup([[InlineKeyboardButton("ok", callback_data="ui:ok")]])
+    png = b"\x89PNG fake"
+    payload, files = encode_payload({"photo": png, "caption": "<b>x</b>", "reply_markup": kb, "parse_mode": None})
+    assert list(files.values()) == [png] and "parse_mode" not in payload
+    kwargs = decode_payload(payload, files)
+    assert kwargs["photo"] == png and kwargs["reply_markup"] == kb
+
+    payload, files = encode_payload({"media": [InputMediaPhoto(png, caption="a"), InputMediaPhoto(png)]})
+    assert len(files) == 1                                   # один и тот же PNG хранится один раз
+    media = decode_payload(payload, files)["media"]
+    assert [m.caption for m in media] == ["a", None]
+
+    assert split_html("a\n" * 10, limit=6) == ["a\na\na\n"] * 3 + ["a\n"]
+
+
+def test_limiter_paces_global_and_per_chat():
+    """Без лимитера пачка ловит 429; с лимитером — ни одного, окна 1с в пределах лимитов сервера."""
+    async def blast(server, bot):
+        await asyncio.gather(*(bot.send_message(chat_id=1 + i % 5, text=str(i)) for i in range(40)),
+                             return_exceptions=True)
+        return server
+
+    naive = asyncio.run(_with_bot(blast, global_rps=20, chat_rps=3))
+    assert naive.rejected[429] > 0
+
+    limiter = DeliveryRateLimiter(global_rps=16, global_burst=4, chat_rps=2, chat_burst=1, max_retries=0)
+    paced = asyncio.run(_with_bot(blast, limiter=limiter, global_rps=20, chat_rps=3))
+    assert paced.rejected[429] == 0 and len(paced.sent) == 40
+    assert paced.max_per_window() <= 20
+    assert max(paced.max_per_window(chat_id=c) for c in range(1, 6)) <= 3
+
+
+def test_limiter_honors_retry_after():
+    limiter = DeliveryRateLimiter(global_rps=1000, global_burst=1000, chat_rps=1000, chat_burst=1000)
+
+    async def run(server, bot):
+        await bot.send_message(chat_id=7, text="a")           # занимает единственный слот чата на 1с
+        t0 = time.monotonic()
+        await bot.send_message(chat_id=7, text="b")           # 429 retry_after=1 → лимитер ждёт и повторяет
+        return server, time.monotonic() - t0
+
+    server, waited = asyncio.run(_with_bot(run, limiter=limiter, chat_rps=1))
+    assert server.rejected[429] == 1 and [m[3]["text"] for m in server.sent] == ["a", "b"]
+    assert waited >= 0.9 and limiter.flood_events == 1
+
+
+def test_interactive_preempts_broadcast():
+    limiter = DeliveryRateLimiter(global_rps=10, global_burst=1, chat_rps=100, chat_burst=100)
+
+    async def run(server, bot):
+        with delivery_lane(LANE_BROADCAST):
+            bulk = [asyncio.create_task(bot.send_message(chat_id=100 + i, text="bulk")) for i in range(10)]
+        await asyncio.sleep(0.05)
+        t0 = time.monotonic()
+        await bot.send_message(chat_id=1, text="reply")
+        took = time.monotonic() - t0
+        await asyncio.gather(*bulk)
+        return server, took
+
+    server, took = asyncio.run(_with_bot(run, limiter=limiter, global_rps=1000))
+    order = [m[3]["text"] for m in server.sent]
+    assert order.index("reply") <= 3 and took < 0.5
+
+
+def test_outbox_lanes_dedup_retry_forbidden(temp_db):
+    box = Outbox(temp_db, concurrency=4, backoff_sec=0.01)
+    removed = []
+    box.on_forbidden = removed.append
+    kb = InlineKeyboardMarkup([[InlineKeyboardButton("ok", callback_data="ui:ok")]])
+
+    assert box.broadcast([1, 2, 3], text="digest", reply_markup=kb) == 3
+    assert box.broadcast([1, 2, 3], text="digest", reply_markup=kb) == 0          # дубль в окне
+    box.enqueue(2, text="second for 2")
+    box.enqueue(4, "send_photo", lane=LANE_ALERT, photo=b"png-bytes", caption="alert")
+    assert box.backlog() == {LANE_ALERT: 1, LANE_BROADCAST: 4}
+    assert DELIVERY_MESSAGES.value(lane="broadcast", outcome="dedup") >= 3
+    first = box._claim(1, set())                              # alert раньше broadcast
+    assert [x.chat_id for x in first] == [4]
+    box._finish(first[0], "pending", retry_in=0, count_attempt=False)
+
+    async def run(server, bot):
+        server.blocked.add(3)
+        server.fail_next = 1
+        await box.drain(bot)
+        await asyncio.sleep(0.1)                              # backoff сетевой ошибки
+        await box.drain(bot)
+        return server
+
+    server = asyncio.run(_with_bot(run))
+    assert server.rejected[502] == 1 and removed == [3]
+    assert server.messages(4)[0][1] == "sendPhoto"
+    assert [m[3].get("text") for m in server.messages(2)] == ["digest", "second for 2"]   # FIFO внутри чата
+    assert "reply_markup" in server.messages(1)[0][3]
+    stats = box.get_stats()
+    assert stats["by_status"] == {"sent": 4, "failed": 1} and stats["backlog"] == {}
+    box.close()
+
+
+def test_outbox_survives_restart_and_dispatcher(temp_db):
+    box = Outbox(temp_db)
+    box.broadcast([10, 11], text="hello")
+    box.conn.execute("UPDATE tg_outbox SET status='sending' WHERE chat_id=10")    # упали посреди отправки
+    box.close()
+
+    box = Outbox(temp_db)
+    assert sum(box.backlog().values()) == 2
+
+    async def run(server, bot):
+        box.start(bot)
+        box.enqueue(12, lane=LANE_ALERT, text="late")
+        for _ in range(100):
+            if not box.backlog():
+                break
+            await asyncio.sleep(0.02)
+        await box.stop()
+        return server
+
+    server = asyncio.run(_with_bot(run))
+    assert sorted(m[2] for m in server.sent) == [10, 11, 12]
+    assert box.purge(keep_sec=0) == 0                          # окно дедупликации ещё держит записи
+    box.close()
@@ -0,0 +1,120 @@
+"""
+Тесты сборщика и хранилища деривативов (infrastructure.derivatives_store): один запрос premiumIndex на рынок,
+ограниченный пул по символам, свежесть по полям, признаки из истории и чтение в MarketDataService.
+"""
+
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.infrastructure import derivatives_client, liquidations, market_data
+from app.infrastructure.derivatives_store import DerivativesCollector, DerivativesStore, get_derivatives_store
+from app.infrastructure.market_data_service import MarketDataService
+
+NOW = 1_750_000_000_000
+MIN = 60_000
+
+
+def _fake_exchanges(monkeypatch, oi=None, fail=()):
+    calls = {"premium": 0, "oi": 0, "liq": [], "cvd": 0, "active": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def premium():
+        calls["premium"] += 1
+        return {"BTCUSDT": {"fundingRate": 0.0001, "markPrice": 100_500.0, "indexPrice": 100_000.0},
+                "ETHUSDT": {"fundingRate": -0.0002, "markPrice": 3_000.0, "indexPrice": 3_000.0}}
+
+    def open_interest(symbol):
+        with lock:
+            calls["oi"] += 1
+            calls["active"] += 1
+            calls["peak"] = max(calls["peak"], calls["active"])
+        time.sleep(0.02)
+        with lock:
+            calls["active"] -= 1
+        if symbol[:-4] in fail:
+            raise RuntimeError("down")
+        return (oi or {}).get(symbol[:-4], 10.0)
+
+    def liqs(base, start_ms, end_ms, limit=200):
+        calls["liq"].append((base, start_ms, end_ms))
+        return 1000.0, 500.0, 3
+
+    monkeypatch.setattr(market_data, "binance_premium_index_all", premium)
+    monkeypatch.setattr(market_data, "binance_open_interest", open_interest)
+    monkeypatch.setattr(liquidations, "bybit_liqs_window", liqs)
+    monkeypatch.setattr(derivatives_client, "has_api_key", lambda: False)
+    return calls
+
+
+def test_collector_batches_and_bounds_concurrency(temp_db, monkeypatch):
+    calls = _fake_exchanges(monkeypatch, fail=("SOL",))
+    store = DerivativesStore(temp_db, max_age_sec=900)
+    coll = DerivativesCollector(store, workers=3, liq_top=2, interval_sec=300)
+    syms = ["BTC", "ETHUSDT", "SOL", "DOGE", "XRP", "ADA", "BTC"]
+    out = coll.collect(syms, now_ms=NOW)
+    assert calls["premium"] == 1 and calls["oi"] == 6 and calls["peak"] <= 3
+    assert out["symbols"] == 6 and out["errors"] == 1
+    assert sorted(calls["liq"]) == [("BTC", NOW - 300 * 1000, NOW), ("ETH", NOW - 300 * 1000, NOW)]   # потоки — в любом порядке
+    assert calls["cvd"] == 0                                                    # без ключа CoinGlass CVD не пишем
+
+    btc = store.latest("BTCUSDT", now_ms=NOW + MIN)
+    assert btc["basis_pct"].value == pytest.approx(0.5) and btc["oi_usd"].value == pytest.approx(10 * 100_500.0)
+    assert btc["funding_rate"].age_sec == 60 and btc["funding_rate"].fresh
+    assert "oi" not in store.latest("SOL", now_ms=NOW) and "funding_rate" not in store.latest("DOGE")
+
+    coll.collect(["BTC"], now_ms=NOW + 5 * MIN)
+    assert calls["liq"][-1][1:] == (NOW, NOW + 5 * MIN)                         # окно — от прошлого сбора
+
+
+def test_freshness_history_and_features(temp_db):
+    store = DerivativesStore(temp_db, max_age_sec=600)
+    rng = np.random.default_rng(3)
+    for i in range(48):
+        ts = NOW - (47 - i) * 30 * MIN
+        store.write("BTC", ts, {"funding_rate": 0.0001 + rng.normal(0, 1e-5), "oi": 1000.0 + i * 10,
+                                "cvd": 5.0 * i, "liq_long_usd": 100.0})
+    store.write("BTC", NOW, {"funding_rate": 0.0004})
+    store.write("ETH", NOW - 3600_000, {"funding_rate": 0.0001, "mark": float("nan")})
+
+    view = store.get_derivatives("BTC", fields=("funding_rate", "oi"), window_sec=3 * 3600, now_ms=NOW)
+    assert set(view.fields) == {"funding_rate", "oi"} and view.fresh
+    ts, vals = view.history["oi"]
+    assert len(ts) == 7 and vals[-1] == 1470.0 and ts.dtype == np.int64
+
+    eth = store.get_derivatives("ETH", now_ms=NOW)
+    assert not eth.fields["funding_rate"].fresh and eth.value("funding_rate") is None
+    assert eth.value("funding_rate", fresh_only=False) == 0.0001 and "mark" not in eth.fields
+
+    f = store.features("BTC", now_ms=NOW)
+    assert f["funding_z"] > 5
+    assert f["oi_change_pct"] == pytest.approx((1470.0 / 1450.0 - 1) * 100)
+    assert f["cvd_slope"] == pytest.approx(10.0)
+    assert f["liq_long_usd"] == 200.0 and f["liq_short_usd"] is None
+
+    fresh = DerivativesStore(temp_db, max_age_sec=600)                          # последние точки — из БД
+    assert fresh.latest_value("BTC", "funding_rate", NOW) == 0.0004
+    assert store.retain(now_ms=NOW + 30 * 86_400_000 - 3600_000 + 1) == 46 * 4 + 1         # до NOW-1h включительно
+
+
+def test_market_data_service_reads_store(temp_db, monkeypatch):
+    store = get_derivatives_store(temp_db)
+    now = int(time.time() * 1000)
+    store.write("BTC", now - 3600_000, {"oi": 1000.0})
+    store.write("BTC", now - 1800_000, {"cvd": 510.0})
+    store.write("BTC", now, {"funding_rate": 0.0003, "oi": 1100.0, "oi_usd": 1.1e8, "cvd": 520.0})
+    monkeypatch.setattr(market_data, "binance_funding_and_mark",
+                        lambda s: pytest.fail("свежие данные в сторе — биржа не нужна"))
+
+    snap = asyncio.run(MarketDataService(temp_db).get_derivatives("BTCUSDT"))
+    assert (snap.funding, snap.oi, snap.quality) == (0.0003, 1.1e8, "full")
+    assert snap.oi_change_pct == pytest.approx(10.0)
+    assert snap.cvd_spot_slope == pytest.approx(20.0)                              # наклон в час, не уровень CVD
+
+    monkeypatch.setattr(market_data, "binance_funding_and_mark",
+                        lambda s: {"fundingRate": 0.0009, "markPrice": 1.0})
+    live = asyncio.run(MarketDataService(temp_db).get_derivatives("ETH"))          # в сторе пусто — живой путь
+    assert live.funding == 0.0009
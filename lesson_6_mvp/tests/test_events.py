@@ -0,0 +1,128 @@
+"""
+Тесты событий (infrastructure.events / event_scheduler): одна миграция на соединение, повторения
+в поясе автора, планировщик напоминаний точно в срок с пакетной отметкой notified_*.
+"""
+
+import asyncio
+import sqlite3
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from app.config import settings
+from app.infrastructure import events
+from app.infrastructure.event_scheduler import EventScheduler
+from app.infrastructure.events_parse import parse_event_add
+
+AMS = ZoneInfo("Europe/Amsterdam")
+H = events.HOUR_MS
+
+
+def _ms(*args, tz=AMS) -> int:
+    return int(datetime(*args, tzinfo=tz).timestamp() * 1000)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "database_path", str(tmp_path / "events.db"))
+    events.close_connections()
+    yield events
+    events.close_connections()
+
+
+def test_migrates_legacy_schema_once(store):
+    legacy = sqlite3.connect(settings.database_path)
+    legacy.execute("CREATE TABLE events (id INTEGER PRIMARY KEY AUTOINCREMENT, ts INTEGER NOT NULL, "
+                   "title TEXT NOT NULL, chat_id INTEGER NOT NULL)")
+    legacy.commit()
+    legacy.close()
+
+    conn = store._conn()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    now = int(time.time() * 1000)
+    eid = store.add_event(now + 2 * H, "FOMC", author_chat_id=7, recur="weekly", tz="Europe/Amsterdam")
+    store.due_events(now)
+    store.mark_notified(eid, "24h")
+    store.list_all_events()
+    assert store._conn() is conn
+    assert not [s for s in statements if "PRAGMA" in s or "ALTER" in s]
+    assert store.get_events([eid])[eid].notified_24h_at is not None
+    assert conn.execute("SELECT chat_id, first_ts FROM events").fetchone() == (7, now + 2 * H)
+    with pytest.raises(ValueError):
+        store.add_event(now, "x", recur="hourly")
+
+
+def test_next_occurrence_keeps_wall_clock_and_month_end():
+    first = _ms(2025, 3, 29, 19, 0)                                   # накануне перехода на летнее время
+    nxt = events.next_occurrence(first, "daily", "Europe/Amsterdam", first)
+    assert nxt - first == 23 * H and datetime.fromtimestamp(nxt / 1000, AMS).hour == 19
+    jan31 = _ms(2025, 1, 31, 9, 0)
+    feb = events.next_occurrence(jan31, "monthly", "Europe/Amsterdam", jan31)
+    mar = events.next_occurrence(jan31, "monthly", "Europe/Amsterdam", feb)
+    assert [datetime.fromtimestamp(t / 1000, AMS).day for t in (feb, mar)] == [28, 31]
+    later = events.next_occurrence(jan31, "monthly", "Europe/Amsterdam", _ms(2035, 6, 1, 0, 0))
+    assert datetime.fromtimestamp(later / 1000, AMS).date().isoformat() == "2035-06-30"
+
+
+def test_scheduler_fires_batches_and_rolls_recurring(store):
+    sent = []
+    sched = EventScheduler(send=lambda chat, text: sent.append((chat, text)))
+    t0 = _ms(2030, 1, 10, 12, 0)
+    a = store.add_event(t0 + 30 * H, "CPI", author_chat_id=1)
+    b = store.add_event(t0 + 30 * H, "PPI", author_chat_id=2)
+    c = store.add_event(t0 + 30 * 60_000, "Soon", author_chat_id=3)  # через 30 минут: только 1h-напоминание
+    d = store.add_event(t0 + 2 * H, "Standup", author_chat_id=4, recur="daily", tz="Europe/Amsterdam")
+    store.set_user_tz(1, "Asia/Tokyo")
+    assert sched.rebuild(t0) == 9                                     # d: 24h, 1h и перенос
+
+    assert sched.fire_due(t0) == 2                                   # c — только 1h, d — опоздавшее 24h
+    assert [chat for chat, _ in sent] == [3, 4] and sched.skipped == 1
+    assert "через ~2 ч" in sent[1][1]
+    assert sched.fire_due(t0 + H) == 1
+
+    assert sched.fire_due(t0 + 2 * H) == 0                           # момент события d — перенос на завтра
+    row = store.get_events([d])[d]
+    assert row.ts == t0 + 26 * H and row.notified_1h_at is None
+    assert sched.fire_due(t0 + 2 * H) == 1 and "через ~24 часа" in sent[-1][1]
+
+    assert sched.next_fire_ms() == t0 + 6 * H                         # 24h-напоминания a и b
+    assert sched.fire_due(t0 + 6 * H - 1) == 0
+    assert sched.fire_due(t0 + 6 * H) == 2
+    assert "2030-01-12 02:00 JST" in dict(sent)[1]                    # время — в поясе получателя
+    rows = store.get_events([a, b])
+    assert all(r.notified_24h_at == t0 + 6 * H for r in rows.values())
+
+    store.del_event(0, b)                                            # удалённое не напоминает
+    assert sched.fire_due(t0 + 25 * H) == 1 and sent[-1][0] == 4
+    assert sched.fire_due(t0 + 29 * H) == 1 and sent[-1][0] == 1
+
+
+def test_scheduler_wakes_on_add_and_fires_on_time(store):
+    sent = []
+
+    async def main():
+        sched = EventScheduler()
+        sched.start(send=lambda chat, text: sent.append((chat, time.monotonic())))
+        await asyncio.sleep(0.05)
+        started = time.monotonic()
+        store.add_event(int(time.time() * 1000) + H + 300, "Launch", author_chat_id=9)
+        for _ in range(100):
+            if sent:
+                break
+            await asyncio.sleep(0.02)
+        await sched.stop()
+        return started
+
+    started = asyncio.run(main())
+    assert len(sent) == 1 and 0.2 <= sent[0][1] - started < 1.0
+
+
+def test_parse_event_add():
+    ts, title, recur = parse_event_add("/events_add 2025-10-05  19:00 FOMC @Weekly", AMS)
+    assert (ts, title, recur) == (_ms(2025, 10, 5, 19, 0), "FOMC", "weekly")
+    assert parse_event_add("/events_add@bot 2025-10-05 CPI", None) == (_ms(2025, 10, 5, tz=ZoneInfo("UTC")), "CPI", None)
+    with pytest.raises(ValueError):
+        parse_event_add("/events_add tomorrow CPI", AMS)
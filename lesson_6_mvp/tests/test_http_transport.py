@@ -0,0 +1,183 @@
+"""
+Тесты общего HTTP-транспорта (infrastructure.http_transport) на локальном сервере:
+ретраи и Retry-After, circuit breaker, single-flight, предел блокировки event loop, фикстуры.
+"""
+
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from app.infrastructure import http_transport
+from app.infrastructure.http_transport import (
+    CircuitBreaker, CircuitOpenError, FixtureMissingError, HostPolicy, HttpTransport, RateLimitedError,
+)
+
+
+class _Server:
+    """Отвечает по сценарию: script[path] — список (status, headers, body, delay), последний повторяется."""
+
+    def __init__(self):
+        self.script = {}
+        self.hits = defaultdict(int)
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self):
+                path = self.path.split("?")[0]
+                owner.hits[path] += 1
+                steps = owner.script.get(path, [(200, {}, b'{"ok": true}', 0.0)])
+                status, headers, body, delay = steps[min(owner.hits[path], len(steps)) - 1]
+                time.sleep(delay)
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = _reply
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(http_transport, "HTTP_BACKOFF_SEC", 0.01)
+    srv = _Server()
+    yield srv
+    srv.close()
+
+
+def _transport(**kw):
+    return HttpTransport(host_limits={"127.0.0.1": HostPolicy(1000.0, 1000.0, 8)}, fixtures="", **kw)
+
+
+def test_retries_retry_after_and_non_idempotent(server):
+    t = _transport()
+    server.script["/flaky"] = [(503, {}, b"", 0.0), (200, {}, b'{"v": 1}', 0.0)]
+    r = t.get(server.url + "/flaky", params={"a": 1})
+    assert r.status_code == 200 and r.json() == {"v": 1} and server.hits["/flaky"] == 2
+
+    server.script["/busy"] = [(429, {"Retry-After": "0.2"}, b"", 0.0), (200, {}, b"{}", 0.0)]
+    t0 = time.monotonic()
+    assert t.get(server.url + "/busy").ok
+    assert time.monotonic() - t0 >= 0.2
+
+    server.script["/missing"] = [(404, {}, b"nope", 0.0)]
+    r = t.get(server.url + "/missing")
+    assert server.hits["/missing"] == 1
+    with pytest.raises(requests.HTTPError) as e:
+        r.raise_for_status()
+    assert e.value.response.status_code == 404
+
+    server.script["/post"] = [(503, {}, b"", 0.0)]
+    assert t.request("POST", server.url + "/post", json={"x": 1}).status_code == 503
+    assert server.hits["/post"] == 1
+
+    server.script["/down"] = [(500, {}, b"", 0.0)]
+    assert t.get(server.url + "/down", retries=2).status_code == 500      # отдали последний ответ
+    assert server.hits["/down"] == 2
+
+
+def test_circuit_breaker_half_open_probe(server):
+    t = _transport(max_attempts=1)
+    t._host(server.url).breaker = CircuitBreaker(failures=2, reset_sec=0.2)
+    server.script["/x"] = [(502, {}, b"", 0.0), (502, {}, b"", 0.0), (200, {}, b"{}", 0.0)]
+    t.get(server.url + "/x")
+    t.get(server.url + "/x")
+    with pytest.raises(CircuitOpenError):
+        t.get(server.url + "/x")
+    assert server.hits["/x"] == 2 and t.get_stats()["127.0.0.1"]["state"] == "open"
+
+    time.sleep(0.25)
+    assert t.get(server.url + "/x").ok                                   # проба прошла — снова closed
+    assert t.get_stats()["127.0.0.1"]["state"] == "closed"
+
+
+def test_single_flight_coalesces_identical_gets(server):
+    t = _transport()
+    server.script["/slow"] = [(200, {}, b'{"n": 1}', 0.3)]
+    out = []
+    threads = [threading.Thread(target=lambda: out.append(t.get(server.url + "/slow", params={"s": "BTC"})))
+               for _ in range(6)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert len(out) == 6 and all(r.json() == {"n": 1} for r in out)
+    assert server.hits["/slow"] == 1
+
+    async def many():
+        try:
+            return await asyncio.gather(*(t.aget(server.url + "/slow", params={"s": "ETH"}) for _ in range(5)))
+        finally:
+            await t.aclose()
+
+    res = asyncio.run(many())
+    assert [r.status_code for r in res] == [200] * 5 and server.hits["/slow"] == 2
+
+
+def test_single_flight_follower_wait_is_bounded(server):
+    """Ожидающий не висит на лидере дольше своего предела: на loop — ошибка, вне loop — свой запрос."""
+    t = _transport(loop_max_block=0.05)
+    server.script["/stuck"] = [(200, {}, b'{"n": 1}', 0.6), (200, {}, b'{"n": 2}', 0.0)]
+    leader = threading.Thread(target=lambda: t.get(server.url + "/stuck"))
+    leader.start()
+    time.sleep(0.1)
+
+    async def on_loop():
+        t0 = time.monotonic()
+        with pytest.raises(RateLimitedError):
+            t.get(server.url + "/stuck")
+        return time.monotonic() - t0
+
+    assert asyncio.run(on_loop()) < 0.3
+    r = t.get(server.url + "/stuck", timeout=0.1)                                  # вне loop — сам в сеть
+    assert r.json() == {"n": 2} and server.hits["/stuck"] == 2
+    leader.join()
+
+
+def test_event_loop_thread_does_not_sleep_for_tokens(server):
+    t = HttpTransport(host_limits={"127.0.0.1": HostPolicy(0.5, 1.0, 2)}, fixtures="", loop_max_block=0.05)
+
+    async def handler():
+        t.get(server.url + "/a")                       # токен был
+        with pytest.raises(RateLimitedError):
+            t.get(server.url + "/b")                   # следующий через 2 с — не ждём на loop
+        try:
+            return await t.aget(server.url + "/c", timeout=5)  # корутина ждёт токен через asyncio.sleep
+        finally:
+            await t.aclose()
+
+    t0 = time.monotonic()
+    assert asyncio.run(handler()).ok
+    assert time.monotonic() - t0 >= 1.5 and server.hits["/b"] == 0
+
+
+def test_record_then_replay_offline(server, tmp_path):
+    t = _transport()
+    server.script["/ticker"] = [(200, {"Content-Type": "application/json"}, '{"p": "€1"}'.encode(), 0.0)]
+    with t.fixtures("record", str(tmp_path)):
+        live = t.get(server.url + "/ticker", params={"symbol": "BTCUSDT", "a": 2})
+    server.close()
+
+    with t.fixtures("replay", str(tmp_path)):
+        again = t.get(server.url + "/ticker", params={"a": 2, "symbol": "BTCUSDT"})
+        assert (again.status_code, again.json()) == (live.status_code, live.json())
+        assert asyncio.run(t.aget(server.url + "/ticker", params={"symbol": "BTCUSDT", "a": 2})).text == live.text
+        with pytest.raises(FixtureMissingError):
+            t.get(server.url + "/ticker", params={"symbol": "ETHUSDT"})
@@ -0,0 +1,195 @@
+"""
+Тесты для infrastructure.job_runtime: skip-if-running, таймауты по видам задач, jitter расписания, метрики.
+"""
+
+import asyncio
+import threading
+import time
+from datetime import time as dtime, timezone
+
+import pytest
+
+from app.infrastructure.job_runtime import (
+    KIND_CPU, KIND_IO, OUTCOME_ERROR, OUTCOME_OK, OUTCOME_SKIPPED, OUTCOME_TIMEOUT, JobRuntime, JobSpec,
+)
+from app.utils.metrics import JOB_RUNS
+
+
+def test_spec_validates_kind():
+    async def coro(ctx):
+        pass
+
+    with pytest.raises(ValueError):
+        JobSpec("x", coro, kind=KIND_IO)
+    with pytest.raises(ValueError):
+        JobSpec("x", lambda ctx: None)
+    with pytest.raises(ValueError):
+        JobSpec("x", lambda ctx: None, kind="gpu")
+
+
+def test_async_skip_if_running_and_timeout():
+    rt = JobRuntime(process_workers=0)
+    cancelled = []
+
+    async def slow(ctx):
+        try:
+            await asyncio.sleep(0.2)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    rt.add(JobSpec("rt_async_slow", slow, max_runtime=5))
+    rt.add(JobSpec("rt_async_hang", slow, max_runtime=0.05))
+    before = JOB_RUNS.value(job="rt_async_slow", outcome=OUTCOME_SKIPPED)
+
+    async def main():
+        first = asyncio.create_task(rt.run("rt_async_slow"))
+        await asyncio.sleep(0.01)
+        second = await rt.run("rt_async_slow")
+        return await first, second, await rt.run("rt_async_hang")
+
+    first, second, hang = asyncio.run(main())
+    assert (first, second, hang) == (OUTCOME_OK, OUTCOME_SKIPPED, OUTCOME_TIMEOUT)
+    assert cancelled == [True]
+    assert JOB_RUNS.value(job="rt_async_slow", outcome=OUTCOME_SKIPPED) == before + 1
+    stats = rt.get_stats()
+    assert stats["rt_async_slow"]["skipped"] == 1 and stats["rt_async_slow"]["running"] == 0
+    assert stats["rt_async_hang"]["timeouts"] == 1
+    assert "rt_async_hang" in rt.format_stats()
+
+
+def test_io_runs_off_loop_and_delivers_result():
+    rt = JobRuntime(process_workers=0)
+    seen = {}
+
+    def work(ctx):
+        seen["thread"] = threading.get_ident()
+        return ctx * 2
+
+    async def deliver(ctx, result):
+        seen["loop_thread"] = threading.get_ident()
+        seen["result"] = result
+
+    def boom(ctx):
+        raise RuntimeError("no data")
+
+    rt.add(JobSpec("rt_io", work, kind=KIND_IO, on_result=deliver))
+    rt.add(JobSpec("rt_io_fail", boom, kind=KIND_IO))
+
+    async def main():
+        return await rt.run("rt_io", 21), await rt.run("rt_io_fail", None)
+
+    try:
+        assert asyncio.run(main()) == (OUTCOME_OK, OUTCOME_ERROR)
+    finally:
+        rt.shutdown()
+    assert seen["result"] == 42
+    assert seen["thread"] != seen["loop_thread"] == threading.get_ident()
+    assert rt.get_stats()["rt_io_fail"]["last_error"] == "RuntimeError: no data"
+
+
+def test_io_jobs_get_own_db_transactions(temp_db):
+    """Параллельные io-задачи с db.atomic() не вкладывают BEGIN в чужую транзакцию и не теряют строки."""
+    temp_db.conn.execute("CREATE TABLE jr_rows (job TEXT, i INTEGER)")
+    rt = JobRuntime(process_workers=0, thread_workers=4)
+    barrier = threading.Barrier(4)
+
+    def write(name):
+        barrier.wait(2)
+        for i in range(20):
+            with temp_db.atomic():
+                temp_db.conn.execute("INSERT INTO jr_rows VALUES (?, ?)", (name, i))
+                time.sleep(0.001)                   # отдаём GIL посреди транзакции
+                if name == "jr_3" and i == 5:
+                    raise RuntimeError("rollback только своей транзакции")
+        return threading.get_ident()
+
+    for n in range(4):
+        rt.add(JobSpec(f"jr_{n}", write, kind=KIND_IO, args=lambda ctx, n=n: (f"jr_{n}",)))
+
+    async def main():
+        return await asyncio.gather(*(rt.run(f"jr_{n}") for n in range(4)))
+
+    try:
+        assert asyncio.run(main()) == [OUTCOME_OK] * 3 + [OUTCOME_ERROR]
+    finally:
+        rt.shutdown()
+    rows = dict(temp_db.conn.execute("SELECT job, COUNT(*) FROM jr_rows GROUP BY job").fetchall())
+    assert rows == {"jr_0": 20, "jr_1": 20, "jr_2": 20, "jr_3": 5}
+
+
+def test_io_timeout_holds_slot_until_thread_returns():
+    rt = JobRuntime(process_workers=0)
+    gate = threading.Event()
+    rt.add(JobSpec("rt_io_stuck", lambda ctx: gate.wait(2), kind=KIND_IO, max_runtime=0.05))
+
+    async def main():
+        timed_out = await rt.run("rt_io_stuck")
+        skipped = await rt.run("rt_io_stuck")        # поток ещё работает — слот занят
+        running = rt.get_stats()["rt_io_stuck"]["running"]
+        gate.set()
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if rt.get_stats()["rt_io_stuck"]["running"] == 0:
+                break
+        return timed_out, skipped, running, await rt.run("rt_io_stuck")
+
+    try:
+        assert asyncio.run(main()) == (OUTCOME_TIMEOUT, OUTCOME_SKIPPED, 1, OUTCOME_OK)
+    finally:
+        rt.shutdown()
+
+
+def test_cpu_job_in_process_pool_killed_on_timeout():
+    rt = JobRuntime(process_workers=1)
+    got = []
+
+    async def deliver(ctx, result):
+        got.append(result)
+
+    rt.add(JobSpec("rt_cpu", sum, kind=KIND_CPU, args=lambda ctx: ([1, 2, 3],), on_result=deliver, max_runtime=60))
+    rt.add(JobSpec("rt_cpu_hang", time.sleep, kind=KIND_CPU, args=lambda ctx: (30,), max_runtime=0.5))
+
+    async def main():
+        return [await rt.run("rt_cpu"), await rt.run("rt_cpu_hang"), await rt.run("rt_cpu")]
+
+    t0 = time.perf_counter()
+    try:
+        assert asyncio.run(main()) == [OUTCOME_OK, OUTCOME_TIMEOUT, OUTCOME_OK]
+    finally:
+        rt.shutdown()
+    assert got == [6, 6]
+    assert time.perf_counter() - t0 < 25                # зависший процесс убит, пул поднят заново
+
+
+class _FakeJobQueue:
+    def __init__(self):
+        self.calls = []
+
+    def run_repeating(self, cb, interval, first, name):
+        self.calls.append(("repeating", name, interval, first))
+
+    def run_daily(self, cb, time, name):
+        self.calls.append(("daily", name, time))
+
+
+def test_schedule_applies_jitter():
+    rt = JobRuntime(process_workers=0)
+    jq = _FakeJobQueue()
+
+    async def job(ctx):
+        pass
+
+    for i in range(20):
+        rt.schedule(jq, JobSpec(f"rt_rep_{i}", job, interval=60, first=10, jitter=5))
+    rt.schedule(jq, JobSpec("rt_exact", job, interval=60, first=10, jitter=0))
+    rt.schedule(jq, JobSpec("rt_daily", job, daily_at=dtime(23, 59, 50, tzinfo=timezone.utc), jitter=60))
+
+    firsts = [c[3] for c in jq.calls if c[0] == "repeating" and c[1].startswith("rt_rep_")]
+    assert all(10 <= f <= 15 for f in firsts) and len(set(firsts)) > 1
+    assert ("repeating", "rt_exact", 60, 10) in jq.calls
+    daily = next(c[2] for c in jq.calls if c[1] == "rt_daily")
+    assert daily.tzinfo is timezone.utc
+    assert daily >= dtime(23, 59, 50, tzinfo=timezone.utc) or daily <= dtime(0, 0, 50, tzinfo=timezone.utc)
+    with pytest.raises(ValueError):
+        rt.schedule(jq, JobSpec("rt_exact", job, interval=60))
@@ -0,0 +1,216 @@
+"""
+Тесты для векторных ядер индикаторов (domain.kernels): паритет в пределах float-допуска (RTOL) с исходными циклами
+services.py / divergence_detector.py, которые сохранены здесь как эталон.
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+from app.domain import divergence_detector, kernels, services
+
+RTOL = 1e-9
+
+
+# ---------- эталон: списочные реализации до перевода на ядра ----------
+
+def ref_ema(values, period):
+    if period <= 0 or not values:
+        return []
+    n = len(values)
+    out = [None] * n
+    if n < period:
+        return out
+    k = 2 / (period + 1)
+    prev = sum(values[:period]) / period
+    out[period - 1] = prev
+    for i in range(period, n):
+        prev = (values[i] - prev) * k + prev
+        out[i] = prev
+    return out
+
+
+def ref_rsi(values, period=14):
+    n = len(values)
+    if n < period + 1:
+        return [None] * n
+    out = [None] * n
+    gains, losses = [], []
+    for i in range(1, period + 1):
+        ch = values[i] - values[i - 1]
+        gains.append(max(ch, 0.0))
+        losses.append(-min(ch, 0.0))
+    avg_gain, avg_loss = sum(gains) / period, sum(losses) / period
+    rs = (avg_gain / avg_loss) if avg_loss != 0 else float("inf")
+    out[period] = 100 - (100 / (1 + rs))
+    for i in range(period + 1, n):
+        ch = values[i] - values[i - 1]
+        avg_gain = (avg_gain * (period - 1) + max(ch, 0.0)) / period
+        avg_loss = (avg_loss * (period - 1) + -min(ch, 0.0)) / period
+        rs = (avg_gain / avg_loss) if avg_loss != 0 else float("inf")
+        out[i] = 100 - (100 / (1 + rs))
+    return out
+
+
+def ref_macd(values, fast=12, slow=26, signal=9):
+    ef, es = ref_ema(values, fast), ref_ema(values, slow)
+    line = [None] * len(values)
+    for i in range(len(values)):
+        if ef[i] is not None and es[i] is not None:
+            line[i] = ef[i] - es[i]
+    sig = ref_ema([x if x is not None else 0.0 for x in line], signal)
+    hist = [None if (m is None or s is None) else (m - s) for m, s in zip(line, sig)]
+    return line, sig, hist
+
+
+def ref_atr(highs, lows, closes, period=14):
+    trs, prev_c = [], None
+    for h, l, c in zip(highs, lows, closes):
+        trs.append(h - l if prev_c is None else max(h - l, abs(h - prev_c), abs(l - prev_c)))
+        prev_c = c
+    return ref_ema(trs, period)
+
+
+def ref_pivots(values, left, right, higher):
+    res = [False] * len(values)
+    cmp = (lambda a, b: a > b) if higher else (lambda a, b: a < b)
+    for i in range(left, len(values) - right):
+        v = values[i]
+        if all(cmp(v, values[i - j]) for j in range(1, left + 1)) and all(cmp(v, values[i + j]) for j in range(1, right + 1)):
+            res[i] = True
+    return res
+
+
+def ref_stochastic(highs, lows, closes, k_period=14, d_period=3):
+    n = len(closes)
+    k_values, d_values = [None] * n, [None] * n
+    if n < k_period:
+        return k_values, d_values
+    for i in range(k_period - 1, n):
+        hh, ll = max(highs[i - k_period + 1:i + 1]), min(lows[i - k_period + 1:i + 1])
+        k_values[i] = 100 * (closes[i] - ll) / (hh - ll) if hh != ll else 50.0
+    for i in range(k_period + d_period - 2, n):
+        d_values[i] = sum(k_values[i - d_period + 1:i + 1]) / d_period
+    return k_values, d_values
+
+
+def ref_cci(highs, lows, closes, period=20):
+    n = len(closes)
+    if n < period:
+        return [None] * n
+    tp = [(h + l + c) / 3.0 for h, l, c in zip(highs, lows, closes)]
+    out = [None] * n
+    for i in range(period - 1, n):
+        sma = sum(tp[i - period + 1:i + 1]) / period
+        md = sum(abs(tp[j] - sma) for j in range(i - period + 1, i + 1)) / period
+        out[i] = (tp[i] - sma) / (0.015 * md) if md != 0 else 0.0
+    return out
+
+
+def ref_mfi(highs, lows, closes, volumes, period=14):
+    n = len(closes)
+    if n < period + 1:
+        return [None] * n
+    tp = [(h + l + c) / 3.0 for h, l, c in zip(highs, lows, closes)]
+    raw = [None] * n
+    for i in range(1, n):
+        if volumes[i] is not None and volumes[i] > 0:
+            raw[i] = tp[i] * volumes[i]
+    out = [None] * n
+    for i in range(period, n):
+        pos = neg = 0.0
+        for j in range(i - period + 1, i + 1):
+            if raw[j] is not None and j > 0:
+                if tp[j] > tp[j - 1]:
+                    pos += raw[j]
+                elif tp[j] < tp[j - 1]:
+                    neg += raw[j]
+        out[i] = 100 - (100 / (1 + pos / neg)) if neg != 0 else (100.0 if pos > 0 else 50.0)
+    return out
+
+
+def ref_obv(closes, volumes):
+    n = len(closes)
+    if n < 2:
+        return [None] * n
+    out = [None] * n
+    out[0] = volumes[0] if volumes[0] is not None else 0.0
+    for i in range(1, n):
+        prev, vol = out[i - 1] or 0.0, volumes[i] if volumes[i] is not None else 0.0
+        out[i] = prev + vol if closes[i] > closes[i - 1] else (prev - vol if closes[i] < closes[i - 1] else prev)
+    return out
+
+
+# ---------- данные ----------
+
+def _ohlcv(n, seed=0, flat_every=0):
+    rng = np.random.default_rng(seed)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, n)))
+    if flat_every:
+        close[::flat_every] = np.roll(close, 1)[::flat_every]   # повторы → нулевые изменения
+    high = close * (1 + rng.uniform(0.0, 0.01, n))
+    low = close * (1 - rng.uniform(0.0, 0.01, n))
+    vol = [None if i % 17 == 5 else float(v) for i, v in enumerate(rng.uniform(0.0, 1000.0, n))]
+    return close.tolist(), high.tolist(), low.tolist(), vol
+
+
+def assert_same(got, want):
+    assert len(got) == len(want)
+    for i, (g, w) in enumerate(zip(got, want)):
+        if w is None:
+            assert g is None, i
+        else:
+            assert g is not None and math.isclose(g, w, rel_tol=RTOL, abs_tol=1e-9), (i, g, w)
+
+
+SIZES = [0, 1, 5, 14, 15, 27, 60, 500, 5000]
+
+
+@pytest.mark.parametrize("n", SIZES)
+def test_services_match_reference(n):
+    c, h, l, _v = _ohlcv(n, seed=n, flat_every=7)
+    for p in (1, 3, 14, 26):
+        assert_same(services.ema(c, p), ref_ema(c, p))
+    assert_same(services.rsi(c, 14), ref_rsi(c, 14))
+    for got, want in zip(services.macd(c), ref_macd(c)):
+        assert_same(got, want)
+    assert_same(services.atr(h, l, c, 14), ref_atr(h, l, c, 14))
+    for left, right in ((2, 2), (1, 3)):
+        assert services.pivots_high(c, left, right) == ref_pivots(c, left, right, True)
+        assert services.pivots_low(c, left, right) == ref_pivots(c, left, right, False)
+    flags = ref_pivots(c, 2, 2, True)
+    assert services._last_two_indices(flags) == [i for i, b in enumerate(flags) if b][-2:]
+
+
+@pytest.mark.parametrize("n", SIZES)
+def test_divergence_indicators_match_reference(n):
+    c, h, l, v = _ohlcv(n, seed=100 + n, flat_every=5)
+    for got, want in zip(divergence_detector.stochastic(h, l, c), ref_stochastic(h, l, c)):
+        assert_same(got, want)
+    assert_same(divergence_detector.cci(h, l, c), ref_cci(h, l, c))
+    assert_same(divergence_detector.mfi(h, l, c, v), ref_mfi(h, l, c, v))
+    assert_same(divergence_detector.obv(c, v), ref_obv(c, v))
+
+
+def test_edge_branches_are_exact():
+    """Ветки «== 0» совпадают точно: монотонный рост → RSI 100, плоский рынок → Stoch 50, CCI 0, MFI 50."""
+    up = [float(i) for i in range(1, 40)]
+    assert services.rsi(up)[14:] == [100.0] * 25
+    flat = [5.0] * 40
+    k, _d = divergence_detector.stochastic(flat, flat, flat)
+    assert k[13:] == [50.0] * 27
+    assert divergence_detector.cci(flat, flat, flat)[19:] == [0.0] * 21
+    assert divergence_detector.mfi(flat, flat, flat, [1.0] * 40)[14:] == [50.0] * 26
+    assert services.ema([], 3) == [] and services.atr([], [], [], 14) == []
+
+
+def test_kernels_take_arrays_and_pad_with_nan():
+    """Ядра принимают ndarray и возвращают float-массивы с NaN в прогреве; блочная EMA устойчива на длинных рядах."""
+    c = np.asarray(_ohlcv(50_000, seed=7)[0])
+    e = kernels.ema(c, 200)
+    assert e.dtype == np.float64 and np.isnan(e[:199]).all() and not np.isnan(e[199:]).any()
+    ref = ref_ema(c.tolist(), 200)
+    np.testing.assert_allclose(e[199:], ref[199:], rtol=RTOL)
+    np.testing.assert_allclose(kernels.rsi(c, 14)[14:], ref_rsi(c.tolist(), 14)[14:], rtol=RTOL)
+    assert kernels.pivots_high(c).dtype == bool
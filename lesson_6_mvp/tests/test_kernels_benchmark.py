@@ -0,0 +1,57 @@
+"""
+Бенчмарки ядер индикаторов (pytest-benchmark): размеры кадров 100…50 000 баров.
+
+    pytest tests/test_kernels_benchmark.py --benchmark-only
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from app.domain import kernels  # noqa: E402
+
+SIZES = [100, 1_000, 10_000, 50_000]
+
+
+def _frame(n):
+    rng = np.random.default_rng(n)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, n)))
+    return close, close * 1.005, close * 0.995, rng.uniform(0.0, 1000.0, n)
+
+
+@pytest.mark.parametrize("n", SIZES)
+def test_bench_ema(benchmark, n):
+    c, _h, _l, _v = _frame(n)
+    benchmark(kernels.ema, c, 26)
+
+
+@pytest.mark.parametrize("n", SIZES)
+def test_bench_rsi(benchmark, n):
+    c, _h, _l, _v = _frame(n)
+    benchmark(kernels.rsi, c, 14)
+
+
+@pytest.mark.parametrize("n", SIZES)
+def test_bench_macd(benchmark, n):
+    c, _h, _l, _v = _frame(n)
+    benchmark(kernels.macd, c)
+
+
+@pytest.mark.parametrize("n", SIZES)
+def test_bench_pivots(benchmark, n):
+    c, _h, _l, _v = _frame(n)
+    benchmark(kernels.pivots_high, c, 2, 2)
+
+
+@pytest.mark.parametrize("n", SIZES)
+def test_bench_divergence_indicators(benchmark, n):
+    c, h, l, v = _frame(n)
+
+    def run():
+        kernels.stochastic(h, l, c)
+        kernels.cci(h, l, c)
+        kernels.mfi(h, l, c, v)
+        kernels.obv(c, v)
+
+    benchmark(run)
@@ -0,0 +1,193 @@
+"""
+Тесты аналитики ликвидаций (domain.liquidation_clusters, infrastructure.liquidation_store): уровни бирж
+совпадают с прежней группировкой словарями, метрики окна — с calculate_*, затухание, адаптивные корзины
+и журнал с дедупликацией и скользящими окнами.
+"""
+
+import math
+import random
+
+import numpy as np
+import pytest
+
+from app.domain.liquidation_clusters import LiquidationEvents, analyze, bucket_width, nice_step, rolling
+from app.infrastructure import free_market_data as fmd
+from app.infrastructure.liquidation_store import LiquidationStore
+
+NOW = 1_750_000_000_000
+H = 3_600_000
+
+
+class _Resp:
+    status_code = 200
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+def _raw(n=400, seed=5, mid=60_000.0):
+    rnd = random.Random(seed)
+    return [{"updatedTime": str(NOW - rnd.randint(0, 40 * H)), "side": rnd.choice(["Buy", "Sell", "?"]),
+             "price": f"{mid * (1 + rnd.gauss(0, 0.02)):.1f}", "value": f"{rnd.expovariate(1 / 3000):.2f}"}
+            for _ in range(n)]
+
+
+def _legacy_levels(raw, symbol):
+    groups = {}
+    for liq in raw:
+        side = liq["side"].lower()
+        if side not in ("buy", "sell"):
+            continue
+        price, value = float(liq["price"]), float(liq["value"])
+        if price <= 0 or value <= 0:
+            continue
+        step = 100 if symbol == "BTC" else 10
+        key = ("long" if side == "buy" else "short", round(price / step) * step)
+        groups[key] = groups.get(key, 0) + value
+    return sorted([(p, v, s) for (s, p), v in groups.items() if v >= 500], key=lambda x: (-x[0], x[2]))
+
+
+def test_bybit_levels_match_legacy_grouping(monkeypatch):
+    raw = _raw()
+    pages = iter([raw[:200], raw[200:]] + [[]] * 10)
+    monkeypatch.setattr(fmd, "_cache", {})
+    monkeypatch.setattr(fmd._sess, "get", lambda url, params=None, timeout=None: _Resp(
+        {"result": {"list": next(pages)}}))
+    got = fmd.get_liquidation_levels_from_bybit("BTC", hours=48)
+    got_rows = sorted([(lv.price, lv.usd_value, lv.side) for lv in got], key=lambda x: (-x[0], x[2]))
+    assert [lv.price for lv in got] == sorted((lv.price for lv in got), reverse=True)
+    want = _legacy_levels(raw, "BTC")
+    assert [(p, s) for p, _, s in got_rows] == [(p, s) for p, _, s in want]
+    assert [v for _, v, _ in got_rows] == pytest.approx([v for _, v, _ in want])
+    assert got and all(lv.exchange == "bybit" for lv in got)
+    assert fmd.get_liquidation_levels_from_bybit("BTC", hours=48) == got          # из кеша, без запросов
+
+
+def test_aggregate_and_metrics_match_loops():
+    a = [fmd.LiquidationLevel(60_010.0, 1000.0, "long", "bybit"), fmd.LiquidationLevel(60_040.0, 3000.0, "long", "x"),
+         fmd.LiquidationLevel(60_020.0, 500.0, "short", "bybit"), fmd.LiquidationLevel(3_001.0, 700.0, "long", "bybit")]
+    b = [fmd.LiquidationLevel(60_030.0, 1000.0, "long", "okx"), fmd.LiquidationLevel(2.345, 800.0, "short", "okx")]
+    got = fmd.aggregate_liquidation_levels({"bybit": a, "okx": b})
+    assert [(lv.side, lv.exchange) for lv in got] == [
+        ("long", "bybit+okx"), ("short", "bybit"), ("long", "bybit"), ("short", "okx")]
+    assert got[0].usd_value == 5000.0 and got[0].price == pytest.approx((60_010 + 3 * 60_040 + 60_030) / 5)
+    assert fmd.aggregate_liquidation_levels({}) == []
+
+    levels = a + b
+    assert fmd.calculate_liquidity_concentration(levels) == pytest.approx(
+        sum((lv.usd_value / 7000.0) ** 2 for lv in levels))
+    assert fmd.calculate_long_short_ratio(levels) == pytest.approx(5700.0 / 1300.0)
+    assert fmd.calculate_long_short_ratio(a[:2]) == math.inf and fmd.calculate_long_short_ratio([]) == 0.0
+    assert fmd.calculate_liquidation_velocity(levels, 7) == pytest.approx(1000.0)
+
+
+def test_analyze_one_pass_stats_and_decay():
+    rnd = random.Random(2)
+    rows = [(NOW - rnd.randint(0, 48 * H), rnd.choice(["bybit", "okx"]), rnd.choice(["long", "short"]),
+             60_000 * (1 + rnd.gauss(0, 0.01)), rnd.uniform(100, 5000)) for _ in range(2000)]
+    ev = LiquidationEvents.from_rows(rows + [(NOW, "okx", "??", 1.0, 1.0), (NOW, "okx", "long", 0.0, 5.0)])
+    assert len(ev) == 2000 and ev.venues == ("bybit", "okx")
+
+    st = analyze(ev, now_ms=NOW, hours=48, ref_price=60_000, min_usd=500)
+    levels = fmd.liquidation_levels(st)
+    assert st.total_usd == pytest.approx(sum(r[4] for r in rows))
+    assert st.long_short_ratio == pytest.approx(
+        sum(r[4] for r in rows if r[2] == "long") / sum(r[4] for r in rows if r[2] == "short"))
+    assert st.velocity_usd_h == pytest.approx(st.total_usd / 48)
+    assert st.hhi == pytest.approx(fmd.calculate_liquidity_concentration(levels))
+    assert sum(st.by_venue.values()) == pytest.approx(st.total_usd)
+    assert [c.level for c in st.clusters] == sorted((c.level for c in st.clusters), reverse=True)
+    for c in st.clusters[:20]:
+        members = [r for r in rows if c.level <= r[3] < c.level + st.width and r[2] == c.side]
+        assert c.count == len(members) and c.usd == pytest.approx(sum(r[4] for r in members))
+        assert c.price == pytest.approx(sum(r[3] * r[4] for r in members) / c.usd)
+        assert set(c.venues) == {r[1] for r in members} and c.strength < c.usd
+
+    one = LiquidationEvents.from_rows([(NOW - 12 * H, "bybit", "long", 100.0, 1000.0)])
+    assert analyze(one, now_ms=NOW, half_life_h=12).clusters[0].strength == pytest.approx(500.0)
+    assert analyze(LiquidationEvents.empty()).count == 0
+
+
+def test_bucket_width_scales_with_volatility():
+    assert [nice_step(x) for x in (0.7, 1.0, 1.3, 3.1, 7.0, 0.013)] == pytest.approx([1, 1, 2, 5, 10, 0.02])
+    calm = 60_000 * (1 + np.random.default_rng(1).normal(0, 0.002, 500))
+    wild = 60_000 * (1 + np.random.default_rng(1).normal(0, 0.02, 500))
+    assert bucket_width(calm) < bucket_width(wild)
+    assert bucket_width(calm, ref_price=60_000, vol=0.01) == 200.0
+    assert bucket_width([60_000.0] * 5) == pytest.approx(nice_step(60_000 * 2e-4))   # нижний зажим
+    assert bucket_width([60_000.0], vol=1.0) == pytest.approx(1000.0)               # верхний: 2% → 1000
+
+
+def test_store_dedupes_and_rolls(temp_db):
+    store = LiquidationStore(temp_db)
+    rnd = random.Random(4)
+    rows = [(NOW - rnd.randint(0, 30 * H), rnd.choice(["bybit", "okx"]), rnd.choice(["buy", "sell"]),
+             rnd.uniform(59_000, 61_000), rnd.uniform(100, 1000)) for _ in range(500)]
+    ev = LiquidationEvents.from_rows(rows)
+    assert store.insert("BTCUSDT", ev) == 500
+    assert store.insert("BTC", ev.window(NOW - 10 * H)) == 0                     # перекрывающееся окно
+
+    back = store.load("BTC", NOW - 24 * H, NOW)
+    assert len(back) == sum(1 for r in rows if r[0] >= NOW - 24 * H) and np.all(np.diff(back.ts) >= 0)
+    assert len(store.load("BTC", 0, venues=["okx"])) == sum(1 for r in rows if r[1] == "okx")
+
+    st = store.analyze("BTC", hours=24, now_ms=NOW)
+    assert st.count == len(back) and st.velocity_usd_h == pytest.approx(back.usd.sum() / 24)
+
+    series = store.rolling("BTC", window_h=2, step_h=1, span_h=24, now_ms=NOW)
+    assert len(series["end"]) == 24 and series["end"][-1] == NOW
+    for i in (0, 11, 23):
+        end = series["end"][i]
+        inside = [r for r in rows if end - 2 * H < r[0] <= end]
+        assert series["count"][i] == len(inside)
+        assert series["long_usd"][i] == pytest.approx(sum(r[4] for r in inside if r[2] == "buy"))
+    assert rolling(LiquidationEvents.empty(), H, H, NOW - 3 * H, NOW)["count"].tolist() == [0, 0, 0]
+    assert store.retain(now_ms=NOW + 14 * 86_400_000 - 20 * H) == sum(1 for r in rows if r[0] < NOW - 20 * H)
+
+
+def test_collect_throttles_and_fetches_all_venues(temp_db, monkeypatch):
+    calls = []
+
+    def fetch(symbol, exchanges, hours):
+        calls.append((symbol, tuple(exchanges), hours))
+        return LiquidationEvents.from_rows([(NOW, "bybit", "long", 100.0, 1000.0), (NOW, "okx", "short", 101.0, 900.0)])
+
+    monkeypatch.setattr(fmd, "fetch_liquidation_events", fetch)
+    store = LiquidationStore(temp_db, collect_min_sec=120)
+    assert store.collect("BTC", now=1000.0) == 2
+    assert store.collect("BTCUSDT", now=1060.0) == 0 and len(calls) == 1
+    assert store.collect("BTC", now=1200.0) == 0 and len(calls) == 2                 # те же события — дубликаты
+    assert calls[0] == ("BTC", ("bybit", "okx"), 48)
+
+
+def test_events_without_venue_time_are_dropped(temp_db, monkeypatch):
+    raw = [{"updatedTime": str(NOW - H), "side": "Buy", "price": "60000", "value": "1000"},
+           {"side": "Sell", "price": "60100", "value": "2000"}]                    # нет времени биржи
+    okx = {"code": "0", "data": [{"ts": str(NOW - H), "side": "long", "px": "3000", "sz": "1"},
+                                 {"side": "short", "px": "3010", "sz": "1"}]}
+
+    seen = set()
+
+    def get(url, params=None, timeout=None):
+        if "okx" in url:
+            return _Resp(okx)
+        first = params.get("category") == "linear" and not seen     # события только в одном окне
+        seen.add(params["endTime"])
+        return _Resp({"result": {"list": raw if first else []}})
+
+    monkeypatch.setattr(fmd._sess, "get", get)
+    store = LiquidationStore(temp_db)
+    for _ in range(2):                                                             # повторный сбор — не новые строки
+        monkeypatch.setattr(fmd, "_cache", {})
+        seen.clear()
+        ev = LiquidationEvents.concat([fmd.fetch_liquidation_events_bybit("BTC", 48),
+                                       fmd.fetch_liquidation_events_okx("BTC", 48)])
+        assert ev.ts.tolist() == [NOW - H, NOW - H] and ev.venues == ("bybit", "okx")
+        store.insert("BTC", ev)
+    assert len(store.load("BTC")) == 2
@@ -0,0 +1,141 @@
+"""
+Тесты для push-канала (LiveHub, ChangeTailer, /ws/stream).
+"""
+
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.infrastructure.live_stream import (
+    ChangeTailer, LiveEvent, LiveHub, create_live_stream_router, parse_topics, replay_events,
+)
+
+H = 3_600_000
+T0 = 1_700_000_000_000
+
+
+def test_hub_routes_by_topic_and_coalesces():
+    """Событие попадает только подписчикам топика; апдейты одного бара схлопываются."""
+    async def run():
+        hub = LiveHub()
+        btc = hub.subscribe([("BTC", "1h")])
+        any_tf = hub.subscribe([("BTC", "*")])
+        other = hub.subscribe([("TOTAL2", "1h")])
+
+        hub.publish(LiveEvent.bar("BTC", "1h", T0, 1, 2, 0.5, 1.0))
+        hub.publish(LiveEvent.bar("BTC", "1h", T0, 1, 2, 0.5, 1.5))  # тот же бар обновился
+        hub.publish(LiveEvent.bar("BTC", "1h", T0, 1, 2, 0.5, 1.5))  # дубль — игнорируется
+        hub.publish(LiveEvent.bar("BTC", "4h", T0, 1, 2, 0.5, 1.0))
+
+        got = await btc.next_batch(timeout=0.1)
+        got_any = await any_tf.next_batch(timeout=0.1)
+        got_other = await other.next_batch(timeout=0.1)
+        return got, got_any, got_other
+
+    got, got_any, got_other = asyncio.run(run())
+
+    assert [(e.timeframe, e.data["c"]) for e in got] == [("1h", 1.5)]
+    assert [e.timeframe for e in got_any] == ["1h", "4h"]
+    assert got_other == []
+
+
+def test_slow_subscriber_gets_lag_event():
+    """Переполненная очередь выбрасывает старые события и сообщает клиенту о лаге."""
+    async def run():
+        hub = LiveHub()
+        sub = hub.subscribe([("BTC", "1h")], max_pending=3)
+        for i in range(10):
+            hub.publish(LiveEvent.bar("BTC", "1h", T0 + i * H, 1, 2, 0.5, 1.0))
+        return await sub.next_batch(timeout=0.1)
+
+    batch = asyncio.run(run())
+
+    assert batch[0].type == "lag" and batch[0].data["dropped"] == 7
+    assert [e.ts for e in batch[1:]] == [T0 + 7 * H, T0 + 8 * H, T0 + 9 * H]
+
+
+def test_tailer_publishes_external_writes(temp_db):
+    """Бары и дивергенции, записанные мимо API (collector), доходят до подписчиков."""
+    temp_db.upsert_bar("BTC", "1h", T0, 1, 2, 0.5, 1.0, 1)
+
+    async def run():
+        hub = LiveHub()
+        tailer = ChangeTailer(temp_db, hub)
+        tailer.poll_once()  # инициализация водяных знаков без рассылки
+        sub = hub.subscribe([("BTC", "*")])
+
+        temp_db.upsert_bar("BTC", "1h", T0, 1, 2, 0.5, 1.2, 1)      # апдейт текущего бара
+        temp_db.upsert_bar("BTC", "1h", T0 + H, 1, 2, 0.5, 1.3, 1)  # новый бар
+        temp_db.upsert_div(metric="BTC", timeframe="1h", indicator="RSI", side="bullish",
+                           implication="neutral", pivot_l_ts=None, pivot_l_val=None,
+                           pivot_r_ts=None, pivot_r_val=None, detected_ts=T0 + H)
+        n = tailer.poll_once()
+        return n, await sub.next_batch(timeout=0.1), tailer.poll_once()
+
+    n, batch, again = asyncio.run(run())
+
+    assert n == 3
+    assert [(e.type, e.ts) for e in batch] == [("bar", T0), ("bar", T0 + H), ("div", T0 + H)]
+    assert batch[0].data["c"] == 1.2
+    assert again == 0
+
+
+def test_replay_and_websocket_resume(temp_db):
+    """Клиент с since получает пропущенные события из БД сразу после подписки."""
+    for i in range(3):
+        temp_db.upsert_bar("BTC", "1h", T0 + i * H, 1, 2, 0.5, 1.0 + i, 1)
+
+    events = replay_events(temp_db, parse_topics("BTC:1h"), T0)
+    assert [e.ts for e in events] == [T0 + H, T0 + 2 * H]
+
+    app = FastAPI()
+    create_live_stream_router(app, temp_db, LiveHub())
+    with TestClient(app).websocket_connect("/ws/stream") as ws:
+        ws.send_json({"topics": "BTC:1h", "since": T0 + H})
+        msg = ws.receive_json()
+
+    assert [(e["type"], e["ts"], e["data"]["c"]) for e in msg] == [("bar", T0 + 2 * H, 3.0)]
+
+
+def test_replay_limit_keeps_newest_bars(temp_db):
+    """Переполнение LIVE_REPLAY_LIMIT отрезает самые старые бары, а не серии в конце сортировки."""
+    for i in range(4):
+        temp_db.upsert_bar("BTC", "1h", T0 + i * H, 1, 2, 0.5, 1.0, 1)
+        temp_db.upsert_bar("TOTAL2", "1h", T0 + i * H, 1, 2, 0.5, 1.0, 1)
+
+    events = replay_events(temp_db, parse_topics("*:1h"), T0 - 1, limit=3)
+
+    assert [(e.metric, e.ts) for e in events] == [("TOTAL2", T0 + 2 * H), ("BTC", T0 + 3 * H), ("TOTAL2", T0 + 3 * H)]
+
+
+def test_tailer_run_reads_db_off_loop(temp_db):
+    """Фоновый цикл tailer-а читает БД в пуле потоков и публикует изменения в хаб."""
+    temp_db.upsert_bar("BTC", "1h", T0, 1, 2, 0.5, 1.0, 1)
+
+    async def run():
+        hub = LiveHub()
+        tailer = ChangeTailer(temp_db, hub, poll_sec=0.01)
+        sub = hub.subscribe([("BTC", "1h")])
+        tailer.start()
+        await asyncio.sleep(0.05)
+        temp_db.upsert_bar("BTC", "1h", T0 + H, 1, 2, 0.5, 1.3, 1)
+        batch = await sub.next_batch(timeout=1.0)
+        await tailer.stop()
+        return batch
+
+    batch = asyncio.run(run())
+
+    assert (batch[-1].type, batch[-1].ts, batch[-1].data["c"]) == ("bar", T0 + H, 1.3)
+
+
+def test_parse_topics_validation():
+    """Топики валидируются по METRICS/TIMEFRAMES, пусто — подписка на всё."""
+    assert parse_topics(None) == [("*", "*")]
+    assert parse_topics("BTC:1h,TOTAL2") == [("BTC", "1h"), ("TOTAL2", "*")]
+    try:
+        parse_topics("NOPE:1h")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("invalid metric accepted")
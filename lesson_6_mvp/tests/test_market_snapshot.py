@@ -0,0 +1,124 @@
+"""
+Тесты колоночного снапшота рынка (infrastructure.market_snapshot): совпадение рейтингов со старой
+сортировкой словарей, вселенная/стейблы, категории-маски, кольцо снапшотов и дельты.
+"""
+
+import random
+import time
+
+import numpy as np
+import pytest
+
+from app.infrastructure import coingecko, market_snapshot
+from app.infrastructure.market_snapshot import MarketSnapshot, MarketSnapshotStore
+
+
+def _coins(n=600, seed=1, price_mul=1.0):
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(n):
+        rows.append({
+            "id": f"coin-{i}", "symbol": f"c{i}", "name": f"Coin {i}",
+            "current_price": (i + 1) * price_mul, "market_cap": 1e9 - i, "total_volume": rnd.random() * 1e6,
+            "price_change_percentage_1h_in_currency": round(rnd.uniform(-5, 5), 1),
+            "price_change_percentage_24h_in_currency": round(rnd.uniform(-20, 20), 1),
+            "price_change_percentage_7d_in_currency": None if i % 7 == 0 else rnd.uniform(-40, 40),
+        })
+    rows[3].update(symbol="usdt", name="Tether")
+    rows[10].update(name="Some Stable Dollar")
+    rows[20]["symbol"] = ""
+    return rows
+
+
+def _old_change(c, tf):
+    k = "price_change_percentage_%s_in_currency" % tf
+    return float(c.get(k) or 0.0)
+
+
+@pytest.mark.parametrize("tf", ["1h", "24h", "7d"])
+def test_ranks_match_legacy_sort(tf):
+    data = _coins()
+    snap = MarketSnapshot(data)
+    legacy = sorted([c for c in data if c.get("symbol")], key=lambda c: _old_change(c, tf), reverse=True)
+    assert snap.ranked(tf, desc=True) == legacy
+    assert [c["id"] for c in snap.ranked(tf, desc=False)] == \
+        [c["id"] for c in sorted([c for c in data if c.get("symbol")], key=lambda c: _old_change(c, tf))]
+    assert snap.ranked(tf) is snap.ranked(tf)                              # материализуется один раз
+
+    by_cap = snap.ranked("market_cap", exclude_stable=True)
+    assert by_cap[:3] == [data[0], data[1], data[2]] and data[3] not in by_cap and data[10] not in by_cap
+
+
+def test_universe_and_stables_like_top_movers():
+    data = _coins()
+    snap = MarketSnapshot(data)
+    coins = [c for c in data[:500] if not market_snapshot.is_stable(c)]
+    assert snap.universe(500, exclude_stable=True) == coins
+    srt = sorted([c for c in coins if c["symbol"]], key=lambda c: _old_change(c, "1h"), reverse=True)
+    assert snap.top("1h", 5, desc=True, exclude_stable=True, universe=500) == srt[:5]
+    assert all(c in coins for c in snap.top("1h", 5, desc=False, exclude_stable=True, universe=500))
+    assert snap.top("1h", 5, universe=10_000) == snap.top("1h", 5)          # вселенная больше рынка — весь рынок
+    assert snap.get("C5") is data[5] and snap.get("nope") is None
+    assert snap.column("bogus") is snap.column("24h")
+
+
+def test_top_is_cheap_after_build():
+    snap = MarketSnapshot(_coins(5000))
+    snap.top("24h", 5, universe=500)
+    t0 = time.perf_counter()
+    for _ in range(2000):
+        snap.top("24h", 5, exclude_stable=True, universe=500)
+    assert (time.perf_counter() - t0) / 2000 < 2e-4
+
+
+def test_store_reuses_cached_object_and_keeps_categories():
+    store = MarketSnapshotStore(ring=3)
+    data = _coins(50)
+    s1 = store.ingest(data)
+    assert store.ingest(data) is s1 and store.built == 1
+    assert len(store.ingest([])) == 0 and store.latest() is s1            # пустой ответ историю не трогает
+
+    cat = [c for c in data if c["id"] in ("coin-1", "coin-2", "coin-30")]
+    csnap = store.category_snapshot("layer-1", cat)
+    assert store.category_snapshot("layer-1", cat) is csnap
+    assert [c["id"] for c in csnap.top("24h", 5)] == \
+        [c["id"] for c in sorted(cat, key=lambda c: _old_change(c, "24h"), reverse=True)]
+    assert int(s1.in_category("layer-1").sum()) == 3
+
+    s2 = store.ingest(_coins(50, price_mul=1.1))
+    assert s2 is not s1 and np.flatnonzero(s2.in_category("layer-1")).tolist() == [1, 2, 30]
+    assert [c["id"] for c in s2.ranked("24h", category="layer-1")] == [c["id"] for c in csnap.ranked("24h")]
+    for i in range(3):
+        store.ingest(_coins(50, seed=i))
+    assert len(store.history()) == 3
+
+
+def test_delta_and_movers_since():
+    store = MarketSnapshotStore()
+    cur, d = store.delta()
+    assert cur is None and d.size == 0
+    old = _coins(30)
+    new = _coins(30)
+    new[5]["current_price"] *= 1.5
+    new[6]["current_price"] *= 0.5
+    new[3]["current_price"] *= 3                                          # стейбл в мувер не попадает
+    new.append({"id": "fresh", "symbol": "new", "current_price": 1.0})
+    store.ingest(old)
+    store.ingest(new)
+    cur, d = store.delta("price")
+    assert d[5] == pytest.approx(50.0) and d[6] == pytest.approx(-50.0) and np.isnan(d[30])
+    up = store.movers_since(k=1)
+    down = store.movers_since(k=1, desc=False)
+    assert up[0][0]["id"] == "coin-5" and down[0][0]["id"] == "coin-6"
+
+
+def test_top_movers_uses_store(monkeypatch):
+    data = _coins()
+    store = MarketSnapshotStore()
+    monkeypatch.setattr(market_snapshot, "_store", store)
+    monkeypatch.setattr(coingecko, "markets_snapshot", lambda vs="usd": data)
+    bubbles, gain, loss, tf = coingecko.top_movers(tf="7d", limit_each=3, top=100)
+    assert tf == "7d" and len(bubbles) == 98 and len(gain) == len(loss) == 3
+    assert gain[0] is max(bubbles, key=lambda c: _old_change(c, "7d"))
+    coingecko.top_movers(tf="1h")
+    assert store.built == 1
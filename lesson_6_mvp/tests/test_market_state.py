@@ -0,0 +1,91 @@
+"""
+Тесты для материализованного состояния рынка (usecases.market_state).
+"""
+
+import math
+
+from app.usecases import market_state
+from app.usecases.generate_report import METRICS, TfCalc, build_full_report
+from app.usecases.market_state import MarketStateStore, get_market_state
+
+HOUR_MS = 3_600_000
+T0 = 1_704_067_200_000
+
+
+def _fill(db, n=120, tf="1h", start=T0):
+    rows = []
+    for m in METRICS:
+        for i in range(n):
+            c = 100.0 + 10.0 * math.sin(i / 7.0) + i * 0.05
+            rows.append((m, tf, start + i * HOUR_MS, c, c * 1.01, c * 0.99, c, 1000.0 + i))
+    db.upsert_many_bars(rows)
+
+
+def test_state_is_recomputed_only_when_bars_change(temp_db):
+    """Повторные чтения не пересчитывают; новый бар любой метрики — пересчёт."""
+    _fill(temp_db)
+    store = MarketStateStore(temp_db, timeframes=("1h",), max_age_sec=0)
+
+    first = store.get("1h")
+    assert set(first.arrows) == set(METRICS)
+    assert set(first.divergences) <= set(METRICS)
+    assert first.bar_ts == T0 + 119 * HOUR_MS
+    store.get("1h")
+    store.get("1h")
+    assert store.get_stats()["recomputes"] == 1
+
+    temp_db.upsert_bar("TOTAL2", "1h", T0 + 120 * HOUR_MS, 101, 102, 100, 101.5, 5)
+    second = store.get("1h")
+    assert store.get_stats()["recomputes"] == 2
+    assert second.bar_ts == T0 + 120 * HOUR_MS
+    assert [ts for ts, _s, _l in store.history("1h")] == [first.bar_ts, second.bar_ts]
+
+
+def test_risk_changes_come_from_history(temp_db, monkeypatch):
+    """Смены label фиксируются в истории; апдейт текущего бара не плодит дубли."""
+    labels = iter([("Risk-ON", 3.0), ("Risk-ON", 2.0), ("Risk-OFF", -3.0), ("Нейтрально", 0.0)])
+
+    def fake_calc(db, tf):
+        label, score = next(labels)
+        return TfCalc(score=score, label=label, arrows={}, counts={}, details=[])
+
+    monkeypatch.setattr(market_state, "_calc_for_tf", fake_calc)
+    _fill(temp_db, n=3)
+    store = MarketStateStore(temp_db, timeframes=("1h",), history=4)
+
+    assert store.refresh() == []
+    temp_db.upsert_bar("BTC", "1h", T0 + 3 * HOUR_MS, 1, 1, 1, 1, 1)
+    assert store.refresh() == []
+    temp_db.upsert_bar("BTC", "1h", T0 + 4 * HOUR_MS, 1, 1, 1, 1, 1)
+    (change,) = store.refresh()
+    assert (change.prev_label, change.label) == ("Risk-ON", "Risk-OFF")
+    assert "Risk-ON → Risk-OFF" in change.text()
+
+    # тот же бар обновился — точка истории заменяется
+    temp_db.upsert_bar("BTC", "1h", T0 + 4 * HOUR_MS, 1, 2, 1, 2, 1)
+    (change,) = store.refresh()
+    assert (change.prev_label, change.label) == ("Risk-OFF", "Нейтрально")
+    assert [label for _ts, _s, label in store.history("1h")] == ["Risk-ON", "Risk-ON", "Нейтрально"]
+    assert store.previous("1h")[2] == "Risk-ON"
+    assert [c.label for c in store.changes("1h")] == ["Нейтрально"]
+    assert store.refresh() == []
+
+
+def test_full_report_reads_materialized_state(temp_db, monkeypatch):
+    """Отчёт берёт TfCalc из store: второй отчёт без новых баров ничего не пересчитывает."""
+    _fill(temp_db)
+    calls = []
+    orig = market_state._calc_for_tf
+
+    def counting(db, tf):
+        calls.append(tf)
+        return orig(db, tf)
+
+    monkeypatch.setattr(market_state, "_calc_for_tf", counting)
+    assert get_market_state(temp_db) is get_market_state(temp_db)
+
+    text = build_full_report(temp_db)
+    assert "(полный)" in text
+    assert sorted(calls) == sorted(["15m", "1h", "4h", "1d"])
+    build_full_report(temp_db)
+    assert len(calls) == 4
@@ -0,0 +1,125 @@
+"""
+Тесты для подсистемы метрик (utils.metrics) и её автоинструментирования.
+"""
+
+import asyncio
+import urllib.request
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.infrastructure.cache import cached
+from app.utils import metrics
+from app.utils.metrics import (
+    CACHE_REQUESTS, DB_QUERY_SECONDS, OVERHEAD_BUDGET_US, Histogram, Registry,
+    bench_overhead, instrument_ptb_application, start_metrics_server, timed,
+)
+from app.utils.performance import PerformanceMonitor
+
+
+def test_histogram_quantiles_within_relative_error():
+    """HDR-бакеты: квантили с относительной ошибкой ≤ 1/8 на разных порядках величин."""
+    h = Histogram("t_seconds", "t", ["op"])
+    values = [i / 10_000 for i in range(1, 1001)]  # 0.1 мс … 100 мс
+    for v in values:
+        h.observe(v, op="x")
+
+    snap = h.snapshot(op="x")
+    assert snap["count"] == 1000
+    assert snap["sum"] == pytest.approx(sum(values), rel=1e-3)
+    for q, exact in (("p50", values[499]), ("p90", values[899]), ("p99", values[989])):
+        assert exact <= snap[q] <= exact * (1 + 1 / metrics.HISTO_SUB_BUCKETS)
+
+
+def test_prometheus_exposition_is_cumulative():
+    """Бакеты le кумулятивные, +Inf == _count, лейблы экранируются."""
+    reg = Registry()
+    h = reg.histogram("req_seconds", "Request latency", ["route"])
+    c = reg.counter("hits_total", "Hits", ["fn"])
+    h.observe(0.0001, route='/a"b')
+    h.observe(0.003, route='/a"b')
+    h.observe(5.0, route='/a"b')
+    c.inc(fn="x")
+    c.inc(2, fn="x")
+
+    text = reg.render()
+    assert "# TYPE alt_forecast_req_seconds histogram" in text
+    assert 'alt_forecast_hits_total{fn="x"} 3' in text
+    buckets = [ln for ln in text.splitlines() if ln.startswith("alt_forecast_req_seconds_bucket")]
+    counts = [int(ln.rsplit(" ", 1)[1]) for ln in buckets]
+    assert counts == sorted(counts) and counts[-1] == 3
+    assert 'route="/a\\"b",le="+Inf"' in buckets[-1]
+    assert 'alt_forecast_req_seconds_count{route="/a\\"b"} 3' in text
+
+
+def test_db_methods_and_cache_are_instrumented(temp_db):
+    """Публичные методы DB пишут db_query_seconds, cached() — hit/miss счётчики."""
+    before = DB_QUERY_SECONDS.snapshot(method="upsert_bar")["count"]
+    temp_db.upsert_bar("BTC", "1h", 1_700_000_000_000, 1, 2, 0.5, 1.5, 10)
+    temp_db.get_last_ts("BTC", "1h")
+    assert DB_QUERY_SECONDS.snapshot(method="upsert_bar")["count"] == before + 1
+    assert DB_QUERY_SECONDS.snapshot(method="get_last_ts")["count"] >= 1
+
+    @cached(ttl=60)
+    def _metrics_probe(x):
+        return x * 2
+
+    _metrics_probe(21)
+    _metrics_probe(21)
+    assert CACHE_REQUESTS.value(fn="_metrics_probe", result="miss") == 1
+    assert CACHE_REQUESTS.value(fn="_metrics_probe", result="hit") == 1
+
+
+def test_timed_async_and_ptb_handlers():
+    """timed() понимает корутины и считает ошибки; PTB-хендлеры оборачиваются один раз."""
+    reg = Registry()
+    hist = reg.histogram("h_seconds", "h", ["handler"])
+    errs = reg.counter("h_errors_total", "e", ["handler"])
+
+    @timed(hist, errs, handler="boom")
+    async def boom():
+        raise RuntimeError("x")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(boom())
+    assert hist.snapshot(handler="boom")["count"] == 1
+    assert errs.value(handler="boom") == 1
+
+    async def on_ping(update, context):
+        return "pong"
+
+    handler = SimpleNamespace(callback=on_ping)
+    app = SimpleNamespace(handlers={0: [handler]})
+    assert instrument_ptb_application(app) == 1
+    assert instrument_ptb_application(app) == 0
+    assert asyncio.run(handler.callback(None, None)) == "pong"
+    assert metrics.HANDLER_SECONDS.snapshot(handler="on_ping")["count"] == 1
+
+
+def test_performance_monitor_feeds_histogram_and_endpoints():
+    """PerformanceMonitor пишет operation_seconds; /metrics отдают API и порт воркера."""
+    with PerformanceMonitor("test_metrics_block"):
+        pass
+    assert metrics.OPERATION_SECONDS.snapshot(op="test_metrics_block")["count"] == 1
+
+    from app.infrastructure.webhook import app
+    resp = TestClient(app).get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    assert 'alt_forecast_operation_seconds_count{op="test_metrics_block"} 1' in resp.text
+
+    server = start_metrics_server(0, host="127.0.0.1")
+    try:
+        port = server.server_address[1]
+        body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read().decode()
+        assert "# TYPE alt_forecast_db_query_seconds histogram" in body
+    finally:
+        server.shutdown()
+
+
+def test_overhead_budget():
+    """Документированный бюджет накладных расходов (см. docstring utils.metrics)."""
+    cost = bench_overhead(n=5000)
+    assert cost["observe"] <= OVERHEAD_BUDGET_US["observe"], cost
+    assert cost["timed"] <= OVERHEAD_BUDGET_US["timed"], cost
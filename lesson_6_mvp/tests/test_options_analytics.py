@@ -0,0 +1,138 @@
+"""
+Тесты опционной аналитики (domain.options) и локальных снимков цепочек (infrastructure.options_store).
+"""
+
+import math
+import threading
+
+import numpy as np
+import pytest
+
+from app.domain.options import OptionChain, analyze, bs_gamma, gamma_flip, gamma_profile, max_pain
+from app.infrastructure import deribit
+from app.infrastructure.deribit import OptionOI
+from app.infrastructure.options_store import OptionsSnapshotStore, pack_chain, unpack_chain
+
+NOW = 1_735_689_600_000          # 2025-01-01 00:00 UTC
+
+
+def _old_max_pain(rows):
+    """Прежний перебор O(S²) из deribit._max_pain_for_expiry."""
+    strikes = sorted({x.strike for x in rows})
+    by = {s: {"C": 0.0, "P": 0.0} for s in strikes}
+    for x in rows:
+        by[x.strike][x.kind] += max(0.0, float(x.oi))
+
+    def pain(price):
+        return sum(v["C"] * max(price - k, 0.0) + v["P"] * max(k - price, 0.0) for k, v in by.items())
+    return min(strikes, key=pain)
+
+
+def _chain(seed=3, expiries=("2025-01-03", "2025-01-31", "2025-03-28"), spot=100_000.0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for e in expiries:
+        for k in np.arange(60_000, 140_001, 2_500.0):
+            m = math.log(k / spot)
+            for kind in "CP":
+                rows.append(OptionOI(e, float(k), kind, float(rng.integers(0, 900)),
+                                     0.55 + 0.4 * m * m - (0.15 * m if kind == "P" else 0.1 * m)))
+    rng.shuffle(rows)
+    return rows
+
+
+def test_max_pain_matches_quadratic_loop():
+    rng = np.random.default_rng(11)
+    for _ in range(50):
+        n = int(rng.integers(1, 40))
+        rows = [OptionOI("2025-01-31", float(rng.choice(np.arange(1, 30)) * 1000), str(rng.choice(["C", "P"])),
+                         float(rng.integers(-5, 50))) for _ in range(n)]
+        assert deribit._max_pain_for_expiry(rows) == _old_max_pain(rows)
+    assert max_pain([1.0, 2.0, 3.0], [0, 0, 0], [0, 0, 0]) == 1.0          # равная боль — меньший страйк
+    assert math.isnan(deribit._max_pain_for_expiry([]))
+
+
+def test_analyze_groups_walls_gex_and_skew():
+    rows = _chain()
+    chain = OptionChain.from_rows(rows)
+    stats = analyze(chain, spot=100_000.0, now_ms=NOW, max_expiries=2)
+    assert [s.expiry for s in stats] == ["2025-01-03", "2025-01-31"]
+    for st in stats:
+        mine = [x for x in rows if x.expiry == st.expiry]
+        assert st.max_pain == _old_max_pain(mine)
+        calls = {x.strike: x.oi for x in mine if x.kind == "C"}
+        assert st.call_wall == max(calls, key=calls.get)
+        assert st.call_oi == pytest.approx(sum(calls.values()))
+        assert st.skew > 0 and 0.5 < st.atm_iv < 0.6                       # путы дороже коллов на тех же 10%
+
+    t = chain.years_to_expiry(NOW)[0]
+    one = [x for x in rows if x.expiry == "2025-01-03"]
+    expected = sum((1 if x.kind == "C" else -1) * x.oi * float(bs_gamma(1e5, x.strike, x.iv, t)) for x in one) * 1e8
+    assert stats[0].gex == pytest.approx(expected, rel=1e-9)
+
+
+def test_gamma_profile_and_flip():
+    rows = [OptionOI("2025-01-31", 90_000.0, "P", 100.0, 0.6), OptionOI("2025-01-31", 110_000.0, "C", 100.0, 0.6)]
+    chain = OptionChain.from_rows(rows)
+    spots = np.linspace(80_000, 120_000, 81)
+    prof = gamma_profile(chain, spots, now_ms=NOW)
+    assert prof[0] < 0 < prof[-1]
+    assert 95_000 < gamma_flip(spots, prof) < 105_000
+    assert math.isnan(gamma_flip(spots, np.abs(prof)))
+
+
+def test_snapshot_store_roundtrip_and_series(temp_db, monkeypatch):
+    rows = _chain()
+    monkeypatch.setattr(deribit, "fetch_chain", lambda ccy: rows)
+    monkeypatch.setattr(deribit, "get_index_price", lambda ccy: 100_000.0)
+    store = OptionsSnapshotStore(temp_db, max_age_sec=600)
+
+    chain = OptionChain.from_rows(rows)
+    back = unpack_chain(pack_chain(chain))
+    assert back.expiries == chain.expiries and np.array_equal(back.strike, chain.strike)
+    assert np.array_equal(back.oi, chain.oi) and np.allclose(back.iv, chain.iv, rtol=1e-6)
+
+    first = store.series("BTC", max_expiries=2, now_ms=NOW)                 # снимка нет — fetch + save
+    assert [p["date"] for p in first] == ["2025-01-03", "2025-01-31"]
+    assert first[0]["deribit_notional_usd"] == pytest.approx(
+        sum(x.oi for x in rows if x.expiry == "2025-01-03") * 100_000.0)
+
+    monkeypatch.setattr(deribit, "fetch_chain", lambda ccy: pytest.fail("снимок свежий — биржа не нужна"))
+    again = store.series("BTC", max_expiries=2, now_ms=NOW + 60_000)
+    assert [p["max_pain"] for p in again] == [p["max_pain"] for p in first]
+
+    moved = [OptionOI(x.expiry, x.strike, x.kind, x.oi * (3 if x.kind == "C" and x.strike == 125_000 else 1), x.iv)
+             for x in rows]
+    monkeypatch.setattr(deribit, "fetch_chain", lambda ccy: moved)
+    store.snapshot("BTC", now_ms=NOW + 900_000)
+    hist = store.history("BTC", since_ms=NOW, expiry="2025-01-31")
+    assert [ts for ts, _ in hist] == [NOW, NOW + 900_000]
+    assert hist[-1][1].call_oi > hist[0][1].call_oi
+
+    ts, spot, loaded = store.load("BTC")
+    assert (ts, spot, len(loaded)) == (NOW + 900_000, 100_000.0, len(moved))
+    assert store.retain(now_ms=NOW + 30 * 86_400_000 + 1) == 1
+
+
+def test_save_from_job_thread_is_isolated_from_other_transactions(temp_db):
+    store = OptionsSnapshotStore(temp_db)
+    chain = OptionChain.from_rows(_chain())
+    stats = analyze(chain, 100_000.0, now_ms=NOW)
+    errors = []
+
+    def job():
+        try:
+            store.save("BTC", NOW, chain, 100_000.0, stats)          # ждёт чужой BEGIN IMMEDIATE, не вкладывается в него
+        except Exception as e:
+            errors.append(e)
+
+    with pytest.raises(RuntimeError):
+        with temp_db.atomic():
+            temp_db.conn.execute("DELETE FROM options_stats")
+            t = threading.Thread(target=job)
+            t.start()
+            t.join(0.2)
+            raise RuntimeError("откат своей транзакции")
+    t.join(5)
+    assert not errors and store.latest_ts("BTC") == NOW
+    assert len(store.stats_at("BTC", NOW)) == len(stats)
@@ -0,0 +1,166 @@
+"""
+Тесты инкрементального L2-стакана (infrastructure.orderbook): дифф-пачки против эталонного словаря,
+синхронизация потока по U/u/pu, события стен и spoof, whale-запросы без REST.
+"""
+
+import json
+import random
+import time
+
+import numpy as np
+import pytest
+
+from app.infrastructure import free_market_data
+from app.infrastructure.orderbook import ASK, BID, OrderBook, OrderBookService
+
+
+def _levels(d):
+    return [[p, q] for p, q in d.items()]
+
+
+def test_diffs_match_reference_dict():
+    rnd = random.Random(7)
+    book = OrderBook("binance", "BTCUSDT", bucket_bps=10)
+    ref = {BID: {}, ASK: {}}
+    for i in range(300):
+        ref[BID][round(99_000 - i * 0.5, 1)] = rnd.uniform(0.1, 5)
+        ref[ASK][round(99_001 + i * 0.5, 1)] = rnd.uniform(0.1, 5)
+    book.load_snapshot(_levels(ref[BID]), _levels(ref[ASK]), ts=1)
+    for step in range(200):
+        upd = {BID: [], ASK: []}
+        for side, base, sign in ((BID, 99_000, -1), (ASK, 99_001, 1)):
+            for _ in range(rnd.randint(1, 15)):
+                p = round(base + sign * rnd.randint(0, 400) * 0.5, 1)
+                q = 0.0 if rnd.random() < 0.3 else rnd.uniform(0.1, 5)
+                upd[side].append([p, q])
+                if q > 0:
+                    ref[side][p] = q
+                else:
+                    ref[side].pop(p, None)
+        book.apply_diff(upd[BID], upd[ASK], ts=step + 2)
+
+    for side in (BID, ASK):
+        s = book.sides[side]
+        assert s.px.tolist() == sorted(ref[side]) and np.allclose(s.qty, [ref[side][p] for p in sorted(ref[side])])
+        assert s.total == pytest.approx(sum(p * q for p, q in ref[side].items()))
+        lo, notional = book.buckets(side)
+        want = {}
+        for p, q in ref[side].items():
+            k = int(np.floor(p / book.bucket_size))
+            want[k] = want.get(k, 0.0) + p * q
+        assert np.allclose(notional, [want[k] for k in sorted(want)])
+    best = sorted(ref[BID], reverse=True)[:20]
+    assert book.depth(BID, levels=20) == pytest.approx(sum(p * ref[BID][p] for p in best))
+    assert book.mid() == pytest.approx((max(ref[BID]) + min(ref[ASK])) / 2)
+
+
+def _write(path, msgs):
+    path.write_text("\n".join(json.dumps(m) for m in msgs))
+    return str(path)
+
+
+def test_replay_syncs_stream_and_detects_walls(tmp_path):
+    sym = "BTCUSDT"
+    snap = {"type": "snapshot", "venue": "binance", "symbol": sym, "ts": 1_000, "lastUpdateId": 100,
+            "bids": [["100.0", "1000"], ["99.0", "1000"], ["90.0", "1000"]],
+            "asks": [["101.0", "1000"], ["102.0", "1000"]]}
+
+    def diff(U, u, pu, ts, bids=(), asks=()):
+        return {"type": "diff", "venue": "binance", "symbol": sym, "ts": ts, "U": U, "u": u, "pu": pu,
+                "bids": list(bids), "asks": list(asks)}
+
+    msgs = [
+        snap,
+        diff(90, 95, 89, 1_050, bids=[["99.5", "1"]]),                     # старее снапшота — мимо
+        diff(98, 105, 97, 1_100, bids=[["95.0", "40000"]]),                 # накрывает lastUpdateId: стена
+        diff(106, 110, 105, 1_200, asks=[["103.0", "50000"]]),              # ещё одна стена
+        diff(111, 115, 110, 3_000, bids=[["95.0", "0"]]),                   # бид-стену сняли до подхода цены
+        diff(116, 120, 115, 4_000, bids=[["100.0", "0"], ["99.0", "0"], ["90.0", "0"]],
+             asks=[["101.0", "0"], ["102.0", "0"]]),                       # цена дошла до аск-стены...
+        diff(121, 125, 120, 5_000, asks=[["103.0", "0"]]),                  # ...и съела её — не spoof
+        diff(140, 150, 130, 6_000, bids=[["80.0", "1"]]),                   # разрыв pu
+    ]
+    svc = OrderBookService(wall_min_usd=2_000_000, wall_share=0.0005, spoof_max_sec=60)
+    got = []
+    svc.add_listener(got.append)
+    svc.replay(_write(tmp_path / "book.jsonl", msgs))
+
+    assert [(e.kind, e.side, e.price) for e in got] == [
+        ("appear", BID, 95.0), ("appear", ASK, 103.0), ("disappear", BID, 95.0), ("disappear", ASK, 103.0)]
+    assert got[2].spoof and got[2].lifetime_ms == 1_900
+    assert not got[3].spoof
+    assert svc.stats["stale_diffs"] == 1 and svc.stats["gaps"] == 1
+    book = svc.book("binance", sym)
+    assert book.needs_snapshot and book.last_update_id == 125
+    assert svc.fresh_book("binance", sym, now_ms=5_100) is None
+    assert svc.recent_events(symbol=sym, spoof_only=True) == [got[2]]
+
+    svc.handle({**snap, "lastUpdateId": 200, "ts": 7_000})
+    svc.handle(diff(199, 205, 198, 7_100, bids=[["98.0", "1"]]))
+    assert svc.fresh_book("binance", sym, now_ms=7_200) is book and 98.0 in book.bids.px
+
+    rest = svc.apply_snapshot("binance", sym, [["50.0", "1"]], [["60.0", "1"]])     # REST не ломает поток
+    assert rest is not book and book.last_update_id == 205
+
+
+def _legacy_whales(bids, asks, min_usd, price):
+    out = []
+    for rows, side in ((bids, "buy"), (asks, "sell")):
+        for p, q in rows:
+            p, q = float(p), float(q)
+            if p * q >= min_usd and abs(p - price) / price <= 0.1:
+                out.append((p * q, p, side))
+    return sorted(out, reverse=True)
+
+
+class _Resp:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+def test_whale_orders_from_book_match_legacy_and_skip_rest(monkeypatch):
+    rnd = random.Random(1)
+    mid = 60_000.0
+    bids = [[f"{mid - 1 - i * 5:.1f}", f"{rnd.expovariate(1 / 3):.3f}"] for i in range(500)]
+    asks = [[f"{mid + 1 + i * 5:.1f}", f"{rnd.expovariate(1 / 3):.3f}"] for i in range(500)]
+    for i in (3, 40, 700 // 5):
+        bids[i][1] = "120"
+        asks[i][1] = "90"
+    calls = []
+
+    def get(url, params=None, timeout=None):
+        calls.append(url)
+        return _Resp({"bids": bids, "asks": asks})
+
+    svc = OrderBookService()
+    monkeypatch.setattr("app.infrastructure.orderbook._service", svc)
+    monkeypatch.setattr(free_market_data, "_cache", {})
+    monkeypatch.setattr(free_market_data._sess, "get", get)
+    got = free_market_data.get_whale_orders_from_binance("BTC", current_price=mid)
+    total = sum(float(p) * float(q) for p, q in bids + asks)
+    want = _legacy_whales(bids, asks, max(2_000_000.0, total * 0.0005), mid)
+    assert [(o.amount, o.price, o.side) for o in got] == pytest.approx(want)
+    assert len(got) == 6 and all(o.exchange == "binance" for o in got) and len(calls) == 1
+
+    book = svc.book("binance", "BTCUSDT")
+    assert len(book.walls()) == 6
+    book.synced, book.ts = True, int(time.time() * 1000)
+    monkeypatch.setattr(free_market_data, "_cache", {})
+    again = free_market_data.get_whale_orders_from_binance("BTC", current_price=mid)
+    assert [(o.amount, o.price) for o in again] == [(o.amount, o.price) for o in got] and len(calls) == 1
+
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        book.whale_orders(current_price=mid)
+    assert (time.perf_counter() - t0) / 1000 < 5e-4
+
+    est = free_market_data.estimate_liquidation_levels_from_positions("BTC", mid)
+    assert len(calls) == 1 and {lv.side for lv in est} == {"long", "short"}
+    top20 = sum(float(p) * float(q) for p, q in bids[:20])
+    assert est[0].usd_value == pytest.approx(top20 * 0.1)
@@ -0,0 +1,113 @@
+"""
+Тесты леджера квоты CoinGecko (infrastructure.quota): атомарные резервы между процессами, пакетная
+запись, учёт по эндпоинтам и планировщик TTL по спросу.
+"""
+
+import calendar
+import multiprocessing as mp
+
+import pytest
+
+from app.infrastructure import quota
+from app.infrastructure.cache import cached
+from app.infrastructure.quota import PLANNED_ENDPOINTS, QuotaLedger, plan_ttls
+
+
+def _drain(path, limit, block):
+    ledger = QuotaLedger(path, limit=limit, block=block)
+    n = 0
+    while True:
+        try:
+            ledger.consume(1, "markets_snapshot")
+        except RuntimeError:
+            break
+        n += 1
+    ledger.flush(release=True)
+    return n
+
+
+def test_processes_never_overspend_month(tmp_path):
+    path = str(tmp_path / "q.db")
+    QuotaLedger(path)._db()
+    ctx = mp.get_context("fork")
+    with ctx.Pool(4) as pool:
+        got = pool.starmap(_drain, [(path, 203, 5)] * 4)
+    assert sum(got) == 203
+    snap = QuotaLedger(path, limit=203).snapshot()
+    assert snap["used"] == 203 and snap["endpoints"]["markets_snapshot"]["used"] == 203
+
+
+def test_blocks_batch_writes_and_release(tmp_path):
+    ledger = QuotaLedger(str(tmp_path / "q.db"), limit=1000, block=10)
+    conn = ledger._db()
+    stmts = []
+    conn.set_trace_callback(stmts.append)
+    for i in range(25):
+        ledger.consume(1, "trending" if i % 5 else "categories")
+        ledger.record_demand("trending")
+    reserves = [s for s in stmts if s.startswith("UPDATE coingecko_quota SET used = used +")]
+    assert len(reserves) == 3                                          # 10 + 10 + 10 единиц
+    snap = ledger.snapshot()
+    assert snap["used"] == 25                                          # свой невыбранный блок не в счёт
+    assert snap["endpoints"] == {"trending": {"used": 20, "demand": 25}, "categories": {"used": 5, "demand": 0}}
+    ledger.flush(release=True)
+    assert conn.execute("SELECT used FROM coingecko_quota").fetchone()[0] == 25
+
+
+def test_in_memory_fallback_and_guard(monkeypatch):
+    monkeypatch.setattr(quota, "_ledger", QuotaLedger(None, limit=2))
+    calls = []
+
+    @quota.budget_guard(units=1, endpoint="global_stats")
+    def fetch():
+        calls.append(1)
+        return len(calls)
+
+    assert fetch() == 1 and fetch() == 2
+    with pytest.raises(RuntimeError, match="COINGECKO_BUDGET_EXCEEDED"):
+        fetch()
+    info, limit = quota.get_budget()
+    assert (info["used"], info["remaining"], limit) == (2, 0, 2)
+    assert info["endpoints"]["global_stats"]["used"] == 2
+
+
+def test_plan_ttls_spreads_budget_by_demand():
+    horizon = 10 * 86400.0
+    rates = {"markets_snapshot": 0.05, "trending": 0.005, "global_stats": 0.0005, "defi_global": 0.0, "categories": 1e-4}
+    ttl = plan_ttls(3000, horizon, rates)
+    assert ttl["markets_snapshot"] < ttl["trending"] < ttl["global_stats"]
+    assert ttl["defi_global"] == PLANNED_ENDPOINTS["defi_global"][2]                  # без спроса — максимум
+    assert ttl["categories"] >= 1 / 1e-4                                              # не чаще спроса
+    assert sum(horizon / t for t in ttl.values()) <= 3000 * 1.0001
+    assert ttl["trending"] / ttl["markets_snapshot"] == pytest.approx((0.05 / 0.005) ** 0.5)
+
+    rich = plan_ttls(1e9, horizon, rates)                                             # денег много — упор в min
+    assert rich["markets_snapshot"] == PLANNED_ENDPOINTS["markets_snapshot"][0]
+    broke = plan_ttls(0, horizon, rates)
+    assert all(broke[n] == PLANNED_ENDPOINTS[n][2] for n in PLANNED_ENDPOINTS)
+
+
+def test_ledger_plan_drives_cache_ttl(tmp_path, monkeypatch):
+    now = [float(calendar.timegm((2030, 5, 16, 0, 0, 0)))]                            # середина месяца
+    ledger = QuotaLedger(str(tmp_path / "q.db"), limit=10_000, block=5, clock=lambda: now[0])
+    monkeypatch.setattr(quota, "_ledger", ledger)
+    assert ledger.ttl("trending") == PLANNED_ENDPOINTS["trending"][1]                # спроса ещё нет
+
+    for _ in range(60_000):
+        ledger.record_demand("markets_snapshot")
+    ledger.consume(3_000, "markets_by_category")                                     # непланируемый расход
+    plan = ledger.plan(force=True)
+    assert plan["trending"] == PLANNED_ENDPOINTS["trending"][2]
+    assert PLANNED_ENDPOINTS["markets_snapshot"][0] < plan["markets_snapshot"] < 3600  # бюджет тесный
+    assert quota.get_budget()[0]["ttl"]["markets_snapshot"] == plan["markets_snapshot"]
+
+    hits = []
+
+    @cached(ttl=quota.ttl_for("markets_snapshot"), key_fn=lambda: "k", stale_ok=False)
+    def data():
+        hits.append(1)
+        return len(hits)
+
+    assert data() == 1 and data() == 1
+    ledger._plan["markets_snapshot"] = 1e-6                                           # план сменился на лету
+    assert data() == 2
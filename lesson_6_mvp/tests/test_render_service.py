@@ -0,0 +1,75 @@
+"""
+Тесты для RenderService и PngCache.
+"""
+
+import asyncio
+
+from app.infrastructure import render_service
+from app.infrastructure.render_service import PngCache, RenderService, RenderSpec
+
+
+def test_cache_key_depends_on_params_and_version():
+    """Ключ кэша стабилен и учитывает params и версию данных, но не payload."""
+    a = RenderSpec("digest", {"tf": "1h", "n_bars": 120})
+    b = RenderSpec("digest", {"n_bars": 120, "tf": "1h"}, payload=[1, 2, 3])
+
+    assert a.cache_key(1) == b.cache_key(1)
+    assert a.cache_key(1) != a.cache_key(2)
+    assert a.cache_key(1) != RenderSpec("digest", {"tf": "4h", "n_bars": 120}).cache_key(1)
+
+
+def test_png_cache_evicts_by_size(tmp_path):
+    """Память ограничена по байтам (LRU), диск переживает вытеснение из памяти."""
+    cache = PngCache(max_mem_bytes=10, disk_dir=str(tmp_path), max_disk_bytes=1024)
+    cache.put("aa1", b"12345")
+    cache.put("bb2", b"12345")
+    cache.get("aa1")            # aa1 становится «свежим»
+    cache.put("cc3", b"12345")  # вытесняет bb2 из памяти
+
+    assert cache.get_stats()["mem_entries"] == 2
+    assert cache.get("bb2") == b"12345"  # поднят с диска
+    assert cache.get("zz9") is None
+
+
+def test_render_is_cached_and_single_flight(monkeypatch):
+    """Одинаковые одновременные запросы рендерятся один раз, повтор — из кэша."""
+    calls = []
+
+    def fake_renderer(params, payload):
+        calls.append(params)
+        return b"PNG" + str(params["x"]).encode()
+
+    monkeypatch.setitem(render_service.RENDERERS, "fake", fake_renderer)
+    svc = RenderService(db_path=":memory:", max_workers=0, cache=PngCache(max_mem_bytes=1024, disk_dir=None))
+    spec = RenderSpec("fake", {"x": 1})
+
+    async def run():
+        first = await asyncio.gather(*(svc.render(spec, data_version=7) for _ in range(5)))
+        again = await svc.render(spec, data_version=7)
+        changed = await svc.render(spec, data_version=8)
+        return first, again, changed
+
+    first, again, changed = asyncio.run(run())
+
+    assert first == [b"PNG1"] * 5
+    assert again == b"PNG1"
+    assert changed == b"PNG1"
+    assert len(calls) == 2  # версия 7 и версия 8
+
+
+def test_data_version_uses_last_bar_ts(temp_db):
+    """Версия данных для графика метрики — ts последнего бара."""
+    temp_db.upsert_bar("BTC", "1h", 1_700_000_000_000, 1, 2, 0.5, 1.5, 10)
+    spec = RenderSpec("chart", {"metric": "BTC", "settings": {"timeframe": "1h"}})
+
+    assert RenderService.data_version(spec, temp_db) == 1_700_000_000_000
+    assert RenderService.bars_version(temp_db, ["BTC", "ETH"], "1h") == (1_700_000_000_000, None)
+
+
+def test_series_version_covers_all_timeframes_and_time(temp_db):
+    """Версия liquidity map меняется от бара любого ТФ и со временем, даже если 5m баров нет."""
+    v = lambda now: RenderService.series_version(temp_db, ["SOL"], ["5m", "1h"], bucket_sec=60, now=now)
+    assert v(6_000.0) == ((None, None), 100)
+    temp_db.upsert_bar("SOL", "1h", 1_700_000_000_000, 1, 2, 0.5, 1.5, 10)
+    assert v(6_000.0) == ((None, 1_700_000_000_000), 100)
+    assert v(6_060.0)[1] == 101
@@ -0,0 +1,102 @@
+"""
+Тесты для replay-харнесса (app.replay).
+"""
+
+import os
+
+import pytest
+import requests
+
+from app.infrastructure.db import DB
+from app.replay import (
+    Recording, ReplayConfig, ReplayHarness, ReplayNetworkError, compare_golden, synthetic_recording,
+)
+from app.replay.stubs import offline
+
+CONFIG = ReplayConfig(doctor_min_bars=20)
+
+
+def _run(tmp_path, name, recording, config=CONFIG, **kwargs):
+    db = DB(os.path.join(str(tmp_path), f"{name}.db"))
+    try:
+        return ReplayHarness(db, recording, config, **kwargs).run()
+    finally:
+        db.close()
+
+
+@pytest.fixture(scope="module")
+def recording():
+    return synthetic_recording(days=1.5, seed=3)
+
+
+def test_replay_is_deterministic_and_drives_all_stages(tmp_path, recording):
+    """Два прогона одной записи дают одинаковый golden; все стадии конвейера отработали."""
+    first = _run(tmp_path, "a", recording)
+    second = _run(tmp_path, "b", recording)
+
+    assert compare_golden(first.golden(), second.golden()) == []
+    counts = first.golden()["counts"]
+    assert counts["bars_written"] > 0 and counts["webhook_rejected"] == 0
+    assert counts["risk"] > 0 and counts["doctor"] > 0 and counts["trades"] > 0
+    assert counts["messages"] > 0
+    assert first.stages["aggregate"]["count"] == first.ticks
+    assert first.throughput()["speedup"] > 100
+
+
+def test_golden_detects_changed_output(tmp_path, recording):
+    """Изменённый бар во входе меняет golden, сохранённая на диск запись — нет."""
+    recording.save(str(tmp_path / "rec"))
+    loaded = Recording.load(str(tmp_path / "rec"))
+    assert loaded.counts() == recording.counts()
+
+    events = list(loaded.events)
+    i = next(i for i, e in enumerate(events) if e.kind == "bars")
+    bumped = dict(events[i].data, c=events[i].data["c"] * 1.01, h=events[i].data["h"] * 1.01)
+    events[i] = type(events[i])(events[i].ts, "bars", bumped)
+
+    base = _run(tmp_path, "base", loaded).golden()
+    changed = _run(tmp_path, "changed", Recording(events)).golden()
+    diffs = compare_golden(base, changed)
+    assert any(d.startswith("digests.bars") for d in diffs)
+
+
+def test_forecast_stage_uses_injected_forecaster(tmp_path):
+    """Стадия прогноза вызывается на закрытии ТФ с DataFrame баров из БД."""
+    seen = []
+
+    def forecaster(symbol, tf, df):
+        seen.append((symbol, tf, len(df)))
+        return {"ret_pred": 0.01, "p_up": 0.6}
+
+    config = ReplayConfig(doctor_symbols=(), forecast_symbols=("BTC",), analysis_timeframes=())
+    result = _run(tmp_path, "fc", synthetic_recording(days=0.5, seed=1), config, forecaster=forecaster)
+
+    assert len(result.outputs["forecasts"]) == len(seen) > 0
+    assert seen[-1][:2] == ("BTC", "1h") and seen[-1][2] > seen[0][2]
+
+
+def test_network_is_blocked_during_replay():
+    """Код под replay не может уйти в сеть мимо заглушек."""
+    with offline():
+        with pytest.raises(ReplayNetworkError):
+            requests.get("https://api.binance.com/api/v3/ping", timeout=1)
+
+
+def test_divergence_alerts_use_report_line(tmp_path):
+    """Алерт дивергенции — та же строка, что в отчёте (format_open_div); закрытые не рассылаются."""
+    from app.usecases.generate_report import format_open_div
+
+    db = DB(os.path.join(str(tmp_path), "alerts.db"))
+    try:
+        db.upsert_div(metric="BTC", timeframe="1h", indicator="RSI", side="bullish", implication="bullish_reversal",
+                      pivot_l_ts=1, pivot_l_val=1.0, pivot_r_ts=2, pivot_r_val=2.0, detected_ts=2)
+        db.upsert_div(metric="ETH", timeframe="4h", indicator="MACD", side="bearish", implication="bearish_reversal",
+                      pivot_l_ts=1, pivot_l_val=1.0, pivot_r_ts=2, pivot_r_val=2.0, detected_ts=2)
+        db.conn.execute("UPDATE divs SET status='invalidated' WHERE metric='ETH'")
+        harness = ReplayHarness(db, Recording([]), CONFIG)
+        harness._divergence_alerts(2)
+        sent = [t for _, _, t in harness.telegram.sent]
+        assert sent == ["1h · " + format_open_div("BTC", "RSI", "bullish", "active", None)] * len(CONFIG.subscribers)
+        assert len(harness._outputs["alerts"]) == 2
+    finally:
+        db.close()
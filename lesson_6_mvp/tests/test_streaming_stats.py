@@ -0,0 +1,113 @@
+"""
+Тесты потоковой статистики (usecases.streaming_stats): совпадение с пересчётом по барам
+в analytics, дочитывание новых баров, ожидание неполного бара, пересборка при правке.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.usecases import analytics
+from app.usecases.streaming_stats import StreamingStats
+
+H1 = 3_600_000
+T0 = 1_735_689_600_000
+METRICS = ("BTC", "ETHBTC", "USDT.D", "BTC.D", "TOTAL2", "TOTAL3")
+
+
+def _walk(n, seed=7):
+    rng = np.random.default_rng(seed)
+    common = rng.normal(0, 0.01, n)
+    out = {}
+    for j, m in enumerate(METRICS):
+        r = (0.5 + 0.3 * j) * common + rng.normal(0, 0.005 + 0.002 * j, n)
+        out[m] = 100.0 * (1 + j) * np.cumprod(1 + r)
+    return out
+
+
+def _write(db, prices, start, stop, metrics=METRICS):
+    rows = []
+    for m in metrics:
+        for i in range(start, stop):
+            c = float(prices[m][i])
+            rows.append((m, "1h", T0 + (i + 1) * H1, c, c * 1.01, c * 0.99, c, 1.0))
+    db.upsert_many_bars(rows)
+
+
+def _bars_only(monkeypatch):
+    monkeypatch.setattr(analytics, "_streaming", lambda db: None)
+
+
+def _stats(db):
+    stats = StreamingStats(db, metrics=METRICS, timeframes=("1h",), max_age_sec=0)
+    stats_of = {id(db): stats}
+    return stats, (lambda d: stats_of.get(id(d)))
+
+
+def _assert_same(monkeypatch, db, stream):
+    monkeypatch.setattr(analytics, "_streaming", stream)
+    corr_s, betas_s = analytics.corr_matrix_and_beta(db, list(METRICS), "BTC", "1h", n=600)
+    vol_s = analytics.vol_regime(db, "TOTAL2", "1h", n=1200)
+    br_s = analytics.breadth(db, list(METRICS), "1h")
+    _bars_only(monkeypatch)
+    corr_b, betas_b = analytics.corr_matrix_and_beta(db, list(METRICS), "BTC", "1h", n=600)
+    vol_b = analytics.vol_regime(db, "TOTAL2", "1h", n=1200)
+    br_b = analytics.breadth(db, list(METRICS), "1h")
+
+    pd.testing.assert_frame_equal(corr_s, corr_b, rtol=1e-9, atol=1e-9)
+    assert betas_s == pytest.approx(betas_b, rel=1e-9)
+    assert (vol_s.rv_7, vol_s.rv_30, vol_s.atr_14) == pytest.approx((vol_b.rv_7, vol_b.rv_30, vol_b.atr_14), rel=1e-9)
+    assert (vol_s.regime, vol_s.pctl) == (vol_b.regime, vol_b.pctl)
+    assert br_s == br_b
+
+
+def test_matches_bar_path_after_build_and_incremental(temp_db, monkeypatch):
+    prices = _walk(1400)
+    _write(temp_db, prices, 0, 1300)
+    stats, stream = _stats(temp_db)
+    assert stats.refresh() == {"1h": 1200}
+    _assert_same(monkeypatch, temp_db, stream)
+
+    _write(temp_db, prices, 1300, 1400)                         # 100 новых баров — только дописываются
+    assert stats.refresh() == {"1h": 100}
+    assert stats.get_stats()["rebuilds"] == 1
+    _assert_same(monkeypatch, temp_db, stream)
+
+
+def test_subset_and_fallbacks(temp_db):
+    prices = _walk(700)
+    _write(temp_db, prices, 0, 700)
+    stats, _ = _stats(temp_db)
+    corr, betas = stats.corr_beta("1h", ["ETHBTC", "BTC"], base="BTC")
+    assert list(corr.columns) == ["ETHBTC", "BTC"] and betas["BTC"] == pytest.approx(1.0)
+    assert stats.corr_beta("1h", ["BTC", "SOL"], base="BTC") is None         # метрика вне вселенной
+    assert stats.realized_vol("1h", "BTC", 30) is None                        # окно 1200 ещё не набрано
+    assert stats.breadth("1h", ma_short=20) is None
+
+
+def test_ew_cov_matches_pandas(temp_db):
+    prices = _walk(300)
+    _write(temp_db, prices, 0, 300)
+    stats, _ = _stats(temp_db)
+    rets = pd.DataFrame(prices).pct_change().dropna()
+    alpha = 1 - 0.5 ** (1 / stats.halflife)
+    expected = rets.ewm(alpha=alpha, adjust=False).corr().loc[rets.index[-1]]
+    np.testing.assert_allclose(stats.corr("1h", kind="ew").to_numpy(), expected.to_numpy(), rtol=1e-8)
+
+
+def test_waits_for_all_metrics_and_rebuilds_on_edit(temp_db):
+    prices = _walk(200)
+    _write(temp_db, prices, 0, 199)
+    stats, _ = _stats(temp_db)
+    stats.refresh()
+    ts = stats.get_stats()["1h"]["ts"]
+
+    _write(temp_db, prices, 199, 200, metrics=METRICS[:3])       # бар закрылся не у всех метрик
+    assert stats.refresh() == {"1h": 0} and stats.get_stats()["1h"]["ts"] == ts
+    _write(temp_db, prices, 199, 200, metrics=METRICS[3:])
+    assert stats.refresh() == {"1h": 1} and stats.get_stats()["1h"]["ts"] == ts + H1
+
+    temp_db.upsert_bar("BTC", "1h", ts + H1, 1.0, 1.0, 1.0, 1.0, 1.0)           # правка учтённого бара
+    stats.refresh()
+    assert stats.get_stats()["rebuilds"] == 2
+    assert stats.breadth("1h")["total"] == len(METRICS)
@@ -0,0 +1,158 @@
+"""
+Тесты хранилища сделок (infrastructure.trade_store): дедупликация, масштаб цен, дневные партиции,
+retention, миграция старой таблицы trades и делегирование из DB.
+"""
+
+import os
+import sqlite3
+
+import pytest
+
+from app.infrastructure.db import DB
+from app.infrastructure.trade_store import DAY_MS, TradeStore, default_path, trade_id
+
+DAY0 = 1_735_689_600_000          # 2025-01-01 00:00 UTC
+
+
+def _trade(t, price=100.5, qty=0.25, ex="Binance", sym="BTCUSDT", tid=None, buyer=True):
+    d = {"symbol": sym, "exchange": ex, "time": t, "price": price, "qty": qty, "is_buyer": buyer}
+    if tid is not None:
+        d["trade_id"] = tid
+    return d
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = TradeStore(str(tmp_path / "t_trades.db"))
+    yield s
+    s.close()
+
+
+def test_trade_id_numeric_string_and_fallback():
+    assert trade_id({"trade_id": 42}) == 42
+    assert trade_id({"trade_id": "42"}) == 42
+    h = trade_id({"trade_id": "b3c1-ef"})
+    assert 0 <= h < 2 ** 63 and h == trade_id({"trade_id": "b3c1-ef"})
+    assert trade_id({"price": 1.0, "qty": 2.0}) != trade_id({"price": 1.0, "qty": 2.5})
+
+
+def test_insert_dedup_and_scaling(store):
+    rows = [_trade(DAY0 + 1, tid=1), _trade(DAY0 + 1, tid=2), _trade(DAY0 + 1, tid=1, price=999.0)]
+    assert store.insert(rows) == 2                                   # повтор id биржи — дубль
+    assert store.insert([_trade(DAY0 + 5, price=0.1 + 0.2)]) == 1
+    assert store.insert([_trade(DAY0 + 5, price=0.3)]) == 0          # без id: тот же (price, qty) после масштаба
+    out = store.range("BTCUSDT", DAY0, DAY0 + 10)
+    assert [r["price"] for r in out] == [100.5, 100.5, 0.3]
+    assert out[0] == {"time": DAY0 + 1, "price": 100.5, "qty": 0.25, "is_buyer": True, "exchange": "Binance"}
+    with pytest.raises(ValueError):
+        store.insert([_trade(DAY0, price=1e12, tid=9)])
+
+
+def test_range_spans_partitions_and_filters(store):
+    store.insert([_trade(DAY0 - 10, tid=1), _trade(DAY0 + 10, tid=2, ex="OKX"),
+                  _trade(DAY0 + 20, tid=3, sym="ETHUSDT"), _trade(DAY0 + DAY_MS + 5, tid=4, buyer=False)])
+    assert store.partitions() == ["20241231", "20250101", "20250102"]
+    got = store.range("BTCUSDT", DAY0 - 100, DAY0 + DAY_MS + 100)
+    assert [r["time"] for r in got] == [DAY0 - 10, DAY0 + 10, DAY0 + DAY_MS + 5]
+    assert [r["exchange"] for r in store.range("BTCUSDT", 0, DAY0 + 2 * DAY_MS, exchange="OKX")] == ["OKX"]
+    assert store.range("BTCUSDT", 0, DAY0 + 2 * DAY_MS, exchange="Kraken") == []
+    assert store.range("DOGEUSDT", 0, DAY0 + 2 * DAY_MS) == []
+    arr = store.range_arrays("BTCUSDT", DAY0, DAY0 + DAY_MS + 100)
+    assert arr["is_buyer"].tolist() == [True, False] and arr["price"].dtype.kind == "f"
+
+
+def test_retain_drops_whole_days(store, tmp_path):
+    store.insert([_trade(DAY0 + i * 3_600_000, tid=i) for i in range(48)])     # два дня по 24 сделки
+    now = DAY0 + 2 * DAY_MS + 3_600_000
+    assert store.retain(max_age_hours=24, archive_dir="", now_ms=now) == 24     # 1 января кончилось до cutoff
+    assert store.partitions() == ["20250102"] and store.count() == 24
+    assert store.retain(max_age_hours=24, archive_dir="", now_ms=now) == 0
+
+
+def test_retain_keeps_partition_when_archive_fails(store, tmp_path, monkeypatch):
+    store.insert([_trade(DAY0, tid=1)])
+
+    def boom(day, archive_dir):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(store, "archive_partition", boom)
+    assert store.retain(max_age_hours=1, archive_dir=str(tmp_path), now_ms=DAY0 + 3 * DAY_MS) == 0
+    assert store.partitions() == ["20250101"]
+
+
+def test_archive_partition_parquet(store, tmp_path):
+    pytest.importorskip("pyarrow")
+    import pandas as pd
+
+    store.insert([_trade(DAY0 + 1, tid=7, ex="Bybit")])
+    assert store.retain(max_age_hours=1, archive_dir=str(tmp_path / "arch"), now_ms=DAY0 + 3 * DAY_MS) == 1
+    df = pd.read_parquet(tmp_path / "arch" / "trades_20250101.parquet")
+    assert df.to_dict("records") == [{"symbol": "BTCUSDT", "exchange": "Bybit", "time": DAY0 + 1, "trade_id": 7,
+                                      "price": 100.5, "qty": 0.25, "is_buyer": True}]
+
+
+def test_db_migrates_legacy_table_and_delegates(tmp_path):
+    path = str(tmp_path / "main.db")
+    legacy = sqlite3.connect(path)
+    legacy.executescript("""
+        CREATE TABLE trades (id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT NOT NULL, exchange TEXT NOT NULL,
+            time INTEGER NOT NULL, price REAL NOT NULL, qty REAL NOT NULL, is_buyer INTEGER NOT NULL,
+            collected_at INTEGER NOT NULL, UNIQUE(symbol, exchange, time, price, qty));
+    """)
+    legacy.executemany("INSERT INTO trades(symbol, exchange, time, price, qty, is_buyer, collected_at) "
+                       "VALUES (?,?,?,?,?,?,?)",
+                       [("BTCUSDT", "Gate", DAY0 + i, 10.0 + i, 1.0, i % 2, DAY0) for i in range(5)])
+    legacy.commit()
+    legacy.close()
+
+    db = DB(path)
+    try:
+        got = db.get_trades_by_period("BTCUSDT", DAY0, DAY0 + 100)
+        assert [r["price"] for r in got] == [10.0, 11.0, 12.0, 13.0, 14.0]
+        assert db.conn.execute("SELECT 1 FROM sqlite_master WHERE name='trades'").fetchone() is None
+        assert os.path.exists(default_path(path))
+        # сборщик отдаёт то же окно повторно — дублей нет
+        assert db.upsert_many_trades([_trade(DAY0 + 1, price=11.0, qty=1.0, ex="Gate", buyer=True)]) == 0
+        assert db.upsert_many_trades([_trade(DAY0 + 50, tid=123, ex="Gate")]) == 1
+        assert db.cleanup_old_trades(max_age_hours=24) == 6
+        assert db.get_trades_by_period("BTCUSDT", 0) == []
+    finally:
+        db.close()
+
+
+def test_dict_ids_unique_across_store_instances(tmp_path):
+    """Два процесса (экземпляра) на одном файле не выдают один id разным символам."""
+    path = str(tmp_path / "shared_trades.db")
+    a, b = TradeStore(path), TradeStore(path)
+    try:
+        a.insert([_trade(DAY0 + 1, sym="BTCUSDT", tid=1)])
+        b.insert([_trade(DAY0 + 2, sym="ETHUSDT", price=3000.0, tid=1)])
+
+        assert [t["price"] for t in b.range("ETHUSDT", DAY0, DAY0 + 10)] == [3000.0]
+        assert [t["price"] for t in a.range("BTCUSDT", DAY0, DAY0 + 10)] == [100.5]
+        assert [t["price"] for t in a.range("ETHUSDT", DAY0, DAY0 + 10)] == [3000.0]
+        ids = a.conn.execute("SELECT name, id FROM trade_dict WHERE kind='sym' ORDER BY id").fetchall()
+        assert ids == [("BTCUSDT", 1), ("ETHUSDT", 2)]
+    finally:
+        a.close()
+        b.close()
+
+
+def test_partitions_created_or_dropped_by_other_process(tmp_path):
+    """Партиции другого процесса: новые дни видны в range, удалённые — пустые, без OperationalError."""
+    path = str(tmp_path / "shared_parts.db")
+    reader, writer = TradeStore(path), TradeStore(path)
+    try:
+        writer.insert([_trade(DAY0 + 1, tid=1)])
+        assert len(reader.range("BTCUSDT", DAY0, DAY0 + 10)) == 1
+        writer.insert([_trade(DAY0 + DAY_MS + 1, tid=2)])                           # новый день у писателя
+        assert [t["time"] for t in reader.range("BTCUSDT", DAY0, DAY0 + DAY_MS + 10)] == [DAY0 + 1, DAY0 + DAY_MS + 1]
+
+        writer.retain(max_age_hours=0, archive_dir="", now_ms=DAY0 + DAY_MS)        # удалил первый день
+        assert [t["time"] for t in reader.range("BTCUSDT", DAY0, DAY0 + DAY_MS + 10)] == [DAY0 + DAY_MS + 1]
+        assert reader.count() == 1
+        assert reader.insert([_trade(DAY0 + 5, tid=3)]) == 1                        # партиция пересоздаётся
+        assert writer.count() == 2
+    finally:
+        reader.close()
+        writer.close()
@@ -0,0 +1,161 @@
+"""
+Тесты алертов watchlist (usecases.watch_alerts): пересечения уровней по индексу, cooldown и once,
+событийные правила, опрос баров/дивергенций из БД с доставкой и бенчмарк на 100k правил.
+"""
+
+import pytest
+
+from app.usecases.watch_alerts import WatchAlertEngine, bench, parse_rule_args
+
+H1 = 3_600_000
+T0 = 1_735_689_600_000
+
+
+def _engine():
+    sent = []
+    return WatchAlertEngine(None, send=lambda uid, text: sent.append((uid, text))), sent
+
+
+def test_level_crossing_once_cooldown_and_remove():
+    eng, _ = _engine()
+    up = eng.add_rule(1, "btc", "1h", "price", level=100.0, direction="up", once=True)
+    down = eng.add_rule(2, "BTC", "1h", "price", level=95.0, direction="down", cooldown_sec=10800)
+    both = eng.add_rule(3, "BTC", "1h", "price", level=98.0, direction="any", cooldown_sec=0)
+    eng.add_rule(4, "BTC", "4h", "price", level=99.0, direction="up")                 # другой ТФ
+
+    assert eng.on_bar("BTC", "1h", T0, 97.0) == []                                  # первое значение — без пересечения
+    hit = eng.on_bar("BTC", "1h", T0 + H1, 100.0)                                   # (97, 100] — вверх
+    assert {a.rule.id for a in hit} == {up.id, both.id} and all(a.detail == "up" for a in hit)
+    assert up.id not in {r.id for r in eng.rules_for(1)}                            # once снят из индекса
+
+    hit = eng.on_bar("BTC", "1h", T0 + 2 * H1, 94.0)                                # [94, 100) — вниз
+    assert {a.rule.id for a in hit} == {down.id, both.id}
+    assert [a.rule.id for a in eng.on_bar("BTC", "1h", T0 + 3 * H1, 99.0)] == [both.id]
+    hit = eng.on_bar("BTC", "1h", T0 + 4 * H1, 94.5)                                # down в cooldown 3 ч
+    assert {a.rule.id for a in hit} == {both.id}
+    assert eng.get_stats()["suppressed"] == 1
+
+    assert eng.remove_rule(both.id, user_id=99) is False and eng.remove_rule(both.id, user_id=3)
+    eng.on_bar("BTC", "1h", T0 + 5 * H1, 99.0)
+    assert eng.on_bar("BTC", "1h", T0 + 9 * H1, 90.0)[0].rule.id == down.id
+    assert eng.get_stats()["rules"] == 2
+
+
+def test_event_rules_and_scores():
+    eng, sent = _engine()
+    eng.add_rule(1, "ETH", "4h", "phase", param="MARKUP")
+    eng.add_rule(2, "ETH", "4h", "phase")
+    eng.add_rule(1, "ETH", "4h", "pump", level=0.8)
+    eng.add_rule(3, "BTC", "1h", "divergence", param="bullish")
+    eng.add_rule(3, "BTC", "1h", "twap", param="BUY", level=1e6)
+    eng.add_rule(4, "BTC", "1h", "funding", level=0.05)
+
+    assert eng.on_diagnostics("ETH", "4h", T0, phase="ACCUMULATION", pump_score=0.5) == []
+    alerts = eng.on_diagnostics("ETH", "4h", T0 + H1, phase="MARKUP", pump_score=0.85)
+    assert sorted((a.rule.user_id, a.rule.kind) for a in alerts) == [(1, "phase"), (1, "pump"), (2, "phase")]
+    assert eng.on_diagnostics("ETH", "4h", T0 + 2 * H1, phase="DISTRIBUTION")[0].rule.user_id == 2
+
+    assert eng.on_divergence("BTC", "1h", T0, "RSI", "bearish") == []
+    assert eng.on_divergence("BTC", "1h", T0, "RSI", "bullish")[0].text() == "BTC 1h: подтверждена дивергенция bullish RSI"
+    assert eng.on_twap("BTC", T0, "SELL", 5e6) == [] and eng.on_twap("BTC", T0, "BUY", 5e5) == []
+    twap = eng.on_twap("BTC", T0, "BUY", 2e6)
+    assert twap[0].rule.tf == "*"
+    eng.on_funding("BTC", T0, 0.01)
+    funding = eng.on_funding("BTC", T0 + H1, 0.06)
+
+    assert eng.deliver(alerts + twap + funding) == 4                                 # одно сообщение на пользователя
+    by_user = dict(sent)
+    assert by_user[1].count("•") == 2 and "funding +0.0600%" in by_user[4]
+
+
+def test_poll_bars_and_divergences_from_db(temp_db):
+    sent = []
+    eng = WatchAlertEngine(temp_db, send=lambda uid, text: sent.append((uid, text)))
+    temp_db.upsert_bar("BTC", "1h", T0, 100, 101, 99, 100, 1)
+    r1 = eng.add_rule(7, "BTC", "1h", "price", level=105.0, direction="up", once=True)
+    eng.add_rule(8, "BTC", "1h", "divergence")
+    assert eng.poll(derivatives=False) == []                                        # засев курсоров
+
+    temp_db.upsert_many_bars([("BTC", "1h", T0 + H1, 100, 104, 99, 103, 1), ("BTC", "1h", T0 + 2 * H1, 103, 107, 102, 106, 1),
+                              ("ETH", "1h", T0 + H1, 1, 1, 1, 200, 1)])
+    temp_db.upsert_div(metric="BTC", timeframe="1h", indicator="RSI", side="bullish", implication="neutral",
+                       pivot_l_ts=T0, pivot_l_val=1.0, pivot_r_ts=T0 + H1, pivot_r_val=2.0, detected_ts=T0 + H1)
+    div_id = temp_db.conn.execute("SELECT id FROM divs").fetchone()[0]
+    temp_db.confirm_div_by_id(div_id, T0 + 2 * H1)
+
+    alerts = eng.poll(derivatives=False)
+    assert sorted(a.rule.kind for a in alerts) == ["divergence", "price"]
+    assert eng.poll(derivatives=False) == []                                        # бары уже прочитаны
+    assert eng.deliver(alerts) == 2 and {u for u, _ in sent} == {7, 8}
+
+    again = WatchAlertEngine(temp_db, send=lambda uid, text: None)                  # рестарт: once выключен
+    assert [r.kind for r in again.rules_for(7)] == [] and [r.kind for r in again.rules_for(8)] == ["divergence"]
+    assert again._fired and r1.id not in again._rules
+
+
+def test_poll_bars_symbol_without_history_starts_at_now(temp_db):
+    eng = WatchAlertEngine(temp_db, send=lambda uid, text: None)
+    temp_db.upsert_bar("BTC", "1h", T0, 100, 101, 99, 100, 1)
+    eng.add_rule(7, "BTC", "1h", "price", level=105.0, direction="up")
+    eng.add_rule(9, "SOL", "1h", "price", level=50.0, direction="up")              # по SOL баров нет
+    assert eng.poll(now_ms=T0 + H1, derivatives=False) == []
+    assert eng._bar_cursor[("SOL", "1h")] == T0 + H1
+
+    seen = []
+    real = temp_db.closes_after
+    temp_db.closes_after = lambda metrics, tf, after: seen.append(after) or real(metrics, tf, after)
+    temp_db.upsert_many_bars([("SOL", "1h", T0 - H1, 40, 60, 40, 60, 1), ("SOL", "1h", T0, 60, 60, 40, 40, 1)])
+    assert eng.poll(now_ms=T0 + H1, derivatives=False) == [] and seen == [T0]      # бэкфилл истории — без алертов
+    temp_db.upsert_bar("SOL", "1h", T0 + 2 * H1, 40, 60, 40, 45, 1)                # первый живой бар — уровень
+    assert eng.poll(now_ms=T0 + 2 * H1, derivatives=False) == []
+    temp_db.upsert_bar("SOL", "1h", T0 + 3 * H1, 45, 60, 45, 55, 1)
+    assert [a.rule.user_id for a in eng.poll(now_ms=T0 + 3 * H1, derivatives=False)] == [9]
+
+
+def test_poll_bars_fire_idle_readd_seeds_from_latest_bar(temp_db):
+    """Правило сработало (once), символ выпал из опроса, цена ушла — новое правило не ловит старое пересечение."""
+    eng = WatchAlertEngine(temp_db, send=lambda uid, text: None)
+    temp_db.upsert_bar("BTC", "1h", T0, 100, 100, 100, 100, 1)
+    eng.add_rule(7, "BTC", "1h", "price", level=150.0, direction="up", once=True)
+    assert eng.poll(now_ms=T0, derivatives=False) == []
+    temp_db.upsert_bar("BTC", "1h", T0 + H1, 100, 160, 100, 160, 1)
+    assert [a.rule.user_id for a in eng.poll(now_ms=T0 + H1, derivatives=False)] == [7]
+    assert ("BTC", "1h") not in eng._bar_cursor                                     # правил нет — курсор сброшен
+
+    temp_db.upsert_many_bars([("BTC", "1h", T0 + i * H1, 150, 250, 150, 160 + 2 * i, 1) for i in range(2, 50)])
+    eng.add_rule(8, "BTC", "1h", "price", level=180.0, direction="up")
+    assert eng.poll(now_ms=T0 + 49 * H1, derivatives=False) == []                   # засев с последнего бара
+    temp_db.upsert_bar("BTC", "1h", T0 + 50 * H1, 250, 250, 170, 170, 1)
+    temp_db.upsert_bar("BTC", "1h", T0 + 51 * H1, 170, 190, 170, 190, 1)
+    alerts = eng.poll(now_ms=T0 + 51 * H1, derivatives=False)
+    assert [(a.rule.user_id, a.ts) for a in alerts] == [(8, T0 + 51 * H1)]
+
+
+def test_check_symbol_rejects_price_rules_without_bars(temp_db):
+    eng = WatchAlertEngine(temp_db, send=lambda uid, text: None)
+    temp_db.upsert_bar("BTC", "1h", T0, 100, 101, 99, 100, 1)
+    eng.check_symbol("btc", "1h", "price")
+    eng.check_symbol("ETH", "4h", "phase")                                          # не ценовое — без проверки
+    with pytest.raises(ValueError, match="ETH 1h нет баров.*BTC"):
+        eng.check_symbol("ETH", "1h", "price")
+    with pytest.raises(ValueError, match="BTC 4h"):
+        eng.check_symbol("BTC", "4h", "price")
+
+
+def test_parse_rule_args():
+    assert parse_rule_args(["btc", "1h", "price", ">", "70000"]) == {
+        "symbol": "BTC", "tf": "1h", "kind": "price", "level": 70000.0, "direction": "up", "once": True}
+    assert parse_rule_args(["ETH", "phase", "markup"]) == {"symbol": "ETH", "tf": "4h", "kind": "phase",
+                                                           "param": "MARKUP"}
+    assert parse_rule_args(["BTC", "funding", "-0.03%"])["direction"] == "down"
+    assert parse_rule_args(["BTC", "twap", "sell", "500000"])["param"] == "SELL"
+    assert parse_rule_args(["BTC", "4h", "div", "Bullish"])["kind"] == "divergence"
+    for bad in (["BTC"], ["BTC", "1h", "moon"], ["BTC", "price"], ["SOL", "1h", "pump", "0.8"]):
+        with pytest.raises(ValueError):
+            parse_rule_args(bad)
+
+
+def test_bench_100k_rules_sub_millisecond():
+    res = bench(n_rules=100_000, n_symbols=200, n_bars=1_000)
+    assert res["fired"] > 0
+    assert res["p50_us"] < 1000 and res["p99_us"] < 5000